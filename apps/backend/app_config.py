@@ -93,13 +93,21 @@ class AppConfig:
     EMBEDDING_DEVICE: str = os.getenv('EMBEDDING_DEVICE', 'cpu')  # cpu/cuda
     EMBEDDINGS_MAX_LENGTH: int = int(os.getenv('EMBEDDINGS_MAX_LENGTH', 512))
     EMBEDDING_BATCH_SIZE: int = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))
-    EMBEDDING_CACHE_SIZE: int = int(os.getenv('EMBEDDING_CACHE_SIZE', 1000))
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv('EMBEDDING_CACHE_SIZE', 1000))  # entradas em memória (LRU)
+    # Cache persistente de embeddings (SQLite compartilhado entre serviços e processos)
+    EMBEDDING_CACHE_PATH: str = os.getenv('EMBEDDING_CACHE_PATH', '')  # padrão: <VECTOR_DB_PATH>/embedding_cache.sqlite3
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 50000))
+    EMBEDDING_CACHE_WARM_ENTRIES: int = int(os.getenv('EMBEDDING_CACHE_WARM_ENTRIES', 1000))
 
     # Sentence-transformers v5.1+ otimizações
     EMBEDDING_CHUNK_SIZE: int = int(os.getenv('EMBEDDING_CHUNK_SIZE', 32))  # Para textos longos
     EMBEDDING_PARALLEL_PROCESSING: bool = os.getenv('EMBEDDING_PARALLEL_PROCESSING', 'false').lower() == 'true'
     EMBEDDING_CONTEXT_TYPE: str = os.getenv('EMBEDDING_CONTEXT_TYPE', 'auto')  # auto/query/document
     EMBEDDING_USE_SPECIALIZED_METHODS: bool = os.getenv('EMBEDDING_USE_SPECIALIZED_METHODS', 'true').lower() == 'true'
+    # Micro-batching de embed_text() concorrentes (janela curta, textos idênticos coalescidos)
+    EMBEDDING_MICROBATCH_ENABLED: bool = os.getenv('EMBEDDING_MICROBATCH_ENABLED', 'true').lower() == 'true'
+    EMBEDDING_MICROBATCH_MAX_SIZE: int = int(os.getenv('EMBEDDING_MICROBATCH_MAX_SIZE', 32))
+    EMBEDDING_MICROBATCH_MAX_WAIT_MS: float = float(os.getenv('EMBEDDING_MICROBATCH_MAX_WAIT_MS', '5'))
     
     # Vector DB Config - Supabase pgvector
     VECTOR_DB_TYPE: str = os.getenv('VECTOR_DB_TYPE', 'supabase')  # 'supabase' or 'local'
@@ -109,6 +117,10 @@ class AppConfig:
     # Lower threshold = better recall of relevant medical chunks = improved accuracy
     SEMANTIC_SIMILARITY_THRESHOLD: float = float(os.getenv('SEMANTIC_SIMILARITY_THRESHOLD', '0.60'))
     PGVECTOR_DIMENSIONS: int = int(os.getenv('PGVECTOR_DIMENSIONS', '384'))  # MiniLM dimensions
+    # ANN engine for the local fallback store: 'ivf' (numpy), 'hnsw' (hnswlib) or 'none' (exact scan)
+    VECTOR_ANN_BACKEND: str = os.getenv('VECTOR_ANN_BACKEND', 'ivf')
+    VECTOR_ANN_NPROBE: int = int(os.getenv('VECTOR_ANN_NPROBE', '8'))
+    VECTOR_ANN_MIN_TRAIN_SIZE: int = int(os.getenv('VECTOR_ANN_MIN_TRAIN_SIZE', '1024'))  # exact scan below this
     
     # Cloud Storage Config - CACHE CLOUD ATIVADO
     EMBEDDINGS_CLOUD_CACHE: bool = os.getenv('EMBEDDINGS_CLOUD_CACHE', 'true').lower() == 'true'
@@ -119,6 +131,72 @@ class AppConfig:
     # Cache Config
     CACHE_MAX_SIZE: int = int(os.getenv('CACHE_MAX_SIZE', 1000))
     CACHE_TTL_MINUTES: int = int(os.getenv('CACHE_TTL_MINUTES', 60))
+    # Semantic answer cache - reuses RAG answers for paraphrased questions (same persona)
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))  # cosine
+    SEMANTIC_CACHE_TTL_SECONDS: int = int(os.getenv('SEMANTIC_CACHE_TTL_SECONDS', 3600))
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 2000))
+    # Cloud cache tiers (GCS/Supabase) - write-behind queue and negative caching
+    CLOUD_CACHE_WRITE_BEHIND: bool = os.getenv('CLOUD_CACHE_WRITE_BEHIND', 'true').lower() == 'true'
+    CLOUD_CACHE_QUEUE_SIZE: int = int(os.getenv('CLOUD_CACHE_QUEUE_SIZE', 1000))  # pending keys; oldest dropped when full
+    CLOUD_CACHE_FLUSH_BATCH_SIZE: int = int(os.getenv('CLOUD_CACHE_FLUSH_BATCH_SIZE', 50))
+    CLOUD_CACHE_FLUSH_INTERVAL_MS: int = int(os.getenv('CLOUD_CACHE_FLUSH_INTERVAL_MS', 200))  # coalescing window
+    CLOUD_CACHE_NEGATIVE_TTL_SECONDS: int = int(os.getenv('CLOUD_CACHE_NEGATIVE_TTL_SECONDS', 30))
+    # Medical analytics ingestion - ring buffer flushed in batched transactions (+ rollups)
+    ANALYTICS_BUFFER_SIZE: int = int(os.getenv('ANALYTICS_BUFFER_SIZE', 10000))  # events; oldest dropped when full
+    ANALYTICS_FLUSH_BATCH_SIZE: int = int(os.getenv('ANALYTICS_FLUSH_BATCH_SIZE', 1000))
+    ANALYTICS_FLUSH_INTERVAL_MS: int = int(os.getenv('ANALYTICS_FLUSH_INTERVAL_MS', 1000))
+    # Medical audit trail - encrypted fixed-size segments with an HMAC-keyed sidecar index
+    MEDICAL_AUDIT_DIR: str = os.getenv('MEDICAL_AUDIT_DIR', 'logs/medical_audit')
+    MEDICAL_AUDIT_SEGMENT_RECORDS: int = int(os.getenv('MEDICAL_AUDIT_SEGMENT_RECORDS', 1000))
+    # Metrics - DDSketch percentiles per minute/hour/day; workers merge through METRICS_SHARED_DIR
+    METRICS_SKETCH_ACCURACY: float = float(os.getenv('METRICS_SKETCH_ACCURACY', 0.01))  # relative error of p50/p95/p99
+    METRICS_SHARED_DIR: str = os.getenv('METRICS_SHARED_DIR', '')  # empty = per-process only
+    # Lexical (BM25) paragraph index - persisted per source content hash; empty = memory only
+    LEXICAL_INDEX_DIR: str = os.getenv('LEXICAL_INDEX_DIR', './cache/lexical_index')
+    # Índice compilado da base estruturada (data/structured), validado por mtime + SHA-256 dos arquivos
+    KNOWLEDGE_INDEX_DIR: str = os.getenv('KNOWLEDGE_INDEX_DIR', './cache/knowledge_index')
+    # Pipeline de indexação (scripts/index_knowledge_base.py): chunk -> embed em lote -> upsert em lote
+    INDEXING_CHUNK_WORKERS: int = int(os.getenv('INDEXING_CHUNK_WORKERS', 2))
+    INDEXING_EMBED_WORKERS: int = int(os.getenv('INDEXING_EMBED_WORKERS', 2))
+    INDEXING_QUEUE_SIZE: int = int(os.getenv('INDEXING_QUEUE_SIZE', 8))  # lotes em trânsito entre estágios
+    INDEXING_MANIFEST_PATH: str = os.getenv('INDEXING_MANIFEST_PATH', './cache/indexing_manifest.json')
+    # Estado do re-chunking incremental por documento (âncoras + impressão digital das seções); vazio = sem estado
+    CHUNK_STATE_DIR: str = os.getenv('CHUNK_STATE_DIR', './cache/chunk_state')
+    # Busca híbrida (BM25 + densa) no SemanticSearchEngine; pesos médicos aplicados após a fusão
+    HYBRID_SEARCH_ENABLED: bool = os.getenv('HYBRID_SEARCH_ENABLED', 'true').lower() == 'true'
+    HYBRID_FUSION: str = os.getenv('HYBRID_FUSION', 'rrf')  # 'rrf' ou 'weighted'
+    HYBRID_RRF_K: int = int(os.getenv('HYBRID_RRF_K', 60))
+    HYBRID_DENSE_WEIGHT: float = float(os.getenv('HYBRID_DENSE_WEIGHT', 0.6))  # só para 'weighted'
+    # BM25 normalizado (fração do maior score possível da consulta, sem stopwords) não é cosseno:
+    # threshold próprio, escalado junto com SEMANTIC_SIMILARITY_THRESHOLD quando a busca pede outro min_score
+    LEXICAL_SIMILARITY_THRESHOLD: float = float(os.getenv('LEXICAL_SIMILARITY_THRESHOLD', '0.35'))
+    
+    # Outbound HTTP - pooled keep-alive clients shared per process (OpenRouter, HuggingFace, Supabase)
+    HTTP_POOL_MAX_CONNECTIONS: int = int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', 20))  # per host
+    HTTP_POOL_MAX_KEEPALIVE: int = int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', 10))
+    HTTP_POOL_KEEPALIVE_EXPIRY: float = float(os.getenv('HTTP_POOL_KEEPALIVE_EXPIRY', '30'))  # seconds
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+    HTTP_READ_TIMEOUT: float = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+    HTTP2_ENABLED: bool = os.getenv('HTTP2_ENABLED', 'true').lower() == 'true'  # requires the h2 package
+
+    # SQLite pool - per-thread WAL readers + single batched writer per database file
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 30000))
+    SQLITE_MMAP_SIZE: int = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv('SQLITE_CACHE_SIZE_KB', 16384))  # per connection
+    SQLITE_CACHED_STATEMENTS: int = int(os.getenv('SQLITE_CACHED_STATEMENTS', 256))
+    SQLITE_WRITE_BATCH_SIZE: int = int(os.getenv('SQLITE_WRITE_BATCH_SIZE', 256))  # max jobs per commit
+
+    # JWT session-state cache - skips the sessions lookup per request; revocations propagate via polling
+    JWT_SESSION_CACHE_TTL_SECONDS: float = float(os.getenv('JWT_SESSION_CACHE_TTL_SECONDS', '30'))  # 0 disables
+    JWT_SESSION_CACHE_MAX_ENTRIES: int = int(os.getenv('JWT_SESSION_CACHE_MAX_ENTRIES', 10000))
+    JWT_REVOCATION_POLL_SECONDS: float = float(os.getenv('JWT_REVOCATION_POLL_SECONDS', '2'))  # max revocation lag
+
+    # Postgres pool (pgvector) - shared by RealSupabaseClient threads
+    PG_POOL_MIN_CONNECTIONS: int = int(os.getenv('PG_POOL_MIN_CONNECTIONS', 1))
+    PG_POOL_MAX_CONNECTIONS: int = int(os.getenv('PG_POOL_MAX_CONNECTIONS', 10))
+    PG_POOL_CHECKOUT_TIMEOUT: float = float(os.getenv('PG_POOL_CHECKOUT_TIMEOUT', '10'))  # seconds
+    PG_PREPARED_STATEMENTS: bool = os.getenv('PG_PREPARED_STATEMENTS', 'true').lower() == 'true'  # false behind PgBouncer transaction mode
     
     # Security Middleware - ATIVADO POR PADRÃO
     SECURITY_MIDDLEWARE_ENABLED: bool = os.getenv('SECURITY_MIDDLEWARE_ENABLED', 'true').lower() == 'true'
@@ -127,6 +205,8 @@ class AppConfig:
     RATE_LIMIT_ENABLED: bool = os.getenv('RATE_LIMIT_ENABLED', '').lower() != 'false'
     RATE_LIMIT_DEFAULT: str = os.getenv('RATE_LIMIT_DEFAULT', '200/hour')
     RATE_LIMIT_CHAT: str = os.getenv('RATE_LIMIT_CHAT', '50/hour')
+    RATE_LIMIT_SHARDS: int = int(os.getenv('RATE_LIMIT_SHARDS', 64))  # lock stripes of the in-memory buckets
+    RATE_LIMIT_PERSIST_SECONDS: float = float(os.getenv('RATE_LIMIT_PERSIST_SECONDS', '5'))  # bucket/stats sync to SQLite
     
     # Security Settings - Bloqueio automático após ataques
     SECURITY_AUTO_BLOCK_ENABLED: bool = os.getenv('SECURITY_AUTO_BLOCK_ENABLED', 'true').lower() == 'true'
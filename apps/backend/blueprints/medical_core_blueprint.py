@@ -5,8 +5,9 @@ Combines: Core medical chat + Medical validation + Health checks
 Strategic consolidation for medical platform optimization
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from datetime import datetime
+import json
 import logging
 
 from core.logging.sanitizer import sanitize_error
@@ -47,17 +48,29 @@ def chat():
         # Map persona names for RAG system
         rag_persona = 'dr_gasnelio' if persona in ['gasnelio', 'dr_gasnelio'] else 'ga_empathetic'
 
-        # Get RAG context using Supabase RAG system
+        # Get RAG context through the async chat pipeline (retrieval + generation
+        # on one event loop); sync Supabase RAG only as fallback
         rag_response = None
         rag_used = False
 
         try:
-            from services.rag.supabase_rag_system import query_rag_system
-            rag_response = query_rag_system(message, persona=rag_persona, max_chunks=3)
-            rag_used = rag_response is not None
-            logger.info("RAG query successful: %s, system: supabase_rag", rag_used)
+            from services.rag.async_chat_pipeline import get_chat_pipeline, run_sync
+            pipeline = get_chat_pipeline()
+            if pipeline is not None:
+                rag_response = run_sync(pipeline.answer(message, persona=rag_persona, max_chunks=3))
+                rag_used = rag_response is not None
+                logger.info("RAG query successful: %s, system: async_pipeline", rag_used)
         except Exception as e:
-            logger.warning("RAG query failed: %s", sanitize_error(e))
+            logger.warning("Async chat pipeline failed: %s", sanitize_error(e))
+
+        if rag_response is None:
+            try:
+                from services.rag.supabase_rag_system import query_rag_system
+                rag_response = query_rag_system(message, persona=rag_persona, max_chunks=3)
+                rag_used = rag_response is not None
+                logger.info("RAG query successful: %s, system: supabase_rag", rag_used)
+            except Exception as e:
+                logger.warning("RAG query failed: %s", sanitize_error(e))
 
         # Generate response based on persona and RAG context
         if rag_response:
@@ -122,6 +135,72 @@ Estou torcendo por você! ✨"""
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@medical_core_bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming chat endpoint (Server-Sent Events): context, token and done events"""
+    data = request.get_json() or {}
+    message = data.get('message', '').strip()
+    if not message:
+        return jsonify({
+            'error': 'Message is required',
+            'error_code': 'MISSING_MESSAGE',
+            'timestamp': datetime.now().isoformat()
+        }), 400
+
+    persona = data.get('persona', 'gasnelio')
+
+    valid_personas = ['gasnelio', 'dr_gasnelio', 'ga', 'ga_empathetic']
+    if persona not in valid_personas:
+        return jsonify({
+            'error': 'Invalid persona specified',
+            'error_code': 'INVALID_PERSONA',
+            'valid_personas': valid_personas,
+            'timestamp': datetime.now().isoformat()
+        }), 400
+
+    rag_persona = 'dr_gasnelio' if persona in ['gasnelio', 'dr_gasnelio'] else 'ga_empathetic'
+
+    try:
+        from services.rag.async_chat_pipeline import get_chat_pipeline, iterate_sync
+        pipeline = get_chat_pipeline()
+    except Exception as e:
+        logger.warning("Chat pipeline unavailable: %s", sanitize_error(e))
+        pipeline = None
+
+    if pipeline is None:
+        return jsonify({
+            'error': 'Streaming chat unavailable',
+            'error_code': 'STREAM_UNAVAILABLE',
+            'timestamp': datetime.now().isoformat()
+        }), 503
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+    def generate():
+        try:
+            for event, payload in iterate_sync(pipeline.stream(message, persona=rag_persona, max_chunks=3)):
+                if event == 'done':
+                    payload = dict(payload, persona=persona, timestamp=datetime.now().isoformat())
+                yield sse(event, payload)
+        except Exception as e:
+            pipeline.stats['errors'] += 1
+            logger.error("Chat stream error: %s", sanitize_error(e))
+            yield sse('error', {
+                'error': 'Internal server error',
+                'error_code': 'CHAT_STREAM_ERROR',
+                'timestamp': datetime.now().isoformat()
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Sem buffer no proxy: tokens chegam assim que gerados
+        }
+    )
+
 # Personas endpoint moved to personas_blueprint.py for:
 # - Better rate limiting control (300 req/min vs 200 req/hour)
 # - Comprehensive persona management features
@@ -255,6 +334,15 @@ def embeddings_diagnostics():
             'timestamp': datetime.now().isoformat()
         }
 
+        # Mapped vs resident size of the local vector index (fallback store)
+        try:
+            from services.vector_store import get_vector_store
+            vector_store = get_vector_store()
+            if vector_store is not None and hasattr(vector_store, 'get_index_diagnostics'):
+                diagnostics['vector_index'] = vector_store.get_index_diagnostics()
+        except Exception as e:
+            diagnostics['vector_index'] = {'error': sanitize_error(e)}
+
         # Add warning if not using HuggingFace
         if stats.get('backend_used') != 'huggingface':
             diagnostics['warning'] = f"Not using HuggingFace backend (expected), using: {stats.get('backend_used')}"
@@ -271,5 +359,58 @@ def embeddings_diagnostics():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+def _diagnostics_response(key: str, stats_fn, label: str):
+    """Resposta padrão dos endpoints de diagnóstico: {'status', key: stats_fn(), 'timestamp'} ou 500"""
+    try:
+        return jsonify({
+            'status': 'OK',
+            key: stats_fn(),
+            'timestamp': datetime.now().isoformat()
+        }), 200
+
+    except Exception as e:
+        logger.error("%s diagnostics error: %s", label, sanitize_error(e))
+        return jsonify({
+            'status': 'ERROR',
+            'message': sanitize_error(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@medical_core_bp.route('/diagnostics/http', methods=['GET'])
+def http_pool_diagnostics():
+    """Outbound HTTP pool utilization and connection reuse per host"""
+    def stats():
+        from core.performance.http_client_pool import get_http_client_registry
+        return get_http_client_registry().get_stats()
+
+    return _diagnostics_response('http_clients', stats, 'HTTP pool')
+
+@medical_core_bp.route('/diagnostics/sqlite', methods=['GET'])
+def sqlite_pool_diagnostics():
+    """SQLite pool batching, commit latency and open connections per database"""
+    def stats():
+        from core.performance.sqlite_pool import get_sqlite_pool_stats
+        return get_sqlite_pool_stats()
+
+    return _diagnostics_response('sqlite_pools', stats, 'SQLite pool')
+
+@medical_core_bp.route('/diagnostics/postgres', methods=['GET'])
+def postgres_pool_diagnostics():
+    """Postgres pool checkout waits and per-statement latency histograms"""
+    def stats():
+        from core.performance.pg_pool import get_pg_pool_stats
+        return get_pg_pool_stats()
+
+    return _diagnostics_response('pg_pools', stats, 'Postgres pool')
+
+@medical_core_bp.route('/diagnostics/sessions', methods=['GET'])
+def session_cache_diagnostics():
+    """Session-state cache hit rate and revocation propagation lag"""
+    def stats():
+        from core.auth.jwt_manager import get_jwt_manager
+        return get_jwt_manager().session_cache.get_stats()
+
+    return _diagnostics_response('session_cache', stats, 'Session cache')
+
 # Export blueprint
 __all__ = ['medical_core_bp']
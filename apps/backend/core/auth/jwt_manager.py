@@ -8,7 +8,7 @@ import jwt
 import uuid
 import hashlib
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
@@ -16,6 +16,7 @@ import logging
 
 from core.database import get_db_connection
 from core.database.models import UserRole
+from core.auth.session_cache import SessionStateCache
 from core.logging.sanitizer import sanitize_log_input, sanitize_error, sanitize_user_id
 
 logger = logging.getLogger(__name__)
@@ -51,9 +52,23 @@ class JWTManager:
         self.access_token_expiry = timedelta(hours=1)  # 1 hora
         self.refresh_token_expiry = timedelta(days=7)  # 7 dias
         self.db = get_db_connection()
+        self.session_cache = self._create_session_cache()
 
         logger.info("JWT Manager initialized with secure configuration")
 
+    def _create_session_cache(self) -> SessionStateCache:
+        """Cache de validade de sessões configurado a partir do app_config"""
+        try:
+            from app_config import config
+            return SessionStateCache(
+                self.db,
+                ttl_seconds=getattr(config, 'JWT_SESSION_CACHE_TTL_SECONDS', 30.0),
+                max_entries=getattr(config, 'JWT_SESSION_CACHE_MAX_ENTRIES', 10000),
+                revocation_poll_seconds=getattr(config, 'JWT_REVOCATION_POLL_SECONDS', 2.0)
+            )
+        except ImportError:
+            return SessionStateCache(self.db)
+
     def _generate_secret_key(self) -> str:
         """Gera chave secreta segura"""
         return secrets.token_urlsafe(64)
@@ -240,19 +255,15 @@ class JWTManager:
                 logger.warning("Invalid token type: expected %s, got %s", token_type.value, sanitize_log_input(str(payload.get('type'))))
                 return None
 
-            # Verificar se sessão ainda é válida
-            session = self.db.fetch_one(
-                "SELECT is_active, expires_at FROM sessions WHERE id = ?",
-                (payload['session_id'],)
-            )
+            # Verificar se sessão ainda é válida (cache + feed de revogações)
+            session = self.session_cache.get(payload['session_id'])
 
-            if not session or not session['is_active']:
+            if not session or not session.is_active:
                 logger.warning("Session not found or inactive: %s", sanitize_log_input(payload['session_id']))
                 return None
 
             # Verificar expiração da sessão
-            expires_at = datetime.fromisoformat(session['expires_at'])
-            if datetime.now(timezone.utc) > expires_at:
+            if datetime.now(timezone.utc) > session.expires_at:
                 logger.warning("Session expired: %s", sanitize_log_input(payload['session_id']))
                 return None
 
@@ -331,14 +342,14 @@ class JWTManager:
                 where_clause += " AND user_id = ?"
                 params.append(user_id)
 
-            affected = self.db.update(
-                'sessions',
-                {'is_active': False},
-                where_clause,
+            # sessions não tem updated_at: UPDATE direto em vez de db.update()
+            affected = self.db.execute(
+                f"UPDATE sessions SET is_active = 0 WHERE {where_clause}",
                 tuple(params)
-            )
+            )['affected_rows']
 
             if affected > 0:
+                self.session_cache.record_revocation(session_id=session_id, user_id=user_id)
                 logger.info("Session revoked: %s", sanitize_log_input(session_id))
                 return True
 
@@ -353,12 +364,13 @@ class JWTManager:
         Revoga todas as sessões de um usuário
         """
         try:
-            affected = self.db.update(
-                'sessions',
-                {'is_active': False},
-                'user_id = ?',
+            affected = self.db.execute(
+                "UPDATE sessions SET is_active = 0 WHERE user_id = ? AND is_active = 1",
                 (user_id,)
-            )
+            )['affected_rows']
+
+            if affected > 0:
+                self.session_cache.record_revocation(user_id=user_id)
 
             logger.info("Revoked %d sessions for user: %s", affected, sanitize_user_id(user_id))
             return affected
@@ -399,6 +411,11 @@ class JWTManager:
         if affected > 0:
             logger.info("Cleaned up %d expired sessions", affected)
 
+        # Revogações antigas já foram aplicadas por todos os workers
+        self.session_cache.prune_revocations(
+            datetime.now(timezone.utc) - timedelta(hours=1)
+        )
+
         return affected
 
     def get_user_sessions(self, user_id: str) -> List[Dict[str, Any]]:
@@ -441,6 +458,9 @@ class JWTManager:
         )
         stats['sessions_last_24h'] = recent_sessions['count'] if recent_sessions else 0
 
+        # Cache de validade: hit rate e atraso de propagação das revogações
+        stats['session_cache'] = self.session_cache.get_stats()
+
         return stats
 
 # Instância global do JWT manager
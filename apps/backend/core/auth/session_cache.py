@@ -0,0 +1,239 @@
+"""
+Session State Cache - Cache de validade de sessões para JWTManager.verify_token
+
+Evita o SELECT em sessions a cada requisição autenticada:
+- Mapa limitado (LRU) session_id -> (is_active, expires_at) com TTL curto
+- Revogações (logout, revogação forçada) gravadas em session_revocations,
+  tabela append-only com seq monotônico; cada processo lê apenas seq > último
+  visto, no máximo a cada revocation_poll_seconds, e remove as entradas
+  afetadas. Uma revogação feita em outro worker vale aqui em até
+  revocation_poll_seconds (o TTL é a rede de segurança para alterações feitas
+  fora do JWTManager)
+- Geração de invalidação: uma leitura do banco que cruzou com uma revogação
+  não é gravada no cache (o estado lido pode ser anterior à revogação)
+- Métricas: hit rate, revogações aplicadas e atraso de propagação
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from core.logging.sanitizer import sanitize_error
+
+logger = logging.getLogger(__name__)
+
+# Janela de amostras para o atraso de propagação
+PROPAGATION_LAG_WINDOW = 1000
+
+@dataclass
+class SessionState:
+    user_id: str
+    is_active: bool
+    expires_at: datetime
+    cached_at: float
+
+def _parse_timestamp(value) -> datetime:
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+class SessionStateCache:
+    """
+    Cache por processo do estado das sessões, invalidado pelo feed de revogações
+    """
+
+    def __init__(self, db, ttl_seconds: float = 30.0, max_entries: int = 10000,
+                 revocation_poll_seconds: float = 2.0):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.revocation_poll_seconds = revocation_poll_seconds
+
+        self._entries: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._last_poll = 0.0
+        self._generation = 0  # incrementada a cada invalidação
+        self._propagation_lags: List[float] = []
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'revocations_applied': 0,
+            'revocation_polls': 0,
+            'stale_loads_discarded': 0,
+            'poll_errors': 0
+        }
+
+        # Revogações anteriores ao start não importam: o cache começa vazio
+        self._last_seq = self._current_seq()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def _current_seq(self) -> int:
+        try:
+            row = self.db.fetch_one("SELECT COALESCE(MAX(seq), 0) AS seq FROM session_revocations")
+            return row['seq'] if row else 0
+        except Exception as e:
+            logger.warning("Feed de revogações indisponível: %s", sanitize_error(e))
+            return 0
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        """
+        Estado da sessão (do cache ou do banco); None se a sessão não existe
+        """
+        if not self.enabled:
+            return self._load(session_id)
+
+        self.poll_revocations()
+
+        now = time.monotonic()
+        with self._lock:
+            state = self._entries.get(session_id)
+            if state is not None and now - state.cached_at < self.ttl_seconds:
+                self._entries.move_to_end(session_id)
+                self._stats['hits'] += 1
+                return state
+            self._stats['misses'] += 1
+            generation = self._generation
+
+        state = self._load(session_id)
+        if state is not None:
+            with self._lock:
+                if self._generation != generation:
+                    # Revogação durante o SELECT: devolve o lido, sem cachear
+                    self._stats['stale_loads_discarded'] += 1
+                    return state
+                self._entries[session_id] = state
+                self._entries.move_to_end(session_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return state
+
+    def _load(self, session_id: str) -> Optional[SessionState]:
+        session = self.db.fetch_one(
+            "SELECT user_id, is_active, expires_at FROM sessions WHERE id = ?",
+            (session_id,)
+        )
+        if not session:
+            return None
+        return SessionState(
+            user_id=session['user_id'],
+            is_active=bool(session['is_active']),
+            expires_at=_parse_timestamp(session['expires_at']),
+            cached_at=time.monotonic()
+        )
+
+    # ------------------------------------------------------------------
+    # Revogação
+    # ------------------------------------------------------------------
+
+    def record_revocation(self, session_id: Optional[str] = None, user_id: Optional[str] = None):
+        """
+        Publica a revogação no feed (session_id=None revoga todas do usuário)
+        e invalida o cache local na hora
+        """
+        self.db.execute(
+            "INSERT INTO session_revocations (session_id, user_id, revoked_at) VALUES (?, ?, ?)",
+            (session_id, user_id, datetime.now(timezone.utc).isoformat())
+        )
+        self._invalidate(session_id, user_id)
+
+    def _invalidate(self, session_id: Optional[str], user_id: Optional[str]) -> int:
+        with self._lock:
+            self._generation += 1
+            if session_id is not None:
+                keys = [session_id] if session_id in self._entries else []
+            else:
+                keys = [key for key, state in self._entries.items() if state.user_id == user_id]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def poll_revocations(self, force: bool = False) -> int:
+        """
+        Aplica revogações novas do feed; só uma thread consulta o banco por vez
+        """
+        if not force and time.monotonic() - self._last_poll < self.revocation_poll_seconds:
+            return 0
+        if not self._poll_lock.acquire(blocking=force):
+            return 0
+
+        try:
+            self._last_poll = time.monotonic()
+            rows = self.db.fetch_all(
+                "SELECT seq, session_id, user_id, revoked_at FROM session_revocations "
+                "WHERE seq > ? ORDER BY seq",
+                (self._last_seq,)
+            )
+
+            applied_at = datetime.now(timezone.utc)
+            for row in rows:
+                self._invalidate(row['session_id'], row['user_id'])
+                self._last_seq = row['seq']
+                try:
+                    lag = (applied_at - _parse_timestamp(row['revoked_at'])).total_seconds()
+                except (TypeError, ValueError):
+                    continue
+                with self._lock:
+                    self._propagation_lags.append(max(lag, 0.0))
+
+            with self._lock:
+                self._stats['revocation_polls'] += 1
+                self._stats['revocations_applied'] += len(rows)
+                if len(self._propagation_lags) > PROPAGATION_LAG_WINDOW:
+                    del self._propagation_lags[:-PROPAGATION_LAG_WINDOW]
+            return len(rows)
+
+        except Exception as e:
+            with self._lock:
+                self._stats['poll_errors'] += 1
+            logger.error("Erro ao ler feed de revogações: %s", sanitize_error(e))
+            return 0
+        finally:
+            self._poll_lock.release()
+
+    def prune_revocations(self, older_than: datetime) -> int:
+        """Remove do feed revogações antigas (já aplicadas por todos os processos)"""
+        return self.db.delete('session_revocations', 'revoked_at < ?', (older_than.isoformat(),))
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            lags = sorted(self._propagation_lags)
+            entries = len(self._entries)
+
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'enabled': self.enabled,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'revocation_poll_seconds': self.revocation_poll_seconds,
+            'last_revocation_seq': self._last_seq,
+            'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+            'propagation_lag_avg_ms': sum(lags) / len(lags) * 1000 if lags else 0.0,
+            'propagation_lag_max_ms': lags[-1] * 1000 if lags else 0.0
+        })
+        return stats
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+pgvector Store - Prepared pgvector queries over the Postgres pool
+
+Query shape used by search/search_batch: the distance is computed once per
+row (embedding <=> $1), ordered and limited in an inner query, and the
+similarity threshold is applied to the k candidates afterwards. ORDER BY
+<=> ... LIMIT is the shape an HNSW/IVFFlat index can serve; filtering on the
+distance in the same WHERE (as before) pushed the planner to a sequential
+scan and sent the query vector three times.
+
+Vectors are adapted to the pgvector text literal once per query ('[x,y,...]',
+float32 precision). psycopg2 only sends text parameters; pgvector's binary
+format would need psycopg 3.
+
+InMemoryPgvectorStore implements the same interface in pure Python for
+tests and local benchmarks.
+"""
+
+import json
+import math
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from core.performance.pg_pool import PostgresConnectionPool, PreparedStatement
+
+logger = logging.getLogger(__name__)
+
+try:
+    from psycopg2.extras import RealDictCursor
+except ImportError:
+    RealDictCursor = None
+
+def to_vector_literal(embedding: Sequence[float]) -> str:
+    """Literal pgvector ('[0.1,0.2]'); 9 dígitos significativos = float32 exato"""
+    return '[' + ','.join('%.9g' % float(value) for value in embedding) + ']'
+
+def to_vector_array_literal(embeddings: Sequence[Sequence[float]]) -> str:
+    """Literal vector[] ('{"[...]","[...]"}') para busca em lote"""
+    return '{' + ','.join(f'"{to_vector_literal(embedding)}"' for embedding in embeddings) + '}'
+
+def _row_to_result(row: Dict[str, Any]) -> Dict[str, Any]:
+    metadata = row['metadata']
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+    created_at = row.get('created_at')
+    return {
+        'id': row['id'],
+        'content': row['content'],
+        'metadata': metadata,
+        'source': row['source'],
+        'similarity': 1.0 - float(row['distance']),
+        'created_at': created_at.isoformat() if hasattr(created_at, 'isoformat') else created_at
+    }
+
+class PgvectorStore:
+    """Consultas pgvector preparadas em knowledge_vectors (ou outra tabela com o mesmo schema)"""
+
+    def __init__(self, pool: PostgresConnectionPool, table: str = 'knowledge_vectors'):
+        if not table.isidentifier():
+            raise ValueError(f"Nome de tabela inválido: {table!r}")
+        self.pool = pool
+        self.table = table
+
+        self._insert = PreparedStatement(
+            name=f"pgv_insert_{table}",
+            sql=f"""
+                INSERT INTO {table} (content, embedding, metadata, source)
+                VALUES ($1, $2, $3, $4)
+                RETURNING id
+            """,
+            param_types=('text', 'vector', 'jsonb', 'varchar')
+        )
+        self._search = PreparedStatement(
+            name=f"pgv_search_{table}",
+            sql=f"""
+                SELECT id, content, metadata, source, created_at, distance
+                FROM (
+                    SELECT id, content, metadata, source, created_at,
+                           embedding <=> $1 AS distance
+                    FROM {table}
+                    ORDER BY embedding <=> $1
+                    LIMIT $2
+                ) AS candidates
+                WHERE distance < $3
+                ORDER BY distance
+            """,
+            param_types=('vector', 'int', 'float8')
+        )
+        self._search_batch = PreparedStatement(
+            name=f"pgv_search_batch_{table}",
+            sql=f"""
+                SELECT q.ord AS query_index, c.id, c.content, c.metadata, c.source,
+                       c.created_at, c.distance
+                FROM unnest($1::vector[]) WITH ORDINALITY AS q(embedding, ord)
+                CROSS JOIN LATERAL (
+                    SELECT kv.id, kv.content, kv.metadata, kv.source, kv.created_at,
+                           kv.embedding <=> q.embedding AS distance
+                    FROM {table} kv
+                    ORDER BY kv.embedding <=> q.embedding
+                    LIMIT $2
+                ) AS c
+                WHERE c.distance < $3
+                ORDER BY q.ord, c.distance
+            """,
+            param_types=('vector[]', 'int', 'float8')
+        )
+        self._count = PreparedStatement(
+            name=f"pgv_count_{table}",
+            sql=f"SELECT COUNT(*) AS total FROM {table}"
+        )
+
+    def store_vector(self, content: str, embedding: Sequence[float],
+                     metadata: Optional[Dict[str, Any]] = None, source: Optional[str] = None) -> int:
+        row = self.pool.execute(
+            self._insert,
+            (content, to_vector_literal(embedding), json.dumps(metadata or {}), source),
+            cursor_factory=RealDictCursor, fetch='one'
+        )
+        return row['id']
+
+    def search(self, query_embedding: Sequence[float], limit: int = 5,
+               similarity_threshold: float = 0.7) -> List[Dict[str, Any]]:
+        rows = self.pool.execute(
+            self._search,
+            (to_vector_literal(query_embedding), limit, 1.0 - similarity_threshold),
+            cursor_factory=RealDictCursor
+        )
+        return [_row_to_result(row) for row in rows]
+
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], limit: int = 5,
+                     similarity_threshold: float = 0.7) -> List[List[Dict[str, Any]]]:
+        """Uma ida ao banco para várias consultas; resultados na ordem das consultas"""
+        results: List[List[Dict[str, Any]]] = [[] for _ in query_embeddings]
+        if not query_embeddings:
+            return results
+
+        rows = self.pool.execute(
+            self._search_batch,
+            (to_vector_array_literal(query_embeddings), limit, 1.0 - similarity_threshold),
+            cursor_factory=RealDictCursor
+        )
+        for row in rows:
+            results[row['query_index'] - 1].append(_row_to_result(row))
+        return results
+
+    def count(self) -> int:
+        row = self.pool.execute(self._count, cursor_factory=RealDictCursor, fetch='one')
+        return row['total'] if row else 0
+
+class InMemoryPgvectorStore:
+    """Fake em Python puro com a mesma interface e semântica (distância de cosseno)"""
+
+    def __init__(self):
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cosine_distance(a: Sequence[float], b: Sequence[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        if not norm:
+            return 1.0
+        return 1.0 - dot / norm
+
+    def store_vector(self, content: str, embedding: Sequence[float],
+                     metadata: Optional[Dict[str, Any]] = None, source: Optional[str] = None) -> int:
+        with self._lock:
+            row_id = len(self._rows) + 1
+            self._rows.append({
+                'id': row_id,
+                'content': content,
+                'embedding': [float(value) for value in embedding],
+                'metadata': dict(metadata or {}),
+                'source': source,
+                'created_at': None
+            })
+        return row_id
+
+    def search(self, query_embedding: Sequence[float], limit: int = 5,
+               similarity_threshold: float = 0.7) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = list(self._rows)
+        scored = sorted(
+            ((self._cosine_distance(row['embedding'], query_embedding), row) for row in rows),
+            key=lambda item: (item[0], item[1]['id'])
+        )[:limit]
+        max_distance = 1.0 - similarity_threshold
+        return [
+            _row_to_result({**row, 'distance': distance})
+            for distance, row in scored if distance < max_distance
+        ]
+
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], limit: int = 5,
+                     similarity_threshold: float = 0.7) -> List[List[Dict[str, Any]]]:
+        return [self.search(query, limit, similarity_threshold) for query in query_embeddings]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._rows)
@@ -6,20 +6,22 @@ Real Supabase Client - NO MOCKS
 
 import os
 import logging
-import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 from supabase import create_client, Client
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from core.logging.sanitizer import sanitize_error
+from core.performance.pg_pool import (
+    PgPoolConfig, PostgresConnectionPool, PooledConnectionProxy, register_pg_pool
+)
+from core.cloud.pgvector_store import PgvectorStore
 
 logger = logging.getLogger(__name__)
 
 class RealSupabaseClient:
     """Real Supabase client with pgvector support - NO MOCKS"""
 
-    def __init__(self, supabase_url: str, supabase_key: str, postgres_url: str = None):
+    def __init__(self, supabase_url: str, supabase_key: str, postgres_url: str = None,
+                 pool_config: Optional[PgPoolConfig] = None):
         """Initialize real Supabase client"""
         self.supabase_url = supabase_url
         self.supabase_key = supabase_key
@@ -28,13 +30,18 @@ class RealSupabaseClient:
         # Initialize Supabase client
         self.client: Client = create_client(supabase_url, supabase_key)
 
-        # Initialize direct PostgreSQL connection for pgvector operations
+        # Initialize pooled PostgreSQL connections for pgvector operations
+        # pg_conn keeps the old interface: each pg_conn.cursor() checks out a pooled connection
+        self.pg_pool = None
         self.pg_conn = None
+        self.vectors = None
         if postgres_url:
             try:
-                self.pg_conn = psycopg2.connect(postgres_url)
-                self.pg_conn.autocommit = True
-                logger.info("✅ Real PostgreSQL connection established for pgvector")
+                self.pg_pool = PostgresConnectionPool(postgres_url, pool_config)
+                self.pg_conn = PooledConnectionProxy(self.pg_pool)
+                self.vectors = PgvectorStore(self.pg_pool)
+                register_pg_pool('supabase', self.pg_pool)
+                logger.info("✅ Real PostgreSQL pool established for pgvector")
             except Exception as e:
                 logger.error("❌ Failed to connect to PostgreSQL: %s", sanitize_error(e))
                 raise
@@ -135,69 +142,50 @@ class RealSupabaseClient:
 
     def store_vector(self, content: str, embedding: List[float], metadata: Dict[str, Any] = None, source: str = None) -> int:
         """Store vector in real pgvector database"""
-        if not self.pg_conn:
+        if not self.vectors:
             raise RuntimeError("PostgreSQL connection required for vector operations")
 
         try:
-            with self.pg_conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("""
-                    INSERT INTO knowledge_vectors (content, embedding, metadata, source)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id;
-                """, (content, embedding, json.dumps(metadata or {}), source))
+            vector_id = self.vectors.store_vector(content, embedding, metadata, source)
 
-                result = cursor.fetchone()
-                vector_id = result['id']
-
-                logger.info(f"✅ Vector stored successfully with ID: {vector_id}")
-                return vector_id
+            logger.info(f"✅ Vector stored successfully with ID: {vector_id}")
+            return vector_id
 
         except Exception as e:
             logger.error("❌ Failed to store vector: %s", sanitize_error(e))
             raise
 
     def search_vectors(self, query_embedding: List[float], limit: int = 5, similarity_threshold: float = 0.7) -> List[Dict[str, Any]]:
-        """Search vectors using real pgvector similarity"""
-        if not self.pg_conn:
+        """Search vectors using real pgvector similarity (k-NN first, threshold on the k candidates)"""
+        if not self.vectors:
             raise RuntimeError("PostgreSQL connection required for vector operations")
 
         try:
-            with self.pg_conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("""
-                    SELECT
-                        id,
-                        content,
-                        metadata,
-                        source,
-                        1 - (embedding <=> %s) as similarity,
-                        created_at
-                    FROM knowledge_vectors
-                    WHERE 1 - (embedding <=> %s) > %s
-                    ORDER BY embedding <=> %s
-                    LIMIT %s;
-                """, (query_embedding, query_embedding, similarity_threshold, query_embedding, limit))
-
-                results = cursor.fetchall()
-
-                # Convert to list of dicts
-                vectors = []
-                for row in results:
-                    vectors.append({
-                        'id': row['id'],
-                        'content': row['content'],
-                        'metadata': row['metadata'],
-                        'source': row['source'],
-                        'similarity': float(row['similarity']),
-                        'created_at': row['created_at'].isoformat() if row['created_at'] else None
-                    })
-
-                logger.info(f"✅ Found {len(vectors)} similar vectors")
-                return vectors
+            vectors = self.vectors.search(query_embedding, limit, similarity_threshold)
+
+            logger.info(f"✅ Found {len(vectors)} similar vectors")
+            return vectors
 
         except Exception as e:
             logger.error("❌ Failed to search vectors: %s", sanitize_error(e))
             raise
 
+    def search_vectors_batch(self, query_embeddings: List[List[float]], limit: int = 5,
+                             similarity_threshold: float = 0.7) -> List[List[Dict[str, Any]]]:
+        """Search many query vectors in one round trip; results follow the input order"""
+        if not self.vectors:
+            raise RuntimeError("PostgreSQL connection required for vector operations")
+
+        try:
+            results = self.vectors.search_batch(query_embeddings, limit, similarity_threshold)
+
+            logger.info(f"✅ Batch search: {len(query_embeddings)} queries, {sum(len(r) for r in results)} results")
+            return results
+
+        except Exception as e:
+            logger.error("❌ Failed to batch search vectors: %s", sanitize_error(e))
+            raise
+
     def store_chat_message(self, session_id: str, user_message: str, assistant_response: str, persona: str, metadata: Dict[str, Any] = None) -> int:
         """Store chat message in real database"""
         try:
@@ -273,6 +261,9 @@ class RealSupabaseClient:
                     avg_rating = cursor.fetchone()[0]
                     stats['average_rating'] = float(avg_rating) if avg_rating else 0.0
 
+                # Pool waits and per-statement latency histograms
+                stats['pg_pool'] = self.pg_pool.get_stats()
+
             # Get recent activity from Supabase
             recent_chats = self.client.table('chat_history').select('created_at').gte('created_at', datetime.now().replace(hour=0, minute=0, second=0).isoformat()).execute()
             stats['chats_today'] = len(recent_chats.data)
@@ -349,9 +340,9 @@ class RealSupabaseClient:
 
     def close(self):
         """Close real database connections"""
-        if self.pg_conn:
-            self.pg_conn.close()
-            logger.info("✅ PostgreSQL connection closed")
+        if self.pg_pool:
+            self.pg_pool.close()
+            logger.info("✅ PostgreSQL pool closed")
 
 def create_real_supabase_client(config) -> RealSupabaseClient:
     """Create real Supabase client with configuration"""
@@ -363,4 +354,4 @@ def create_real_supabase_client(config) -> RealSupabaseClient:
         raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY are required for real Supabase integration")
 
     logger.info("🚀 Creating REAL Supabase client (NO MOCKS)")
-    return RealSupabaseClient(supabase_url, supabase_key, postgres_url)
\ No newline at end of file
+    return RealSupabaseClient(supabase_url, supabase_key, postgres_url, PgPoolConfig.from_config(config))
\ No newline at end of file
@@ -121,6 +121,16 @@ class DatabaseSchema:
             )
             """,
 
+            # Feed de revogações de sessão (lido incrementalmente por seq)
+            """
+            CREATE TABLE IF NOT EXISTS session_revocations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,  -- NULL = todas as sessões do usuário
+                user_id TEXT,
+                revoked_at TIMESTAMP NOT NULL
+            )
+            """,
+
             # Tabela de logs de auditoria
             """
             CREATE TABLE IF NOT EXISTS audit_logs (
@@ -220,6 +230,7 @@ class DatabaseSchema:
             "CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_sessions_active ON sessions(is_active)",
             "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)",
+            "CREATE INDEX IF NOT EXISTS idx_session_revocations_revoked ON session_revocations(revoked_at)",
             "CREATE INDEX IF NOT EXISTS idx_audit_logs_user_id ON audit_logs(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp ON audit_logs(timestamp)",
             "CREATE INDEX IF NOT EXISTS idx_audit_logs_expires ON audit_logs(expires_at)",
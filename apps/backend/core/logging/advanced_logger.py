@@ -8,7 +8,6 @@ import logging
 import logging.handlers
 import os
 import json
-import re
 import time
 import threading
 from datetime import datetime
@@ -20,6 +19,7 @@ import shutil
 
 # Import configurações
 from app_config import config, EnvironmentConfig
+from core.logging.redaction import DIGITS, RedactionRule, StagedRedactionEngine
 
 @dataclass
 class LogMetrics:
@@ -72,51 +72,50 @@ class SensitiveDataRedactor:
             'address': r'\b(?:rua|av|avenida|alameda)\s+[^,]{10,50},?\s*\d+\b'
         }
         
-        # Compilar padrões para performance
-        self.compiled_patterns = {}
-        for name, pattern in {**self.sensitive_patterns, **self.medical_patterns}.items():
-            self.compiled_patterns[name] = re.compile(pattern, re.IGNORECASE)
+        # Substituição e gatilhos do pré-filtro por padrão (default: ***REDACTED***, exige dígito)
+        replacements = {
+            'cpf': '***CPF_REDACTED***',
+            'cpf_numbers': '***CPF_REDACTED***',
+            'email': '***EMAIL_REDACTED***',
+            'api_key': '***SENSITIVE_REDACTED***',
+            'phone': '***PHONE_REDACTED***',
+            'private_ip': '***IP_REDACTED***'
+        }
+        triggers = {
+            'email': ('@',),
+            'api_key': ('api', 'token', 'secret'),
+            'password_pattern': ('password', 'senha', 'pwd')
+        }
+        identifier_rules, context_rules = [
+            [RedactionRule(name, pattern, replacements.get(name, '***REDACTED***'), triggers.get(name, DIGITS))
+             for name, pattern in patterns.items()]
+            for patterns in (self.sensitive_patterns, self.medical_patterns)
+        ]
+        
+        # Identificadores numa varredura; regras de contexto amplas (endereço, prontuário,
+        # nascimento) numa segunda, sobre o texto já redigido, para que um endereço não
+        # engula o início de um CPF e deixe o resto exposto
+        self.production_engine = StagedRedactionEngine([identifier_rules, context_rules])
+        self.development_engine = StagedRedactionEngine([
+            [rule for rule in identifier_rules if rule.name in ['cpf', 'cpf_numbers', 'credit_card', 'api_key', 'password']]
+        ])
     
     def redact_sensitive_data(self, message: str, context: str = "") -> tuple[str, int]:
         """
         Redige dados sensíveis da mensagem de log
         Retorna (mensagem_redacted, quantidade_redacted)
         """
-        redacted_message = message
-        redaction_count = 0
-        
         # Aplicar redação baseada no contexto
         if EnvironmentConfig.is_production():
             # Em produção, rediger mais agressivamente
-            patterns_to_use = self.compiled_patterns
+            engine = self.production_engine
         else:
             # Em desenvolvimento, rediger apenas dados críticos
-            patterns_to_use = {
-                k: v for k, v in self.compiled_patterns.items() 
-                if k in ['cpf', 'cpf_numbers', 'credit_card', 'api_key', 'password']
-            }
+            engine = self.development_engine
         
-        # Aplicar redação
-        for pattern_name, pattern in patterns_to_use.items():
-            matches = pattern.findall(redacted_message)
-            if matches:
-                redaction_count += len(matches)
-                
-                # Estratégias de redação específicas
-                if pattern_name in ['cpf', 'cpf_numbers']:
-                    redacted_message = pattern.sub('***CPF_REDACTED***', redacted_message)
-                elif pattern_name == 'email':
-                    redacted_message = pattern.sub('***EMAIL_REDACTED***', redacted_message)
-                elif pattern_name in ['api_key', 'password']:
-                    redacted_message = pattern.sub('***SENSITIVE_REDACTED***', redacted_message)
-                elif pattern_name == 'phone':
-                    redacted_message = pattern.sub('***PHONE_REDACTED***', redacted_message)
-                elif pattern_name == 'private_ip' and EnvironmentConfig.is_production():
-                    redacted_message = pattern.sub('***IP_REDACTED***', redacted_message)
-                else:
-                    redacted_message = pattern.sub('***REDACTED***', redacted_message)
-        
-        return redacted_message, redaction_count
+        # Redação e contagem numa única varredura
+        redacted_message, counts = engine.redact(message)
+        return redacted_message, sum(counts.values())
 
 class StructuredJSONFormatter(logging.Formatter):
     """Formatter para logs estruturados em JSON"""
@@ -6,12 +6,14 @@ Sistema de logging robusto com retenção automática e mascaramento de dados se
 import json
 import re
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional, List, Literal
 import hashlib
 import uuid
 from dataclasses import dataclass
 
+from .redaction import DIGITS, RedactionEngine, RedactionRule
+
 # Tentar importar Google Cloud, usar fallback se não disponível
 try:
     from google.cloud import logging as cloud_logging
@@ -25,6 +27,10 @@ except ImportError:
 
 LogLevel = Literal['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
 
+# Formatos mascarados em valores do contexto (compilados uma vez)
+_CPF_VALUE = re.compile(r'\d{3}\.?\d{3}\.?\d{3}-?\d{2}')
+_PHONE_VALUE = re.compile(r'\(?\d{2}\)?\s*\d{4,5}-?\d{4}')
+
 @dataclass
 class LGPDLogEntry:
     """Entrada de log com metadados LGPD"""
@@ -67,6 +73,12 @@ class CloudLogger:
             'crm': r'\bCRM[-\s]?[A-Z]{2}[-\s]?\d{4,6}\b',
             'medication': r'\b(?:rifampicina|clofazimina|dapsona|PQT-U|poliquimioterapia)\b'
         }
+        # Detecção numa única varredura (pré-filtro: dígito, '@' ou nome de medicamento)
+        triggers = {'email': ('@',), 'medication': ('rifampicina', 'clofazimina', 'dapsona', 'pqt-u', 'poliquimioterapia')}
+        self.redaction_engine = RedactionEngine([
+            RedactionRule(data_type, pattern, triggers=triggers.get(data_type, DIGITS))
+            for data_type, pattern in self.sensitive_patterns.items()
+        ])
 
     def _hash_user_id(self, user_id: str) -> str:
         """Gera hash do user_id para anonimização"""
@@ -78,10 +90,8 @@ class CloudLogger:
         """Detecta dados sensíveis no conteúdo usando DLP API e regex"""
         found_types = []
 
-        # Verificação por regex (rápida)
-        for data_type, pattern in self.sensitive_patterns.items():
-            if re.search(pattern, content, re.IGNORECASE):
-                found_types.append(data_type)
+        # Verificação por regex (rápida, uma varredura para todos os padrões)
+        found_types.extend(self.redaction_engine.detect(content))
 
         # DLP API para verificação avançada (opcional - se configurado)
         try:
@@ -127,10 +137,10 @@ class CloudLogger:
                         else:
                             masked[key] = value
                     # Mascarar CPF
-                    elif re.match(r'\d{3}\.?\d{3}\.?\d{3}-?\d{2}', value):
+                    elif _CPF_VALUE.match(value):
                         masked[key] = f"{value[:4]}***.**-**"
                     # Mascarar telefones
-                    elif re.match(r'\(?\d{2}\)?\s*\d{4,5}-?\d{4}', value):
+                    elif _PHONE_VALUE.match(value):
                         masked[key] = f"{value[:5]}****-****"
                     else:
                         masked[key] = value
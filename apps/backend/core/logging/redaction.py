@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Redaction Engine - Redação de dados sensíveis em uma única varredura
+====================================================================
+
+Compartilhado por SensitiveDataRedactor (advanced_logger), CloudLogger
+(cloud_logger) e sanitize_log_input (sanitizer).
+
+Todas as regras de um redator são combinadas numa única alternação com
+grupos nomeados, na ordem de prioridade das regras. Um único `sub` percorre a
+linha substituindo e contando por tipo (o grupo que casou diz a regra), em vez
+de um `findall` + `sub` por padrão. O `\\b` comum a todas as regras é fatorado
+para fora da alternação, então posições no meio de palavras falham num único
+teste. Linhas sem nenhum caractere/termo que alguma regra exige (ex.: sem
+dígito, '@' ou 'token') são devolvidas sem passar pela alternação.
+
+Em cada posição vence a primeira regra (na ordem dada) que casa ali; numa
+única alternação uma regra ampla que casa *antes* engole o início de um
+identificador e deixa o resto dele exposto (ex.: o endereço "rua ..., 123"
+dentro de "rua ..., 123.456.789-00"). StagedRedactionEngine resolve isso em
+estágios: identificadores primeiro, regras de contexto amplas depois, sobre
+o texto já redigido - como nos passes sequenciais anteriores.
+
+Usage:
+    engine = RedactionEngine([
+        RedactionRule('cpf', r'\\b\\d{3}\\.\\d{3}\\.\\d{3}-\\d{2}\\b', '***CPF_REDACTED***', DIGITS),
+        RedactionRule('email', EMAIL_PATTERN, '***EMAIL_REDACTED***', ('@',)),
+    ])
+    text, counts = engine.redact("cpf 123.456.789-00")  # counts == {'cpf': 1}
+
+    staged = StagedRedactionEngine([[cpf_rule, phone_rule], [address_rule]])
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+Replacement = Union[str, Callable[['re.Match'], str]]
+
+DIGITS = tuple('0123456789')
+
+@dataclass(frozen=True)
+class RedactionRule:
+    """Padrão sensível, sua substituição e o pré-filtro que ele exige"""
+    name: str
+    pattern: str
+    replacement: Replacement = '***REDACTED***'
+    # Literais (sem distinção de caixa) dos quais toda ocorrência contém ao menos um;
+    # vazio = sem pré-filtro
+    triggers: Tuple[str, ...] = ()
+
+class RedactionEngine:
+    """Alternação compilada de um conjunto de regras: substitui e conta numa varredura"""
+
+    def __init__(self, rules: Sequence[RedactionRule], flags: int = re.IGNORECASE):
+        self.rules = tuple(rules)
+        self.rule_names = tuple(rule.name for rule in self.rules)
+        groups = [f"r{index}" for index in range(len(self.rules))]
+        self._group_names = dict(zip(groups, self.rule_names))
+        self._replacements = {group: rule.replacement for group, rule in zip(groups, self.rules)}
+        branches = [rule.pattern for rule in self.rules]
+        # \b inicial comum a todas as regras: testado uma vez por posição
+        prefix = r'\b' if branches and all(branch.startswith(r'\b') for branch in branches) else ''
+        if prefix:
+            branches = [branch[len(prefix):] for branch in branches]
+        self._pattern = re.compile(
+            prefix + '(?:' + '|'.join(f"(?P<{group}>{branch})" for group, branch in zip(groups, branches)) + ')', flags
+        ) if self.rules else None
+
+        # Pré-filtro: classe com os gatilhos de um caractere + `in` para os termos
+        self._prefilter = bool(self.rules) and all(rule.triggers for rule in self.rules)
+        triggers = {trigger.lower() for rule in self.rules for trigger in rule.triggers}
+        chars = sorted(trigger for trigger in triggers if len(trigger) == 1)
+        self._trigger_chars = re.compile('[' + ''.join(re.escape(char) for char in chars) + ']', flags) if chars else None
+        self._trigger_terms = tuple(sorted(trigger for trigger in triggers if len(trigger) > 1))
+
+    def has_candidates(self, text: str) -> bool:
+        """False quando nenhuma regra pode casar (linha sai sem varredura completa)"""
+        if not text or self._pattern is None:
+            return False
+        if not self._prefilter:
+            return True
+        if self._trigger_chars is not None and self._trigger_chars.search(text) is not None:
+            return True
+        if self._trigger_terms:
+            lowered = text.lower()
+            return any(term in lowered for term in self._trigger_terms)
+        return False
+
+    def redact(self, text: str) -> Tuple[str, Dict[str, int]]:
+        """Retorna (texto_redigido, {regra: ocorrências})"""
+        if not self.has_candidates(text):
+            return text, {}
+        counts: Dict[str, int] = {}
+        group_names = self._group_names
+        replacements = self._replacements
+
+        def replace(match) -> str:
+            group = match.lastgroup
+            name = group_names[group]
+            counts[name] = counts.get(name, 0) + 1
+            replacement = replacements[group]
+            return replacement if isinstance(replacement, str) else replacement(match)
+
+        return self._pattern.sub(replace, text), counts
+
+    def detect(self, text: str) -> List[str]:
+        """Regras encontradas no texto, em ordem de primeira ocorrência"""
+        if not self.has_candidates(text):
+            return []
+        found = {}
+        for match in self._pattern.finditer(text):
+            found[self._group_names[match.lastgroup]] = True
+        return list(found)
+
+    def search(self, text: str) -> bool:
+        """True se alguma regra casa (sem percorrer o resto da linha)"""
+        return self.has_candidates(text) and self._pattern.search(text) is not None
+
+class StagedRedactionEngine:
+    """Estágios de RedactionEngine aplicados em sequência (cada um sobre a saída do anterior)"""
+
+    def __init__(self, stages: Sequence[Sequence[RedactionRule]], flags: int = re.IGNORECASE):
+        self.engines = tuple(RedactionEngine(rules, flags) for rules in stages if rules)
+        self.rules = tuple(rule for engine in self.engines for rule in engine.rules)
+        self.rule_names = tuple(rule.name for rule in self.rules)
+
+    def has_candidates(self, text: str) -> bool:
+        return any(engine.has_candidates(text) for engine in self.engines)
+
+    def redact(self, text: str) -> Tuple[str, Dict[str, int]]:
+        """Retorna (texto_redigido, {regra: ocorrências})"""
+        counts: Dict[str, int] = {}
+        for engine in self.engines:
+            text, stage_counts = engine.redact(text)
+            for name, count in stage_counts.items():
+                counts[name] = counts.get(name, 0) + count
+        return text, counts
+
+    def detect(self, text: str) -> List[str]:
+        """Regras encontradas, estágio a estágio (o seguinte vê o texto já redigido)"""
+        found = {}
+        for engine in self.engines:
+            for name in engine.detect(text):
+                found[name] = True
+            if engine is not self.engines[-1]:
+                text, _ = engine.redact(text)
+        return list(found)
+
+    def search(self, text: str) -> bool:
+        """True se alguma regra casa"""
+        return any(engine.search(text) for engine in self.engines)
@@ -18,6 +18,14 @@ Usage:
 import re
 from typing import Any, Optional
 
+from .redaction import RedactionEngine, RedactionRule
+
+# Quebras de linha e tab viram escapes visíveis; demais caracteres de controle são removidos
+_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_CONTROL_CHARS = RedactionEngine([
+    RedactionRule('control', r'[\x00-\x1f\x7f]', lambda match: _CONTROL_ESCAPES.get(match.group(), ''))
+], flags=0)
+
 
 def sanitize_log_input(value: Any, max_length: int = 500) -> str:
     """
@@ -51,14 +59,12 @@ def sanitize_log_input(value: Any, max_length: int = 500) -> str:
     except Exception:
         return "<unprintable>"
 
-    # Replace control characters that could forge log entries
-    sanitized = str_value.replace('\n', '\\n')
-    sanitized = sanitized.replace('\r', '\\r')
-    sanitized = sanitized.replace('\t', '\\t')
-
-    # Remove other control characters (except printable ASCII and common UTF-8)
-    # Keep chars >= 32 (space) and common unicode
-    sanitized = re.sub(r'[\x00-\x1f\x7f]', '', sanitized)
+    # Escape newlines/tabs and remove other control characters in one pass.
+    # Printable strings (the common case) have none and skip the scan.
+    if str_value.isprintable():
+        sanitized = str_value
+    else:
+        sanitized, _ = _CONTROL_CHARS.redact(str_value)
 
     # Truncate if too long
     if len(sanitized) > max_length:
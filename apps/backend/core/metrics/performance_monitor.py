@@ -18,6 +18,7 @@ import json
 
 # Import configurações
 from app_config import config
+from core.metrics.sketches import WINDOWS, MetricsRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -100,6 +101,10 @@ class PerformanceMonitor:
         self.performance_history = CircularBuffer(maxsize=1440)  # 24h de dados (1 por minuto)
         self.request_times = CircularBuffer(maxsize=10000)  # Últimas 10k requests
         
+        # Percentis de latência por janela (minuto/hora/dia), geral e por endpoint
+        self.latency = MetricsRegistry(getattr(config, 'METRICS_SKETCH_ACCURACY', 0.01))
+        self.shared_dir = getattr(config, 'METRICS_SHARED_DIR', '')
+        
         # Locks para thread safety
         self.metrics_lock = threading.Lock()
         self.ai_metrics_lock = threading.Lock()
@@ -138,6 +143,8 @@ class PerformanceMonitor:
                     self._collect_system_metrics()
                     self._save_performance_snapshot()
                     self._check_alerts()
+                    if self.shared_dir:
+                        self.latency.publish(self.shared_dir, f"perf-{os.getpid()}")
                 except Exception as e:
                     logger.error(f"Erro no monitoramento do sistema: {e}")
                 time.sleep(60)  # A cada minuto
@@ -281,6 +288,11 @@ class PerformanceMonitor:
                 'error': error_occurred,
                 'request_id': request_id
             })
+        
+        self.latency.record('request_ms', duration_ms)
+        self.latency.record(f"request_ms:{endpoint}", duration_ms)
+        if error_occurred:
+            self.latency.record('request_errors', 1.0)
     
     def record_ai_metrics(self, metric_type: str, value: Any, **kwargs):
         """Registra métricas específicas de IA"""
@@ -295,6 +307,7 @@ class PerformanceMonitor:
                     self.ai_metrics.rag_avg_response_time_ms = (
                         (current_avg * (current_count - 1)) + new_time
                     ) / current_count
+                    self.latency.record('rag_response_ms', new_time)
             
             elif metric_type == 'qa_validation':
                 self.ai_metrics.qa_validations_count += 1
@@ -343,10 +356,25 @@ class PerformanceMonitor:
                 'endpoints': {k: asdict(v) for k, v in self.endpoint_metrics.items()},
                 'ai_metrics': asdict(self.ai_metrics),
                 'custom_metrics': dict(self.custom_metrics),
+                'latency': self.get_latency_percentiles(),
                 'request_history_size': self.request_times.get_size(),
                 'performance_history_size': self.performance_history.get_size()
             }
     
+    def get_latency_percentiles(self, endpoint: str = None, metric: str = 'request_ms') -> Dict[str, Dict[str, float]]:
+        """Percentis de latência por janela ('minute', 'hour', 'day'), geral ou de um endpoint"""
+        name = f"{metric}:{endpoint}" if endpoint else metric
+        return {window: self.latency.snapshot(name, window=window) for window in WINDOWS}
+    
+    def get_cluster_latency_percentiles(self, endpoint: str = None, metric: str = 'request_ms') -> Dict[str, Dict[str, float]]:
+        """Como get_latency_percentiles, mesclando todos os workers de METRICS_SHARED_DIR"""
+        if not self.shared_dir:
+            return self.get_latency_percentiles(endpoint, metric)
+        self.latency.publish(self.shared_dir, f"perf-{os.getpid()}")
+        merged = MetricsRegistry.load_dir(self.shared_dir)
+        name = f"{metric}:{endpoint}" if endpoint else metric
+        return {window: merged.snapshot(name, window=window) for window in WINDOWS}
+    
     def get_performance_history(self, hours: int = 1) -> List[Dict[str, Any]]:
         """Retorna histórico de performance"""
         snapshots = self.performance_history.get_recent()
@@ -0,0 +1,543 @@
+# -*- coding: utf-8 -*-
+"""
+Metric Sketches - Percentis e taxas em memória constante
+========================================================
+
+Substitui as janelas de pontos brutos (deque de 10k + np.percentile a cada
+leitura) por estruturas de custo O(1) por atualização:
+
+- DDSketch: histograma em buckets logarítmicos (gamma = (1+a)/(1-a)); todo
+  percentil retornado tem erro relativo <= a (padrão 1%) em relação ao valor
+  exato. Sketches somam-se bucket a bucket, então o merge entre janelas ou
+  workers é exato (o mesmo resultado de um sketch único com todos os pontos).
+- WindowedSketch: sketches por slot de tempo em três resoluções (5 s, 1 min,
+  1 h), consolidados em cascata quando o slot fecha; a janela pedida é
+  atendida pela resolução mais fina que a cobre (arredondada para cima em no
+  máximo um slot).
+- DecayingCounter: contador com decaimento exponencial (meia-vida fixa) para
+  taxas por minuto/hora/dia sem guardar eventos.
+- MetricsRegistry: um WindowedSketch (com os contadores) por nome de métrica;
+  `publish(dir)` grava o estado do worker em `metrics-<pid>.json` (troca
+  atômica) e `MetricsRegistry.load_dir(dir)` mescla todos os workers.
+
+Usage:
+    registry = MetricsRegistry()
+    registry.record('response_time', 182.0)
+    registry.snapshot('response_time', window='hour')   # count, avg, p95, p99...
+    registry.publish('/tmp/metrics')                      # por worker
+    MetricsRegistry.load_dir('/tmp/metrics').snapshot('response_time', window='minute')
+"""
+
+import os
+import json
+import math
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Janelas nomeadas (segundos) e meias-vidas dos contadores correspondentes
+WINDOWS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# (largura do slot em segundos, slots mantidos): cobre 2 min, 2 h e 2 dias
+DEFAULT_TIERS: Tuple[Tuple[int, int], ...] = ((5, 24), (60, 120), (3600, 48))
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Abaixo disso o valor conta como zero (log indefinido)
+_MIN_INDEXABLE = 1e-9
+
+class DDSketch:
+    """Sketch de quantis com erro relativo garantido e merge exato"""
+
+    __slots__ = ('relative_accuracy', 'gamma', '_multiplier', 'max_bins',
+                 'positive', 'negative', 'zero_count', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = 2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy deve estar em (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._multiplier = 1.0 / math.log(self.gamma)
+        self.max_bins = max_bins
+        self.positive: Dict[int, float] = {}
+        self.negative: Dict[int, float] = {}
+        self.zero_count = 0.0
+        self.count = 0.0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def key(self, value: float) -> int:
+        """Índice do bucket de |value| (value fora de zero)"""
+        return math.ceil(math.log(abs(value)) * self._multiplier)
+
+    def add(self, value: float, weight: float = 1.0):
+        if value > _MIN_INDEXABLE or value < -_MIN_INDEXABLE:
+            self.add_key(self.key(value), value, weight)
+        else:
+            self.add_key(None, value, weight)
+
+    def add_key(self, key: Optional[int], value: float, weight: float = 1.0):
+        """add() com o índice já calculado (None = zero); usado por WindowedSketch"""
+        if key is None:
+            self.zero_count += weight
+        else:
+            bins = self.positive if value > 0 else self.negative
+            if key in bins:
+                bins[key] += weight
+            else:
+                bins[key] = weight
+                if len(bins) > self.max_bins:
+                    self._collapse(bins)
+        self.count += weight
+        self.sum += value * weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def _collapse(self, bins: Dict[int, float]):
+        """Funde os dois buckets de menor magnitude (só com faixa dinâmica extrema)"""
+        lowest, second = sorted(bins)[:2]
+        bins[second] += bins.pop(lowest)
+
+    def merge(self, other: 'DDSketch'):
+        if other.gamma != self.gamma:
+            raise ValueError("sketches com precisões diferentes não podem ser mesclados")
+        if not other.count:
+            return
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, weight in theirs.items():
+                mine[key] = mine.get(key, 0.0) + weight
+            while len(mine) > self.max_bins:
+                self._collapse(mine)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> 'DDSketch':
+        sketch = DDSketch.__new__(DDSketch)
+        for attribute in self.__slots__:
+            setattr(sketch, attribute, getattr(self, attribute))
+        sketch.positive = dict(self.positive)
+        sketch.negative = dict(self.negative)
+        return sketch
+
+    def _value(self, key: int) -> float:
+        """Ponto do bucket com erro relativo <= relative_accuracy para todo o intervalo"""
+        return 2.0 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+
+        cumulative = 0.0
+        result = None
+        for key in sorted(self.negative, reverse=True):
+            cumulative += self.negative[key]
+            if cumulative > rank:
+                result = -self._value(key)
+                break
+        if result is None:
+            cumulative += self.zero_count
+            if cumulative > rank:
+                result = 0.0
+        if result is None:
+            for key in sorted(self.positive):
+                cumulative += self.positive[key]
+                if cumulative > rank:
+                    result = self._value(key)
+                    break
+        if result is None:
+            result = self.max
+        return min(max(result, self.min), self.max)
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        """Vários quantis numa única ordenação dos buckets"""
+        qs = list(qs)
+        if not self.count:
+            return [None] * len(qs)
+        ordered = [(-self._value(key), self.negative[key]) for key in sorted(self.negative, reverse=True)]
+        if self.zero_count:
+            ordered.append((0.0, self.zero_count))
+        ordered.extend((self._value(key), self.positive[key]) for key in sorted(self.positive))
+
+        results: List[Optional[float]] = [None] * len(qs)
+        pending = sorted(range(len(qs)), key=lambda i: qs[i])
+        position = 0
+        cumulative = 0.0
+        for value, weight in ordered:
+            cumulative += weight
+            while position < len(pending):
+                q = qs[pending[position]]
+                if q <= 0:
+                    results[pending[position]] = self.min
+                elif q >= 1:
+                    results[pending[position]] = self.max
+                elif cumulative > q * (self.count - 1):
+                    results[pending[position]] = min(max(value, self.min), self.max)
+                else:
+                    break
+                position += 1
+        for index in pending[position:]:
+            results[index] = self.max
+        return results
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'zero': self.zero_count,
+            'positive': {str(k): v for k, v in self.positive.items()},
+            'negative': {str(k): v for k, v in self.negative.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], max_bins: int = 2048) -> 'DDSketch':
+        sketch = cls(data['relative_accuracy'], max_bins=max_bins)
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        if sketch.count:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        sketch.zero_count = data['zero']
+        sketch.positive = {int(k): v for k, v in data['positive'].items()}
+        sketch.negative = {int(k): v for k, v in data['negative'].items()}
+        return sketch
+
+class DecayingCounter:
+    """Contador com decaimento exponencial: ~eventos da última meia-vida, sem histórico"""
+
+    __slots__ = ('half_life', '_decay', 'value', 'updated')
+
+    def __init__(self, half_life: float, value: float = 0.0, updated: float = 0.0):
+        self.half_life = half_life
+        self._decay = math.log(2) / half_life
+        self.value = value
+        self.updated = updated
+
+    def add(self, amount: float = 1.0, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        if now > self.updated:
+            if self.value:
+                self.value *= math.exp(-(now - self.updated) * self._decay)
+            self.updated = now
+        self.value += amount
+
+    def get(self, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        if now <= self.updated:
+            return self.value
+        return self.value * math.exp(-(now - self.updated) * self._decay)
+
+    def rate_per_second(self, now: Optional[float] = None, pending: float = 0.0) -> float:
+        """Taxa estimada (estado estacionário: valor = taxa / constante de decaimento);
+        `pending` = eventos recentes ainda não somados"""
+        return (self.get(now) + pending) * self._decay
+
+    def copy(self) -> 'DecayingCounter':
+        return DecayingCounter(self.half_life, self.value, self.updated)
+
+    def merge(self, other: 'DecayingCounter'):
+        now = max(self.updated, other.updated)
+        self.value = self.get(now) + other.get(now)
+        self.updated = now
+
+class WindowedSketch:
+    """DDSketches por slot de tempo em várias resoluções, consolidados em cascata
+
+    Cada registro entra só no slot aberto da resolução mais fina. Quando esse
+    slot fecha ele é somado ao slot da resolução acima (e assim por diante),
+    então o custo por registro é O(1) e o de consolidação é amortizado. Uma
+    leitura soma os slots fechados da resolução escolhida (merge em cache até
+    o próximo fechamento) com os slots ainda abertos das resoluções abaixo.
+    Os contadores com decaimento (uma meia-vida por janela de WINDOWS) também
+    recebem a contagem do slot fino só quando ele fecha.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                 tiers: Tuple[Tuple[int, int], ...] = DEFAULT_TIERS):
+        self.relative_accuracy = relative_accuracy
+        self.tiers = tuple(tiers)
+        self._mapping = DDSketch(relative_accuracy)
+        # por tier: {índice do slot: sketch}
+        self.slots: List[Dict[int, DDSketch]] = [{} for _ in self.tiers]
+        # por tier: (índice, sketch) do slot aberto, ainda não somado ao tier acima
+        self._open: List[Tuple[Optional[int], Optional[DDSketch]]] = [(None, None) for _ in self.tiers]
+        # merge dos slots fechados por tier: ((primeiro, aberto, versão), sketch)
+        self._cache: List[Optional[Tuple[Tuple[int, Optional[int], int], DDSketch]]] = [None for _ in self.tiers]
+        self._version = 0
+        self.counters: Dict[str, DecayingCounter] = {window: DecayingCounter(seconds)
+                                                      for window, seconds in WINDOWS.items()}
+
+    def add(self, value: float, timestamp: float):
+        key = self._mapping.key(value) if (value > _MIN_INDEXABLE or value < -_MIN_INDEXABLE) else None
+        index = int(timestamp // self.tiers[0][0])
+        open_index, sketch = self._open[0]
+        if index != open_index:
+            if open_index is not None and index < open_index:
+                self._add_late(key, value, index)
+                return
+            self._roll(0, index)
+            sketch = self._open[0][1]
+        sketch.add_key(key, value)
+
+    def _parent(self, tier: int, index: int) -> int:
+        return int(index * self.tiers[tier][0] // self.tiers[tier + 1][0])
+
+    def _roll(self, tier: int, index: int):
+        """Abre o slot `index`; o aberto anterior é somado ao slot correspondente do tier acima"""
+        old_index, old = self._open[tier]
+        self._open[tier] = (index, self._slot(tier, index))
+        if tier == 0 and old is not None and old.count:
+            midpoint = (old_index + 0.5) * self.tiers[0][0]
+            for counter in self.counters.values():
+                counter.add(old.count, midpoint)
+        if tier + 1 < len(self.tiers):
+            if old is not None and old.count:
+                self._slot(tier + 1, self._parent(tier, old_index)).merge(old)
+            parent = self._parent(tier, index)
+            if parent != self._open[tier + 1][0]:
+                self._roll(tier + 1, parent)
+
+    def _add_late(self, key: Optional[int], value: float, index: int):
+        """Registro fora de ordem: entra no slot dele e nos já consolidados acima"""
+        self._version += 1
+        for counter in self.counters.values():
+            counter.add(1.0, (index + 0.5) * self.tiers[0][0])
+        for tier in range(len(self.tiers)):
+            self._slot(tier, index).add_key(key, value)
+            open_index = self._open[tier][0]
+            if open_index is None or index >= open_index or tier + 1 == len(self.tiers):
+                break
+            index = self._parent(tier, index)
+
+    def _slot(self, tier: int, index: int) -> DDSketch:
+        slots = self.slots[tier]
+        sketch = slots.get(index)
+        if sketch is None:
+            sketch = slots[index] = DDSketch(self.relative_accuracy)
+            if len(slots) > self.tiers[tier][1]:
+                oldest = index - self.tiers[tier][1]
+                for stale in [i for i in slots if i <= oldest]:
+                    del slots[stale]
+        return sketch
+
+    def _window_slots(self, seconds: float, now: float) -> Tuple[int, int, int]:
+        """(tier, primeiro slot, último slot) que atendem a janela"""
+        tier = next((t for t, (width, slots) in enumerate(self.tiers) if width * slots >= seconds),
+                    len(self.tiers) - 1)
+        width = self.tiers[tier][0]
+        return tier, int((now - seconds) // width), int(now // width)
+
+    def window_start(self, seconds: float, now: Optional[float] = None) -> float:
+        """Início efetivo da janela (alinhado ao slot da resolução usada)"""
+        now = time.time() if now is None else now
+        tier, first, _ = self._window_slots(seconds, now)
+        return first * self.tiers[tier][0]
+
+    def window(self, seconds: float, now: Optional[float] = None) -> DDSketch:
+        """Sketch da resolução mais fina que cobre `seconds` (janela arredondada para o slot)"""
+        now = time.time() if now is None else now
+        tier, first, last = self._window_slots(seconds, now)
+        width = self.tiers[tier][0]
+        open_index, open_sketch = self._open[tier]
+
+        cache_key = (first, open_index, self._version)
+        cached = self._cache[tier]
+        if cached is None or cached[0] != cache_key:
+            closed = DDSketch(self.relative_accuracy)
+            for index, sketch in self.slots[tier].items():
+                if first <= index <= last and sketch is not open_sketch:
+                    closed.merge(sketch)
+            self._cache[tier] = cached = (cache_key, closed)
+
+        merged = cached[1].copy()
+        if open_sketch is not None and first <= open_index <= last:
+            merged.merge(open_sketch)
+        for finer in range(tier):
+            index, sketch = self._open[finer]
+            if sketch is not None and first <= int(index * self.tiers[finer][0] // width) <= last:
+                merged.merge(sketch)
+        return merged
+
+    def rate(self, window: str, now: Optional[float] = None) -> float:
+        """Eventos por segundo com meia-vida da janela (inclui o slot fino aberto)"""
+        pending = self._open[0][1].count if self._open[0][1] is not None else 0.0
+        return self.counters[window].rate_per_second(now, pending)
+
+    def _complete_counters(self) -> Dict[str, DecayingCounter]:
+        """Contadores já incluindo o slot fino aberto"""
+        counters = {window: counter.copy() for window, counter in self.counters.items()}
+        open_index, sketch = self._open[0]
+        if sketch is not None and sketch.count:
+            for counter in counters.values():
+                counter.add(sketch.count, (open_index + 0.5) * self.tiers[0][0])
+        return counters
+
+    def _complete_slots(self) -> List[Dict[int, DDSketch]]:
+        """Slots de cada tier já incluindo os dados ainda abertos nos tiers abaixo"""
+        complete = []
+        for tier, slots in enumerate(self.slots):
+            pending = {}
+            for finer in range(tier):
+                index, sketch = self._open[finer]
+                if sketch is not None and sketch.count:
+                    parent = int(index * self.tiers[finer][0] // self.tiers[tier][0])
+                    pending.setdefault(parent, []).append(sketch)
+            tier_slots = dict(slots)
+            for index, sketches in pending.items():
+                combined = tier_slots[index].copy() if index in tier_slots else DDSketch(self.relative_accuracy)
+                for sketch in sketches:
+                    combined.merge(sketch)
+                tier_slots[index] = combined
+            complete.append(tier_slots)
+        return complete
+
+    def merge(self, other: 'WindowedSketch'):
+        """Soma outro WindowedSketch (de outro worker) a esta visão consolidada, só de leitura"""
+        if other.tiers != self.tiers:
+            raise ValueError("WindowedSketch com resoluções diferentes")
+        if any(sketch is not None for _, sketch in self._open):
+            raise ValueError("merge só em visões consolidadas (sem registros locais)")
+        self._version += 1
+        for tier, slots in enumerate(other._complete_slots()):
+            for index, sketch in slots.items():
+                self._slot(tier, index).merge(sketch)
+        for window, counter in other._complete_counters().items():
+            self.counters[window].merge(counter)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'tiers': [list(tier) for tier in self.tiers],
+            'slots': [{str(index): sketch.to_dict() for index, sketch in slots.items()}
+                      for slots in self._complete_slots()],
+            'counters': {window: [counter.half_life, counter.value, counter.updated]
+                         for window, counter in self._complete_counters().items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'WindowedSketch':
+        """Visão consolidada (todos os slots fechados), pronta para merge e leitura"""
+        windowed = cls(data['relative_accuracy'], tuple(tuple(tier) for tier in data['tiers']))
+        for tier, slots in enumerate(data['slots']):
+            for index, sketch in slots.items():
+                windowed.slots[tier][int(index)] = DDSketch.from_dict(sketch)
+        windowed.counters = {window: DecayingCounter(*values) for window, values in data['counters'].items()}
+        return windowed
+
+class MetricsRegistry:
+    """Um WindowedSketch (percentis + contadores com decaimento) por nome de métrica"""
+
+    FILE_PREFIX = 'metrics-'
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                 tiers: Tuple[Tuple[int, int], ...] = DEFAULT_TIERS):
+        self.relative_accuracy = relative_accuracy
+        self.tiers = tuple(tiers)
+        self.sketches: Dict[str, WindowedSketch] = {}
+        self.lock = threading.Lock()
+
+    def record(self, name: str, value: float, timestamp: Optional[float] = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            sketch = self.sketches.get(name)
+            if sketch is None:
+                sketch = self.sketches[name] = WindowedSketch(self.relative_accuracy, self.tiers)
+            sketch.add(value, timestamp)
+
+    def names(self) -> List[str]:
+        with self.lock:
+            return list(self.sketches)
+
+    def snapshot(self, name: str, window: str = 'hour', window_seconds: Optional[float] = None,
+                 now: Optional[float] = None) -> Dict[str, float]:
+        """count/sum/avg/min/max/median/p95/p99 e taxa por segundo da janela; {} sem pontos"""
+        seconds = window_seconds if window_seconds is not None else WINDOWS[window]
+        now = time.time() if now is None else now
+        with self.lock:
+            windowed = self.sketches.get(name)
+            if windowed is None:
+                return {}
+            sketch = windowed.window(seconds, now)
+            rate = windowed.rate(window, now) if window_seconds is None else sketch.count / seconds
+        if not sketch.count:
+            return {}
+        median, p95, p99 = sketch.quantiles((0.5, 0.95, 0.99))
+        return {
+            'count': int(sketch.count),
+            'sum': sketch.sum,
+            'avg': sketch.sum / sketch.count,
+            'min': sketch.min,
+            'max': sketch.max,
+            'median': median,
+            'p95': p95,
+            'p99': p99,
+            'rate_per_second': rate
+        }
+
+    def merge(self, other: 'MetricsRegistry'):
+        """Soma outro registro a este (visão consolidada, ex.: load_dir)"""
+        with self.lock:
+            for name, sketch in other.sketches.items():
+                if name not in self.sketches:
+                    self.sketches[name] = WindowedSketch(self.relative_accuracy, self.tiers)
+                self.sketches[name].merge(sketch)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'relative_accuracy': self.relative_accuracy,
+                'tiers': [list(tier) for tier in self.tiers],
+                'metrics': {name: sketch.to_dict() for name, sketch in self.sketches.items()}
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MetricsRegistry':
+        registry = cls(data['relative_accuracy'], tuple(tuple(tier) for tier in data['tiers']))
+        for name, sketch in data['metrics'].items():
+            registry.sketches[name] = WindowedSketch.from_dict(sketch)
+        return registry
+    def publish(self, directory: str, worker_id: Optional[str] = None) -> str:
+        """Grava o estado deste worker em <directory>/metrics-<worker>.json (troca atômica)"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.FILE_PREFIX}{worker_id or os.getpid()}.json")
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+        os.replace(temp_path, path)
+        return path
+
+    @classmethod
+    def load_dir(cls, directory: str, max_age_seconds: float = WINDOWS['day'] * 2,
+                 relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                 tiers: Tuple[Tuple[int, int], ...] = DEFAULT_TIERS) -> 'MetricsRegistry':
+        """Mescla os arquivos de todos os workers (ignora os mais velhos que max_age_seconds)"""
+        merged = cls(relative_accuracy, tiers)
+        if not os.path.isdir(directory):
+            return merged
+        cutoff = time.time() - max_age_seconds
+        for filename in sorted(os.listdir(directory)):
+            if not (filename.startswith(cls.FILE_PREFIX) and filename.endswith('.json')):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    merged.merge(cls.from_dict(json.load(f)))
+            except (OSError, ValueError, KeyError):
+                # Arquivo de outro worker sendo substituído/corrompido: fica de fora desta leitura
+                continue
+        return merged
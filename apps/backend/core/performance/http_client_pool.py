@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP Client Pool - Process-wide pooled httpx clients for outbound APIs
+
+One keep-alive client per origin (scheme://host:port), so every chat turn
+reuses the TCP+TLS connections already open to OpenRouter, HuggingFace and
+Supabase instead of paying a new handshake per request.
+
+- Sync clients (httpx.Client) are shared by all threads of the process
+- Async clients (httpx.AsyncClient) are bound to an event loop, so there is
+  one per (origin, loop); clients of closed loops are discarded
+- Limits apply per origin: HTTP_POOL_MAX_CONNECTIONS / HTTP_POOL_MAX_KEEPALIVE
+- HTTP/2 is negotiated when HTTP2_ENABLED and the h2 package is installed
+- After a fork (gunicorn workers) the inherited clients are dropped, never shared
+
+Counters per origin: requests, new connections (from the httpcore trace
+extension), reused connections and current pool utilization.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.logging.sanitizer import sanitize_error
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 é opcional (pacote h2)
+H2_AVAILABLE = False
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    pass
+
+# Timeout para fechar clientes async de outro event loop no shutdown
+CLOSE_TIMEOUT_SECONDS = 5.0
+
+@dataclass
+class HTTPPoolConfig:
+    """Limites e timeouts dos pools"""
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    http2: bool = True
+
+    @classmethod
+    def from_config(cls, config) -> 'HTTPPoolConfig':
+        return cls(
+            max_connections=getattr(config, 'HTTP_POOL_MAX_CONNECTIONS', 20),
+            max_keepalive_connections=getattr(config, 'HTTP_POOL_MAX_KEEPALIVE', 10),
+            keepalive_expiry=getattr(config, 'HTTP_POOL_KEEPALIVE_EXPIRY', 30.0),
+            connect_timeout=getattr(config, 'HTTP_CONNECT_TIMEOUT', 5.0),
+            read_timeout=getattr(config, 'HTTP_READ_TIMEOUT', 30.0),
+            http2=getattr(config, 'HTTP2_ENABLED', True)
+        )
+
+def origin_of(url: str) -> str:
+    """scheme://host:port de uma URL (chave do pool)"""
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.hostname:
+        raise ValueError(f"URL sem origem: {url!r}")
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+class _OriginStats:
+    """Contadores de um origin (somados entre clientes sync e async)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.errors = 0
+
+    def on_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def on_trace(self, event: str):
+        if event == 'connection.connect_tcp.complete':
+            with self.lock:
+                self.connections_opened += 1
+        elif event.endswith('.failed') and event.startswith('connection.'):
+            with self.lock:
+                self.errors += 1
+
+class HTTPClientRegistry:
+    """Registro de clientes httpx compartilhados por origin"""
+
+    def __init__(self, pool_config: Optional[HTTPPoolConfig] = None):
+        self.pool_config = pool_config or HTTPPoolConfig()
+        self.http2 = self.pool_config.http2 and H2_AVAILABLE
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._sync_clients: Dict[str, httpx.Client] = {}
+        self._async_clients: Dict[Tuple[str, int], Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self._stats: Dict[str, _OriginStats] = {}
+
+        if self.pool_config.http2 and not H2_AVAILABLE:
+            logger.info("[HTTP POOL] h2 não instalado - usando HTTP/1.1 keep-alive")
+
+    # ------------------------------------------------------------------
+    # Clientes
+    # ------------------------------------------------------------------
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        cfg = self.pool_config
+        return {
+            'limits': httpx.Limits(
+                max_connections=cfg.max_connections,
+                max_keepalive_connections=cfg.max_keepalive_connections,
+                keepalive_expiry=cfg.keepalive_expiry
+            ),
+            'timeout': httpx.Timeout(cfg.read_timeout, connect=cfg.connect_timeout),
+            'http2': self.http2
+        }
+
+    def _check_fork(self):
+        # Conexões herdadas de outro processo não podem ser usadas nem fechadas aqui
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._sync_clients = {}
+            self._async_clients = {}
+            self._stats = {}
+
+    def _origin_stats(self, origin: str) -> _OriginStats:
+        stats = self._stats.get(origin)
+        if stats is None:
+            stats = self._stats[origin] = _OriginStats()
+        return stats
+
+    def client(self, url: str) -> httpx.Client:
+        """Cliente síncrono compartilhado para o origin da URL"""
+        origin = origin_of(url)
+        with self._lock:
+            self._check_fork()
+            client = self._sync_clients.get(origin)
+            if client is None or client.is_closed:
+                stats = self._origin_stats(origin)
+
+                def trace(event, info):
+                    stats.on_trace(event)
+
+                def on_request(request):
+                    stats.on_request()
+                    request.extensions['trace'] = trace
+
+                client = httpx.Client(event_hooks={'request': [on_request]}, **self._client_kwargs())
+                self._sync_clients[origin] = client
+                logger.debug("[HTTP POOL] Novo cliente sync para %s", origin)
+            return client
+
+    def async_client(self, url: str) -> httpx.AsyncClient:
+        """Cliente assíncrono compartilhado para o origin da URL no event loop atual"""
+        origin = origin_of(url)
+        loop = asyncio.get_running_loop()
+        key = (origin, id(loop))
+
+        with self._lock:
+            self._check_fork()
+            self._discard_dead_loops()
+            entry = self._async_clients.get(key)
+            if entry is None or entry[0] is not loop or entry[1].is_closed:
+                stats = self._origin_stats(origin)
+
+                async def trace(event, info):
+                    stats.on_trace(event)
+
+                async def on_request(request):
+                    stats.on_request()
+                    request.extensions['trace'] = trace
+
+                client = httpx.AsyncClient(event_hooks={'request': [on_request]}, **self._client_kwargs())
+                self._async_clients[key] = (loop, client)
+                logger.debug("[HTTP POOL] Novo cliente async para %s", origin)
+                return client
+            return entry[1]
+
+    def _discard_dead_loops(self):
+        dead = [key for key, (loop, _) in self._async_clients.items() if loop.is_closed()]
+        for key in dead:
+            # O loop já foi fechado: as conexões não podem mais ser encerradas de forma assíncrona
+            del self._async_clients[key]
+
+    # ------------------------------------------------------------------
+    # Shutdown
+    # ------------------------------------------------------------------
+
+    def close(self):
+        """Fecha todos os clientes (hook de shutdown da aplicação)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            sync_clients = list(self._sync_clients.values())
+            async_clients = list(self._async_clients.values())
+            self._sync_clients = {}
+            self._async_clients = {}
+
+        for client in sync_clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.debug("Erro ao fechar cliente HTTP: %s", sanitize_error(e))
+
+        for loop, client in async_clients:
+            try:
+                if loop.is_closed():
+                    continue
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(CLOSE_TIMEOUT_SECONDS)
+                else:
+                    loop.run_until_complete(client.aclose())
+            except Exception as e:
+                logger.debug("Erro ao fechar cliente HTTP async: %s", sanitize_error(e))
+
+        if sync_clients or async_clients:
+            logger.info("[HTTP POOL] %d clientes HTTP fechados", len(sync_clients) + len(async_clients))
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _pool_usage(client) -> Tuple[int, int]:
+        """(conexões abertas, conexões em uso) do pool httpcore do cliente"""
+        try:
+            connections = client._transport._pool.connections
+        except AttributeError:
+            return 0, 0
+        active = sum(1 for connection in connections if not connection.is_idle())
+        return len(connections), active
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            origins = {}
+            for origin, stats in self._stats.items():
+                clients = [c for o, c in self._sync_clients.items() if o == origin]
+                clients += [c for (o, _), (_, c) in self._async_clients.items() if o == origin]
+                open_connections = active = 0
+                for client in clients:
+                    total, in_use = self._pool_usage(client)
+                    open_connections += total
+                    active += in_use
+
+                with stats.lock:
+                    requests = stats.requests
+                    opened = stats.connections_opened
+                    errors = stats.errors
+
+                capacity = self.pool_config.max_connections * max(1, len(clients))
+                origins[origin] = {
+                    'requests': requests,
+                    'connections_opened': opened,
+                    'connections_reused': max(0, requests - opened),
+                    'reuse_rate': (requests - opened) / requests * 100 if requests else 0.0,
+                    'connection_errors': errors,
+                    'clients': len(clients),
+                    'open_connections': open_connections,
+                    'active_connections': active,
+                    'pool_utilization': active / capacity * 100
+                }
+
+            return {
+                'http2': self.http2,
+                'max_connections_per_host': self.pool_config.max_connections,
+                'max_keepalive_connections': self.pool_config.max_keepalive_connections,
+                'keepalive_expiry': self.pool_config.keepalive_expiry,
+                'sync_clients': len(self._sync_clients),
+                'async_clients': len(self._async_clients),
+                'origins': origins
+            }
+
+# Instância global
+_registry: Optional[HTTPClientRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_http_client_registry() -> HTTPClientRegistry:
+    """Obtém o registro global (configurado a partir do app_config)"""
+    global _registry
+
+    with _registry_lock:
+        if _registry is None:
+            try:
+                from app_config import config
+                pool_config = HTTPPoolConfig.from_config(config)
+            except Exception as e:
+                logger.warning("Configuração HTTP indisponível, usando padrões: %s", sanitize_error(e))
+                pool_config = HTTPPoolConfig()
+            _registry = HTTPClientRegistry(pool_config)
+        return _registry
+
+def get_http_client(url: str) -> httpx.Client:
+    """Cliente síncrono pooled para a URL"""
+    return get_http_client_registry().client(url)
+
+def get_async_http_client(url: str) -> httpx.AsyncClient:
+    """Cliente assíncrono pooled para a URL (event loop atual)"""
+    return get_http_client_registry().async_client(url)
+
+def close_http_clients():
+    """Fecha os clientes do registro global"""
+    if _registry is not None:
+        _registry.close()
+
+def init_http_clients(app) -> HTTPClientRegistry:
+    """Registra o pool na aplicação Flask e o fechamento no shutdown do processo"""
+    import atexit
+
+    registry = get_http_client_registry()
+    app.extensions['http_clients'] = registry
+    atexit.register(close_http_clients)
+    logger.info("[HTTP POOL] Clientes HTTP compartilhados (HTTP/2: %s)", registry.http2)
+    return registry
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+Postgres Pool - Thread-safe pooled psycopg2 connections with prepared statements
+
+Replaces the single autocommit connection that RealSupabaseClient shared
+between every gunicorn thread:
+
+- Blocking checkout (up to max_connections); time spent waiting for a free
+  connection is recorded, so pool pressure is visible instead of hidden
+- Connections that fail with OperationalError/InterfaceError are discarded,
+  not returned to the pool
+- Statements are declared once with $n placeholders and executed with
+  PREPARE/EXECUTE on each connection (one parse/plan per connection). A
+  parameter referenced several times ($1 ... $1) is sent once. With
+  prepared_statements=False (PgBouncer in transaction mode) the same
+  statement runs as plain parameterized SQL
+- Latency histograms per statement and for checkout waits
+- After a fork (gunicorn workers) the inherited connections are dropped, never shared
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from core.logging.sanitizer import sanitize_error
+
+logger = logging.getLogger(__name__)
+
+# psycopg2 é opcional (pool indisponível sem ele)
+try:
+    import psycopg2
+    PSYCOPG2_AVAILABLE = True
+    DISCONNECT_ERRORS: Tuple[type, ...] = (psycopg2.OperationalError, psycopg2.InterfaceError)
+except ImportError:
+    psycopg2 = None
+    PSYCOPG2_AVAILABLE = False
+    DISCONNECT_ERRORS = ()
+
+# Limites dos buckets dos histogramas (ms); o último bucket é +inf
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_PLACEHOLDER = re.compile(r'\$(\d+)')
+
+@dataclass
+class PgPoolConfig:
+    """Limites do pool"""
+    min_connections: int = 1
+    max_connections: int = 10
+    checkout_timeout: float = 10.0
+    prepared_statements: bool = True
+
+    @classmethod
+    def from_config(cls, config) -> 'PgPoolConfig':
+        return cls(
+            min_connections=getattr(config, 'PG_POOL_MIN_CONNECTIONS', 1),
+            max_connections=getattr(config, 'PG_POOL_MAX_CONNECTIONS', 10),
+            checkout_timeout=getattr(config, 'PG_POOL_CHECKOUT_TIMEOUT', 10.0),
+            prepared_statements=getattr(config, 'PG_PREPARED_STATEMENTS', True)
+        )
+
+@dataclass(frozen=True)
+class PreparedStatement:
+    """
+    Statement com placeholders $n; param_types na ordem dos parâmetros
+    (ex.: ('vector', 'int', 'float8'))
+    """
+    name: str
+    sql: str
+    param_types: Tuple[str, ...] = ()
+
+    def prepare_sql(self) -> str:
+        types = f" ({', '.join(self.param_types)})" if self.param_types else ""
+        return f"PREPARE {self.name}{types} AS {self.sql}"
+
+    def execute_sql(self) -> str:
+        if not self.param_types:
+            return f"EXECUTE {self.name}"
+        return f"EXECUTE {self.name} ({', '.join(['%s'] * len(self.param_types))})"
+
+    def plain_sql(self) -> str:
+        """SQL equivalente sem PREPARE ($n -> %(pn)s, cada parâmetro enviado uma vez)"""
+        return _PLACEHOLDER.sub(lambda m: f"%(p{m.group(1)})s", self.sql.replace('%', '%%'))
+
+    def plain_params(self, params: Sequence[Any]) -> Dict[str, Any]:
+        return {f"p{i}": value for i, value in enumerate(params, start=1)}
+
+class LatencyHistogram:
+    """Histograma de latência com buckets fixos (ms)"""
+
+    def __init__(self, buckets_ms: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        index = len(self.buckets_ms)
+        for i, bound in enumerate(self.buckets_ms):
+            if ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p: float) -> float:
+        """Limite superior do bucket que contém o percentil p (ms)"""
+        if not self.total:
+            return 0.0
+        target = self.total * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return float(self.buckets_ms[i]) if i < len(self.buckets_ms) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{bound}ms" for bound in self.buckets_ms] + ['gt_%sms' % self.buckets_ms[-1]]
+        return {
+            'count': self.total,
+            'avg_ms': self.sum_ms / self.total if self.total else 0.0,
+            'max_ms': self.max_ms,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+class PostgresConnectionPool:
+    """Pool de conexões autocommit com checkout bloqueante e statements preparados"""
+
+    def __init__(self, dsn: str, pool_config: Optional[PgPoolConfig] = None,
+                 connect: Optional[Callable[[str], Any]] = None):
+        if connect is None and not PSYCOPG2_AVAILABLE:
+            raise RuntimeError("psycopg2 not available - install with: pip install psycopg2-binary")
+
+        self.dsn = dsn
+        self.pool_config = pool_config or PgPoolConfig()
+        self._connect = connect or psycopg2.connect
+        self._cond = threading.Condition()
+        self._closed = False
+        self._reset_process_state()
+
+        # Conexões mínimas abertas já no startup (falha cedo se o banco não responde)
+        with self._cond:
+            for _ in range(max(0, self.pool_config.min_connections)):
+                self._idle.append(self._open())
+                self._stats['connections_opened'] += 1
+
+    def _reset_process_state(self):
+        # Estado que não sobrevive a um fork
+        self._pid = os.getpid()
+        self._idle: List[Any] = []
+        self._in_use = 0
+        self._prepared: Dict[int, set] = {}
+        self._wait_histogram = LatencyHistogram()
+        self._query_histograms: Dict[str, LatencyHistogram] = {}
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_timeouts': 0,
+            'connections_opened': 0,
+            'connections_discarded': 0,
+            'prepares': 0,
+            'query_errors': 0
+        }
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._cond:
+                if self._pid != os.getpid():
+                    self._reset_process_state()
+
+    def _open(self):
+        conn = self._connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    # ------------------------------------------------------------------
+    # Checkout
+    # ------------------------------------------------------------------
+
+    def _acquire(self, timeout: Optional[float]):
+        timeout = self.pool_config.checkout_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Pool PostgreSQL fechado")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._in_use < self.pool_config.max_connections:
+                    conn = None
+                    break
+                waited = True
+                remaining = timeout - (time.perf_counter() - started)
+                if remaining <= 0:
+                    self._stats['wait_timeouts'] += 1
+                    raise TimeoutError(
+                        f"Nenhuma conexão PostgreSQL livre em {timeout:.1f}s "
+                        f"(max_connections={self.pool_config.max_connections})"
+                    )
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+            self._wait_histogram.observe(time.perf_counter() - started)
+
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['connections_opened'] += 1
+        return conn
+
+    def _release(self, conn, discard: bool = False):
+        if discard or getattr(conn, 'closed', False):
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._in_use -= 1
+            if discard or getattr(conn, 'closed', False) or self._closed:
+                self._prepared.pop(id(conn), None)
+                self._stats['connections_discarded'] += 1
+                if self._closed and not getattr(conn, 'closed', False):
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Conexão exclusiva da thread até o fim do bloco"""
+        self._check_fork()
+        conn = self._acquire(timeout)
+        try:
+            yield conn
+        except DISCONNECT_ERRORS:
+            self._release(conn, discard=True)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    # ------------------------------------------------------------------
+    # Statements
+    # ------------------------------------------------------------------
+
+    def run(self, conn, statement: PreparedStatement, params: Sequence[Any] = (),
+            cursor_factory=None, fetch: str = 'all'):
+        """
+        Executa o statement numa conexão já obtida; fetch: 'all', 'one' ou 'none'
+        """
+        started = time.perf_counter()
+        try:
+            cursor_kwargs = {'cursor_factory': cursor_factory} if cursor_factory else {}
+            with conn.cursor(**cursor_kwargs) as cursor:
+                if self.pool_config.prepared_statements:
+                    prepared = self._prepared.setdefault(id(conn), set())
+                    if statement.name not in prepared:
+                        cursor.execute(statement.prepare_sql())
+                        prepared.add(statement.name)
+                        self._stats['prepares'] += 1
+                    cursor.execute(statement.execute_sql(), tuple(params))
+                else:
+                    cursor.execute(statement.plain_sql(), statement.plain_params(params))
+
+                if fetch == 'all':
+                    result = cursor.fetchall()
+                elif fetch == 'one':
+                    result = cursor.fetchone()
+                else:
+                    result = cursor.rowcount
+        except Exception:
+            with self._cond:
+                self._stats['query_errors'] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._cond:
+                histogram = self._query_histograms.get(statement.name)
+                if histogram is None:
+                    histogram = self._query_histograms[statement.name] = LatencyHistogram()
+                histogram.observe(elapsed)
+        return result
+
+    def execute(self, statement: PreparedStatement, params: Sequence[Any] = (),
+                cursor_factory=None, fetch: str = 'all', timeout: Optional[float] = None):
+        """Checkout + run + devolução"""
+        with self.connection(timeout) as conn:
+            return self.run(conn, statement, params, cursor_factory=cursor_factory, fetch=fetch)
+
+    # ------------------------------------------------------------------
+    # Shutdown e métricas
+    # ------------------------------------------------------------------
+
+    def close(self):
+        """Fecha as conexões livres; as em uso fecham ao serem devolvidas"""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.debug("Erro ao fechar conexão PostgreSQL: %s", sanitize_error(e))
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'idle_connections': len(self._idle),
+                'in_use_connections': self._in_use,
+                'max_connections': self.pool_config.max_connections,
+                'prepared_statements': self.pool_config.prepared_statements,
+                'checkout_wait': self._wait_histogram.to_dict(),
+                'query_latency': {name: hist.to_dict() for name, hist in self._query_histograms.items()}
+            })
+        return stats
+
+class _PooledCursor:
+    """Cursor que devolve a conexão ao pool quando é fechado"""
+
+    def __init__(self, pool: PostgresConnectionPool, kwargs: Dict[str, Any]):
+        self._pool = pool
+        self._context = pool.connection()
+        self._conn = self._context.__enter__()
+        try:
+            self._cursor = self._conn.cursor(**kwargs)
+        except BaseException as e:
+            self._context.__exit__(type(e), e, e.__traceback__)
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._cursor.close()
+        finally:
+            self._context.__exit__(exc_type, exc, tb)
+        return False
+
+    def close(self):
+        self.__exit__(None, None, None)
+
+class PooledConnectionProxy:
+    """
+    Substituto de uma conexão psycopg2 compartilhada: cada cursor() faz
+    checkout de uma conexão do pool e a devolve ao sair do bloco `with`
+    """
+
+    def __init__(self, pool: PostgresConnectionPool):
+        self.pool = pool
+        self.autocommit = True
+
+    def cursor(self, **kwargs) -> _PooledCursor:
+        return _PooledCursor(self.pool, kwargs)
+
+    @property
+    def closed(self) -> bool:
+        return self.pool.closed
+
+    def close(self):
+        self.pool.close()
+
+# Pools nomeados do processo (diagnóstico)
+_pools: Dict[str, PostgresConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def register_pg_pool(name: str, pool: PostgresConnectionPool):
+    with _pools_lock:
+        _pools[name] = pool
+
+def get_pg_pool_stats() -> Dict[str, Any]:
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool.get_stats() for name, pool in pools.items() if not pool.closed}
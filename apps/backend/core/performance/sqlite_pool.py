@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite Pool - Process-wide pooled SQLite connections per database file
+
+Replaces "sqlite3.connect() per operation" in the storage, rate limiting and
+analytics subsystems:
+
+- Reads use one long-lived connection per thread (gunicorn gthread workers
+  keep their threads), opened read-only at the SQL level (query_only)
+- Writes are executed by a single writer thread per database; jobs queued
+  while a commit is in flight are grouped into one transaction (group
+  commit), each job isolated by a SAVEPOINT so a failing job does not roll
+  back its neighbours
+- WAL journal + tuned PRAGMAs (mmap_size, cache_size, temp_store, busy_timeout)
+- Compiled statements are reused through the sqlite3 statement cache
+  (cached_statements), so every call site should use bound parameters
+- After a fork the inherited connections are dropped, never shared
+
+The writer result is delivered only after COMMIT, so a caller that waits on
+write() reads its own writes from any thread.
+"""
+
+import os
+import atexit
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from core.logging.sanitizer import sanitize_error
+
+logger = logging.getLogger(__name__)
+
+# Timeout padrão de espera por um write enfileirado
+WRITE_TIMEOUT_SECONDS = 30.0
+# Timeout para o writer drenar a fila no shutdown
+CLOSE_TIMEOUT_SECONDS = 10.0
+# Janela de amostras para latência de commit
+COMMIT_LATENCY_WINDOW = 1000
+
+@dataclass
+class SQLitePoolConfig:
+    """PRAGMAs e limites das conexões"""
+    busy_timeout_ms: int = 30000
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size_kb: int = 16384  # por conexão
+    cached_statements: int = 256
+    write_batch_size: int = 256
+    synchronous: str = 'NORMAL'  # seguro com WAL: perde no máximo o último commit em queda de energia
+
+    @classmethod
+    def from_config(cls, config) -> 'SQLitePoolConfig':
+        return cls(
+            busy_timeout_ms=getattr(config, 'SQLITE_BUSY_TIMEOUT_MS', 30000),
+            mmap_size=getattr(config, 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+            cache_size_kb=getattr(config, 'SQLITE_CACHE_SIZE_KB', 16384),
+            cached_statements=getattr(config, 'SQLITE_CACHED_STATEMENTS', 256),
+            write_batch_size=getattr(config, 'SQLITE_WRITE_BATCH_SIZE', 256)
+        )
+
+class _WriteJob:
+    """Job do writer; isolated=True roda fora da transação do lote (DDL, checkpoint)"""
+    __slots__ = ('fn', 'isolated', 'future')
+
+    def __init__(self, fn: Callable[[sqlite3.Connection], Any], isolated: bool = False):
+        self.fn = fn
+        self.isolated = isolated
+        self.future: Future = Future()
+
+class SQLiteConnectionPool:
+    """Conexões de leitura por thread + writer único com commits em lote"""
+
+    def __init__(self, db_path, pool_config: Optional[SQLitePoolConfig] = None):
+        self.db_path = str(Path(db_path).resolve())
+        self.pool_config = pool_config or SQLitePoolConfig()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._reset_process_state()
+
+    def _reset_process_state(self):
+        # Estado que não sobrevive a um fork
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._readers: Dict[int, tuple] = {}
+        self._queue: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_ident: Optional[int] = None
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._commit_latencies: List[float] = []
+        self._stats = {
+            'writes': 0,
+            'write_errors': 0,
+            'batches': 0,
+            'max_batch_size': 0,
+            'commit_errors': 0
+        }
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_process_state()
+
+    # ------------------------------------------------------------------
+    # Conexões
+    # ------------------------------------------------------------------
+
+    def _open_connection(self, read_only: bool) -> sqlite3.Connection:
+        cfg = self.pool_config
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=cfg.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            isolation_level=None,  # transações explícitas (BEGIN IMMEDIATE no writer)
+            cached_statements=cfg.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(cfg.busy_timeout_ms)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {cfg.synchronous}")
+        conn.execute(f"PRAGMA mmap_size = {int(cfg.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(cfg.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexão de leitura da thread atual (mantida aberta entre requisições)"""
+        self._check_fork()
+        if self._closed:
+            raise RuntimeError(f"Pool SQLite fechado: {self.db_path}")
+
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = self._open_connection(read_only=True)
+            self._local.connection = conn
+            with self._lock:
+                self._prune_dead_readers()
+                self._readers[threading.get_ident()] = (threading.current_thread(), conn)
+        return conn
+
+    def _prune_dead_readers(self):
+        dead = [ident for ident, (thread, _) in self._readers.items() if not thread.is_alive()]
+        for ident in dead:
+            _, conn = self._readers.pop(ident)
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # ------------------------------------------------------------------
+    # Writer
+    # ------------------------------------------------------------------
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                ready = threading.Event()
+                self._writer = threading.Thread(
+                    target=self._writer_loop, args=(ready,),
+                    name=f"sqlite-writer-{Path(self.db_path).name}", daemon=True
+                )
+                self._writer.start()
+                ready.wait()
+
+    def _submit(self, job: _WriteJob, wait: bool, timeout: Optional[float]):
+        self._check_fork()
+        if self._closed:
+            raise RuntimeError(f"Pool SQLite fechado: {self.db_path}")
+
+        if threading.get_ident() == self._writer_ident:
+            # Chamado de dentro de um job: executar na transação corrente
+            if job.isolated:
+                raise RuntimeError("DDL/checkpoint não pode ser chamado dentro de um job de escrita")
+            result = job.fn(self._writer_conn)
+            if wait:
+                return result
+            future = Future()
+            future.set_result(result)
+            return future
+
+        self._ensure_writer()
+        self._queue.put(job)
+        if not wait:
+            return job.future
+        return job.future.result(timeout if timeout is not None else WRITE_TIMEOUT_SECONDS)
+
+    def write(self, fn: Callable[[sqlite3.Connection], Any], wait: bool = True,
+              timeout: Optional[float] = None):
+        """
+        Executa fn(conn) no writer, dentro de uma transação compartilhada com
+        os outros jobs do lote. fn não deve chamar commit/rollback.
+
+        wait=True retorna o resultado de fn após o COMMIT (ou propaga a exceção);
+        wait=False retorna um Future (fire-and-forget para analytics).
+        """
+        return self._submit(_WriteJob(fn=fn), wait, timeout)
+
+    def execute(self, sql: str, params=(), wait: bool = True, timeout: Optional[float] = None):
+        """Atalho para um único statement de escrita; retorna (rowcount, lastrowid)"""
+        def run(conn):
+            cursor = conn.execute(sql, params)
+            return cursor.rowcount, cursor.lastrowid
+        return self.write(run, wait=wait, timeout=timeout)
+
+    def executemany(self, sql: str, seq_of_params, wait: bool = True, timeout: Optional[float] = None) -> int:
+        """Escrita em massa numa única transação; retorna rowcount"""
+        rows = list(seq_of_params)
+        return self.write(lambda conn: conn.executemany(sql, rows).rowcount, wait=wait, timeout=timeout)
+
+    def executescript(self, script: str, timeout: Optional[float] = None):
+        """Script DDL (CREATE TABLE/INDEX) executado fora do lote"""
+        return self._submit(_WriteJob(lambda conn: conn.executescript(script), isolated=True), True, timeout)
+
+    def checkpoint(self, mode: str = 'PASSIVE', timeout: Optional[float] = None):
+        """Checkpoint do WAL (ex.: antes de copiar o arquivo .db para backup)"""
+        if mode.upper() not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+            raise ValueError(f"Modo de checkpoint inválido: {mode}")
+        sql = f"PRAGMA wal_checkpoint({mode.upper()})"
+        return self._submit(_WriteJob(lambda conn: tuple(conn.execute(sql).fetchone()), isolated=True), True, timeout)
+
+    def _writer_loop(self, ready: threading.Event):
+        try:
+            self._writer_conn = self._open_connection(read_only=False)
+        except Exception as e:
+            logger.error("[SQLITE POOL] Falha ao abrir writer para %s: %s", self.db_path, sanitize_error(e))
+            self._writer_conn = None
+        self._writer_ident = threading.get_ident()
+        ready.set()
+
+        batch_size = max(1, self.pool_config.write_batch_size)
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            # Group commit: tudo que chegou enquanto o commit anterior rodava
+            while len(batch) < batch_size:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._run_batch(batch)
+
+        if self._writer_conn is not None:
+            try:
+                self._writer_conn.close()
+            except Exception:
+                pass
+        self._writer_ident = None
+
+    def _run_batch(self, batch: List[_WriteJob]):
+        conn = self._writer_conn
+        if conn is None:
+            error = RuntimeError(f"Writer SQLite indisponível: {self.db_path}")
+            for job in batch:
+                job.future.set_exception(error)
+            return
+
+        pending: List[tuple] = []  # (job, result) aguardando COMMIT
+        for job in batch:
+            if job.isolated:
+                self._commit(pending)
+                pending = []
+                try:
+                    job.future.set_result(job.fn(conn))
+                except Exception as e:
+                    job.future.set_exception(e)
+                continue
+
+            try:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                conn.execute("SAVEPOINT pool_job")
+            except Exception as e:
+                job.future.set_exception(e)
+                continue
+
+            try:
+                result = job.fn(conn)
+                conn.execute("RELEASE SAVEPOINT pool_job")
+                pending.append((job, result))
+            except Exception as e:
+                try:
+                    conn.execute("ROLLBACK TO SAVEPOINT pool_job")
+                    conn.execute("RELEASE SAVEPOINT pool_job")
+                except Exception:
+                    pass
+                with self._lock:
+                    self._stats['write_errors'] += 1
+                job.future.set_exception(e)
+
+        self._commit(pending)
+
+    def _commit(self, pending: List[tuple]):
+        conn = self._writer_conn
+        if not conn.in_transaction:
+            for job, result in pending:
+                job.future.set_result(result)
+            return
+
+        started = time.perf_counter()
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            logger.error("[SQLITE POOL] Commit falhou em %s: %s", self.db_path, sanitize_error(e))
+            with self._lock:
+                self._stats['commit_errors'] += 1
+            for job, _ in pending:
+                job.future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._stats['writes'] += len(pending)
+            self._stats['batches'] += 1
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(pending))
+            self._commit_latencies.append(elapsed)
+            if len(self._commit_latencies) > COMMIT_LATENCY_WINDOW:
+                del self._commit_latencies[:-COMMIT_LATENCY_WINDOW]
+
+        for job, result in pending:
+            job.future.set_result(result)
+
+    # ------------------------------------------------------------------
+    # Shutdown e métricas
+    # ------------------------------------------------------------------
+
+    def close(self):
+        """Drena a fila de escrita e fecha todas as conexões do processo"""
+        if self._pid != os.getpid():
+            return
+
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            writer = self._writer
+            readers = list(self._readers.values())
+            self._readers = {}
+
+        if writer is not None and writer.is_alive():
+            self._queue.put(None)
+            writer.join(CLOSE_TIMEOUT_SECONDS)
+
+        for _, conn in readers:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.debug("Erro ao fechar conexão SQLite: %s", sanitize_error(e))
+        self._local = threading.local()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._commit_latencies)
+            readers = len(self._readers)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+
+        stats.update({
+            'db_path': self.db_path,
+            'reader_connections': readers,
+            'writer_alive': bool(self._writer and self._writer.is_alive()),
+            'queue_depth': self._queue.qsize(),
+            'avg_batch_size': stats['writes'] / stats['batches'] if stats['batches'] else 0.0,
+            'commit_p50_ms': percentile(50),
+            'commit_p99_ms': percentile(99)
+        })
+        return stats
+
+# Pools globais, um por arquivo de banco
+_pools: Dict[str, SQLiteConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_sqlite_pool(db_path) -> SQLiteConnectionPool:
+    """Pool compartilhado do arquivo (configurado a partir do app_config)"""
+    key = str(Path(db_path).resolve())
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            try:
+                from app_config import config
+                pool_config = SQLitePoolConfig.from_config(config)
+            except Exception as e:
+                logger.warning("Configuração SQLite indisponível, usando padrões: %s", sanitize_error(e))
+                pool_config = SQLitePoolConfig()
+            if not _pools:
+                atexit.register(close_sqlite_pools)
+            pool = _pools[key] = SQLiteConnectionPool(key, pool_config)
+            logger.info("[SQLITE POOL] Pool aberto: %s", key)
+        return pool
+
+def close_sqlite_pools():
+    """Fecha todos os pools do processo (hook de shutdown)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+def get_sqlite_pool_stats() -> Dict[str, Any]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.db_path: pool.get_stats() for pool in pools}
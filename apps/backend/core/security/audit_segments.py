@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Segmented Audit Store - Trilha de auditoria criptografada em segmentos indexados
+
+Os registros entram primeiro num arquivo "tail" do processo (uma linha
+Fernet por registro, durável no append, como o formato diário anterior). A
+cada MEDICAL_AUDIT_SEGMENT_RECORDS registros o tail é selado num segmento:
+
+    segments/00000042.seg   um único token Fernet com os registros (JSON lines)
+    segments/00000042.idx   sidecar em claro: contagem, intervalo de tempo e
+                            tags HMAC de sessão/ação/persona (sem valores em claro)
+
+O sidecar traz também o hash do ciphertext e um chain_hash
+HMAC(prev_chain_hash, content_hash, índice) - uma cadeia verificável por
+verify_chain(): trocar, remover ou reordenar segmentos (ou editar um índice)
+quebra a cadeia sem a chave.
+
+Consultas usam os índices (mantidos em memória e atualizados pelo diretório)
+para descriptografar apenas os segmentos candidatos, mais os tails ainda não
+selados, e filtram os registros pelos valores reais.
+"""
+
+import os
+import hmac
+import json
+import time
+import base64
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+GENESIS_HASH = '0' * 64
+INDEX_FIELDS = ('session', 'action', 'persona')
+_LOCK_STALE_SECONDS = 30
+
+def _timestamp(value: Any) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+class SegmentedAuditStore:
+    """Armazenamento append-only em segmentos criptografados com índice HMAC"""
+
+    def __init__(self, base_dir: str, encryption_key: bytes, segment_records: int = 1000):
+        self.base_dir = base_dir
+        self.segments_dir = os.path.join(base_dir, 'segments')
+        self.segment_records = max(1, int(segment_records))
+        self.cipher = Fernet(encryption_key)
+        # Chave separada para as tags do índice e a cadeia de hashes
+        self._index_key = hmac.new(encryption_key, b'medical-audit-index', hashlib.sha256).digest()
+        os.makedirs(self.segments_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._segments: Dict[int, Dict[str, Any]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._reset_process_state()
+        self._adopt_orphan_tails()
+
+    # ------------------------------------------------------------------
+    # Estado por processo (tail próprio; filhos de fork começam um novo)
+    # ------------------------------------------------------------------
+
+    def _reset_process_state(self):
+        self._pid = os.getpid()
+        # Um tail por instância: duas instâncias no mesmo processo não selam linhas uma da outra
+        self._tail_path = os.path.join(self.base_dir, f'tail-{self._pid}-{uuid.uuid4().hex[:8]}.log')
+        self._tail_file = None
+        # (payload JSON, timestamp, chaves) dos registros ainda não selados
+        self._tail_entries: List[Tuple[str, str, Dict[str, Any]]] = []
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            self._reset_process_state()
+
+    def _tag(self, field: str, value: Any) -> str:
+        return hmac.new(self._index_key, f"{field}\x00{value}".encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+
+    def append(self, record: Dict[str, Any], keys: Dict[str, Optional[str]], timestamp: datetime) -> None:
+        """Grava o registro no tail (append sem fsync, como antes) e sela ao completar um segmento"""
+        ts = _timestamp(timestamp)
+        keys = {field: keys.get(field) for field in INDEX_FIELDS}
+        payload = json.dumps({'ts': ts, 'keys': keys, 'record': record}, default=str, ensure_ascii=False)
+        token = self.cipher.encrypt(payload.encode('utf-8'))
+        line = f"{ts}|{base64.b64encode(token).decode()}\n"
+
+        with self._lock:
+            self._check_fork()
+            if self._tail_file is None:
+                self._tail_file = open(self._tail_path, 'ab')
+            self._tail_file.write(line.encode('utf-8'))
+            self._tail_file.flush()
+            self._tail_entries.append((payload, ts, keys))
+            if len(self._tail_entries) >= self.segment_records:
+                self._seal_own_tail()
+
+    def flush(self) -> None:
+        """Sela o tail desta instância mesmo incompleto (shutdown, testes)"""
+        with self._lock:
+            self._check_fork()
+            if self._tail_entries:
+                self._seal_own_tail()
+
+    def close(self) -> None:
+        """Fecha o arquivo tail (registros não selados continuam nele e são adotados depois)"""
+        with self._lock:
+            if self._tail_file is not None and os.getpid() == self._pid:
+                self._tail_file.close()
+            self._tail_file = None
+
+    def _seal_own_tail(self):
+        if self._tail_file is not None:
+            self._tail_file.close()
+            self._tail_file = None
+        self._seal(self._tail_entries, [self._tail_path])
+        self._tail_entries = []
+
+    def _seal(self, entries: List[Tuple[str, str, Dict[str, Any]]], tail_paths: Iterable[str]) -> None:
+        with self._seal_lock():
+            self._seal_locked(entries, tail_paths)
+
+    def _seal_locked(self, entries: List[Tuple[str, str, Dict[str, Any]]], tail_paths: Iterable[str]) -> None:
+        """Grava o próximo segmento e apaga os tails; exige _seal_lock()"""
+        body = '\n'.join(payload for payload, _, _ in entries).encode('utf-8')
+        ciphertext = self.cipher.encrypt(body)
+        tags = {field: sorted({self._tag(field, keys[field]) for _, _, keys in entries
+                               if keys.get(field) is not None})
+                for field in INDEX_FIELDS}
+        timestamps = [ts for _, ts, _ in entries]
+
+        self._refresh_index()
+        seq = max(self._segments, default=0) + 1
+        prev_hash = self._segments[seq - 1]['chain_hash'] if seq > 1 else GENESIS_HASH
+        index = {
+            'seq': seq,
+            'count': len(entries),
+            'min_ts': min(timestamps),
+            'max_ts': max(timestamps),
+            'tags': tags,
+            'content_hash': hashlib.sha256(ciphertext).hexdigest(),
+            'prev_hash': prev_hash
+        }
+        index['chain_hash'] = self._chain_hash(index)
+
+        # Segmento antes do sidecar: um índice nunca aponta para segmento inexistente
+        self._write_atomic(self._segment_path(seq, '.seg'), ciphertext)
+        self._write_atomic(self._segment_path(seq, '.idx'),
+                           json.dumps(index, sort_keys=True).encode('utf-8'))
+        for path in tail_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._add_to_index(index)
+
+    def _chain_hash(self, index: Dict[str, Any]) -> str:
+        covered = {key: index[key] for key in ('seq', 'count', 'min_ts', 'max_ts', 'tags', 'content_hash')}
+        message = index['prev_hash'] + json.dumps(covered, sort_keys=True)
+        return hmac.new(self._index_key, message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _segment_path(self, seq: int, suffix: str) -> str:
+        return os.path.join(self.segments_dir, f'{seq:08d}{suffix}')
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    @contextmanager
+    def _seal_lock(self):
+        """Lock entre processos (arquivo O_EXCL; portável, inclusive Windows)"""
+        path = os.path.join(self.segments_dir, '.seal.lock')
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > _LOCK_STALE_SECONDS:
+                        os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _adopt_orphan_tails(self):
+        """Sela tails de processos encerrados (POSIX; nos demais continuam consultáveis)"""
+        if os.name != 'posix':
+            return
+        for pid, path in self._tail_files():
+            if pid == self._pid or self._pid_alive(pid):
+                continue
+            # Leitura dentro do lock: dois workers subindo juntos não selam o mesmo tail duas vezes
+            with self._lock, self._seal_lock():
+                if not os.path.exists(path):
+                    continue  # já adotado por outro processo
+                entries = []
+                for payload in self._read_tail(path):
+                    entry = json.loads(payload)
+                    entries.append((payload, entry['ts'], entry['keys']))
+                if entries:
+                    self._seal_locked(entries, [path])
+                else:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    # ------------------------------------------------------------------
+    # Índice
+    # ------------------------------------------------------------------
+
+    def _add_to_index(self, index: Dict[str, Any]):
+        seq = index['seq']
+        self._segments[seq] = index
+        for field, tags in index['tags'].items():
+            for tag in tags:
+                self._postings.setdefault(f'{field}:{tag}', set()).add(seq)
+
+    def _refresh_index(self):
+        """Carrega sidecars novos (selados por este ou por outros processos)"""
+        if not self._segments:
+            names = sorted(name for name in os.listdir(self.segments_dir) if name.endswith('.idx'))
+        else:
+            # Sequência contígua: basta sondar os próximos números
+            names = []
+            seq = max(self._segments) + 1
+            while os.path.exists(self._segment_path(seq, '.idx')):
+                names.append(f'{seq:08d}.idx')
+                seq += 1
+        for name in names:
+            try:
+                with open(os.path.join(self.segments_dir, name), 'rb') as f:
+                    self._add_to_index(json.loads(f.read()))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Índice de auditoria ilegível {name}: {e}")
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def query(self, session: Optional[str] = None, action: Optional[str] = None, persona: Optional[str] = None,
+              start: Optional[str] = None, end: Optional[str] = None,
+              predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        """
+        Registros (dicts) que casam com todos os filtros, em ordem de timestamp.
+        start/end são timestamps ISO (comparação lexicográfica, inclusive).
+        """
+        filters = {field: value for field, value in zip(INDEX_FIELDS, (session, action, persona)) if value is not None}
+
+        with self._lock:
+            self._check_fork()
+            self._refresh_index()
+            candidates = set(self._segments)
+            for field, value in filters.items():
+                candidates &= self._postings.get(f'{field}:{self._tag(field, value)}', set())
+            own_tail = list(self._tail_entries)
+
+        candidates = [seq for seq in sorted(candidates)
+                      if (start is None or self._segments[seq]['max_ts'] >= start)
+                      and (end is None or self._segments[seq]['min_ts'] <= end)]
+
+        # Pré-checagem barata: o valor serializado precisa aparecer na linha antes do json.loads
+        needles = [json.dumps(value, ensure_ascii=False) for value in filters.values() if isinstance(value, str)]
+        results = []
+
+        def collect(payloads):
+            for payload in payloads:
+                if any(needle not in payload for needle in needles):
+                    continue
+                entry = json.loads(payload)
+                if start is not None and entry['ts'] < start:
+                    continue
+                if end is not None and entry['ts'] > end:
+                    continue
+                if any(entry['keys'].get(field) != value for field, value in filters.items()):
+                    continue
+                if predicate is None or predicate(entry['record']):
+                    results.append(entry)
+
+        for seq in candidates:
+            collect(self._read_segment(seq))
+        collect(payload for payload, _, _ in own_tail)
+        for _, path in self._tail_files():
+            if path != self._tail_path:
+                collect(self._read_tail(path))
+
+        results.sort(key=lambda entry: entry['ts'])
+        return [entry['record'] for entry in results]
+
+    def _read_segment(self, seq: int) -> List[str]:
+        with open(self._segment_path(seq, '.seg'), 'rb') as f:
+            body = self.cipher.decrypt(f.read())
+        return [line for line in body.decode('utf-8').split('\n') if line]
+
+    def _read_tail(self, path: str) -> List[str]:
+        payloads = []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if '|' not in line:
+                        continue
+                    try:
+                        token = base64.b64decode(line.strip().split('|', 1)[1])
+                        payloads.append(self.cipher.decrypt(token).decode('utf-8'))
+                    except (InvalidToken, ValueError):
+                        # Linha parcial de um append concorrente
+                        continue
+        except FileNotFoundError:
+            pass
+        return payloads
+
+    def _tail_files(self) -> List[Tuple[int, str]]:
+        tails = []
+        for name in os.listdir(self.base_dir):
+            if name.startswith('tail-') and name.endswith('.log'):
+                try:
+                    tails.append((int(name[5:-4].split('-')[0]), os.path.join(self.base_dir, name)))
+                except ValueError:
+                    continue
+        return tails
+
+    # ------------------------------------------------------------------
+    # Integridade
+    # ------------------------------------------------------------------
+
+    def verify_chain(self) -> Dict[str, Any]:
+        """Confere a cadeia de hashes e o conteúdo de cada segmento (sem descriptografar)"""
+        with self._lock:
+            self._refresh_index()
+            segments = dict(self._segments)
+
+        prev_hash = GENESIS_HASH
+        for expected_seq, seq in enumerate(sorted(segments), start=1):
+            index = segments[seq]
+            problem = None
+            if seq != expected_seq:
+                problem = 'missing_segment'
+            elif index['prev_hash'] != prev_hash:
+                problem = 'broken_link'
+            elif not hmac.compare_digest(index['chain_hash'], self._chain_hash(index)):
+                problem = 'index_tampered'
+            else:
+                try:
+                    with open(self._segment_path(seq, '.seg'), 'rb') as f:
+                        if hashlib.sha256(f.read()).hexdigest() != index['content_hash']:
+                            problem = 'segment_tampered'
+                except FileNotFoundError:
+                    problem = 'segment_missing'
+            if problem:
+                return {'valid': False, 'segments': len(segments), 'broken_at': expected_seq, 'reason': problem}
+            prev_hash = index['chain_hash']
+        return {'valid': True, 'segments': len(segments), 'broken_at': None, 'reason': None}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'segments': len(self._segments),
+                'sealed_records': sum(index['count'] for index in self._segments.values()),
+                'tail_records': len(self._tail_entries),
+                'segment_records': self.segment_records
+            }
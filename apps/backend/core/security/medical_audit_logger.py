@@ -18,6 +18,13 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
 
+from .audit_segments import SegmentedAuditStore
+
+try:
+    from app_config import config
+except ImportError:
+    config = None
+
 # Configurar logger específico para auditoria
 audit_logger = logging.getLogger('medical_audit')
 audit_logger.setLevel(logging.INFO)
@@ -118,9 +125,9 @@ class LGPDComplianceChecker:
         return flags
 
 class EncryptedLogStorage:
-    """Armazenamento criptografado de logs de auditoria"""
+    """Armazenamento criptografado de logs de auditoria (segmentos indexados)"""
     
-    def __init__(self, encryption_key: Optional[bytes] = None):
+    def __init__(self, encryption_key: Optional[bytes] = None, base_dir: Optional[str] = None):
         if encryption_key is None:
             # Gerar chave a partir de senha mestre (deve vir de variável de ambiente)
             password = os.getenv('MEDICAL_AUDIT_PASSWORD', 'default_audit_key').encode()
@@ -132,31 +139,31 @@ class EncryptedLogStorage:
                 salt=salt,
                 iterations=100000,
             )
-            key = base64.urlsafe_b64encode(kdf.derive(password))
-            self.cipher = Fernet(key)
-        else:
-            self.cipher = Fernet(encryption_key)
+            encryption_key = base64.urlsafe_b64encode(kdf.derive(password))
+        self.cipher = Fernet(encryption_key)
+        
+        # Segmentos criptografados + índice HMAC (sessão, ação, persona, tempo)
+        self.store = SegmentedAuditStore(
+            base_dir or getattr(config, 'MEDICAL_AUDIT_DIR', 'logs/medical_audit'),
+            encryption_key,
+            segment_records=getattr(config, 'MEDICAL_AUDIT_SEGMENT_RECORDS', 1000)
+        )
     
     def append(self, audit_record: 'AuditRecord') -> None:
         """Adiciona registro de auditoria criptografado"""
         try:
             # Serializar registro
             record_data = asdict(audit_record)
-            record_json = json.dumps(record_data, default=str, ensure_ascii=False)
-            
-            # Criptografar
-            encrypted_data = self.cipher.encrypt(record_json.encode('utf-8'))
-            
-            # Salvar em arquivo com timestamp
-            timestamp = datetime.now(timezone.utc).strftime('%Y%m%d')
-            filename = f'logs/medical_audit_encrypted_{timestamp}.log'
-            
-            os.makedirs('logs', exist_ok=True)
+            interaction = audit_record.interaction
+            action_type = interaction.action_type
+            keys = {
+                'session': interaction.user_session_id,
+                'action': action_type.value if isinstance(action_type, ActionType) else action_type,
+                'persona': interaction.persona_id
+            }
             
-            with open(filename, 'ab') as f:
-                # Adicionar separador de linha e timestamp
-                entry = f"{datetime.now(timezone.utc).isoformat()}|{base64.b64encode(encrypted_data).decode()}\n"
-                f.write(entry.encode('utf-8'))
+            # Criptografar e gravar (selado em segmento a cada N registros)
+            self.store.append(record_data, keys, audit_record.timestamp)
                 
             audit_logger.info(f"Audit record appended: {audit_record.audit_id}")
             
@@ -164,10 +171,46 @@ class EncryptedLogStorage:
             audit_logger.error(f"Failed to append audit record: {e}")
             raise
     
+    def query_records(
+        self,
+        session_id: Optional[str] = None,
+        action_type: Optional[Any] = None,
+        persona_id: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> List['AuditRecord']:
+        """
+        Consulta registros por sessão, tipo de ação, persona e intervalo de tempo,
+        descriptografando apenas os segmentos indicados pelo índice
+        """
+        if isinstance(action_type, ActionType):
+            action_type = action_type.value
+        try:
+            records = self.store.query(
+                session=session_id,
+                action=action_type,
+                persona=persona_id,
+                start=start.isoformat() if isinstance(start, datetime) else start,
+                end=end.isoformat() if isinstance(end, datetime) else end
+            )
+            return [AuditRecord(**record_data) for record_data in records]
+        except Exception as e:
+            audit_logger.error(f"Failed to query audit records: {e}")
+            return []
+    
     def read_records(self, date: str) -> List['AuditRecord']:
-        """Lê registros de auditoria de uma data específica"""
+        """Lê registros de auditoria de uma data específica (YYYYMMDD)"""
+        day = datetime.strptime(date, '%Y%m%d').replace(tzinfo=timezone.utc)
+        records = self._read_legacy_file(date)
+        records.extend(self.query_records(start=day, end=day.replace(hour=23, minute=59, second=59, microsecond=999999)))
+        return records
+    
+    def _read_legacy_file(self, date: str) -> List['AuditRecord']:
+        """Arquivo diário do formato anterior (uma linha Fernet por registro)"""
         filename = f'logs/medical_audit_encrypted_{date}.log'
         records = []
+        if not os.path.exists(filename):
+            return records
         
         try:
             with open(filename, 'r', encoding='utf-8') as f:
@@ -184,12 +227,14 @@ class EncryptedLogStorage:
                         record = AuditRecord(**record_data)
                         records.append(record)
                         
-        except FileNotFoundError:
-            audit_logger.warning(f"Audit file not found: {filename}")
         except Exception as e:
             audit_logger.error(f"Failed to read audit records: {e}")
             
         return records
+    
+    def verify_integrity(self) -> Dict[str, Any]:
+        """Verifica a cadeia de hashes dos segmentos"""
+        return self.store.verify_chain()
 
 @dataclass
 class AuditRecord:
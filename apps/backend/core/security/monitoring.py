@@ -22,6 +22,7 @@ Autor: Sistema de Segurança Roteiro de Dispensação
 Data: 2025-01-27
 """
 
+import os
 import json
 import time
 import logging
@@ -39,6 +40,12 @@ import requests
 import queue
 
 from core.logging.sanitizer import sanitize_log_input, sanitize_error
+from core.metrics.sketches import MetricsRegistry
+
+try:
+    from app_config import config
+except ImportError:
+    config = None
 
 
 # Logger específico para monitoramento
@@ -282,6 +289,11 @@ class MetricsCollector:
         # Estatísticas em tempo real
         self.real_time_stats: Dict[MetricType, Dict[str, float]] = defaultdict(dict)
         
+        # Percentis por janela (minuto/hora/dia) em sketches: O(1) por registro,
+        # leitura sem copiar nem ordenar os pontos brutos
+        self.registry = MetricsRegistry(getattr(config, 'METRICS_SKETCH_ACCURACY', 0.01))
+        self.shared_dir = getattr(config, 'METRICS_SHARED_DIR', '')
+        
         # Thread para limpeza periódica
         self._start_cleanup_thread()
     
@@ -296,6 +308,7 @@ class MetricsCollector:
         with self.lock:
             self.metrics[metric_type].append(point)
             self._update_real_time_stats(metric_type, value)
+        self.registry.record(metric_type.value, value, point.timestamp.timestamp())
     
     def _update_real_time_stats(self, metric_type: MetricType, value: float):
         """Atualiza estatísticas em tempo real"""
@@ -322,16 +335,19 @@ class MetricsCollector:
     def get_metrics(self, metric_type: MetricType, since: Optional[datetime] = None, limit: Optional[int] = None) -> List[MetricPoint]:
         """Obtém métricas de um tipo específico"""
         with self.lock:
-            metrics = list(self.metrics[metric_type])
-            
-            # Filtrar por tempo
-            if since:
-                metrics = [m for m in metrics if m.timestamp >= since]
-            
-            # Limitar quantidade
-            if limit:
-                metrics = metrics[-limit:]
+            points = self.metrics[metric_type]
+            if not since and not limit:
+                return list(points)
             
+            # Percorre do mais recente para trás, parando no corte de tempo/limite
+            metrics = []
+            for point in reversed(points):
+                if since and point.timestamp < since:
+                    break
+                metrics.append(point)
+                if limit and len(metrics) >= limit:
+                    break
+            metrics.reverse()
             return metrics
     
     def get_real_time_stats(self, metric_type: MetricType) -> Dict[str, float]:
@@ -339,25 +355,25 @@ class MetricsCollector:
         return self.real_time_stats[metric_type].copy()
     
     def get_aggregated_stats(self, metric_type: MetricType, window_minutes: int = 60) -> Dict[str, float]:
-        """Obtém estatísticas agregadas para janela de tempo"""
-        since = datetime.now() - timedelta(minutes=window_minutes)
-        metrics = self.get_metrics(metric_type, since=since)
-        
-        if not metrics:
-            return {}
-        
-        values = [m.value for m in metrics]
-        
-        return {
-            'count': len(values),
-            'sum': sum(values),
-            'avg': statistics.mean(values),
-            'min': min(values),
-            'max': max(values),
-            'median': statistics.median(values),
-            'p95': np.percentile(values, 95) if len(values) > 1 else values[0],
-            'p99': np.percentile(values, 99) if len(values) > 1 else values[0]
-        }
+        """Obtém estatísticas agregadas para janela de tempo (percentis com erro relativo <= 1%)"""
+        return self.registry.snapshot(metric_type.value, window_seconds=window_minutes * 60)
+    
+    def get_window_stats(self, metric_type: MetricType, window: str = 'hour') -> Dict[str, float]:
+        """Estatísticas da janela 'minute', 'hour' ou 'day' com taxa por segundo decaída"""
+        return self.registry.snapshot(metric_type.value, window=window)
+    
+    def publish_metrics(self) -> Optional[str]:
+        """Grava os sketches deste worker no diretório compartilhado (METRICS_SHARED_DIR)"""
+        if not self.shared_dir:
+            return None
+        return self.registry.publish(self.shared_dir, f"security-{os.getpid()}")
+    
+    def get_cluster_stats(self, metric_type: MetricType, window: str = 'hour') -> Dict[str, float]:
+        """Estatísticas mescladas de todos os workers que publicaram no diretório compartilhado"""
+        if not self.shared_dir:
+            return self.get_window_stats(metric_type, window)
+        self.publish_metrics()
+        return MetricsRegistry.load_dir(self.shared_dir).snapshot(metric_type.value, window=window)
     
     def _start_cleanup_thread(self):
         """Inicia thread para limpeza de dados antigos"""
@@ -698,6 +714,9 @@ class SecurityMonitor:
                 # Detectar anomalias
                 self._detect_anomalies()
                 
+                # Compartilhar sketches com os demais workers
+                self.metrics_collector.publish_metrics()
+                
                 # Aguardar próximo ciclo
                 time.sleep(30)  # Monitoramento a cada 30 segundos
 
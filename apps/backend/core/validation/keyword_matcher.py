@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Keyword Matcher - Multi-pattern matching compartilhado pelos classificadores
+
+Cada vocabulário (categoria -> palavras-chave) é compilado uma única vez numa
+trie sem acentos e em minúsculas, emitida como uma regex com lookahead. Um
+finditer percorre a mensagem uma vez dentro do motor de regex (C) e devolve o
+maior padrão em cada posição; os padrões que são prefixos dele também casam
+ali, então cada ocorrência é expandida pelo fecho de prefixos pré-computado.
+O custo deixa de ser O(keywords x texto) por passe e os vários passes de um
+classificador viram uma única varredura.
+
+Semântica igual à dos loops `keyword in texto` que substitui: substring,
+sem fronteira de palavra, salvo nas categorias marcadas como whole_word.
+
+    matcher = get_keyword_matcher('rag_scope', {'hanseniase': ['hanseníase', 'pqt']})
+    matcher.categories("Dose de PQT na hanseniase")  # {'hanseniase': {'hanseniase', 'pqt'}}
+"""
+
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+Keyword = Union[str, Tuple[str, float]]
+
+def _build_fold_table() -> Dict[str, str]:
+    # Latin-1 + Latin Extended-A: remove diacríticos (ã -> a, ç -> c)
+    table = {}
+    for code in range(0xC0, 0x180):
+        char = chr(code)
+        base = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c))
+        if base and base != char:
+            table[char] = base
+    return table
+
+_FOLD_TABLE = _build_fold_table()
+_FOLD_PATTERN = re.compile('[' + ''.join(sorted(_FOLD_TABLE)) + ']')
+
+def _fold_char(match) -> str:
+    return _FOLD_TABLE[match.group()]
+
+def fold_text(text: str) -> str:
+    """Minúsculas e sem acentos (mesma normalização usada na compilação)"""
+    text = text.lower()
+    if text.isascii():
+        return text
+    return _FOLD_PATTERN.sub(_fold_char, text)
+
+@dataclass(frozen=True)
+class KeywordHit:
+    """Uma ocorrência de palavra-chave no texto normalizado"""
+    keyword: str
+    category: str
+    weight: float
+    start: int
+    end: int
+
+class _TrieNode:
+    __slots__ = ('children', 'terminal')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.terminal = False
+
+def _trie_to_regex(node: _TrieNode) -> str:
+    branches = [re.escape(char) + _trie_to_regex(child) for char, child in sorted(node.children.items())]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # Terminal com filhos: tenta o mais longo primeiro (greedy), recua para o prefixo
+    if node.terminal:
+        return '(?:' + body + ')?'
+    return body
+
+def _compile_trie(patterns: Iterable[str], whole_word: bool = False) -> Optional['re.Pattern']:
+    root = _TrieNode()
+    for pattern in patterns:
+        node = root
+        for char in pattern:
+            node = node.children.setdefault(char, _TrieNode())
+        node.terminal = True
+    if not root.children:
+        return None
+    body = _trie_to_regex(root)
+    # Lookahead: casa em toda posição (ocorrências sobrepostas), devolvendo o maior padrão
+    return re.compile(r'(?=\b(' + body + r')\b)' if whole_word else '(?=(' + body + '))')
+
+def _prefix_closure(patterns: Iterable[str]) -> Dict[str, Tuple[str, ...]]:
+    # Padrões que são prefixos de cada padrão (incluindo ele mesmo)
+    patterns = sorted(patterns, key=len, reverse=True)
+    return {pattern: tuple(other for other in patterns if pattern.startswith(other)) for pattern in patterns}
+
+class KeywordMatcher:
+    """Autômato compilado de um vocabulário: uma varredura por texto"""
+
+    def __init__(self, vocabulary: Dict[str, Iterable[Keyword]], whole_word: Iterable[str] = (),
+                 name: str = 'keywords'):
+        self.name = name
+        self.whole_word_categories = frozenset(whole_word)
+        self.category_sizes: Dict[str, int] = {}
+        # padrão normalizado -> ((categoria, peso), ...), separado por modo de casamento
+        substring_targets: Dict[str, List[Tuple[str, float]]] = {}
+        word_targets: Dict[str, List[Tuple[str, float]]] = {}
+
+        for category, keywords in vocabulary.items():
+            keywords = list(keywords)
+            self.category_sizes[category] = len(keywords)
+            targets = word_targets if category in self.whole_word_categories else substring_targets
+            for keyword in keywords:
+                pattern, weight = (keyword, 1.0) if isinstance(keyword, str) else keyword
+                folded = fold_text(pattern)
+                if folded:
+                    targets.setdefault(folded, []).append((category, float(weight)))
+
+        self._targets = {pattern: tuple(targets) for pattern, targets in substring_targets.items()}
+        self._word_targets = {pattern: tuple(targets) for pattern, targets in word_targets.items()}
+        self._regex = _compile_trie(self._targets)
+        self._word_regex = _compile_trie(self._word_targets, whole_word=True)
+        self._prefixes = _prefix_closure(self._targets)
+        self._word_prefixes = _prefix_closure(self._word_targets)
+        self._last: Optional[tuple] = None
+
+    def __len__(self):
+        return len(set(self._targets) | set(self._word_targets))
+
+    @staticmethod
+    def _is_word_char(char: str) -> bool:
+        return char.isalnum() or char == '_'
+
+    def _word_matches(self, folded: str):
+        """(padrão, início) das categorias de palavra inteira"""
+        for match in self._word_regex.finditer(folded):
+            start = match.start()
+            for pattern in self._word_prefixes[match.group(1)]:
+                end = start + len(pattern)
+                # O maior padrão já respeita \b; prefixos dele precisam da fronteira final
+                if end < len(folded) and self._is_word_char(folded[end]):
+                    continue
+                yield pattern, start
+
+    def scan(self, text: str, normalized: bool = False) -> List[KeywordHit]:
+        """Todas as ocorrências (com sobreposição), em ordem de posição"""
+        if not text:
+            return []
+        folded = text if normalized else fold_text(text)
+        hits = []
+        if self._regex is not None:
+            for match in self._regex.finditer(folded):
+                start = match.start()
+                for pattern in self._prefixes[match.group(1)]:
+                    for category, weight in self._targets[pattern]:
+                        hits.append(KeywordHit(pattern, category, weight, start, start + len(pattern)))
+        if self._word_regex is not None:
+            for pattern, start in self._word_matches(folded):
+                for category, weight in self._word_targets[pattern]:
+                    hits.append(KeywordHit(pattern, category, weight, start, start + len(pattern)))
+            hits.sort(key=lambda hit: hit.start)
+        return hits
+
+    def _distinct_matches(self, text: str, normalized: bool) -> Tuple[Tuple[str, Tuple[Tuple[str, float], ...]], ...]:
+        """Pares (padrão, alvos) distintos, sem posições (caminho rápido)"""
+        # Memo de uma entrada: a mesma mensagem passa por vários classificadores seguidos
+        last = self._last
+        if last is not None and last[0] == text and last[1] == normalized:
+            return last[2]
+        matches = {}
+        if text:
+            folded = text if normalized else fold_text(text)
+            if self._regex is not None:
+                for longest in set(self._regex.findall(folded)):
+                    for pattern in self._prefixes[longest]:
+                        matches[pattern] = self._targets[pattern]
+            if self._word_regex is not None:
+                for pattern, _ in self._word_matches(folded):
+                    matches[(pattern,)] = self._word_targets[pattern]
+        result = tuple((key[0] if isinstance(key, tuple) else key, targets) for key, targets in matches.items())
+        self._last = (text, normalized, result)
+        return result
+
+    def categories(self, text: str, normalized: bool = False) -> Dict[str, Set[str]]:
+        """Palavras-chave distintas encontradas, por categoria"""
+        found: Dict[str, Set[str]] = {}
+        for pattern, targets in self._distinct_matches(text, normalized):
+            for category, _ in targets:
+                found.setdefault(category, set()).add(pattern)
+        return found
+
+    def scores(self, text: str, normalized: bool = False) -> Dict[str, float]:
+        """Soma dos pesos das palavras-chave distintas, por categoria"""
+        scores: Dict[str, float] = {}
+        for _, targets in self._distinct_matches(text, normalized):
+            for category, weight in targets:
+                scores[category] = scores.get(category, 0.0) + weight
+        return scores
+
+_matchers: Dict[str, KeywordMatcher] = {}
+_matchers_lock = threading.Lock()
+
+def get_keyword_matcher(name: str, vocabulary: Optional[Dict[str, Iterable[Keyword]]] = None,
+                        whole_word: Iterable[str] = ()) -> KeywordMatcher:
+    """
+    Autômato compartilhado por nome: compilado na primeira chamada (startup
+    do classificador) e reutilizado pelas demais instâncias do processo.
+    """
+    matcher = _matchers.get(name)
+    if matcher is not None:
+        return matcher
+    if vocabulary is None:
+        raise KeyError(f"Vocabulário não registrado: {name}")
+    with _matchers_lock:
+        matcher = _matchers.get(name)
+        if matcher is None:
+            matcher = KeywordMatcher(vocabulary, whole_word=whole_word, name=name)
+            _matchers[name] = matcher
+    return matcher
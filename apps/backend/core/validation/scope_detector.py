@@ -10,7 +10,11 @@ Versão: 1.0
 
 import json
 import re
-from typing import Dict, Optional
+from typing import Dict, Optional, Set
+
+from core.validation.keyword_matcher import fold_text, get_keyword_matcher
+
+_NON_WORD = re.compile(r'[^\w\s]')
 
 class ScopeDetectionSystem:
     """
@@ -44,6 +48,36 @@ class ScopeDetectionSystem:
             "aids", "dengue", "malaria", "gripe"
         ]
         
+        # Indicadores de contexto (qualquer termo presente liga o indicador)
+        self.context_keywords = {
+            "medication_query": ["rifampicina", "clofazimina", "dapsona", "medicamento", "remedio"],
+            "dosing_query": ["dose", "dosagem", "quanto", "como tomar", "administrar"],
+            "safety_query": ["efeito", "reacao", "seguro", "perigo", "problema"],
+            "procedure_query": ["dispensacao", "farmacia", "roteiro", "como fazer"],
+            "diagnosis_query": ["diagnostico", "como saber", "sintomas", "exame"],
+            "treatment_query": ["tratamento", "cura", "como tratar"],
+            "administrative_query": ["auxilio", "aposentadoria", "trabalho", "direitos"]
+        }
+
+        # Padrões específicos (asks_for_diagnosis casa só palavras inteiras)
+        self.pattern_keywords = {
+            "asks_for_diagnosis": ["como saber", "tenho", "sintomas", "diagnostico"],
+            "asks_for_other_diseases": ["tuberculose", "diabetes", "covid", "cancer"],
+            "asks_for_legal_advice": ["direitos", "lei", "auxilio", "aposentadoria"],
+            "emergency_situation": ["urgente", "emergencia", "grave", "hospital"],
+            "medication_specific": ["rifampicina", "clofazimina", "dapsona"],
+            "hanseniase_specific": ["hanseniase", "hansen", "pqt"],
+            "comparison_or": ["ou"],
+            "comparison_terms": ["melhor", "diferenca"]
+        }
+
+        # Um único autômato para todas as listas: uma varredura por pergunta
+        vocabulary = {"in_scope": self.in_scope_keywords, "out_scope": self.out_of_scope_indicators}
+        vocabulary.update((f"context:{name}", terms) for name, terms in self.context_keywords.items())
+        vocabulary.update((f"pattern:{name}", terms) for name, terms in self.pattern_keywords.items())
+        self.matcher = get_keyword_matcher("scope_detection", vocabulary,
+                                           whole_word=["pattern:asks_for_diagnosis"])
+
         # Confiança por categoria
         self.confidence_levels = {
             "high": ["doses padrao", "esquema administracao", "efeitos adversos comuns"],
@@ -82,15 +116,16 @@ class ScopeDetectionSystem:
             Dict com: is_in_scope, confidence_level, category, reasoning, redirect_suggestion
         """
         question_normalized = self._normalize_text(user_question)
+        matches = self.matcher.categories(question_normalized, normalized=True)
         
         # Análise inicial de palavras-chave
-        scope_analysis = self._analyze_keywords(question_normalized)
+        scope_analysis = self._analyze_keywords(question_normalized, matches)
         
         # Análise de contexto
-        context_analysis = self._analyze_context(question_normalized)
+        context_analysis = self._analyze_context(matches)
         
         # Análise de padrões específicos
-        pattern_analysis = self._analyze_patterns(question_normalized)
+        pattern_analysis = self._analyze_patterns(matches)
         
         # Consolidar análises
         final_analysis = self._consolidate_analysis(
@@ -101,31 +136,18 @@ class ScopeDetectionSystem:
     
     def _normalize_text(self, text: str) -> str:
         """Normaliza texto para análise"""
-        # Converter para minúsculas
-        text = text.lower()
-        
-        # Remover acentos básicos
-        replacements = {
-            'ã': 'a', 'á': 'a', 'à': 'a', 'â': 'a',
-            'é': 'e', 'ê': 'e', 'è': 'e',
-            'í': 'i', 'î': 'i', 'ì': 'i',
-            'ó': 'o', 'ô': 'o', 'ò': 'o', 'õ': 'o',
-            'ú': 'u', 'û': 'u', 'ù': 'u',
-            'ç': 'c'
-        }
-        
-        for old, new in replacements.items():
-            text = text.replace(old, new)
+        # Minúsculas e sem acentos
+        text = fold_text(text)
         
         # Remover pontuação e caracteres especiais
-        text = re.sub(r'[^\w\s]', ' ', text)
+        text = _NON_WORD.sub(' ', text)
         
         return text
     
-    def _analyze_keywords(self, question: str) -> Dict:
+    def _analyze_keywords(self, question: str, matches: Dict[str, Set[str]]) -> Dict:
         """Analisa presença de palavras-chave"""
-        in_scope_count = sum(1 for keyword in self.in_scope_keywords if keyword in question)
-        out_scope_count = sum(1 for keyword in self.out_of_scope_indicators if keyword in question)
+        in_scope_count = len(matches.get("in_scope", ()))
+        out_scope_count = len(matches.get("out_scope", ()))
         
         total_words = len(question.split())
         in_scope_density = in_scope_count / max(total_words, 1)
@@ -139,31 +161,17 @@ class ScopeDetectionSystem:
             "keyword_balance": in_scope_count - out_scope_count
         }
     
-    def _analyze_context(self, question: str) -> Dict:
+    def _analyze_context(self, matches: Dict[str, Set[str]]) -> Dict:
         """Analisa contexto da pergunta"""
-        context_indicators = {
-            "medication_query": any(med in question for med in ["rifampicina", "clofazimina", "dapsona", "medicamento", "remedio"]),
-            "dosing_query": any(dose in question for dose in ["dose", "dosagem", "quanto", "como tomar", "administrar"]),
-            "safety_query": any(safety in question for safety in ["efeito", "reacao", "seguro", "perigo", "problema"]),
-            "procedure_query": any(proc in question for proc in ["dispensacao", "farmacia", "roteiro", "como fazer"]),
-            "diagnosis_query": any(diag in question for diag in ["diagnostico", "como saber", "sintomas", "exame"]),
-            "treatment_query": any(treat in question for treat in ["tratamento", "cura", "como tratar"]),
-            "administrative_query": any(admin in question for admin in ["auxilio", "aposentadoria", "trabalho", "direitos"])
-        }
-        
-        return context_indicators
+        return {name: f"context:{name}" in matches for name in self.context_keywords}
     
-    def _analyze_patterns(self, question: str) -> Dict:
+    def _analyze_patterns(self, matches: Dict[str, Set[str]]) -> Dict:
         """Analisa padrões específicos da pergunta"""
         patterns = {
-            "asks_for_diagnosis": bool(re.search(r'\b(como saber|tenho|sintomas|diagnostico)\b', question)),
-            "asks_for_other_diseases": any(disease in question for disease in ["tuberculose", "diabetes", "covid", "cancer"]),
-            "asks_for_legal_advice": any(legal in question for legal in ["direitos", "lei", "auxilio", "aposentadoria"]),
-            "emergency_situation": any(emergency in question for emergency in ["urgente", "emergencia", "grave", "hospital"]),
-            "medication_specific": any(med in question for med in ["rifampicina", "clofazimina", "dapsona"]),
-            "hanseniase_specific": any(hans in question for hans in ["hanseniase", "hansen", "pqt"]),
-            "asks_comparison": "ou" in question and ("melhor" in question or "diferenca" in question)
+            name: f"pattern:{name}" in matches
+            for name in self.pattern_keywords if not name.startswith("comparison_")
         }
+        patterns["asks_comparison"] = "pattern:comparison_or" in matches and "pattern:comparison_terms" in matches
         
         return patterns
     
@@ -135,6 +135,13 @@ def create_app():
     except Exception as e:
         logger.error("Rate limiter initialization failed: %s", sanitize_error(e))
 
+    # Shared outbound HTTP pools (keep-alive per host), closed on process exit
+    try:
+        from core.performance.http_client_pool import init_http_clients
+        init_http_clients(app)
+    except Exception as e:
+        logger.warning("HTTP client pool setup failed: %s", sanitize_error(e))
+
     # Health check endpoints - Cloud Run optimized - ultra fast
     @app.route('/health', methods=['GET'])
     @app.route('/_ah/health', methods=['GET'])
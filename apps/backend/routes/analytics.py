@@ -342,7 +342,8 @@ def health_check():
             'success': True,
             'status': 'healthy',
             'database': 'connected',
-            'active_sessions': metrics.get('active_sessions', 0)
+            'active_sessions': metrics.get('active_sessions', 0),
+            'ingest': analytics_service.get_ingest_stats()
         })
 
     except Exception as e:
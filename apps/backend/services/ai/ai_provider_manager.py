@@ -5,18 +5,27 @@ Configuração via GitHub Secrets/Environment Variables
 """
 
 import os
+import json
 import time
+import asyncio
 import logging
-from typing import Dict, List, Optional, Tuple
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 from enum import Enum
-import httpx
 
 from core.logging.sanitizer import sanitize_error
+from core.performance.http_client_pool import get_async_http_client
 
 logger = logging.getLogger(__name__)
 
+# Limites superiores (segundos) do histograma de latência por provedor
+LATENCY_BUCKETS = (0.5, 1.0, 2.0, 4.0, 8.0, 15.0)
+
+# Amostras de latência mantidas por modelo para o cálculo do atraso de hedge
+LATENCY_WINDOW_SIZE = 200
+
 class ProviderStatus(Enum):
     HEALTHY = "healthy"
     DEGRADED = "degraded" 
@@ -72,6 +81,22 @@ class AIProviderManager:
         self.base_timeout = int(os.getenv('AI_TIMEOUT_SECONDS', 15))
         self.circuit_breaker_enabled = os.getenv('AI_CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
         
+        # Hedged requests: após o atraso (p95 observado do modelo), o próximo modelo roda em paralelo
+        self.hedge_enabled = os.getenv('AI_HEDGE_ENABLED', 'true').lower() == 'true'
+        self.hedge_percentile = float(os.getenv('AI_HEDGE_PERCENTILE', 95))
+        self.hedge_default_delay = float(os.getenv('AI_HEDGE_DEFAULT_DELAY_MS', 2000)) / 1000
+        self.hedge_min_delay = float(os.getenv('AI_HEDGE_MIN_DELAY_MS', 250)) / 1000
+        self.hedge_max_delay = float(os.getenv('AI_HEDGE_MAX_DELAY_MS', 5000)) / 1000
+        self.hedge_min_samples = int(os.getenv('AI_HEDGE_MIN_SAMPLES', 20))
+        self.hedge_max_parallel = max(1, int(os.getenv('AI_HEDGE_MAX_PARALLEL', 2)))
+        self.latency_windows: Dict[str, Deque[float]] = {}
+        self.hedge_stats = {
+            'hedged_requests': 0,
+            'hedges_launched': 0,
+            'hedge_wins': 0,
+            'losers_cancelled': 0
+        }
+        
         self._initialize_models()
         
         logger.info("AI Provider Manager inicializado com GitHub config")
@@ -214,6 +239,67 @@ class AIProviderManager:
 
         logger.warning("[ERROR] %s failure: %s", provider, error)
     
+    def _record_latency(self, model_name: str, provider: str, response_time: float):
+        """Registra latência de uma resposta bem-sucedida (janela do modelo + histograma do provedor)"""
+        window = self.latency_windows.get(model_name)
+        if window is None:
+            window = self.latency_windows[model_name] = deque(maxlen=LATENCY_WINDOW_SIZE)
+        window.append(response_time)
+        
+        metrics = self.performance_metrics.setdefault(provider, {})
+        overflow = f">{LATENCY_BUCKETS[-1]}s"
+        histogram = metrics.get('latency_histogram')
+        if histogram is None:
+            histogram = metrics['latency_histogram'] = {f"<={bucket}s": 0 for bucket in LATENCY_BUCKETS}
+            histogram[overflow] = 0
+        for bucket in LATENCY_BUCKETS:
+            if response_time <= bucket:
+                histogram[f"<={bucket}s"] += 1
+                break
+        else:
+            histogram[overflow] += 1
+    
+    def _latency_percentile(self, model_name: str, percentile: float) -> Optional[float]:
+        """Percentil da latência observada do modelo (None sem amostras suficientes)"""
+        window = self.latency_windows.get(model_name)
+        if not window or len(window) < self.hedge_min_samples:
+            return None
+        ordered = sorted(window)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+    
+    def _hedge_delay(self, model_name: str, provider: str) -> float:
+        """
+        Quanto esperar pelo modelo antes de disparar o próximo em paralelo
+        
+        Provedor instável (circuit breaker HALF_OPEN, saúde degradada) -> atraso mínimo;
+        sem histórico suficiente -> atraso padrão; caso contrário o percentil configurado.
+        """
+        breaker = self.circuit_breakers.get(provider)
+        if breaker and breaker.state == CircuitBreakerState.HALF_OPEN:
+            return self.hedge_min_delay
+        if self.health_status.get(provider) in (ProviderStatus.DEGRADED, ProviderStatus.UNHEALTHY):
+            return self.hedge_min_delay
+        
+        observed = self._latency_percentile(model_name, self.hedge_percentile)
+        if observed is None:
+            return self.hedge_default_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, observed))
+    
+    def _available_models(self, model_preference: Optional[str] = None) -> List[Tuple[str, ModelConfig]]:
+        """Modelos com circuit breaker fechado, ordenados por prioridade (preferido primeiro)"""
+        available_models = [
+            (name, config) for name, config in self.models.items()
+            if not self._is_circuit_breaker_open(config.provider)
+        ]
+        
+        if model_preference and model_preference in self.models:
+            available_models.sort(key=lambda x: 0 if x[0] == model_preference else x[1].priority)
+        else:
+            available_models.sort(key=lambda x: x[1].priority)
+        
+        return available_models
+    
     async def generate_response(
         self, 
         messages: List[Dict],
@@ -228,11 +314,7 @@ class AIProviderManager:
             (response_text, metadata)
         """
         
-        # Verificar modelos disponíveis
-        available_models = [
-            (name, config) for name, config in self.models.items()
-            if not self._is_circuit_breaker_open(config.provider)
-        ]
+        available_models = self._available_models(model_preference)
         
         if not available_models:
             logger.warning("[WARNING] Nenhum modelo disponível - usando fallback")
@@ -243,13 +325,31 @@ class AIProviderManager:
                 'fallback_reason': 'no_models_available'
             }
         
-        # Ordenar por prioridade (preferir modelo especificado)
-        if model_preference and model_preference in self.models:
-            available_models.sort(key=lambda x: 0 if x[0] == model_preference else x[1].priority)
+        if self.hedge_enabled and self.hedge_max_parallel > 1 and len(available_models) > 1:
+            result = await self._generate_hedged(available_models, messages, temperature, max_tokens)
         else:
-            available_models.sort(key=lambda x: x[1].priority)
+            result = await self._generate_sequential(available_models, messages, temperature, max_tokens)
+        
+        if result is not None:
+            return result
         
-        # Tentar cada modelo
+        # Fallback se todos falharam
+        logger.warning("[WARNING] Todos os modelos falharam - usando fallback")
+        return self._generate_fallback_response(messages), {
+            'model_used': 'fallback',
+            'provider': 'internal',
+            'success': False,
+            'fallback_reason': 'all_models_failed'
+        }
+    
+    async def _generate_sequential(
+        self,
+        available_models: List[Tuple[str, ModelConfig]],
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> Optional[Tuple[str, Dict]]:
+        """Tenta cada modelo em ordem de prioridade"""
         for model_name, model_config in available_models:
             try:
                 start_time = time.time()
@@ -262,6 +362,7 @@ class AIProviderManager:
                 
                 if response_text:
                     self._record_success(model_config.provider, response_time)
+                    self._record_latency(model_name, model_config.provider, response_time)
                     
                     return response_text, {
                         'model_used': model_name,
@@ -275,14 +376,231 @@ class AIProviderManager:
                 logger.warning(f"[WARNING] {model_name} falhou: {e}")
                 continue
         
-        # Fallback se todos falharam
-        logger.warning("[WARNING] Todos os modelos falharam - usando fallback")
-        return self._generate_fallback_response(messages), {
+        return None
+    
+    async def _generate_hedged(
+        self,
+        available_models: List[Tuple[str, ModelConfig]],
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> Optional[Tuple[str, Dict]]:
+        """
+        Hedged requests: o modelo de maior prioridade começa sozinho; se não responder
+        dentro do seu atraso de hedge, o próximo é disparado em paralelo (até
+        hedge_max_parallel). Uma falha dispara o próximo imediatamente. A primeira
+        resposta válida vence e as demais chamadas são canceladas.
+        """
+        queue = list(available_models)
+        pending: Dict[asyncio.Task, Tuple[str, ModelConfig, float]] = {}
+        request_start = time.time()
+        attempts = 0
+        next_hedge_at = None
+        
+        def launch():
+            nonlocal attempts, next_hedge_at
+            model_name, model_config = queue.pop(0)
+            task = asyncio.create_task(self._call_model_api(model_config, messages, temperature, max_tokens))
+            pending[task] = (model_name, model_config, time.time())
+            attempts += 1
+            next_hedge_at = time.time() + self._hedge_delay(model_name, model_config.provider)
+        
+        self.hedge_stats['hedged_requests'] += 1
+        launch()
+        
+        try:
+            while pending:
+                can_hedge = queue and len(pending) < self.hedge_max_parallel
+                timeout = max(0.0, next_hedge_at - time.time()) if can_hedge else None
+                
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    # Atraso de hedge expirou sem resposta
+                    self.hedge_stats['hedges_launched'] += 1
+                    logger.info(f"[HEDGE] {queue[0][0]} disparado em paralelo após {time.time() - request_start:.2f}s")
+                    launch()
+                    continue
+                
+                for task in done:
+                    model_name, model_config, start_time = pending.pop(task)
+                    try:
+                        response_text = task.result()
+                    except Exception as e:
+                        self._record_failure(model_config.provider, str(e))
+                        logger.warning(f"[WARNING] {model_name} falhou: {e}")
+                        continue
+                    
+                    if not response_text:
+                        continue
+                    
+                    response_time = time.time() - start_time
+                    self._record_success(model_config.provider, response_time)
+                    self._record_latency(model_name, model_config.provider, response_time)
+                    hedged = attempts > 1
+                    if hedged and model_name != available_models[0][0]:
+                        self.hedge_stats['hedge_wins'] += 1
+                    
+                    return response_text, {
+                        'model_used': model_name,
+                        'provider': model_config.provider,
+                        'response_time': time.time() - request_start,
+                        'success': True,
+                        'hedged': hedged,
+                        'attempts': attempts
+                    }
+                
+                # Falhas liberam vagas: próximo modelo imediatamente
+                while queue and len(pending) < self.hedge_max_parallel:
+                    launch()
+            
+            return None
+        
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.hedge_stats['losers_cancelled'] += len(pending)
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def stream_response(
+        self,
+        messages: List[Dict],
+        model_preference: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        metadata: Optional[Dict] = None,
+        use_fallback: bool = True
+    ) -> AsyncIterator[str]:
+        """
+        Gera resposta em streaming, produzindo trechos de texto à medida que chegam
+        
+        Troca de modelo só acontece antes do primeiro trecho; uma falha no meio
+        do stream encerra a resposta (metadata['interrupted'] = True).
+        O dicionário metadata, se fornecido, é preenchido como em generate_response.
+        """
+        metadata = metadata if metadata is not None else {}
+        
+        for model_name, model_config in self._available_models(model_preference):
+            start_time = time.time()
+            first_token_time = None
+            
+            try:
+                async for chunk in self._stream_model_api(model_config, messages, temperature, max_tokens):
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    yield chunk
+                    
+            except Exception as e:
+                self._record_failure(model_config.provider, str(e))
+                if first_token_time is None:
+                    logger.warning(f"[WARNING] {model_name} falhou: {e}")
+                    continue
+                
+                metadata.update({
+                    'model_used': model_name,
+                    'provider': model_config.provider,
+                    'response_time': time.time() - start_time,
+                    'first_token_time': first_token_time,
+                    'success': False,
+                    'interrupted': True
+                })
+                return
+            
+            if first_token_time is None:
+                # Stream vazio conta como falha do modelo
+                self._record_failure(model_config.provider, "empty stream")
+                continue
+            
+            response_time = time.time() - start_time
+            self._record_success(model_config.provider, response_time)
+            metadata.update({
+                'model_used': model_name,
+                'provider': model_config.provider,
+                'response_time': response_time,
+                'first_token_time': first_token_time,
+                'success': True
+            })
+            return
+        
+        metadata.update({
             'model_used': 'fallback',
             'provider': 'internal',
             'success': False,
-            'fallback_reason': 'all_models_failed'
+            'fallback_reason': 'all_models_failed' if self.models else 'no_models_available'
+        })
+        if use_fallback:
+            logger.warning("[WARNING] Nenhum modelo respondeu em streaming - usando fallback")
+            yield self._generate_fallback_response(messages)
+    
+    async def _stream_model_api(
+        self,
+        model_config: ModelConfig,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> AsyncIterator[str]:
+        """Stream da API específica do modelo (HuggingFace não suporta: resposta inteira)"""
+        
+        if model_config.provider == 'openrouter':
+            async for chunk in self._stream_openrouter_api(model_config, messages, temperature, max_tokens):
+                yield chunk
+        elif model_config.provider == 'huggingface':
+            text = await self._call_huggingface_api(model_config, messages, temperature, max_tokens)
+            if text:
+                yield text
+        else:
+            raise ValueError(f"Provedor não suportado: {model_config.provider}")
+    
+    async def _stream_openrouter_api(
+        self,
+        model_config: ModelConfig,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> AsyncIterator[str]:
+        """Chama OpenRouter API com stream=True e lê os eventos SSE (choices[0].delta.content)"""
+
+        if not self.openrouter_key:
+            raise ValueError("OpenRouter API key não configurada no GitHub")
+
+        headers = self._openrouter_headers()
+
+        data = {
+            "model": model_config.name,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens or model_config.max_tokens,
+            "stream": True
         }
+
+        client = get_async_http_client(model_config.endpoint_url)
+        async with client.stream(
+            "POST",
+            model_config.endpoint_url,
+            headers=headers,
+            json=data,
+            timeout=model_config.timeout_seconds
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise Exception(f"OpenRouter API error: {response.status_code} - {body.decode(errors='replace')}")
+
+            async for line in response.aiter_lines():
+                # Linhas de comentário (": OPENROUTER PROCESSING") e vazias são ignoradas
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+
+                event = json.loads(payload)
+                if "error" in event:
+                    raise Exception(f"OpenRouter stream error: {event['error']}")
+                choices = event.get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
     
     async def _call_model_api(
         self,
@@ -300,6 +618,15 @@ class AIProviderManager:
         else:
             raise ValueError(f"Provedor não suportado: {model_config.provider}")
     
+    def _openrouter_headers(self) -> Dict[str, str]:
+        """Headers OpenRouter (valores ASCII: httpx não codifica acentos em headers)"""
+        return {
+            "Authorization": f"Bearer {self.openrouter_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://github.com/roteiro-dispensacao",
+            "X-Title": "Roteiro de Dispensacao PQT-U"
+        }
+    
     async def _call_openrouter_api(
         self,
         model_config: ModelConfig,
@@ -312,12 +639,7 @@ class AIProviderManager:
         if not self.openrouter_key:
             raise ValueError("OpenRouter API key não configurada no GitHub")
 
-        headers = {
-            "Authorization": f"Bearer {self.openrouter_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/roteiro-dispensacao",
-            "X-Title": "Roteiro de Dispensação PQT-U"
-        }
+        headers = self._openrouter_headers()
 
         data = {
             "model": model_config.name,
@@ -326,14 +648,14 @@ class AIProviderManager:
             "max_tokens": max_tokens or model_config.max_tokens
         }
 
-        # SonarCloud python:S7499 fix - usar httpx.AsyncClient para async functions
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                model_config.endpoint_url,
-                headers=headers,
-                json=data,
-                timeout=model_config.timeout_seconds
-            )
+        # Cliente httpx.AsyncClient compartilhado (keep-alive por host)
+        client = get_async_http_client(model_config.endpoint_url)
+        response = await client.post(
+            model_config.endpoint_url,
+            headers=headers,
+            json=data,
+            timeout=model_config.timeout_seconds
+        )
 
         if response.status_code == 200:
             result = response.json()
@@ -369,14 +691,14 @@ class AIProviderManager:
             }
         }
 
-        # SonarCloud python:S7499 fix - usar httpx.AsyncClient para async functions
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                model_config.endpoint_url,
-                headers=headers,
-                json=data,
-                timeout=model_config.timeout_seconds
-            )
+        # Cliente httpx.AsyncClient compartilhado (keep-alive por host)
+        client = get_async_http_client(model_config.endpoint_url)
+        response = await client.post(
+            model_config.endpoint_url,
+            headers=headers,
+            json=data,
+            timeout=model_config.timeout_seconds
+        )
 
         if response.status_code == 200:
             result = response.json()
@@ -431,6 +753,16 @@ class AIProviderManager:
                 'circuit_breaker_enabled': self.circuit_breaker_enabled,
                 'max_retries': self.max_retries,
                 'timeout_seconds': self.base_timeout
+            },
+            'hedging': {
+                'enabled': self.hedge_enabled,
+                'max_parallel': self.hedge_max_parallel,
+                'percentile': self.hedge_percentile,
+                'stats': dict(self.hedge_stats),
+                'delays_seconds': {
+                    name: round(self._hedge_delay(name, config.provider), 3)
+                    for name, config in self.models.items()
+                }
             }
         }
     
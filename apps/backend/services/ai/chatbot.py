@@ -5,7 +5,7 @@ import logging
 import time
 from typing import Dict, List, Optional
 from datetime import datetime
-import requests
+import httpx
 from pathlib import Path
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -22,6 +22,7 @@ from core.security.medical_audit_logger import (
 
 # Log injection prevention
 from core.logging.sanitizer import sanitize_log_input, sanitize_error
+from core.performance.http_client_pool import get_http_client
 
 # Analytics médico interno (SQLite + Google Storage)
 try:
@@ -162,8 +163,9 @@ class ChatbotService:
             "Authorization": f"Bearer {self.openrouter_api_key}",
             "Content-Type": "application/json",
             "HTTP-Referer": "https://github.com/roteiro-dispensacao",
-            "X-Title": "Roteiro de Dispensação"
+            "X-Title": "Roteiro de Dispensacao"
         }
+        client = get_http_client(self.openrouter_url)
         
         # Tentar todos os modelos disponíveis
         for attempt, model in enumerate(self.models):
@@ -177,7 +179,7 @@ class ChatbotService:
                 
                 logger.info(f"Tentativa {attempt + 1}: Usando modelo {model}")
                 
-                response = requests.post(
+                response = client.post(
                     self.openrouter_url,
                     headers=headers,
                     json=data,
@@ -202,7 +204,7 @@ class ChatbotService:
                         logger.info("Tentando próximo modelo disponível...")
                         continue
                     
-            except requests.exceptions.Timeout:
+            except httpx.TimeoutException:
                 logger.warning("Timeout no modelo %s", model)
                 if attempt < len(self.models) - 1:
                     logger.info("Tentando próximo modelo disponível...")
@@ -296,14 +296,16 @@ class OpenRouterClient(APIClient):
             logger.warning("OpenRouter API key not configured")
             return None
 
-        import requests
+        import httpx
+        from core.performance.http_client_pool import get_http_client
 
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
             "HTTP-Referer": "https://github.com/roteiro-dispensacao",
-            "X-Title": "Roteiro de Dispensação"
+            "X-Title": "Roteiro de Dispensacao"
         }
+        client = get_http_client(self.base_url)
 
         # Try each model
         for attempt, model in enumerate(self.models):
@@ -315,7 +317,7 @@ class OpenRouterClient(APIClient):
                     "max_tokens": kwargs.get("max_tokens", 1000)
                 }
 
-                response = requests.post(
+                response = client.post(
                     self.base_url,
                     headers=headers,
                     json=data,
@@ -338,7 +340,7 @@ class OpenRouterClient(APIClient):
                     if attempt < len(self.models) - 1:
                         continue
 
-            except requests.exceptions.Timeout:
+            except httpx.TimeoutException:
                 logger.warning(f"Model {model} timed out")
                 if attempt < len(self.models) - 1:
                     continue
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Analytics Rollups - Hourly/daily aggregates maintained alongside medical_events
+
+Each flushed batch of events is aggregated in Python and upserted into small
+rollup tables in the same transaction as the raw insert, so the dashboard
+reads a few hundred rows instead of rescanning medical_events/sessions:
+
+- analytics_rollup_hourly / analytics_rollup_daily: per (bucket, persona,
+  urgency) counts of events, fallbacks, errors and questions, plus the
+  response-time sum and a fixed-bucket histogram (percentiles)
+- analytics_rollup_questions: per (day, question) counts for top questions
+- analytics_rollup_sessions: per hour sessions started/anonymous/ended/bounced
+- analytics_rollup_users: distinct (day, user_id) pairs for unique users
+
+Backfill for databases that predate the rollups:
+    python -m services.analytics.analytics_rollups --db data/analytics/medical_analytics.db
+"""
+
+import sys
+import time
+import argparse
+import logging
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores (segundos) do histograma de tempo de resposta; o último
+# balde (h{len}) é o overflow acima de 60s
+RESPONSE_TIME_BOUNDS: Tuple[float, ...] = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0, 60.0)
+HISTOGRAM_COLUMNS = [f"h{i}" for i in range(len(RESPONSE_TIME_BOUNDS) + 1)]
+
+# Ordem das colunas de medical_events (como inserido pelo serviço)
+EVENT_COLUMNS = ('event_id', 'session_id', 'user_id', 'is_anonymous', 'timestamp', 'event_type', 'persona_id',
+                 'question', 'response_time', 'fallback_used', 'error_occurred', 'urgency_level', 'device_type',
+                 'ip_hash')
+_TS, _PERSONA, _QUESTION, _RESPONSE, _FALLBACK, _ERROR, _URGENCY = 4, 6, 7, 8, 9, 10, 11
+
+_COUNTER_COLUMNS = ['events', 'fallbacks', 'errors', 'questions', 'response_count', 'response_sum'] + HISTOGRAM_COLUMNS
+_HISTOGRAM_DDL = ",\n    ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in HISTOGRAM_COLUMNS)
+
+def _metric_table_ddl(table: str) -> str:
+    return f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    bucket TEXT NOT NULL,
+    persona_id TEXT NOT NULL DEFAULT '',
+    urgency_level TEXT NOT NULL DEFAULT '',
+    events INTEGER NOT NULL DEFAULT 0,
+    fallbacks INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    questions INTEGER NOT NULL DEFAULT 0,
+    response_count INTEGER NOT NULL DEFAULT 0,
+    response_sum REAL NOT NULL DEFAULT 0,
+    response_max REAL NOT NULL DEFAULT 0,
+    {_HISTOGRAM_DDL},
+    PRIMARY KEY (bucket, persona_id, urgency_level)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_SCHEMA = _metric_table_ddl('analytics_rollup_hourly') + _metric_table_ddl('analytics_rollup_daily') + """
+CREATE TABLE IF NOT EXISTS analytics_rollup_questions (
+    day TEXT NOT NULL,
+    question TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, question)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS analytics_rollup_sessions (
+    hour TEXT PRIMARY KEY,
+    started INTEGER NOT NULL DEFAULT 0,
+    anonymous INTEGER NOT NULL DEFAULT 0,
+    ended INTEGER NOT NULL DEFAULT 0,
+    bounced INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS analytics_rollup_users (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (day, user_id)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_TABLES = ('analytics_rollup_hourly', 'analytics_rollup_daily', 'analytics_rollup_questions',
+                 'analytics_rollup_sessions', 'analytics_rollup_users')
+
+def _metric_upsert_sql(table: str) -> str:
+    columns = ['bucket', 'persona_id', 'urgency_level'] + _COUNTER_COLUMNS + ['response_max']
+    updates = [f"{column} = {column} + excluded.{column}" for column in _COUNTER_COLUMNS]
+    updates.append("response_max = MAX(response_max, excluded.response_max)")
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(bucket, persona_id, urgency_level) DO UPDATE SET {', '.join(updates)}")
+
+_HOURLY_UPSERT = _metric_upsert_sql('analytics_rollup_hourly')
+_DAILY_UPSERT = _metric_upsert_sql('analytics_rollup_daily')
+_QUESTION_UPSERT = ("INSERT INTO analytics_rollup_questions (day, question, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(day, question) DO UPDATE SET count = count + excluded.count")
+_SESSION_UPSERT = ("INSERT INTO analytics_rollup_sessions (hour, started, anonymous, ended, bounced) "
+                   "VALUES (?, ?, ?, ?, ?) ON CONFLICT(hour) DO UPDATE SET started = started + excluded.started, "
+                   "anonymous = anonymous + excluded.anonymous, ended = ended + excluded.ended, "
+                   "bounced = bounced + excluded.bounced")
+_USER_INSERT = "INSERT OR IGNORE INTO analytics_rollup_users (day, user_id) VALUES (?, ?)"
+
+def ensure_schema(pool):
+    """Cria as tabelas de rollup (idempotente)"""
+    pool.executescript(ROLLUP_SCHEMA)
+
+def histogram_bucket(seconds: float) -> int:
+    """Índice do balde do histograma para um tempo de resposta"""
+    for index, bound in enumerate(RESPONSE_TIME_BOUNDS):
+        if seconds <= bound:
+            return index
+    return len(RESPONSE_TIME_BOUNDS)
+
+class RollupBatch:
+    """Agregados de um lote de eventos/sessões, aplicados numa única transação"""
+
+    def __init__(self):
+        self.hourly: Dict[Tuple[str, str, str], List[float]] = {}
+        self.daily: Dict[Tuple[str, str, str], List[float]] = {}
+        self.questions: Counter = Counter()
+        self.sessions: Dict[str, List[int]] = {}
+        self.users = set()
+
+    def __len__(self):
+        return len(self.hourly) + len(self.questions) + len(self.sessions) + len(self.users)
+
+    @staticmethod
+    def _accumulate(target: Dict, key: Tuple[str, str, str], row: Sequence[Any]):
+        # [events, fallbacks, errors, questions, response_count, response_sum, h0..hN, response_max]
+        values = target.get(key)
+        if values is None:
+            values = target[key] = [0] * (len(_COUNTER_COLUMNS) + 1)
+        values[0] += 1
+        values[1] += 1 if row[_FALLBACK] else 0
+        values[2] += 1 if row[_ERROR] else 0
+        values[3] += 1 if row[_QUESTION] else 0
+        response_time = row[_RESPONSE]
+        if response_time is not None:
+            values[4] += 1
+            values[5] += response_time
+            values[6 + histogram_bucket(response_time)] += 1
+            values[-1] = max(values[-1], response_time)
+
+    def add_event(self, row: Sequence[Any]):
+        """row na ordem de EVENT_COLUMNS"""
+        timestamp = row[_TS]
+        persona = row[_PERSONA] or ''
+        urgency = row[_URGENCY] or ''
+        self._accumulate(self.hourly, (timestamp[:13], persona, urgency), row)
+        self._accumulate(self.daily, (timestamp[:10], persona, urgency), row)
+        if row[_QUESTION]:
+            self.questions[(timestamp[:10], row[_QUESTION])] += 1
+
+    def add_session_start(self, start_time: str, user_id: Optional[str], is_anonymous: bool):
+        values = self.sessions.setdefault(start_time[:13], [0, 0, 0, 0])
+        values[0] += 1
+        values[1] += 1 if is_anonymous else 0
+        if user_id:
+            self.users.add((start_time[:10], user_id))
+
+    def add_session_end(self, start_time: str, total_messages: int):
+        values = self.sessions.setdefault(start_time[:13], [0, 0, 0, 0])
+        values[2] += 1
+        values[3] += 1 if total_messages <= 1 else 0
+
+    def apply(self, conn):
+        """Upserts do lote; roda dentro de um job de pool.write"""
+        if self.hourly:
+            conn.executemany(_HOURLY_UPSERT, [key + tuple(values) for key, values in self.hourly.items()])
+            conn.executemany(_DAILY_UPSERT, [key + tuple(values) for key, values in self.daily.items()])
+        if self.questions:
+            conn.executemany(_QUESTION_UPSERT, [key + (count,) for key, count in self.questions.items()])
+        if self.sessions:
+            conn.executemany(_SESSION_UPSERT, [(hour,) + tuple(values) for hour, values in self.sessions.items()])
+        if self.users:
+            conn.executemany(_USER_INSERT, list(self.users))
+
+# ---------------------------------------------------------------------------
+# Consultas do dashboard
+# ---------------------------------------------------------------------------
+
+def _hour_bounds(start: str, end: str) -> Tuple[str, str]:
+    start_hour = start[:13] if len(start) >= 13 else f"{start[:10]}T00"
+    end_hour = end[:13] if len(end) >= 13 else f"{end[:10]}T23"
+    return start_hour, end_hour
+
+def _segments(start: str, end: str) -> List[Tuple[str, str, str]]:
+    """
+    Divide [start, end] em dias inteiros (rollup diário) e bordas parciais
+    (rollup horário). Granularidade de hora: a hora de start/end entra inteira.
+    """
+    start_hour, end_hour = _hour_bounds(start, end)
+    first_day = date.fromisoformat(start_hour[:10])
+    last_day = date.fromisoformat(end_hour[:10])
+    if not start_hour.endswith('T00'):
+        first_day += timedelta(days=1)
+    if not end_hour.endswith('T23'):
+        last_day -= timedelta(days=1)
+
+    if first_day > last_day:
+        return [('analytics_rollup_hourly', start_hour, end_hour)]
+
+    segments = []
+    if start_hour < f"{first_day.isoformat()}T00":
+        segments.append(('analytics_rollup_hourly', start_hour, f"{(first_day - timedelta(days=1)).isoformat()}T23"))
+    segments.append(('analytics_rollup_daily', first_day.isoformat(), last_day.isoformat()))
+    if end_hour > f"{last_day.isoformat()}T23":
+        segments.append(('analytics_rollup_hourly', f"{(last_day + timedelta(days=1)).isoformat()}T00", end_hour))
+    return segments
+
+def percentile_from_histogram(counts: Sequence[int], quantile: float, maximum: float) -> float:
+    """Percentil aproximado (interpolação linear dentro do balde)"""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = quantile * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if count and cumulative + count >= rank:
+            lower = RESPONSE_TIME_BOUNDS[index - 1] if index else 0.0
+            upper = RESPONSE_TIME_BOUNDS[index] if index < len(RESPONSE_TIME_BOUNDS) else maximum
+            upper = min(upper, maximum)
+            return round(lower + (upper - lower) * (rank - cumulative) / count, 4)
+        cumulative += count
+    return maximum
+
+def query_metrics(conn, start: str, end: str) -> Dict[str, Any]:
+    """Métricas agregadas de [start, end] lidas apenas das tabelas de rollup"""
+    totals = [0] * (len(_COUNTER_COLUMNS) + 1)
+    persona_usage: Counter = Counter()
+    urgency_usage: Counter = Counter()
+    sums = ", ".join(f"SUM({column})" for column in _COUNTER_COLUMNS)
+
+    for table, low, high in _segments(start, end):
+        rows = conn.execute(f'''
+            SELECT persona_id, urgency_level, {sums}, MAX(response_max)
+            FROM {table}
+            WHERE bucket BETWEEN ? AND ?
+            GROUP BY persona_id, urgency_level
+        ''', (low, high)).fetchall()
+        for row in rows:
+            persona, urgency, values = row[0], row[1], row[2:]
+            for index, value in enumerate(values[:-1]):
+                totals[index] += value or 0
+            totals[-1] = max(totals[-1], values[-1] or 0)
+            if persona:
+                persona_usage[persona] += values[0]
+            if urgency:
+                urgency_usage[urgency] += values[0]
+
+    start_hour, end_hour = _hour_bounds(start, end)
+    peak_hours = [int(hour) for hour, _ in conn.execute('''
+        SELECT substr(bucket, 12, 2) AS hour, SUM(events) AS count
+        FROM analytics_rollup_hourly
+        WHERE bucket BETWEEN ? AND ?
+        GROUP BY hour
+        ORDER BY count DESC
+        LIMIT 5
+    ''', (start_hour, end_hour)).fetchall()]
+
+    top_questions = [question for question, _ in conn.execute('''
+        SELECT question, SUM(count) AS total
+        FROM analytics_rollup_questions
+        WHERE day BETWEEN ? AND ?
+        GROUP BY question
+        ORDER BY total DESC
+        LIMIT 10
+    ''', (start_hour[:10], end_hour[:10])).fetchall()]
+
+    started, anonymous, ended, bounced = conn.execute('''
+        SELECT SUM(started), SUM(anonymous), SUM(ended), SUM(bounced)
+        FROM analytics_rollup_sessions
+        WHERE hour BETWEEN ? AND ?
+    ''', (start_hour, end_hour)).fetchone()
+
+    unique_users = conn.execute('''
+        SELECT COUNT(DISTINCT user_id) FROM analytics_rollup_users WHERE day BETWEEN ? AND ?
+    ''', (start_hour[:10], end_hour[:10])).fetchone()[0]
+
+    events, fallbacks, errors, questions, response_count, response_sum = totals[:6]
+    histogram = totals[6:-1]
+    response_max = totals[-1]
+
+    return {
+        'sessions': started or 0,
+        'unique_users': unique_users or 0,
+        'anonymous_sessions': anonymous or 0,
+        'events': events,
+        'avg_messages': events / started if started else 0,
+        'avg_response_time': response_sum / response_count if response_count else 0,
+        'response_time_percentiles': {
+            'p50': percentile_from_histogram(histogram, 0.50, response_max),
+            'p95': percentile_from_histogram(histogram, 0.95, response_max),
+            'p99': percentile_from_histogram(histogram, 0.99, response_max)
+        },
+        'fallback_rate': fallbacks / events if events else 0,
+        'error_rate': errors / events if events else 0,
+        'resolution_rate': questions / events * 100 if events else 0,
+        'bounce_rate': bounced / ended if ended else 0,
+        'top_questions': top_questions,
+        'persona_usage': dict(persona_usage),
+        'urgency_usage': dict(urgency_usage),
+        'peak_hours': peak_hours
+    }
+
+# ---------------------------------------------------------------------------
+# Backfill
+# ---------------------------------------------------------------------------
+
+def _iter_chunks(pool, sql: str, batch_size: int, max_rowid: int) -> Iterable[List[tuple]]:
+    last_rowid = 0
+    while last_rowid < max_rowid:
+        with pool.connection() as conn:
+            rows = conn.execute(sql, (last_rowid, max_rowid, batch_size)).fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        yield [row[1:] for row in rows]
+
+def rebuild_rollups(pool, batch_size: int = 50000) -> Dict[str, Any]:
+    """
+    Recalcula os rollups a partir de medical_events e sessions.
+
+    A limpeza e o snapshot do maior rowid acontecem num único job do writer,
+    então eventos gravados pelo buffer durante o backfill não são contados
+    duas vezes. Sessões encerradas durante o backfill podem entrar duas vezes
+    em 'ended'; rode com o tráfego parado para números exatos.
+    """
+    started = time.perf_counter()
+    ensure_schema(pool)
+
+    def reset(conn):
+        for table in ROLLUP_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        return (conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM medical_events").fetchone()[0],
+                conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM sessions").fetchone()[0])
+
+    max_event_rowid, max_session_rowid = pool.write(reset)
+    result = {'events': 0, 'sessions': 0, 'batches': 0}
+
+    event_sql = (f"SELECT rowid, {', '.join(EVENT_COLUMNS)} FROM medical_events "
+                 f"WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?")
+    for rows in _iter_chunks(pool, event_sql, batch_size, max_event_rowid):
+        batch = RollupBatch()
+        for row in rows:
+            batch.add_event(row)
+        pool.write(batch.apply)
+        result['events'] += len(rows)
+        result['batches'] += 1
+
+    session_sql = ("SELECT rowid, start_time, user_id, is_anonymous, end_time, total_messages FROM sessions "
+                   "WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?")
+    for rows in _iter_chunks(pool, session_sql, batch_size, max_session_rowid):
+        batch = RollupBatch()
+        for start_time, user_id, is_anonymous, end_time, total_messages in rows:
+            batch.add_session_start(start_time, user_id, is_anonymous)
+            if end_time:
+                batch.add_session_end(start_time, total_messages or 0)
+        pool.write(batch.apply)
+        result['sessions'] += len(rows)
+        result['batches'] += 1
+
+    result['duration_seconds'] = round(time.perf_counter() - started, 3)
+    logger.info("Rollups de analytics recalculados: %s", result)
+    return result
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recalcula os rollups de analytics a partir dos dados brutos")
+    parser.add_argument('--db', default='data/analytics/medical_analytics.db', help="banco de analytics")
+    parser.add_argument('--batch-size', type=int, default=50000, help="linhas por transação")
+    args = parser.parse_args(argv)
+
+    from core.performance.sqlite_pool import get_sqlite_pool
+    pool = get_sqlite_pool(args.db)
+    try:
+        result = rebuild_rollups(pool, batch_size=args.batch_size)
+    finally:
+        pool.close()
+    print(f"{result['events']} eventos e {result['sessions']} sessões em {result['batches']} lotes "
+          f"({result['duration_seconds']}s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
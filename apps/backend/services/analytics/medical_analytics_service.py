@@ -3,18 +3,29 @@
 Medical Analytics Service
 Real-time analytics collection for hanseníase medical application
 Integrates with SQLite for local storage and Google Storage for aggregation
+
+track_event only appends to an in-memory ring buffer; a flusher thread writes
+batches of events in one transaction together with the hourly/daily rollups
+(services.analytics.analytics_rollups) that the dashboard queries read.
 """
 
-import sqlite3
+import json
+import time
+import atexit
 import hashlib
+import threading
+from collections import Counter, deque
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from pathlib import Path
 import logging
 from dataclasses import dataclass
 from google.cloud import storage
 import os
 
+from core.performance.sqlite_pool import get_sqlite_pool
+from services.analytics.analytics_rollups import RollupBatch, ensure_schema, query_metrics, rebuild_rollups
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -54,13 +65,25 @@ class SessionMetrics:
 class MedicalAnalyticsService:
     """Real-time analytics service for medical application"""
 
-    def __init__(self):
+    def __init__(self, db_path: Optional[str] = None):
         """Initialize analytics service with SQLite and Google Storage"""
         # SQLite configuration
-        self.db_path = Path("data/analytics/medical_analytics.db")
+        self.db_path = Path(db_path or "data/analytics/medical_analytics.db")
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool = get_sqlite_pool(self.db_path)
         self._init_database()
 
+        # Buffer de ingestão (anel limitado; o evento mais antigo é descartado quando cheio)
+        try:
+            from app_config import config
+        except ImportError:
+            config = None
+        self.buffer_size = getattr(config, 'ANALYTICS_BUFFER_SIZE', 10000)
+        self.flush_batch_size = getattr(config, 'ANALYTICS_FLUSH_BATCH_SIZE', 1000)
+        self.flush_interval = getattr(config, 'ANALYTICS_FLUSH_INTERVAL_MS', 1000) / 1000
+        self._reset_buffer_state()
+        atexit.register(self.close)
+
         # Google Storage configuration
         self.storage_client = None
         self.bucket_name = os.getenv('GOOGLE_STORAGE_BUCKET', 'roteiros-dispensacao-analytics')
@@ -71,7 +94,7 @@ class MedicalAnalyticsService:
 
     def _init_database(self):
         """Initialize SQLite database with analytics tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        def create_tables(conn):
             cursor = conn.cursor()
 
             # Events table
@@ -139,7 +162,36 @@ class MedicalAnalyticsService:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_timestamp ON sessions(start_time)')
 
-            conn.commit()
+        self._pool.write(create_tables)
+        ensure_schema(self._pool)
+
+    def _reset_buffer_state(self):
+        self._pid = os.getpid()
+        self._buffer: deque = deque(maxlen=self.buffer_size)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._flush_waiters = 0
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+        self.ingest_stats = {
+            'buffered': 0,
+            'dropped': 0,
+            'flushed': 0,
+            'batches': 0,
+            'flush_errors': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0
+        }
+
+    def _check_fork(self):
+        # Serviço criado no import (gunicorn preload): o filho não herda a thread
+        if self._pid != os.getpid():
+            self._reset_buffer_state()
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._run_flusher, name="analytics-flusher", daemon=True)
+            self._flusher.start()
 
     def _init_storage(self):
         """Initialize Google Storage client"""
@@ -161,8 +213,9 @@ class MedicalAnalyticsService:
             self.storage_client = None
 
     def track_event(self, event_data: Dict[str, Any]) -> bool:
-        """Track a medical analytics event"""
+        """Track a medical analytics event (buffered; written by the flusher thread)"""
         try:
+            self._check_fork()
             # Create event object
             event = MedicalEvent(
                 event_id=self._generate_event_id(),
@@ -181,21 +234,22 @@ class MedicalAnalyticsService:
                 ip_hash=self._hash_ip(event_data.get('ip_address'))
             )
 
-            # Store in SQLite
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO medical_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (
-                    event.event_id, event.session_id, event.user_id, event.is_anonymous,
-                    event.timestamp, event.event_type, event.persona_id, event.question,
-                    event.response_time, event.fallback_used, event.error_occurred,
-                    event.urgency_level, event.device_type, event.ip_hash
-                ))
-                conn.commit()
-
-            # Update session metrics
-            self._update_session_metrics(event)
+            row = (
+                event.event_id, event.session_id, event.user_id, event.is_anonymous,
+                event.timestamp, event.event_type, event.persona_id, event.question,
+                event.response_time, event.fallback_used, event.error_occurred,
+                event.urgency_level, event.device_type, event.ip_hash
+            )
+            with self._cond:
+                if self._closed:
+                    return False
+                if len(self._buffer) == self._buffer.maxlen:
+                    self.ingest_stats['dropped'] += 1
+                self._buffer.append(row)
+                self.ingest_stats['buffered'] += 1
+                self._ensure_flusher()
+                if len(self._buffer) >= self.flush_batch_size:
+                    self._cond.notify()
 
             return True
 
@@ -207,22 +261,28 @@ class MedicalAnalyticsService:
         """Start a new analytics session"""
         try:
             session_id = session_data.get('session_id', self._generate_session_id())
+            start_time = datetime.now(timezone.utc).isoformat()
+            user_id = session_data.get('user_id')
+            is_anonymous = session_data.get('is_anonymous', True)
 
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
+            def open_session(conn):
+                conn.execute('''
                     INSERT OR REPLACE INTO sessions
                     (session_id, user_id, is_anonymous, start_time, device_type, ip_hash)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', (
                     session_id,
-                    session_data.get('user_id'),
-                    session_data.get('is_anonymous', True),
-                    datetime.now(timezone.utc).isoformat(),
+                    user_id,
+                    is_anonymous,
+                    start_time,
                     session_data.get('device_type', 'desktop'),
                     self._hash_ip(session_data.get('ip_address'))
                 ))
-                conn.commit()
+                rollup = RollupBatch()
+                rollup.add_session_start(start_time, user_id, is_anonymous)
+                rollup.apply(conn)
+
+            self._pool.write(open_session)
 
             self.active_sessions[session_id] = {
                 'start_time': datetime.now(timezone.utc),
@@ -238,7 +298,10 @@ class MedicalAnalyticsService:
     def end_session(self, session_id: str) -> bool:
         """End an analytics session and calculate metrics"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            # Eventos ainda no buffer também contam para a sessão
+            self.flush()
+
+            def close_session(conn):
                 cursor = conn.cursor()
 
                 # Get session events
@@ -271,6 +334,14 @@ class MedicalAnalyticsService:
                 avg_response_time = total_response_time / len(events) if events else 0
                 fallback_rate = fallback_count / len(events) if events else 0
 
+                # Sessão encerrada conta no rollup da hora em que começou
+                cursor.execute('SELECT start_time, end_time FROM sessions WHERE session_id = ?', (session_id,))
+                session_row = cursor.fetchone()
+                if session_row and not session_row[1]:
+                    rollup = RollupBatch()
+                    rollup.add_session_end(session_row[0], len(events))
+                    rollup.apply(conn)
+
                 # Update session record
                 cursor.execute('''
                     UPDATE sessions
@@ -286,7 +357,10 @@ class MedicalAnalyticsService:
                     questions_resolved,
                     session_id
                 ))
-                conn.commit()
+                return True
+
+            if not self._pool.write(close_session):
+                return False
 
             # Remove from active sessions
             if session_id in self.active_sessions:
@@ -301,7 +375,7 @@ class MedicalAnalyticsService:
     def get_realtime_metrics(self) -> Dict[str, Any]:
         """Get real-time metrics from active sessions and recent events"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
 
                 # Get active users in last 5 minutes
@@ -353,86 +427,123 @@ class MedicalAnalyticsService:
             return {}
 
     def get_aggregated_metrics(self, start_date: str, end_date: str) -> Dict[str, Any]:
-        """Get aggregated metrics for a date range"""
+        """
+        Get aggregated metrics for a date range from the rollup tables.
+        Whole days come from the daily rollup and partial days from the hourly
+        one; the range is resolved to the hour.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-
-                # Get session metrics including bounce rate
-                cursor.execute('''
-                    SELECT
-                        COUNT(DISTINCT session_id) as total_sessions,
-                        COUNT(DISTINCT user_id) as unique_users,
-                        COUNT(DISTINCT CASE WHEN is_anonymous = 1 THEN session_id END) as anonymous_sessions,
-                        AVG(total_messages) as avg_messages,
-                        AVG(avg_response_time) as avg_response_time,
-                        AVG(fallback_rate) as avg_fallback_rate,
-                        AVG(questions_resolved) as avg_questions_resolved,
-                        CAST(SUM(CASE WHEN total_messages <= 1 THEN 1 ELSE 0 END) AS REAL) / COUNT(session_id) as bounce_rate
-                    FROM sessions
-                    WHERE start_time BETWEEN ? AND ?
-                ''', (start_date, end_date))
-
-                metrics = cursor.fetchone()
-
-                # Get top questions
-                cursor.execute('''
-                    SELECT question, COUNT(*) as count
-                    FROM medical_events
-                    WHERE question IS NOT NULL
-                    AND timestamp BETWEEN ? AND ?
-                    GROUP BY question
-                    ORDER BY count DESC
-                    LIMIT 10
-                ''', (start_date, end_date))
-
-                top_questions = [q[0] for q in cursor.fetchall()]
-
-                # Get persona usage
-                cursor.execute('''
-                    SELECT persona_id, COUNT(*) as count
-                    FROM medical_events
-                    WHERE persona_id IS NOT NULL
-                    AND timestamp BETWEEN ? AND ?
-                    GROUP BY persona_id
-                ''', (start_date, end_date))
-
-                persona_usage = dict(cursor.fetchall())
+            with self._pool.connection() as conn:
+                metrics = query_metrics(conn, start_date, end_date)
 
-                # Get peak hours
-                cursor.execute('''
-                    SELECT strftime('%H', timestamp) as hour, COUNT(*) as count
-                    FROM medical_events
-                    WHERE timestamp BETWEEN ? AND ?
-                    GROUP BY hour
-                    ORDER BY count DESC
-                    LIMIT 5
-                ''', (start_date, end_date))
-
-                peak_hours = [int(h[0]) for h in cursor.fetchall()]
-
-                return {
-                    'sessions': metrics[0] or 0,
-                    'unique_users': metrics[1] or 0,
-                    'anonymous_sessions': metrics[2] or 0,
-                    'avg_messages': metrics[3] or 0,
-                    'avg_response_time': metrics[4] or 0,
-                    'fallback_rate': metrics[5] or 0,
-                    'resolution_rate': (metrics[6] / metrics[3] * 100) if metrics[3] else 0,
-                    'bounce_rate': metrics[7] or 0,  # Real bounce rate calculation
-                    'top_questions': top_questions,
-                    'persona_usage': persona_usage,
-                    'peak_hours': peak_hours,
-                    'date_range': {
-                        'start': start_date,
-                        'end': end_date
-                    }
-                }
+            metrics['date_range'] = {
+                'start': start_date,
+                'end': end_date
+            }
+            return metrics
 
         except Exception as e:
             logger.error(f"Failed to get aggregated metrics: {e}")
             return {}
 
+    def backfill_rollups(self, batch_size: int = 50000) -> Dict[str, Any]:
+        """Rebuild the rollup tables from medical_events/sessions (existing data)"""
+        self.flush()
+        return rebuild_rollups(self._pool, batch_size=batch_size)
+
+    def _run_flusher(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer and self._closed:
+                    return
+
+            # Espera o lote encher ou o intervalo vencer (flush() antecipa)
+            if self.flush_interval > 0:
+                deadline = time.monotonic() + self.flush_interval
+                with self._cond:
+                    while (len(self._buffer) < self.flush_batch_size and not self._closed
+                           and not self._flush_waiters and time.monotonic() < deadline):
+                        self._cond.wait(deadline - time.monotonic())
+
+            with self._cond:
+                batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.flush_batch_size))]
+                self._in_flight = len(batch)
+
+            if batch:
+                self._write_batch(batch)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _write_batch(self, rows: List[tuple]):
+        """Eventos, contadores de sessão e rollups numa única transação"""
+        started = time.perf_counter()
+        rollup = RollupBatch()
+        for row in rows:
+            rollup.add_event(row)
+        messages = Counter(row[1] for row in rows)
+
+        def store(conn):
+            conn.executemany('''
+                INSERT OR IGNORE INTO medical_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', rows)
+            self._update_session_metrics(conn, messages)
+            rollup.apply(conn)
+
+        try:
+            self._pool.write(store)
+            self.ingest_stats['flushed'] += len(rows)
+        except Exception as e:
+            self.ingest_stats['flush_errors'] += 1
+            logger.error(f"Failed to flush {len(rows)} analytics events: {e}")
+        self.ingest_stats['batches'] += 1
+        self.ingest_stats['last_batch_size'] = len(rows)
+        self.ingest_stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Grava os eventos do buffer; False se o timeout expirar"""
+        self._check_fork()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._buffer:
+                self._ensure_flusher()
+            self._flush_waiters += 1
+            try:
+                self._cond.notify_all()
+                while self._buffer or self._in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._flush_waiters -= 1
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Grava o que está no buffer e encerra o flusher"""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None and self._flusher.is_alive():
+            self._flusher.join(timeout)
+
+    def get_ingest_stats(self) -> Dict[str, Any]:
+        """Contadores do pipeline de ingestão"""
+        with self._cond:
+            depth = len(self._buffer)
+        stats = dict(self.ingest_stats)
+        stats['buffer_depth'] = depth
+        stats['buffer_size'] = self.buffer_size
+        stats['avg_batch_size'] = stats['flushed'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
     def export_to_storage(self, date: Optional[str] = None) -> bool:
         """Export daily metrics to Google Storage"""
         if not self.storage_client:
@@ -472,7 +583,7 @@ class MedicalAnalyticsService:
         try:
             cutoff_date = (datetime.now(timezone.utc) - timedelta(days=days_to_keep)).isoformat()
 
-            with sqlite3.connect(self.db_path) as conn:
+            def cleanup(conn):
                 cursor = conn.cursor()
 
                 # Delete old events
@@ -481,9 +592,9 @@ class MedicalAnalyticsService:
 
                 # Delete old sessions
                 cursor.execute('DELETE FROM sessions WHERE start_time < ?', (cutoff_date,))
-                deleted_sessions = cursor.rowcount
+                return deleted_events, cursor.rowcount
 
-                conn.commit()
+            deleted_events, deleted_sessions = self._pool.write(cleanup)
 
             logger.info(f"Cleaned up {deleted_events} events and {deleted_sessions} sessions")
             return True
@@ -506,17 +617,14 @@ class MedicalAnalyticsService:
             return None
         return hashlib.sha256(ip_address.encode()).hexdigest()[:16]
 
-    def _update_session_metrics(self, event: MedicalEvent):
-        """Update session metrics in real-time"""
+    def _update_session_metrics(self, conn, messages: Counter):
+        """Update session message counts (runs inside the batch write)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE sessions
-                    SET total_messages = total_messages + 1
-                    WHERE session_id = ?
-                ''', (event.session_id,))
-                conn.commit()
+            conn.executemany('''
+                UPDATE sessions
+                SET total_messages = total_messages + ?
+                WHERE session_id = ?
+            ''', [(count, session_id) for session_id, count in messages.items()])
         except Exception as e:
             logger.error(f"Failed to update session metrics: {e}")
 
@@ -4,12 +4,12 @@ Persona Stats Manager - Sistema de persistência para estatísticas das personas
 Substitui dados mockados por persistência real no SQLite
 """
 
-import sqlite3
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 from pathlib import Path
-from contextlib import contextmanager
+
+from core.performance.sqlite_pool import get_sqlite_pool
 
 logger = logging.getLogger(__name__)
 
@@ -28,81 +28,65 @@ class PersonaStatsManager:
     def __init__(self, db_path: str = './data/persona_stats.db'):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(exist_ok=True)
+        self._pool = get_sqlite_pool(self.db_path)
         self._init_database()
         logger.info("Persona Stats Manager inicializado")
 
     def _init_database(self):
         """Inicializar tabelas do banco"""
         try:
-            with self._get_connection() as conn:
-                # Tabela de interações
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS persona_interactions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        persona_id TEXT NOT NULL,
-                        user_id TEXT,
-                        session_id TEXT,
-                        question_type TEXT,
-                        response_time_ms INTEGER,
-                        success BOOLEAN DEFAULT 1,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Tabela de ratings/feedback
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS persona_ratings (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        persona_id TEXT NOT NULL,
-                        user_id TEXT,
-                        rating INTEGER CHECK(rating >= 1 AND rating <= 5),
-                        feedback_text TEXT,
-                        interaction_id INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (interaction_id) REFERENCES persona_interactions(id)
-                    )
-                ''')
-
-                # Tabela de estatísticas agregadas (cache)
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS persona_stats_cache (
-                        persona_id TEXT PRIMARY KEY,
-                        total_interactions INTEGER DEFAULT 0,
-                        total_ratings INTEGER DEFAULT 0,
-                        total_rating_sum INTEGER DEFAULT 0,
-                        average_rating REAL DEFAULT 0.0,
-                        success_count INTEGER DEFAULT 0,
-                        success_rate REAL DEFAULT 0.0,
-                        avg_response_time_ms REAL DEFAULT 0.0,
-                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Índices para performance
-                conn.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_interactions_persona_date
-                    ON persona_interactions(persona_id, created_at)
-                ''')
-
-                conn.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_ratings_persona
-                    ON persona_ratings(persona_id, created_at)
-                ''')
-
-                conn.commit()
+            self._pool.executescript('''
+                -- Tabela de interações
+                CREATE TABLE IF NOT EXISTS persona_interactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    persona_id TEXT NOT NULL,
+                    user_id TEXT,
+                    session_id TEXT,
+                    question_type TEXT,
+                    response_time_ms INTEGER,
+                    success BOOLEAN DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+
+                -- Tabela de ratings/feedback
+                CREATE TABLE IF NOT EXISTS persona_ratings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    persona_id TEXT NOT NULL,
+                    user_id TEXT,
+                    rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+                    feedback_text TEXT,
+                    interaction_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (interaction_id) REFERENCES persona_interactions(id)
+                );
+
+                -- Tabela de estatísticas agregadas (cache)
+                CREATE TABLE IF NOT EXISTS persona_stats_cache (
+                    persona_id TEXT PRIMARY KEY,
+                    total_interactions INTEGER DEFAULT 0,
+                    total_ratings INTEGER DEFAULT 0,
+                    total_rating_sum INTEGER DEFAULT 0,
+                    average_rating REAL DEFAULT 0.0,
+                    success_count INTEGER DEFAULT 0,
+                    success_rate REAL DEFAULT 0.0,
+                    avg_response_time_ms REAL DEFAULT 0.0,
+                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+
+                -- Índices para performance
+                CREATE INDEX IF NOT EXISTS idx_interactions_persona_date
+                ON persona_interactions(persona_id, created_at);
+
+                CREATE INDEX IF NOT EXISTS idx_ratings_persona
+                ON persona_ratings(persona_id, created_at);
+            ''')
 
         except Exception as e:
             logger.error(f"Erro ao inicializar banco de stats: {e}")
 
-    @contextmanager
     def _get_connection(self):
-        """Context manager para conexões SQLite"""
-        conn = sqlite3.connect(self.db_path, timeout=10.0)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
+        """Conexão de leitura da thread atual (pool compartilhado)"""
+        return self._pool.connection()
 
     def record_interaction(
         self,
@@ -120,21 +104,21 @@ class PersonaStatsManager:
             interaction_id para referência futura
         """
         try:
-            with self._get_connection() as conn:
+            def record(conn):
                 cursor = conn.execute('''
                     INSERT INTO persona_interactions
                     (persona_id, user_id, session_id, question_type, response_time_ms, success)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', (persona_id, user_id, session_id, question_type, response_time_ms, success))
 
-                interaction_id = cursor.lastrowid
-                conn.commit()
-
-                # Atualizar cache de estatísticas
+                # Atualizar cache de estatísticas (mesma transação)
                 self._update_stats_cache(conn, persona_id)
+                return cursor.lastrowid
 
-                logger.debug(f"Interação registrada: {persona_id} (ID: {interaction_id})")
-                return interaction_id
+            interaction_id = self._pool.write(record)
+
+            logger.debug(f"Interação registrada: {persona_id} (ID: {interaction_id})")
+            return interaction_id
 
         except Exception as e:
             logger.error(f"Erro ao registrar interação: {e}")
@@ -154,20 +138,20 @@ class PersonaStatsManager:
                 logger.warning(f"Rating inválido: {rating}")
                 return False
 
-            with self._get_connection() as conn:
+            def record(conn):
                 conn.execute('''
                     INSERT INTO persona_ratings
                     (persona_id, user_id, rating, feedback_text, interaction_id)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (persona_id, user_id, rating, feedback_text, interaction_id))
 
-                conn.commit()
-
-                # Atualizar cache de estatísticas
+                # Atualizar cache de estatísticas (mesma transação)
                 self._update_stats_cache(conn, persona_id)
 
-                logger.debug(f"Rating registrado: {persona_id} = {rating}")
-                return True
+            self._pool.write(record)
+
+            logger.debug(f"Rating registrado: {persona_id} = {rating}")
+            return True
 
         except Exception as e:
             logger.error(f"Erro ao registrar rating: {e}")
@@ -224,35 +208,33 @@ class PersonaStatsManager:
     def get_persona_stats(self, persona_id: str) -> Dict:
         """Obter estatísticas completas de uma persona"""
         try:
-            with self._get_connection() as conn:
-                # Buscar do cache primeiro
-                cached_stats = conn.execute('''
-                    SELECT * FROM persona_stats_cache WHERE persona_id = ?
-                ''', (persona_id,)).fetchone()
-
-                if cached_stats:
-                    return {
-                        'total_interactions': cached_stats['total_interactions'],
-                        'average_rating': round(cached_stats['average_rating'], 2),
-                        'success_rate': round(cached_stats['success_rate'], 2),
-                        'total_ratings': cached_stats['total_ratings'],
-                        'avg_response_time_ms': round(cached_stats['avg_response_time_ms'] or 0, 0),
-                        'last_updated': cached_stats['last_updated']
-                    }
-
-                # Se não existe cache, criar entrada inicial
-                self._update_stats_cache(conn, persona_id)
-                conn.commit()
+            # Buscar do cache primeiro
+            cached_stats = self._get_connection().execute('''
+                SELECT * FROM persona_stats_cache WHERE persona_id = ?
+            ''', (persona_id,)).fetchone()
 
+            if cached_stats:
                 return {
-                    'total_interactions': 0,
-                    'average_rating': 0.0,
-                    'success_rate': 0.0,
-                    'total_ratings': 0,
-                    'avg_response_time_ms': 0.0,
-                    'last_updated': datetime.now().isoformat()
+                    'total_interactions': cached_stats['total_interactions'],
+                    'average_rating': round(cached_stats['average_rating'], 2),
+                    'success_rate': round(cached_stats['success_rate'], 2),
+                    'total_ratings': cached_stats['total_ratings'],
+                    'avg_response_time_ms': round(cached_stats['avg_response_time_ms'] or 0, 0),
+                    'last_updated': cached_stats['last_updated']
                 }
 
+            # Se não existe cache, criar entrada inicial (sem bloquear a leitura)
+            self._pool.write(lambda conn: self._update_stats_cache(conn, persona_id), wait=False)
+
+            return {
+                'total_interactions': 0,
+                'average_rating': 0.0,
+                'success_rate': 0.0,
+                'total_ratings': 0,
+                'avg_response_time_ms': 0.0,
+                'last_updated': datetime.now().isoformat()
+            }
+
         except Exception as e:
             logger.error(f"Erro ao obter stats da persona: {e}")
             return {
@@ -348,7 +330,7 @@ class PersonaStatsManager:
         try:
             cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
 
-            with self._get_connection() as conn:
+            def cleanup(conn):
                 # Limpar interações antigas
                 cursor = conn.execute('''
                     DELETE FROM persona_interactions WHERE created_at < ?
@@ -369,11 +351,13 @@ class PersonaStatsManager:
                 for persona in personas:
                     self._update_stats_cache(conn, persona['persona_id'])
 
-                conn.commit()
-
-                logger.info(f"Limpeza concluída: {deleted_interactions} interações removidas")
                 return deleted_interactions
 
+            deleted_interactions = self._pool.write(cleanup)
+
+            logger.info(f"Limpeza concluída: {deleted_interactions} interações removidas")
+            return deleted_interactions
+
         except Exception as e:
             logger.error(f"Erro na limpeza: {e}")
             return 0
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+Approximate Nearest Neighbour Index - In-process ANN engines for the local vector store
+
+Engines:
+    IVFFlatEngine   pure numpy inverted-file index (k-means coarse quantizer,
+                    exact cosine re-scoring inside the probed lists)
+    HNSWEngine      optional hnswlib graph index (pip install hnswlib)
+
+ANNLocalVectorStore plugs an engine into LocalVectorStore and keeps the same
+search_similar(query_embedding, top_k, min_score, chunk_types) contract, so it
+can replace the brute-force scan wherever LocalVectorStore is used. Engines work
+on the store's row numbers; the IVF engine scores against the store's own
+normalized rows (mapped + overflow segments) instead of keeping a second copy
+of the vectors.
+"""
+
+import os
+import json
+import logging
+from typing import List, Dict, Optional, Tuple, Any
+
+import numpy as np
+
+from services.vector_store import LocalVectorStore, VectorDocument
+
+logger = logging.getLogger(__name__)
+
+# Optional hnswlib backend
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+    hnswlib = None
+
+class IVFFlatEngine:
+    """
+    Inverted-file index with flat (exact) re-scoring
+
+    Rows are assigned to the nearest of nlist k-means centroids; a query scores
+    only the rows in its nprobe closest lists. Below min_train_size rows the
+    engine stays untrained and callers fall back to an exact scan.
+    """
+
+    name = 'ivf_flat'
+    STATE_FILENAME = 'ann_ivf.npz'
+
+    def __init__(self, nprobe: int = 8, min_train_size: int = 1024, kmeans_iterations: int = 12, seed: int = 0):
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.empty(0, dtype=np.int32)  # row -> list (-1 = not indexed)
+        self.lists: List[List[int]] = []
+        self.trained_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, matrix: np.ndarray, rows: np.ndarray):
+        """Fit the coarse quantizer on live rows and assign them to lists"""
+        if len(rows) < self.min_train_size:
+            self.centroids = None
+            self.lists = []
+            self.assignments = np.full(len(matrix), -1, dtype=np.int32)
+            return
+
+        nlist = max(1, int(np.sqrt(len(rows))))
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a sample; 64 points per list is plenty for a coarse quantizer
+        sample = rows if len(rows) <= nlist * 64 else rng.choice(rows, nlist * 64, replace=False)
+        data = np.asarray(matrix[sample], dtype=np.float32)
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[labels == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[c] = centroid / norm if norm > 0 else centroid
+                else:
+                    # Re-seed empty lists from a random sample point
+                    centroids[c] = data[rng.integers(len(data))]
+
+        self.centroids = centroids
+        self.lists = [[] for _ in range(nlist)]
+        self.assignments = np.full(len(matrix), -1, dtype=np.int32)
+        self._assign(matrix, rows)
+        self.trained_size = len(rows)
+
+    def _assign(self, matrix: np.ndarray, rows: np.ndarray):
+        labels = np.argmax(np.asarray(matrix[rows], dtype=np.float32) @ self.centroids.T, axis=1)
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            self.lists[label].append(row)
+            self.assignments[row] = label
+
+    def add(self, matrix: np.ndarray, row: int):
+        """Index (or re-index) a single row"""
+        if row >= len(self.assignments):
+            grown = np.full(max(row + 1, len(self.assignments) * 2), -1, dtype=np.int32)
+            grown[:len(self.assignments)] = self.assignments
+            self.assignments = grown
+        if not self.is_trained:
+            return
+        self.remove(row)
+        self._assign(matrix, np.array([row]))
+
+    def remove(self, row: int):
+        if row < len(self.assignments) and self.assignments[row] >= 0:
+            self.lists[self.assignments[row]].remove(row)
+            self.assignments[row] = -1
+
+    def needs_retrain(self, live_rows: int) -> bool:
+        """Retrain once the corpus has doubled (or first crosses the threshold)"""
+        if not self.is_trained:
+            return live_rows >= self.min_train_size
+        return live_rows >= self.trained_size * 2
+
+    def candidates(self, query: np.ndarray, needed: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Rows from the closest lists; widens the probe until at least `needed`
+        rows pass the mask (or every list has been probed)
+        """
+        order = np.argsort(-(self.centroids @ query))
+        probe = min(self.nprobe, len(order))
+        while True:
+            rows = [row for label in order[:probe] for row in self.lists[label]]
+            candidates = np.fromiter(rows, dtype=np.int64, count=len(rows))
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            if len(candidates) >= needed or probe >= len(order):
+                return candidates
+            probe = min(len(order), probe * 2)
+
+    def remap(self, old_rows: np.ndarray):
+        """Follow a store compaction: row old_rows[i] is now row i"""
+        if not self.is_trained:
+            self.assignments = np.full(len(old_rows), -1, dtype=np.int32)
+            return
+        self.assignments = self.assignments[old_rows].copy()
+        self.lists = [[] for _ in range(len(self.centroids))]
+        for row, label in enumerate(self.assignments.tolist()):
+            if label >= 0:
+                self.lists[label].append(row)
+
+    def save(self, directory: str, rows: np.ndarray):
+        """Persist list assignments for `rows` (the rows written to disk, in order)"""
+        path = os.path.join(directory, self.STATE_FILENAME)
+        if not self.is_trained:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments[rows],
+                 trained_size=np.array([self.trained_size]))
+        os.replace(tmp_path, path)
+
+    def load(self, directory: str, size: int) -> bool:
+        """Restore state saved for a store of `size` rows; False if absent or stale"""
+        path = os.path.join(directory, self.STATE_FILENAME)
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as state:
+            assignments = state['assignments']
+            if len(assignments) != size:
+                return False
+            self.centroids = state['centroids']
+            self.trained_size = int(state['trained_size'][0])
+            self.assignments = assignments.astype(np.int32)
+        self.lists = [[] for _ in range(len(self.centroids))]
+        for row, label in enumerate(self.assignments.tolist()):
+            if label >= 0:
+                self.lists[label].append(row)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        sizes = [len(members) for members in self.lists]
+        return {
+            'engine': self.name,
+            'trained': self.is_trained,
+            'nlist': len(self.lists),
+            'nprobe': self.nprobe,
+            'trained_size': self.trained_size,
+            'largest_list': max(sizes) if sizes else 0
+        }
+
+class HNSWEngine:
+    """
+    hnswlib graph index over the store's rows (labels are row numbers)
+    hnswlib keeps its own copy of the vectors.
+    """
+
+    name = 'hnsw'
+    STATE_FILENAME = 'ann_hnsw.bin'
+
+    def __init__(self, ef_search: int = 64, ef_construction: int = 200, m: int = 16, min_train_size: int = 1024):
+        if not HNSWLIB_AVAILABLE:
+            raise ImportError("hnswlib not available - install with: pip install hnswlib")
+        self.ef_search = ef_search
+        self.ef_construction = ef_construction
+        self.m = m
+        self.min_train_size = min_train_size
+        self.index = None
+        self.trained_size = 0
+        self._deleted = set()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.index is not None
+
+    def _new_index(self, dimension: int, capacity: int):
+        index = hnswlib.Index(space='ip', dim=dimension)
+        index.init_index(max_elements=max(capacity, 16), ef_construction=self.ef_construction, M=self.m,
+                         allow_replace_deleted=False)
+        index.set_ef(self.ef_search)
+        return index
+
+    def train(self, matrix: np.ndarray, rows: np.ndarray):
+        self._deleted = set()
+        if len(rows) < self.min_train_size:
+            self.index = None
+            return
+        self.index = self._new_index(matrix.shape[1], len(matrix) * 2)
+        self.index.add_items(np.asarray(matrix[rows], dtype=np.float32), rows)
+        self.trained_size = len(rows)
+
+    def add(self, matrix: np.ndarray, row: int):
+        if not self.is_trained:
+            return
+        if self.index.get_current_count() >= self.index.get_max_elements():
+            self.index.resize_index(self.index.get_max_elements() * 2)
+        if row in self._deleted:
+            self.index.unmark_deleted(row)
+            self._deleted.discard(row)
+        self.index.add_items(np.asarray(matrix[row:row + 1], dtype=np.float32), np.array([row]))
+
+    def remove(self, row: int):
+        if self.is_trained and row not in self._deleted:
+            try:
+                self.index.mark_deleted(row)
+                self._deleted.add(row)
+            except RuntimeError:
+                pass  # row was never indexed
+
+    def needs_retrain(self, live_rows: int) -> bool:
+        return not self.is_trained and live_rows >= self.min_train_size
+
+    def search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        live = self.index.get_current_count() - len(self._deleted)
+        k = min(k, live)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        filter_fn = (lambda label: bool(mask[label])) if mask is not None else None
+        self.index.set_ef(max(self.ef_search, k))
+        labels, distances = self.index.knn_query(query.astype(np.float32), k=k, filter=filter_fn)
+        # 'ip' space returns 1 - dot product
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def remap(self, old_rows: np.ndarray):
+        # Labels cannot be renumbered in place; drop the graph and let the
+        # store retrain it over the new rows (ANNLocalVectorStore._on_rows_renumbered)
+        self.index = None
+        self._deleted = set()
+
+    def save(self, directory: str, rows: np.ndarray):
+        path = os.path.join(directory, self.STATE_FILENAME)
+        # Labels are row numbers, so the graph is only reusable when the rows
+        # written to disk are exactly 0..n-1 (no tombstones dropped on save)
+        contiguous = len(rows) == 0 or int(rows[-1]) == len(rows) - 1
+        if self.is_trained and contiguous:
+            self.index.save_index(path)
+            with open(f"{path}.json", 'w', encoding='utf-8') as f:
+                json.dump({'trained_size': self.trained_size, 'deleted': sorted(self._deleted),
+                           'size': len(rows), 'dimension': self.index.dim}, f)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def load(self, directory: str, size: int) -> bool:
+        path = os.path.join(directory, self.STATE_FILENAME)
+        if not (os.path.exists(path) and os.path.exists(f"{path}.json")):
+            return False
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('size') != size:
+            return False
+        index = hnswlib.Index(space='ip', dim=state['dimension'])
+        index.load_index(path)
+        index.set_ef(self.ef_search)
+        self.index = index
+        self.trained_size = state['trained_size']
+        self._deleted = set(state['deleted'])
+        for row in self._deleted:
+            self.index.mark_deleted(row)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'engine': self.name,
+            'trained': self.is_trained,
+            'ef_search': self.ef_search,
+            'm': self.m,
+            'trained_size': self.trained_size,
+            'indexed': self.index.get_current_count() if self.is_trained else 0
+        }
+
+def create_ann_engine(backend: str, **kwargs):
+    """Engine factory; 'hnsw' degrades to IVF-flat when hnswlib is missing"""
+    backend = (backend or 'ivf').lower()
+    if backend == 'hnsw':
+        if HNSWLIB_AVAILABLE:
+            return HNSWEngine(**{k: v for k, v in kwargs.items() if k in ('ef_search', 'min_train_size')})
+        logger.warning("[WARNING] hnswlib not installed - using IVF-flat ANN engine")
+    return IVFFlatEngine(**{k: v for k, v in kwargs.items() if k in ('nprobe', 'min_train_size')})
+
+class ANNLocalVectorStore(LocalVectorStore):
+    """
+    LocalVectorStore with an approximate nearest-neighbour engine
+    Same public interface; the engine state is persisted next to the vector index.
+    """
+
+    def __init__(self, storage_path: str, backend: str = 'ivf', vector_dtype: str = 'float32', **engine_options):
+        self.engine = create_ann_engine(backend, **engine_options)
+        self.ann_stats = {'ann_searches': 0, 'exact_searches': 0, 'rebuilds': 0}
+        super().__init__(storage_path, vector_dtype=vector_dtype)
+
+        if self._size and not self.engine.load(storage_path, self._size):
+            self._rebuild_engine()
+
+        logger.info(f"[OK] ANNLocalVectorStore using {self.engine.name} engine")
+
+    def _rebuild_engine(self):
+        self.engine.train(self._row_matrix, self._live_rows())
+        self.ann_stats['rebuilds'] += 1
+
+    def _write_row(self, row: int, embedding: np.ndarray, chunk_type: str):
+        super()._write_row(row, embedding, chunk_type)
+        if hasattr(self, 'engine'):
+            self.engine.add(self._row_matrix, row)
+
+    def _on_rows_renumbered(self, old_rows: np.ndarray):
+        was_trained = self.engine.is_trained
+        self.engine.remap(old_rows)
+        if was_trained and not self.engine.is_trained:
+            # HNSW drops its graph on remap; rebuild now instead of serving exact scans
+            self._rebuild_engine()
+
+    def _reset_rows(self):
+        super()._reset_rows()
+        if hasattr(self, 'engine'):
+            self.engine.train(self._row_matrix, self._live_rows())
+
+    def _save_store(self):
+        super()._save_store()
+        try:
+            # The vector index on disk holds live rows only, in row order
+            self.engine.save(self.storage_path, self._live_rows())
+        except Exception as e:
+            logger.error(f"[ERROR] Failed to save ANN index: {e}")
+
+    def add_document(self, document: VectorDocument) -> bool:
+        added = super().add_document(document)
+        if added and self.engine.needs_retrain(self._size - self._tombstones):
+            self._rebuild_engine()
+        return added
+
+    def delete_document(self, doc_id: str) -> bool:
+        row = self._id_to_row.get(doc_id)
+        if row is not None:
+            self.engine.remove(row)
+        return super().delete_document(doc_id)
+
+    def search_similar(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        min_score: float = 0.0,
+        chunk_types: Optional[List[str]] = None
+    ) -> List[Tuple[VectorDocument, float]]:
+        """Approximate search; exact scan until the engine has enough rows to train"""
+        if not self.engine.is_trained:
+            self.ann_stats['exact_searches'] += 1
+            return super().search_similar(query_embedding, top_k, min_score, chunk_types)
+
+        if not self.documents or top_k <= 0:
+            return []
+
+        try:
+            query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+            query_norm = float(np.linalg.norm(query))
+            if query_norm == 0:
+                return []
+            query = query / query_norm
+
+            mask = None
+            if chunk_types:
+                codes = [self._chunk_type_codes[ct] for ct in chunk_types if ct in self._chunk_type_codes]
+                if not codes:
+                    return []
+                mask = self._alive[:self._size] & np.isin(self._all_chunk_codes(), codes)
+
+            if isinstance(self.engine, HNSWEngine):
+                rows, scores = self.engine.search(query, top_k, mask)
+            else:
+                rows = self.engine.candidates(query, top_k, mask)
+                scores = self._similarities(query, rows)
+                if len(rows) > top_k:
+                    top = np.argpartition(-scores, top_k - 1)[:top_k]
+                    rows, scores = rows[top], scores[top]
+                order = np.argsort(-scores, kind='stable')
+                rows, scores = rows[order], scores[order]
+
+            self.ann_stats['ann_searches'] += 1
+
+            results = []
+            for row, score in zip(rows.tolist(), scores.tolist()):
+                if score < min_score:
+                    break
+                doc = self.documents[self._row_ids[row]]
+                if doc.embedding is None:
+                    doc.embedding = self._row_embedding(row)
+                results.append((doc, float(score)))
+            return results
+
+        except Exception as e:
+            logger.error(f"[ERROR] ANN search failed, using exact scan: {e}")
+            return super().search_similar(query_embedding, top_k, min_score, chunk_types)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats['backend'] = f"local_{self.engine.name}"
+        stats['ann'] = {**self.engine.get_stats(), **self.ann_stats}
+        return stats
@@ -231,15 +231,10 @@ class JWTAuthManager:
 
     def revoke_all_sessions(self, user_id: str) -> bool:
         """Revogar todas as sessões do usuário"""
-        try:
-            with self.db._get_connection() as conn:
-                conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
-                conn.commit()
-                logger.info("Todas as sessões revogadas para usuário: %s", sanitize_user_id(user_id))
-                return True
-        except Exception as e:
-            logger.error("Erro ao revogar sessões: %s", sanitize_error(e))
-            return False
+        if self.db.delete_user_sessions(user_id):
+            logger.info("Todas as sessões revogadas para usuário: %s", sanitize_user_id(user_id))
+            return True
+        return False
 
     # === GOOGLE OAUTH ===
 
@@ -542,18 +537,9 @@ class JWTAuthManager:
 
     def cleanup_expired_sessions(self) -> int:
         """Limpar sessões expiradas"""
-        try:
-            with self.db._get_connection() as conn:
-                cursor = conn.execute("""
-                    DELETE FROM sessions WHERE expires_at <= CURRENT_TIMESTAMP
-                """)
-                conn.commit()
-                count = cursor.rowcount
-                logger.debug("Sessões expiradas removidas: %d", count)
-                return count
-        except Exception as e:
-            logger.error("Erro ao limpar sessões: %s", sanitize_error(e))
-            return 0
+        count = self.db.delete_expired_sessions()
+        logger.debug("Sessões expiradas removidas: %d", count)
+        return count
 
 # Instância global
 auth_manager = None
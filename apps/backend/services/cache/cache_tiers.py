@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Cache Tiers - Persistent tiers behind CloudNativeCache
+
+Each tier stores entries as an envelope {'value', 'type', 'expires_at'} and
+exposes the same interface:
+
+- get(cache_key) -> envelope or None (expired entries count as misses)
+- put_many([(cache_key, envelope), ...]) - one call per write-behind batch
+- delete(cache_key)
+
+GCSCacheTier writes one blob per key (GCS has no multi-object upload);
+SupabaseCacheTier upserts a whole batch in one statement on the Postgres
+pool; LocalDirectoryCacheTier is the local fallback and the stand-in used
+by tests for both.
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.logging.sanitizer import sanitize_error
+
+logger = logging.getLogger(__name__)
+
+try:
+    from google.api_core.exceptions import NotFound as GCSNotFound
+except ImportError:
+    class GCSNotFound(Exception):
+        pass
+
+Envelope = Dict[str, Any]
+
+def encode_envelope(value: Any, expires_at: datetime) -> Envelope:
+    """Envelope serializável em JSON (numpy arrays viram listas)"""
+    if isinstance(value, np.ndarray):
+        return {'value': value.tolist(), 'type': 'numpy_array', 'expires_at': expires_at.isoformat()}
+    return {'value': value, 'type': 'standard', 'expires_at': expires_at.isoformat()}
+
+def decode_envelope(envelope: Envelope) -> Any:
+    value = envelope.get('value')
+    if envelope.get('type') == 'numpy_array':
+        return np.array(value)
+    return value
+
+def envelope_expired(envelope: Envelope) -> bool:
+    expires_at = datetime.fromisoformat(envelope.get('expires_at', '1970-01-01T00:00:00+00:00'))
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) >= expires_at
+
+class CacheTier:
+    """Interface comum dos tiers persistentes"""
+
+    name = 'tier'
+
+    def get(self, cache_key: str) -> Optional[Envelope]:
+        raise NotImplementedError
+
+    def put_many(self, entries: List[Tuple[str, Envelope]]) -> int:
+        raise NotImplementedError
+
+    def delete(self, cache_key: str) -> bool:
+        raise NotImplementedError
+
+class LocalDirectoryCacheTier(CacheTier):
+    """Um arquivo JSON por chave em um diretório local"""
+
+    def __init__(self, directory, name: str = 'cloud_storage'):
+        self.name = name
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, cache_key: str) -> Path:
+        return self.directory / f"{cache_key}.json"
+
+    def get(self, cache_key: str) -> Optional[Envelope]:
+        path = self._path(cache_key)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            envelope = json.load(f)
+        if envelope_expired(envelope):
+            path.unlink(missing_ok=True)
+            return None
+        return envelope
+
+    def put_many(self, entries: List[Tuple[str, Envelope]]) -> int:
+        for cache_key, envelope in entries:
+            # Escrita atômica: leitores nunca veem um arquivo pela metade
+            temp_path = self._path(cache_key).with_suffix('.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(envelope, f, ensure_ascii=False)
+            temp_path.replace(self._path(cache_key))
+        return len(entries)
+
+    def delete(self, cache_key: str) -> bool:
+        path = self._path(cache_key)
+        if path.exists():
+            path.unlink(missing_ok=True)
+            return True
+        return False
+
+class GCSCacheTier(CacheTier):
+    """Blobs JSON em embeddings_cache/ no bucket do RealGCSClient"""
+
+    name = 'cloud_storage'
+
+    def __init__(self, gcs_client, prefix: str = 'embeddings_cache/'):
+        self.client = gcs_client
+        self.prefix = prefix
+
+    def get(self, cache_key: str) -> Optional[Envelope]:
+        # Download direto: uma ida ao GCS (download_string faz exists() + download e loga erro no miss)
+        try:
+            content = self.client.bucket.blob(f"{self.prefix}{cache_key}.json").download_as_text()
+        except GCSNotFound:
+            return None
+        envelope = json.loads(content)
+        if envelope_expired(envelope):
+            self.delete(cache_key)
+            return None
+        return envelope
+
+    def put_many(self, entries: List[Tuple[str, Envelope]]) -> int:
+        written = 0
+        for cache_key, envelope in entries:
+            try:
+                self.client.upload_string(json.dumps(envelope), f"{self.prefix}{cache_key}.json",
+                                          content_type='application/json')
+                written += 1
+            except Exception as e:
+                logger.debug("Falha ao gravar blob de cache: %s", sanitize_error(e))
+        return written
+
+    def delete(self, cache_key: str) -> bool:
+        return self.client.delete_file(f"{self.prefix}{cache_key}.json")
+
+class SupabaseCacheTier(CacheTier):
+    """Tabela search_cache no Postgres do Supabase (pool compartilhado, upsert em lote)"""
+
+    name = 'supabase'
+
+    def __init__(self, supabase_client):
+        from core.performance.pg_pool import PreparedStatement
+
+        self.pool = supabase_client.pg_pool
+        if self.pool is None:
+            raise RuntimeError("Supabase cache tier requires a Postgres connection")
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS search_cache (
+                        query_hash VARCHAR(64) PRIMARY KEY,
+                        results JSONB NOT NULL,
+                        expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                    );
+                """)
+
+        self._get = PreparedStatement(
+            name="cache_get",
+            sql="SELECT results FROM search_cache WHERE query_hash = $1 AND expires_at > NOW()",
+            param_types=('varchar',)
+        )
+        # Listas Python chegam como text[]: declarados text[] e convertidos no SQL
+        # (EXECUTE não converte text[] -> jsonb[]/timestamptz[] implicitamente)
+        self._put_many = PreparedStatement(
+            name="cache_put_many",
+            sql="""
+                INSERT INTO search_cache (query_hash, results, expires_at)
+                SELECT * FROM unnest($1::varchar[], $2::jsonb[], $3::timestamptz[])
+                ON CONFLICT (query_hash) DO UPDATE SET
+                    results = excluded.results,
+                    expires_at = excluded.expires_at
+            """,
+            param_types=('text[]', 'text[]', 'text[]')
+        )
+        self._delete = PreparedStatement(
+            name="cache_delete",
+            sql="DELETE FROM search_cache WHERE query_hash = $1",
+            param_types=('varchar',)
+        )
+
+    def get(self, cache_key: str) -> Optional[Envelope]:
+        row = self.pool.execute(self._get, (cache_key,), fetch='one')
+        if not row:
+            return None
+        results = row[0]
+        return json.loads(results) if isinstance(results, str) else results
+
+    def put_many(self, entries: List[Tuple[str, Envelope]]) -> int:
+        if not entries:
+            return 0
+        self.pool.execute(self._put_many, (
+            [cache_key for cache_key, _ in entries],
+            [json.dumps(envelope) for _, envelope in entries],
+            [envelope['expires_at'] for _, envelope in entries]
+        ), fetch='none')
+        return len(entries)
+
+    def delete(self, cache_key: str) -> bool:
+        self.pool.execute(self._delete, (cache_key,), fetch='none')
+        return True
@@ -3,17 +3,29 @@
 Cloud Native Cache - Sistema de cache para embeddings e RAG
 Integra Supabase + Cloud Storage para cache distribuído
 FASE 3 - Cache otimizado para Cloud Run stateless
+
+Tiers persistentes em services/cache/cache_tiers.py; gravação em segundo
+plano via services/cache/write_behind.py.
 """
 
 import json
+import time
 import hashlib
 import logging
-from typing import Dict, Any, Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 import numpy as np
 
 from core.logging.sanitizer import sanitize_error
+from core.performance.pg_pool import LatencyHistogram
+from services.cache.cache_tiers import (
+    CacheTier, GCSCacheTier, SupabaseCacheTier, LocalDirectoryCacheTier,
+    encode_envelope, decode_envelope, envelope_expired
+)
+from services.cache.write_behind import WriteBehindQueue
 
 logger = logging.getLogger(__name__)
 
@@ -36,10 +48,15 @@ except ImportError:
 class RealCloudNativeCache:
     """
     REAL Cloud-Native Cache - NO MOCKS
-    100% Real cloud integrations: Memory -> Real Supabase -> Real GCS
+    100% Real cloud integrations: Memory -> Real GCS -> Real Supabase
+
+    Escritas retornam após o tier de memória; uma fila write-behind limitada
+    coalesce chaves repetidas e grava os tiers persistentes em lotes. Hits em
+    um tier inferior são promovidos para os tiers acima em segundo plano, e
+    misses completos ficam em cache negativo por alguns segundos.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, tiers: Optional[List[CacheTier]] = None):
         self.config = config
 
         # Cache em memória (rápido mas volátil)
@@ -49,6 +66,10 @@ class RealCloudNativeCache:
         # TTL configurável
         self.default_ttl = timedelta(hours=getattr(config, 'CACHE_TTL_MINUTES', 60) / 60)
 
+        # Cache negativo: cache_key -> expiração (monotonic)
+        self.negative_ttl = getattr(config, 'CLOUD_CACHE_NEGATIVE_TTL_SECONDS', 30)
+        self._negative_cache: 'OrderedDict[str, float]' = OrderedDict()
+
         # REAL cloud clients - NO MOCKS
         self.real_supabase_client: Optional[RealSupabaseClient] = None
         self.real_gcs_client: Optional[RealGCSClient] = None
@@ -60,22 +81,51 @@ class RealCloudNativeCache:
             'cloud_storage': True   # Real Google Cloud Storage
         }
 
-        self._init_real_cloud_clients()
+        # Tiers persistentes em ordem de leitura
+        if tiers is None:
+            self.tiers: List[CacheTier] = []
+            self._init_real_cloud_clients()
+        else:
+            self.tiers = list(tiers)
+        tier_names = {tier.name for tier in self.tiers}
+        self.cache_enabled['supabase'] = 'supabase' in tier_names
+        self.cache_enabled['cloud_storage'] = 'cloud_storage' in tier_names
 
         # Estatísticas de cache
         self.stats = {
             'memory_hits': 0,
+            'pending_hits': 0,
             'supabase_hits': 0,
             'cloud_storage_hits': 0,
+            'negative_hits': 0,
             'misses': 0,
             'evictions': 0,
+            'promotions': 0,
+            'tier_errors': 0,
             'total_requests': 0
         }
+        self._latency_lock = threading.Lock()
+        self._tier_latency = {
+            tier.name: {'get': LatencyHistogram(), 'put': LatencyHistogram()} for tier in self.tiers
+        }
+
+        # Write-behind para os tiers persistentes
+        self.write_queue: Optional[WriteBehindQueue] = None
+        if self.tiers and getattr(config, 'CLOUD_CACHE_WRITE_BEHIND', True):
+            self.write_queue = WriteBehindQueue(
+                self._flush_batch,
+                max_pending=getattr(config, 'CLOUD_CACHE_QUEUE_SIZE', 1000),
+                batch_size=getattr(config, 'CLOUD_CACHE_FLUSH_BATCH_SIZE', 50),
+                flush_interval=getattr(config, 'CLOUD_CACHE_FLUSH_INTERVAL_MS', 200) / 1000,
+                merge_fn=self._merge_pending,
+                name="cloud-cache-write-behind"
+            )
 
         logger.info("🚀 REAL CloudNativeCache initialized - NO MOCKS")
         logger.info(f"   ✅ Real Supabase: {'ACTIVE' if self.real_supabase_client else 'FAILED'}")
         logger.info(f"   ✅ Real GCS: {'ACTIVE' if self.real_gcs_client else 'FAILED'}")
         logger.info(f"   ✅ Memory Cache: ACTIVE ({self.max_memory_items} items max)")
+        logger.info(f"   ✅ Write-behind: {'ACTIVE' if self.write_queue else 'OFF'}")
     
     def _init_real_cloud_clients(self):
         """Initialize REAL cloud clients - NO MOCKS"""
@@ -107,6 +157,17 @@ class RealCloudNativeCache:
                     logger.warning("⚠️ Failed to initialize REAL GCS cache: %s", sanitize_error(e))
                     self.cache_enabled['cloud_storage'] = False
 
+            # Level 2: Cloud Storage (ou diretório local)
+            if self.real_gcs_client:
+                self.tiers.append(GCSCacheTier(self.real_gcs_client))
+
+            # Level 3: Supabase (tabela search_cache no pool Postgres)
+            if self.real_supabase_client:
+                try:
+                    self.tiers.append(SupabaseCacheTier(self.real_supabase_client))
+                except Exception as e:
+                    logger.warning("⚠️ Supabase cache table unavailable: %s", sanitize_error(e))
+
             # Setup local fallback if no real cloud services available
             if not self.real_supabase_client and not self.real_gcs_client:
                 logger.info("🔄 No real cloud services available - using local fallbacks only")
@@ -121,6 +182,8 @@ class RealCloudNativeCache:
         """Configura fallback local para Cloud Storage"""
         self.local_cache_dir = Path('./cache/cloud_storage_fallback')
         self.local_cache_dir.mkdir(parents=True, exist_ok=True)
+        if not any(tier.name == 'cloud_storage' for tier in self.tiers):
+            self.tiers.insert(0, LocalDirectoryCacheTier(self.local_cache_dir))
         logger.info(f"[OK] Fallback local configurado: {self.local_cache_dir}")
 
     def _generate_cache_key(self, key_data: Any) -> str:
@@ -146,50 +209,157 @@ class RealCloudNativeCache:
             self.stats['memory_hits'] += 1
             return result
 
-        # Level 2: Cloud Storage cache (NOVO PRIORIZADO)
-        if self.cache_enabled['cloud_storage']:
-            result = self._get_from_cloud_storage(cache_key)
-            if result is not None:
-                self.stats['cloud_storage_hits'] += 1
-                # Promover para memory cache
-                self._set_to_memory(cache_key, result)
-                return result
-
-        # Level 3: Supabase cache (para dados estruturados)
-        if self.cache_enabled['supabase']:
-            result = self._get_from_supabase(cache_key)
-            if result is not None:
-                self.stats['supabase_hits'] += 1
-                # Promover para memory cache
-                self._set_to_memory(cache_key, result)
-                return result
+        # Escrita ainda na fila (memória já descartou a entrada)
+        if self.write_queue:
+            pending = self.write_queue.get_pending(cache_key)
+            if pending is not None and not envelope_expired(pending['envelope']):
+                self.stats['pending_hits'] += 1
+                value = decode_envelope(pending['envelope'])
+                self._set_to_memory(cache_key, value)
+                return value
+
+        # Miss recente: não repetir as idas à rede
+        if self._is_negative(cache_key):
+            self.stats['negative_hits'] += 1
+            self.stats['misses'] += 1
+            return default
+
+        # Level 2+: tiers persistentes (Cloud Storage, depois Supabase)
+        missed = []
+        for tier in self.tiers:
+            envelope = self._get_from_tier(tier, cache_key)
+            if envelope is not None:
+                self.stats[f'{tier.name}_hits'] = self.stats.get(f'{tier.name}_hits', 0) + 1
+                value = decode_envelope(envelope)
+                # Promover para memory cache (e, em segundo plano, para os tiers acima)
+                self._set_to_memory(cache_key, value, self._remaining_ttl(envelope))
+                if missed:
+                    self._promote(cache_key, envelope, missed)
+                return value
+            missed.append(tier.name)
         
         # Miss completo
         self.stats['misses'] += 1
+        self._remember_miss(cache_key)
         return default
     
     def set(self, key: str, value: Any, ttl: Optional[timedelta] = None) -> bool:
-        """Salva item em todos os cache levels habilitados"""
+        """Salva na memória e agenda a gravação nos tiers persistentes"""
         cache_key = self._generate_cache_key(key)
         ttl = ttl or self.default_ttl
-        
-        success_count = 0
+        self._negative_cache.pop(cache_key, None)
 
-        # Salvar em todos os levels simultaneamente
+        stored = False
         if self.cache_enabled['memory']:
-            if self._set_to_memory(cache_key, value, ttl):
-                success_count += 1
+            stored = self._set_to_memory(cache_key, value, ttl)
+
+        if self.tiers:
+            item = {
+                'envelope': encode_envelope(value, datetime.now(timezone.utc) + ttl),
+                'tiers': {tier.name for tier in self.tiers},
+                'promotion': False
+            }
+            if self.write_queue:
+                stored = self.write_queue.put(cache_key, item) or stored
+            else:
+                stored = self._flush_batch([(cache_key, item)]) > 0 or stored
+
+        return stored  # Sucesso se pelo menos um level funcionou
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Espera as escritas pendentes chegarem aos tiers persistentes"""
+        return self.write_queue.flush(timeout) if self.write_queue else True
+
+    def close(self):
+        """Grava as escritas pendentes e encerra a thread de write-behind"""
+        if self.write_queue:
+            self.write_queue.close()
+
+    # ------------------------------------------------------------------
+    # Write-behind e promoção
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _merge_pending(current: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+        """Coalescer: um set substitui o valor; uma promoção nunca sobrescreve um set pendente"""
+        if new['promotion'] and not current['promotion']:
+            return current
+        return {
+            'envelope': new['envelope'],
+            'tiers': current['tiers'] | new['tiers'],
+            'promotion': new['promotion'] and current['promotion']
+        }
+
+    def _promote(self, cache_key: str, envelope: Dict[str, Any], tier_names: List[str]):
+        """Copiar um hit de tier inferior para os tiers que falharam (assíncrono)"""
+        self.stats['promotions'] += 1
+        item = {'envelope': envelope, 'tiers': set(tier_names), 'promotion': True}
+        if self.write_queue:
+            self.write_queue.put(cache_key, item)
+        else:
+            self._flush_batch([(cache_key, item)])
+
+    def _flush_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """Grava um lote em cada tier (uma chamada put_many por tier)"""
+        written = 0
+        for tier in self.tiers:
+            entries = [(cache_key, item['envelope']) for cache_key, item in batch if tier.name in item['tiers']]
+            if not entries:
+                continue
+            started = time.perf_counter()
+            try:
+                written += tier.put_many(entries)
+            except Exception as e:
+                self.stats['tier_errors'] += 1
+                logger.debug("Erro ao gravar no tier %s: %s", tier.name, sanitize_error(e))
+            finally:
+                self._observe(tier.name, 'put', time.perf_counter() - started)
+        return written
+
+    def _get_from_tier(self, tier: CacheTier, cache_key: str) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            return tier.get(cache_key)
+        except Exception as e:
+            self.stats['tier_errors'] += 1
+            logger.debug("Erro no tier %s: %s", tier.name, sanitize_error(e))
+            return None
+        finally:
+            self._observe(tier.name, 'get', time.perf_counter() - started)
+
+    def _observe(self, tier_name: str, operation: str, seconds: float):
+        with self._latency_lock:
+            histograms = self._tier_latency.setdefault(
+                tier_name, {'get': LatencyHistogram(), 'put': LatencyHistogram()})
+            histograms[operation].observe(seconds)
+
+    def _remaining_ttl(self, envelope: Dict[str, Any]) -> timedelta:
+        expires_at = datetime.fromisoformat(envelope['expires_at'])
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return min(self.default_ttl, expires_at - datetime.now(timezone.utc))
+
+    # ------------------------------------------------------------------
+    # Cache negativo
+    # ------------------------------------------------------------------
+
+    def _is_negative(self, cache_key: str) -> bool:
+        expires = self._negative_cache.get(cache_key)
+        if expires is None:
+            return False
+        if time.monotonic() < expires:
+            return True
+        self._negative_cache.pop(cache_key, None)
+        return False
+
+    def _remember_miss(self, cache_key: str):
+        if self.negative_ttl <= 0:
+            return
+        self._negative_cache[cache_key] = time.monotonic() + self.negative_ttl
+        self._negative_cache.move_to_end(cache_key)
+        while len(self._negative_cache) > self.max_memory_items:
+            self._negative_cache.popitem(last=False)
 
-        if self.cache_enabled['supabase']:
-            if self._set_to_supabase(cache_key, value, ttl):
-                success_count += 1
-        
-        if self.cache_enabled['cloud_storage']:
-            if self._set_to_cloud_storage(cache_key, value, ttl):
-                success_count += 1
-        
-        return success_count > 0  # Sucesso se pelo menos um level funcionou
-    
     def _get_from_memory(self, cache_key: str) -> Any:
         """Busca no cache de memória"""
         try:
@@ -237,148 +407,25 @@ class RealCloudNativeCache:
         except Exception as e:
             logger.debug("Erro na eviction: %s", sanitize_error(e))
     
-    def _get_from_supabase(self, cache_key: str) -> Any:
-        """Busca no Supabase cache table"""
-        try:
-            if not self.real_supabase_client:
-                return None
-            
-            result = self.real_supabase_client.query_table('search_cache', {'query_hash': cache_key})
-            
-            if result.data and len(result.data) > 0:
-                cache_entry = result.data[0]
-                expires_at = datetime.fromisoformat(cache_entry['expires_at'])
-                
-                if datetime.now(timezone.utc) < expires_at:
-                    return cache_entry['results']
-                else:
-                    # Expirado - remover
-                    self.real_supabase_client.delete_from_table('search_cache', {'query_hash': cache_key})
-            
-            return None
-
-        except Exception as e:
-            logger.debug("Erro no Supabase cache: %s", sanitize_error(e))
-            return None
-    
-    def _set_to_supabase(self, cache_key: str, value: Any, ttl: Optional[timedelta] = None) -> bool:
-        """Salva no Supabase cache"""
-        try:
-            if not self.real_supabase_client:
-                return False
-            
-            expires_at = datetime.now(timezone.utc) + (ttl or self.default_ttl)
-            
-            cache_data = {
-                'query_hash': cache_key,
-                'query': f'Cached at {datetime.now().isoformat()}',
-                'results': value if not isinstance(value, np.ndarray) else value.tolist(),
-                'similarity_threshold': 0.0,
-                'result_count': 1 if not isinstance(value, list) else len(value),
-                'expires_at': expires_at.isoformat()
-            }
-            
-            self.real_supabase_client.upsert_to_table('search_cache', cache_data)
-            return True
-
-        except Exception as e:
-            logger.debug("Erro ao salvar no Supabase cache: %s", sanitize_error(e))
-            return False
-    
-    def _get_from_cloud_storage(self, cache_key: str) -> Any:
-        """Busca no Cloud Storage com fallback local"""
-        try:
-            # Prioridade 1: Cloud Storage
-            if self.real_gcs_client:
-                return self._get_from_gcs_bucket(cache_key)
-            # Fallback: Storage local
-            else:
-                return self._get_from_local_storage(cache_key)
-        except Exception as e:
-            logger.debug(f"Erro no Cloud Storage cache: {e}")
-            return None
-
-    def _get_from_gcs_bucket(self, cache_key: str) -> Any:
-        """Busca no Google Cloud Storage bucket"""
-        try:
-            blob_name = f"embeddings_cache/{cache_key}.json"
-            blob = self.real_gcs_client.get_blob(blob_name)
-            
-            if blob and blob.get('exists', False):
-                data = json.loads(blob.get('content', '{}'))
-                expires_at = datetime.fromisoformat(data.get('expires_at', '1970-01-01T00:00:00'))
-                
-                if datetime.now(timezone.utc) < expires_at:
-                    value = data.get('value')
-                    # Deserializar numpy arrays
-                    if data.get('type') == 'numpy_array':
-                        return np.array(value)
-                    return value
-                else:
-                    # Expirado - remover
-                    self.real_gcs_client.delete_blob(blob_name)
-            
-            return None
-            
-        except Exception as e:
-            logger.debug(f"Erro no Cloud Storage cache: {e}")
-            return None
-    
-    def _set_to_cloud_storage(self, cache_key: str, value: Any, ttl: Optional[timedelta] = None) -> bool:
-        """Salva no Cloud Storage com fallback local"""
-        try:
-            # Prioridade 1: Cloud Storage
-            if self.real_gcs_client:
-                return self._set_to_gcs_bucket(cache_key, value, ttl)
-            # Fallback: Storage local
-            else:
-                return self._set_to_local_storage(cache_key, value, ttl)
-        except Exception as e:
-            logger.debug(f"Erro ao salvar no Cloud Storage: {e}")
-            return False
-
-    def _set_to_gcs_bucket(self, cache_key: str, value: Any, ttl: Optional[timedelta] = None) -> bool:
-        """Salva no Google Cloud Storage bucket"""
-        try:
-            # Preparar dados
-            cache_data = {
-                'value': value,
-                'type': 'standard',
-                'created_at': datetime.now(timezone.utc).isoformat(),
-                'expires_at': (datetime.now(timezone.utc) + (ttl or self.default_ttl)).isoformat()
-            }
-            
-            # Serializar numpy arrays
-            if isinstance(value, np.ndarray):
-                cache_data['value'] = value.tolist()
-                cache_data['type'] = 'numpy_array'
-            
-            blob_name = f"embeddings_cache/{cache_key}.json"
-            self.real_gcs_client.upload_blob(
-                blob_name,
-                json.dumps(cache_data),
-                content_type='application/json'
-            )
-            
-            return True
-            
-        except Exception as e:
-            logger.debug(f"Erro ao salvar no Cloud Storage: {e}")
-            return False
-    
     def clear_expired(self) -> Dict[str, int]:
         """Limpa itens expirados de todos os caches"""
-        cleared = {'memory': 0, 'supabase': 0, 'cloud_storage': 0}
+        cleared = {'memory': 0, 'negative': 0, 'supabase': 0, 'cloud_storage': 0}
         
         try:
             # Memory cache
             expired_keys = [
-                k for k, (_, expires_at) in self.memory_cache.items() 
+                k for k, (_, expires_at) in list(self.memory_cache.items())
                 if datetime.now() > expires_at
             ]
             for key in expired_keys:
-                del self.memory_cache[key]
+                self.memory_cache.pop(key, None)
             cleared['memory'] = len(expired_keys)
+
+            now = time.monotonic()
+            expired_misses = [k for k, expires in list(self._negative_cache.items()) if expires <= now]
+            for key in expired_misses:
+                self._negative_cache.pop(key, None)
+            cleared['negative'] = len(expired_misses)
             
             # Cloud services - cleanup automático via TTL ou scheduled functions
             
@@ -390,74 +437,29 @@ class RealCloudNativeCache:
     def get_stats(self) -> Dict[str, Any]:
         """Estatísticas detalhadas do cache"""
         total_requests = self.stats['total_requests']
+        with self._latency_lock:
+            tier_latency = {
+                name: {operation: histogram.to_dict() for operation, histogram in histograms.items()}
+                for name, histograms in self._tier_latency.items()
+            }
         
         return {
             'enabled_levels': [k for k, v in self.cache_enabled.items() if v],
+            'tiers': [tier.name for tier in self.tiers],
             'memory_size': len(self.memory_cache),
             'memory_limit': self.max_memory_items,
+            'negative_cache_size': len(self._negative_cache),
             'hit_rates': {
                 'memory': (self.stats['memory_hits'] / total_requests * 100) if total_requests > 0 else 0,
                 'supabase': (self.stats['supabase_hits'] / total_requests * 100) if total_requests > 0 else 0,
                 'cloud_storage': (self.stats['cloud_storage_hits'] / total_requests * 100) if total_requests > 0 else 0,
                 'total': ((total_requests - self.stats['misses']) / total_requests * 100) if total_requests > 0 else 0
             },
+            'write_behind': self.write_queue.get_stats() if self.write_queue else None,
+            'tier_latency': tier_latency,
             'stats': self.stats.copy()
         }
 
-    def _get_from_local_storage(self, cache_key: str) -> Any:
-        """Fallback local para Cloud Storage"""
-        try:
-            if not hasattr(self, 'local_cache_dir'):
-                return None
-
-            cache_file = self.local_cache_dir / f"{cache_key}.json"
-            if cache_file.exists():
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-
-                expires_at = datetime.fromisoformat(data.get('expires_at', '1970-01-01T00:00:00'))
-                if datetime.now() < expires_at:
-                    value = data.get('value')
-                    # Deserializar numpy arrays
-                    if data.get('type') == 'numpy_array':
-                        return np.array(value)
-                    return value
-                else:
-                    # Expirado - remover
-                    cache_file.unlink()
-            return None
-        except Exception as e:
-            logger.debug(f"Erro no local storage cache: {e}")
-            return None
-
-    def _set_to_local_storage(self, cache_key: str, value: Any, ttl: Optional[timedelta] = None) -> bool:
-        """Fallback local para Cloud Storage"""
-        try:
-            if not hasattr(self, 'local_cache_dir'):
-                self._setup_local_storage_fallback()
-
-            # Preparar dados
-            cache_data = {
-                'value': value,
-                'type': 'standard',
-                'created_at': datetime.now().isoformat(),
-                'expires_at': (datetime.now() + (ttl or self.default_ttl)).isoformat()
-            }
-
-            # Serializar numpy arrays
-            if isinstance(value, np.ndarray):
-                cache_data['value'] = value.tolist()
-                cache_data['type'] = 'numpy_array'
-
-            cache_file = self.local_cache_dir / f"{cache_key}.json"
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
-
-            return True
-        except Exception as e:
-            logger.debug(f"Erro ao salvar no local storage: {e}")
-            return False
-
 # Alias for backward compatibility
 CloudNativeCache = RealCloudNativeCache
 
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Semantic Answer Cache - Reuses answers for paraphrased questions
+
+Entries are (query embedding, partition, value). A lookup is a hit when the
+most similar live entry in the same partition has cosine similarity >= the
+threshold. The partition is an exact-match key chosen by the caller (persona
+plus anything that must never be mixed, e.g. numbers or patient group), so
+"dose de rifampicina em adultos" can never be answered with the cached
+answer for "dose de rifampicina em crianças" however close the embeddings are.
+
+Embeddings live in a small contiguous float32 matrix of normalized rows;
+a lookup is one matrix-vector product. Entries expire after ttl_seconds and
+the least recently used entry is evicted when max_entries is reached.
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the best-match similarity histogram buckets
+SIMILARITY_BUCKETS = (0.5, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0)
+
+class SemanticAnswerCache:
+    """Thread-safe in-memory semantic cache"""
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 2000):
+        self.threshold = float(threshold)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries))
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # (max_entries, dim) normalized rows
+        self._partitions: List[Optional[str]] = [None] * self.max_entries
+        self._values: List[Any] = [None] * self.max_entries
+        self._created = np.zeros(self.max_entries, dtype=np.float64)
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self._saved_ms = np.zeros(self.max_entries, dtype=np.float64)  # cost of producing the value
+        self._alive = np.zeros(self.max_entries, dtype=bool)
+
+        self._similarity_histogram = {bucket: 0 for bucket in SIMILARITY_BUCKETS}
+        self.stats = {
+            'lookups': 0,
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'saved_latency_ms': 0.0
+        }
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    def _expire(self, now: float):
+        expired = self._alive & (now - self._created > self.ttl_seconds)
+        count = int(expired.sum())
+        if count:
+            self._alive[expired] = False
+            for row in np.flatnonzero(expired):
+                self._values[row] = None
+                self._partitions[row] = None
+            self.stats['expirations'] += count
+
+    def _record_similarity(self, similarity: float):
+        for bucket in SIMILARITY_BUCKETS:
+            if similarity <= bucket:
+                self._similarity_histogram[bucket] += 1
+                return
+        self._similarity_histogram[SIMILARITY_BUCKETS[-1]] += 1
+
+    def lookup(self, embedding, partition: str) -> Optional[Tuple[Any, float]]:
+        """(value, similarity) of the best match above the threshold, else None"""
+        query = self._normalize(embedding)
+        now = time.time()
+
+        with self._lock:
+            self.stats['lookups'] += 1
+            if query is None or self._matrix is None or len(query) != self._matrix.shape[1]:
+                self.stats['misses'] += 1
+                return None
+
+            self._expire(now)
+            candidates = np.flatnonzero(self._alive)
+            candidates = [row for row in candidates.tolist() if self._partitions[row] == partition]
+            if not candidates:
+                self.stats['misses'] += 1
+                return None
+
+            scores = self._matrix[candidates] @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            self._record_similarity(similarity)
+
+            if similarity < self.threshold:
+                self.stats['misses'] += 1
+                return None
+
+            row = candidates[best]
+            self._last_used[row] = now
+            self.stats['hits'] += 1
+            self.stats['saved_latency_ms'] += self._saved_ms[row]
+            return self._values[row], similarity
+
+    def store(self, embedding, partition: str, value: Any, latency_ms: float = 0.0):
+        """Add an entry; latency_ms is what a future hit on it saves"""
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        now = time.time()
+
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != len(vector):
+                self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._alive[:] = False
+
+            self._expire(now)
+            free = np.flatnonzero(~self._alive)
+            if len(free):
+                row = int(free[0])
+            else:
+                # Least recently used (or stored) entry makes room
+                row = int(np.argmin(np.maximum(self._last_used, self._created)))
+                self.stats['evictions'] += 1
+
+            self._matrix[row] = vector
+            self._partitions[row] = partition
+            self._values[row] = value
+            self._created[row] = now
+            self._last_used[row] = now
+            self._saved_ms[row] = latency_ms
+            self._alive[row] = True
+            self.stats['stores'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._alive[:] = False
+            self._values = [None] * self.max_entries
+            self._partitions = [None] * self.max_entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._alive.sum())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                'entries': int(self._alive.sum()),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'ttl_seconds': self.ttl_seconds,
+                'hit_rate': stats['hits'] / stats['lookups'] * 100 if stats['lookups'] else 0.0,
+                'avg_saved_latency_ms': stats['saved_latency_ms'] / stats['hits'] if stats['hits'] else 0.0,
+                'similarity_histogram': {f"<={bucket}": count
+                                         for bucket, count in self._similarity_histogram.items()}
+            })
+        return stats
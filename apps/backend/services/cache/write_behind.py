@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Write-Behind Queue - Bounded, coalescing background writer for cache tiers
+
+put() only records the latest item for a key; a daemon thread hands items to
+flush_fn in FIFO batches of up to batch_size. A key written again before it
+is flushed is coalesced (one write instead of two). When max_pending keys are
+waiting the oldest is dropped: the cache tier is best-effort, and request
+threads must never block on the network.
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.logging.sanitizer import sanitize_error
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindQueue:
+    """Fila limitada de escritas pendentes, indexada por chave"""
+
+    def __init__(self, flush_fn: Callable[[List[Tuple[str, Any]]], None], max_pending: int = 1000,
+                 batch_size: int = 50, flush_interval: float = 0.2,
+                 merge_fn: Optional[Callable[[Any, Any], Any]] = None, name: str = "write-behind"):
+        self.flush_fn = flush_fn
+        self.merge_fn = merge_fn  # merge_fn(pendente, novo) -> item; padrão: o novo substitui
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.name = name
+        self._reset_process_state()
+        atexit.register(self.close)
+
+    def _reset_process_state(self):
+        self._pid = os.getpid()
+        self._pending: 'OrderedDict[str, Any]' = OrderedDict()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            'enqueued': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'flushed': 0,
+            'batches': 0,
+            'flush_errors': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0
+        }
+
+    def _check_fork(self):
+        # Filho do fork (gunicorn preload) herda a fila mas não a thread
+        if self._pid != os.getpid():
+            self._reset_process_state()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def put(self, key: str, item: Any) -> bool:
+        """Agenda a escrita; False se a fila estiver fechada"""
+        self._check_fork()
+        with self._cond:
+            if self._closed:
+                return False
+            if key in self._pending:
+                current = self._pending[key]
+                self._pending[key] = self.merge_fn(current, item) if self.merge_fn else item
+                self.stats['coalesced'] += 1
+            else:
+                if len(self._pending) >= self.max_pending:
+                    self._pending.popitem(last=False)
+                    self.stats['dropped'] += 1
+                self._pending[key] = item
+            self.stats['enqueued'] += 1
+            self._ensure_thread()
+            self._cond.notify()
+        return True
+
+    def get_pending(self, key: str) -> Optional[Any]:
+        """Item ainda não gravado (leitura das próprias escritas)"""
+        with self._cond:
+            return self._pending.get(key)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+
+            # Janela curta para coalescer escritas repetidas e encher o lote
+            if not self._closed and self.flush_interval > 0:
+                deadline = time.monotonic() + self.flush_interval
+                with self._cond:
+                    while (len(self._pending) < self.batch_size and not self._closed
+                           and time.monotonic() < deadline):
+                        self._cond.wait(deadline - time.monotonic())
+
+            with self._cond:
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popitem(last=False))
+                self._in_flight = len(batch)
+
+            if batch:
+                try:
+                    self.flush_fn(batch)
+                    self.stats['flushed'] += len(batch)
+                except Exception as e:
+                    self.stats['flush_errors'] += 1
+                    logger.warning("Erro no flush %s: %s", self.name, sanitize_error(e))
+                self.stats['batches'] += 1
+                self.stats['last_batch_size'] = len(batch)
+                self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Espera a fila esvaziar; False se o timeout expirar"""
+        self._check_fork()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._pending:
+                self._ensure_thread()
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Grava o que está pendente e encerra a thread"""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._pending)
+        stats = dict(self.stats)
+        stats['queue_depth'] = depth
+        stats['max_pending'] = self.max_pending
+        stats['avg_batch_size'] = stats['flushed'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
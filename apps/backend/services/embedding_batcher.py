@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Embedding Micro-Batcher - Coalesces concurrent single-text embedding requests
+
+Concurrent embed_text() calls are collected for a short window (max_wait_ms)
+and sent to the backend as one batch of at most max_batch_size texts. Identical
+texts that are queued or in flight share a single future, so N callers asking
+for the same query trigger one embedding.
+
+The batch function receives a list of unique texts and must return one result
+per text, in order. Each caller gets its own result through a
+concurrent.futures.Future; an exception raised by the batch function is set on
+every future of that batch.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Any, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class EmbeddingMicroBatcher:
+    """
+    Background worker that turns concurrent single-text requests into batches
+
+    The worker thread is started lazily on the first submit (and restarted
+    after a fork), so creating a batcher costs nothing until it is used.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[str]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = 'embedding-batcher'
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending: Dict[str, Future] = {}  # text -> future (queued or in flight)
+        self._enqueued_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+        # Metrics
+        self._wait_times = deque(maxlen=1000)  # seconds from submit to batch dispatch
+        self._histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._histogram_overflow = 0
+        self.stats = {
+            'requests': 0,
+            'coalesced': 0,
+            'batches': 0,
+            'texts_dispatched': 0,
+            'texts_embedded': 0,
+            'batch_errors': 0,
+            'max_queue_depth': 0
+        }
+
+    def submit(self, text: str) -> Future:
+        """Queue a text; identical texts already pending share the same future"""
+        if self._closed:
+            raise RuntimeError("Embedding micro-batcher is closed")
+
+        with self._lock:
+            self.stats['requests'] += 1
+            future = self._pending.get(text)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future
+
+            future = Future()
+            self._pending[text] = future
+            self._enqueued_at[text] = time.perf_counter()
+            self._ensure_worker()
+            self._queue.put(text)
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._queue.qsize())
+            return future
+
+    def _ensure_worker(self):
+        """Start (or restart after fork) the worker thread; caller holds the lock"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _collect(self) -> List[str]:
+        """Block for the first text, then gather more until the window closes or the batch is full"""
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                text = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if text is None:
+                self._closed = True
+                break
+            batch.append(text)
+        return batch
+
+    def _run(self):
+        while not self._closed:
+            batch = self._collect()
+            if not batch:
+                break
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[str]):
+        now = time.perf_counter()
+        with self._lock:
+            for text in batch:
+                self._wait_times.append(now - self._enqueued_at.pop(text, now))
+            self._record_batch_size(len(batch))
+
+        try:
+            results = list(self.batch_fn(batch))
+            if len(results) != len(batch):
+                raise ValueError(f"Batch function returned {len(results)} results for {len(batch)} texts")
+        except Exception as e:
+            logger.error(f"[ERROR] Embedding micro-batch of {len(batch)} failed: {e}")
+            with self._lock:
+                self.stats['batch_errors'] += 1
+                futures = [self._pending.pop(text) for text in batch]
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.stats['texts_embedded'] += len(batch)
+            futures = [self._pending.pop(text) for text in batch]
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    def _record_batch_size(self, size: int):
+        self.stats['batches'] += 1
+        self.stats['texts_dispatched'] += size
+        for bucket in BATCH_SIZE_BUCKETS:
+            if size <= bucket:
+                self._histogram[bucket] += 1
+                return
+        self._histogram_overflow += 1
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker after the texts already queued have been dispatched"""
+        if self._closed:
+            return
+        self._queue.put(None)
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self._closed = True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, batch-size histogram and wait-time percentiles (milliseconds)"""
+        with self._lock:
+            stats = dict(self.stats)
+            waits = np.array(self._wait_times, dtype=np.float64) * 1000.0
+            histogram = {f"<={bucket}": count for bucket, count in self._histogram.items()}
+            histogram[f">{BATCH_SIZE_BUCKETS[-1]}"] = self._histogram_overflow
+            in_flight = len(self._pending)
+
+        stats.update({
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queue_depth': self.queue_depth(),
+            'pending': in_flight,
+            'batch_size_histogram': histogram,
+            'avg_batch_size': stats['texts_dispatched'] / stats['batches'] if stats['batches'] else 0.0,
+            'wait_ms': {
+                'avg': float(waits.mean()) if len(waits) else 0.0,
+                'p50': float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                'p95': float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                'max': float(waits.max()) if len(waits) else 0.0
+            }
+        })
+        return stats
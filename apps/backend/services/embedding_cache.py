@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent Embedding Cache - Content-addressed SQLite store shared by the embedding services
+
+Keys are SHA-256 digests of (model id, e5 prefix, normalized text), so two
+texts only share an entry when they are the same text for the same model and
+role ('query: ' / 'passage: ' / '' for raw text). Vectors are stored as raw
+float32 bytes.
+
+Layout:
+    SQLite file (WAL mode, busy timeout) - safe for several worker processes
+    In-process LRU front                 - hot entries served without SQLite
+    Warm load                            - the N most-hit rows are read at startup
+
+Eviction is least-recently-used over the whole file once it holds more than
+max_entries rows. Access times are written back in small batches to keep
+cache hits read-only most of the time.
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Iterable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILENAME = 'embedding_cache.sqlite3'
+
+# e5 role prefixes (intfloat/multilingual-e5-*)
+QUERY_PREFIX = 'query: '
+PASSAGE_PREFIX = 'passage: '
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    model TEXT NOT NULL,
+    dimension INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access);
+"""
+
+def normalize_text(text: str) -> str:
+    """NFC, trimmed, internal whitespace collapsed to single spaces"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def embedding_cache_key(model_id: str, text: str, prefix: str = '') -> bytes:
+    """SHA-256 over the full normalized text (no truncation)"""
+    content = '\x1f'.join((model_id, prefix, normalize_text(text)))
+    return hashlib.sha256(content.encode('utf-8')).digest()
+
+class PersistentEmbeddingCache:
+    """
+    Embedding cache backed by a single SQLite file
+
+    path=None keeps the cache in memory only (used when the cache directory is
+    not writable, e.g. a read-only container filesystem).
+    """
+
+    EVICTION_FRACTION = 0.1  # evict 10% of max_entries at a time
+    TOUCH_FLUSH_SIZE = 64
+
+    def __init__(
+        self,
+        path: Optional[str],
+        max_entries: int = 50000,
+        memory_entries: int = 2000,
+        warm_entries: int = 1000
+    ):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.memory_entries = max(0, int(memory_entries))
+
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._touches: Dict[bytes, float] = {}
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self._entries = 0
+
+        self.stats = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+            'bytes_read': 0,
+            'bytes_written': 0,
+            'warm_loaded': 0,
+            'errors': 0
+        }
+
+        if path:
+            try:
+                directory = os.path.dirname(os.path.abspath(path))
+                os.makedirs(directory, exist_ok=True)
+                with self._lock:
+                    conn = self._connection()
+                    self._entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                self._warm_load(warm_entries)
+                logger.info(f"[OK] Embedding cache: {path} ({self._entries} entries, "
+                            f"{self.stats['warm_loaded']} warm)")
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"[WARNING] Embedding cache file unavailable ({e}) - using memory only")
+                self.path = None
+                self._conn = None
+
+    # --- SQLite plumbing ---
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-process connection (reopened after fork); caller holds the lock"""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _warm_load(self, count: int):
+        """Prime the in-process LRU with the most frequently hit rows"""
+        count = min(int(count), self.memory_entries)
+        if count <= 0:
+            return
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, vector FROM embeddings ORDER BY hits DESC, last_access DESC LIMIT ?", (count,)
+            ).fetchall()
+            # Least hot first, so the hottest end up most recently used
+            for key, blob in reversed(rows):
+                self._remember(bytes(key), np.frombuffer(blob, dtype=np.float32))
+                self.stats['bytes_read'] += len(blob)
+            self.stats['warm_loaded'] = len(rows)
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        if self.memory_entries == 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touches(self, conn: sqlite3.Connection):
+        if not self._touches:
+            return
+        touches = [(ts, key) for key, ts in self._touches.items()]
+        self._touches.clear()
+        conn.executemany("UPDATE embeddings SET last_access = ?, hits = hits + 1 WHERE key = ?", touches)
+
+    def _touch(self, key: bytes):
+        """Record an access; written back once TOUCH_FLUSH_SIZE accesses are pending"""
+        if not self.path:
+            return
+        self._touches[key] = time.time()
+        if len(self._touches) >= self.TOUCH_FLUSH_SIZE:
+            try:
+                self._flush_touches(self._connection())
+            except sqlite3.Error as e:
+                self.stats['errors'] += 1
+                logger.warning(f"[WARNING] Embedding cache access update failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop the least recently used rows once the file is over capacity"""
+        self._entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = self._entries - self.max_entries
+        if overflow <= 0:
+            return
+        to_remove = overflow + int(self.max_entries * self.EVICTION_FRACTION)
+        victims = conn.execute(
+            "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?", (to_remove,)
+        ).fetchall()
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        for (key,) in victims:
+            self._memory.pop(bytes(key), None)
+        self._entries -= len(victims)
+        self.stats['evictions'] += len(victims)
+        logger.info(f"Embedding cache eviction: {len(victims)} least recently used entries removed")
+
+    # --- Public API ---
+
+    def get(self, model_id: str, text: str, prefix: str = '') -> Optional[np.ndarray]:
+        """Cached float32 vector or None"""
+        key = embedding_cache_key(model_id, text, prefix)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.stats['hits'] += 1
+                self.stats['memory_hits'] += 1
+                self._touch(key)
+                return vector
+
+            if not self.path:
+                self.stats['misses'] += 1
+                return None
+
+            try:
+                conn = self._connection()
+                row = conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.stats['misses'] += 1
+                    return None
+                blob = row[0]
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self.stats['hits'] += 1
+                self.stats['disk_hits'] += 1
+                self.stats['bytes_read'] += len(blob)
+                self._remember(key, vector)
+                self._touch(key)
+                return vector
+            except sqlite3.Error as e:
+                self.stats['errors'] += 1
+                self.stats['misses'] += 1
+                logger.warning(f"[WARNING] Embedding cache read failed: {e}")
+                return None
+
+    def set(self, model_id: str, text: str, embedding, prefix: str = ''):
+        """Store one vector"""
+        self.set_many(model_id, [(text, embedding)], prefix=prefix)
+
+    def set_many(self, model_id: str, items: Iterable[Tuple[str, Any]], prefix: str = ''):
+        """Store several vectors in one transaction"""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, embedding in items:
+                # Private read-only copy: cached vectors are shared between callers
+                vector = np.array(embedding, dtype=np.float32).reshape(-1)
+                vector.flags.writeable = False
+                key = embedding_cache_key(model_id, text, prefix)
+                self._remember(key, vector)
+                rows.append((key, model_id, len(vector), vector.tobytes(), now, now))
+
+            if not rows or not self.path:
+                return
+
+            try:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._flush_touches(conn)
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, model, dimension, vector, created_at, last_access) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", rows
+                    )
+                    self._entries += len(rows)
+                    if self._entries > self.max_entries:
+                        self._evict(conn)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                self.stats['writes'] += len(rows)
+                self.stats['bytes_written'] += sum(len(row[3]) for row in rows)
+            except sqlite3.Error as e:
+                self.stats['errors'] += 1
+                logger.warning(f"[WARNING] Embedding cache write failed: {e}")
+
+    def flush(self):
+        """Persist pending access-time updates"""
+        with self._lock:
+            if self.path and self._touches:
+                try:
+                    self._flush_touches(self._connection())
+                except sqlite3.Error as e:
+                    logger.warning(f"[WARNING] Embedding cache flush failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touches.clear()
+            if self.path:
+                self._connection().execute("DELETE FROM embeddings")
+            self._entries = 0
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            if not self.path:
+                return len(self._memory)
+            return self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'path': self.path,
+                'persistent': bool(self.path),
+                'entries': self._entries if self.path else len(self._memory),
+                'max_entries': self.max_entries,
+                'memory_entries': len(self._memory),
+                'memory_bytes': sum(vector.nbytes for vector in self._memory.values()),
+                'hit_rate': stats['hits'] / lookups * 100 if lookups else 0.0
+            })
+        if self.path:
+            stats['file_bytes'] = sum(
+                os.path.getsize(f) for f in (self.path, f"{self.path}-wal") if os.path.exists(f)
+            )
+        return stats
+
+# One cache instance per file within a process
+_caches: Dict[str, PersistentEmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(config=None, path: Optional[str] = None) -> PersistentEmbeddingCache:
+    """
+    Shared cache for the configured file
+    (EMBEDDING_CACHE_PATH, default <VECTOR_DB_PATH>/embedding_cache.sqlite3)
+    """
+    if path is None:
+        path = getattr(config, 'EMBEDDING_CACHE_PATH', '') or os.path.join(
+            getattr(config, 'VECTOR_DB_PATH', './cache/embeddings'), CACHE_FILENAME
+        )
+    path = os.path.abspath(path)
+
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = PersistentEmbeddingCache(
+                path,
+                max_entries=getattr(config, 'EMBEDDING_CACHE_MAX_ENTRIES', 50000),
+                memory_entries=getattr(config, 'EMBEDDING_CACHE_SIZE', 2000),
+                warm_entries=getattr(config, 'EMBEDDING_CACHE_WARM_ENTRIES', 1000)
+            )
+            _caches[path] = cache
+        return cache
+
+__all__ = [
+    'CACHE_FILENAME',
+    'QUERY_PREFIX',
+    'PASSAGE_PREFIX',
+    'PersistentEmbeddingCache',
+    'embedding_cache_key',
+    'get_embedding_cache',
+    'normalize_text'
+]
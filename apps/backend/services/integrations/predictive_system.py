@@ -6,10 +6,11 @@ Implementação de sugestões contextuais inteligentes
 Seguindo FASE 4.1 do PLANO Q2 2025 - IA e Machine Learning
 """
 
+import re
 import json
 import logging
 import hashlib
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
 from dataclasses import dataclass
@@ -17,6 +18,7 @@ from pathlib import Path
 
 # Importações locais
 from app_config import config
+from core.validation.keyword_matcher import get_keyword_matcher
 
 @dataclass
 class UserContext:
@@ -58,6 +60,14 @@ class ContextAnalyzer:
     def __init__(self):
         self.medical_terms = self._load_medical_terms()
         self.category_patterns = self._load_category_patterns()
+        self.complexity_terms = {
+            'technical': ['mecanismo', 'farmacocinética', 'bioequivalência', 'metabolismo'],
+            'simple': ['como', 'o que é', 'pode explicar', 'simples']
+        }
+        # Categorias médicas e indicadores de complexidade numa única varredura
+        vocabulary = {f"medical:{category}": terms for category, terms in self.medical_terms.items()}
+        vocabulary.update((f"complexity:{level}", terms) for level, terms in self.complexity_terms.items())
+        self.term_matcher = get_keyword_matcher('predictive_context', vocabulary)
         
     def _load_medical_terms(self) -> Dict[str, List[str]]:
         """Carregar termos médicos por categoria"""
@@ -122,10 +132,10 @@ class ContextAnalyzer:
             'persona_hints': []
         }
         
-        # Detectar categorias médicas - otimizado com list comprehension
+        # Detectar categorias médicas (autômato compartilhado, sem acentos)
+        matches = self.term_matcher.categories(query)
         analysis['medical_categories'] = [
-            category for category, terms in self.medical_terms.items()
-            if any(term in query_lower for term in terms)
+            category for category in self.medical_terms if f"medical:{category}" in matches
         ]
         
         # Detectar padrões de query - otimizado com list comprehension
@@ -135,14 +145,11 @@ class ContextAnalyzer:
         ]
         
         # Detectar complexidade
-        technical_indicators = ['mecanismo', 'farmacocinética', 'bioequivalência', 'metabolismo']
-        simple_indicators = ['como', 'o que é', 'pode explicar', 'simples']
-        
-        if any(indicator in query_lower for indicator in technical_indicators):
+        if 'complexity:technical' in matches:
             analysis['complexity_indicators'].append('technical')
             analysis['persona_hints'].append('dr_gasnelio')
         
-        if any(indicator in query_lower for indicator in simple_indicators):
+        if 'complexity:simple' in matches:
             analysis['complexity_indicators'].append('simple')
             analysis['persona_hints'].append('ga_empathetic')
         
@@ -57,8 +57,8 @@ class SupabaseVectorStore:
         self.search_cache_table = "search_cache"
         
         # Fallback local se Supabase não disponível
-        from services.vector_store import LocalVectorStore
-        self.local_store = LocalVectorStore(config.VECTOR_DB_PATH)
+        from services.vector_store import create_local_vector_store
+        self.local_store = create_local_vector_store(config, config.VECTOR_DB_PATH)
         self.use_local = not self._connect_supabase()
         
         if not self.use_local:
@@ -199,6 +199,42 @@ CREATE TABLE IF NOT EXISTS {self.metadata_table} (
             # Fallback para local
             return self.local_store.add_document(document)
     
+    def add_documents(self, documents: List[VectorDocument]) -> int:
+        """Upsert em lote (uma requisição por chamada); retorna quantos foram gravados"""
+        documents = [document for document in documents if document.embedding is not None]
+        if not documents:
+            return 0
+        if self.use_local:
+            return self.local_store.add_documents(documents)
+        
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            rows = [{
+                'id': document.id,
+                'text': document.text,
+                'embedding': document.embedding.tolist(),
+                'chunk_type': document.chunk_type,
+                'priority': document.priority,
+                'source_file': document.source_file,
+                'metadata': document.metadata,
+                'created_at': (document.created_at or datetime.now(timezone.utc)).isoformat(),
+                'updated_at': now
+            } for document in documents]
+            result = self.client.table(self.table_name).upsert(rows).execute()
+            
+            if result.data:
+                logger.debug(f"{len(rows)} documentos inseridos no Supabase")
+                # Também salvar localmente para cache rápido
+                self.local_store.add_documents(documents)
+                return len(rows)
+            logger.error(f"Falha ao inserir lote: {result}")
+            return 0
+            
+        except Exception as e:
+            logger.error(f"Erro ao adicionar lote no Supabase: {e}")
+            # Fallback para local
+            return self.local_store.add_documents(documents)
+    
     def search_similar(
         self,
         query_embedding: np.ndarray,
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped Vector Index - Versioned on-disk format for local vector stores
+
+Layout (little-endian):
+    [header]    magic b'RDVX', format version, flags, manifest length
+    [manifest]  compact JSON: count, dimension, dtype, chunk types and the
+                (offset, length) of every section below
+    [sections]  64-byte aligned blocks
+                vectors         count x dimension float32/float16, L2-normalized
+                norms           count float32 (original vector norms)
+                chunk_codes     count int32 (index into manifest chunk_types)
+                id_offsets      count+1 uint64 into id_blob
+                id_blob         utf-8 document ids
+                record_offsets  count+1 uint64 into record_blob
+                record_blob     utf-8 compact JSON per document (text + metadata)
+
+The vector block is opened with np.memmap, so gunicorn workers share the same
+page-cache pages and startup cost no longer grows with corpus size. Document
+records are decoded lazily, one at a time, through the offsets table.
+"""
+
+import os
+import json
+import struct
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "vector_index.bin"
+FORMAT_MAGIC = b"RDVX"
+FORMAT_VERSION = 1
+SECTION_ALIGNMENT = 64
+
+_HEADER = struct.Struct("<4sHHQ")
+_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+class VectorIndexFormatError(ValueError):
+    """Raised when an index file is missing, truncated or of an unknown version"""
+
+def _align(offset: int) -> int:
+    return (offset + SECTION_ALIGNMENT - 1) // SECTION_ALIGNMENT * SECTION_ALIGNMENT
+
+def _pack_strings(values: Sequence[bytes]) -> Tuple[np.ndarray, bytes]:
+    offsets = np.zeros(len(values) + 1, dtype=np.uint64)
+    if values:
+        offsets[1:] = np.cumsum([len(v) for v in values], dtype=np.uint64)
+    return offsets, b"".join(values)
+
+def write_vector_index(
+    path: str,
+    ids: Sequence[str],
+    vectors: np.ndarray,
+    norms: np.ndarray,
+    chunk_codes: np.ndarray,
+    chunk_types: Sequence[str],
+    records: Sequence[Dict[str, Any]],
+    dtype: str = "float32"
+) -> str:
+    """
+    Write a vector index file atomically
+
+    vectors must already be L2-normalized; norms keep the original scale.
+    The file is written next to its destination and moved into place with
+    os.replace, so processes that still map the previous version keep a
+    valid view of it.
+    """
+    if dtype not in _DTYPES:
+        raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+    count = len(ids)
+    vectors = np.ascontiguousarray(vectors, dtype=_DTYPES[dtype]).reshape(count, -1) if count else \
+        np.zeros((0, 0), dtype=_DTYPES[dtype])
+    dimension = int(vectors.shape[1]) if count else 0
+
+    id_offsets, id_blob = _pack_strings([doc_id.encode("utf-8") for doc_id in ids])
+    record_offsets, record_blob = _pack_strings([
+        json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        for record in records
+    ])
+
+    payloads = [
+        ("vectors", vectors.tobytes()),
+        ("norms", np.ascontiguousarray(norms, dtype=np.float32).tobytes()),
+        ("chunk_codes", np.ascontiguousarray(chunk_codes, dtype=np.int32).tobytes()),
+        ("id_offsets", id_offsets.tobytes()),
+        ("id_blob", id_blob),
+        ("record_offsets", record_offsets.tobytes()),
+        ("record_blob", record_blob),
+    ]
+
+    manifest = {
+        "count": count,
+        "dimension": dimension,
+        "dtype": dtype,
+        "chunk_types": list(chunk_types),
+        "created_at": datetime.now().isoformat(),
+    }
+
+    # Reserve room for the manifest up front: section offsets are only known
+    # once the manifest length is fixed, and their digits can still grow.
+    manifest["sections"] = {name: [0, 0] for name, _ in payloads}
+    reserved = _align(_HEADER.size + len(json.dumps(manifest, separators=(",", ":"))) + 256) - _HEADER.size
+
+    offset = _HEADER.size + reserved
+    for name, payload in payloads:
+        manifest["sections"][name] = [offset, len(payload)]
+        offset = _align(offset + len(payload))
+    manifest_bytes = json.dumps(manifest, separators=(",", ":")).encode("utf-8").ljust(reserved)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, 0, len(manifest_bytes)))
+        f.write(manifest_bytes)
+        for name, payload in payloads:
+            section_offset = manifest["sections"][name][0]
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    logger.debug(f"[OK] Wrote vector index {path}: {count} vectors x {dimension}D ({dtype})")
+    return path
+
+class MappedVectorIndex:
+    """
+    Read view over a vector index file
+
+    vectors, norms and chunk_codes are numpy views into a single mapping.
+    mode='r' gives a read-only shared mapping; mode='c' gives copy-on-write,
+    so in-place row updates only privatize the pages they touch.
+    """
+
+    def __init__(self, path: str, mode: str = "r"):
+        self.path = path
+        self.mode = mode
+
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise VectorIndexFormatError(f"Truncated vector index header: {path}")
+            magic, version, _flags, manifest_length = _HEADER.unpack(header)
+            if magic != FORMAT_MAGIC:
+                raise VectorIndexFormatError(f"Not a vector index file: {path}")
+            if version != FORMAT_VERSION:
+                raise VectorIndexFormatError(f"Unsupported vector index version {version}: {path}")
+            self.manifest = json.loads(f.read(manifest_length).decode("utf-8"))
+
+        self.count: int = self.manifest["count"]
+        self.dimension: int = self.manifest["dimension"]
+        self.dtype: str = self.manifest["dtype"]
+        self.chunk_types: List[str] = self.manifest["chunk_types"]
+        self.created_at: Optional[str] = self.manifest.get("created_at")
+
+        self._buffer = np.memmap(path, dtype=np.uint8, mode=mode)
+        self.mapped_bytes = int(self._buffer.size)
+
+        self.vectors = self._section("vectors", _DTYPES[self.dtype]).reshape(self.count, self.dimension)
+        self.norms = self._section("norms", np.float32)
+        self.chunk_codes = self._section("chunk_codes", np.int32)
+        self._record_offsets = self._section("record_offsets", np.uint64)
+        self._record_blob = self._section("record_blob", np.uint8)
+
+        # Ids are small and needed for O(1) lookups, so decode them eagerly
+        id_offsets = self._section("id_offsets", np.uint64)
+        id_blob = self._section("id_blob", np.uint8).tobytes()
+        self.ids: List[str] = [
+            id_blob[int(id_offsets[i]):int(id_offsets[i + 1])].decode("utf-8")
+            for i in range(self.count)
+        ]
+
+    def _section(self, name: str, dtype) -> np.ndarray:
+        offset, length = self.manifest["sections"][name]
+        if offset + length > self._buffer.size:
+            raise VectorIndexFormatError(f"Truncated section '{name}' in {self.path}")
+        return self._buffer[offset:offset + length].view(dtype)
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Decode the JSON record for a row"""
+        start, end = int(self._record_offsets[row]), int(self._record_offsets[row + 1])
+        return json.loads(self._record_blob[start:end].tobytes().decode("utf-8"))
+
+    def resident_bytes(self) -> Optional[int]:
+        """Bytes of this mapping currently resident in memory (Linux only)"""
+        return mapping_resident_bytes(self.path)
+
+    def get_diagnostics(self) -> Dict[str, Any]:
+        """Mapped versus resident size for /diagnostics"""
+        resident = self.resident_bytes()
+        return {
+            'path': self.path,
+            'format_version': FORMAT_VERSION,
+            'vectors': self.count,
+            'dimension': self.dimension,
+            'dtype': self.dtype,
+            'mapped_bytes': self.mapped_bytes,
+            'resident_bytes': resident,
+            'resident_ratio': round(min(1.0, resident / self.mapped_bytes), 4) if resident is not None and self.mapped_bytes else None
+        }
+
+def mapping_resident_bytes(path: str) -> Optional[int]:
+    """Sum the Rss of every mapping of path in this process via /proc/self/smaps"""
+    smaps = "/proc/self/smaps"
+    if not os.path.exists(smaps):
+        return None
+
+    target = os.path.realpath(path)
+    resident_kb = 0
+    in_target = False
+    try:
+        with open(smaps, "r") as f:
+            for line in f:
+                first = line.split(None, 1)[0]
+                if "-" in first and not first.endswith(":"):
+                    # Mapping header line: address perms offset dev inode [path]
+                    parts = line.split()
+                    in_target = len(parts) >= 6 and parts[5] == target
+                elif in_target and first == "Rss:":
+                    resident_kb += int(line.split()[1])
+    except OSError:
+        return None
+    return resident_kb * 1024
+
+def convert_legacy_store(storage_path: str, dtype: str = "float32") -> Optional[str]:
+    """
+    Convert an embeddings.npy / metadata.json store to the mapped index format
+
+    Rows of embeddings.npy are paired with metadata.json entries in file order,
+    which is how LocalVectorStore has always written them.
+    """
+    embeddings_file = os.path.join(storage_path, "embeddings.npy")
+    metadata_file = os.path.join(storage_path, "metadata.json")
+    if not (os.path.exists(embeddings_file) and os.path.exists(metadata_file)):
+        logger.warning(f"[WARNING] No legacy vector store found at {storage_path}")
+        return None
+
+    embeddings = np.load(embeddings_file, allow_pickle=True)
+    if embeddings.dtype == object:
+        embeddings = np.stack([np.asarray(row, dtype=np.float32) for row in embeddings])
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    ids = list(metadata.keys())[:len(embeddings)]
+    embeddings = embeddings[:len(ids)]
+
+    norms = np.linalg.norm(embeddings, axis=1).astype(np.float32) if len(ids) else np.zeros(0, np.float32)
+    safe_norms = np.where(norms > 0, norms, 1.0)
+    vectors = embeddings / safe_norms[:, None] if len(ids) else embeddings
+
+    chunk_types: List[str] = []
+    chunk_codes = np.zeros(len(ids), dtype=np.int32)
+    records = []
+    for row, doc_id in enumerate(ids):
+        record = dict(metadata[doc_id])
+        record.setdefault("id", doc_id)
+        chunk_type = record.get("chunk_type", "general")
+        if chunk_type not in chunk_types:
+            chunk_types.append(chunk_type)
+        chunk_codes[row] = chunk_types.index(chunk_type)
+        records.append(record)
+
+    path = write_vector_index(
+        os.path.join(storage_path, INDEX_FILENAME),
+        ids, vectors, norms, chunk_codes, chunk_types, records, dtype=dtype
+    )
+    logger.info(f"[OK] Converted {len(ids)} vectors from {storage_path} to {path}")
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert embeddings.npy/metadata.json stores to the mapped index format")
+    parser.add_argument("storage_paths", nargs="+")
+    parser.add_argument("--float16", action="store_true", help="Store vectors as float16")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for storage_path in args.storage_paths:
+        convert_legacy_store(storage_path, dtype="float16" if args.float16 else "float32")
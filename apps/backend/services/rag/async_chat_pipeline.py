@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+Async Chat Pipeline - Caminho de chat assíncrono ponta a ponta
+
+Etapas de uma pergunta:
+1. Escopo (síncrono, barato) - perguntas fora de escopo não consultam nada
+2. Em paralelo (asyncio.gather): embedding da pergunta -> cache semântico,
+   busca vetorial (retrieve_context) e busca na StructuredKnowledgeBase
+3. Geração pelo AIProviderManager (httpx async), com tokens em streaming
+4. Analytics (rag_context no Supabase) enviado em fire-and-forget
+
+Um cache semântico hit responde sem esperar a busca vetorial. Quando nenhum
+provedor de IA responde, a resposta base do SupabaseRAGSystem (montada a
+partir do contexto recuperado) é usada no lugar do fallback genérico.
+
+Views Flask são síncronas: run_sync() e iterate_sync() executam corrotinas e
+geradores assíncronos num event loop dedicado em background.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from core.logging.sanitizer import sanitize_error
+
+logger = logging.getLogger(__name__)
+
+# Tempo máximo de uma etapa (contexto ou próximo token) antes de desistir
+STEP_TIMEOUT_SECONDS = 60.0
+
+# Parâmetros de geração (os mesmos do enhancement OpenRouter do RAG)
+GENERATION_TEMPERATURE = 0.3
+GENERATION_MAX_TOKENS = 600
+
+# Escritas de analytics não bloqueiam a resposta
+_analytics_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-analytics")
+
+@dataclass
+class ChatPreparation:
+    """Resultado da etapa de contexto"""
+    query: str
+    persona: str
+    in_scope: bool
+    category: str
+    scope_confidence: float
+    context: Any = None                    # RAGContext
+    structured_context: str = ""
+    embedding: Any = None
+    partition: Optional[str] = None
+    response: Any = None                   # RAGResponse pronta (cache hit / fora de escopo)
+    cache_similarity: Optional[float] = None
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+class AsyncChatPipeline:
+    """Pipeline de chat sobre SupabaseRAGSystem + StructuredKnowledgeBase + AIProviderManager"""
+
+    def __init__(self, rag_system, ai_manager=None, knowledge_base=None):
+        self.rag_system = rag_system
+        self.ai_manager = ai_manager
+        self.knowledge_base = knowledge_base
+
+        self.stats = {
+            'requests': 0,
+            'streams': 0,
+            'semantic_cache_hits': 0,
+            'out_of_scope': 0,
+            'llm_answers': 0,
+            'template_answers': 0,
+            'analytics_submitted': 0,
+            'errors': 0
+        }
+
+    # ------------------------------------------------------------------
+    # Etapa de contexto
+    # ------------------------------------------------------------------
+
+    async def prepare(self, query: str, persona: str = 'dr_gasnelio', max_chunks: int = 3) -> ChatPreparation:
+        """Escopo, cache semântico, busca vetorial e base estruturada (concorrentes)"""
+        start_time = time.perf_counter()
+        rag = self.rag_system
+
+        in_scope, category, scope_confidence = rag.is_query_in_scope(query)
+        prep = ChatPreparation(
+            query=query,
+            persona=persona,
+            in_scope=in_scope,
+            category=category,
+            scope_confidence=scope_confidence
+        )
+
+        if not in_scope:
+            self.stats['out_of_scope'] += 1
+            prep.response = rag._generate_out_of_scope_response(query, self._empty_context(query), persona)
+            return prep
+
+        semantic_cache = getattr(rag, 'semantic_cache', None)
+        embed_task = (
+            asyncio.create_task(self._timed(prep, 'embedding', rag._embed_query, query))
+            if semantic_cache is not None else None
+        )
+        search_task = asyncio.create_task(
+            self._timed(prep, 'vector_search', rag.retrieve_context,
+                        query=query, max_chunks=max_chunks, use_cache=True)
+        )
+        structured_task = asyncio.create_task(
+            self._timed(prep, 'structured_lookup', self._structured_lookup, query)
+        )
+
+        if embed_task is not None:
+            prep.embedding = await embed_task
+            prep.partition = rag._semantic_cache_partition(query, persona)
+            if prep.embedding is not None:
+                cached = semantic_cache.lookup(prep.embedding, prep.partition)
+                if cached:
+                    # A busca vetorial em andamento é descartada
+                    prep.response, prep.cache_similarity = cached
+                    self.stats['semantic_cache_hits'] += 1
+                    rag.stats['semantic_cache_hits'] += 1
+                    search_task.add_done_callback(self._discard_result)
+                    structured_task.add_done_callback(self._discard_result)
+                    prep.timings_ms['total'] = (time.perf_counter() - start_time) * 1000
+                    return prep
+
+        prep.context, prep.structured_context = await asyncio.gather(search_task, structured_task)
+        prep.timings_ms['total'] = (time.perf_counter() - start_time) * 1000
+        return prep
+
+    async def _timed(self, prep: ChatPreparation, name: str, func, *args, **kwargs):
+        """Executa func (bloqueante) numa thread e registra o tempo da etapa"""
+        start_time = time.perf_counter()
+        try:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        finally:
+            prep.timings_ms[name] = (time.perf_counter() - start_time) * 1000
+
+    @staticmethod
+    def _discard_result(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Etapa descartada falhou: %s", sanitize_error(task.exception()))
+
+    def _structured_lookup(self, query: str) -> str:
+        """Dados estruturados (medicamentos, dosagem, FAQ) relevantes para a pergunta"""
+        if self.knowledge_base is None:
+            return ""
+        try:
+            return self.knowledge_base.enhance_context_with_structured_data(query, "").strip()
+        except Exception as e:
+            logger.warning("Erro na base estruturada: %s", sanitize_error(e))
+            return ""
+
+    @staticmethod
+    def _empty_context(query: str):
+        from services.rag.supabase_rag_system import RAGContext
+        return RAGContext(
+            chunks=[],
+            total_score=0.0,
+            source_files=[],
+            chunk_types=[],
+            confidence_level='low',
+            metadata={'query': query, 'chunks_found': 0}
+        )
+
+    def _context_text(self, prep: ChatPreparation) -> str:
+        context_text = self.rag_system._format_context_for_generation(prep.context, prep.persona)
+        if prep.structured_context:
+            context_text += f"\n\n{prep.structured_context}"
+        return context_text
+
+    # ------------------------------------------------------------------
+    # Geração
+    # ------------------------------------------------------------------
+
+    async def answer(self, query: str, persona: str = 'dr_gasnelio', max_chunks: int = 3):
+        """Resposta completa (RAGResponse) pelo caminho assíncrono"""
+        start_time = time.perf_counter()
+        self.stats['requests'] += 1
+
+        prep = await self.prepare(query, persona, max_chunks)
+        if prep.response is not None:
+            return self._elapsed(prep.response, start_time)
+
+        context_text = self._context_text(prep)
+        answer_text, metadata = None, {'success': False}
+        if self.ai_manager is not None and self.ai_manager.models:
+            _, messages = self.rag_system.build_generation_messages(
+                query, context_text, persona, prep.category
+            )
+            answer_text, metadata = await self.ai_manager.generate_response(
+                messages, temperature=GENERATION_TEMPERATURE, max_tokens=GENERATION_MAX_TOKENS
+            )
+
+        if not metadata.get('success'):
+            answer_text = self.rag_system._generate_base_answer(query, context_text, persona)
+
+        return self._finish(prep, answer_text, metadata, start_time)
+
+    async def stream(
+        self,
+        query: str,
+        persona: str = 'dr_gasnelio',
+        max_chunks: int = 3
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Eventos (nome, dados) para SSE:
+        - context: fontes e confiança, assim que o contexto fica pronto
+        - token: trechos da resposta à medida que chegam do provedor
+        - done: metadados finais (qualidade, fontes, tempos, modelo)
+        """
+        start_time = time.perf_counter()
+        self.stats['requests'] += 1
+        self.stats['streams'] += 1
+
+        prep = await self.prepare(query, persona, max_chunks)
+
+        if prep.response is not None:
+            response = self._elapsed(prep.response, start_time)
+            yield 'context', self._context_event(prep, response.context)
+            yield 'token', {'text': response.answer}
+            yield 'done', self._done_event(prep, response, {'model_used': 'cache' if prep.in_scope else 'scope'})
+            return
+
+        yield 'context', self._context_event(prep, prep.context)
+
+        context_text = self._context_text(prep)
+        parts = []
+        metadata: Dict[str, Any] = {'success': False}
+
+        if self.ai_manager is not None and self.ai_manager.models:
+            _, messages = self.rag_system.build_generation_messages(
+                query, context_text, persona, prep.category
+            )
+            async for chunk in self.ai_manager.stream_response(
+                messages,
+                temperature=GENERATION_TEMPERATURE,
+                max_tokens=GENERATION_MAX_TOKENS,
+                metadata=metadata,
+                use_fallback=False
+            ):
+                parts.append(chunk)
+                yield 'token', {'text': chunk}
+
+        if not parts:
+            base_answer = self.rag_system._generate_base_answer(query, context_text, persona)
+            parts.append(base_answer)
+            yield 'token', {'text': base_answer}
+
+        response = self._finish(prep, "".join(parts), metadata, start_time)
+        yield 'done', self._done_event(prep, response, metadata)
+
+    def _finish(self, prep: ChatPreparation, answer_text: str, metadata: Dict, start_time: float):
+        """RAGResponse final + cache semântico + analytics em background"""
+        from services.rag.supabase_rag_system import RAGResponse
+
+        rag = self.rag_system
+        used_llm = bool(metadata.get('success'))
+        self.stats['llm_answers' if used_llm else 'template_answers'] += 1
+
+        processing_time_ms = (time.perf_counter() - start_time) * 1000
+        response = RAGResponse(
+            answer=answer_text,
+            context=prep.context,
+            persona=prep.persona,
+            quality_score=rag._calculate_response_quality(answer_text, prep.context, prep.scope_confidence),
+            sources=rag._extract_sources(prep.context),
+            limitations=rag._identify_response_limitations(
+                prep.context, used_llm and metadata.get('provider') == 'openrouter'
+            ),
+            generated_at=datetime.now(timezone.utc),
+            processing_time_ms=int(processing_time_ms)
+        )
+        rag.stats['queries_processed'] += 1
+
+        # Só respostas completas e fundamentadas em contexto entram no cache
+        if (prep.embedding is not None and prep.context.chunks
+                and not metadata.get('interrupted')):
+            rag.semantic_cache.store(prep.embedding, prep.partition, response, latency_ms=processing_time_ms)
+
+        self._submit_analytics(prep.query, response)
+        return response
+
+    def _submit_analytics(self, query: str, response):
+        try:
+            _analytics_executor.submit(self.rag_system._save_rag_context_to_supabase, query, response)
+            self.stats['analytics_submitted'] += 1
+        except RuntimeError as e:
+            # Executor encerrado (shutdown do interpretador)
+            logger.debug("Analytics não enviado: %s", sanitize_error(e))
+
+    @staticmethod
+    def _elapsed(response, start_time: float):
+        from dataclasses import replace
+        return replace(response, processing_time_ms=int((time.perf_counter() - start_time) * 1000))
+
+    @staticmethod
+    def _context_event(prep: ChatPreparation, context) -> Dict[str, Any]:
+        return {
+            'persona': prep.persona,
+            'in_scope': prep.in_scope,
+            'cached': prep.cache_similarity is not None,
+            'confidence_level': context.confidence_level if context is not None else 'low',
+            'sources': list(context.source_files) if context is not None else [],
+            'structured_data': bool(prep.structured_context),
+            'timings_ms': {name: round(ms, 1) for name, ms in prep.timings_ms.items()}
+        }
+
+    @staticmethod
+    def _done_event(prep: ChatPreparation, response, metadata: Dict) -> Dict[str, Any]:
+        return {
+            'persona': response.persona,
+            'confidence': response.quality_score,
+            'sources': response.sources,
+            'limitations': response.limitations,
+            'processing_time_ms': response.processing_time_ms,
+            'model_used': metadata.get('model_used', 'template'),
+            'first_token_time': metadata.get('first_token_time'),
+            'interrupted': bool(metadata.get('interrupted')),
+            'cache_similarity': prep.cache_similarity
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+# ----------------------------------------------------------------------
+# Ponte síncrona (Flask) -> event loop em background
+# ----------------------------------------------------------------------
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop compartilhado, executado numa thread daemon"""
+    global _loop
+
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="chat-event-loop", daemon=True)
+            thread.start()
+        return _loop
+
+def run_sync(coro, timeout: float = STEP_TIMEOUT_SECONDS):
+    """Executa uma corrotina no loop de background e aguarda o resultado"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+    try:
+        return future.result(timeout)
+    except Exception:
+        future.cancel()
+        raise
+
+def iterate_sync(agen: AsyncIterator, timeout: float = STEP_TIMEOUT_SECONDS) -> Iterator:
+    """Itera um gerador assíncrono a partir de código síncrono (ex.: resposta SSE do Flask)"""
+    loop = get_background_loop()
+    try:
+        while True:
+            future = asyncio.run_coroutine_threadsafe(agen.__anext__(), loop)
+            try:
+                item = future.result(timeout)
+            except StopAsyncIteration:
+                return
+            except Exception:
+                future.cancel()
+                raise
+            yield item
+    finally:
+        # Cliente desconectou ou erro: fecha o gerador no loop e espera o fechamento
+        # (libera conexões httpx antes de a view terminar)
+        try:
+            asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result(timeout)
+        except Exception as e:
+            logger.debug("Gerador não fechado: %s", sanitize_error(e))
+
+# Instância global
+_chat_pipeline: Optional[AsyncChatPipeline] = None
+
+def get_chat_pipeline() -> Optional[AsyncChatPipeline]:
+    """Obtém instância global do pipeline de chat (None se o RAG não estiver disponível)"""
+    global _chat_pipeline
+
+    if _chat_pipeline is None:
+        from services.rag.supabase_rag_system import get_rag_system
+        rag_system = get_rag_system()
+        if rag_system is None:
+            return None
+
+        try:
+            from services.ai.ai_provider_manager import ai_provider_manager
+        except Exception as e:
+            logger.warning("AI Provider Manager indisponível: %s", sanitize_error(e))
+            ai_provider_manager = None
+
+        try:
+            from services.rag.knowledge_loader import get_structured_knowledge_base
+            knowledge_base = get_structured_knowledge_base()
+        except Exception as e:
+            logger.warning("Base estruturada indisponível: %s", sanitize_error(e))
+            knowledge_base = None
+
+        _chat_pipeline = AsyncChatPipeline(rag_system, ai_provider_manager, knowledge_base)
+
+    return _chat_pipeline
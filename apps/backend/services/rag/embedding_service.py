@@ -6,14 +6,15 @@ Implementa lazy loading para evitar timeout em Cloud Run
 Compatível com sentence-transformers v5.1+ - novas funcionalidades de performance
 """
 
-import json
 import logging
-import hashlib
 from typing import List, Dict, Optional, Tuple, Any, Union
 from datetime import datetime
-from pathlib import Path
 import threading
 
+from services.embedding_cache import (
+    QUERY_PREFIX, PASSAGE_PREFIX, get_embedding_cache
+)
+
 # Import apenas bibliotecas leves na inicialização
 try:
     import numpy as np
@@ -79,130 +80,41 @@ def _lazy_import_sentence_transformers():
 logger = logging.getLogger(__name__)
 
 class EmbeddingCache:
-    """Cache persistente para embeddings"""
-    
-    def __init__(self, cache_dir: str, max_size: int = 1000):
-        self.cache_dir = Path(cache_dir)
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.max_size = max_size
-        self.cache_file = self.cache_dir / "embedding_cache.pkl"
-        self.metadata_file = self.cache_dir / "cache_metadata.pkl"
-        
-        self._cache: Dict[str, np.ndarray] = {}
-        self._metadata: Dict[str, Dict] = {}
-        
-        self._load_cache()
-    
-    def _get_hash(self, text: str, model_name: str) -> str:
-        """Gera hash único para texto + modelo"""
-        content = f"{model_name}:{text}"
-        # SHA-256 for cache keys (not sensitive data)
-        return hashlib.sha256(content.encode()).hexdigest()
-    
-    def _load_cache(self):
-        """Carrega cache do disco de forma segura usando JSON"""
-        try:
-            if self.cache_file.exists():
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                    # Converter listas de volta para numpy arrays se disponível
-                    if NUMPY_AVAILABLE:
-                        self._cache = {k: np.array(v) for k, v in cache_data.items()}
-                    else:
-                        self._cache = cache_data
-                    
-            if self.metadata_file.exists():
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    self._metadata = json.load(f)
-                    
-            logger.info(f"Cache carregado: {len(self._cache)} embeddings")
-        except Exception as e:
-            logger.warning(f"Erro ao carregar cache de embeddings: {e}")
-            self._cache = {}
-            self._metadata = {}
+    """
+    Cache persistente para embeddings
+    Fachada sobre o cache SQLite compartilhado (services/embedding_cache.py):
+    chave SHA-256 de (modelo, prefixo e5, texto normalizado), vetores float32 brutos
+    """
     
-    def _save_cache(self):
-        """Salva cache no disco de forma segura usando JSON"""
-        try:
-            # Converter numpy arrays para listas para serialização JSON
-            cache_for_json = {}
-            for k, v in self._cache.items():
-                if NUMPY_AVAILABLE and isinstance(v, np.ndarray):
-                    cache_for_json[k] = v.tolist()
-                else:
-                    cache_for_json[k] = v
-                    
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_for_json, f, ensure_ascii=False, indent=2)
-                
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self._metadata, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            logger.error(f"Erro ao salvar cache de embeddings: {e}")
+    def __init__(self, config):
+        # EMBEDDING_CACHE_PATH (padrão <VECTOR_DB_PATH>/embedding_cache.sqlite3) e limites do config
+        self.store = get_embedding_cache(config)
     
-    def get(self, text: str, model_name: str) -> Optional[np.ndarray]:
+    def get(self, text: str, model_name: str, prefix: str = '') -> Optional[np.ndarray]:
         """Obtém embedding do cache"""
-        hash_key = self._get_hash(text, model_name)
-        
-        if hash_key in self._cache:
-            # Atualizar timestamp de acesso
-            self._metadata[hash_key]['last_accessed'] = datetime.now()
-            return self._cache[hash_key]
-        
-        return None
+        return self.store.get(model_name, text, prefix)
     
-    def set(self, text: str, model_name: str, embedding: np.ndarray):
+    def set(self, text: str, model_name: str, embedding: np.ndarray, prefix: str = ''):
         """Armazena embedding no cache"""
-        hash_key = self._get_hash(text, model_name)
-        
-        # Gerenciar tamanho do cache
-        if len(self._cache) >= self.max_size:
-            self._evict_oldest()
-        
-        self._cache[hash_key] = embedding
-        self._metadata[hash_key] = {
-            'text_length': len(text),
-            'model_name': model_name,
-            'created_at': datetime.now(),
-            'last_accessed': datetime.now()
-        }
-        
-        # Salvar periodicamente
-        if len(self._cache) % 100 == 0:
-            self._save_cache()
+        self.store.set(model_name, text, embedding, prefix)
     
-    def _evict_oldest(self):
-        """Remove embeddings mais antigos"""
-        if not self._metadata:
-            return
-        
-        # Ordenar por último acesso
-        sorted_keys = sorted(
-            self._metadata.keys(),
-            key=lambda k: self._metadata[k]['last_accessed']
-        )
-        
-        # Remover 10% mais antigos
-        to_remove = max(1, len(sorted_keys) // 10)
-        
-        for key in sorted_keys[:to_remove]:
-            self._cache.pop(key, None)
-            self._metadata.pop(key, None)
-        
-        logger.info(f"Cache eviction: removidos {to_remove} embeddings antigos")
+    def set_many(self, texts: List[str], model_name: str, embeddings, prefix: str = ''):
+        """Armazena vários embeddings em uma única transação"""
+        self.store.set_many(model_name, zip(texts, embeddings), prefix)
+    
+    def _save_cache(self):
+        """Grava atualizações de acesso pendentes (os vetores já são persistidos no set)"""
+        self.store.flush()
+    
+    def clear(self):
+        self.store.clear()
     
     def get_stats(self) -> Dict[str, Any]:
         """Estatísticas do cache"""
-        return {
-            'total_embeddings': len(self._cache),
-            'cache_size_mb': len(json.dumps(self._cache, default=str)) / (1024 * 1024),
-            'oldest_entry': min(
-                (meta['created_at'] for meta in self._metadata.values()),
-                default=None
-            ),
-            'cache_hit_potential': len(self._cache) / max(self.max_size, 1) * 100
-        }
+        stats = self.store.get_stats()
+        stats['total_embeddings'] = stats['entries']
+        stats['cache_size_mb'] = stats.get('file_bytes', stats['memory_bytes']) / (1024 * 1024)
+        return stats
 
 class EmbeddingService:
     """
@@ -219,9 +131,7 @@ class EmbeddingService:
         
         # Cache só se numpy disponível
         if NUMPY_AVAILABLE:
-            cache_path = getattr(config, 'VECTOR_DB_PATH', './cache/embeddings')
-            cache_size = getattr(config, 'EMBEDDING_CACHE_SIZE', 1000)
-            self.cache = EmbeddingCache(cache_path, cache_size)
+            self.cache = EmbeddingCache(config)
         else:
             self.cache = None
             logger.warning("[WARNING] NumPy indisponível - cache de embeddings desabilitado")
@@ -482,9 +392,8 @@ class EmbeddingService:
     def _cache_batch_embeddings(self, texts_to_embed: List[str], new_embeddings, batch_embeddings: List, indices_to_embed: List[int]):
         """Insere embeddings na posição correta e salva no cache"""
         for k, embedding in enumerate(new_embeddings):
-            idx = indices_to_embed[k]
-            batch_embeddings[idx] = embedding
-            self.cache.set(texts_to_embed[k], self.model_name, embedding)
+            batch_embeddings[indices_to_embed[k]] = embedding
+        self.cache.set_many(texts_to_embed, self.model_name, new_embeddings)
 
     def embed_batch(self, texts: List[str], batch_size: Optional[int] = None) -> List[Optional[np.ndarray]]:
         """
@@ -553,9 +462,8 @@ class EmbeddingService:
         query = query.strip()
         
         # Cache específico para queries
-        cache_key = f"query:{query}"
         if self.cache and NUMPY_AVAILABLE:
-            cached_embedding = self.cache.get(cache_key, self.model_name)
+            cached_embedding = self.cache.get(query, self.model_name, prefix=QUERY_PREFIX)
             if cached_embedding is not None:
                 self.stats['cache_hits'] += 1
                 return cached_embedding
@@ -593,7 +501,7 @@ class EmbeddingService:
             
             # Cache com prefixo específico
             if self.cache and NUMPY_AVAILABLE and hasattr(embedding, 'shape'):
-                self.cache.set(cache_key, self.model_name, embedding)
+                self.cache.set(query, self.model_name, embedding, prefix=QUERY_PREFIX)
             
             logger.debug(f"[OK] Query embedding gerado em {embedding_time:.3f}s")
             return embedding
@@ -619,9 +527,8 @@ class EmbeddingService:
         document = document.strip()
         
         # Cache específico para documentos
-        cache_key = f"doc:{document}"
         if self.cache and NUMPY_AVAILABLE:
-            cached_embedding = self.cache.get(cache_key, self.model_name)
+            cached_embedding = self.cache.get(document, self.model_name, prefix=PASSAGE_PREFIX)
             if cached_embedding is not None:
                 self.stats['cache_hits'] += 1
                 return cached_embedding
@@ -665,7 +572,7 @@ class EmbeddingService:
             
             # Cache com prefixo específico
             if self.cache and NUMPY_AVAILABLE and hasattr(embedding, 'shape'):
-                self.cache.set(cache_key, self.model_name, embedding)
+                self.cache.set(document, self.model_name, embedding, prefix=PASSAGE_PREFIX)
             
             logger.debug(f"[OK] Document embedding gerado em {embedding_time:.3f}s")
             return embedding
@@ -796,9 +703,7 @@ class EmbeddingService:
         """Limpa cache de embeddings (se disponível)"""
         if self.cache:
             try:
-                self.cache._cache.clear()
-                self.cache._metadata.clear()
-                self.cache._save_cache()
+                self.cache.clear()
                 logger.info("[OK] Cache de embeddings limpo")
             except Exception as e:
                 logger.error(f"[ERROR] Erro ao limpar cache: {e}")
@@ -8,6 +8,8 @@ from datetime import datetime
 from collections import defaultdict
 import re
 
+from services.rag.lexical_index import get_lexical_index
+
 
 class EnhancedRAGSystem:
     """Sistema RAG avançado com cache e feedback"""
@@ -53,30 +55,14 @@ class EnhancedRAGSystem:
     
     def get_enhanced_context(self, question: str, full_text: str, max_length: int = 3000) -> str:
         """Busca contexto melhorado usando técnicas avançadas"""
-        # Dividir em parágrafos
-        paragraphs = full_text.split('\n\n')
-        question_words = set(re.findall(r'\w+', question.lower()))
-        
-        # Buscar parágrafos relevantes
-        relevant_paragraphs = []
-        for paragraph in paragraphs:
-            if len(paragraph.strip()) < 50:
-                continue
-                
-            paragraph_words = set(re.findall(r'\w+', paragraph.lower()))
-            common_words = question_words.intersection(paragraph_words)
-            
-            if common_words:
-                score = len(common_words) / len(question_words)
-                relevant_paragraphs.append((paragraph, score))
-        
-        # Ordenar por relevância
-        relevant_paragraphs.sort(key=lambda x: x[1], reverse=True)
+        # Parágrafos ranqueados por BM25 no índice léxico do texto (tokenizado uma vez)
+        index = get_lexical_index(full_text)
+        relevant_paragraphs = index.search(question, k=5)
         
         # Construir contexto
         context = ""
-        for paragraph, score in relevant_paragraphs[:5]:
-            context += paragraph + "\n\n"
+        for paragraph_id, score in relevant_paragraphs:
+            context += index.paragraphs[paragraph_id] + "\n\n"
             if len(context) > max_length:
                 break
         
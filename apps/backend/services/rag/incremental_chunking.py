@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental Chunking - Re-chunking por seção com conjunto de mudanças
+=====================================================================
+
+MedicalChunker.chunk_document re-detecta e re-divide o documento inteiro a
+cada edição. Aqui cada seção ganha uma âncora estável (título normalizado,
+~2/~3 para títulos repetidos) e uma impressão digital (SHA-256 do conteúdo).
+Na próxima versão do documento só as seções com impressão diferente passam
+pelo chunker; as demais reaproveitam os chunks do estado salvo.
+
+Os ids dos chunks são os mesmos do pipeline de indexação (SHA-256 de
+"arquivo:texto"): texto intocado mantém o id. O resultado é um
+ChunkChangeSet:
+
+- added: ids novos sem correspondente anterior;
+- removed: ids que saíram do documento;
+- modified: id antigo -> id novo, pareados por posição dentro da mesma seção;
+- unchanged: ids mantidos (não precisam de embedding).
+
+O estado só é gravado em commit(), depois que o indexador aplicou as
+mudanças; uma aplicação interrompida é refeita por inteiro na próxima vez.
+
+Usage:
+    incremental = IncrementalChunker()
+    change_set = incremental.rechunk(text, 'hanseniase.md')
+    report = pipeline.run(change_sets=[change_set])
+    if not report['errors']:
+        incremental.commit(change_set)
+"""
+
+import os
+import json
+import hashlib
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.rag.indexing_pipeline import content_id
+from services.rag.medical_chunking import MedicalChunk, MedicalChunker
+
+try:
+    from app_config import config
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+def fingerprint(section_content: str) -> str:
+    """Impressão digital da seção (espaços finais de linha não contam)"""
+    normalized = '\n'.join(line.rstrip() for line in section_content.strip().split('\n'))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+@dataclass
+class AnchoredChunk:
+    """MedicalChunk com id endereçado por conteúdo e âncora da seção"""
+    id: str
+    anchor: str
+    chunk: MedicalChunk
+
+    @property
+    def text(self) -> str:
+        return self.chunk.content
+
+@dataclass
+class ChunkChangeSet:
+    """Diferença entre o estado salvo e a versão atual de um documento"""
+    document_name: str
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    modified: Dict[str, str] = field(default_factory=dict)
+    unchanged: List[str] = field(default_factory=list)
+    chunks: Dict[str, AnchoredChunk] = field(default_factory=dict)
+    sections_total: int = 0
+    sections_rechunked: int = 0
+    state: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def to_embed(self) -> List[AnchoredChunk]:
+        """Chunks que precisam de embedding (added + lado novo de modified)"""
+        return [self.chunks[chunk_id] for chunk_id in self.added + list(self.modified.values())]
+
+    @property
+    def to_delete(self) -> List[str]:
+        """Ids a remover do vector store (removed + lado antigo de modified)"""
+        return self.removed + list(self.modified.keys())
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.modified)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'document_name': self.document_name,
+            'added': list(self.added),
+            'removed': list(self.removed),
+            'modified': dict(self.modified),
+            'unchanged': len(self.unchanged),
+            'sections_total': self.sections_total,
+            'sections_rechunked': self.sections_rechunked
+        }
+
+class IncrementalChunker:
+    """Re-chunking só das seções alteradas, com estado por documento"""
+
+    def __init__(self, chunker: Optional[MedicalChunker] = None, state_dir: Optional[str] = None):
+        self.chunker = chunker or MedicalChunker()
+        # '' = sem persistência (estado só via previous=)
+        self.state_dir = state_dir if state_dir is not None else getattr(
+            config, 'CHUNK_STATE_DIR', './cache/chunk_state')
+
+    # Estado
+
+    def _state_path(self, document_name: str) -> Optional[str]:
+        if not self.state_dir:
+            return None
+        digest = hashlib.sha256(document_name.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.state_dir, f"{digest}.json")
+
+    def load_state(self, document_name: str) -> Optional[Dict[str, Any]]:
+        path = self._state_path(document_name)
+        if not path:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('version') != STATE_VERSION or state.get('document_name') != document_name:
+            return None
+        return state
+
+    def commit(self, change_set: ChunkChangeSet) -> bool:
+        """Grava o estado da versão atual; chamar depois de aplicar as mudanças"""
+        path = self._state_path(change_set.document_name)
+        if not path:
+            return False
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(change_set.state, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            return True
+        except OSError as e:
+            logger.warning(f"[WARNING] Estado de chunking não salvo ({change_set.document_name}): {e}")
+            return False
+
+    # Diff
+
+    def rechunk(
+        self,
+        document: str,
+        document_name: str,
+        previous: Optional[Dict[str, Any]] = None,
+        use_saved_state: bool = True
+    ) -> ChunkChangeSet:
+        """
+        Chunking da versão atual reaproveitando as seções inalteradas de
+        `previous` (ou do estado salvo, se use_saved_state). Sem estado
+        anterior, todos os chunks saem como added.
+        """
+        if previous is None and use_saved_state:
+            previous = self.load_state(document_name)
+        previous_sections = (previous or {}).get('sections', {})
+
+        sections: Dict[str, Dict[str, Any]] = {}
+        chunks: Dict[str, AnchoredChunk] = {}
+        rechunked = 0
+        for anchor, content in self.chunker.detect_anchored_sections(document):
+            section_fingerprint = fingerprint(content)
+            cached = previous_sections.get(anchor)
+            if cached and cached['fingerprint'] == section_fingerprint:
+                section_chunks = [MedicalChunk(**record) for record in cached['chunks']]
+            elif content.strip():
+                section_chunks = self.chunker.chunk_by_medical_semantics(content, anchor)
+                rechunked += 1
+            else:
+                section_chunks = []
+
+            section_chunks = [chunk for chunk in section_chunks if chunk.content.strip()]
+            ids = []
+            for chunk in section_chunks:
+                chunk_id = content_id(chunk.content, document_name)
+                if chunk_id not in chunks:
+                    chunks[chunk_id] = AnchoredChunk(id=chunk_id, anchor=anchor, chunk=chunk)
+                    ids.append(chunk_id)
+            sections[anchor] = {
+                'fingerprint': section_fingerprint,
+                'ids': ids,
+                'chunks': [asdict(chunks[chunk_id].chunk) for chunk_id in ids]
+            }
+
+        change_set = ChunkChangeSet(
+            document_name=document_name,
+            chunks=chunks,
+            sections_total=len(sections),
+            sections_rechunked=rechunked,
+            state={'version': STATE_VERSION, 'document_name': document_name, 'sections': sections}
+        )
+        self._diff(change_set, previous_sections, sections)
+
+        logger.info(f"Re-chunking incremental de {document_name}: {rechunked}/{len(sections)} seções, "
+                    f"{len(change_set.added)} novos, {len(change_set.modified)} modificados, "
+                    f"{len(change_set.removed)} removidos")
+        return change_set
+
+    def _diff(self, change_set: ChunkChangeSet, previous_sections: Dict[str, Any],
+              sections: Dict[str, Dict[str, Any]]) -> None:
+        old_ids = {chunk_id for section in previous_sections.values() for chunk_id in section['ids']}
+        new_ids = set(change_set.chunks)
+        kept = old_ids & new_ids
+        # ordem do documento para o mesmo resultado a cada execução
+        change_set.unchanged = [chunk_id for section in sections.values() for chunk_id in section['ids']
+                                if chunk_id in kept]
+
+        # Texto que só mudou de seção mantém o id; o resto é pareado por
+        # posição dentro da mesma âncora (antigo -> novo = modified)
+        paired: List[Tuple[str, str]] = []
+        for anchor in list(sections) + [anchor for anchor in previous_sections if anchor not in sections]:
+            before = [chunk_id for chunk_id in previous_sections.get(anchor, {}).get('ids', [])
+                      if chunk_id not in kept]
+            after = [chunk_id for chunk_id in sections.get(anchor, {}).get('ids', []) if chunk_id not in kept]
+            paired.extend(zip(before, after))
+            change_set.removed.extend(before[len(after):])
+            change_set.added.extend(after[len(before):])
+        change_set.modified = dict(paired)
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+"""
+Indexing Pipeline - Indexação da base de conhecimento em três estágios
+=====================================================================
+
+    documentos --[chunk x N]--> lotes --[embed x M]--> vetores --[upsert x 1]--> vector store
+
+- chunk: MedicalChunker.chunk_document para cada documento (chunks prontos,
+  como os extraídos dos JSON estruturados, entram direto neste estágio);
+- embed: um embed_batch por lote de `batch_size` textos, `embed_workers` threads;
+- upsert: escrita em lote (add_documents) e checkpoint do manifesto.
+
+Os estágios são ligados por filas limitadas (queue_size), então um estágio
+lento segura os anteriores em vez de acumular tudo em memória.
+
+Cada chunk é identificado pelo SHA-256 de "arquivo:texto". O manifesto
+(JSON, regravado a cada lote gravado) guarda os ids já no vector store: uma
+nova execução pula chunks inalterados sem gerar embedding, e uma execução
+interrompida retoma de onde parou. Com `prune=True`, ids do manifesto que não
+apareceram na execução (parágrafo editado ou removido) são apagados do store.
+
+Usage:
+    pipeline = IndexingPipeline(vector_store, embedding_service.embed_batch, VectorDocument,
+                                manifest_path='./cache/indexing_manifest.json')
+    report = pipeline.run(documents=[('hanseniase.md', text)], chunks=json_chunks)
+    print(report['stages']['embed']['chunks_per_second'])
+"""
+
+import os
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from app_config import config
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+_DONE = object()
+
+def content_id(text: str, source_file: str) -> str:
+    """
+    Id endereçado por conteúdo: muda quando o texto do chunk muda. Único
+    esquema de id dos chunks (pipeline, IncrementalChunker e SemanticSearchEngine)
+    """
+    return hashlib.sha256(f"{source_file}:{text}".encode('utf-8')).hexdigest()
+
+def legacy_chunk_id(text: str, source_file: str) -> str:
+    """
+    Id antigo do SemanticSearchEngine e do migrate_json_to_supabase (só os 100
+    primeiros caracteres). Usado apenas para apagar as linhas gravadas nesse
+    esquema (IndexingPipeline.drop_legacy_ids)
+    """
+    return hashlib.sha256(f"{source_file}:{text[:100]}".encode()).hexdigest()
+
+@dataclass
+class PipelineChunk:
+    """Chunk pronto para embedding"""
+    text: str
+    chunk_type: str
+    priority: float
+    source_file: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    id: str = ''
+
+    def __post_init__(self):
+        if not self.id:
+            self.id = content_id(self.text, self.source_file)
+
+class _StageStats:
+    """Itens e tempo ocupado por estágio (somado entre as threads do estágio)"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int, seconds: float):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        # throughput do estágio com suas threads em paralelo
+        wall = self.busy / self.workers if self.workers else 0.0
+        return {
+            'workers': self.workers,
+            'chunks': self.items,
+            'busy_seconds': round(self.busy, 4),
+            'chunks_per_second': round(self.items / wall, 1) if wall > 0 else 0.0
+        }
+
+class IndexingPipeline:
+    """Chunking, embedding em lote e upsert em lote, com retomada por manifesto"""
+
+    def __init__(
+        self,
+        vector_store,
+        embed_batch: Callable[[List[str]], Sequence[Any]],
+        document_factory: Callable[..., Any],
+        manifest_path: Optional[str] = None,
+        chunker=None,
+        batch_size: Optional[int] = None,
+        chunk_workers: Optional[int] = None,
+        embed_workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        force: bool = False,
+        dry_run: bool = False,
+        on_indexed: Optional[Callable[[List[PipelineChunk]], None]] = None,
+        on_deleted: Optional[Callable[[List[str]], None]] = None
+    ):
+        self.vector_store = vector_store
+        self.embed_batch = embed_batch
+        self.document_factory = document_factory
+        self.manifest_path = manifest_path if manifest_path is not None else getattr(
+            config, 'INDEXING_MANIFEST_PATH', './cache/indexing_manifest.json')
+        self.chunker = chunker
+        self.batch_size = max(1, batch_size or getattr(config, 'EMBEDDING_BATCH_SIZE', 32))
+        self.chunk_workers = max(1, chunk_workers or getattr(config, 'INDEXING_CHUNK_WORKERS', 2))
+        self.embed_workers = max(1, embed_workers or getattr(config, 'INDEXING_EMBED_WORKERS', 2))
+        self.queue_size = max(1, queue_size or getattr(config, 'INDEXING_QUEUE_SIZE', 8))
+        self.force = force
+        self.dry_run = dry_run
+        self.on_indexed = on_indexed
+        self.on_deleted = on_deleted  # ex.: remover do índice léxico os ids apagados
+
+        self.manifest: Dict[str, str] = {} if force else self._load_manifest()
+        self._manifest_lock = threading.Lock()
+
+    # Manifesto
+
+    def _load_manifest(self) -> Dict[str, str]:
+        if not self.manifest_path:
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != MANIFEST_VERSION:
+            return {}
+        return dict(data.get('chunks', {}))
+
+    def _save_manifest(self):
+        if not self.manifest_path or self.dry_run:
+            return
+        with self._manifest_lock:
+            payload = {
+                'version': MANIFEST_VERSION,
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+                'chunks': dict(self.manifest)
+            }
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+            temp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f)
+            os.replace(temp_path, self.manifest_path)
+        except OSError as e:
+            logger.warning(f"[WARNING] Manifesto de indexação não salvo: {e}")
+
+    # Execução
+
+    def run(
+        self,
+        documents: Iterable[Tuple[str, str]] = (),
+        chunks: Iterable[PipelineChunk] = (),
+        prune: bool = False,
+        change_sets: Iterable[Any] = ()
+    ) -> Dict[str, Any]:
+        """
+        Indexa `documents` ([(arquivo, texto)], chunking pelo MedicalChunker),
+        `chunks` prontos e `change_sets` do IncrementalChunker (chunks atuais
+        indexados, ids removidos/substituídos apagados do store). Retorna o
+        relatório com chunks/s por estágio.
+        """
+        started = time.perf_counter()
+        change_sets = list(change_sets)
+        work: "queue.Queue" = queue.Queue()
+        for document in documents:
+            work.put(('document', document))
+        for chunk in chunks:
+            work.put(('chunk', chunk))
+        for change_set in change_sets:
+            # o manifesto pula os inalterados; uma aplicação anterior
+            # interrompida é completada aqui
+            for chunk in self.change_set_chunks(change_set):
+                work.put(('chunk', chunk))
+        for _ in range(self.chunk_workers):
+            work.put((None, None))
+
+        batches: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        vectors: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        stages = {
+            'chunk': _StageStats(self.chunk_workers),
+            'embed': _StageStats(self.embed_workers),
+            'upsert': _StageStats(1)
+        }
+        counters = {'chunks': 0, 'skipped': 0, 'indexed': 0, 'failed': 0, 'errors': []}
+        counters_lock = threading.Lock()
+        seen: set = set()
+
+        def count(key: str, value: int = 1):
+            with counters_lock:
+                counters[key] += value
+
+        def chunk_stage():
+            batch: List[PipelineChunk] = []
+            while True:
+                kind, item = work.get()
+                if kind is None:
+                    break
+                stage_started = time.perf_counter()
+                try:
+                    produced = self._chunk_document(*item) if kind == 'document' else [item]
+                except Exception as e:
+                    logger.error(f"[ERROR] Chunking falhou: {e}")
+                    with counters_lock:
+                        counters['errors'].append(f"chunk: {e}")
+                    continue
+                pending = []
+                with counters_lock:
+                    for chunk in produced:
+                        if chunk.id in seen:
+                            continue
+                        seen.add(chunk.id)
+                        counters['chunks'] += 1
+                        if chunk.id in self.manifest:
+                            counters['skipped'] += 1
+                        else:
+                            pending.append(chunk)
+                stages['chunk'].add(len(produced), time.perf_counter() - stage_started)
+                for chunk in pending:
+                    batch.append(chunk)
+                    if len(batch) >= self.batch_size:
+                        batches.put(batch)
+                        batch = []
+            if batch:
+                batches.put(batch)
+
+        def embed_stage():
+            try:
+                while True:
+                    batch = batches.get()
+                    if batch is _DONE:
+                        break
+                    stage_started = time.perf_counter()
+                    if self.dry_run:
+                        embeddings = [None] * len(batch)
+                    else:
+                        try:
+                            embeddings = list(self.embed_batch([chunk.text for chunk in batch]))
+                        except Exception as e:
+                            logger.error(f"[ERROR] Embedding em lote falhou: {e}")
+                            with counters_lock:
+                                counters['errors'].append(f"embed: {e}")
+                            embeddings = [None] * len(batch)
+                    stages['embed'].add(len(batch), time.perf_counter() - stage_started)
+                    vectors.put(list(zip(batch, embeddings)))
+            finally:
+                vectors.put(_DONE)
+
+        def upsert_stage():
+            # única consumidora de `vectors`: precisa drenar até o último _DONE,
+            # senão as threads de embedding travam na fila cheia
+            finished = 0
+            while finished < self.embed_workers:
+                pairs = vectors.get()
+                if pairs is _DONE:
+                    finished += 1
+                    continue
+                stage_started = time.perf_counter()
+                try:
+                    written = self._upsert(pairs, count)
+                except Exception as e:
+                    logger.error(f"[ERROR] Upsert em lote falhou: {e}")
+                    with counters_lock:
+                        counters['errors'].append(f"upsert: {e}")
+                    written = 0
+                stages['upsert'].add(written, time.perf_counter() - stage_started)
+
+        chunkers = [threading.Thread(target=chunk_stage, name=f'index-chunk-{i}', daemon=True)
+                    for i in range(self.chunk_workers)]
+        downstream = [threading.Thread(target=embed_stage, name=f'index-embed-{i}', daemon=True)
+                      for i in range(self.embed_workers)]
+        downstream.append(threading.Thread(target=upsert_stage, name='index-upsert', daemon=True))
+        for thread in chunkers + downstream:
+            thread.start()
+        try:
+            for thread in chunkers:
+                thread.join()
+        finally:
+            # só depois de todos os chunkers: um aviso de fim por thread de embedding
+            for _ in range(self.embed_workers):
+                batches.put(_DONE)
+        for thread in downstream:
+            thread.join()
+
+        deleted = 0
+        if change_sets and not counters['errors']:
+            deleted = self._delete([chunk_id for change_set in change_sets for chunk_id in change_set.to_delete
+                                    if chunk_id not in seen])
+        pruned = self._prune(seen) if prune and not counters['errors'] else 0
+        return {
+            'chunks': counters['chunks'],
+            'skipped': counters['skipped'],
+            'indexed': counters['indexed'],
+            'failed': counters['failed'],
+            'pruned': pruned,
+            'deleted': deleted,
+            'errors': counters['errors'],
+            'dry_run': self.dry_run,
+            'wall_seconds': round(time.perf_counter() - started, 4),
+            'stages': {name: stats.to_dict() for name, stats in stages.items()}
+        }
+
+    def _chunk_document(self, source_file: str, text: str) -> List[PipelineChunk]:
+        if self.chunker is None:
+            from services.rag.medical_chunking import MedicalChunker
+            self.chunker = MedicalChunker()
+        return [
+            PipelineChunk(
+                text=chunk.content,
+                chunk_type=chunk.category,
+                priority=chunk.priority,
+                source_file=source_file,
+                metadata={
+                    'section': chunk.source_section,
+                    'word_count': chunk.word_count,
+                    'source_type': 'markdown'
+                }
+            )
+            for chunk in self.chunker.chunk_document(text, source_file)
+        ]
+
+    def _upsert(self, pairs: List[Tuple[PipelineChunk, Any]], count: Callable[[str, int], None]) -> int:
+        # EmbeddingResult (serviço unificado) ou o vetor direto
+        ready = [(chunk, getattr(embedding, 'embedding', embedding)) for chunk, embedding in pairs]
+        ready = [(chunk, embedding) for chunk, embedding in ready if embedding is not None]
+        if self.dry_run:
+            return len(pairs)
+        count('failed', len(pairs) - len(ready))
+        if not ready:
+            return 0
+
+        try:
+            stored = self._write_documents(ready)
+        except Exception:
+            count('failed', len(ready))
+            raise
+
+        count('indexed', len(stored))
+        count('failed', len(ready) - len(stored))
+        with self._manifest_lock:
+            for chunk in stored:
+                self.manifest[chunk.id] = chunk.source_file
+        self._save_manifest()
+        if self.on_indexed and stored:
+            # já gravados no store: uma falha aqui vira erro do relatório, não falha dos chunks
+            self.on_indexed(stored)
+        return len(stored)
+
+    def _write_documents(self, ready: List[Tuple[PipelineChunk, Any]]) -> List[PipelineChunk]:
+        """Grava o lote no vector store; retorna os chunks efetivamente gravados"""
+        now = datetime.now(timezone.utc)
+        documents = [
+            self.document_factory(
+                id=chunk.id,
+                text=chunk.text,
+                embedding=np.asarray(embedding, dtype=np.float32),
+                metadata={**chunk.metadata, 'content_hash': chunk.id, 'indexed_at': now.isoformat()},
+                chunk_type=chunk.chunk_type,
+                priority=chunk.priority,
+                source_file=chunk.source_file,
+                created_at=now
+            )
+            for chunk, embedding in ready
+        ]
+        add_documents = getattr(self.vector_store, 'add_documents', None)
+        if add_documents is not None:
+            written = add_documents(documents)
+            if written == len(documents):
+                return [chunk for chunk, _ in ready]
+            return [chunk for chunk, _ in ready if self.vector_store.get_document(chunk.id) is not None]
+        return [chunk for (chunk, _), document in zip(ready, documents) if self.vector_store.add_document(document)]
+
+    def change_set_chunks(self, change_set) -> List[PipelineChunk]:
+        return [
+            PipelineChunk(
+                text=anchored.chunk.content,
+                chunk_type=anchored.chunk.category,
+                priority=anchored.chunk.priority,
+                source_file=change_set.document_name,
+                metadata={
+                    'section': anchored.anchor,
+                    'word_count': anchored.chunk.word_count,
+                    'source_type': 'markdown'
+                },
+                id=anchored.id
+            )
+            for anchored in change_set.chunks.values()
+        ]
+
+    def drop_legacy_ids(self, chunks: Iterable[PipelineChunk]) -> int:
+        """
+        Apaga as linhas que `chunks` ainda têm no store sob legacy_chunk_id
+        (duplicatas do id atual). Chunks de até 100 caracteres têm o mesmo id
+        nos dois esquemas, e nenhum id atual é apagado. Retorna as linhas apagadas.
+        """
+        chunks = list(chunks)
+        current = {chunk.id for chunk in chunks}
+        legacy = sorted({legacy_chunk_id(chunk.text, chunk.source_file) for chunk in chunks} - current)
+        if self.dry_run or not legacy:
+            return 0
+        deleted = [chunk_id for chunk_id in legacy if self.vector_store.delete_document(chunk_id)]
+        with self._manifest_lock:
+            for chunk_id in legacy:
+                self.manifest.pop(chunk_id, None)
+        self._save_manifest()
+        if self.on_deleted:
+            # o índice léxico do SemanticSearchEngine pode ter o id antigo mesmo sem linha no store
+            self.on_deleted(legacy)
+        return len(deleted)
+
+    def _prune(self, seen: set) -> int:
+        """Apaga do store os chunks do manifesto que esta execução não produziu"""
+        return self._delete([chunk_id for chunk_id in list(self.manifest) if chunk_id not in seen])
+
+    def _delete(self, chunk_ids: List[str]) -> int:
+        if self.dry_run or not chunk_ids:
+            return len(chunk_ids)
+        for chunk_id in chunk_ids:
+            self.vector_store.delete_document(chunk_id)
+            with self._manifest_lock:
+                self.manifest.pop(chunk_id, None)
+        self._save_manifest()
+        if self.on_deleted:
+            self.on_deleted(chunk_ids)
+        return len(chunk_ids)
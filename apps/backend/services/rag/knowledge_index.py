@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+Knowledge Index - Camada de consulta indexada da base estruturada (data/structured)
+==================================================================================
+
+Montado uma vez no carregamento da StructuredKnowledgeBase:
+
+- medicamentos: hash de nome e sinônimos (aliases da clinical_taxonomy),
+  sem acentos e em minúsculas -> entrada tipada (MedicationEntry);
+- protocolos de dosagem: hash de chave do protocolo + apelidos de faixa
+  etária ("adult", "criança", "30-50kg"...) -> DosingProtocol;
+- FAQ: hash de palavra-chave -> entradas e índice invertido token -> {entrada:
+  peso} (2 se o token está na pergunta, +1 se está nas palavras-chave), então a
+  busca só soma as postings dos tokens da consulta;
+- seções por nome (etapas de dispensação, referência rápida, eventos adversos
+  por medicamento): hash da chave normalizada.
+
+O índice compilado (junto com os dados) é salvo em JSON em KNOWLEDGE_INDEX_DIR.
+A validade é checada pelo mtime/tamanho de cada arquivo de origem e, se o mtime
+mudou, pelo SHA-256 do conteúdo (um `touch` ou checkout não força rebuild).
+
+Usage:
+    knowledge_base, index, loaded = load_or_build({'faq': 'data/structured/frequently_asked_questions.json', ...})
+    for match in index.search_faq("Posso tomar com anticoncepcional?"):
+        print(match.entry.question, match.score)
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.validation.keyword_matcher import fold_text
+from services.rag.lexical_index import STOPWORDS as _STOPWORDS
+
+try:
+    from app_config import config
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+# Apelidos de faixa etária/peso -> chave em dosing_protocols
+_DOSING_ALIASES = {
+    'adult': 'pqt_u_adulto',
+    'adulto': 'pqt_u_adulto',
+    'adultos': 'pqt_u_adulto',
+    '30_50kg': 'pqt_u_30_50kg',
+    '30-50kg': 'pqt_u_30_50kg',
+    'pediatric': 'pediatric_under_30kg',
+    'pediatrico': 'pediatric_under_30kg',
+    'infantil': 'pediatric_under_30kg',
+    'crianca': 'pediatric_under_30kg',
+    'child': 'pediatric_under_30kg',
+    'under_30kg': 'pediatric_under_30kg',
+}
+
+# Estrutura dos arquivos: chave da knowledge_base -> chave que embrulha o conteúdo
+_WRAPPERS = {
+    'faq': 'faq_hanseniase_pqtu',
+    'dosing_protocols': 'dosing_protocols',
+    'medications': 'medications',
+    'dispensing_workflow': 'dispensing_workflow',
+    'quick_reference': 'quick_reference_protocols',
+    'pharmacovigilance': 'pharmacovigilance_guidelines',
+    'clinical_taxonomy': 'clinical_taxonomy',
+}
+
+def normalize(text: str) -> str:
+    """Chave de hash: minúsculas, sem acentos, espaços nas pontas removidos"""
+    return fold_text(text).strip()
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(fold_text(text))
+
+def section(knowledge_base: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """Conteúdo de um arquivo sem a chave de topo que o embrulha"""
+    data = knowledge_base.get(key)
+    if not isinstance(data, dict):
+        return {}
+    wrapper = _WRAPPERS.get(key)
+    if wrapper and isinstance(data.get(wrapper), dict):
+        return data[wrapper]
+    return data
+
+def _nested(data: Dict[str, Any], *path: str) -> Dict[str, Any]:
+    for key in path:
+        data = data.get(key) if isinstance(data, dict) else None
+    return data if isinstance(data, dict) else {}
+
+@dataclass(frozen=True)
+class MedicationEntry:
+    """Medicamento da PQT-U com seus sinônimos"""
+    name: str
+    aliases: Tuple[str, ...]
+    data: Dict[str, Any]
+
+@dataclass(frozen=True)
+class DosingProtocol:
+    """Protocolo de dosagem por faixa de peso/idade"""
+    key: str
+    population: str
+    data: Dict[str, Any]
+
+@dataclass(frozen=True)
+class FAQEntry:
+    """Pergunta frequente (respostas por persona)"""
+    id: int
+    category: str
+    key: str
+    question: str
+    gasnelio_answer: str
+    ga_answer: str
+    keywords: Tuple[str, ...]
+    priority: str
+
+    @property
+    def answer(self) -> str:
+        return self.gasnelio_answer or self.ga_answer or 'Resposta não disponível'
+
+@dataclass(frozen=True)
+class FAQMatch:
+    """FAQ encontrada e sua pontuação"""
+    entry: FAQEntry
+    score: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Formato de StructuredKnowledgeBase.search_faq"""
+        return {
+            'question': self.entry.question,
+            'answer': self.entry.answer,
+            'score': self.score,
+            'category': self.entry.category
+        }
+
+class KnowledgeIndex:
+    """Índices hash e invertido sobre a knowledge_base carregada"""
+
+    def __init__(self, knowledge_base: Dict[str, Any]):
+        self.knowledge_base = knowledge_base
+        self.medications: Dict[str, MedicationEntry] = {}
+        self.medication_aliases: Dict[str, str] = {}
+        self.dosing_protocols: Dict[str, DosingProtocol] = {}
+        self.dosing_aliases: Dict[str, str] = {}
+        self.faq: List[FAQEntry] = []
+        self.faq_keywords: Dict[str, List[int]] = {}
+        # token -> {entrada: peso}
+        self.faq_postings: Dict[str, Dict[int, int]] = {}
+        # seção -> {chave normalizada: chave original}
+        self.section_keys: Dict[str, Dict[str, str]] = {}
+
+    @classmethod
+    def build(cls, knowledge_base: Dict[str, Any]) -> 'KnowledgeIndex':
+        index = cls(knowledge_base)
+
+        taxonomy = _nested(section(knowledge_base, 'clinical_taxonomy'), 'level_3_entities', 'medication_specific')
+        medication_aliases = {}
+        for name in section(knowledge_base, 'medications'):
+            aliases = taxonomy.get(name, {}).get('aliases', []) if isinstance(taxonomy.get(name), dict) else []
+            medication_aliases[name] = [name] + [alias for alias in aliases if isinstance(alias, str)]
+        index._set_medications(medication_aliases)
+
+        index._set_dosing()
+
+        faq_rows = []
+        for category, entries in section(knowledge_base, 'faq').items():
+            if category == 'metadata' or not isinstance(entries, dict):
+                continue
+            for key, item in entries.items():
+                if isinstance(item, dict) and 'question' in item:
+                    faq_rows.append([category, key, item['question'], item.get('gasnelio_answer', ''),
+                                     item.get('ga_answer', ''), list(item.get('keywords', [])),
+                                     item.get('priority', '')])
+        index._set_faq(faq_rows)
+
+        for name, data in (
+            ('dispensing_workflow', section(knowledge_base, 'dispensing_workflow')),
+            ('quick_reference', section(knowledge_base, 'quick_reference')),
+            ('adverse_effects', index._adverse_effects_section()),
+        ):
+            index.section_keys[name] = {normalize(key): key for key in data}
+        return index
+
+    def _set_medications(self, medication_aliases: Dict[str, List[str]]):
+        medications = section(self.knowledge_base, 'medications')
+        for name, aliases in medication_aliases.items():
+            if not isinstance(medications.get(name), dict):
+                continue
+            self.medications[name] = MedicationEntry(name, tuple(aliases), medications[name])
+            for alias in aliases:
+                self.medication_aliases.setdefault(normalize(alias), name)
+
+    def _set_dosing(self):
+        for key, data in section(self.knowledge_base, 'dosing_protocols').items():
+            if isinstance(data, dict):
+                self.dosing_protocols[key] = DosingProtocol(key, data.get('population', ''), data)
+                self.dosing_aliases[normalize(key)] = key
+        for alias, key in _DOSING_ALIASES.items():
+            if key in self.dosing_protocols:
+                self.dosing_aliases.setdefault(alias, key)
+
+    def _set_faq(self, rows: List[List[Any]]):
+        for entry_id, (category, key, question, gasnelio_answer, ga_answer, keywords, priority) in enumerate(rows):
+            entry = FAQEntry(entry_id, category, key, question, gasnelio_answer, ga_answer,
+                             tuple(keywords), priority)
+            self.faq.append(entry)
+            question_tokens = set(tokenize(question))
+            keyword_tokens = set()
+            for keyword in keywords:
+                self.faq_keywords.setdefault(normalize(keyword), []).append(entry_id)
+                keyword_tokens.update(tokenize(keyword))
+            # mesmo critério da busca antiga: +2 na pergunta, +1 nas palavras-chave
+            for token in (question_tokens | keyword_tokens) - _STOPWORDS:
+                weight = (2 if token in question_tokens else 0) + (1 if token in keyword_tokens else 0)
+                self.faq_postings.setdefault(token, {})[entry_id] = weight
+
+    def _adverse_effects_section(self) -> Dict[str, Any]:
+        return _nested(section(self.knowledge_base, 'pharmacovigilance'),
+                       'adverse_events_classification', 'by_medication')
+
+    # Consultas
+
+    def medication(self, name: str) -> Optional[MedicationEntry]:
+        """Medicamento por nome ou sinônimo; nome parcial ("rifamp") cai na busca por prefixo/trecho"""
+        key = normalize(name)
+        if not key:
+            return None
+        found = self.medication_aliases.get(key)
+        if found is None:
+            found = next((target for alias, target in self.medication_aliases.items() if key in alias), None)
+        return self.medications.get(found) if found else None
+
+    def medications_in(self, text: str) -> List[MedicationEntry]:
+        """Medicamentos citados no texto (nome ou sinônimo), na ordem em que aparecem"""
+        seen = []
+        for token in tokenize(text):
+            name = self.medication_aliases.get(token)
+            if name and name not in seen:
+                seen.append(name)
+        return [self.medications[name] for name in seen]
+
+    def dosing_protocol(self, age_group: str) -> Optional[DosingProtocol]:
+        key = self.dosing_aliases.get(normalize(age_group))
+        return self.dosing_protocols.get(key) if key else None
+
+    def faq_by_keyword(self, keyword: str) -> List[FAQEntry]:
+        return [self.faq[entry_id] for entry_id in self.faq_keywords.get(normalize(keyword), [])]
+
+    def search_faq(self, question: str, limit: Optional[int] = None) -> List[FAQMatch]:
+        """FAQs por soma dos pesos dos tokens da pergunta (score decrescente, empate: ordem no arquivo)"""
+        scores: Dict[int, int] = {}
+        for token in tokenize(question):
+            postings = self.faq_postings.get(token)
+            if postings:
+                for entry_id, weight in postings.items():
+                    scores[entry_id] = scores.get(entry_id, 0) + weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [FAQMatch(self.faq[entry_id], score) for entry_id, score in ranked]
+
+    def section_entry(self, name: str, key: str) -> Dict[str, Any]:
+        """Entrada de uma seção por chave; sem chave exata, a primeira chave que contém o termo"""
+        keys = self.section_keys.get(name, {})
+        normalized = normalize(key)
+        original = keys.get(normalized)
+        if original is None and normalized:
+            original = next((value for folded, value in keys.items() if normalized in folded), None)
+        if original is None:
+            return {}
+        if name == 'adverse_effects':
+            data = self._adverse_effects_section()
+        elif name == 'quick_reference':
+            data = section(self.knowledge_base, 'quick_reference')
+        else:
+            data = section(self.knowledge_base, name)
+        return data.get(original, {})
+
+    # Persistência
+
+    def to_dict(self) -> Dict:
+        return {
+            'medications': {name: list(entry.aliases) for name, entry in self.medications.items()},
+            'medication_aliases': self.medication_aliases,
+            'dosing_aliases': self.dosing_aliases,
+            'faq': [[entry.category, entry.key, entry.question, entry.gasnelio_answer, entry.ga_answer,
+                     list(entry.keywords), entry.priority] for entry in self.faq],
+            'faq_keywords': self.faq_keywords,
+            'faq_postings': {token: list(postings.items()) for token, postings in self.faq_postings.items()},
+            'sections': self.section_keys
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, knowledge_base: Dict[str, Any]) -> 'KnowledgeIndex':
+        """Reidrata sobre os dados do cache, sem re-tokenizar"""
+        index = cls(knowledge_base)
+        medications = section(knowledge_base, 'medications')
+        index.medications = {name: MedicationEntry(name, tuple(aliases), medications[name])
+                             for name, aliases in data['medications'].items()}
+        index.medication_aliases = data['medication_aliases']
+        dosing = section(knowledge_base, 'dosing_protocols')
+        index.dosing_protocols = {key: DosingProtocol(key, dosing[key].get('population', ''), dosing[key])
+                                  for key in set(data['dosing_aliases'].values())}
+        index.dosing_aliases = data['dosing_aliases']
+        index.faq = [FAQEntry(entry_id, category, key, question, gasnelio_answer, ga_answer, tuple(keywords), priority)
+                     for entry_id, (category, key, question, gasnelio_answer, ga_answer, keywords, priority)
+                     in enumerate(data['faq'])]
+        index.faq_keywords = data['faq_keywords']
+        index.faq_postings = {token: dict((entry_id, weight) for entry_id, weight in postings)
+                              for token, postings in data['faq_postings'].items()}
+        index.section_keys = data['sections']
+        return index
+
+def _file_stat(path: str) -> Optional[Dict[str, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+def _file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def _cache_path(sources: Dict[str, str], cache_dir: str) -> str:
+    key = hashlib.sha256('\n'.join(
+        f"{name}={os.path.realpath(path)}" for name, path in sorted(sources.items())
+    ).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{key}.json")
+
+def _cache_dir() -> str:
+    return getattr(config, 'KNOWLEDGE_INDEX_DIR', './cache/knowledge_index')
+
+def _read_cache(path: str, sources: Dict[str, str]) -> Tuple[Optional[Dict], bool]:
+    """(cache, precisa regravar manifesto); cache None se ausente ou desatualizado"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None, False
+    manifest = cached.get('sources', {})
+    if cached.get('version') != INDEX_VERSION or set(manifest) != set(sources):
+        return None, False
+
+    touched = False
+    for name, source in sources.items():
+        entry, stat = manifest[name], _file_stat(source)
+        if stat is None or entry.get('missing'):
+            if (stat is None) != bool(entry.get('missing')):
+                return None, False
+            continue
+        if stat['mtime_ns'] == entry['mtime_ns'] and stat['size'] == entry['size']:
+            continue
+        # mtime mudou: só reconstrói se o conteúdo também mudou
+        if stat['size'] != entry['size'] or _file_hash(source) != entry['sha256']:
+            return None, False
+        entry.update(stat)
+        touched = True
+    return cached, touched
+
+def _write_cache(path: str, cached: Dict):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cached, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"[WARNING] Índice da base estruturada não salvo: {e}")
+
+def load_sources(sources: Dict[str, str]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]], int]:
+    """Lê os JSON de origem: (knowledge_base, manifesto mtime/tamanho/hash, arquivos carregados)"""
+    knowledge_base, manifest, loaded_count = {}, {}, 0
+    for key, path in sources.items():
+        filename = os.path.basename(path)
+        stat = _file_stat(path)
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            knowledge_base[key] = json.loads(raw.decode('utf-8'))
+            loaded_count += 1
+            logger.info(f"[OK] Carregado: {filename}")
+        except FileNotFoundError:
+            logger.warning(f"[WARNING] Arquivo não encontrado: {filename}")
+            knowledge_base[key] = {}
+            manifest[key] = {'missing': True}
+            continue
+        except json.JSONDecodeError as e:
+            logger.error(f"[ERROR] Erro JSON em {filename}: {e}")
+            knowledge_base[key] = {}
+        except Exception as e:
+            logger.error(f"[ERROR] Erro ao carregar {filename}: {e}")
+            knowledge_base[key] = {}
+            raw = b''
+        manifest[key] = {**(stat or {'mtime_ns': 0, 'size': 0}), 'sha256': hashlib.sha256(raw).hexdigest()}
+    return knowledge_base, manifest, loaded_count
+
+def load_or_build(sources: Dict[str, str], cache_dir: Optional[str] = None) -> Tuple[Dict[str, Any], KnowledgeIndex, int]:
+    """
+    (knowledge_base, índice, arquivos carregados) para {chave: caminho do JSON}.
+    Usa o cache compilado quando os arquivos não mudaram; senão lê, indexa e regrava.
+    cache_dir='' desativa o cache em disco.
+    """
+    cache_dir = _cache_dir() if cache_dir is None else cache_dir
+    path = _cache_path(sources, cache_dir) if cache_dir else ''
+    if path:
+        cached, touched = _read_cache(path, sources)
+        if cached is not None:
+            knowledge_base = cached['knowledge_base']
+            index = KnowledgeIndex.from_dict(cached['index'], knowledge_base)
+            if touched:
+                _write_cache(path, cached)
+            loaded_count = sum(1 for entry in cached['sources'].values() if not entry.get('missing'))
+            logger.info(f"[OK] Base estruturada do cache compilado: {path}")
+            return knowledge_base, index, loaded_count
+
+    knowledge_base, manifest, loaded_count = load_sources(sources)
+    index = KnowledgeIndex.build(knowledge_base)
+    if path:
+        _write_cache(path, {
+            'version': INDEX_VERSION,
+            'sources': manifest,
+            'knowledge_base': knowledge_base,
+            'index': index.to_dict()
+        })
+    return knowledge_base, index, loaded_count
@@ -4,10 +4,13 @@ SISTEMA DE CARREGAMENTO DE BASE DE CONHECIMENTO ESTRUTURADA
 Integra dados JSON estruturados para melhorar respostas do sistema
 """
 
-import json
 import os
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from services.rag.knowledge_index import (
+    DosingProtocol, FAQMatch, KnowledgeIndex, MedicationEntry, load_or_build
+)
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +51,7 @@ class StructuredKnowledgeBase:
         
         self.data_path = data_path
         self.knowledge_base = {}
+        self.index = KnowledgeIndex({})
         self.load_all_data()
     
     def load_all_data(self):
@@ -73,7 +77,8 @@ class StructuredKnowledgeBase:
                 'quick_reference_protocols.json': 'quick_reference'
             }
             
-            loaded_count = 0
+            sources = {}
+            real_data_path = os.path.realpath(self.data_path)
             for filename, key in file_mappings.items():
                 # Sanitize filename to prevent path traversal
                 safe_filename = os.path.basename(filename)
@@ -81,160 +86,69 @@ class StructuredKnowledgeBase:
                 
                 # Validate that file path is within expected directory
                 real_path = os.path.realpath(file_path)
-                real_data_path = os.path.realpath(self.data_path)
-                if not real_path.startswith(real_data_path):
+                if os.path.commonpath([real_path, real_data_path]) != real_data_path:
                     logger.warning(f"[ERROR] Path traversal tentativa bloqueada: {filename}")
                     continue
-                
-                # Use hardcoded safe file paths to eliminate path traversal completely
-                allowed_files = {
-                    'clinical_taxonomy.json': 'data/structured/clinical_taxonomy.json',
-                    'dispensing_workflow.json': 'data/structured/dispensing_workflow.json',
-                    'dosing_protocols.json': 'data/structured/dosing_protocols.json',
-                    'pharmacovigilance_guidelines.json': 'data/structured/pharmacovigilance_guidelines.json',
-                    'quick_reference_protocols.json': 'data/structured/quick_reference_protocols.json'
-                }
-                
-                if safe_filename not in allowed_files:
-                    logger.warning(f"[ERROR] Arquivo não permitido: {safe_filename}")
-                    continue
-                    
-                static_file_path = allowed_files[safe_filename]
-                try:
-                    with open(static_file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        self.knowledge_base[key] = data
-                        loaded_count += 1
-                        logger.info(f"[OK] Carregado: {filename}")
-                except FileNotFoundError:
-                    logger.warning(f"[WARNING] Arquivo não encontrado: {filename}")
-                    self.knowledge_base[key] = {}
-                except json.JSONDecodeError as e:
-                    logger.error(f"[ERROR] Erro JSON em {filename}: {e}")
-                    self.knowledge_base[key] = {}
-                except Exception as e:
-                    logger.error(f"[ERROR] Erro ao carregar {filename}: {e}")
-                    self.knowledge_base[key] = {}
+                sources[key] = real_path
+            
+            # Índices (hash + invertido) montados aqui ou lidos do cache compilado
+            self.knowledge_base, self.index, loaded_count = load_or_build(sources)
             
             logger.info(f"[REPORT] Base estruturada carregada: {loaded_count}/{len(file_mappings)} arquivos")
             
         except Exception as e:
             logger.error(f"[ERROR] Erro crítico ao carregar base estruturada: {e}")
             self.knowledge_base = {}
+            self.index = KnowledgeIndex({})
+    
+    def find_medication(self, medication_name: str) -> Optional[MedicationEntry]:
+        """Medicamento por nome ou sinônimo (ex.: 'rifampin', 'CLO')"""
+        return self.index.medication(medication_name)
+    
+    def find_dosing_protocol(self, age_group: str = "adult") -> Optional[DosingProtocol]:
+        """Protocolo por chave ou faixa etária ('adult', 'criança', '30-50kg')"""
+        return self.index.dosing_protocol(age_group)
+    
+    def query_faq(self, question: str, limit: int = None) -> List[FAQMatch]:
+        """FAQs tipadas, mais relevantes primeiro"""
+        return self.index.search_faq(question, limit)
     
     def get_medication_info(self, medication_name: str) -> Dict[str, Any]:
         """Obtém informações detalhadas sobre um medicamento"""
-        medications = self.knowledge_base.get('medications', {})
-        
-        # Busca case-insensitive
-        medication_name_lower = medication_name.lower()
-        for med_key, med_data in medications.items():
-            if medication_name_lower in med_key.lower():
-                return med_data
-        
-        return {}
+        entry = self.index.medication(medication_name)
+        return entry.data if entry else {}
     
     def get_dosing_protocol(self, age_group: str = "adult", weight_range: str = None) -> Dict[str, Any]:
         """Obtém protocolo de dosagem específico"""
-        protocols = self.knowledge_base.get('dosing_protocols', {})
-        
-        # Buscar por grupo etário
-        if age_group in protocols:
-            age_protocols = protocols[age_group]
-            
-            # Se especificado peso, buscar faixa específica
-            if weight_range and isinstance(age_protocols, dict):
-                for weight_key, dosing_data in age_protocols.items():
-                    if weight_range.lower() in weight_key.lower():
-                        return dosing_data
-                        
-            return age_protocols
-        
-        return {}
+        protocol = self.index.dosing_protocol(age_group)
+        if protocol is None:
+            return {}
+        age_protocols = protocol.data
+        
+        # Se especificado peso, buscar faixa específica
+        if weight_range:
+            for weight_key, dosing_data in age_protocols.items():
+                if weight_range.lower() in weight_key.lower():
+                    return dosing_data
+        
+        return age_protocols
     
     def search_faq(self, question: str) -> List[Dict[str, Any]]:
         """Busca FAQs relacionadas à pergunta"""
-        faq_data = self.knowledge_base.get('faq', {})
-        
-        if not isinstance(faq_data, dict):
-            return []
-        
-        # Navegar na estrutura das FAQs
-        matched_faqs = []
-        
-        # Percorrer categorias de FAQ
-        for category_key, category_data in faq_data.items():
-            if category_key == 'metadata':
-                continue
-                
-            if isinstance(category_data, dict):
-                for faq_key, faq_item in category_data.items():
-                    if isinstance(faq_item, dict) and 'question' in faq_item:
-                        # Verificar correspondência
-                        question_lower = question.lower()
-                        faq_question = faq_item['question'].lower()
-                        keywords = faq_item.get('keywords', [])
-                        
-                        # Pontuação de relevância
-                        score = 0
-                        
-                        # Palavras na pergunta
-                        for word in question_lower.split():
-                            if word in faq_question:
-                                score += 2
-                            if any(word in keyword for keyword in keywords):
-                                score += 1
-                        
-                        if score > 0:
-                            matched_faqs.append({
-                                'question': faq_item['question'],
-                                'answer': faq_item.get('gasnelio_answer', faq_item.get('ga_answer', 'Resposta não disponível')),
-                                'score': score,
-                                'category': category_key
-                            })
-        
-        # Ordenar por relevância
-        matched_faqs.sort(key=lambda x: x['score'], reverse=True)
-        return matched_faqs
+        return [match.to_dict() for match in self.index.search_faq(question)]
     
     def get_dispensing_workflow_step(self, step_name: str) -> Dict[str, Any]:
         """Obtém passo específico do workflow de dispensação"""
-        workflow = self.knowledge_base.get('dispensing_workflow', {})
-        
-        # Busca flexível por nome do passo
-        step_name_lower = step_name.lower()
-        for step_key, step_data in workflow.items():
-            if step_name_lower in step_key.lower():
-                return step_data
-        
-        return {}
+        return self.index.section_entry('dispensing_workflow', step_name)
     
     def get_adverse_effects(self, medication: str) -> Dict[str, Any]:
         """Obtém efeitos adversos de medicamento específico"""
-        pharma_data = self.knowledge_base.get('pharmacovigilance', {})
-        
-        medication_lower = medication.lower()
-        
-        # Buscar em dados de farmacovigilância
-        if 'adverse_effects' in pharma_data:
-            adverse_effects = pharma_data['adverse_effects']
-            
-            for med_key, effects_data in adverse_effects.items():
-                if medication_lower in med_key.lower():
-                    return effects_data
-        
-        return {}
+        entry = self.index.medication(medication)
+        return self.index.section_entry('adverse_effects', entry.name if entry else medication)
     
     def get_quick_reference(self, topic: str) -> Dict[str, Any]:
         """Obtém referência rápida para tópico específico"""
-        quick_ref = self.knowledge_base.get('quick_reference', {})
-        
-        topic_lower = topic.lower()
-        for ref_key, ref_data in quick_ref.items():
-            if topic_lower in ref_key.lower():
-                return ref_data
-        
-        return {}
+        return self.index.section_entry('quick_reference', topic)
     
     def enhance_context_with_structured_data(self, question: str, base_context: str) -> str:
         """Enriquece contexto básico com dados estruturados relevantes"""
@@ -243,19 +157,17 @@ class StructuredKnowledgeBase:
         # Detectar tópicos na pergunta
         question_lower = question.lower()
         
-        # Se pergunta sobre medicamentos específicos
-        medications = ['rifampicina', 'dapsona', 'clofazimina']
-        for med in medications:
-            if med in question_lower:
-                med_info = self.get_medication_info(med)
-                if med_info:
-                    enhanced_context += f"\n\n=== INFORMAÇÕES ESTRUTURADAS - {med.upper()} ===\n"
-                    if 'mechanism' in med_info:
-                        enhanced_context += f"Mecanismo: {med_info['mechanism']}\n"
-                    if 'dosing' in med_info:
-                        enhanced_context += f"Dosagem: {med_info['dosing']}\n"
-                    if 'adverse_effects' in med_info:
-                        enhanced_context += f"Efeitos adversos: {med_info['adverse_effects']}\n"
+        # Se pergunta sobre medicamentos específicos (nome ou sinônimo)
+        for entry in self.index.medications_in(question):
+            med_info = entry.data
+            enhanced_context += f"\n\n=== INFORMAÇÕES ESTRUTURADAS - {entry.name.upper()} ===\n"
+            mechanism = med_info.get('mechanism', med_info.get('mechanism_of_action'))
+            if mechanism:
+                enhanced_context += f"Mecanismo: {mechanism}\n"
+            if 'dosing' in med_info:
+                enhanced_context += f"Dosagem: {med_info['dosing']}\n"
+            if 'adverse_effects' in med_info:
+                enhanced_context += f"Efeitos adversos: {med_info['adverse_effects']}\n"
         
         # Se pergunta sobre dosagem
         if any(word in question_lower for word in ['dose', 'dosagem', 'mg', 'quantidade']):
@@ -264,11 +176,11 @@ class StructuredKnowledgeBase:
                 enhanced_context += f"\n\n=== PROTOCOLOS DE DOSAGEM ===\n{str(dosing_info)[:300]}...\n"
         
         # Buscar FAQs relevantes
-        relevant_faqs = self.search_faq(question)
+        relevant_faqs = self.index.search_faq(question, limit=2)  # Top 2 FAQs
         if relevant_faqs:
             enhanced_context += "\n\n=== PERGUNTAS FREQUENTES RELACIONADAS ===\n"
-            for faq in relevant_faqs[:2]:  # Top 2 FAQs
-                enhanced_context += f"P: {faq['question']}\nR: {faq['answer'][:200]}...\n\n"
+            for match in relevant_faqs:
+                enhanced_context += f"P: {match.entry.question}\nR: {match.entry.answer[:200]}...\n\n"
         
         return enhanced_context
     
@@ -279,11 +191,11 @@ class StructuredKnowledgeBase:
     def get_enhanced_response(self, question: str, persona: str) -> str:
         """Gera resposta otimizada usando base estruturada"""
         # Buscar FAQs relevantes
-        relevant_faqs = self.search_faq(question)
+        relevant_faqs = self.index.search_faq(question, limit=1)
         
         if relevant_faqs:
             # Usar primeira FAQ como resposta base
-            faq = relevant_faqs[0]
+            faq = relevant_faqs[0].to_dict()
             
             # Adaptar para persona
             if persona == "ga":
@@ -294,15 +206,12 @@ class StructuredKnowledgeBase:
             return response
         
         # Buscar informações de medicamentos
-        medication_keywords = ['rifampicina', 'clofazimina', 'dapsona']
-        for keyword in medication_keywords:
-            if keyword in question.lower():
-                med_info = self.get_medication_info(keyword)
-                if med_info:
-                    if persona == "ga":
-                        return f"Oi! 😊\n\nSobre {keyword}: {med_info.get('description', 'Medicamento do tratamento de hanseníase')}\n\nPode ficar tranquilo(a)! 💝"
-                    else:
-                        return f"**INFORMAÇÕES TÉCNICAS - {keyword.upper()}**\n\n{med_info.get('description', 'Medicamento componente da PQT-U')}\n\n*Baseado nos protocolos da tese.*"
+        for entry in self.index.medications_in(question):
+            keyword, med_info = entry.name, entry.data
+            if persona == "ga":
+                return f"Oi! 😊\n\nSobre {keyword}: {med_info.get('description', 'Medicamento do tratamento de hanseníase')}\n\nPode ficar tranquilo(a)! 💝"
+            else:
+                return f"**INFORMAÇÕES TÉCNICAS - {keyword.upper()}**\n\n{med_info.get('description', 'Medicamento componente da PQT-U')}\n\n*Baseado nos protocolos da tese.*"
         
         return None  # Não encontrou resposta estruturada
     
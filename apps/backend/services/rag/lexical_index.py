@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Lexical Index - Índice invertido BM25 sobre os parágrafos da base de conhecimento
+================================================================================
+
+Os parágrafos são tokenizados uma única vez (minúsculas, sem acentos, `\\w+`)
+e cada posting guarda o peso BM25 já calculado (idf x saturação de tf com
+normalização de tamanho), então uma consulta só soma pesos.
+
+Top-k exato com poda MaxScore: os termos da consulta são percorridos do maior
+para o menor peso máximo possível; quando a soma dos pesos máximos restantes
+não alcança o k-ésimo score, documentos novos não podem mais entrar no top-k e
+os termos restantes só pontuam os candidatos já encontrados (interseção das
+postings com o conjunto de candidatos, pela menor das duas).
+
+O índice é salvo em disco (JSON) com o SHA-256 do texto de origem; só é
+reconstruído quando o texto muda. Em memória, o mesmo texto (o `hash` de str
+fica em cache no objeto) reaproveita o índice sem re-hash nem re-tokenização.
+
+Usage:
+    index = get_lexical_index(full_text)
+    for paragraph_id, score in index.search("dose de rifampicina na PQT", k=5):
+        print(index.paragraphs[paragraph_id], score)
+"""
+
+import os
+import re
+import json
+import math
+import heapq
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from core.validation.keyword_matcher import fold_text
+
+try:
+    from app_config import config
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+# Palavras que aparecem em quase toda pergunta; não pontuam consultas
+STOPWORDS = frozenset(fold_text(word) for word in (
+    'a', 'o', 'as', 'os', 'e', 'é', 'de', 'da', 'do', 'das', 'dos', 'em', 'no', 'na', 'nos', 'nas',
+    'um', 'uma', 'que', 'com', 'para', 'por', 'se', 'eu', 'meu', 'minha', 'como', 'qual', 'quais',
+    'quando', 'posso', 'pode', 'ser', 'ao', 'à', 'sobre', 'mais'
+))
+
+def tokenize(text: str) -> List[str]:
+    """Tokens em minúsculas e sem acentos"""
+    return _TOKEN_PATTERN.findall(fold_text(text))
+
+def content_query(query: str) -> str:
+    """
+    Consulta sem stopwords. Termos como "de" e "para" estão em quase todo
+    parágrafo: somam pouco ao BM25 mas entram inteiros no upper_bound, e uma
+    consulta que só casa neles chegaria perto de 1.0 normalizada.
+    """
+    return ' '.join(token for token in tokenize(query) if token not in STOPWORDS)
+
+def _count_terms(term_frequencies: Dict[str, Dict[Hashable, int]], document_id: Hashable, tokens: List[str]):
+    for token in tokens:
+        postings = term_frequencies.get(token)
+        if postings is None:
+            postings = term_frequencies[token] = {}
+        postings[document_id] = postings.get(document_id, 0) + 1
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class LexicalIndex:
+    """Índice invertido com pesos BM25 pré-calculados por posting"""
+
+    def __init__(self, paragraphs: Sequence[str], source_hash: str = '', k1: float = 1.2, b: float = 0.75,
+                 min_paragraph_chars: int = 50):
+        self.paragraphs = list(paragraphs)
+        self.source_hash = source_hash
+        self.k1 = k1
+        self.b = b
+        self.min_paragraph_chars = min_paragraph_chars
+        # termo -> {parágrafo (ou id do documento): peso BM25}
+        self.postings: Dict[str, Dict[Hashable, float]] = {}
+        # termo -> maior peso da posting (limite superior para a poda)
+        self.max_weights: Dict[str, float] = {}
+        self.documents = 0
+
+    @classmethod
+    def from_text(cls, text: str, separator: str = '\n\n', **kwargs) -> 'LexicalIndex':
+        index = cls(text.split(separator), content_hash(text), **kwargs)
+        index.build()
+        return index
+
+    def build(self):
+        term_frequencies: Dict[str, Dict[int, int]] = {}
+        lengths: Dict[int, int] = {}
+        for paragraph_id, paragraph in enumerate(self.paragraphs):
+            if len(paragraph.strip()) < self.min_paragraph_chars:
+                continue
+            tokens = tokenize(paragraph)
+            if not tokens:
+                continue
+            lengths[paragraph_id] = len(tokens)
+            _count_terms(term_frequencies, paragraph_id, tokens)
+        self._set_weights(term_frequencies, lengths)
+
+    def _set_weights(self, term_frequencies: Dict[str, Dict[Hashable, int]], lengths: Dict[Hashable, int]):
+        """Pesos BM25 por posting a partir das frequências e tamanhos (em tokens)"""
+        self.documents = len(lengths)
+        average_length = (sum(lengths.values()) / self.documents) if self.documents else 0.0
+        k1, b = self.k1, self.b
+        self.postings = {}
+        self.max_weights = {}
+        for term, frequencies in term_frequencies.items():
+            frequency = len(frequencies)
+            idf = math.log(1 + (self.documents - frequency + 0.5) / (frequency + 0.5))
+            weights = {}
+            for document_id, tf in frequencies.items():
+                norm = k1 * (1 - b + b * lengths[document_id] / average_length)
+                weights[document_id] = idf * tf * (k1 + 1) / (tf + norm)
+            self.postings[term] = weights
+            self.max_weights[term] = max(weights.values())
+
+    def upper_bound(self, query: str) -> float:
+        """Maior score possível para a consulta (soma dos pesos máximos dos termos); normaliza scores em 0-1"""
+        return sum(self.max_weights.get(term, 0.0) for term in set(tokenize(query)))
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[Any, float]]:
+        """[(parágrafo, score)] dos k melhores, score decrescente (empate: menor id)"""
+        terms = sorted((term for term in set(tokenize(query)) if term in self.postings),
+                       key=lambda term: self.max_weights[term], reverse=True)
+        if not terms or k <= 0:
+            return []
+
+        # remaining[i] = soma dos pesos máximos dos termos i..fim
+        remaining = [0.0] * (len(terms) + 1)
+        for position in range(len(terms) - 1, -1, -1):
+            remaining[position] = remaining[position + 1] + self.max_weights[terms[position]]
+
+        scores: Dict[Hashable, float] = {}
+        for position, term in enumerate(terms):
+            postings = self.postings[term]
+            if len(scores) >= k and heapq.nlargest(k, scores.values())[-1] > remaining[position]:
+                # Nenhum documento ainda sem score chega ao top-k: só os candidatos pontuam
+                if len(postings) < len(scores):
+                    for paragraph_id, weight in postings.items():
+                        if paragraph_id in scores:
+                            scores[paragraph_id] += weight
+                else:
+                    for paragraph_id in scores:
+                        weight = postings.get(paragraph_id)
+                        if weight is not None:
+                            scores[paragraph_id] += weight
+            else:
+                for paragraph_id, weight in postings.items():
+                    scores[paragraph_id] = scores.get(paragraph_id, 0.0) + weight
+
+        return heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': INDEX_VERSION,
+            'source_hash': self.source_hash,
+            'params': {'k1': self.k1, 'b': self.b, 'min_paragraph_chars': self.min_paragraph_chars},
+            'documents': self.documents,
+            'postings': {term: [list(weights), list(weights.values())] for term, weights in self.postings.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, paragraphs: Sequence[str]) -> 'LexicalIndex':
+        index = cls(paragraphs, data['source_hash'], **data['params'])
+        index.documents = data['documents']
+        index.postings = {term: dict(zip(ids, weights)) for term, (ids, weights) in data['postings'].items()}
+        index.max_weights = {term: max(weights) for term, (_, weights) in data['postings'].items()}
+        return index
+
+    def save(self, path: str):
+        """Grava o índice (troca atômica)"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, text: str, source_hash: str, separator: str = '\n\n',
+             **params) -> Optional['LexicalIndex']:
+        """Índice salvo para este texto, ou None se ausente, de outra versão ou de outro conteúdo"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != INDEX_VERSION or data.get('source_hash') != source_hash:
+            return None
+        if params and any(data['params'].get(name) != value for name, value in params.items()):
+            return None
+        return cls.from_dict(data, text.split(separator))
+
+class DocumentLexicalIndex(LexicalIndex):
+    """
+    Índice léxico incremental por id de documento (ex.: os chunk ids do vector
+    store). add/remove só atualizam as frequências; os pesos BM25 (que dependem
+    do total de documentos e do tamanho médio) são recalculados na primeira
+    busca depois de uma alteração.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        super().__init__([], k1=k1, b=b, min_paragraph_chars=0)
+        self.texts: Dict[str, str] = {}
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+        self._term_frequencies: Dict[str, Dict[Hashable, int]] = {}
+        self._lengths: Dict[Hashable, int] = {}
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __contains__(self, document_id) -> bool:
+        return document_id in self.texts
+
+    def add(self, document_id: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        tokens = tokenize(text)
+        with self._lock:
+            if document_id in self.texts:
+                self._discard_terms(document_id)
+            self.texts[document_id] = text
+            self.metadata[document_id] = dict(metadata or {})
+            if tokens:
+                self._lengths[document_id] = len(tokens)
+                _count_terms(self._term_frequencies, document_id, tokens)
+            self._dirty = True
+
+    def remove(self, document_id: str) -> bool:
+        with self._lock:
+            if document_id not in self.texts:
+                return False
+            self._discard_terms(document_id)
+            del self.texts[document_id]
+            del self.metadata[document_id]
+            self._dirty = True
+            return True
+
+    def _discard_terms(self, document_id: str):
+        if self._lengths.pop(document_id, None) is None:
+            return
+        for token in set(tokenize(self.texts[document_id])):
+            postings = self._term_frequencies.get(token)
+            if postings is not None:
+                postings.pop(document_id, None)
+                if not postings:
+                    del self._term_frequencies[token]
+
+    def _refresh(self):
+        if self._dirty:
+            self._set_weights(self._term_frequencies, self._lengths)
+            self._dirty = False
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[Any, float]]:
+        with self._lock:
+            self._refresh()
+            return super().search(query, k)
+
+    def upper_bound(self, query: str) -> float:
+        with self._lock:
+            self._refresh()
+            return super().upper_bound(query)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'version': INDEX_VERSION,
+                'params': {'k1': self.k1, 'b': self.b},
+                'documents': {document_id: [text, self.metadata[document_id]]
+                              for document_id, text in self.texts.items()}
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DocumentLexicalIndex':
+        index = cls(**data['params'])
+        for document_id, (text, metadata) in data['documents'].items():
+            index.add(document_id, text, metadata)
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> Optional['DocumentLexicalIndex']:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != INDEX_VERSION:
+            return None
+        return cls.from_dict(data)
+
+def _index_dir() -> str:
+    return getattr(config, 'LEXICAL_INDEX_DIR', './cache/lexical_index')
+
+def load_or_build(text: str, path: str, **params) -> LexicalIndex:
+    """Carrega o índice salvo em `path` se o hash do texto bate; senão reconstrói e salva"""
+    source_hash = content_hash(text)
+    index = LexicalIndex.load(path, text, source_hash, **params)
+    if index is not None:
+        return index
+    index = LexicalIndex(text.split('\n\n'), source_hash, **params)
+    index.build()
+    try:
+        index.save(path)
+    except OSError as e:
+        logger.warning(f"Índice léxico não persistido em {path}: {e}")
+    return index
+
+_indexes: 'OrderedDict[Tuple[int, int], Tuple[str, LexicalIndex]]' = OrderedDict()
+_indexes_lock = threading.Lock()
+_MAX_INDEXES = 8
+
+def get_lexical_index(text: str, index_dir: Optional[str] = None) -> LexicalIndex:
+    """
+    Índice do texto, compartilhado no processo. Em disco fica em
+    <LEXICAL_INDEX_DIR>/<sha256[:16]>.json (vazio = só memória).
+    """
+    key = (len(text), hash(text))
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None and (cached[0] is text or cached[0] == text):
+            _indexes.move_to_end(key)
+            return cached[1]
+
+        directory = _index_dir() if index_dir is None else index_dir
+        if directory:
+            index = load_or_build(text, os.path.join(directory, f"{content_hash(text)[:16]}.json"))
+        else:
+            index = LexicalIndex.from_text(text)
+        _indexes[key] = (text, index)
+        while len(_indexes) > _MAX_INDEXES:
+            _indexes.popitem(last=False)
+        return index
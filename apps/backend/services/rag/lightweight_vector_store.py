@@ -33,6 +33,10 @@ from datetime import datetime, timedelta
 from collections import OrderedDict
 import hashlib
 
+from services.mmap_vector_index import (
+    INDEX_FILENAME, MappedVectorIndex, write_vector_index
+)
+
 logger = logging.getLogger(__name__)
 
 class LightweightVectorStore:
@@ -92,6 +96,13 @@ class LightweightVectorStore:
         # Load existing data
         self._load_metadata_index()
 
+        # Optional memory-mapped vector block (see export_mapped_index)
+        self.mapped_index: Optional[MappedVectorIndex] = None
+        self.mapped_ids = set()       # ids served by the mapped block (live rows only)
+        self._mapped_rows = {}        # id -> row in the mapped block
+        self._mapped_tombstones = set()  # rows deleted or superseded since the export
+        self._load_mapped_index()
+
         # Start memory monitoring
         self._start_memory_monitoring()
 
@@ -250,6 +261,132 @@ class LightweightVectorStore:
             logger.error(f"[LIGHTWEIGHT VECTOR] Failed to load metadata index: {e}")
             self.metadata_index = {}
 
+    def _load_mapped_index(self):
+        """Map vector_index.bin if present; its pages live in the shared page cache"""
+        index_file = os.path.join(self.storage_path, INDEX_FILENAME)
+        self.mapped_index = None
+        self.mapped_ids, self._mapped_rows, self._mapped_tombstones = set(), {}, set()
+        if not os.path.exists(index_file):
+            return
+
+        try:
+            self.mapped_index = MappedVectorIndex(index_file)
+            if self.mapped_index.count:
+                self.vector_dimensions = self.mapped_index.dimension
+            self._mapped_rows = {vector_id: row for row, vector_id in enumerate(self.mapped_index.ids)}
+
+            # Rows deleted (not in the metadata index) or re-added after the
+            # export ('unmapped') stay out of the scan until the next export
+            stale = {vector_id for vector_id in self._mapped_rows
+                     if self.metadata_index.get(vector_id, {'unmapped': True}).get('unmapped')}
+            self._mapped_tombstones = {self._mapped_rows[vector_id] for vector_id in stale}
+            self.mapped_ids = set(self._mapped_rows) - stale
+            logger.info(f"[LIGHTWEIGHT VECTOR] Mapped {self.mapped_index.count} vectors from {index_file} "
+                        f"({len(stale)} stale)")
+        except Exception as e:
+            logger.error(f"[LIGHTWEIGHT VECTOR] Failed to map vector index: {e}")
+            self.mapped_index = None
+            self.mapped_ids, self._mapped_rows, self._mapped_tombstones = set(), {}, set()
+
+    def _unmap(self, vector_id: str) -> bool:
+        """Tombstone the mapped row of vector_id; its per-file copy (if any) is authoritative"""
+        if vector_id not in self.mapped_ids:
+            return False
+        self.mapped_ids.discard(vector_id)
+        self._mapped_tombstones.add(self._mapped_rows[vector_id])
+        return True
+
+    def _drop_mapped_index(self):
+        """Unmap and remove vector_index.bin"""
+        self.mapped_index = None
+        self.mapped_ids, self._mapped_rows, self._mapped_tombstones = set(), {}, set()
+        index_file = os.path.join(self.storage_path, INDEX_FILENAME)
+        if os.path.exists(index_file):
+            os.remove(index_file)
+
+    def export_mapped_index(self, dtype: str = 'float32') -> Optional[str]:
+        """
+        Pack every per-file vector into a single memory-mapped index
+
+        After export, searches scan the mapped block instead of unpickling
+        vectors one at a time, and the 100-vector processing cap no longer
+        applies to mapped vectors.
+        """
+        with self.lock:
+            try:
+                ids, vectors, records, chunk_codes = [], [], [], []
+                priorities = list(self.medical_priorities.keys())
+
+                for vector_id in self.metadata_index:
+                    vector_data = self._load_vector_from_disk(vector_id)
+                    if not vector_data:
+                        continue
+                    metadata = vector_data['metadata']
+                    priority = metadata.get('medical_priority', 'general')
+                    if priority not in priorities:
+                        priorities.append(priority)
+
+                    ids.append(vector_id)
+                    vectors.append(np.asarray(vector_data['vector'], dtype=np.float32))
+                    records.append({'text': vector_data.get('text', ''), 'metadata': metadata})
+                    chunk_codes.append(priorities.index(priority))
+
+                matrix = np.vstack(vectors) if vectors else np.zeros((0, self.vector_dimensions or 0), dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1) if len(ids) else np.zeros(0, dtype=np.float32)
+                normalized = matrix / np.where(norms > 0, norms, 1.0)[:, None] if len(ids) else matrix
+
+                path = write_vector_index(
+                    os.path.join(self.storage_path, INDEX_FILENAME),
+                    ids, normalized, norms, np.asarray(chunk_codes, dtype=np.int32),
+                    priorities, records, dtype=dtype
+                )
+
+                # Exported ids are served by the new block again
+                for vector_id in ids:
+                    self.metadata_index[vector_id].pop('unmapped', None)
+                self._save_metadata_index()
+            except Exception as e:
+                logger.error(f"[LIGHTWEIGHT VECTOR] Failed to export mapped index: {e}")
+                return None
+
+        self._load_mapped_index()
+        return path
+
+    def _search_mapped(
+        self,
+        query_vector: np.ndarray,
+        top_k: int,
+        min_score: float,
+        medical_priority_filter: Optional[List[str]]
+    ) -> List[Tuple[str, float, Dict]]:
+        """Vectorized scan over the mapped block"""
+        index = self.mapped_index
+        if index is None or index.count == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+
+        similarities = index.vectors @ (query / query_norm)
+        if medical_priority_filter:
+            codes = [code for code, priority in enumerate(index.chunk_types) if priority in medical_priority_filter]
+            similarities = np.where(np.isin(index.chunk_codes, codes), similarities, -np.inf)
+        if self._mapped_tombstones:
+            similarities[list(self._mapped_tombstones)] = -np.inf
+
+        k = min(top_k, index.count)
+        top = np.argpartition(-similarities, k - 1)[:k] if k < index.count else np.arange(index.count)
+
+        results = []
+        for row in top[np.argsort(-similarities[top])]:
+            score = float(similarities[row])
+            if score < min_score or score == -np.inf:
+                break
+            results.append((index.ids[row], score, index.record(int(row))['metadata']))
+        return results
+
     def _save_metadata_index(self):
         """Save metadata index to disk (compressed)"""
         try:
@@ -338,6 +475,12 @@ class LightweightVectorStore:
                     'added_at': minimal_metadata['added_at']
                 }
 
+                # Re-added id: the mapped copy is stale, serve the new file
+                if vector_id in self._mapped_rows:
+                    self._unmap(vector_id)
+                    self.metadata_index[vector_id]['unmapped'] = True
+                    self._save_metadata_index()
+
                 # Add to cache if space available and important enough
                 if (len(self.vector_cache) < self.max_cache_size and
                     minimal_metadata['priority_score'] > 0.5):
@@ -381,7 +524,11 @@ class LightweightVectorStore:
         """
         with self.lock:
             try:
-                results = []
+                # Mapped vectors are scanned in one pass; per-file vectors
+                # below only cover ids added after the last export
+                results = self._search_mapped(query_vector, top_k, min_score, medical_priority_filter)
+                mapped_ids = self.mapped_ids
+
                 processed_count = 0
                 max_process_limit = 100  # Process max 100 vectors for memory
 
@@ -390,6 +537,9 @@ class LightweightVectorStore:
                     if processed_count >= max_process_limit:
                         break
 
+                    if vector_id in mapped_ids:
+                        continue
+
                     # Apply priority filter
                     if (medical_priority_filter and
                         metadata.get('medical_priority') not in medical_priority_filter):
@@ -425,7 +575,7 @@ class LightweightVectorStore:
                         if processed_count >= max_process_limit:
                             break
 
-                        if vector_id in self.vector_cache:
+                        if vector_id in self.vector_cache or vector_id in mapped_ids:
                             continue  # Already processed
 
                         # Apply priority filter
@@ -502,6 +652,9 @@ class LightweightVectorStore:
                 if vector_id in self.vector_cache:
                     del self.vector_cache[vector_id]
 
+                # Keep the mapped copy out of searches
+                self._unmap(vector_id)
+
                 # Remove from metadata index
                 if vector_id in self.metadata_index:
                     vector_file = self.metadata_index[vector_id]['file_path']
@@ -543,8 +696,9 @@ class LightweightVectorStore:
                     if os.path.exists(vector_file):
                         os.remove(vector_file)
 
-                # Clear metadata index
+                # Clear metadata index and the mapped block
                 self.metadata_index.clear()
+                self._drop_mapped_index()
                 self.stats['vectors_stored'] = 0
 
                 # Save empty index
@@ -570,7 +724,8 @@ class LightweightVectorStore:
                 'max_memory_mb': self.max_memory_mb,
                 'memory_pressure': self.memory_pressure,
                 'stats': dict(self.stats),
-                'medical_priorities': list(self.medical_priorities.keys())
+                'medical_priorities': list(self.medical_priorities.keys()),
+                'mapped_index': self.mapped_index.get_diagnostics() if self.mapped_index is not None else None
             }
 
     def force_memory_optimization(self) -> Dict[str, Any]:
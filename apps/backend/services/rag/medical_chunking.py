@@ -285,6 +285,9 @@ class MedicalChunker:
         
         all_chunks = []
         for section_name, section_content in sections.items():
+            # Título sem texto próprio (seguido direto de subtítulo) não vira chunk vazio
+            if not section_content.strip():
+                continue
             section_chunks = self.chunk_by_medical_semantics(section_content, section_name)
             all_chunks.extend(section_chunks)
             
@@ -300,6 +303,15 @@ class MedicalChunker:
     
     def _detect_sections(self, document: str) -> Dict[str, str]:
         """Detecta seções do documento médico"""
+        return dict(self.detect_anchored_sections(document))
+    
+    def detect_anchored_sections(self, document: str) -> List[Tuple[str, str]]:
+        """
+        Seções em ordem do documento como (âncora, conteúdo)
+        A âncora é o título normalizado; títulos repetidos recebem sufixo
+        ~2, ~3... na ordem em que aparecem, então editar o texto de uma seção
+        não muda a âncora de nenhuma outra.
+        """
         # Padrões para títulos de seções
         section_patterns = [
             (r'^#+\s+(.+)$', r'markdown_header'),  # Headers markdown
@@ -307,7 +319,7 @@ class MedicalChunker:
             (r'^(\d+\.?\s+[A-Za-z].+)$', r'numbered_section'),  # Seções numeradas
         ]
         
-        sections = {}
+        sections = []
         current_section = "introduction"
         current_content = []
         
@@ -322,7 +334,7 @@ class MedicalChunker:
                 if re.match(pattern, line_stripped, re.MULTILINE):
                     # Salvar seção anterior
                     if current_content:
-                        sections[current_section] = '\n'.join(current_content).strip()
+                        sections.append((current_section, '\n'.join(current_content).strip()))
                     
                     # Iniciar nova seção
                     current_section = self._normalize_section_name(line_stripped)
@@ -335,13 +347,21 @@ class MedicalChunker:
         
         # Salvar última seção
         if current_content:
-            sections[current_section] = '\n'.join(current_content).strip()
+            sections.append((current_section, '\n'.join(current_content).strip()))
         
         # Se não detectou seções, usar documento completo
-        if len(sections) <= 1 and not sections:
-            sections["document"] = document
-        
-        return sections
+        if not sections:
+            sections.append(("document", document))
+        
+        # Âncoras únicas: antes, títulos repetidos sobrescreviam a seção anterior
+        seen = {}
+        anchored = []
+        for section_name, section_content in sections:
+            seen[section_name] = seen.get(section_name, 0) + 1
+            anchor = section_name if seen[section_name] == 1 else f"{section_name}~{seen[section_name]}"
+            anchored.append((anchor, section_content))
+        
+        return anchored
     
     def _normalize_section_name(self, header: str) -> str:
         """Normaliza nome da seção"""
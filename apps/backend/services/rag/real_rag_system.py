@@ -17,6 +17,7 @@ import numpy as np
 from services.rag.real_vector_store import get_real_vector_store, VectorDocument, VectorSearchResult
 from services.cache.real_cloud_cache import get_real_cloud_cache
 from core.cloud.unified_real_cloud_manager import get_unified_cloud_manager
+from core.validation.keyword_matcher import get_keyword_matcher
 
 logger = logging.getLogger(__name__)
 
@@ -68,6 +69,11 @@ class RealRAGSystem:
         self.min_similarity_threshold = getattr(config, 'SEMANTIC_SIMILARITY_THRESHOLD', 0.7)
         self.max_context_chunks = getattr(config, 'MAX_CONTEXT_CHUNKS', 5)
         self.scope_keywords = self._load_scope_keywords()
+        # Normalized score: each keyword weighs 1/len(category)
+        self.scope_matcher = get_keyword_matcher('rag_scope', {
+            category: [(keyword, 1.0 / len(keywords)) for keyword in keywords]
+            for category, keywords in self.scope_keywords.items()
+        })
 
         # Cache configuration
         self.context_cache_ttl = timedelta(hours=2)
@@ -121,16 +127,9 @@ class RealRAGSystem:
         Check if query is within system scope
         Returns: (in_scope, category, confidence)
         """
-        query_lower = query.lower()
-
-        # Check keywords by category
-        category_scores = {}
-
-        for category, keywords in self.scope_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in query_lower)
-            if score > 0:
-                # Normalize score based on category size
-                category_scores[category] = score / len(keywords)
+        # Check keywords by category (single pass, accent-insensitive)
+        scores = self.scope_matcher.scores(query)
+        category_scores = {category: scores[category] for category in self.scope_keywords if category in scores}
 
         if not category_scores:
             return False, 'unknown', 0.0
@@ -6,12 +6,17 @@ Implementa lazy loading para evitar timeout em Cloud Run
 Compatível com sentence-transformers v5.1+ - métodos otimizados query/document
 """
 
+import os
 import logging
-import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Tuple, Any
 from datetime import datetime
 from dataclasses import dataclass
 
+from services.rag.indexing_pipeline import content_id
+from services.rag.lexical_index import DocumentLexicalIndex, content_query
+
 # Import apenas bibliotecas leves na inicialização
 try:
     import numpy as np
@@ -36,6 +41,33 @@ except ImportError:
 
     MEDICAL_CHUNKING_AVAILABLE = False
 
+# Busca léxica roda em paralelo à densa (embedding + RPC do vector store)
+_lexical_executor: Optional[ThreadPoolExecutor] = None
+_lexical_executor_lock = threading.Lock()
+
+def _get_lexical_executor() -> ThreadPoolExecutor:
+    global _lexical_executor
+    if _lexical_executor is None:
+        with _lexical_executor_lock:
+            if _lexical_executor is None:
+                _lexical_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='lexical-search')
+    return _lexical_executor
+
+def get_lexical_index_path(config) -> str:
+    """Arquivo do índice léxico do SemanticSearchEngine ('' sem LEXICAL_INDEX_DIR)"""
+    index_dir = getattr(config, 'LEXICAL_INDEX_DIR', '')
+    return os.path.join(index_dir, 'semantic_chunks.json') if index_dir else ''
+
+def pipeline_lexical_metadata(chunk) -> Dict[str, Any]:
+    """Metadados léxicos de um PipelineChunk (mesmo formato de _lexical_metadata)"""
+    return {
+        'section': chunk.metadata.get('section'),
+        'category': chunk.chunk_type,
+        'priority': chunk.priority,
+        'chunk_type': chunk.chunk_type,
+        'source_file': chunk.source_file
+    }
+
 # Lazy imports - só carregados quando necessário
 def _lazy_import_embedding_service():
     """Import lazy do embedding service"""
@@ -105,6 +137,18 @@ class SemanticSearchEngine:
             'general': 0.6      # Informação geral básica
         })
         
+        # Índice léxico (BM25) sobre os mesmos chunk ids do vector store: busca híbrida
+        # fundida por RRF (ou média ponderada) antes dos pesos médicos
+        self.hybrid_enabled = getattr(config, 'HYBRID_SEARCH_ENABLED', True)
+        self.fusion_method = getattr(config, 'HYBRID_FUSION', 'rrf')  # 'rrf' ou 'weighted'
+        self.rrf_k = getattr(config, 'HYBRID_RRF_K', 60)
+        self.dense_weight = getattr(config, 'HYBRID_DENSE_WEIGHT', 0.6)  # só para 'weighted'
+        self.lexical_threshold = getattr(config, 'LEXICAL_SIMILARITY_THRESHOLD', 0.35)
+        self.lexical_index_path = get_lexical_index_path(config)
+        self.lexical_index = (
+            DocumentLexicalIndex.load(self.lexical_index_path) if self.lexical_index_path else None
+        ) or DocumentLexicalIndex()
+        
         # Cache de busca recente
         self.search_cache = {}
         self.cache_ttl = 3600  # 1 hora
@@ -114,7 +158,9 @@ class SemanticSearchEngine:
             'searches_performed': 0,
             'cache_hits': 0,
             'avg_search_time': 0.0,
-            'documents_indexed': 0
+            'documents_indexed': 0,
+            'hybrid_searches': 0,
+            'lexical_only_searches': 0
         }
         
         logger.info("[SEARCH] Semantic Search Engine inicializado")
@@ -128,11 +174,17 @@ class SemanticSearchEngine:
             self.embedding_service.is_available()
         )
     
+    def is_hybrid_active(self) -> bool:
+        """Índice léxico habilitado e com documentos"""
+        return self.hybrid_enabled and len(self.lexical_index) > 0
+    
+    def is_search_available(self) -> bool:
+        """Busca possível: densa, ou só léxica quando embeddings/vector store estão fora"""
+        return self.is_available() or self.is_hybrid_active()
+    
     def _generate_chunk_id(self, text: str, source: str) -> str:
-        """Gera ID único para chunk"""
-        content = f"{source}:{text[:100]}"
-        # SHA-256 for chunk IDs (not sensitive data)
-        return hashlib.sha256(content.encode()).hexdigest()
+        """Gera ID único para chunk (mesmo id do pipeline de indexação)"""
+        return content_id(text, source)
     
     def index_medical_chunk(
         self, 
@@ -163,6 +215,8 @@ class SemanticSearchEngine:
                 existing = self.vector_store.get_document(chunk_id)
                 if existing:
                     logger.debug(f"Chunk {chunk_id} já indexado")
+                    if chunk_id not in self.lexical_index:
+                        self.lexical_index.add(chunk_id, chunk.content, self._lexical_metadata(chunk, source_file))
                     return True
             
             # Gerar embedding
@@ -204,6 +258,7 @@ class SemanticSearchEngine:
             success = self.vector_store.add_document(doc)
             
             if success:
+                self.lexical_index.add(chunk_id, chunk.content, self._lexical_metadata(chunk, source_file))
                 self.stats['documents_indexed'] += 1
                 logger.debug(f"Chunk indexado: {chunk_id} - Tipo: {chunk.category}")
             
@@ -252,7 +307,8 @@ class SemanticSearchEngine:
                 else:
                     embeddings.append(result)
 
-            # Indexar cada chunk com seu embedding
+            # Montar os documentos do lote com seus embeddings
+            documents = []
             for chunk, embedding in zip(batch, embeddings):
                 if embedding is not None:
                     chunk_id = self._generate_chunk_id(chunk.content, source_file)
@@ -272,20 +328,61 @@ class SemanticSearchEngine:
                         source_file=source_file,
                         created_at=datetime.now()
                     )
-                    
-                    if self.vector_store.add_document(doc):
-                        success_count += 1
-                    else:
-                        failed_count += 1
+                    documents.append((chunk, doc))
                 else:
                     failed_count += 1
+
+            # Upsert do lote inteiro numa escrita quando o store suporta
+            add_documents = getattr(self.vector_store, 'add_documents', None)
+            if add_documents is not None and documents:
+                written = add_documents([doc for _, doc in documents])
+                stored = documents if written == len(documents) else [
+                    (chunk, doc) for chunk, doc in documents if self.vector_store.get_document(doc.id) is not None]
+            else:
+                stored = [(chunk, doc) for chunk, doc in documents if self.vector_store.add_document(doc)]
+            for chunk, doc in stored:
+                self.lexical_index.add(doc.id, chunk.content, self._lexical_metadata(chunk, source_file))
+            success_count += len(stored)
+            failed_count += len(documents) - len(stored)
             
             logger.info(f"Lote processado: {success_count} indexados, {failed_count} falhas")
         
         self.stats['documents_indexed'] += success_count
+        self.save_lexical_index()
         
         return success_count, failed_count
     
+    def _lexical_metadata(self, chunk: MedicalChunk, source_file: str) -> Dict[str, Any]:
+        return {
+            'section': chunk.source_section,
+            'category': chunk.category,
+            'priority': chunk.priority,
+            'chunk_type': chunk.category,
+            'source_file': source_file
+        }
+    
+    def index_lexical_chunks(self, chunks: List[MedicalChunk], source_file: str) -> int:
+        """
+        Indexa chunks apenas no índice léxico (não exige embeddings): mantém a
+        busca disponível quando o serviço de embeddings ou o vector store caem
+        """
+        for chunk in chunks:
+            chunk_id = self._generate_chunk_id(chunk.content, source_file)
+            self.lexical_index.add(chunk_id, chunk.content, self._lexical_metadata(chunk, source_file))
+        self.save_lexical_index()
+        return len(chunks)
+    
+    def save_lexical_index(self) -> bool:
+        """Persiste o índice léxico em LEXICAL_INDEX_DIR (recarregado no próximo start)"""
+        if not self.lexical_index_path or not len(self.lexical_index):
+            return False
+        try:
+            self.lexical_index.save(self.lexical_index_path)
+            return True
+        except OSError as e:
+            logger.warning(f"Índice léxico não persistido: {e}")
+            return False
+    
     def search(
         self,
         query: str,
@@ -295,7 +392,7 @@ class SemanticSearchEngine:
         use_medical_weights: bool = True
     ) -> List[SearchResult]:
         """
-        Busca semântica com priorização médica
+        Busca híbrida (densa + BM25) com priorização médica
         
         Args:
             query: Texto da consulta
@@ -307,7 +404,9 @@ class SemanticSearchEngine:
         Returns:
             Lista de resultados ordenados por relevância
         """
-        if not self.is_available():
+        dense_available = self.is_available()
+        lexical_available = self.is_hybrid_active()
+        if not dense_available and not lexical_available:
             logger.warning("Busca semântica não disponível")
             return []
         
@@ -316,7 +415,7 @@ class SemanticSearchEngine:
             min_score = self.config.SEMANTIC_SIMILARITY_THRESHOLD
         
         # Verificar cache
-        cache_key = f"{query}:{top_k}:{min_score}:{chunk_types}"
+        cache_key = f"{query}:{top_k}:{min_score}:{chunk_types}:{use_medical_weights}:{dense_available}"
         if cache_key in self.search_cache:
             cached_result, cached_time = self.search_cache[cache_key]
             if (datetime.now() - cached_time).total_seconds() < self.cache_ttl:
@@ -325,71 +424,27 @@ class SemanticSearchEngine:
         
         try:
             start_time = datetime.now()
-            
-            # Gerar embedding da query
-            # Sentence-transformers v5.1+ - usar embed_query para consultas do usuário
-            if hasattr(self.embedding_service, 'embed_query'):
-                query_embedding_result = self.embedding_service.embed_query(query)
-                logger.debug(f"[V5.1+] Usando embed_query() para consulta do usuário")
-            else:
-                query_embedding_result = self.embedding_service.embed_text(query)
-
-            # Extract numpy array from EmbeddingResult
-            if hasattr(query_embedding_result, 'embedding'):
-                query_embedding = query_embedding_result.embedding
-            else:
-                query_embedding = query_embedding_result
-
-            if query_embedding is None:
-                logger.error("Falha ao gerar embedding da query")
-                return []
-            
-            # Buscar documentos similares
             # Buscar mais resultados para aplicar filtros depois
-            search_results = self.vector_store.search_similar(
-                query_embedding,
-                top_k=top_k * 2 if chunk_types else top_k,
-                min_score=min_score * 0.8  # Margem para weighted score
-            )
+            candidate_k = top_k * 2 if chunk_types else top_k
             
-            # Converter para SearchResults
-            results = []
-            for doc, score in search_results:
-                # Filtrar por tipo se especificado
-                if chunk_types and doc.chunk_type not in chunk_types:
-                    continue
-                
-                # Criar MedicalChunk
-                chunk = MedicalChunk(
-                    content=doc.text,
-                    category=doc.chunk_type,
-                    priority=doc.priority,
-                    source_section=doc.metadata.get('section', ''),
-                    word_count=len(doc.text.split()),
-                    contains_dosage=('dosage' in doc.chunk_type),
-                    contains_contraindication=('contraindication' in doc.chunk_type)
-                )
-                
-                # Calcular weighted score se habilitado
-                if use_medical_weights:
-                    # Aplicar peso baseado no tipo de conteúdo
-                    weight = self.content_weights.get(doc.chunk_type, 0.5)
-                    weighted_score = score * weight * doc.priority
-                else:
-                    weighted_score = score
-                
-                # Aplicar threshold no weighted score
-                if weighted_score >= min_score:
-                    results.append(SearchResult(
-                        chunk=chunk,
-                        score=score,
-                        weighted_score=weighted_score,
-                        source=doc.source_file or 'unknown',
-                        metadata=doc.metadata
-                    ))
+            # BM25 em paralelo ao embedding da query + busca no vector store
+            lexical_future = None
+            if lexical_available and dense_available:
+                lexical_future = _get_lexical_executor().submit(self._lexical_search, query, candidate_k)
             
-            # Ordenar por weighted score
-            results.sort(key=lambda x: x.weighted_score, reverse=True)
+            dense_hits = []
+            if dense_available:
+                dense_hits = self._dense_search(query, candidate_k, min_score)
+                if dense_hits is None and not lexical_available:
+                    return []
+                dense_hits = dense_hits or []
+            
+            if lexical_available:
+                lexical_hits = lexical_future.result() if lexical_future else self._lexical_search(query, candidate_k)
+                results = self._fuse_results(dense_hits, lexical_hits, min_score, chunk_types, use_medical_weights)
+                self.stats['hybrid_searches' if dense_available else 'lexical_only_searches'] += 1
+            else:
+                results = self._dense_results(dense_hits, min_score, chunk_types, use_medical_weights)
             
             # Limitar ao top_k
             results = results[:top_k]
@@ -417,6 +472,148 @@ class SemanticSearchEngine:
             logger.error(f"Erro na busca semântica: {e}")
             return []
     
+    def _dense_search(self, query: str, candidate_k: int, min_score: float) -> Optional[List[Tuple[Any, float]]]:
+        """[(VectorDocument, similaridade)] do vector store; None se o embedding da query falhar"""
+        # Sentence-transformers v5.1+ - usar embed_query para consultas do usuário
+        if hasattr(self.embedding_service, 'embed_query'):
+            query_embedding_result = self.embedding_service.embed_query(query)
+            logger.debug(f"[V5.1+] Usando embed_query() para consulta do usuário")
+        else:
+            query_embedding_result = self.embedding_service.embed_text(query)
+
+        # Extract numpy array from EmbeddingResult
+        if hasattr(query_embedding_result, 'embedding'):
+            query_embedding = query_embedding_result.embedding
+        else:
+            query_embedding = query_embedding_result
+
+        if query_embedding is None:
+            logger.error("Falha ao gerar embedding da query")
+            return None
+        
+        return self.vector_store.search_similar(
+            query_embedding,
+            top_k=candidate_k,
+            min_score=min_score * 0.8  # Margem para weighted score
+        )
+    
+    def _lexical_search(self, query: str, candidate_k: int) -> Tuple[List[Tuple[str, float]], float]:
+        """([(chunk_id, bm25)], maior score possível da consulta), sem stopwords nos dois"""
+        query = content_query(query)
+        if not query:
+            return [], 0.0
+        return self.lexical_index.search(query, k=candidate_k), self.lexical_index.upper_bound(query)
+    
+    def _medical_weight(self, chunk_type: str, priority: float, use_medical_weights: bool) -> float:
+        """Peso do tipo de conteúdo x prioridade do chunk"""
+        if not use_medical_weights:
+            return 1.0
+        return self.content_weights.get(chunk_type, 0.5) * priority
+    
+    def _make_result(self, text: str, chunk_type: str, priority: float, metadata: Dict[str, Any],
+                     source_file: Optional[str], score: float, weighted_score: float) -> SearchResult:
+        chunk = MedicalChunk(
+            content=text,
+            category=chunk_type,
+            priority=priority,
+            source_section=metadata.get('section', ''),
+            word_count=len(text.split()),
+            contains_dosage=('dosage' in chunk_type),
+            contains_contraindication=('contraindication' in chunk_type)
+        )
+        return SearchResult(
+            chunk=chunk,
+            score=score,
+            weighted_score=weighted_score,
+            source=source_file or 'unknown',
+            metadata=metadata
+        )
+    
+    def _dense_results(self, dense_hits, min_score: float, chunk_types: Optional[List[str]],
+                       use_medical_weights: bool) -> List[SearchResult]:
+        """Só busca densa (índice léxico vazio ou desabilitado)"""
+        results = []
+        for doc, score in dense_hits:
+            # Filtrar por tipo se especificado
+            if chunk_types and doc.chunk_type not in chunk_types:
+                continue
+            
+            # Aplicar peso baseado no tipo de conteúdo
+            weighted_score = score * self._medical_weight(doc.chunk_type, doc.priority, use_medical_weights)
+            
+            # Aplicar threshold no weighted score
+            if weighted_score >= min_score:
+                results.append(self._make_result(doc.text, doc.chunk_type, doc.priority, doc.metadata,
+                                                 doc.source_file, score, weighted_score))
+        
+        # Ordenar por weighted score
+        results.sort(key=lambda x: x.weighted_score, reverse=True)
+        return results
+    
+    def _fuse_results(self, dense_hits, lexical_hits: Tuple[List[Tuple[str, float]], float], min_score: float,
+                      chunk_types: Optional[List[str]], use_medical_weights: bool) -> List[SearchResult]:
+        """
+        Funde as listas densa e léxica (RRF: soma de 1/(k + posição); 'weighted':
+        média ponderada dos scores normalizados) e só depois aplica os pesos
+        médicos. score = maior evidência entre similaridade densa e BM25
+        normalizado (BM25 / maior score possível da consulta sem stopwords).
+        O lado denso passa com similaridade x peso médico >= min_score, como na
+        busca só densa; o BM25 normalizado mede cobertura dos termos, não
+        cosseno, e passa com LEXICAL_SIMILARITY_THRESHOLD (escalado por
+        min_score / SEMANTIC_SIMILARITY_THRESHOLD).
+        """
+        candidates: Dict[str, Dict[str, Any]] = {}
+        default_min_score = self.config.SEMANTIC_SIMILARITY_THRESHOLD
+        lexical_min_score = (self.lexical_threshold * min_score / default_min_score
+                             if default_min_score else min_score)
+        
+        dense = [(doc, score) for doc, score in dense_hits if not chunk_types or doc.chunk_type in chunk_types]
+        for rank, (doc, score) in enumerate(dense):
+            candidates[doc.id] = {
+                'fields': (doc.text, doc.chunk_type, doc.priority, doc.metadata, doc.source_file),
+                'dense': score, 'lexical': None, 'ranks': [rank]
+            }
+        
+        hits, bound = lexical_hits
+        metadata = self.lexical_index.metadata
+        lexical = [(doc_id, bm25) for doc_id, bm25 in hits
+                   if not chunk_types or metadata[doc_id].get('chunk_type') in chunk_types]
+        for rank, (doc_id, bm25) in enumerate(lexical):
+            entry = candidates.get(doc_id)
+            if entry is None:
+                meta = metadata[doc_id]
+                entry = candidates[doc_id] = {
+                    'fields': (self.lexical_index.texts[doc_id], meta.get('chunk_type', 'general'),
+                               meta.get('priority', 0.5), meta, meta.get('source_file')),
+                    'dense': None, 'lexical': None, 'ranks': []
+                }
+            entry['lexical'] = bm25 / bound if bound else 0.0
+            entry['ranks'].append(rank)
+        
+        ranked = []
+        for entry in candidates.values():
+            text, chunk_type, priority, doc_metadata, source_file = entry['fields']
+            dense_score = entry['dense'] or 0.0
+            lexical_score = entry['lexical'] or 0.0
+            if self.fusion_method == 'weighted':
+                fused = self.dense_weight * dense_score + (1 - self.dense_weight) * lexical_score
+            else:
+                fused = sum(1.0 / (self.rrf_k + rank + 1) for rank in entry['ranks'])
+            
+            score = max(dense_score, lexical_score)
+            weight = self._medical_weight(chunk_type, priority, use_medical_weights)
+            if dense_score * weight < min_score and lexical_score < lexical_min_score:
+                continue
+            
+            retrieval = 'hybrid' if entry['dense'] is not None and entry['lexical'] is not None else (
+                'dense' if entry['dense'] is not None else 'lexical')
+            result_metadata = {**doc_metadata, 'retrieval': retrieval, 'fused_score': fused}
+            ranked.append((fused * weight, self._make_result(text, chunk_type, priority, result_metadata,
+                                                              source_file, score, score * weight)))
+        
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [result for _, result in ranked]
+    
     def search_medical_context(
         self,
         query: str,
@@ -513,6 +710,7 @@ class SemanticSearchEngine:
             stats['vector_store_stats'] = self.vector_store.get_stats()
         
         stats['cache_size'] = len(self.search_cache)
+        stats['lexical_documents'] = len(self.lexical_index)
         stats['available'] = self.is_available()
         
         return stats
@@ -542,11 +740,11 @@ def get_semantic_search() -> Optional[SemanticSearchEngine]:
 def search_medical_context(query: str, max_chunks: int = 3) -> str:
     """Função de conveniência para buscar contexto médico"""
     engine = get_semantic_search()
-    if engine and engine.is_available():
+    if engine and engine.is_search_available():
         return engine.search_medical_context(query, 'mixed', max_chunks)
     return ""
 
 def is_semantic_search_available() -> bool:
     """Verifica se busca semântica está disponível"""
     engine = get_semantic_search()
-    return engine is not None and engine.is_available()
\ No newline at end of file
+    return engine is not None and engine.is_search_available()
\ No newline at end of file
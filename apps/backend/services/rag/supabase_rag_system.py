@@ -4,15 +4,18 @@ Supabase RAG System - Sistema RAG integrado com Supabase pgvector
 FASE 3 - Sistema RAG refatorado para usar PostgreSQL + embeddings
 """
 
+import re
+import time
 import logging
 import hashlib
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime, timezone, timedelta
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 # Import dependências necessárias
 # SearchResult será importado nas linhas seguintes
 from core.logging.sanitizer import sanitize_error
+from core.validation.keyword_matcher import get_keyword_matcher
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +25,7 @@ try:
     from services.rag.semantic_search import SemanticSearchEngine, SearchResult
     from services.cache.cloud_native_cache import get_cloud_cache
     from services.rag.medical_chunking import MedicalChunk
+    from services.cache.semantic_answer_cache import SemanticAnswerCache
     DEPENDENCIES_AVAILABLE = True
 except ImportError as e:
     logger.warning("[WARNING] Dependências RAG não disponíveis: %s", sanitize_error(e))
@@ -30,6 +34,33 @@ except ImportError as e:
 # SonarQube S1192: Constant for duplicated string literal
 INTERACTION_KEYWORD = 'interação'
 
+# Termos que nunca podem ser misturados no cache semântico: uma resposta para
+# "dose em adultos" não serve para "dose em crianças", por mais próximos que
+# sejam os embeddings
+POPULATION_TERMS = {
+    'pediatrico': ['criança', 'crianca', 'infantil', 'pediátric', 'pediatric', 'bebê', 'lactente', 'menor de'],
+    'adulto': ['adulto'],
+    'gestante': ['gestante', 'grávida', 'gravida', 'gravidez', 'gestação', 'lactação', 'amamenta'],
+    'idoso': ['idoso'],
+    'peso': ['kg', 'peso'],
+}
+_NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)?')
+
+# Keywords por tipo de consulta (ordem = desempate de _classify_query_type)
+QUERY_TYPE_KEYWORDS = {
+    'dosing_queries': ['dosagem', 'dose', 'mg', 'kg', 'quantidade', 'quanto', 'posologia',
+                       'administra', 'toma', 'peso', 'rifampicina', 'dapsona', 'clofazimina',
+                       'diário', 'mensal', 'supervisionado'],
+    'safety_queries': ['efeito', 'adverso', 'colateral', 'segurança', 'contraindicação',
+                       'reação', 'toxicidade', 'risco', 'perigo', 'cuidado', 'gestante',
+                       'gravidez', 'hepatotoxicidade', 'hemólise', 'anemia'],
+    'interaction_queries': [INTERACTION_KEYWORD, 'interações', 'combinação', 'junto', 'associa',
+                            'anticoncepcional', 'medicamento', 'fármaco', 'droga',
+                            'cefazolina', 'nevirapina', 'antirretroviral'],
+    'procedure_queries': ['procedimento', 'dispensação', 'roteiro', 'como', 'etapa',
+                          'passo', 'protocolo', 'processo', 'fluxo', 'orientação']
+}
+
 # Import OpenRouter para contexto adicional
 try:
     from services.ai.openai_integration import get_openrouter_client
@@ -88,9 +119,26 @@ class SupabaseRAGSystem:
         logger.info(f"📦 Max context chunks: {self.max_context_chunks}")
 
         self.scope_keywords = self._load_scope_keywords()
+        # Escopo e tipo de consulta num único autômato: a mensagem é varrida uma vez
+        # e _classify_query_type reaproveita a varredura de is_query_in_scope.
+        # Escopo pesa 1/len(categoria) (score normalizado); tipo conta keywords.
+        self.query_matcher = get_keyword_matcher('rag_query', {
+            **{category: [(keyword, 1.0 / len(keywords)) for keyword in keywords]
+               for category, keywords in self.scope_keywords.items()},
+            **QUERY_TYPE_KEYWORDS
+        })
         
         # Cache de contextos gerados
         self.context_cache_ttl = timedelta(hours=2)
+
+        # Cache semântico de respostas (perguntas parafraseadas, mesma persona)
+        self.semantic_cache = None
+        if DEPENDENCIES_AVAILABLE and config and getattr(config, 'SEMANTIC_CACHE_ENABLED', True):
+            self.semantic_cache = SemanticAnswerCache(
+                threshold=getattr(config, 'SEMANTIC_CACHE_THRESHOLD', 0.95),
+                ttl_seconds=getattr(config, 'SEMANTIC_CACHE_TTL_SECONDS', 3600),
+                max_entries=getattr(config, 'SEMANTIC_CACHE_MAX_ENTRIES', 2000)
+            )
         
         # Estatísticas
         self.stats = {
@@ -99,7 +147,8 @@ class SupabaseRAGSystem:
             'supabase_searches': 0,
             'openrouter_calls': 0,
             'avg_context_score': 0.0,
-            'scope_violations': 0
+            'scope_violations': 0,
+            'semantic_cache_hits': 0
         }
         
         logger.info("🧠 SupabaseRAGSystem inicializado")
@@ -107,6 +156,7 @@ class SupabaseRAGSystem:
         logger.info(f"   - Cache: {'[OK]' if self.cache else '[ERROR]'}")
         logger.info(f"   - Search Engine: {'[OK]' if self.search_engine else '[ERROR]'}")
         logger.info(f"   - OpenRouter: {'[OK]' if self.openrouter_client else '[ERROR]'}")
+        logger.info(f"   - Semantic Cache: {'[OK]' if self.semantic_cache is not None else '[DISABLED]'}")
     
     def _load_scope_keywords(self) -> Dict[str, List[str]]:
         """Carrega palavras-chave para detecção de escopo"""
@@ -132,16 +182,9 @@ class SupabaseRAGSystem:
         Verifica se query está dentro do escopo do sistema
         Returns: (in_scope, category, confidence)
         """
-        query_lower = query.lower()
-        
-        # Verificar palavras-chave por categoria
-        category_scores = {}
-        
-        for category, keywords in self.scope_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in query_lower)
-            if score > 0:
-                # Normalizar score baseado no tamanho da categoria
-                category_scores[category] = score / len(keywords)
+        # Verificar palavras-chave por categoria (uma varredura, sem acentos)
+        scores = self.query_matcher.scores(query)
+        category_scores = {category: scores[category] for category in self.scope_keywords if category in scores}
         
         if not category_scores:
             return False, 'unknown', 0.0
@@ -185,10 +228,12 @@ class SupabaseRAGSystem:
         # Busca semântica no Supabase
         context_chunks = []
         
-        if self.search_engine and self.search_engine.is_available():
+        if self.search_engine and self.search_engine.is_search_available():
+            # A fusão híbrida já traz os candidatos lexicais; só a busca densa pura
+            # precisa de folga para filtrar depois
             search_results = self.search_engine.search(
                 query=query,
-                top_k=max_chunks * 2,  # Buscar mais para filtrar depois
+                top_k=max_chunks if self.search_engine.is_hybrid_active() else max_chunks * 2,
                 min_score=self.min_similarity_threshold,
                 chunk_types=chunk_types,
                 use_medical_weights=True
@@ -313,6 +358,76 @@ class SupabaseRAGSystem:
         
         return response
     
+    def answer_query(
+        self,
+        query: str,
+        persona: str = 'dr_gasnelio',
+        max_chunks: int = 3,
+        enhance_with_openrouter: bool = True
+    ) -> RAGResponse:
+        """
+        Pipeline completo (contexto + resposta) com cache semântico:
+        perguntas parafraseadas da mesma persona reutilizam a resposta anterior
+        """
+        start_time = time.perf_counter()
+
+        query_embedding = self._embed_query(query) if self.semantic_cache is not None else None
+        partition = self._semantic_cache_partition(query, persona)
+
+        if query_embedding is not None:
+            cached = self.semantic_cache.lookup(query_embedding, partition)
+            if cached:
+                response, similarity = cached
+                self.stats['semantic_cache_hits'] += 1
+                logger.debug("[SEMANTIC CACHE] hit (similarity %.3f)", similarity)
+                return replace(
+                    response,
+                    processing_time_ms=int((time.perf_counter() - start_time) * 1000)
+                )
+
+        context = self.retrieve_context(query=query, max_chunks=max_chunks, use_cache=True)
+        response = self.generate_answer(
+            query=query,
+            context=context,
+            persona=persona,
+            enhance_with_openrouter=enhance_with_openrouter
+        )
+
+        # Só respostas fundamentadas em contexto entram no cache
+        if query_embedding is not None and context.chunks:
+            self.semantic_cache.store(
+                query_embedding, partition, response,
+                latency_ms=(time.perf_counter() - start_time) * 1000
+            )
+
+        return response
+
+    def _embed_query(self, query: str):
+        """Embedding da query pelo serviço do motor de busca (None se indisponível)"""
+        embedding_service = getattr(self.search_engine, 'embedding_service', None)
+        if embedding_service is None:
+            return None
+        try:
+            if hasattr(embedding_service, 'embed_query'):
+                result = embedding_service.embed_query(query)
+            else:
+                result = embedding_service.embed_text(query)
+            return getattr(result, 'embedding', result)
+        except Exception as e:
+            logger.debug("Embedding para cache semântico indisponível: %s", sanitize_error(e))
+            return None
+
+    @staticmethod
+    def _semantic_cache_partition(query: str, persona: str) -> str:
+        """Chave exata do cache semântico: persona + números + grupo de pacientes"""
+        query_lower = query.lower()
+        numbers = sorted(set(_NUMBER_PATTERN.findall(query_lower)))
+        groups = sorted(
+            group for group, terms in POPULATION_TERMS.items()
+            if any(term in query_lower for term in terms)
+        )
+        return f"{persona}|{','.join(numbers)}|{','.join(groups)}"
+
     def _format_context_for_generation(self, context: RAGContext, persona: str) -> str:
         """Formata contexto recuperado para geração"""
         if not context.chunks:
@@ -395,39 +510,13 @@ class SupabaseRAGSystem:
     ) -> Optional[str]:
         """Enhanceamento com OpenRouter usando prompts estruturados existentes"""
         try:
-            # Usar prompts estruturados existentes
-            if persona == 'dr_gasnelio':
-                from config.dr_gasnelio_technical_prompt import DrGasnelioTechnicalPrompt
-                prompt_system = DrGasnelioTechnicalPrompt()
-                
-                # Determinar tipo de query
-                query_type = self._classify_query_type(query, category)
-                system_prompt = prompt_system.create_context_specific_prompt(query_type, query)
-                
-            else:  # ga_empathetic
-                from config.ga_empathetic_prompt import GaEmpatheticPrompt
-                prompt_system = GaEmpatheticPrompt()
-                system_prompt = prompt_system.get_empathetic_prompt(query)
-            
-            # Contexto para OpenRouter
-            user_prompt = f"""
-Contexto da base de conhecimento:
-{base_answer}
-
-Pergunta específica: {query}
-Categoria identificada: {category}
-
-INSTRUÇÃO: Responda usando sua expertise em hanseníase, baseando-se no contexto fornecido e mantendo fidelidade ao seu estilo de comunicação.
-"""
+            prompt_system, messages = self.build_generation_messages(query, base_answer, persona, category)
             
             if self.openrouter_client:
                 # Usar modelo gratuito com prompts estruturados
                 response = self.openrouter_client.chat.completions.create(
                     model="qwen/qwen3-8b:free",     # Qwen 8B Free
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
+                    messages=messages,
                     max_tokens=600,
                     temperature=0.3,
                     top_p=0.9
@@ -451,6 +540,47 @@ INSTRUÇÃO: Responda usando sua expertise em hanseníase, baseando-se no contex
             logger.warning("Erro no enhancement OpenRouter: %s", sanitize_error(e))
             return None
 
+    def build_generation_messages(
+        self,
+        query: str,
+        context_text: str,
+        persona: str,
+        category: str
+    ) -> Tuple[Any, List[Dict[str, str]]]:
+        """
+        Mensagens (system + user) para o LLM usando os prompts estruturados das personas
+
+        Returns:
+            (prompt_system, messages) - prompt_system expõe a validação da persona
+        """
+        if persona == 'dr_gasnelio':
+            from config.dr_gasnelio_technical_prompt import DrGasnelioTechnicalPrompt
+            prompt_system = DrGasnelioTechnicalPrompt()
+
+            # Determinar tipo de query
+            query_type = self._classify_query_type(query, category)
+            system_prompt = prompt_system.create_context_specific_prompt(query_type, query)
+
+        else:  # ga_empathetic
+            from config.ga_empathetic_prompt import GaEmpatheticPrompt
+            prompt_system = GaEmpatheticPrompt()
+            system_prompt = prompt_system.get_empathetic_prompt(query)
+
+        user_prompt = f"""
+Contexto da base de conhecimento:
+{context_text}
+
+Pergunta específica: {query}
+Categoria identificada: {category}
+
+INSTRUÇÃO: Responda usando sua expertise em hanseníase, baseando-se no contexto fornecido e mantendo fidelidade ao seu estilo de comunicação.
+"""
+
+        return prompt_system, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
     def _classify_query_type(self, query: str, category: str) -> str:
         """
         Classifica o tipo de consulta baseado em palavras-chave e categoria
@@ -458,37 +588,9 @@ INSTRUÇÃO: Responda usando sua expertise em hanseníase, baseando-se no contex
         Returns:
             str: Tipo de consulta ('dosing_queries', 'safety_queries', 'interaction_queries', 'procedure_queries')
         """
-        query_lower = query.lower()
-
-        # Keywords por tipo de consulta
-        dosing_keywords = ['dosagem', 'dose', 'mg', 'kg', 'quantidade', 'quanto', 'posologia',
-                          'administra', 'toma', 'peso', 'rifampicina', 'dapsona', 'clofazimina',
-                          'diário', 'mensal', 'supervisionado']
-
-        safety_keywords = ['efeito', 'adverso', 'colateral', 'segurança', 'contraindicação',
-                          'reação', 'toxicidade', 'risco', 'perigo', 'cuidado', 'gestante',
-                          'gravidez', 'hepatotoxicidade', 'hemólise', 'anemia']
-
-        interaction_keywords = [INTERACTION_KEYWORD, 'interações', 'combinação', 'junto', 'associa',
-                               'anticoncepcional', 'medicamento', 'fármaco', 'droga',
-                               'cefazolina', 'nevirapina', 'antirretroviral']
-
-        procedure_keywords = ['procedimento', 'dispensação', 'roteiro', 'como', 'etapa',
-                             'passo', 'protocolo', 'processo', 'fluxo', 'orientação']
-
-        # Contagem de keywords por categoria
-        dosing_score = sum(1 for keyword in dosing_keywords if keyword in query_lower)
-        safety_score = sum(1 for keyword in safety_keywords if keyword in query_lower)
-        interaction_score = sum(1 for keyword in interaction_keywords if keyword in query_lower)
-        procedure_score = sum(1 for keyword in procedure_keywords if keyword in query_lower)
-
-        # Determina categoria com maior score
-        scores = {
-            'dosing_queries': dosing_score,
-            'safety_queries': safety_score,
-            'interaction_queries': interaction_score,
-            'procedure_queries': procedure_score
-        }
+        # Contagem de keywords distintas por tipo (uma varredura)
+        found = self.query_matcher.scores(query)
+        scores = {query_type: int(found.get(query_type, 0)) for query_type in QUERY_TYPE_KEYWORDS}
 
         # Retorna categoria com maior pontuação, ou dosing como padrão
         max_score = max(scores.values())
@@ -703,12 +805,16 @@ Se você tiver dúvidas sobre hanseníase, ficarei feliz em ajudar! 😊
         
         if self.search_engine:
             base_stats['search_engine'] = self.search_engine.get_statistics()
+
+        if self.semantic_cache is not None:
+            base_stats['semantic_cache'] = self.semantic_cache.get_stats()
         
         base_stats['available_components'] = {
             'vector_store': self.vector_store is not None,
             'cache': self.cache is not None,
             'search_engine': self.search_engine is not None,
-            'openrouter': self.openrouter_client is not None
+            'openrouter': self.openrouter_client is not None,
+            'semantic_cache': self.semantic_cache is not None
         }
 
         return base_stats
@@ -767,23 +873,14 @@ def query_rag_system(
         return None
     
     try:
-        # Recuperar contexto
-        context = rag_system.retrieve_context(
-            query=query,
-            max_chunks=max_chunks,
-            use_cache=True
-        )
-        
-        # Gerar resposta
-        response = rag_system.generate_answer(
+        # Contexto + resposta (com cache semântico)
+        return rag_system.answer_query(
             query=query,
-            context=context,
             persona=persona,
+            max_chunks=max_chunks,
             enhance_with_openrouter=enhance_with_openrouter
         )
         
-        return response
-        
     except Exception as e:
         logger.error(f"Erro na query RAG: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+GCRA Rate Limiter - Sharded in-memory token buckets with background persistence
+
+Each key holds one number, its TAT (theoretical arrival time). For a limit of
+N requests per W seconds the emission interval is T = W / N; a request is
+admitted when max(TAT, now) + T - now <= W. That is a token bucket of N
+tokens refilled at 1 every T, evaluated in O(1) with no per-request history.
+
+- Keys are spread over lock-striped shards, so concurrent threads only
+  contend when they hit the same shard
+- Buckets whose TAT is in the past are full and are dropped on the next sweep
+  (memory is bounded by the keys active within one window)
+- With a BucketPersister the buckets are synchronised with a SQLite file in
+  the background: restart survival, and gunicorn workers sharing the file add
+  their consumption to a common TAT, approximating one limit across workers
+  (lag = persist interval)
+"""
+
+import time
+import atexit
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from core.logging.sanitizer import sanitize_error
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARDS = 64
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # segundos até o bucket encher de novo
+    retry_after: float  # segundos até a próxima requisição ser aceita (0 se permitida)
+
+class _Bucket:
+    __slots__ = ('tat', 'interval', 'window', 'pending')
+
+    def __init__(self, tat: float, interval: float, window: float):
+        self.tat = tat
+        self.interval = interval
+        self.window = window
+        self.pending = 0  # requisições admitidas desde a última sincronização
+
+class _Shard:
+    __slots__ = ('lock', 'buckets')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, _Bucket] = {}
+
+class ShardedGCRALimiter:
+    """Mapa de buckets GCRA dividido em shards com lock próprio"""
+
+    def __init__(self, shards: int = DEFAULT_SHARDS, clock=time.time):
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._clock = clock
+        self.track_pending = False  # ligado pelo BucketPersister
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def decide(self, key: str, limit: int, window_seconds: float, cost: int = 1,
+               now: Optional[float] = None) -> RateLimitDecision:
+        """Admite ou bloqueia uma requisição de `key` (consome `cost` tokens se admitida)"""
+        now = self._clock() if now is None else now
+        limit = max(1, int(limit))
+        interval = window_seconds / limit
+        shard = self._shard(key)
+
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None or bucket.interval != interval:
+                tat = bucket.tat if bucket is not None else now
+                bucket = shard.buckets[key] = _Bucket(tat, interval, window_seconds)
+
+            base = max(bucket.tat, now)
+            new_tat = base + interval * cost
+            if new_tat - now <= window_seconds + 1e-9:
+                bucket.tat = new_tat
+                if self.track_pending:
+                    bucket.pending += cost
+                allowed = True
+                retry_after = 0.0
+            else:
+                new_tat = base
+                allowed = False
+                retry_after = base + interval * cost - window_seconds - now
+
+        remaining = int((window_seconds - (new_tat - now)) / interval + 1e-9)
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=limit,
+            remaining=max(0, remaining),
+            reset_after=max(0.0, new_tat - now),
+            retry_after=max(0.0, retry_after)
+        )
+
+    def peek(self, key: str, limit: int, window_seconds: float,
+             now: Optional[float] = None) -> RateLimitDecision:
+        """Estado do bucket sem consumir tokens"""
+        now = self._clock() if now is None else now
+        limit = max(1, int(limit))
+        interval = window_seconds / limit
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            tat = max(bucket.tat, now) if bucket is not None else now
+
+        remaining = int((window_seconds - (tat - now)) / interval + 1e-9)
+        return RateLimitDecision(
+            allowed=remaining > 0,
+            limit=limit,
+            remaining=max(0, remaining),
+            reset_after=tat - now,
+            retry_after=0.0 if remaining > 0 else tat + interval - window_seconds - now
+        )
+
+    def reset(self, key: Optional[str] = None, prefix: Optional[str] = None):
+        """Remove um bucket, todos com o prefixo, ou todos"""
+        for shard in self._shards:
+            with shard.lock:
+                if key is not None:
+                    shard.buckets.pop(key, None)
+                elif prefix is not None:
+                    for bucket_key in [k for k in shard.buckets if k.startswith(prefix)]:
+                        del shard.buckets[bucket_key]
+                else:
+                    shard.buckets.clear()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Descarta buckets cheios (TAT no passado) que não têm nada a sincronizar"""
+        now = self._clock() if now is None else now
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                expired = [k for k, b in shard.buckets.items() if b.tat <= now and not b.pending]
+                for bucket_key in expired:
+                    del shard.buckets[bucket_key]
+                removed += len(expired)
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard.buckets) for shard in self._shards)
+
+    # ------------------------------------------------------------------
+    # Sincronização (usada pelo BucketPersister)
+    # ------------------------------------------------------------------
+
+    def take_pending(self) -> List[Tuple[str, float, float, int]]:
+        """(key, interval, window, pending) dos buckets com consumo não sincronizado"""
+        pending = []
+        for shard in self._shards:
+            with shard.lock:
+                for bucket_key, bucket in shard.buckets.items():
+                    if bucket.pending:
+                        pending.append((bucket_key, bucket.interval, bucket.window, bucket.pending))
+                        bucket.pending = 0
+        return pending
+
+    def return_pending(self, pending: List[Tuple[str, float, float, int]]):
+        """Devolve consumo cuja sincronização falhou"""
+        for key, interval, window, count in pending:
+            shard = self._shard(key)
+            with shard.lock:
+                bucket = shard.buckets.get(key)
+                if bucket is None:
+                    bucket = shard.buckets[key] = _Bucket(0.0, interval, window)
+                bucket.pending += count
+
+    def merge(self, key: str, tat: float, interval: float, window: float):
+        """Adota o TAT compartilhado se ele estiver à frente do local"""
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                shard.buckets[key] = _Bucket(tat, interval, window)
+            elif tat > bucket.tat:
+                bucket.tat = tat
+
+class BucketPersister:
+    """
+    Sincroniza um ShardedGCRALimiter com a tabela rate_limit_buckets de um
+    arquivo SQLite (pool compartilhado), em uma thread de fundo
+    """
+
+    def __init__(self, limiter: ShardedGCRALimiter, pool, interval_seconds: float = 5.0,
+                 on_sync=None):
+        self.limiter = limiter
+        self.pool = pool
+        self.interval_seconds = interval_seconds
+        self.on_sync = on_sync  # callback(conn) executado na mesma transação (ex.: estatísticas)
+        self._last_sync = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'syncs': 0, 'keys_synced': 0, 'sync_errors': 0, 'last_sync_ms': 0.0}
+        limiter.track_pending = True
+
+        self.pool.executescript('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tat REAL NOT NULL,
+                interval REAL NOT NULL,
+                window_seconds REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated
+            ON rate_limit_buckets(updated_at);
+        ''')
+
+    def restore(self) -> int:
+        """Carrega buckets ainda não cheios (sobrevive a restart)"""
+        rows = self.pool.connection().execute(
+            'SELECT key, tat, interval, window_seconds FROM rate_limit_buckets WHERE tat > ?',
+            (time.time(),)
+        ).fetchall()
+        for row in rows:
+            self.limiter.merge(row['key'], row['tat'], row['interval'], row['window_seconds'])
+        return len(rows)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rate-limit-persister", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            if getattr(self.pool, '_closed', False):
+                break
+            self.sync()
+
+    def sync(self) -> int:
+        """Soma o consumo local ao TAT compartilhado e adota o resultado"""
+        started = time.perf_counter()
+        pending = self.limiter.take_pending()
+        since = self._last_sync
+
+        def apply(conn):
+            now = time.time()
+            merged = []
+            for key, interval, window, count in pending:
+                row = conn.execute('SELECT tat FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+                shared_tat = max(row['tat'] if row else now, now) + interval * count
+                conn.execute('''
+                    INSERT INTO rate_limit_buckets (key, tat, interval, window_seconds, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        tat = excluded.tat,
+                        interval = excluded.interval,
+                        window_seconds = excluded.window_seconds,
+                        updated_at = excluded.updated_at
+                ''', (key, shared_tat, interval, window, now))
+                merged.append((key, shared_tat, interval, window))
+
+            # Consumo dos outros workers desde a última sincronização
+            others = conn.execute('''
+                SELECT key, tat, interval, window_seconds FROM rate_limit_buckets
+                WHERE updated_at >= ? AND tat > ?
+            ''', (since, now)).fetchall()
+            merged.extend((row['key'], row['tat'], row['interval'], row['window_seconds']) for row in others)
+
+            conn.execute('DELETE FROM rate_limit_buckets WHERE tat <= ?', (now - 60,))
+            if self.on_sync:
+                self.on_sync(conn)
+            return now, merged
+
+        try:
+            now, merged = self.pool.write(apply)
+        except Exception as e:
+            self.stats['sync_errors'] += 1
+            logger.error("Erro ao persistir buckets de rate limit: %s", sanitize_error(e))
+            self.limiter.return_pending(pending)  # tenta de novo na próxima sincronização
+            return 0
+
+        for key, tat, interval, window in merged:
+            self.limiter.merge(key, tat, interval, window)
+        self.limiter.sweep()
+
+        self._last_sync = now
+        self.stats['syncs'] += 1
+        self.stats['keys_synced'] += len(pending)
+        self.stats['last_sync_ms'] = (time.perf_counter() - started) * 1000
+        return len(pending)
+
+    def stop(self):
+        """Para a thread e faz a última sincronização"""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(self.interval_seconds + 1)
+        if getattr(self.pool, '_closed', False):
+            return
+        try:
+            self.sync()
+        except Exception as e:
+            logger.debug("Sincronização final do rate limit falhou: %s", sanitize_error(e))
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats['last_sync'] = datetime.fromtimestamp(self._last_sync).isoformat() if self._last_sync else None
+        return stats
@@ -2,16 +2,22 @@
 """
 SQLite Rate Limiter - Sistema de rate limiting baseado em SQLite
 Substitui Redis para rate limiting distribuído
+
+Decisões em memória (services/security/gcra_rate_limiter.py); o SQLite guarda
+configurações, estatísticas e um snapshot dos buckets gravado em segundo plano.
 """
 
-import sqlite3
+import math
 import time
 import logging
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Tuple
 from pathlib import Path
 from threading import Lock
-from contextlib import contextmanager
+
+from core.performance.sqlite_pool import get_sqlite_pool
+from services.security.gcra_rate_limiter import ShardedGCRALimiter, BucketPersister, DEFAULT_SHARDS
 
 logger = logging.getLogger(__name__)
 
@@ -21,16 +27,26 @@ class SQLiteRateLimiter:
 
     Features:
     - Rate limiting por IP, usuário e endpoint
-    - Janelas deslizantes para contagem precisa
-    - Limpeza automática de registros antigos
-    - Thread-safe com locks
+    - Decisão O(1) em memória (GCRA/token bucket em shards com lock próprio)
+    - Buckets e estatísticas persistidos em segundo plano (sobrevivem a restart
+      e são somados entre workers que compartilham o arquivo)
     - Fallback gracioso em caso de erro
     """
 
-    def __init__(self, db_path: str = './data/rate_limits.db'):
+    def __init__(self, db_path: str = './data/rate_limits.db', shards: Optional[int] = None,
+                 persist_interval: Optional[float] = None):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(exist_ok=True)
-        self._lock = Lock()
+        self._pool = get_sqlite_pool(self.db_path)
+
+        try:
+            from app_config import config
+        except ImportError:
+            config = None
+        if shards is None:
+            shards = getattr(config, 'RATE_LIMIT_SHARDS', DEFAULT_SHARDS)
+        if persist_interval is None:
+            persist_interval = getattr(config, 'RATE_LIMIT_PERSIST_SECONDS', 5.0)
 
         # Configurações padrão
         self.default_limits = {
@@ -39,71 +55,69 @@ class SQLiteRateLimiter:
             'auth': {'requests': 5, 'window': 300},       # 5 req/5min para auth
             'general': {'requests': 100, 'window': 60}    # 100 req/min geral
         }
+        self._endpoint_configs: Dict[str, Dict] = {}
+
+        # Contadores do período ainda não gravados em rate_limit_stats
+        self._stats_lock = Lock()
+        self._pending_allowed = 0
+        self._pending_blocked = 0
+        self._blocked_by_endpoint: Counter = Counter()
 
         self._init_database()
+
+        self.buckets = ShardedGCRALimiter(shards=shards)
+        self.persister = BucketPersister(self.buckets, self._pool, persist_interval, on_sync=self._flush_stats)
+        try:
+            self.persister.restore()
+            self._load_endpoint_configs(self._get_connection())
+        except Exception as e:
+            logger.error(f"Erro ao restaurar estado do rate limiting: {e}")
+        self.persister.start()
+
         logger.info("SQLite Rate Limiter inicializado")
 
     def _init_database(self):
         """Inicializar tabelas do banco"""
         try:
-            with self._get_connection() as conn:
-                # Tabela principal de rate limiting
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS rate_limits (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        identifier TEXT NOT NULL,
-                        endpoint TEXT NOT NULL,
-                        timestamp INTEGER NOT NULL,
-                        window_seconds INTEGER NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Índices para performance
-                conn.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_rate_limits_identifier
-                    ON rate_limits(identifier, endpoint, timestamp)
-                ''')
-
-                # Tabela de configurações personalizadas
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS rate_limit_configs (
-                        endpoint TEXT PRIMARY KEY,
-                        max_requests INTEGER NOT NULL,
-                        window_seconds INTEGER NOT NULL,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Tabela de estatísticas
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS rate_limit_stats (
-                        date TEXT PRIMARY KEY,
-                        total_requests INTEGER DEFAULT 0,
-                        blocked_requests INTEGER DEFAULT 0,
-                        unique_ips INTEGER DEFAULT 0,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                conn.commit()
+            self._pool.executescript('''
+                -- Tabela legada de requisições (decisões agora usam rate_limit_buckets)
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    identifier TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    timestamp INTEGER NOT NULL,
+                    window_seconds INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+
+                -- Índices para performance
+                CREATE INDEX IF NOT EXISTS idx_rate_limits_identifier
+                ON rate_limits(identifier, endpoint, timestamp);
+
+                -- Tabela de configurações personalizadas
+                CREATE TABLE IF NOT EXISTS rate_limit_configs (
+                    endpoint TEXT PRIMARY KEY,
+                    max_requests INTEGER NOT NULL,
+                    window_seconds INTEGER NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+
+                -- Tabela de estatísticas
+                CREATE TABLE IF NOT EXISTS rate_limit_stats (
+                    date TEXT PRIMARY KEY,
+                    total_requests INTEGER DEFAULT 0,
+                    blocked_requests INTEGER DEFAULT 0,
+                    unique_ips INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            ''')
 
         except Exception as e:
             logger.error(f"Erro ao inicializar banco de rate limiting: {e}")
 
-    @contextmanager
     def _get_connection(self):
-        """Context manager para conexões SQLite thread-safe"""
-        conn = sqlite3.connect(
-            self.db_path,
-            timeout=10.0,
-            check_same_thread=False
-        )
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
+        """Conexão de leitura da thread atual (pool compartilhado)"""
+        return self._pool.connection()
 
     def _get_identifier(self, ip: str, user_id: Optional[str] = None) -> str:
         """Gerar identificador único para rate limiting"""
@@ -114,15 +128,6 @@ class SQLiteRateLimiter:
             # Rate limiting por IP
             return f"ip:{ip}"
 
-    def _clean_old_records(self, conn, identifier: str, endpoint: str, window_seconds: int) -> None:
-        """Limpar registros antigos da janela"""
-        cutoff_time = int(time.time()) - window_seconds
-
-        conn.execute('''
-            DELETE FROM rate_limits
-            WHERE identifier = ? AND endpoint = ? AND timestamp < ?
-        ''', (identifier, endpoint, cutoff_time))
-
     def check_rate_limit(
         self,
         ip: str,
@@ -143,65 +148,38 @@ class SQLiteRateLimiter:
             Tuple[permitido, info_detalhada]
         """
         try:
-            with self._lock:
-                # Determinar limites
-                if custom_limit:
-                    max_requests = custom_limit['requests']
-                    window_seconds = custom_limit['window']
+            # Determinar limites
+            if custom_limit:
+                max_requests = custom_limit['requests']
+                window_seconds = custom_limit['window']
+            else:
+                config = self._get_endpoint_config(endpoint)
+                max_requests = config['requests']
+                window_seconds = config['window']
+
+            identifier = self._get_identifier(ip, user_id)
+            current_time = time.time()
+            decision = self.buckets.decide(f"{identifier}|{endpoint}", max_requests, window_seconds,
+                                           now=current_time)
+
+            with self._stats_lock:
+                if decision.allowed:
+                    self._pending_allowed += 1
                 else:
-                    config = self._get_endpoint_config(endpoint)
-                    max_requests = config['requests']
-                    window_seconds = config['window']
-
-                identifier = self._get_identifier(ip, user_id)
-                current_time = int(time.time())
-
-                with self._get_connection() as conn:
-                    # Limpar registros antigos
-                    self._clean_old_records(conn, identifier, endpoint, window_seconds)
-
-                    # Contar requisições na janela atual
-                    result = conn.execute('''
-                        SELECT COUNT(*) as count
-                        FROM rate_limits
-                        WHERE identifier = ? AND endpoint = ? AND timestamp >= ?
-                    ''', (identifier, endpoint, current_time - window_seconds)).fetchone()
-
-                    current_count = result['count'] if result else 0
-
-                    # Verificar se está dentro do limite
-                    if current_count >= max_requests:
-                        # Rate limit excedido
-                        self._update_stats(conn, blocked=True)
-
-                        return False, {
-                            'allowed': False,
-                            'limit': max_requests,
-                            'remaining': 0,
-                            'reset_time': current_time + window_seconds,
-                            'window_seconds': window_seconds,
-                            'current_count': current_count
-                        }
-
-                    # Registrar nova requisição
-                    conn.execute('''
-                        INSERT INTO rate_limits (identifier, endpoint, timestamp, window_seconds)
-                        VALUES (?, ?, ?, ?)
-                    ''', (identifier, endpoint, current_time, window_seconds))
-
-                    conn.commit()
-
-                    # Atualizar estatísticas
-                    self._update_stats(conn, blocked=False)
-
-                    return True, {
-                        'allowed': True,
-                        'limit': max_requests,
-                        'remaining': max_requests - current_count - 1,
-                        'reset_time': current_time + window_seconds,
-                        'window_seconds': window_seconds,
-                        'current_count': current_count + 1
-                    }
+                    self._pending_blocked += 1
+                    self._blocked_by_endpoint[endpoint] += 1
+
+            info = {
+                'allowed': decision.allowed,
+                'limit': decision.limit,
+                'remaining': decision.remaining,
+                'reset_time': int(math.ceil(current_time + decision.reset_after)),
+                'window_seconds': window_seconds,
+                'current_count': decision.limit - decision.remaining
+            }
+            if not decision.allowed:
+                info['retry_after'] = int(math.ceil(decision.retry_after))
+            return decision.allowed, info
 
         except Exception as e:
             logger.error(f"Erro no rate limiting: {e}")
@@ -212,23 +190,21 @@ class SQLiteRateLimiter:
                 'message': 'Rate limiter com falha, permitindo requisição'
             }
 
+    def _load_endpoint_configs(self, conn):
+        """Recarregar configurações personalizadas (inclusive as gravadas por outros workers)"""
+        rows = conn.execute('''
+            SELECT endpoint, max_requests, window_seconds FROM rate_limit_configs
+        ''').fetchall()
+        self._endpoint_configs = {
+            row['endpoint']: {'requests': row['max_requests'], 'window': row['window_seconds']}
+            for row in rows
+        }
+
     def _get_endpoint_config(self, endpoint: str) -> Dict:
-        """Obter configuração de rate limit para endpoint"""
-        try:
-            with self._get_connection() as conn:
-                result = conn.execute('''
-                    SELECT max_requests, window_seconds
-                    FROM rate_limit_configs
-                    WHERE endpoint = ?
-                ''', (endpoint,)).fetchone()
-
-                if result:
-                    return {
-                        'requests': result['max_requests'],
-                        'window': result['window_seconds']
-                    }
-        except Exception as e:
-            logger.error(f"Erro ao obter config do endpoint: {e}")
+        """Obter configuração de rate limit para endpoint (cache recarregado a cada sincronização)"""
+        config = self._endpoint_configs.get(endpoint)
+        if config:
+            return config
 
         # Fallback para configuração padrão
         for pattern, config in self.default_limits.items():
@@ -237,45 +213,46 @@ class SQLiteRateLimiter:
 
         return self.default_limits['general']
 
-    def _update_stats(self, conn, blocked: bool = False):
-        """Atualizar estatísticas diárias"""
-        try:
-            today = datetime.now().strftime('%Y-%m-%d')
+    def _flush_stats(self, conn):
+        """Gravar contadores pendentes em rate_limit_stats (executado na sincronização dos buckets)"""
+        with self._stats_lock:
+            allowed, blocked = self._pending_allowed, self._pending_blocked
+            self._pending_allowed = self._pending_blocked = 0
 
-            # Inserir ou atualizar estatísticas
-            if blocked:
-                conn.execute('''
-                    INSERT INTO rate_limit_stats (date, blocked_requests)
-                    VALUES (?, 1)
-                    ON CONFLICT(date) DO UPDATE SET
-                        blocked_requests = blocked_requests + 1,
-                        updated_at = CURRENT_TIMESTAMP
-                ''', (today,))
-            else:
+        try:
+            if allowed or blocked:
+                today = datetime.now().strftime('%Y-%m-%d')
                 conn.execute('''
-                    INSERT INTO rate_limit_stats (date, total_requests)
-                    VALUES (?, 1)
+                    INSERT INTO rate_limit_stats (date, total_requests, blocked_requests)
+                    VALUES (?, ?, ?)
                     ON CONFLICT(date) DO UPDATE SET
-                        total_requests = total_requests + 1,
+                        total_requests = total_requests + excluded.total_requests,
+                        blocked_requests = blocked_requests + excluded.blocked_requests,
                         updated_at = CURRENT_TIMESTAMP
-                ''', (today,))
-
-        except Exception as e:
-            logger.error(f"Erro ao atualizar stats: {e}")
+                ''', (today, allowed, blocked))
+            self._load_endpoint_configs(conn)
+        except Exception:
+            with self._stats_lock:
+                self._pending_allowed += allowed
+                self._pending_blocked += blocked
+            raise
+
+    def flush(self) -> int:
+        """Sincronizar buckets e estatísticas agora"""
+        return self.persister.sync()
 
     def set_endpoint_config(self, endpoint: str, max_requests: int, window_seconds: int) -> bool:
         """Configurar rate limit personalizado para endpoint"""
         try:
-            with self._get_connection() as conn:
-                conn.execute('''
-                    INSERT OR REPLACE INTO rate_limit_configs
-                    (endpoint, max_requests, window_seconds)
-                    VALUES (?, ?, ?)
-                ''', (endpoint, max_requests, window_seconds))
-                conn.commit()
+            self._pool.execute('''
+                INSERT OR REPLACE INTO rate_limit_configs
+                (endpoint, max_requests, window_seconds)
+                VALUES (?, ?, ?)
+            ''', (endpoint, max_requests, window_seconds))
+            self._endpoint_configs[endpoint] = {'requests': max_requests, 'window': window_seconds}
 
-                logger.info(f"Rate limit configurado: {endpoint} = {max_requests}/{window_seconds}s")
-                return True
+            logger.info(f"Rate limit configurado: {endpoint} = {max_requests}/{window_seconds}s")
+            return True
 
         except Exception as e:
             logger.error(f"Erro ao configurar rate limit: {e}")
@@ -284,67 +261,68 @@ class SQLiteRateLimiter:
     def get_stats(self, days: int = 7) -> Dict:
         """Obter estatísticas de rate limiting"""
         try:
-            with self._get_connection() as conn:
-                # Stats dos últimos N dias
-                start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-
-                result = conn.execute('''
-                    SELECT
-                        SUM(total_requests) as total,
-                        SUM(blocked_requests) as blocked,
-                        AVG(unique_ips) as avg_unique_ips
-                    FROM rate_limit_stats
-                    WHERE date >= ?
-                ''', (start_date,)).fetchone()
-
-                # Top endpoints mais limitados
-                top_limited = conn.execute('''
-                    SELECT endpoint, COUNT(*) as blocks
-                    FROM rate_limits
-                    WHERE timestamp >= ?
-                    GROUP BY endpoint
-                    ORDER BY blocks DESC
-                    LIMIT 10
-                ''', (int(time.time()) - (days * 86400),)).fetchall()
-
-                return {
-                    'period_days': days,
-                    'total_requests': result['total'] or 0,
-                    'blocked_requests': result['blocked'] or 0,
-                    'block_rate': (result['blocked'] or 0) / max(result['total'] or 1, 1) * 100,
-                    'avg_unique_ips': result['avg_unique_ips'] or 0,
-                    'top_limited_endpoints': [
-                        {'endpoint': row['endpoint'], 'blocks': row['blocks']}
-                        for row in top_limited
-                    ]
-                }
+            self.flush()
+            conn = self._get_connection()
+            # Stats dos últimos N dias
+            start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+            result = conn.execute('''
+                SELECT
+                    SUM(total_requests) as total,
+                    SUM(blocked_requests) as blocked,
+                    AVG(unique_ips) as avg_unique_ips
+                FROM rate_limit_stats
+                WHERE date >= ?
+            ''', (start_date,)).fetchone()
+
+            # Top endpoints mais limitados (desde o início deste processo)
+            with self._stats_lock:
+                top_limited = self._blocked_by_endpoint.most_common(10)
+
+            return {
+                'period_days': days,
+                'total_requests': result['total'] or 0,
+                'blocked_requests': result['blocked'] or 0,
+                'block_rate': (result['blocked'] or 0) / max(result['total'] or 1, 1) * 100,
+                'avg_unique_ips': result['avg_unique_ips'] or 0,
+                'top_limited_endpoints': [
+                    {'endpoint': endpoint, 'blocks': blocks}
+                    for endpoint, blocks in top_limited
+                ],
+                'active_buckets': len(self.buckets),
+                'persistence': self.persister.get_stats()
+            }
         except Exception as e:
             logger.error(f"Erro ao obter stats: {e}")
             return {}
 
+    def close(self):
+        """Parar a sincronização em segundo plano (grava o estado pendente)"""
+        self.persister.stop()
+
     def cleanup_old_data(self, days_to_keep: int = 30) -> int:
         """Limpar dados antigos do banco"""
         try:
             cutoff_time = int(time.time()) - (days_to_keep * 86400)
 
-            with self._get_connection() as conn:
+            cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).strftime('%Y-%m-%d')
+
+            def cleanup(conn):
                 # Limpar rate limits antigos
                 cursor = conn.execute('''
                     DELETE FROM rate_limits WHERE timestamp < ?
                 ''', (cutoff_time,))
 
-                deleted_count = cursor.rowcount
-
                 # Limpar stats antigas
-                cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).strftime('%Y-%m-%d')
                 conn.execute('''
                     DELETE FROM rate_limit_stats WHERE date < ?
                 ''', (cutoff_date,))
+                return cursor.rowcount
 
-                conn.commit()
+            deleted_count = self._pool.write(cleanup)
 
-                logger.info(f"Limpeza concluída: {deleted_count} registros removidos")
-                return deleted_count
+            logger.info(f"Limpeza concluída: {deleted_count} registros removidos")
+            return deleted_count
 
         except Exception as e:
             logger.error(f"Erro na limpeza: {e}")
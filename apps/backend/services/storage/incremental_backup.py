@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental SQLite Backup - Online snapshots with page-delta shipping
+
+Each cycle copies the live database with sqlite3.Connection.backup in steps
+of `pages_per_step` pages (the source is only locked while a step runs; in
+WAL mode writers are not blocked at all) into a local snapshot, then
+compares it page by page with the previous snapshot:
+
+- full:  zlib-compressed database image; written on the first cycle, every
+         `full_every` cycles, or when more than half the pages changed
+- delta: only the changed pages plus the new page count (truncation)
+
+Object layout under `prefix/`:
+    catalog.json            ordered list of entries (seq, kind, key, timestamp,
+                            page_size, page_count, changed_pages, bytes)
+    full/<seq>.db.z
+    delta/<seq>.delta.z     header b'RDBD' + page numbers + page data
+
+Objects are written before the catalog entry that references them, so a
+crash mid-cycle never leaves the catalog pointing at a missing object.
+Restore rebuilds the file from the latest full at or before the requested
+point in time and applies the following deltas in order.
+
+CLI (point-in-time restore):
+    python -m services.storage.incremental_backup list --store DIR --prefix database/app_database.db
+    python -m services.storage.incremental_backup restore --store DIR --prefix ... --until 2025-01-31T12:00:00 out.db
+"""
+
+import json
+import time
+import zlib
+import shutil
+import sqlite3
+import struct
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DELTA_MAGIC = b"RDBD"
+DELTA_VERSION = 1
+_DELTA_HEADER = struct.Struct("<4sHIII")  # magic, version, page_size, page_count, changed
+_COPY_CHUNK = 1024 * 1024
+
+class BackupFormatError(ValueError):
+    """Raised when a catalog entry or delta object cannot be decoded"""
+
+# ----------------------------------------------------------------------
+# Object stores
+# ----------------------------------------------------------------------
+
+class LocalDirectoryObjectStore:
+    """Object store em um diretório local (desenvolvimento, testes, volume montado)"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Chave fora do diretório do store: {key!r}")
+        return path
+
+    def put_bytes(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + '.tmp')
+        temp_path.write_bytes(data)
+        temp_path.replace(path)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        return path.read_bytes() if path.exists() else None
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+class GCSObjectStore:
+    """Object store sobre um bucket google.cloud.storage"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def put_bytes(self, key: str, data: bytes):
+        self.bucket.blob(key).upload_from_string(data, content_type='application/octet-stream')
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        blob = self.bucket.blob(key)
+        if not blob.exists():
+            return None
+        return blob.download_as_bytes()
+
+    def delete(self, key: str):
+        blob = self.bucket.blob(key)
+        if blob.exists():
+            blob.delete()
+
+# ----------------------------------------------------------------------
+# Backup manager
+# ----------------------------------------------------------------------
+
+def _page_hashes(path: Path, page_size: int) -> List[bytes]:
+    hashes = []
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            hashes.append(hashlib.blake2b(page, digest_size=8).digest())
+    return hashes
+
+def _parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        timestamp = value
+    else:
+        timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+class IncrementalBackupManager:
+    """Snapshots consistentes + deltas de páginas para um object store"""
+
+    def __init__(self, db_path, store, prefix: Optional[str] = None, pages_per_step: int = 1024,
+                 step_sleep: float = 0.0, full_every: int = 24, keep_full: int = 3,
+                 compression_level: int = 6):
+        self.db_path = Path(db_path)
+        self.store = store
+        self.prefix = (prefix or f"database/{self.db_path.name}").rstrip('/')
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.full_every = full_every
+        self.keep_full = keep_full
+        self.compression_level = compression_level
+
+        self._lock = threading.Lock()
+        self._base_hashes: Optional[List[bytes]] = None
+        self._base_page_size: Optional[int] = None
+        self._cycles_since_full = 0
+        self.stats = {
+            'cycles': 0,
+            'full_backups': 0,
+            'delta_backups': 0,
+            'unchanged_cycles': 0,
+            'bytes_shipped_total': 0,
+            'last_cycle': None,
+            'last_restore': None
+        }
+
+    @property
+    def catalog_key(self) -> str:
+        return f"{self.prefix}/catalog.json"
+
+    def load_catalog(self) -> List[Dict[str, Any]]:
+        data = self.store.get_bytes(self.catalog_key)
+        if not data:
+            return []
+        return json.loads(data.decode('utf-8'))['entries']
+
+    def _save_catalog(self, entries: List[Dict[str, Any]]):
+        payload = json.dumps({'format': DELTA_VERSION, 'entries': entries}, indent=1)
+        self.store.put_bytes(self.catalog_key, payload.encode('utf-8'))
+
+    # --- snapshot ---
+
+    def snapshot_to(self, target_path) -> Dict[str, Any]:
+        """Cópia consistente do banco em passos de pages_per_step páginas"""
+        steps = [0]
+
+        def progress(status, remaining, total):
+            steps[0] += 1
+
+        started = time.perf_counter()
+        source = sqlite3.connect(str(self.db_path), timeout=30)
+        target = sqlite3.connect(str(target_path))
+        try:
+            source.backup(target, pages=self.pages_per_step, progress=progress, sleep=self.step_sleep)
+            page_size = target.execute('PRAGMA page_size').fetchone()[0]
+            page_count = target.execute('PRAGMA page_count').fetchone()[0]
+            # Cópia independente do WAL de origem: arquivo autocontido em modo rollback
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+        return {
+            'page_size': page_size,
+            'page_count': page_count,
+            'steps': steps[0],
+            'snapshot_ms': (time.perf_counter() - started) * 1000
+        }
+
+    def run_cycle(self, force_full: bool = False) -> Dict[str, Any]:
+        """Um ciclo de backup: snapshot, diff de páginas e envio de full/delta"""
+        with self._lock:
+            started = time.perf_counter()
+            temp_dir = tempfile.mkdtemp(prefix='sqlite-backup-')
+            try:
+                snapshot_path = Path(temp_dir) / 'snapshot.db'
+                info = self.snapshot_to(snapshot_path)
+                page_size = info['page_size']
+                hashes = _page_hashes(snapshot_path, page_size)
+
+                entries = self.load_catalog()
+                seq = entries[-1]['seq'] + 1 if entries else 1
+
+                changed = None
+                if (not force_full and entries and self._base_hashes is not None
+                        and self._base_page_size == page_size and self._cycles_since_full < self.full_every):
+                    base = self._base_hashes
+                    changed = [i for i, digest in enumerate(hashes) if i >= len(base) or base[i] != digest]
+                    if len(changed) > len(hashes) // 2:
+                        changed = None  # delta maior que metade do banco: full é mais barato de restaurar
+
+                if changed is not None and not changed and len(hashes) == len(self._base_hashes):
+                    result = {'kind': 'unchanged', 'bytes_shipped': 0, 'changed_pages': 0}
+                    self.stats['unchanged_cycles'] += 1
+                else:
+                    if changed is None:
+                        key = f"{self.prefix}/full/{seq:010d}.db.z"
+                        data = self._compress_file(snapshot_path)
+                        kind = 'full'
+                        changed_pages = len(hashes)
+                    else:
+                        key = f"{self.prefix}/delta/{seq:010d}.delta.z"
+                        data = self._encode_delta(snapshot_path, page_size, len(hashes), changed)
+                        kind = 'delta'
+                        changed_pages = len(changed)
+
+                    self.store.put_bytes(key, data)
+                    entries.append({
+                        'seq': seq,
+                        'kind': kind,
+                        'key': key,
+                        'timestamp': datetime.now(timezone.utc).isoformat(),
+                        'page_size': page_size,
+                        'page_count': len(hashes),
+                        'changed_pages': changed_pages,
+                        'bytes': len(data)
+                    })
+                    entries = self._apply_retention(entries)
+
+                    if kind == 'full':
+                        self._cycles_since_full = 0
+                        self.stats['full_backups'] += 1
+                    else:
+                        self._cycles_since_full += 1
+                        self.stats['delta_backups'] += 1
+                    self.stats['bytes_shipped_total'] += len(data)
+                    result = {'kind': kind, 'seq': seq, 'bytes_shipped': len(data), 'changed_pages': changed_pages}
+
+                self._base_hashes = hashes
+                self._base_page_size = page_size
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+            result.update({
+                'db_bytes': info['page_count'] * page_size,
+                'backup_steps': info['steps'],
+                'snapshot_ms': info['snapshot_ms'],
+                'duration_ms': (time.perf_counter() - started) * 1000,
+                'timestamp': datetime.now(timezone.utc).isoformat()
+            })
+            self.stats['cycles'] += 1
+            self.stats['last_cycle'] = result
+            return result
+
+    def _compress_file(self, path: Path) -> bytes:
+        compressor = zlib.compressobj(self.compression_level)
+        parts = []
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_COPY_CHUNK), b''):
+                parts.append(compressor.compress(chunk))
+        parts.append(compressor.flush())
+        return b''.join(parts)
+
+    def _encode_delta(self, path: Path, page_size: int, page_count: int, changed: List[int]) -> bytes:
+        compressor = zlib.compressobj(self.compression_level)
+        parts = [compressor.compress(_DELTA_HEADER.pack(DELTA_MAGIC, DELTA_VERSION, page_size,
+                                                        page_count, len(changed))),
+                 compressor.compress(array('I', changed).tobytes())]
+        with open(path, 'rb') as f:
+            for page_number in changed:
+                f.seek(page_number * page_size)
+                parts.append(compressor.compress(f.read(page_size)))
+        parts.append(compressor.flush())
+        return b''.join(parts)
+
+    def _apply_retention(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Mantém as últimas keep_full cadeias (full + seus deltas) e grava o
+        catálogo; os objetos expirados só são apagados depois, para que uma
+        falha no meio nunca deixe o catálogo apontando para objetos removidos
+        """
+        full_indexes = [i for i, entry in enumerate(entries) if entry['kind'] == 'full']
+        if self.keep_full <= 0 or len(full_indexes) <= self.keep_full:
+            self._save_catalog(entries)
+            return entries
+        cutoff = full_indexes[-self.keep_full]
+        self._save_catalog(entries[cutoff:])
+        for entry in entries[:cutoff]:
+            try:
+                self.store.delete(entry['key'])
+            except Exception as e:
+                logger.warning(f"Falha ao remover backup antigo {entry['key']}: {e}")
+        return entries[cutoff:]
+
+    # --- restore ---
+
+    def restore(self, target_path, until=None) -> Dict[str, Any]:
+        """
+        Reconstrói o banco no estado do último backup <= until (ou o mais recente)
+        e o grava atomicamente em target_path
+        """
+        started = time.perf_counter()
+        entries = self.load_catalog()
+        if until is not None:
+            limit = _parse_timestamp(until)
+            entries = [entry for entry in entries if _parse_timestamp(entry['timestamp']) <= limit]
+        full_indexes = [i for i, entry in enumerate(entries) if entry['kind'] == 'full']
+        if not full_indexes:
+            raise FileNotFoundError("Nenhum backup completo disponível para o ponto solicitado")
+        chain = entries[full_indexes[-1]:]
+
+        target_path = Path(target_path)
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target_path.with_name(target_path.name + '.restore')
+        bytes_downloaded = 0
+        try:
+            data = self._get_object(chain[0])
+            bytes_downloaded += len(data)
+            with open(temp_path, 'wb') as f:
+                f.write(zlib.decompress(data))
+
+            for entry in chain[1:]:
+                data = self._get_object(entry)
+                bytes_downloaded += len(data)
+                self._apply_delta(temp_path, zlib.decompress(data))
+
+            # Remover WAL/SHM antigos: o arquivo restaurado é autocontido
+            for suffix in ('-wal', '-shm'):
+                Path(str(target_path) + suffix).unlink(missing_ok=True)
+            temp_path.replace(target_path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+        # O arquivo restaurado é o estado do último backup: próximo ciclo pode ser delta
+        last = chain[-1]
+        with self._lock:
+            self._base_hashes = _page_hashes(target_path, last['page_size'])
+            self._base_page_size = last['page_size']
+            self._cycles_since_full = len(chain) - 1
+
+        result = {
+            'seq': last['seq'],
+            'timestamp': last['timestamp'],
+            'deltas_applied': len(chain) - 1,
+            'bytes_downloaded': bytes_downloaded,
+            'restore_seconds': time.perf_counter() - started
+        }
+        self.stats['last_restore'] = result
+        return result
+
+    def _get_object(self, entry: Dict[str, Any]) -> bytes:
+        data = self.store.get_bytes(entry['key'])
+        if data is None:
+            raise BackupFormatError(f"Objeto de backup ausente: {entry['key']}")
+        return data
+
+    @staticmethod
+    def _apply_delta(path: Path, payload: bytes):
+        magic, version, page_size, page_count, changed = _DELTA_HEADER.unpack_from(payload)
+        if magic != DELTA_MAGIC or version != DELTA_VERSION:
+            raise BackupFormatError("Delta com formato desconhecido")
+        offset = _DELTA_HEADER.size
+        page_numbers = array('I')
+        page_numbers.frombytes(payload[offset:offset + changed * page_numbers.itemsize])
+        offset += changed * page_numbers.itemsize
+
+        with open(path, 'r+b') as f:
+            f.truncate(page_count * page_size)
+            for page_number in page_numbers:
+                f.seek(page_number * page_size)
+                f.write(payload[offset:offset + page_size])
+                offset += page_size
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['prefix'] = self.prefix
+        stats['cycles_since_full'] = self._cycles_since_full
+        return stats
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="List or restore incremental SQLite backups")
+    parser.add_argument("command", choices=["list", "restore"])
+    parser.add_argument("output", nargs="?", help="Restored database path (restore)")
+    parser.add_argument("--store", help="Local directory used as object store")
+    parser.add_argument("--bucket", help="GCS bucket used as object store")
+    parser.add_argument("--prefix", required=True, help="Backup prefix, e.g. database/app_database.db")
+    parser.add_argument("--until", help="Point in time (ISO 8601, UTC if no offset)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.bucket:
+        from google.cloud import storage
+        store = GCSObjectStore(storage.Client().bucket(args.bucket))
+    elif args.store:
+        store = LocalDirectoryObjectStore(args.store)
+    else:
+        parser.error("--store or --bucket is required")
+
+    manager = IncrementalBackupManager(args.output or "restore.db", store, prefix=args.prefix)
+    if args.command == "list":
+        for entry in manager.load_catalog():
+            print(f"{entry['seq']:>6} {entry['kind']:<5} {entry['timestamp']}  "
+                  f"{entry['changed_pages']:>8} pages  {entry['bytes']:>12} bytes")
+        return
+
+    if not args.output:
+        parser.error("restore requires an output path")
+    result = manager.restore(args.output, until=args.until)
+    print(f"Restored seq {result['seq']} ({result['timestamp']}) with {result['deltas_applied']} deltas, "
+          f"{result['bytes_downloaded']} bytes in {result['restore_seconds']:.2f}s -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@
 """
 SQLite Manager com Cloud Storage Sync
 Sistema de persistência híbrida: SQLite local + backup Cloud Storage automático
+
+Backups incrementais (services/storage/incremental_backup.py): snapshot
+consistente pela API de backup do SQLite e envio só das páginas alteradas.
 """
 
 import sqlite3
@@ -16,6 +19,9 @@ import hashlib
 from google.cloud import storage
 import logging
 
+from core.performance.sqlite_pool import get_sqlite_pool
+from services.storage.incremental_backup import IncrementalBackupManager, GCSObjectStore
+
 logger = logging.getLogger(__name__)
 
 class SQLiteCloudManager:
@@ -23,9 +29,9 @@ class SQLiteCloudManager:
     Gerenciador SQLite com sincronização automática Cloud Storage
 
     Features:
-    - SQLite local para performance
-    - Backup automático para Cloud Storage
-    - Restore automático no startup
+    - SQLite local para performance (pool compartilhado: leitores por thread + writer único em lote)
+    - Backup incremental automático para Cloud Storage (ou diretório local)
+    - Restore automático no startup (point-in-time pela CLI do incremental_backup)
     - Thread background para sync
     - Controle de versioning
     """
@@ -35,7 +41,10 @@ class SQLiteCloudManager:
         db_path: str = "app_database.db",
         bucket_name: Optional[str] = None,
         backup_interval: int = 300,  # 5 minutos
-        enable_cloud_sync: bool = True
+        enable_cloud_sync: bool = True,
+        backup_store=None,
+        full_backup_every: int = 24,  # ciclos entre backups completos
+        backup_pages_per_step: int = 1024
     ):
         self.db_path = db_path
         self.bucket_name = bucket_name or os.getenv("GCS_BUCKET_NAME", "roteiro-dispensacao-storage")
@@ -43,15 +52,19 @@ class SQLiteCloudManager:
         self.enable_cloud_sync = enable_cloud_sync
 
         self._local_db_path = Path(db_path)
-        self._backup_key = f"database/{db_path}"
+        self._backup_key = f"database/{db_path}"  # backup legado (arquivo inteiro)
         self._metadata_key = f"database/{db_path}.metadata"
 
         self._client = None
         self._bucket = None
+        self._store = backup_store
+        self._backup = None
+        self._full_backup_every = full_backup_every
+        self._backup_pages_per_step = backup_pages_per_step
         self._last_backup = None
         self._sync_thread = None
         self._stop_sync = threading.Event()
-        self._db_lock = threading.RLock()
+        self._pool = None
 
         # Inicializar
         self._init_storage()
@@ -64,19 +77,29 @@ class SQLiteCloudManager:
         if not self.enable_cloud_sync:
             return
 
-        try:
-            # Verificar se estamos em desenvolvimento
-            from app_config import config
+        if self._store is None:
+            try:
+                # Verificar se estamos em desenvolvimento
+                from app_config import config
 
-            # SEMPRE usar cliente real - NO MOCKS (user requirement)
-            # Try real cloud first, fallback to local-only if unavailable
-            self._client = storage.Client()
-            self._bucket = self._client.bucket(self.bucket_name)
-            logger.info(f"[PROD] Cloud Storage inicializado: {self.bucket_name}")
+                # SEMPRE usar cliente real - NO MOCKS (user requirement)
+                # Try real cloud first, fallback to local-only if unavailable
+                self._client = storage.Client()
+                self._bucket = self._client.bucket(self.bucket_name)
+                self._store = GCSObjectStore(self._bucket)
+                logger.info(f"[PROD] Cloud Storage inicializado: {self.bucket_name}")
 
-        except Exception as e:
-            logger.info(f"Cloud Storage não disponível - usando apenas SQLite local: {e}")
-            self.enable_cloud_sync = False
+            except Exception as e:
+                logger.info(f"Cloud Storage não disponível - usando apenas SQLite local: {e}")
+                self.enable_cloud_sync = False
+                return
+
+        self._backup = IncrementalBackupManager(
+            self.db_path, self._store,
+            prefix=f"database/{self._local_db_path.name}.backups",
+            pages_per_step=self._backup_pages_per_step,
+            full_every=self._full_backup_every
+        )
 
     def _init_database(self):
         """Inicializar banco SQLite"""
@@ -84,6 +107,9 @@ class SQLiteCloudManager:
         if self.enable_cloud_sync:
             self._restore_from_cloud()
 
+        # Pool aberto só depois do restore (o arquivo pode ter sido substituído)
+        self._pool = get_sqlite_pool(self.db_path)
+
         # Criar/verificar estrutura do banco
         self._create_tables()
 
@@ -91,104 +117,91 @@ class SQLiteCloudManager:
 
     def _create_tables(self):
         """Criar tabelas básicas do sistema"""
-        with self._get_connection() as conn:
-            conn.executescript("""
-                -- Usuários
-                CREATE TABLE IF NOT EXISTS users (
-                    id TEXT PRIMARY KEY,
-                    email TEXT UNIQUE,
-                    name TEXT,
-                    profile_data TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-
-                -- Conversas
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT,
-                    persona TEXT,
-                    title TEXT,
-                    messages TEXT,
-                    metadata TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                );
-
-                -- Analytics
-                CREATE TABLE IF NOT EXISTS analytics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT,
-                    event_type TEXT,
-                    event_data TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                );
-
-                -- Cache
-                CREATE TABLE IF NOT EXISTS cache (
-                    key TEXT PRIMARY KEY,
-                    value TEXT,
-                    expires_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-
-                -- Sessões
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT,
-                    token_hash TEXT,
-                    expires_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                );
-
-                -- Índices para performance
-                CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
-                CREATE INDEX IF NOT EXISTS idx_analytics_user_id ON analytics(user_id);
-                CREATE INDEX IF NOT EXISTS idx_analytics_timestamp ON analytics(timestamp);
-                CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires_at);
-                CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
-                CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
-            """)
-            conn.commit()
+        self._pool.executescript("""
+            -- Usuários
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                email TEXT UNIQUE,
+                name TEXT,
+                profile_data TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            -- Conversas
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                persona TEXT,
+                title TEXT,
+                messages TEXT,
+                metadata TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            );
+
+            -- Analytics
+            CREATE TABLE IF NOT EXISTS analytics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                event_type TEXT,
+                event_data TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            );
+
+            -- Cache
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                expires_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            -- Sessões
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                token_hash TEXT,
+                expires_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            );
+
+            -- Índices para performance
+            CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
+            CREATE INDEX IF NOT EXISTS idx_analytics_user_id ON analytics(user_id);
+            CREATE INDEX IF NOT EXISTS idx_analytics_timestamp ON analytics(timestamp);
+            CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires_at);
+            CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
+        """)
 
     def _get_connection(self) -> sqlite3.Connection:
-        """Obter conexão SQLite com configurações otimizadas"""
-        conn = sqlite3.connect(
-            self.db_path,
-            timeout=30.0,
-            check_same_thread=False
-        )
-        conn.row_factory = sqlite3.Row
+        """Conexão de leitura da thread atual (WAL, PRAGMAs e statement cache do pool)"""
+        return self._pool.connection()
 
-        # Configurações de performance
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("PRAGMA synchronous=NORMAL")
-        conn.execute("PRAGMA cache_size=10000")
-        conn.execute("PRAGMA temp_store=MEMORY")
-
-        return conn
+    def _write(self, sql: str, params: tuple = ()) -> int:
+        """Escrita pelo writer do pool; retorna rowcount após o commit"""
+        rowcount, _ = self._pool.execute(sql, params)
+        return rowcount
 
     # === OPERAÇÕES CRUD ===
 
     def insert_user(self, user_id: str, email: str, name: str, profile_data: Dict = None) -> bool:
         """Inserir/atualizar usuário"""
-        with self._db_lock:
-            try:
-                with self._get_connection() as conn:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO users
-                        (id, email, name, profile_data, updated_at)
-                        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                    """, (user_id, email, name, json.dumps(profile_data or {})))
-                    conn.commit()
-                    logger.debug(f"Usuário inserido: {email}")
-                    return True
-            except Exception as e:
-                logger.error(f"Erro ao inserir usuário: {e}")
-                return False
+        try:
+            self._write("""
+                INSERT OR REPLACE INTO users
+                (id, email, name, profile_data, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (user_id, email, name, json.dumps(profile_data or {})))
+            logger.debug(f"Usuário inserido: {email}")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao inserir usuário: {e}")
+            return False
 
     def get_user(self, user_id: str) -> Optional[Dict]:
         """Obter usuário por ID"""
@@ -227,21 +240,18 @@ class SQLiteCloudManager:
     def insert_conversation(self, conv_id: str, user_id: str, persona: str,
                           title: str, messages: List, metadata: Dict = None) -> bool:
         """Inserir/atualizar conversa"""
-        with self._db_lock:
-            try:
-                with self._get_connection() as conn:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO conversations
-                        (id, user_id, persona, title, messages, metadata, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                    """, (conv_id, user_id, persona, title,
-                         json.dumps(messages), json.dumps(metadata or {})))
-                    conn.commit()
-                    logger.debug(f"Conversa inserida: {conv_id}")
-                    return True
-            except Exception as e:
-                logger.error(f"Erro ao inserir conversa: {e}")
-                return False
+        try:
+            self._write("""
+                INSERT OR REPLACE INTO conversations
+                (id, user_id, persona, title, messages, metadata, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (conv_id, user_id, persona, title,
+                 json.dumps(messages), json.dumps(metadata or {})))
+            logger.debug(f"Conversa inserida: {conv_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao inserir conversa: {e}")
+            return False
 
     def get_user_conversations(self, user_id: str, limit: int = 50) -> List[Dict]:
         """Obter conversas do usuário"""
@@ -268,36 +278,30 @@ class SQLiteCloudManager:
 
     def log_analytics(self, user_id: Optional[str], event_type: str, event_data: Dict) -> bool:
         """Log de evento de analytics"""
-        with self._db_lock:
-            try:
-                with self._get_connection() as conn:
-                    conn.execute("""
-                        INSERT INTO analytics (user_id, event_type, event_data)
-                        VALUES (?, ?, ?)
-                    """, (user_id, event_type, json.dumps(event_data)))
-                    conn.commit()
-                    return True
-            except Exception as e:
-                logger.error(f"Erro ao log analytics: {e}")
-                return False
+        try:
+            self._write("""
+                INSERT INTO analytics (user_id, event_type, event_data)
+                VALUES (?, ?, ?)
+            """, (user_id, event_type, json.dumps(event_data)))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao log analytics: {e}")
+            return False
 
     # === CACHE ===
 
     def cache_set(self, key: str, value: Any, ttl_seconds: int = 3600) -> bool:
         """Definir cache com TTL"""
-        with self._db_lock:
-            try:
-                expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
-                with self._get_connection() as conn:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO cache (key, value, expires_at)
-                        VALUES (?, ?, ?)
-                    """, (key, json.dumps(value), expires_at))
-                    conn.commit()
-                    return True
-            except Exception as e:
-                logger.error(f"Erro ao definir cache: {e}")
-                return False
+        try:
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+            self._write("""
+                INSERT OR REPLACE INTO cache (key, value, expires_at)
+                VALUES (?, ?, ?)
+            """, (key, json.dumps(value), expires_at))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao definir cache: {e}")
+            return False
 
     def cache_get(self, key: str) -> Optional[Any]:
         """Obter valor do cache"""
@@ -317,36 +321,29 @@ class SQLiteCloudManager:
 
     def cache_clear_expired(self) -> int:
         """Limpar cache expirado"""
-        with self._db_lock:
-            try:
-                with self._get_connection() as conn:
-                    cursor = conn.execute("""
-                        DELETE FROM cache WHERE expires_at <= CURRENT_TIMESTAMP
-                    """)
-                    conn.commit()
-                    return cursor.rowcount
-            except Exception as e:
-                logger.error(f"Erro ao limpar cache: {e}")
-                return 0
+        try:
+            return self._write("""
+                DELETE FROM cache WHERE expires_at <= CURRENT_TIMESTAMP
+            """)
+        except Exception as e:
+            logger.error(f"Erro ao limpar cache: {e}")
+            return 0
 
     # === SESSÕES ===
 
     def create_session(self, session_id: str, user_id: str, token_hash: str,
                       expires_at: datetime) -> bool:
         """Criar sessão"""
-        with self._db_lock:
-            try:
-                with self._get_connection() as conn:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO sessions
-                        (id, user_id, token_hash, expires_at)
-                        VALUES (?, ?, ?, ?)
-                    """, (session_id, user_id, token_hash, expires_at))
-                    conn.commit()
-                    return True
-            except Exception as e:
-                logger.error(f"Erro ao criar sessão: {e}")
-                return False
+        try:
+            self._write("""
+                INSERT OR REPLACE INTO sessions
+                (id, user_id, token_hash, expires_at)
+                VALUES (?, ?, ?, ?)
+            """, (session_id, user_id, token_hash, expires_at))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao criar sessão: {e}")
+            return False
 
     def get_session(self, session_id: str) -> Optional[Dict]:
         """Obter sessão"""
@@ -366,41 +363,47 @@ class SQLiteCloudManager:
 
     def delete_session(self, session_id: str) -> bool:
         """Deletar sessão"""
-        with self._db_lock:
-            try:
-                with self._get_connection() as conn:
-                    conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-                    conn.commit()
-                    return True
-            except Exception as e:
-                logger.error(f"Erro ao deletar sessão: {e}")
-                return False
-
-    # === CLOUD SYNC ===
+        try:
+            self._write("DELETE FROM sessions WHERE id = ?", (session_id,))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao deletar sessão: {e}")
+            return False
 
-    def _backup_to_cloud(self) -> bool:
-        """Fazer backup do banco para Cloud Storage"""
-        if not self.enable_cloud_sync or not self._bucket:
+    def delete_user_sessions(self, user_id: str) -> bool:
+        """Deletar todas as sessões do usuário"""
+        try:
+            self._write("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao deletar sessões do usuário: {e}")
             return False
 
+    def delete_expired_sessions(self) -> int:
+        """Deletar sessões expiradas"""
         try:
-            # Criar metadata
-            metadata = {
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-                'size': os.path.getsize(self.db_path),
-                'hash': self._get_file_hash(self.db_path)
-            }
+            return self._write("DELETE FROM sessions WHERE expires_at <= CURRENT_TIMESTAMP")
+        except Exception as e:
+            logger.error(f"Erro ao deletar sessões expiradas: {e}")
+            return 0
 
-            # Upload do arquivo
-            blob = self._bucket.blob(self._backup_key)
-            blob.upload_from_filename(self.db_path)
+    # === CLOUD SYNC ===
 
-            # Upload da metadata
-            metadata_blob = self._bucket.blob(self._metadata_key)
-            metadata_blob.upload_from_string(json.dumps(metadata))
+    def _backup_to_cloud(self, full: bool = False) -> bool:
+        """Backup incremental: snapshot consistente + páginas alteradas desde o último ciclo"""
+        if not self.enable_cloud_sync or not self._backup:
+            return False
 
+        try:
+            result = self._backup.run_cycle(force_full=full)
             self._last_backup = datetime.now(timezone.utc)
-            logger.info("Backup realizado com sucesso")
+            if result['kind'] == 'unchanged':
+                logger.debug("Backup: nenhuma página alterada desde o último ciclo")
+                return True
+            logger.info(
+                f"Backup {result['kind']} realizado: {result['bytes_shipped']} bytes enviados, "
+                f"{result['changed_pages']} páginas, {result['duration_ms']:.0f} ms"
+            )
             return True
 
         except Exception as e:
@@ -408,21 +411,29 @@ class SQLiteCloudManager:
             return False
 
     def _restore_from_cloud(self) -> bool:
-        """Restaurar banco do Cloud Storage"""
-        if not self.enable_cloud_sync or not self._bucket:
+        """Restaurar banco do último backup (incremental; arquivo inteiro legado como fallback)"""
+        if not self.enable_cloud_sync or not self._backup:
             return False
 
         try:
-            # Verificar se existe backup
-            blob = self._bucket.blob(self._backup_key)
-            if not blob.exists():
-                logger.info("Nenhum backup encontrado")
-                return False
-
-            # Download do arquivo
-            blob.download_to_filename(self.db_path)
-            logger.info("Banco restaurado do backup")
-            return True
+            if self._backup.load_catalog():
+                result = self._backup.restore(self.db_path)
+                logger.info(
+                    f"Banco restaurado do backup {result['seq']} ({result['deltas_applied']} deltas, "
+                    f"{result['bytes_downloaded']} bytes) em {result['restore_seconds']:.2f}s"
+                )
+                return True
+
+            # Backup legado: arquivo inteiro em database/<db_path>
+            if self._bucket:
+                blob = self._bucket.blob(self._backup_key)
+                if blob.exists():
+                    blob.download_to_filename(self.db_path)
+                    logger.info("Banco restaurado do backup legado")
+                    return True
+
+            logger.info("Nenhum backup encontrado")
+            return False
 
         except Exception as e:
             logger.error(f"Erro no restore: {e}")
@@ -448,9 +459,9 @@ class SQLiteCloudManager:
         self._sync_thread.start()
         logger.info("Background sync iniciado")
 
-    def force_backup(self) -> bool:
+    def force_backup(self, full: bool = False) -> bool:
         """Forçar backup imediato"""
-        return self._backup_to_cloud()
+        return self._backup_to_cloud(full=full)
 
     def get_stats(self) -> Dict:
         """Obter estatísticas do banco"""
@@ -467,6 +478,7 @@ class SQLiteCloudManager:
                 stats['db_size_mb'] = os.path.getsize(self.db_path) / (1024 * 1024)
                 stats['last_backup'] = self._last_backup.isoformat() if self._last_backup else None
                 stats['cloud_sync_enabled'] = self.enable_cloud_sync
+                stats['backup'] = self._backup.get_stats() if self._backup else None
 
                 return stats
         except Exception as e:
@@ -486,6 +498,9 @@ class SQLiteCloudManager:
         if self.enable_cloud_sync:
             self._backup_to_cloud()
 
+        if self._pool:
+            self._pool.close()
+
         logger.info("SQLite Manager fechado")
 
     def __enter__(self):
@@ -512,11 +527,23 @@ def init_database(app=None):
         bucket_name = os.getenv("GCS_BUCKET_NAME", "roteiro-dispensacao-storage")
         backup_interval = int(os.getenv("DB_BACKUP_INTERVAL", "300"))  # 5 min
         enable_sync = os.getenv("ENABLE_CLOUD_SYNC", "true").lower() == "true"
+        full_every = int(os.getenv("DB_BACKUP_FULL_EVERY", "24"))  # ciclos entre backups completos
+        pages_per_step = int(os.getenv("DB_BACKUP_PAGES_PER_STEP", "1024"))
+
+        # Diretório local como object store (volume montado / desenvolvimento)
+        backup_store = None
+        local_backup_dir = os.getenv("DB_BACKUP_LOCAL_DIR")
+        if local_backup_dir:
+            from services.storage.incremental_backup import LocalDirectoryObjectStore
+            backup_store = LocalDirectoryObjectStore(local_backup_dir)
 
         db_manager = SQLiteCloudManager(
             bucket_name=bucket_name,
             backup_interval=backup_interval,
-            enable_cloud_sync=enable_sync
+            enable_cloud_sync=enable_sync,
+            backup_store=backup_store,
+            full_backup_every=full_every,
+            backup_pages_per_step=pages_per_step
         )
 
         if app:
@@ -12,11 +12,13 @@ Strategy:
 import os
 import logging
 import time
+import threading
 import numpy as np
-import requests
 from typing import List, Optional, Dict, Any
 from dataclasses import dataclass
-from cachetools import TTLCache
+from services.embedding_batcher import EmbeddingMicroBatcher
+from services.embedding_cache import get_embedding_cache
+from core.performance.http_client_pool import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +64,8 @@ class UnifiedEmbeddingService:
     MODEL_ID = "intfloat/multilingual-e5-small"
     EMBEDDING_DIMENSION = 384
     API_URL = "https://api-inference.huggingface.co/models/{model}"
+    # Longest a caller waits for its micro-batch (rate-limit sleep + 30s API timeout)
+    BATCH_RESULT_TIMEOUT = 65.0
 
     def __init__(self, config):
         self.config = config
@@ -85,12 +89,14 @@ class UnifiedEmbeddingService:
         # API configuration
         self.headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
 
-        # Caching (1 hour TTL, 1000 items max)
-        self.cache = TTLCache(maxsize=1000, ttl=3600)
+        # Persistent cache keyed by SHA-256 of (model, prefix, full normalized text),
+        # shared with services/rag/embedding_service.py
+        self.cache = get_embedding_cache(config)
 
         # Rate limiting (free tier: ~1 request/second)
         self.last_request_time = 0
         self.min_interval = 1.0  # seconds between requests
+        self._api_lock = threading.Lock()
 
         # Statistics
         backend = 'local_model' if self.use_local else 'huggingface_api'
@@ -104,6 +110,16 @@ class UnifiedEmbeddingService:
             'model_loaded': True
         }
 
+        # Micro-batching: concurrent embed_text() calls share one backend call
+        # (and one rate-limit wait) per window instead of queuing behind the sleep
+        self.batcher = None
+        if getattr(config, 'EMBEDDING_MICROBATCH_ENABLED', True):
+            self.batcher = EmbeddingMicroBatcher(
+                self._embed_uncached_batch,
+                max_batch_size=getattr(config, 'EMBEDDING_MICROBATCH_MAX_SIZE', 32),
+                max_wait_ms=getattr(config, 'EMBEDDING_MICROBATCH_MAX_WAIT_MS', 5.0)
+            )
+
         logger.info("=" * 80)
         logger.info("[UNIFIED EMBEDDING SERVICE] Initialized")
         logger.info("[MODEL] %s", self.MODEL_ID)
@@ -111,7 +127,10 @@ class UnifiedEmbeddingService:
         logger.info("[BACKEND] %s", backend.upper())
         if not self.use_local:
             logger.info("[API KEY] %s", 'SET' if self.api_key else 'NOT SET')
-        logger.info("[CACHE] TTL=3600s, maxsize=1000")
+        logger.info("[CACHE] %s (max %d entries)", self.cache.path or 'memory only', self.cache.max_entries)
+        if self.batcher:
+            logger.info("[MICRO-BATCH] max_batch_size=%d, max_wait=%.1fms",
+                        self.batcher.max_batch_size, self.batcher.max_wait * 1000)
         logger.info("=" * 80)
 
     def _load_local_model(self):
@@ -187,10 +206,9 @@ class UnifiedEmbeddingService:
     def embed_text(self, text: str) -> EmbeddingResult:
         """Generate embedding for single text with caching and rate limiting"""
         # Check cache first
-        cache_key = text[:200]  # Use first 200 chars as key
-        if cache_key in self.cache:
+        cached_embedding = self.cache.get(self.MODEL_ID, text)
+        if cached_embedding is not None:
             self.stats['cache_hits'] += 1
-            cached_embedding = self.cache[cache_key]
             logger.debug("[CACHE HIT] Returning cached embedding")
             return EmbeddingResult(
                 embedding=cached_embedding,
@@ -203,41 +221,174 @@ class UnifiedEmbeddingService:
         self.stats['cache_misses'] += 1
         start_time = time.time()
 
+        if self.batcher is not None:
+            return self._embed_with_batcher(text, start_time)
+
         # Strategy 1: Development/Testing → LOCAL preferred
         if self.use_local and self.local_model:
-            result = self._embed_with_local_model(text, cache_key, start_time)
+            result = self._embed_with_local_model(text, start_time)
             if result.success:
                 return result
             # Local failed, try API fallback
             if self.api_key:
                 logger.warning("[FALLBACK] Local model failed, trying API...")
-                return self._embed_with_api(text, cache_key, start_time)
+                return self._embed_with_api(text, start_time)
             return result  # Return failed local result
 
         # Strategy 2: Production → API preferred with LOCAL fallback
         if self.prefer_api and self.api_key:
-            result = self._embed_with_api(text, cache_key, start_time)
+            result = self._embed_with_api(text, start_time)
             if result.success:
                 return result
             # API failed, try local fallback
             if self.local_model:
                 logger.warning("[FALLBACK] API failed, trying local model...")
-                return self._embed_with_local_model(text, cache_key, start_time)
+                return self._embed_with_local_model(text, start_time)
             return result  # Return failed API result
 
         # Fallback: use whatever is available
         if self.local_model:
             logger.info("[FALLBACK] Using local model (no API key)")
-            return self._embed_with_local_model(text, cache_key, start_time)
+            return self._embed_with_local_model(text, start_time)
 
         if self.api_key:
             logger.info("[FALLBACK] Using API (no local model)")
-            return self._embed_with_api(text, cache_key, start_time)
+            return self._embed_with_api(text, start_time)
 
         # No backend available
         raise ValueError("No embedding backend available")
 
-    def _embed_with_local_model(self, text: str, cache_key: str, start_time: float) -> EmbeddingResult:
+    def _embed_with_batcher(self, text: str, start_time: float) -> EmbeddingResult:
+        """Wait for the micro-batch carrying this text"""
+        try:
+            return self.batcher.submit(text).result(timeout=self.BATCH_RESULT_TIMEOUT)
+        except Exception as e:
+            logger.error(f"[ERROR] Micro-batched embedding failed: {e}")
+            self.stats['errors'] += 1
+            return EmbeddingResult(
+                embedding=None,
+                dimension=0,
+                model_used=self.MODEL_ID,
+                generation_time=time.time() - start_time,
+                success=False,
+                error_message=str(e)
+            )
+
+    def _backend_order(self) -> List[str]:
+        """Backends to try, same strategy as embed_text: primary first, then fallback"""
+        if self.use_local and self.local_model:
+            return ['local'] + (['api'] if self.api_key else [])
+        if self.prefer_api and self.api_key:
+            return ['api'] + (['local'] if self.local_model else [])
+        if self.local_model:
+            return ['local']
+        if self.api_key:
+            return ['api']
+        return []
+
+    def _encode_local_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """One SentenceTransformer encode() call for the whole batch"""
+        embeddings = self.local_model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            normalize_embeddings=False
+        )
+        return [np.asarray(embedding, dtype=np.float32) for embedding in embeddings]
+
+    def _request_api_batch(self, texts: List[str], timeout: int = 60) -> List[np.ndarray]:
+        """One HuggingFace request for the whole batch (rate limited); raises on API errors"""
+        with self._api_lock:
+            elapsed = time.time() - self.last_request_time
+            if elapsed < self.min_interval:
+                sleep_time = self.min_interval - elapsed
+                logger.debug("[RATE LIMIT] Sleeping %.2fs", sleep_time)
+                time.sleep(sleep_time)
+
+            logger.info("[API CALL] Generating %d embeddings in one request", len(texts))
+            api_url = self.API_URL.format(model=self.MODEL_ID)
+            response = get_http_client(api_url).post(
+                api_url,
+                headers=self.headers,
+                json={
+                    "inputs": texts,
+                    "options": {"wait_for_model": True, "use_cache": True}
+                },
+                timeout=timeout
+            )
+            self.last_request_time = time.time()
+
+        if response.status_code != 200:
+            raise RuntimeError(f"API error {response.status_code}: {response.text[:200]}")
+
+        embeddings = response.json()
+        if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+            raise ValueError(f"Unexpected API response for batch of {len(texts)}")
+        return [np.asarray(embedding, dtype=np.float32) for embedding in embeddings]
+
+    def _embed_uncached_batch(self, texts: List[str]) -> List[EmbeddingResult]:
+        """
+        Embed texts with one backend call, falling back to the other backend
+        when the primary one fails. Always returns one result per text.
+        """
+        start_time = time.time()
+        embeddings, backend, error = None, None, "No embedding backend available"
+
+        for backend in self._backend_order():
+            try:
+                if backend == 'local':
+                    embeddings = self._encode_local_batch(texts)
+                else:
+                    embeddings = self._request_api_batch(texts)
+                break
+            except Exception as e:
+                error = str(e)
+                logger.warning(f"[FALLBACK] {backend} batch of {len(texts)} failed: {e}")
+
+        generation_time = time.time() - start_time
+        if embeddings is None:
+            self.stats['errors'] += len(texts)
+            return [EmbeddingResult(
+                embedding=None,
+                dimension=0,
+                model_used=self.MODEL_ID,
+                generation_time=generation_time,
+                success=False,
+                error_message=error
+            ) for _ in texts]
+
+        model_used = f"{self.MODEL_ID}_local" if backend == 'local' else self.MODEL_ID
+        results, fresh = [], []
+        for text, embedding in zip(texts, embeddings):
+            if len(embedding) != self.EMBEDDING_DIMENSION:
+                self.stats['errors'] += 1
+                results.append(EmbeddingResult(
+                    embedding=None,
+                    dimension=0,
+                    model_used=model_used,
+                    generation_time=generation_time,
+                    success=False,
+                    error_message=f"Dimension mismatch: expected {self.EMBEDDING_DIMENSION}, got {len(embedding)}"
+                ))
+                continue
+
+            fresh.append((text, embedding))
+            self.stats['embeddings_generated'] += 1
+            self.stats['total_generation_time'] += generation_time
+            results.append(EmbeddingResult(
+                embedding=embedding,
+                dimension=self.EMBEDDING_DIMENSION,
+                model_used=model_used,
+                generation_time=generation_time,
+                success=True
+            ))
+
+        self.cache.set_many(self.MODEL_ID, fresh)
+        logger.debug("[BATCH] %d embeddings via %s in %.3fs", len(texts), backend, generation_time)
+        return results
+
+    def _embed_with_local_model(self, text: str, start_time: float) -> EmbeddingResult:
         """Generate embedding using local sentence-transformers model"""
         try:
             logger.debug("[LOCAL] Generating embedding (text length: %d)", len(text))
@@ -266,7 +417,7 @@ class UnifiedEmbeddingService:
                 )
 
             # Cache result
-            self.cache[cache_key] = embedding_array
+            self.cache.set(self.MODEL_ID, text, embedding_array)
 
             # Update stats
             generation_time = time.time() - start_time
@@ -296,7 +447,7 @@ class UnifiedEmbeddingService:
                 error_message=str(e)
             )
 
-    def _embed_with_api(self, text: str, cache_key: str, start_time: float) -> EmbeddingResult:
+    def _embed_with_api(self, text: str, start_time: float) -> EmbeddingResult:
         """Generate embedding using HuggingFace API"""
 
         try:
@@ -310,7 +461,7 @@ class UnifiedEmbeddingService:
             # API call
             api_url = self.API_URL.format(model=self.MODEL_ID)
             logger.info("[API CALL] Generating embedding (text length: %d)", len(text))
-            response = requests.post(
+            response = get_http_client(api_url).post(
                 api_url,
                 headers=self.headers,
                 json={
@@ -339,7 +490,7 @@ class UnifiedEmbeddingService:
                     raise ValueError(error_msg)
 
                 # Cache result
-                self.cache[cache_key] = embedding_array
+                self.cache.set(self.MODEL_ID, text, embedding_array)
 
                 # Update stats
                 generation_time = time.time() - start_time
@@ -407,68 +558,30 @@ class UnifiedEmbeddingService:
             return []
 
         logger.info(f"[BATCH] Processing {len(texts)} texts (batch_size={batch_size})")
-        results = []
-
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            logger.debug(f"[BATCH] Processing batch {i//batch_size + 1} ({len(batch)} texts)")
-
-            try:
-                # Rate limiting
-                elapsed = time.time() - self.last_request_time
-                if elapsed < self.min_interval:
-                    time.sleep(self.min_interval - elapsed)
-
-                # API call for batch
-                response = requests.post(
-                    self.API_URL,
-                    headers=self.headers,
-                    json={
-                        "inputs": batch,
-                        "options": {"wait_for_model": True, "use_cache": True}
-                    },
-                    timeout=60
+        results: List[Optional[EmbeddingResult]] = [None] * len(texts)
+
+        # Serve cached texts first; only misses go to the backend
+        missing = []
+        for i, text in enumerate(texts):
+            cached_embedding = self.cache.get(self.MODEL_ID, text)
+            if cached_embedding is not None:
+                self.stats['cache_hits'] += 1
+                results[i] = EmbeddingResult(
+                    embedding=cached_embedding,
+                    dimension=self.EMBEDDING_DIMENSION,
+                    model_used=f"{self.MODEL_ID}_cached",
+                    generation_time=0.0,
+                    success=True
                 )
+            else:
+                self.stats['cache_misses'] += 1
+                missing.append(i)
 
-                self.last_request_time = time.time()
-
-                if response.status_code == 200:
-                    embeddings = response.json()
-
-                    for text, embedding in zip(batch, embeddings):
-                        embedding_array = np.array(embedding, dtype=np.float32)
-
-                        # Validate dimension
-                        if len(embedding_array) != self.EMBEDDING_DIMENSION:
-                            logger.warning(f"[WARNING] Dimension mismatch in batch: {len(embedding_array)}")
-                            continue
-
-                        results.append(EmbeddingResult(
-                            embedding=embedding_array,
-                            dimension=self.EMBEDDING_DIMENSION,
-                            model_used=self.MODEL_ID,
-                            generation_time=0.0,  # Amortized across batch
-                            success=True
-                        ))
-
-                        # Cache individual results
-                        cache_key = text[:200]
-                        self.cache[cache_key] = embedding_array
-
-                    self.stats['embeddings_generated'] += len(batch)
-                    logger.info(f"[BATCH SUCCESS] Generated {len(batch)} embeddings")
-
-                else:
-                    # Batch failed - fallback to individual processing
-                    logger.warning(f"[BATCH FAILED] {response.status_code}, processing individually")
-                    for text in batch:
-                        results.append(self.embed_text(text))
-
-            except Exception as e:
-                logger.error(f"[BATCH ERROR] {e}, processing individually")
-                # Fallback to individual processing for this batch
-                for text in batch:
-                    results.append(self.embed_text(text))
+        for start in range(0, len(missing), batch_size):
+            indices = missing[start:start + batch_size]
+            logger.debug(f"[BATCH] Processing batch {start // batch_size + 1} ({len(indices)} texts)")
+            for i, result in zip(indices, self._embed_uncached_batch([texts[i] for i in indices])):
+                results[i] = result
 
         successful = sum(1 for r in results if r.success)
         logger.info(f"[BATCH COMPLETE] {successful}/{len(texts)} successful")
@@ -507,11 +620,17 @@ class UnifiedEmbeddingService:
             'model_name': self.MODEL_ID,
             'embedding_dimension': self.EMBEDDING_DIMENSION,
             'cache_enabled': True,
-            'cache_size': len(self.cache),
-            'cache_ttl': 3600,
+            'cache_persistent': bool(self.cache.path),
             'rate_limit_interval': self.min_interval
         }
 
+        stats['cache'] = self.cache.get_stats()
+        stats['cache_size'] = stats['cache']['entries']
+
+        stats['micro_batching'] = (
+            {'enabled': True, **self.batcher.get_stats()} if self.batcher else {'enabled': False}
+        )
+
         stats['is_available'] = self.is_available()
 
         return stats
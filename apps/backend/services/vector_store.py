@@ -8,7 +8,7 @@ import os
 import logging
 from typing import List, Dict, Optional, Tuple, Any, Union
 from datetime import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, replace
 import numpy as np
 
 logger = logging.getLogger(__name__)
@@ -24,6 +24,11 @@ except ImportError:
 
 # Import JSON for metadata handling
 import json
+from collections.abc import MutableMapping
+
+from services.mmap_vector_index import (
+    INDEX_FILENAME, MappedVectorIndex, VectorIndexFormatError, write_vector_index
+)
 
 @dataclass
 class VectorDocument:
@@ -39,7 +44,7 @@ class VectorDocument:
 
     def to_dict(self) -> Dict:
         """Convert to dictionary (without embedding for serialization)"""
-        data = asdict(self)
+        data = asdict(replace(self, embedding=None))  # Skip deep-copying the embedding
         data.pop('embedding', None)  # Remove embedding from dict
         if self.created_at:
             data['created_at'] = self.created_at.isoformat()
@@ -52,6 +57,91 @@ class VectorDocument:
             data['embedding'] = self.embedding.tolist()
         return data
 
+def _document_from_record(doc_id: str, doc_data: Dict[str, Any]) -> VectorDocument:
+    """Build a VectorDocument from its persisted (to_dict) form"""
+    return VectorDocument(
+        id=doc_id,
+        text=doc_data['text'],
+        embedding=None,  # Loaded on demand
+        metadata=doc_data.get('metadata', {}),
+        chunk_type=doc_data.get('chunk_type', 'general'),
+        priority=doc_data.get('priority', 0.5),
+        source_file=doc_data.get('source_file'),
+        created_at=datetime.fromisoformat(doc_data['created_at']) if doc_data.get('created_at') else None
+    )
+
+class _MappedDocuments(MutableMapping):
+    """
+    Document mapping backed by a MappedVectorIndex
+    Records are decoded from the mapped file on first access instead of at startup
+    """
+
+    def __init__(self, index: MappedVectorIndex):
+        self._index = index
+        self._pending: Dict[str, int] = {doc_id: row for row, doc_id in enumerate(index.ids)}
+        self._loaded: Dict[str, VectorDocument] = {}
+
+    def __getitem__(self, doc_id: str) -> VectorDocument:
+        doc = self._loaded.get(doc_id)
+        if doc is None:
+            row = self._pending.pop(doc_id)
+            doc = _document_from_record(doc_id, self._index.record(row))
+            self._loaded[doc_id] = doc
+        return doc
+
+    def __setitem__(self, doc_id: str, doc: VectorDocument):
+        self._pending.pop(doc_id, None)
+        self._loaded[doc_id] = doc
+
+    def __delitem__(self, doc_id: str):
+        if doc_id in self._loaded:
+            del self._loaded[doc_id]
+        else:
+            del self._pending[doc_id]
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._loaded or doc_id in self._pending
+
+    def __iter__(self):
+        yield from list(self._loaded)
+        yield from list(self._pending)
+
+    def __len__(self) -> int:
+        return len(self._loaded) + len(self._pending)
+
+    def clear(self):
+        self._pending.clear()
+        self._loaded.clear()
+
+    def persisted_record(self, doc_id: str) -> Dict[str, Any]:
+        """Serializable form of a document without materializing undecoded records"""
+        if doc_id in self._loaded:
+            return self._loaded[doc_id].to_dict()
+        return self._index.record(self._pending[doc_id])
+
+class _SegmentedRows:
+    """
+    Read-only row view over LocalVectorStore's mapped + overflow segments
+    (normalized float32 rows by store row number, for the ANN engines)
+    """
+
+    def __init__(self, store: 'LocalVectorStore'):
+        self._store = store
+
+    def __len__(self) -> int:
+        return self._store._size
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._store._size, self._store._dimension
+
+    def __getitem__(self, rows) -> np.ndarray:
+        if isinstance(rows, slice):
+            rows = np.arange(*rows.indices(self._store._size))
+        elif np.isscalar(rows):
+            return self._store._gather(np.array([rows], dtype=np.int64))[0][0]
+        return self._store._gather(np.asarray(rows, dtype=np.int64))[0]
+
 class SupabaseVectorStore:
     """
     Real vector store implementation using Supabase PostgreSQL with pgvector extension
@@ -231,6 +321,10 @@ class SupabaseVectorStore:
             logger.error(f"[ERROR] Failed to add document: {e}")
             return False
 
+    def add_documents(self, documents: List[VectorDocument]) -> int:
+        """Upsert several documents; returns how many were written"""
+        return sum(1 for document in documents if self.add_document(document))
+
     def search_similar(
         self,
         query_embedding: np.ndarray,
@@ -408,76 +502,365 @@ class LocalVectorStore:
     """
     Local fallback vector store using numpy and file storage
     For development and testing when Supabase is not available
+
+    Embeddings live in a single preallocated float32 matrix whose rows are
+    L2-normalized on insert (norms are cached separately so the original
+    vectors can be reconstructed). Deletes leave tombstones that are
+    reclaimed by periodic compaction.
+
+    After a load (and after every save) rows [0, _base) are served straight
+    from the mapped vector_index.bin; rows appended since then go into a
+    private overflow segment, so the first add never copies the mapped block.
     """
 
-    def __init__(self, storage_path: str):
+    INITIAL_CAPACITY = 64
+    GROWTH_FACTOR = 2
+    COMPACT_MIN_TOMBSTONES = 64
+    COMPACT_TOMBSTONE_RATIO = 0.25
+
+    def __init__(self, storage_path: str, vector_dtype: str = 'float32'):
         self.storage_path = storage_path
-        self.documents: Dict[str, VectorDocument] = {}
-        self.embeddings: List[np.ndarray] = []
-        self.doc_ids: List[str] = []
+        self.vector_dtype = vector_dtype
+        self.documents: Union[Dict[str, VectorDocument], _MappedDocuments] = {}
+        self._mapped_index: Optional[MappedVectorIndex] = None
+        # Serialized form of documents added since load; periodic saves reuse
+        # it instead of re-serializing every document each time
+        self._records: Dict[str, Dict[str, Any]] = {}
+
+        # Row storage: mapped segment [0, _base) + private overflow [_base, _size)
+        self._dimension = 0
+        self._base = 0
+        self._mapped_matrix = np.empty((0, 0), dtype=np.float32)
+        self._mapped_norms = np.empty(0, dtype=np.float32)
+        self._mapped_codes = np.empty(0, dtype=np.int32)
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._chunk_codes = np.empty(0, dtype=np.int32)
+        self._row_ids: List[Optional[str]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._chunk_type_codes: Dict[str, int] = {}
+        self._size = 0
+        self._tombstones = 0
 
         os.makedirs(storage_path, exist_ok=True)
         self._load_store()
 
         logger.info(f"[OK] LocalVectorStore initialized at {storage_path}")
 
+    # ------------------------------------------------------------------
+    # Row storage helpers
+    # ------------------------------------------------------------------
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Live embeddings in row order, in their original (unnormalized) scale"""
+        matrix, norms, _ = self._gather(self._live_rows())
+        return matrix * norms[:, None]
+
+    @property
+    def doc_ids(self) -> List[str]:
+        """Live document ids in row order"""
+        return [self._row_ids[row] for row in self._live_rows()]
+
+    @property
+    def _row_matrix(self) -> _SegmentedRows:
+        """Normalized rows across both segments, indexed by row number"""
+        return _SegmentedRows(self)
+
+    def _live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._alive[:self._size])
+
+    def _reset_rows(self):
+        self._dimension = 0
+        self._drop_mapped_segment()
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._chunk_codes = np.empty(0, dtype=np.int32)
+        self._row_ids = []
+        self._id_to_row = {}
+        self._size = 0
+        self._tombstones = 0
+
+    def _chunk_code(self, chunk_type: str) -> int:
+        code = self._chunk_type_codes.get(chunk_type)
+        if code is None:
+            code = len(self._chunk_type_codes)
+            self._chunk_type_codes[chunk_type] = code
+        return code
+
+    def _drop_mapped_segment(self):
+        self._base = 0
+        self._mapped_matrix = np.empty((0, 0), dtype=np.float32)
+        self._mapped_norms = np.empty(0, dtype=np.float32)
+        self._mapped_codes = np.empty(0, dtype=np.int32)
+
+    def _segment(self, row: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        """(matrix, norms, chunk codes, offset) holding a row"""
+        if row < self._base:
+            return self._mapped_matrix, self._mapped_norms, self._mapped_codes, row
+        return self._matrix, self._norms, self._chunk_codes, row - self._base
+
+    def _gather(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Normalized vectors, norms and chunk codes of rows across both segments"""
+        mapped = rows[rows < self._base]
+        private = rows[rows >= self._base] - self._base
+        if not len(private) and len(mapped):
+            return (np.asarray(self._mapped_matrix[mapped], dtype=np.float32),
+                    self._mapped_norms[mapped], self._mapped_codes[mapped])
+        if not len(mapped):
+            return self._matrix[private], self._norms[private], self._chunk_codes[private]
+        return (
+            np.concatenate([np.asarray(self._mapped_matrix[mapped], dtype=np.float32), self._matrix[private]]),
+            np.concatenate([self._mapped_norms[mapped], self._norms[private]]),
+            np.concatenate([self._mapped_codes[mapped], self._chunk_codes[private]])
+        )
+
+    def _all_chunk_codes(self) -> np.ndarray:
+        private = self._size - self._base
+        if not self._base:
+            return self._chunk_codes[:private]
+        return np.concatenate([self._mapped_codes, self._chunk_codes[:private]])
+
+    def _similarities(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity of every row (or of `rows`) against a normalized query"""
+        private = self._size - self._base
+        if rows is None:
+            if not self._base:
+                return self._matrix[:private] @ query
+            if not private:
+                return self._mapped_matrix @ query
+            return np.concatenate([self._mapped_matrix @ query, self._matrix[:private] @ query])
+
+        if not self._base:
+            return self._matrix[rows] @ query
+        mapped = rows < self._base
+        similarities = np.empty(len(rows), dtype=np.float32)
+        similarities[mapped] = self._mapped_matrix[rows[mapped]] @ query
+        if not mapped.all():
+            similarities[~mapped] = self._matrix[rows[~mapped] - self._base] @ query
+        return similarities
+
+    def _ensure_capacity(self, required: int):
+        """Grow the private segment geometrically so appends are amortized O(d)"""
+        capacity = self._matrix.shape[0]
+        if required <= capacity:
+            return
+
+        new_capacity = max(self.INITIAL_CAPACITY, capacity)
+        while new_capacity < required:
+            new_capacity *= self.GROWTH_FACTOR
+
+        private = self._size - self._base
+        matrix = np.zeros((new_capacity, self._dimension), dtype=np.float32)
+        matrix[:private] = self._matrix[:private]
+        norms = np.zeros(new_capacity, dtype=np.float32)
+        norms[:private] = self._norms[:private]
+        chunk_codes = np.full(new_capacity, -1, dtype=np.int32)
+        chunk_codes[:private] = self._chunk_codes[:private]
+        alive = np.zeros(self._base + new_capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+
+        self._matrix, self._norms, self._alive, self._chunk_codes = matrix, norms, alive, chunk_codes
+
+    def _write_row(self, row: int, embedding: np.ndarray, chunk_type: str):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        # Updates to mapped rows only privatize the touched pages (copy-on-write)
+        matrix, norms, chunk_codes, offset = self._segment(row)
+        matrix[offset] = vector / norm if norm > 0 else vector
+        norms[offset] = norm
+        chunk_codes[offset] = self._chunk_code(chunk_type)
+        self._alive[row] = True
+
+    def _append_row(self, doc_id: str, embedding: np.ndarray, chunk_type: str) -> int:
+        if self._size == 0:
+            self._dimension = int(np.asarray(embedding).size)
+            self._matrix = np.empty((0, self._dimension), dtype=np.float32)
+
+        self._ensure_capacity(self._size - self._base + 1)
+        row = self._size
+        self._write_row(row, embedding, chunk_type)
+        self._row_ids.append(doc_id)
+        self._id_to_row[doc_id] = row
+        self._size += 1
+        return row
+
+    def _row_embedding(self, row: int) -> np.ndarray:
+        matrix, norms, _, offset = self._segment(row)
+        return np.asarray(matrix[offset], dtype=np.float32) * norms[offset]
+
+    def _maybe_compact(self):
+        if (self._tombstones >= self.COMPACT_MIN_TOMBSTONES and
+                self._tombstones >= self._size * self.COMPACT_TOMBSTONE_RATIO):
+            self._compact()
+
+    def _compact(self):
+        """Drop tombstoned rows and rebuild the id -> row map (live rows become private)"""
+        rows = self._live_rows()
+        live = len(rows)
+        if live == 0:
+            self._reset_rows()
+            return
+
+        matrix, norms, chunk_codes = self._gather(rows)
+        self._drop_mapped_segment()
+        self._matrix = np.array(matrix, dtype=np.float32)
+        self._norms = np.array(norms, dtype=np.float32)
+        self._chunk_codes = np.array(chunk_codes, dtype=np.int32)
+        self._alive = np.ones(live, dtype=bool)
+
+        self._row_ids = [self._row_ids[row] for row in rows]
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._row_ids)}
+        self._size = live
+        self._tombstones = 0
+        self._on_rows_renumbered(rows)
+
+    def _on_rows_renumbered(self, old_rows: np.ndarray):
+        """Hook: row old_rows[i] is now row i (compaction or remap after a save)"""
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
     def _load_store(self):
         """Load vector store from disk"""
         try:
-            embeddings_file = os.path.join(self.storage_path, "embeddings.npy")
-            metadata_file = os.path.join(self.storage_path, "metadata.json")
-
-            if os.path.exists(embeddings_file):
-                self.embeddings = np.load(embeddings_file, allow_pickle=True).tolist()
-
-            if os.path.exists(metadata_file):
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-
-                for doc_id, doc_data in metadata.items():
-                    self.documents[doc_id] = VectorDocument(
-                        id=doc_id,
-                        text=doc_data['text'],
-                        embedding=None,  # Loaded on demand
-                        metadata=doc_data.get('metadata', {}),
-                        chunk_type=doc_data.get('chunk_type', 'general'),
-                        priority=doc_data.get('priority', 0.5),
-                        source_file=doc_data.get('source_file'),
-                        created_at=datetime.fromisoformat(doc_data['created_at']) if doc_data.get('created_at') else None
-                    )
-
-                self.doc_ids = list(self.documents.keys())
+            index_file = os.path.join(self.storage_path, INDEX_FILENAME)
+            if os.path.exists(index_file):
+                self._load_mapped_index(index_file)
+            else:
+                self._load_legacy_store()
 
             logger.info(f"[OK] Loaded {len(self.documents)} documents from local store")
 
         except Exception as e:
             logger.warning(f"[WARNING] Failed to load local store: {e}")
             self.documents = {}
-            self.embeddings = []
-            self.doc_ids = []
+            self._mapped_index = None
+            self._reset_rows()
+
+    def _load_mapped_index(self, index_file: str, loaded: Optional[Dict[str, VectorDocument]] = None):
+        """
+        Adopt the mapped vector block directly as the row storage; `loaded`
+        documents (already decoded, same ids) are carried over as they are
+        """
+        index = MappedVectorIndex(index_file, mode='c')
+        if len(index.norms) != index.count or len(index.chunk_codes) != index.count:
+            raise VectorIndexFormatError(f"Inconsistent section sizes in {index_file}")
+
+        self._mapped_index = index
+        self.documents = _MappedDocuments(index)
+        for doc_id, doc in (loaded or {}).items():
+            if doc_id in self.documents:
+                self.documents[doc_id] = doc
+        self._records = {}
+
+        self._dimension = index.dimension
+        self._base = index.count
+        self._mapped_matrix = index.vectors
+        self._mapped_norms = index.norms
+        self._mapped_codes = index.chunk_codes
+        self._matrix = np.empty((0, self._dimension), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._chunk_codes = np.empty(0, dtype=np.int32)
+        self._alive = np.ones(index.count, dtype=bool)
+        self._row_ids = list(index.ids)
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._row_ids)}
+        self._chunk_type_codes = {chunk_type: code for code, chunk_type in enumerate(index.chunk_types)}
+        self._size = index.count
+        self._tombstones = 0
+
+    def _load_legacy_store(self):
+        """Load the embeddings.npy / metadata.json layout"""
+        embeddings_file = os.path.join(self.storage_path, "embeddings.npy")
+        metadata_file = os.path.join(self.storage_path, "metadata.json")
+
+        embeddings = None
+        if os.path.exists(embeddings_file):
+            # allow_pickle keeps legacy object-array files loadable
+            embeddings = np.load(embeddings_file, allow_pickle=True)
+
+        if os.path.exists(metadata_file):
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+
+            for doc_id, doc_data in metadata.items():
+                self.documents[doc_id] = _document_from_record(doc_id, doc_data)
+
+        if embeddings is not None and len(embeddings):
+            if embeddings.dtype == object:
+                embeddings = np.stack([np.asarray(row, dtype=np.float32) for row in embeddings])
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            for doc_id, vector in zip(list(self.documents.keys()), matrix):
+                self._append_row(doc_id, vector, self.documents[doc_id].chunk_type)
 
     def _save_store(self):
-        """Save vector store to disk"""
+        """Save vector store to disk and remap it (the overflow segment becomes mapped)"""
         try:
-            embeddings_file = os.path.join(self.storage_path, "embeddings.npy")
-            metadata_file = os.path.join(self.storage_path, "metadata.json")
-
-            # Save embeddings
-            if self.embeddings:
-                np.save(embeddings_file, np.array(self.embeddings))
-
-            # Save metadata
-            metadata = {}
-            for doc_id, doc in self.documents.items():
-                metadata[doc_id] = doc.to_dict()
-
-            with open(metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2, default=str)
+            rows = self._live_rows()
+            ids = [self._row_ids[row] for row in rows]
+            matrix, norms, chunk_codes = self._gather(rows) if len(rows) else (
+                np.zeros((0, self._dimension), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                np.zeros(0, dtype=np.int32))
+
+            # Records in row order so they line up with the vector block
+            chunk_types = list(self._chunk_type_codes)
+            index_file = write_vector_index(
+                os.path.join(self.storage_path, INDEX_FILENAME),
+                ids,
+                matrix,
+                norms,
+                chunk_codes,
+                chunk_types,
+                [self._persisted_record(doc_id) for doc_id in ids],
+                dtype=self.vector_dtype
+            )
 
             logger.debug(f"[OK] Saved {len(self.documents)} documents to local store")
 
         except Exception as e:
             logger.error(f"[ERROR] Failed to save local store: {e}")
+            return
+
+        if self._mapped_index is not None and self._size == self._base:
+            return  # no overflow rows: the current mapping (plus tombstones) still matches
+
+        # The file holds live rows only: dropped tombstones renumber the rest
+        renumbered = self._tombstones > 0
+        loaded = self.documents._loaded if isinstance(self.documents, _MappedDocuments) else self.documents
+        try:
+            self._load_mapped_index(index_file, loaded=dict(loaded))
+        except Exception as e:
+            logger.error(f"[ERROR] Failed to remap local store: {e}")
+            self._load_store()
+            renumbered = True
+        if renumbered:
+            self._on_rows_renumbered(rows)
+
+    def _persisted_record(self, doc_id: str) -> Dict[str, Any]:
+        record = self._records.get(doc_id)
+        if record is not None:
+            return record
+        if isinstance(self.documents, _MappedDocuments):
+            return self.documents.persisted_record(doc_id)
+        return self.documents[doc_id].to_dict()
+
+    def get_index_diagnostics(self) -> Dict[str, Any]:
+        """Mapped versus resident size of the on-disk vector index"""
+        if self._mapped_index is None:
+            return {'mapped': False, 'backend': 'local_numpy'}
+
+        diagnostics = self._mapped_index.get_diagnostics()
+        diagnostics['mapped'] = True
+        # Rows appended since the last save live in the private overflow segment
+        diagnostics['private_rows'] = self._size - self._base
+        return diagnostics
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
 
     def add_document(self, document: VectorDocument) -> bool:
         """Add document to local store"""
@@ -485,17 +868,15 @@ class LocalVectorStore:
             return False
 
         try:
-            # Add or update document
-            if document.id in self.documents:
-                # Update existing
-                idx = self.doc_ids.index(document.id)
-                self.embeddings[idx] = document.embedding
+            row = self._id_to_row.get(document.id)
+            if row is not None:
+                # Update existing row in place
+                self._write_row(row, document.embedding, document.chunk_type)
             else:
-                # Add new
-                self.doc_ids.append(document.id)
-                self.embeddings.append(document.embedding)
+                self._append_row(document.id, document.embedding, document.chunk_type)
 
             self.documents[document.id] = document
+            self._records[document.id] = document.to_dict()
 
             # Periodic save
             if len(self.documents) % 10 == 0:
@@ -507,6 +888,27 @@ class LocalVectorStore:
             logger.error(f"[ERROR] Failed to add document to local store: {e}")
             return False
 
+    def add_documents(self, documents: List[VectorDocument]) -> int:
+        """Bulk upsert: rows written in place/appended, one save at the end"""
+        added = 0
+        for document in documents:
+            if document.embedding is None:
+                continue
+            try:
+                row = self._id_to_row.get(document.id)
+                if row is not None:
+                    self._write_row(row, document.embedding, document.chunk_type)
+                else:
+                    self._append_row(document.id, document.embedding, document.chunk_type)
+                self.documents[document.id] = document
+                self._records[document.id] = document.to_dict()
+                added += 1
+            except Exception as e:
+                logger.error(f"[ERROR] Failed to add document to local store: {e}")
+        if added:
+            self._save_store()
+        return added
+
     def search_similar(
         self,
         query_embedding: np.ndarray,
@@ -515,42 +917,55 @@ class LocalVectorStore:
         chunk_types: Optional[List[str]] = None
     ) -> List[Tuple[VectorDocument, float]]:
         """Search similar documents using cosine similarity"""
-        if not self.embeddings:
+        if not self.documents or self._size == 0 or top_k <= 0:
             return []
 
         try:
-            # Convert to numpy array for vectorized operations
-            embeddings_matrix = np.array(self.embeddings)
-
-            # Normalize embeddings for cosine similarity
-            embeddings_norm = embeddings_matrix / np.linalg.norm(embeddings_matrix, axis=1, keepdims=True)
-            query_norm = query_embedding / np.linalg.norm(query_embedding)
-
-            # Calculate cosine similarities
-            similarities = np.dot(embeddings_norm, query_norm)
-
-            # Get top-k indices
-            top_indices = np.argsort(similarities)[::-1]
+            query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+            query_norm = float(np.linalg.norm(query))
+            if query_norm == 0:
+                return []
+            query = query / query_norm
+
+            # Rows are pre-normalized so the dot product is the cosine similarity
+            if chunk_types:
+                # Restrict to the precomputed chunk-type codes before ranking
+                codes = [self._chunk_type_codes[ct] for ct in chunk_types if ct in self._chunk_type_codes]
+                if not codes:
+                    return []
+                mask = self._alive[:self._size] & np.isin(self._all_chunk_codes(), codes)
+                candidates = np.flatnonzero(mask)
+                similarities = self._similarities(query, candidates)
+            else:
+                # Contiguous scan over both segments; tombstones can never rank
+                candidates = np.arange(self._size)
+                similarities = self._similarities(query)
+                if self._tombstones:
+                    similarities[~self._alive[:self._size]] = -np.inf
+
+            available = len(candidates) - (0 if chunk_types else self._tombstones)
+            if available <= 0:
+                return []
+
+            # Top-k selection without a full sort
+            k = min(top_k, available)
+            if k < len(candidates):
+                top = np.argpartition(-similarities, k - 1)[:k]
+            else:
+                top = np.arange(len(candidates))
+            top = top[np.argsort(-similarities[top], kind='stable')][:k]
 
             results = []
-            for idx in top_indices:
-                if len(results) >= top_k:
-                    break
-
-                score = similarities[idx]
+            for idx in top:
+                score = float(similarities[idx])
                 if score < min_score:
-                    continue
-
-                doc_id = self.doc_ids[idx]
-                doc = self.documents[doc_id]
-
-                # Filter by chunk type if specified
-                if chunk_types and doc.chunk_type not in chunk_types:
-                    continue
+                    break
 
-                # Add embedding back to document
-                doc.embedding = self.embeddings[idx]
-                results.append((doc, float(score)))
+                row = int(candidates[idx])
+                doc = self.documents[self._row_ids[row]]
+                if doc.embedding is None:
+                    doc.embedding = self._row_embedding(row)
+                results.append((doc, score))
 
             return results
 
@@ -561,9 +976,10 @@ class LocalVectorStore:
     def get_document(self, doc_id: str) -> Optional[VectorDocument]:
         """Get document by ID"""
         doc = self.documents.get(doc_id)
-        if doc and doc_id in self.doc_ids:
-            idx = self.doc_ids.index(doc_id)
-            doc.embedding = self.embeddings[idx]
+        if doc and doc.embedding is None:
+            row = self._id_to_row.get(doc_id)
+            if row is not None:
+                doc.embedding = self._row_embedding(row)
         return doc
 
     def delete_document(self, doc_id: str) -> bool:
@@ -572,10 +988,14 @@ class LocalVectorStore:
             return False
 
         try:
-            idx = self.doc_ids.index(doc_id)
+            row = self._id_to_row.pop(doc_id, None)
             del self.documents[doc_id]
-            self.doc_ids.pop(idx)
-            self.embeddings.pop(idx)
+            self._records.pop(doc_id, None)
+            if row is not None:
+                self._alive[row] = False
+                self._row_ids[row] = None
+                self._tombstones += 1
+                self._maybe_compact()
 
             self._save_store()
             return True
@@ -584,11 +1004,17 @@ class LocalVectorStore:
             logger.error(f"[ERROR] Failed to delete document from local store: {e}")
             return False
 
+    def compact(self):
+        """Reclaim rows left behind by deletes"""
+        if self._tombstones:
+            self._compact()
+
     def clear(self):
         """Clear all documents"""
         self.documents.clear()
-        self.embeddings.clear()
-        self.doc_ids.clear()
+        self._records.clear()
+        self._reset_rows()
+        self._chunk_type_codes = {}
         self._save_store()
 
     def get_stats(self) -> Dict[str, Any]:
@@ -604,7 +1030,9 @@ class LocalVectorStore:
             'total_documents': len(self.documents),
             'chunk_types': chunk_types,
             'average_priority': total_priority / len(self.documents) if self.documents else 0.0,
-            'embedding_dimension': len(self.embeddings[0]) if self.embeddings else 0,
+            'embedding_dimension': self._dimension if self._size else 0,
+            'matrix_capacity': self._base + int(self._matrix.shape[0]),
+            'tombstones': self._tombstones,
             'backend': 'local_numpy',
             'connection_status': 'file_based'
         }
@@ -617,6 +1045,19 @@ class LocalVectorStore:
         """Save and close local store"""
         self._save_store()
 
+def create_local_vector_store(config, storage_path: str) -> LocalVectorStore:
+    """Local store with the ANN engine selected by VECTOR_ANN_BACKEND ('none' = exact scan)"""
+    ann_backend = getattr(config, 'VECTOR_ANN_BACKEND', 'none')
+    if ann_backend and ann_backend != 'none':
+        from services.ann_index import ANNLocalVectorStore
+        return ANNLocalVectorStore(
+            storage_path,
+            backend=ann_backend,
+            nprobe=getattr(config, 'VECTOR_ANN_NPROBE', 8),
+            min_train_size=getattr(config, 'VECTOR_ANN_MIN_TRAIN_SIZE', 1024)
+        )
+    return LocalVectorStore(storage_path)
+
 # Global vector store instance
 _vector_store_instance: Optional[Union[SupabaseVectorStore, LocalVectorStore]] = None
 
@@ -650,7 +1091,7 @@ def get_vector_store() -> Optional[Union[SupabaseVectorStore, LocalVectorStore]]
             # Fallback to local store for development
             if _vector_store_instance is None:
                 storage_path = getattr(config, 'VECTOR_DB_PATH', './data/vector_store')
-                _vector_store_instance = LocalVectorStore(storage_path)
+                _vector_store_instance = create_local_vector_store(config, storage_path)
                 logger.info("[OK] Using LocalVectorStore as fallback (dev only)")
 
         except Exception as e:
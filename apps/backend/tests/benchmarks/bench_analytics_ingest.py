@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - analytics ingest events/sec and dashboard query time
+
+Ingest: "per-event" is the previous track_event (one pool.write per event,
+waited on the request path); "buffered" is the ring buffer + batched flush
+that also maintains the rollups. Dashboard: after loading --events rows into
+medical_events (and backfilling the rollups), compares the previous GROUP BY
+queries over the raw tables with get_aggregated_metrics on the rollups for a
+7-day and a 1-day range.
+
+Usage: python tests/benchmarks/bench_analytics_ingest.py [--events 1000000] [--ingest 20000] [--repeats 20]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.analytics.medical_analytics_service import MedicalAnalyticsService
+from services.analytics.analytics_rollups import EVENT_COLUMNS
+
+PERSONAS = ('dr_gasnelio', 'ga', None)
+URGENCY = ('standard', 'important', 'critical')
+QUESTIONS = [f"pergunta frequente {i}" for i in range(200)]
+
+def event_data(rng, session_id):
+    return {
+        'session_id': session_id,
+        'event_type': 'chat',
+        'persona_id': rng.choice(PERSONAS),
+        'question': rng.choice(QUESTIONS),
+        'response_time': rng.lognormvariate(0.3, 0.6),
+        'fallback_used': rng.random() < 0.05,
+        'urgency_level': rng.choice(URGENCY)
+    }
+
+def legacy_track_event(service, data, index):
+    """track_event anterior: uma transação por evento, esperada pela requisição"""
+    row = (f"legacy_{index}", data['session_id'], None, True, datetime.now(timezone.utc).isoformat(), 'chat',
+           data['persona_id'], data['question'], data['response_time'], data['fallback_used'], False,
+           data['urgency_level'], 'desktop', None)
+
+    def store(conn):
+        conn.execute('INSERT INTO medical_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)', row)
+        conn.execute('UPDATE sessions SET total_messages = total_messages + 1 WHERE session_id = ?',
+                     (data['session_id'],))
+
+    service._pool.write(store)
+
+def legacy_aggregated_metrics(conn, start_date, end_date):
+    """Consultas anteriores de get_aggregated_metrics (GROUP BY nas tabelas brutas)"""
+    conn.execute('''
+        SELECT COUNT(DISTINCT session_id), COUNT(DISTINCT user_id),
+               COUNT(DISTINCT CASE WHEN is_anonymous = 1 THEN session_id END),
+               AVG(total_messages), AVG(avg_response_time), AVG(fallback_rate), AVG(questions_resolved),
+               CAST(SUM(CASE WHEN total_messages <= 1 THEN 1 ELSE 0 END) AS REAL) / COUNT(session_id)
+        FROM sessions WHERE start_time BETWEEN ? AND ?
+    ''', (start_date, end_date)).fetchone()
+    conn.execute('''
+        SELECT question, COUNT(*) as count FROM medical_events
+        WHERE question IS NOT NULL AND timestamp BETWEEN ? AND ?
+        GROUP BY question ORDER BY count DESC LIMIT 10
+    ''', (start_date, end_date)).fetchall()
+    conn.execute('''
+        SELECT persona_id, COUNT(*) as count FROM medical_events
+        WHERE persona_id IS NOT NULL AND timestamp BETWEEN ? AND ?
+        GROUP BY persona_id
+    ''', (start_date, end_date)).fetchall()
+    conn.execute('''
+        SELECT strftime('%H', timestamp) as hour, COUNT(*) as count FROM medical_events
+        WHERE timestamp BETWEEN ? AND ?
+        GROUP BY hour ORDER BY count DESC LIMIT 5
+    ''', (start_date, end_date)).fetchall()
+
+def timed(fn, repeats):
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - started) * 1000)
+    return np.percentile(durations, 50), np.percentile(durations, 95)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=1000000, help="rows in medical_events for the dashboard test")
+    parser.add_argument('--ingest', type=int, default=20000, help="events tracked per ingest variant")
+    parser.add_argument('--repeats', type=int, default=20, help="dashboard query repetitions")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # --- ingestão ---
+        legacy = MedicalAnalyticsService(db_path=os.path.join(temp_dir, "legacy.db"))
+        session_id = legacy.start_session({'session_id': 'bench'})
+        started = time.perf_counter()
+        for index in range(args.ingest):
+            legacy_track_event(legacy, event_data(rng, session_id), index)
+        legacy_rate = args.ingest / (time.perf_counter() - started)
+
+        buffered = MedicalAnalyticsService(db_path=os.path.join(temp_dir, "buffered.db"))
+        session_id = buffered.start_session({'session_id': 'bench'})
+        payloads = [event_data(rng, session_id) for _ in range(args.ingest)]
+        call_durations = []
+        started = time.perf_counter()
+        for payload in payloads:
+            call_started = time.perf_counter()
+            buffered.track_event(payload)
+            call_durations.append((time.perf_counter() - call_started) * 1000)
+        buffered.flush(timeout=120)
+        buffered_rate = args.ingest / (time.perf_counter() - started)
+        stats = buffered.get_ingest_stats()
+
+        print(f"ingest per-event  {legacy_rate:>10,.0f} events/s")
+        print(f"ingest buffered   {buffered_rate:>10,.0f} events/s  (track_event p99 "
+              f"{np.percentile(call_durations, 99):.3f} ms, {stats['batches']} batches, {stats['dropped']} dropped)")
+        legacy.close()
+        buffered.close()
+
+        # --- dashboard com --events linhas ---
+        service = MedicalAnalyticsService(db_path=os.path.join(temp_dir, "dashboard.db"))
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        placeholders = ", ".join("?" * len(EVENT_COLUMNS))
+        insert_sql = f"INSERT INTO medical_events ({', '.join(EVENT_COLUMNS)}) VALUES ({placeholders})"
+        started = time.perf_counter()
+        chunk = 50000
+        for offset in range(0, args.events, chunk):
+            rows = []
+            for index in range(offset, min(offset + chunk, args.events)):
+                timestamp = (now - timedelta(seconds=rng.randrange(30 * 86400))).isoformat()
+                data = event_data(rng, f"s{index // 8}")
+                rows.append((f"evt_{index}", data['session_id'], None, True, timestamp, 'chat', data['persona_id'],
+                             data['question'], data['response_time'], data['fallback_used'], False,
+                             data['urgency_level'], 'desktop', None))
+            service._pool.executemany(insert_sql, rows)
+        service._pool.executemany(
+            "INSERT INTO sessions (session_id, is_anonymous, start_time, total_messages) VALUES (?, 1, ?, 8)",
+            [(f"s{i}", (now - timedelta(seconds=rng.randrange(30 * 86400))).isoformat())
+             for i in range(args.events // 8)])
+        print(f"\nloaded {args.events:,} events in {time.perf_counter() - started:.1f} s")
+
+        result = service.backfill_rollups()
+        print(f"backfill          {result['events']:,} events in {result['duration_seconds']:.1f} s")
+
+        for label, days in (("7 days", 7), ("1 day", 1)):
+            start_date = (now - timedelta(days=days)).isoformat()
+            end_date = now.isoformat()
+            with service._pool.connection() as conn:
+                legacy_p50, legacy_p95 = timed(lambda: legacy_aggregated_metrics(conn, start_date, end_date),
+                                               args.repeats)
+            rollup_p50, rollup_p95 = timed(lambda: service.get_aggregated_metrics(start_date, end_date),
+                                           args.repeats)
+            print(f"dashboard {label:<7} raw GROUP BY p50 {legacy_p50:9.2f} ms  p95 {legacy_p95:9.2f} ms  |  "
+                  f"rollups p50 {rollup_p50:7.2f} ms  p95 {rollup_p95:7.2f} ms")
+        service.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
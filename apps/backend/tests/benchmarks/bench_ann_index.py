@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - ANN engines vs exact scan on the real 384-d e5 embeddings
+
+The committed fallback corpus (cache/embeddings/embeddings.npy) is small, so it
+is used as the seed set: every synthetic chunk is a real embedding plus
+Gaussian noise, which keeps the neighbourhood structure of the e5 space.
+Queries are fresh perturbations of real embeddings.
+
+Reports recall@k against the exact scan and p50/p99 query latency.
+
+Usage: python tests/benchmarks/bench_ann_index.py [--sizes 10000 50000] [--k 10]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.vector_store import LocalVectorStore, VectorDocument
+from services.ann_index import ANNLocalVectorStore, HNSWLIB_AVAILABLE
+
+EMBEDDINGS_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'cache', 'embeddings', 'embeddings.npy')
+
+def synthetic_corpus(seed_vectors: np.ndarray, size: int, noise: float, rng) -> np.ndarray:
+    base = seed_vectors[rng.integers(len(seed_vectors), size=size)]
+    return (base + noise * rng.normal(size=base.shape)).astype(np.float32)
+
+def fill(store, vectors):
+    store._save_store = lambda: None  # keep disk I/O out of the measurement
+    for i, vector in enumerate(vectors):
+        store.add_document(VectorDocument(
+            id=f"chunk_{i}", text="", embedding=vector, metadata={}, chunk_type='general', priority=0.5
+        ))
+
+def measure(store, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = store.search_similar(query, top_k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append({doc.id for doc, _ in found})
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), results
+
+def run(size: int, n_queries: int, k: int, noise: float):
+    seed_vectors = np.load(EMBEDDINGS_FILE).astype(np.float32)
+    rng = np.random.default_rng(size)
+    corpus = synthetic_corpus(seed_vectors, size, noise, rng)
+    queries = synthetic_corpus(seed_vectors, n_queries, noise, rng)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        exact = LocalVectorStore(os.path.join(temp_dir, 'exact'))
+        fill(exact, corpus)
+        exact_p50, exact_p99, truth = measure(exact, queries, k)
+        print(f"{size:>7} chunks  exact      p50={exact_p50:7.3f}ms p99={exact_p99:7.3f}ms recall@{k}=1.000")
+
+        backends = ['ivf'] + (['hnsw'] if HNSWLIB_AVAILABLE else [])
+        for backend in backends:
+            start = time.perf_counter()
+            store = ANNLocalVectorStore(os.path.join(temp_dir, backend), backend=backend, min_train_size=1024)
+            fill(store, corpus)
+            build_s = time.perf_counter() - start
+
+            p50, p99, found = measure(store, queries, k)
+            recall = np.mean([len(t & f) / k for t, f in zip(truth, found)])
+            print(f"{size:>7} chunks  {backend:<10} p50={p50:7.3f}ms p99={p99:7.3f}ms recall@{k}={recall:.3f} "
+                  f"build={build_s:.1f}s")
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 50_000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--noise', type=float, default=0.02, help='per-dimension std of the synthetic perturbation')
+    args = parser.parse_args()
+
+    if not HNSWLIB_AVAILABLE:
+        print("hnswlib not installed - benchmarking IVF-flat only")
+    for size in args.sizes:
+        run(size, args.queries, args.k, args.noise)
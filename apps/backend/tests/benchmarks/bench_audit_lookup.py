@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - audit point lookup: full-file decrypt vs segmented indexed store
+
+Writes --records audit records twice: to a daily file in the previous format
+(one Fernet line per record; read_records decrypted the whole file for any
+query) and to SegmentedAuditStore. Sessions are interleaved the way
+concurrent chats are (--concurrent sessions active at a time, each spanning a
+few segments). Then times single-session lookups: "full-file" decrypts and
+filters every line, "segmented" decrypts only the segments the HMAC index
+points to.
+
+Usage: python tests/benchmarks/bench_audit_lookup.py [--records 1000000] [--lookups 50] [--legacy-lookups 3]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.security.audit_segments import SegmentedAuditStore
+
+def make_record(index, session_id, timestamp):
+    return {
+        'audit_id': f"audit_{index}",
+        'timestamp': timestamp.isoformat(),
+        'interaction': {
+            'interaction_id': f"int_{index}",
+            'user_session_id': session_id,
+            'action_type': 'question_asked' if index % 3 else 'response_generated',
+            'persona_id': 'ga' if index % 2 else 'dr_gasnelio',
+            'question_hash': f"{index:016x}",
+            'response_classification': 'educational',
+            'legal_basis': 'legitimate_interest',
+            'retention_period': 730,
+            'anonymized_metadata': {'response_time': 1.2},
+            'compliance_flags': []
+        },
+        'compliance_flags': [],
+        'system_metadata': {'environment': 'production', 'audit_version': '1.0.0'},
+        'checksum': f"{index:064x}"
+    }
+
+def legacy_lookup(cipher, filename, session_id):
+    """read_records anterior (descriptografa o arquivo inteiro) + filtro por sessão"""
+    found = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            if '|' in line:
+                _, encrypted_b64 = line.strip().split('|', 1)
+                record = json.loads(cipher.decrypt(base64.b64decode(encrypted_b64)).decode('utf-8'))
+                if record['interaction']['user_session_id'] == session_id:
+                    found.append(record)
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=1000000, help="audit records written")
+    parser.add_argument('--concurrent', type=int, default=200, help="sessions active at the same time")
+    parser.add_argument('--segment-records', type=int, default=1000, help="records per sealed segment")
+    parser.add_argument('--lookups', type=int, default=50, help="segmented point lookups")
+    parser.add_argument('--legacy-lookups', type=int, default=3, help="full-file lookups (slow)")
+    args = parser.parse_args()
+
+    rng = random.Random(19)
+    key = Fernet.generate_key()
+    cipher = Fernet(key)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        legacy_file = os.path.join(temp_dir, 'medical_audit_encrypted_20260501.log')
+        store = SegmentedAuditStore(os.path.join(temp_dir, 'segmented'), key, segment_records=args.segment_records)
+        start_time = datetime(2026, 5, 1, tzinfo=timezone.utc)
+        session_span = args.concurrent * 8
+
+        legacy_seconds = segmented_seconds = 0.0
+        for index in range(args.records):
+            session_id = f"ses_{(index // session_span) * args.concurrent + rng.randrange(args.concurrent)}"
+            timestamp = start_time + timedelta(milliseconds=index * 50)
+            record = make_record(index, session_id, timestamp)
+
+            # append anterior: abre o arquivo diário a cada registro
+            started = time.perf_counter()
+            token = cipher.encrypt(json.dumps(record, default=str, ensure_ascii=False).encode('utf-8'))
+            with open(legacy_file, 'ab') as legacy:
+                legacy.write(f"{timestamp.isoformat()}|{base64.b64encode(token).decode()}\n".encode('utf-8'))
+            legacy_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            store.append(record, {'session': session_id, 'action': record['interaction']['action_type'],
+                                  'persona': record['interaction']['persona_id']}, timestamp)
+            segmented_seconds += time.perf_counter() - started
+        store.flush()
+        print(f"write {args.records:,} records  full-file {args.records / legacy_seconds:,.0f} rec/s  "
+              f"segmented {args.records / segmented_seconds:,.0f} rec/s  ({store.get_stats()['segments']} segments)")
+
+        sessions = [f"ses_{rng.randrange((args.records // session_span) * args.concurrent or 1)}"
+                    for _ in range(args.lookups)]
+
+        durations = []
+        for session_id in sessions:
+            started = time.perf_counter()
+            store.query(session=session_id)
+            durations.append((time.perf_counter() - started) * 1000)
+        print(f"lookup segmented   p50 {np.percentile(durations, 50):10.1f} ms  p95 {np.percentile(durations, 95):10.1f} ms")
+
+        legacy_durations = []
+        for session_id in sessions[:args.legacy_lookups]:
+            started = time.perf_counter()
+            expected = legacy_lookup(cipher, legacy_file, session_id)
+            legacy_durations.append((time.perf_counter() - started) * 1000)
+            assert [r['audit_id'] for r in expected] == [r['audit_id'] for r in store.query(session=session_id)]
+        print(f"lookup full-file   p50 {np.percentile(legacy_durations, 50):10.1f} ms  "
+              f"max {max(legacy_durations):10.1f} ms")
+
+        started = time.perf_counter()
+        result = store.verify_chain()
+        print(f"verify_chain       {result['segments']} segments in {(time.perf_counter() - started) * 1000:.0f} ms "
+              f"(valid={result['valid']})")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
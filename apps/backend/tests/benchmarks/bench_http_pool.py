@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - pooled keep-alive clients vs one client per request
+
+Runs offline against the local stub server (tests/services/http_stub_server.py).
+--connect-delay stands in for the TCP+TLS handshake to a remote API: a fresh
+client pays it on every request, the pooled registry only on the first.
+
+Reports mean/p50/p95 latency and the number of connections the server saw,
+for the sync (embeddings, chatbot) and async (AIProviderManager) paths.
+
+Usage: python tests/benchmarks/bench_http_pool.py [--requests 200] [--connect-delay 0.03]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services'))
+
+from http_stub_server import StubHTTPServer
+from core.performance.http_client_pool import HTTPClientRegistry
+
+def summarize(label, latencies, connections):
+    ms = np.array(latencies) * 1000
+    print(f"{label:<28} mean {ms.mean():7.2f} ms  p50 {np.percentile(ms, 50):7.2f} ms  "
+          f"p95 {np.percentile(ms, 95):7.2f} ms  connections {connections}")
+
+def bench_sync(server, url, requests, pooled):
+    registry = HTTPClientRegistry()
+    before = server.connections
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        if pooled:
+            registry.client(url).post(url, json={"inputs": ["hanseníase"]})
+        else:
+            with httpx.Client() as client:
+                client.post(url, json={"inputs": ["hanseníase"]})
+        latencies.append(time.perf_counter() - start)
+    registry.close()
+    return latencies, server.connections - before
+
+async def bench_async(server, url, requests, pooled):
+    registry = HTTPClientRegistry()
+    before = server.connections
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        if pooled:
+            await registry.async_client(url).post(url, json={"messages": []})
+        else:
+            async with httpx.AsyncClient() as client:
+                await client.post(url, json={"messages": []})
+        latencies.append(time.perf_counter() - start)
+    # registry.close() waits on the loop it would run in; close this loop's clients here
+    for _, client in list(registry._async_clients.values()):
+        await client.aclose()
+    return latencies, server.connections - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--connect-delay', type=float, default=0.03, help="simulated handshake (s)")
+    parser.add_argument('--response-delay', type=float, default=0.0)
+    args = parser.parse_args()
+
+    with StubHTTPServer(connect_delay=args.connect_delay, response_delay=args.response_delay) as server:
+        embeddings_url = f"{server.url}/models/intfloat/multilingual-e5-small"
+        chat_url = f"{server.url}/api/v1/chat/completions"
+
+        print(f"{args.requests} requests, simulated handshake {args.connect_delay * 1000:.0f} ms\n")
+        summarize("sync  fresh client", *bench_sync(server, embeddings_url, args.requests, pooled=False))
+        summarize("sync  pooled", *bench_sync(server, embeddings_url, args.requests, pooled=True))
+        summarize("async fresh client", *asyncio.run(bench_async(server, chat_url, args.requests, pooled=False)))
+        summarize("async pooled", *asyncio.run(bench_async(server, chat_url, args.requests, pooled=True)))
+
+if __name__ == '__main__':
+    main()
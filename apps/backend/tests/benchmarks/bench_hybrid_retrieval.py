@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - SemanticSearchEngine: dense-only (top_k*2 over-fetch) vs lexical vs hybrid RRF
+
+Offline recall/latency evaluation over data/structured/frequently_asked_questions.json.
+Every FAQ answer (gasnelio_answer and ga_answer) is a chunk, plus the paragraphs
+of data/knowledge-base/hanseniase.md as distractors. Each FAQ question (and,
+as a harder set, its keyword list) is a query whose relevant chunks are that
+entry's two answers. Reports hit rate@k (any relevant chunk in the top k),
+recall@k, MRR and per-query latency for:
+
+  dense   - HYBRID_SEARCH_ENABLED=False, top_k=k*2 sliced to k (previous retrieve_context)
+  lexical - embeddings unavailable, BM25 index only
+  hybrid  - BM25 + dense fused with RRF, top_k=k (current retrieve_context)
+
+Dense scores come from the unified embedding service when it loads
+(--embeddings real); otherwise from hashed character 3-gram vectors, a crude
+stand-in that is not a semantic model. --dense-latency-ms adds a sleep to every
+query embedding to model the embedding call + Supabase RPC, which the hybrid
+path overlaps with the BM25 search.
+
+Usage: python tests/benchmarks/bench_hybrid_retrieval.py [--k 3] [--rounds 5] [--dense-latency-ms 0] [--embeddings hashed|real]
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import argparse
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag import semantic_search
+from services.rag.semantic_search import MedicalChunk, SemanticSearchEngine
+from services.vector_store import LocalVectorStore, VectorDocument
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'data')
+DEFAULT_FAQ = os.path.join(DATA_DIR, 'structured', 'frequently_asked_questions.json')
+DEFAULT_KB = os.path.join(DATA_DIR, 'knowledge-base', 'hanseniase.md')
+
+CATEGORY_TYPES = {
+    'medicamentos': 'mechanism',
+    'administracao': 'administration',
+    'efeitos_adversos': 'safety',
+    'dispensacao': 'procedure',
+    'populacoes_especiais': 'dosing',
+    'seguranca': 'safety',
+}
+PRIORITIES = {'high': 1.0, 'medium': 0.8, 'low': 0.6}
+
+class HashedNgramEmbeddings:
+    """Vetores de 3-gramas de caracteres (hash) - substituto offline do modelo e5"""
+
+    def __init__(self, dimension=512, latency_ms=0.0):
+        self.dimension = dimension
+        self.latency = latency_ms / 1000
+
+    def is_available(self):
+        return True
+
+    def embed_text(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        padded = f"  {text.lower()}  "
+        for start in range(len(padded) - 2):
+            vector[zlib.crc32(padded[start:start + 3].encode()) % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_query(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.embed_text(text)
+
+    def embed_batch(self, texts):
+        return [self.embed_text(text) for text in texts]
+
+    def get_statistics(self):
+        return {}
+
+class DelayedEmbeddings:
+    """Serviço real com a mesma latência artificial por consulta"""
+
+    def __init__(self, service, latency_ms):
+        self.service = service
+        self.latency = latency_ms / 1000
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    def embed_query(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        embed = getattr(self.service, 'embed_query', self.service.embed_text)
+        return embed(text)
+
+def load_corpus(faq_path, kb_path):
+    with open(faq_path, encoding='utf-8') as f:
+        faq = json.load(f)['faq_hanseniase_pqtu']
+    chunks, queries = [], []
+    for category, entries in faq.items():
+        if category not in CATEGORY_TYPES:
+            continue
+        for entry in entries.values():
+            relevant = set()
+            for field in ('gasnelio_answer', 'ga_answer'):
+                if entry.get(field):
+                    relevant.add(entry[field])
+                    chunks.append(MedicalChunk(
+                        content=entry[field], category=CATEGORY_TYPES[category],
+                        priority=PRIORITIES.get(entry.get('priority'), 0.8), source_section=category,
+                        word_count=len(entry[field].split()), contains_dosage=False,
+                        contains_contraindication=False))
+            queries.append(('question', entry['question'], relevant))
+            if entry.get('keywords'):
+                queries.append(('keywords', ' '.join(entry['keywords']), relevant))
+    if kb_path and os.path.exists(kb_path):
+        with open(kb_path, encoding='utf-8') as f:
+            for paragraph in f.read().split('\n\n'):
+                if len(paragraph.strip()) >= 50:
+                    chunks.append(MedicalChunk(
+                        content=paragraph.strip(), category='general', priority=0.6, source_section='kb',
+                        word_count=len(paragraph.split()), contains_dosage=False, contains_contraindication=False))
+    return chunks, queries
+
+def make_engine(config, service, store):
+    with patch.object(semantic_search, '_lazy_import_embedding_service',
+                      return_value=(lambda: service, None, None)), \
+         patch.object(semantic_search, '_lazy_import_vector_store',
+                      return_value=(lambda: store, VectorDocument, None)):
+        engine = SemanticSearchEngine(config)
+    engine.cache_ttl = 0  # medir a busca, não o cache
+    return engine
+
+def evaluate(label, engine, queries, k, top_k, rounds):
+    timings, hits, recall, reciprocal = [], {}, {}, {}
+    for round_index in range(rounds):
+        for query_set, query, relevant in queries:
+            started = time.perf_counter()
+            results = engine.search(query, top_k=top_k, min_score=0.0)[:k]
+            timings.append((time.perf_counter() - started) * 1000)
+            if round_index:
+                continue
+            found = [position for position, result in enumerate(results) if result.chunk.content in relevant]
+            hits.setdefault(query_set, []).append(1.0 if found else 0.0)
+            recall.setdefault(query_set, []).append(len(found) / len(relevant))
+            reciprocal.setdefault(query_set, []).append(1.0 / (found[0] + 1) if found else 0.0)
+    scores = '   '.join(
+        f"{query_set} hit@{k} {np.mean(hits[query_set]):.2f} recall@{k} {np.mean(recall[query_set]):.2f} "
+        f"mrr {np.mean(reciprocal[query_set]):.2f}"
+        for query_set in sorted(hits)
+    )
+    print(f"{label:8s} top_k={top_k:<3d} {scores}   p50 {np.percentile(timings, 50):7.2f} ms  "
+          f"p95 {np.percentile(timings, 95):7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--k', type=int, default=3, help="chunks passed to the answer (max_chunks)")
+    parser.add_argument('--rounds', type=int, default=5, help="timing passes over the query set")
+    parser.add_argument('--dense-latency-ms', type=float, default=0.0, help="simulated embedding + RPC latency")
+    parser.add_argument('--embeddings', choices=['hashed', 'real'], default='hashed')
+    parser.add_argument('--faq', default=DEFAULT_FAQ)
+    parser.add_argument('--kb', default=DEFAULT_KB, help="distractor paragraphs ('' to skip)")
+    args = parser.parse_args()
+
+    chunks, queries = load_corpus(args.faq, args.kb)
+    service = HashedNgramEmbeddings(latency_ms=args.dense_latency_ms)
+    if args.embeddings == 'real':
+        from services.unified_embedding_service import get_embedding_service
+        real = get_embedding_service()
+        if real is not None and real.is_available():
+            service = DelayedEmbeddings(real, args.dense_latency_ms)
+        else:
+            print("embedding service unavailable - using hashed 3-gram vectors")
+    print(f"{len(chunks)} chunks, {len(queries)} queries, embeddings: {type(service).__name__}")
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        config = SimpleNamespace(EMBEDDINGS_ENABLED=True, SEMANTIC_SIMILARITY_THRESHOLD=0.0,
+                                 LEXICAL_INDEX_DIR=os.path.join(temp_dir, 'lexical'),
+                                 HYBRID_SEARCH_ENABLED=True, HYBRID_FUSION='rrf')
+        store = LocalVectorStore(os.path.join(temp_dir, 'vectors'))
+        hybrid = make_engine(config, service, store)
+        started = time.perf_counter()
+        hybrid.index_medical_chunks_batch(chunks, 'faq.json')
+        print(f"indexed in {(time.perf_counter() - started) * 1000:.0f} ms "
+              f"({len(hybrid.lexical_index)} lexical documents)")
+
+        dense = make_engine(SimpleNamespace(**{**vars(config), 'HYBRID_SEARCH_ENABLED': False}), service, store)
+        lexical = make_engine(config, service, store)
+        lexical.embedding_service = None
+
+        evaluate('dense', dense, queries, args.k, args.k * 2, args.rounds)
+        evaluate('lexical', lexical, queries, args.k, args.k, args.rounds)
+        evaluate('hybrid', hybrid, queries, args.k, args.k, args.rounds)
+        hybrid.fusion_method = 'weighted'
+        evaluate('weighted', hybrid, queries, args.k, args.k, args.rounds)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - bytes shipped per backup cycle: whole file vs incremental page deltas
+
+Builds an analytics-like database of --rows rows, then runs --cycles backup
+cycles with --writes new rows between them. "file" is the previous behaviour
+(upload the whole database every cycle); "incremental" ships a full snapshot
+once and page deltas afterwards. Also reports the restore time of the
+resulting chain.
+
+Usage: python tests/benchmarks/bench_incremental_backup.py [--rows 200000] [--cycles 10] [--writes 500]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.performance.sqlite_pool import get_sqlite_pool
+from services.storage.incremental_backup import IncrementalBackupManager, LocalDirectoryObjectStore
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help="initial analytics rows")
+    parser.add_argument('--cycles', type=int, default=10, help="backup cycles")
+    parser.add_argument('--writes', type=int, default=500, help="rows inserted between cycles")
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(temp_dir, "analytics.db")
+        pool = get_sqlite_pool(db_path)
+        pool.executescript("""
+            CREATE TABLE IF NOT EXISTS analytics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, event_type TEXT, event_data TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_analytics_timestamp ON analytics(timestamp);
+        """)
+
+        def write(count, start):
+            pool.executemany("INSERT INTO analytics (event_type, event_data) VALUES (?, ?)",
+                             [("chat", f'{{"persona": "ga", "n": {start + i}, "q": "dose pqt-u adulto"}}')
+                              for i in range(count)])
+
+        write(args.rows, 0)
+        store = LocalDirectoryObjectStore(os.path.join(temp_dir, "bucket"))
+        manager = IncrementalBackupManager(db_path, store)
+
+        file_bytes, delta_bytes, durations = [], [], []
+        for cycle in range(args.cycles):
+            if cycle:
+                write(args.writes, args.rows + cycle * args.writes)
+            pool.checkpoint('PASSIVE')
+            file_bytes.append(os.path.getsize(db_path))
+            result = manager.run_cycle()
+            delta_bytes.append(result['bytes_shipped'])
+            durations.append(result['duration_ms'])
+            print(f"cycle {cycle:>2}  {result['kind']:<9} {result['changed_pages']:>7} pages  "
+                  f"{result['bytes_shipped'] / 1024:>9.1f} KiB shipped  ({file_bytes[-1] / 1024:>9.1f} KiB file)  "
+                  f"{result['duration_ms']:7.1f} ms")
+
+        print(f"\nwhole file   {sum(file_bytes) / 1024 ** 2:8.2f} MiB over {args.cycles} cycles")
+        print(f"incremental  {sum(delta_bytes) / 1024 ** 2:8.2f} MiB over {args.cycles} cycles "
+              f"(cycle p50 {np.percentile(durations, 50):.1f} ms)")
+
+        started = time.perf_counter()
+        restore = manager.restore(os.path.join(temp_dir, "restored.db"))
+        print(f"restore      {restore['deltas_applied']} deltas, {restore['bytes_downloaded'] / 1024 ** 2:.2f} MiB "
+              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        pool.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - Single-section edits: full-document chunking vs IncrementalChunker
+
+For every non-empty section of each guide in data/knowledge-base/*.md, appends
+" (revisado)" to the section's first line and counts the embeddings the edit
+costs:
+
+  full        - chunk_document on the edited file, every chunk re-embedded
+                (index_medical_chunks_batch / the per-chunk script path)
+  hash-skip   - chunk_document again, only chunk ids not seen before
+                (IndexingPipeline manifest without a chunk state)
+  incremental - IncrementalChunker change set (to_embed), re-chunking only
+                sections whose fingerprint changed; also reports to_delete
+
+plus the chunking time per edit (full re-chunk vs incremental diff).
+
+Usage: python tests/benchmarks/bench_incremental_chunking.py [--kb ../../data/knowledge-base] [--rounds 5]
+"""
+
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag.incremental_chunking import IncrementalChunker
+from services.rag.indexing_pipeline import content_id
+from services.rag.medical_chunking import MedicalChunker
+
+DEFAULT_KB = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'data', 'knowledge-base')
+
+def section_edits(chunker, document):
+    """Uma versão do documento por seção, com só aquela seção editada"""
+    for anchor, content in chunker.detect_anchored_sections(document):
+        if not content.strip():
+            continue
+        first_line, _, rest = content.partition('\n')
+        edited = f"{first_line} (revisado)" + (f"\n{rest}" if rest else '')
+        yield anchor, document.replace(content, edited, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--kb', default=DEFAULT_KB, help="directory with the markdown guides")
+    parser.add_argument('--rounds', type=int, default=5, help="timing passes per edit")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    chunker = MedicalChunker()
+    incremental = IncrementalChunker(chunker, state_dir='')
+    for path in sorted(glob.glob(os.path.join(args.kb, '*.md'))):
+        name = os.path.basename(path)
+        with open(path, encoding='utf-8') as f:
+            document = f.read()
+        base_ids = {content_id(chunk.content, name) for chunk in chunker.chunk_document(document, name)}
+        state = incremental.rechunk(document, name).state
+
+        full, hash_skip, delta, deletes, sections = [], [], [], [], []
+        full_ms, incremental_ms = [], []
+        for anchor, edited in section_edits(chunker, document):
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                chunks = chunker.chunk_document(edited, name)
+                full_ms.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                change_set = incremental.rechunk(edited, name, previous=state)
+                incremental_ms.append((time.perf_counter() - started) * 1000)
+            full.append(len(chunks))
+            hash_skip.append(len({content_id(chunk.content, name) for chunk in chunks} - base_ids))
+            delta.append(len(change_set.to_embed))
+            deletes.append(len(change_set.to_delete))
+            sections.append(change_set.sections_rechunked)
+
+        print(f"{name}: {len(base_ids)} chunks, {len(full)} single-section edits")
+        for label, counts in (('full', full), ('hash-skip', hash_skip), ('incremental', delta)):
+            print(f"  {label:11s} embeddings/edit mean {np.mean(counts):6.2f}  max {max(counts):3d}  "
+                  f"total {sum(counts):5d}")
+        print(f"  incremental deletes/edit mean {np.mean(deletes):.2f}, sections re-chunked/edit "
+              f"mean {np.mean(sections):.2f}")
+        print(f"  chunking  full p50 {np.percentile(full_ms, 50):7.3f} ms   "
+              f"incremental p50 {np.percentile(incremental_ms, 50):7.3f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - Knowledge base indexing: per-chunk loop vs three-stage pipeline
+
+"sequential" is the previous index_knowledge_base.py loop: one embedding call
+and one add_document (LocalVectorStore save) per chunk, no sleeps. "pipeline"
+is IndexingPipeline (MedicalChunker -> embed_batch -> add_documents) with the
+given workers and batch size; "rerun" repeats it with the manifest from the
+previous run, so every chunk is skipped by content hash.
+
+The corpus is data/knowledge-base/*.md (chunked by MedicalChunker) plus every
+string > 50 chars in data/structured/*.json, replicated --copies times with a
+copy marker so each copy hashes differently. The model is simulated: every
+embedding call sleeps --call-ms + --text-ms per text (like a forward pass, the
+sleep releases the GIL). Reports chunks/sec per stage and end to end.
+
+Usage: python tests/benchmarks/bench_indexing_pipeline.py [--copies 4] [--workers 2] [--batch-size 32] [--call-ms 5] [--text-ms 0.5]
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import zlib
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag.indexing_pipeline import IndexingPipeline, PipelineChunk
+from services.rag.medical_chunking import MedicalChunker
+from services.vector_store import LocalVectorStore, VectorDocument
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'data')
+
+class SimulatedModel:
+    """Custo fixo por chamada + custo por texto; vetores 384D determinísticos"""
+
+    def __init__(self, call_ms, text_ms):
+        self.call = call_ms / 1000
+        self.text = text_ms / 1000
+
+    def embed_batch(self, texts):
+        time.sleep(self.call + self.text * len(texts))
+        return [np.random.default_rng(zlib.crc32(text.encode())).standard_normal(384).astype(np.float32)
+                for text in texts]
+
+def json_strings(obj):
+    if isinstance(obj, dict):
+        for value in obj.values():
+            yield from json_strings(value)
+    elif isinstance(obj, list):
+        for item in obj:
+            yield from json_strings(item)
+    elif isinstance(obj, str) and len(obj.strip()) > 50:
+        yield obj.strip()
+
+def load_corpus(copies):
+    documents, chunks = [], []
+    for copy in range(copies):
+        for path in sorted(glob.glob(os.path.join(DATA_DIR, 'knowledge-base', '*.md'))):
+            with open(path, encoding='utf-8') as f:
+                documents.append((f"{copy}/{os.path.basename(path)}", f.read()))
+        for path in sorted(glob.glob(os.path.join(DATA_DIR, 'structured', '*.json'))):
+            with open(path, encoding='utf-8') as f:
+                for text in json_strings(json.load(f)):
+                    chunks.append(PipelineChunk(text=text, chunk_type='general', priority=0.7,
+                                                source_file=f"{copy}/{os.path.basename(path)}"))
+    return documents, chunks
+
+def sequential(store, model, documents, chunks):
+    chunker = MedicalChunker()
+    all_chunks = list(chunks)
+    for source_file, text in documents:
+        all_chunks.extend(PipelineChunk(text=chunk.content, chunk_type=chunk.category, priority=chunk.priority,
+                                        source_file=source_file)
+                          for chunk in chunker.chunk_document(text, source_file) if chunk.content.strip())
+    for chunk in all_chunks:
+        embedding = model.embed_batch([chunk.text])[0]
+        store.add_document(VectorDocument(id=chunk.id, text=chunk.text, embedding=embedding, metadata={},
+                                          chunk_type=chunk.chunk_type, priority=chunk.priority,
+                                          source_file=chunk.source_file, created_at=datetime.now(timezone.utc)))
+    return len(all_chunks)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--copies', type=int, default=4, help="corpus replicas")
+    parser.add_argument('--workers', type=int, default=2, help="chunk and embed workers")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--queue-size', type=int, default=8)
+    parser.add_argument('--call-ms', type=float, default=5.0, help="simulated fixed cost per embedding call")
+    parser.add_argument('--text-ms', type=float, default=0.5, help="simulated cost per embedded text")
+    args = parser.parse_args()
+
+    documents, chunks = load_corpus(args.copies)
+    model = SimulatedModel(args.call_ms, args.text_ms)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        started = time.perf_counter()
+        total = sequential(LocalVectorStore(os.path.join(temp_dir, 'sequential')), model, documents, chunks)
+        elapsed = time.perf_counter() - started
+        print(f"{len(documents)} markdown documents + {len(chunks)} JSON chunks -> {total} chunks")
+        print(f"sequential  {elapsed:7.2f} s  {total / elapsed:8.1f} chunks/s")
+
+        store = LocalVectorStore(os.path.join(temp_dir, 'pipeline'))
+        manifest = os.path.join(temp_dir, 'manifest.json')
+        for label in ('pipeline', 'rerun'):
+            pipeline = IndexingPipeline(store, model.embed_batch, VectorDocument, manifest_path=manifest,
+                                        batch_size=args.batch_size, chunk_workers=args.workers,
+                                        embed_workers=args.workers, queue_size=args.queue_size)
+            report = pipeline.run(documents=documents, chunks=chunks)
+            stages = '  '.join(f"{name} {stats['chunks_per_second']:9.1f}/s"
+                               for name, stats in report['stages'].items())
+            print(f"{label:10s}  {report['wall_seconds']:7.2f} s  "
+                  f"{report['chunks'] / report['wall_seconds']:8.1f} chunks/s   indexed {report['indexed']:5d}  "
+                  f"skipped {report['skipped']:5d}   {stages}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - per-message classification time: keyword loops vs shared automata
+
+Runs every keyword classifier touched by a chat message (ScopeDetectionSystem,
+RAG is_query_in_scope + _classify_query_type, predictive ContextAnalyzer
+categories) over the repo's test questions (scope_detector sample cases and
+scripts/medical_ai_validation.py questions). "loops" is the previous
+implementation (chained .replace() normalization plus `keyword in text` loops
+per list); "automata" is the current code on core.validation.keyword_matcher.
+
+Also times one vocabulary of --vocabulary synthetic keywords against the same
+messages, to show how each approach scales with vocabulary size.
+
+Usage: python tests/benchmarks/bench_keyword_matcher.py [--rounds 2000] [--vocabulary 2000]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.validation.scope_detector import ScopeDetectionSystem
+from core.validation.keyword_matcher import KeywordMatcher, fold_text, get_keyword_matcher
+from services.rag.supabase_rag_system import QUERY_TYPE_KEYWORDS, SupabaseRAGSystem
+from services.integrations.predictive_system import ContextAnalyzer
+
+QUESTIONS = [
+    # core/validation/scope_detector.py
+    "Qual a dose de rifampicina para adultos?",
+    "Posso tomar clofazimina na gravidez?",
+    "Como fazer a dispensação PQT-U?",
+    "Como saber se tenho hanseníase?",
+    "Tenho diabetes, posso tomar esses remédios?",
+    "Tenho direito a auxílio por ter hanseníase?",
+    "Estou com dor forte, é urgente!",
+    "Rifampicina serve para tuberculose?",
+    "Posso parar o tratamento se melhorar?",
+    # scripts/medical_ai_validation.py
+    "Qual é a posologia da rifampicina no esquema PQT-MB para adultos?",
+    "Quais são os critérios diagnósticos para hanseníase neural pura?",
+    "Como manejar uma reação hansênica tipo 2 (ENL)?",
+    "Qual a dose de dapsona para crianças com hanseníase?",
+    "Interações medicamentosas da clofazimina?",
+    "Estou com medo dos efeitos colaterais do tratamento da hanseníase",
+    "Como posso explicar para minha família que tenho hanseníase?",
+    "O tratamento é muito longo, estou desanimado",
+    "Como explicar hanseníase para uma criança?",
+    "Tenho vergonha do preconceito com hanseníase",
+]
+
+# ---------------------------------------------------------------------------
+# Implementação anterior (loops de substring)
+# ---------------------------------------------------------------------------
+
+_ACCENTS = {'ã': 'a', 'á': 'a', 'à': 'a', 'â': 'a', 'é': 'e', 'ê': 'e', 'è': 'e', 'í': 'i', 'î': 'i', 'ì': 'i',
+            'ó': 'o', 'ô': 'o', 'ò': 'o', 'õ': 'o', 'ú': 'u', 'û': 'u', 'ù': 'u', 'ç': 'c'}
+
+def legacy_scope(detector, question):
+    text = question.lower()
+    for old, new in _ACCENTS.items():
+        text = text.replace(old, new)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    in_count = sum(1 for keyword in detector.in_scope_keywords if keyword in text)
+    out_count = sum(1 for keyword in detector.out_of_scope_indicators if keyword in text)
+    total_words = max(len(text.split()), 1)
+    scope = {"in_scope_keywords": in_count, "out_scope_keywords": out_count,
+             "in_scope_density": in_count / total_words, "out_scope_density": out_count / total_words,
+             "keyword_balance": in_count - out_count}
+    context = {name: any(term in text for term in terms) for name, terms in detector.context_keywords.items()}
+    patterns = {name: any(term in text for term in terms) for name, terms in detector.pattern_keywords.items()
+                if not name.startswith('comparison_')}
+    patterns['asks_for_diagnosis'] = bool(re.search(r'\b(como saber|tenho|sintomas|diagnostico)\b', text))
+    patterns['asks_comparison'] = "ou" in text and ("melhor" in text or "diferenca" in text)
+    return detector._consolidate_analysis(scope, context, patterns)
+
+def legacy_rag(scope_keywords, question):
+    query_lower = question.lower()
+    category_scores = {}
+    in_scope = False
+    for category, keywords in scope_keywords.items():
+        score = sum(1 for keyword in keywords if keyword in query_lower)
+        if score > 0:
+            category_scores[category] = score / len(keywords)
+    if category_scores:
+        best_category = max(category_scores.keys(), key=lambda k: category_scores[k])
+        in_scope = category_scores[best_category] > 0.1
+    scores = {query_type: sum(1 for keyword in keywords if keyword in query_lower)
+              for query_type, keywords in QUERY_TYPE_KEYWORDS.items()}
+    if max(scores.values()) > 0:
+        return in_scope, max(scores.items(), key=lambda x: x[1])[0]
+    return in_scope, 'procedure_queries'
+
+def legacy_predictive(analyzer, question):
+    query_lower = question.lower()
+    categories = [category for category, terms in analyzer.medical_terms.items()
+                  if any(term in query_lower for term in terms)]
+    complexity = [level for level, terms in analyzer.complexity_terms.items()
+                  if any(term in query_lower for term in terms)]
+    return categories, complexity
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=2000, help="passes over the question set")
+    parser.add_argument('--vocabulary', type=int, default=2000, help="synthetic keywords for the scaling test")
+    args = parser.parse_args()
+
+    detector = ScopeDetectionSystem()
+    analyzer = ContextAnalyzer()
+    scope_keywords = SupabaseRAGSystem._load_scope_keywords(None)
+    rag = SimpleNamespace(
+        scope_keywords=scope_keywords,
+        query_matcher=get_keyword_matcher('rag_query', {
+            **{category: [(keyword, 1.0 / len(terms)) for keyword in terms]
+               for category, terms in scope_keywords.items()},
+            **QUERY_TYPE_KEYWORDS
+        }),
+        stats={'scope_violations': 0}
+    )
+
+    def rag_automata(question):
+        in_scope, category, _ = SupabaseRAGSystem.is_query_in_scope(rag, question)
+        return in_scope, SupabaseRAGSystem._classify_query_type(rag, question, category)
+
+    variants = [
+        ("scope detector", lambda q: legacy_scope(detector, q), detector.detect_scope),
+        ("rag scope + query type", lambda q: legacy_rag(scope_keywords, q), rag_automata),
+        ("predictive categories", lambda q: legacy_predictive(analyzer, q), analyzer.term_matcher.categories),
+    ]
+
+    for question in QUESTIONS:
+        assert legacy_scope(detector, question) == detector.detect_scope(question), question
+
+    totals = {"loops": 0.0, "automata": 0.0}
+    for name, legacy_fn, new_fn in variants:
+        for label, fn in (("loops", legacy_fn), ("automata", new_fn)):
+            durations = []
+            for _ in range(args.rounds):
+                for question in QUESTIONS:
+                    started = time.perf_counter()
+                    fn(question)
+                    durations.append((time.perf_counter() - started) * 1e6)
+            totals[label] += np.mean(durations)
+            print(f"{name:<23} {label:<9} p50 {np.percentile(durations, 50):7.1f} us  "
+                  f"p95 {np.percentile(durations, 95):7.1f} us  mean {np.mean(durations):7.1f} us")
+    print(f"\nper message (sum of means): loops {totals['loops']:.1f} us  automata {totals['automata']:.1f} us")
+
+    # Escala com o tamanho do vocabulário (termos reais + variações sintéticas)
+    base_terms = sorted({fold_text(term) for terms in analyzer.medical_terms.values() for term in terms} |
+                        {fold_text(term) for term in detector.in_scope_keywords + detector.out_of_scope_indicators})
+    keywords = [f"{term}{suffix}" for suffix in ('', 'al', 'ica', 'ose', 'ismo', 'ologia', 'ante', 'mente')
+                for term in base_terms] + [f"termo{i}" for i in range(args.vocabulary)]
+    keywords = keywords[:args.vocabulary]
+    matcher = KeywordMatcher({'vocab': keywords})
+    folded = [fold_text(question) for question in QUESTIONS]
+    for label, fn in (("loops", lambda text: [k for k in keywords if k in text]),
+                      ("automata", lambda text: matcher.categories(text, normalized=True))):
+        started = time.perf_counter()
+        for _ in range(max(args.rounds // 10, 1)):
+            for text in folded:
+                fn(text)
+        elapsed = (time.perf_counter() - started) / (max(args.rounds // 10, 1) * len(folded)) * 1e6
+        print(f"{len(keywords)} keywords  {label:<9} {elapsed:8.1f} us per message")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - StructuredKnowledgeBase: nested linear scans vs indexed query layer
+
+"scan" is the previous lookup code (every call walks the FAQ categories and
+does lowercase substring checks per question word; medications and dosing
+protocols are matched by substring over the keys). It runs on the unwrapped
+sections so that it does real work: the old loader never found them under the
+files' top-level keys. "index" is KnowledgeIndex (hash lookups on names,
+synonyms and protocol aliases, plus a token -> FAQ postings index). The query
+mix is what /chat triggers through enhance_context_with_structured_data:
+FAQ search, medication detection and the default dosing protocol. Also times
+worker startup: parse the nine files + build vs load the compiled cache.
+
+Usage: python tests/benchmarks/bench_knowledge_lookup.py [--queries 20000] [--data ../../data/structured]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag.knowledge_index import load_or_build, section
+
+DEFAULT_DATA = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'data', 'structured')
+
+FILES = {
+    'clinical_taxonomy.json': 'clinical_taxonomy',
+    'dispensing_workflow.json': 'dispensing_workflow',
+    'dosing_protocols.json': 'dosing_protocols',
+    'frequently_asked_questions.json': 'faq',
+    'hanseniase_catalog.json': 'hanseniase_catalog',
+    'knowledge_scope_limitations.json': 'scope_limitations',
+    'medications_mechanisms.json': 'medications',
+    'pharmacovigilance_guidelines.json': 'pharmacovigilance',
+    'quick_reference_protocols.json': 'quick_reference'
+}
+
+QUESTIONS = [
+    "Qual a dose de rifampicina para adultos?",
+    "Como é a dose para criança?",
+    "PQT-U corta o efeito do anticoncepcional?",
+    "Minha urina ficou laranja, é normal?",
+    "Esqueci de tomar a dose diária, o que faço?",
+    "A clofazimina deixa a pele escura?",
+    "Posso beber álcool durante o tratamento?",
+    "Quais documentos preciso para retirar o medicamento?",
+]
+
+def legacy_search_faq(faq_data, question):
+    """search_faq anterior"""
+    matched_faqs = []
+    for category_key, category_data in faq_data.items():
+        if category_key == 'metadata':
+            continue
+        if isinstance(category_data, dict):
+            for faq_key, faq_item in category_data.items():
+                if isinstance(faq_item, dict) and 'question' in faq_item:
+                    question_lower = question.lower()
+                    faq_question = faq_item['question'].lower()
+                    keywords = faq_item.get('keywords', [])
+                    score = 0
+                    for word in question_lower.split():
+                        if word in faq_question:
+                            score += 2
+                        if any(word in keyword for keyword in keywords):
+                            score += 1
+                    if score > 0:
+                        matched_faqs.append({
+                            'question': faq_item['question'],
+                            'answer': faq_item.get('gasnelio_answer', faq_item.get('ga_answer', 'Resposta não disponível')),
+                            'score': score,
+                            'category': category_key
+                        })
+    matched_faqs.sort(key=lambda x: x['score'], reverse=True)
+    return matched_faqs
+
+def legacy_medication(medications, medication_name):
+    """get_medication_info anterior"""
+    medication_name_lower = medication_name.lower()
+    for med_key, med_data in medications.items():
+        if medication_name_lower in med_key.lower():
+            return med_data
+    return {}
+
+def legacy_dosing(protocols, age_group):
+    """get_dosing_protocol anterior (grupo já como chave do arquivo)"""
+    return protocols.get(age_group, {})
+
+def legacy_chat_lookups(knowledge_base, question):
+    question_lower = question.lower()
+    found = []
+    for med in ['rifampicina', 'dapsona', 'clofazimina']:
+        if med in question_lower:
+            found.append(legacy_medication(section(knowledge_base, 'medications'), med))
+    if any(word in question_lower for word in ['dose', 'dosagem', 'mg', 'quantidade']):
+        found.append(legacy_dosing(section(knowledge_base, 'dosing_protocols'), 'pqt_u_adulto'))
+    found.append(legacy_search_faq(section(knowledge_base, 'faq'), question)[:2])
+    return found
+
+def index_chat_lookups(index, question):
+    question_lower = question.lower()
+    found = [entry.data for entry in index.medications_in(question)]
+    if any(word in question_lower for word in ['dose', 'dosagem', 'mg', 'quantidade']):
+        found.append(index.dosing_protocol('adult').data)
+    found.append(index.search_faq(question, limit=2))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=20000, help="lookups per variant")
+    parser.add_argument('--data', default=DEFAULT_DATA, help="data/structured directory")
+    args = parser.parse_args()
+
+    sources = {key: os.path.join(args.data, filename) for filename, key in FILES.items()}
+    temp_dir = tempfile.mkdtemp()
+    try:
+        started = time.perf_counter()
+        knowledge_base, index, loaded = load_or_build(sources, cache_dir='')
+        cold_ms = (time.perf_counter() - started) * 1000
+        load_or_build(sources, cache_dir=temp_dir)
+        warm = []
+        for _ in range(20):
+            started = time.perf_counter()
+            load_or_build(sources, cache_dir=temp_dir)
+            warm.append((time.perf_counter() - started) * 1000)
+        print(f"startup ({loaded} files, {len(index.faq)} FAQs)   parse + build {cold_ms:6.2f} ms   "
+              f"compiled cache p50 {np.percentile(warm, 50):6.2f} ms")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    faq = section(knowledge_base, 'faq')
+    medications = section(knowledge_base, 'medications')
+    variants = [
+        ('search_faq', lambda q: legacy_search_faq(faq, q), lambda q: index.search_faq(q)),
+        ('medication', lambda q: legacy_medication(medications, 'clofazimina'), lambda q: index.medication('clofazimina')),
+        ('dosing', lambda q: legacy_dosing(section(knowledge_base, 'dosing_protocols'), 'pqt_u_adulto'),
+         lambda q: index.dosing_protocol('adult')),
+        ('/chat mix', lambda q: legacy_chat_lookups(knowledge_base, q), lambda q: index_chat_lookups(index, q)),
+    ]
+    for label, legacy, indexed in variants:
+        scan, lookup = [], []
+        for position in range(args.queries):
+            question = QUESTIONS[position % len(QUESTIONS)]
+            started = time.perf_counter()
+            legacy(question)
+            scan.append((time.perf_counter() - started) * 1e6)
+            started = time.perf_counter()
+            indexed(question)
+            lookup.append((time.perf_counter() - started) * 1e6)
+        print(f"{label:11s} scan p50 {np.percentile(scan, 50):7.1f} us  p95 {np.percentile(scan, 95):7.1f} us   "
+              f"index p50 {np.percentile(lookup, 50):6.1f} us  p95 {np.percentile(lookup, 95):6.1f} us")
+
+if __name__ == '__main__':
+    main()
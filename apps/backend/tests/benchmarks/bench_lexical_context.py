@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - get_enhanced_context: per-call paragraph scan vs BM25 lexical index
+
+"scan" is the previous get_enhanced_context (split on blank lines and
+re.findall over every paragraph on every question). "index" is the current one
+(paragraphs tokenized once, top-k from the inverted index). Runs on
+data/knowledge-base/hanseniase.md and on the same text replicated
+--replicate times (each copy tagged so paragraphs stay distinct) to show how
+both scale with corpus size. Also times the cold build and the reload from
+the persisted index.
+
+Usage: python tests/benchmarks/bench_lexical_context.py [--queries 500] [--replicate 90] [--source ../../data/knowledge-base/hanseniase.md]
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag.lexical_index import LexicalIndex, load_or_build
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'data', 'knowledge-base', 'hanseniase.md')
+
+QUESTIONS = [
+    "Qual a dose de rifampicina para adultos?",
+    "Como tratar reação hansênica tipo 2?",
+    "Quais os efeitos adversos da clofazimina?",
+    "A dapsona pode causar anemia?",
+    "Qual a duração do tratamento multibacilar com PQT-U?",
+    "Como orientar o paciente sobre a dose supervisionada mensal?",
+    "criança com hanseniase paucibacilar dose",
+    "interações medicamentosas da rifampicina com anticoncepcionais",
+]
+
+def legacy_context(question, full_text, max_length=3000):
+    """get_enhanced_context anterior"""
+    paragraphs = full_text.split('\n\n')
+    question_words = set(re.findall(r'\w+', question.lower()))
+    relevant_paragraphs = []
+    for paragraph in paragraphs:
+        if len(paragraph.strip()) < 50:
+            continue
+        paragraph_words = set(re.findall(r'\w+', paragraph.lower()))
+        common_words = question_words.intersection(paragraph_words)
+        if common_words:
+            relevant_paragraphs.append((paragraph, len(common_words) / len(question_words)))
+    relevant_paragraphs.sort(key=lambda x: x[1], reverse=True)
+    context = ""
+    for paragraph, score in relevant_paragraphs[:5]:
+        context += paragraph + "\n\n"
+        if len(context) > max_length:
+            break
+    return context[:max_length] if context else full_text[:max_length]
+
+def index_context(index, question, full_text, max_length=3000):
+    context = ""
+    for paragraph_id, _ in index.search(question, k=5):
+        context += index.paragraphs[paragraph_id] + "\n\n"
+        if len(context) > max_length:
+            break
+    return context[:max_length] if context else full_text[:max_length]
+
+def run(label, full_text, queries, temp_dir):
+    path = os.path.join(temp_dir, f"{label}.json")
+    started = time.perf_counter()
+    index = LexicalIndex.from_text(full_text)
+    build_ms = (time.perf_counter() - started) * 1000
+    load_or_build(full_text, path)
+    started = time.perf_counter()
+    load_or_build(full_text, path)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    scan, indexed = [], []
+    for position in range(queries):
+        question = QUESTIONS[position % len(QUESTIONS)]
+        started = time.perf_counter()
+        legacy_context(question, full_text)
+        scan.append((time.perf_counter() - started) * 1e6)
+        started = time.perf_counter()
+        index_context(index, question, full_text)
+        indexed.append((time.perf_counter() - started) * 1e6)
+
+    print(f"{label:12s} {len(full_text) / 1024:8.0f} KB  {index.documents:6d} paragraphs   "
+          f"scan p50 {np.percentile(scan, 50):9.0f} us  p95 {np.percentile(scan, 95):9.0f} us   "
+          f"index p50 {np.percentile(indexed, 50):6.0f} us  p95 {np.percentile(indexed, 95):6.0f} us   "
+          f"build {build_ms:7.1f} ms  reload {load_ms:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=500, help="questions per corpus")
+    parser.add_argument('--replicate', type=int, default=90, help="copies of the source for the large corpus")
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help="knowledge base markdown")
+    args = parser.parse_args()
+
+    with open(args.source, encoding='utf-8') as f:
+        text = f.read()
+    large = '\n\n'.join(
+        '\n\n'.join(f"{paragraph} [copia {copy}]" for paragraph in text.split('\n\n'))
+        for copy in range(args.replicate)
+    )
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        run('source', text, args.queries, temp_dir)
+        run(f"x{args.replicate}", large, args.queries, temp_dir)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark - LocalVectorStore.search_similar
+Compares the contiguous pre-normalized matrix against the previous
+list-of-arrays scan (rebuild + normalize + full argsort per query).
+
+Usage: python tests/benchmarks/bench_local_vector_store.py [--sizes 1000 10000 100000]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.vector_store import LocalVectorStore, VectorDocument
+
+DIMENSION = 384
+CHUNK_TYPES = ['dosage', 'protocol', 'general', 'safety']
+
+def legacy_search(embeddings, doc_ids, documents, query, top_k, chunk_types=None):
+    """Search path used before the contiguous matrix (kept for comparison)"""
+    embeddings_matrix = np.array(embeddings)
+    embeddings_norm = embeddings_matrix / np.linalg.norm(embeddings_matrix, axis=1, keepdims=True)
+    query_norm = query / np.linalg.norm(query)
+    similarities = np.dot(embeddings_norm, query_norm)
+    top_indices = np.argsort(similarities)[::-1]
+
+    results = []
+    for idx in top_indices:
+        if len(results) >= top_k:
+            break
+        doc = documents[doc_ids[idx]]
+        if chunk_types and doc.chunk_type not in chunk_types:
+            continue
+        results.append((doc, float(similarities[idx])))
+    return results
+
+def time_queries(fn, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+def run(size: int, n_queries: int):
+    rng = np.random.default_rng(size)
+    vectors = rng.normal(size=(size, DIMENSION)).astype(np.float32)
+    queries = rng.normal(size=(n_queries, DIMENSION)).astype(np.float32)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        store = LocalVectorStore(temp_dir)
+        store._save_store = lambda: None  # keep disk I/O out of the measurement
+
+        legacy_embeddings, legacy_ids = [], []
+        start = time.perf_counter()
+        for i, vector in enumerate(vectors):
+            doc = VectorDocument(
+                id=f"chunk_{i}", text=f"chunk {i}", embedding=vector, metadata={},
+                chunk_type=CHUNK_TYPES[i % len(CHUNK_TYPES)], priority=0.5
+            )
+            store.add_document(doc)
+            legacy_embeddings.append(vector)
+            legacy_ids.append(doc.id)
+        insert_ms = (time.perf_counter() - start) * 1000
+
+        for label, chunk_types in (('all', None), ('dosage', ['dosage'])):
+            new_p50, new_p99 = time_queries(
+                lambda q: store.search_similar(q, top_k=5, chunk_types=chunk_types), queries)
+            old_p50, old_p99 = time_queries(
+                lambda q: legacy_search(legacy_embeddings, legacy_ids, store.documents, q, 5, chunk_types),
+                queries)
+            print(f"{size:>7} chunks  filter={label:<7} "
+                  f"legacy p50={old_p50:8.3f}ms p99={old_p99:8.3f}ms | "
+                  f"matrix p50={new_p50:8.3f}ms p99={new_p99:8.3f}ms | "
+                  f"speedup x{old_p50 / max(new_p50, 1e-9):.1f}")
+        print(f"{size:>7} chunks  insert total={insert_ms:.1f}ms")
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.queries)
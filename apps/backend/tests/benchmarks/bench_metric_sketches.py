@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - metric windows: raw-point deque + np.percentile vs DDSketch registry
+
+Records --updates latency samples (lognormal, like request timings) into the
+previous MetricsCollector layout (deque(maxlen=10000) of points; every
+get_aggregated_stats copies, filters and runs statistics/np.percentile) and
+into MetricsRegistry (windowed DDSketch + decaying counters). Reports the
+per-update cost, the cost of one aggregated read for each window and the
+relative error of the sketch percentiles against exact ones over the same
+(slot-aligned) window. The deque only
+sees its last 10,000 points, so its "hour" is really "the last 10k points".
+
+Usage: python tests/benchmarks/bench_metric_sketches.py [--updates 200000] [--reads 200] [--workers 4]
+"""
+
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import statistics
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.metrics.sketches import WINDOWS, MetricsRegistry
+
+def legacy_aggregated_stats(points, window_minutes):
+    """get_aggregated_stats anterior"""
+    since = datetime.now() - timedelta(minutes=window_minutes)
+    values = [value for timestamp, value in list(points) if timestamp >= since]
+    if not values:
+        return {}
+    return {
+        'count': len(values), 'sum': sum(values), 'avg': statistics.mean(values),
+        'min': min(values), 'max': max(values), 'median': statistics.median(values),
+        'p95': np.percentile(values, 95), 'p99': np.percentile(values, 99)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=200000, help="samples recorded")
+    parser.add_argument('--reads', type=int, default=200, help="aggregated reads per window")
+    parser.add_argument('--workers', type=int, default=4, help="registries merged through the shared directory")
+    args = parser.parse_args()
+
+    rng = random.Random(20)
+    values = [rng.lognormvariate(5, 1.2) for _ in range(args.updates)]
+    now = time.time()
+    # amostras espalhadas pelas últimas 24 h, em ordem
+    timestamps = [now - 86400 + 86400 * index / args.updates for index in range(args.updates)]
+
+    points = deque(maxlen=10000)
+    started = time.perf_counter()
+    for timestamp, value in zip(timestamps, values):
+        points.append((datetime.fromtimestamp(timestamp), value))
+    legacy_update = (time.perf_counter() - started) / args.updates * 1e6
+
+    registry = MetricsRegistry()
+    started = time.perf_counter()
+    for timestamp, value in zip(timestamps, values):
+        registry.record('response_time', value, timestamp)
+    sketch_update = (time.perf_counter() - started) / args.updates * 1e6
+    print(f"update           deque {legacy_update:6.2f} us   sketch {sketch_update:6.2f} us")
+
+    for window, seconds in WINDOWS.items():
+        legacy_times, sketch_times = [], []
+        for _ in range(args.reads):
+            started = time.perf_counter()
+            legacy_aggregated_stats(points, seconds // 60)
+            legacy_times.append((time.perf_counter() - started) * 1e6)
+            started = time.perf_counter()
+            snapshot = registry.snapshot('response_time', window=window)
+            sketch_times.append((time.perf_counter() - started) * 1e6)
+
+        # exatos sobre os mesmos pontos (janela alinhada ao slot) e o mesmo rank do sketch
+        start = registry.sketches['response_time'].window_start(seconds, now)
+        exact = sorted(value for timestamp, value in zip(timestamps, values) if timestamp >= start)
+        errors = []
+        for key, q in (('median', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            expected = exact[int(q * (len(exact) - 1))]
+            errors.append(f"{key} {abs(snapshot[key] - expected) / expected * 100:5.2f}%")
+        print(f"read {window:6s}      deque p50 {np.percentile(legacy_times, 50):8.0f} us   "
+              f"sketch p50 {np.percentile(sketch_times, 50):6.0f} us   "
+              f"n={snapshot['count']:,} (exact {len(exact):,})   err {'  '.join(errors)}")
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for worker in range(args.workers):
+            shard = MetricsRegistry()
+            for timestamp, value in zip(timestamps[worker::args.workers], values[worker::args.workers]):
+                shard.record('response_time', value, timestamp)
+            shard.publish(temp_dir, f"w{worker}")
+        started = time.perf_counter()
+        merged = MetricsRegistry.load_dir(temp_dir)
+        load_ms = (time.perf_counter() - started) * 1000
+        snapshot = merged.snapshot('response_time', window='day')
+        expected = registry.snapshot('response_time', window='day')
+        print(f"merge {args.workers} workers  load {load_ms:.1f} ms   "
+              f"p99 {snapshot['p99']:.1f} vs single {expected['p99']:.1f}   count {snapshot['count']:,}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
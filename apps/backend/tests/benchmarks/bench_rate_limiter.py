@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - rate limit decisions: SQL sliding window vs in-memory GCRA buckets
+
+"sql" reproduces the previous SQLiteRateLimiter.check_rate_limit: DELETE old
+rows, COUNT the window, INSERT the request and bump the daily stats, all as
+one job on the pool's single writer. "gcra" is the current limiter: an O(1)
+decision on a sharded bucket map, persisted in the background.
+
+Reports decisions/sec and mean/p50/p99 latency under --threads concurrent
+callers spread over --clients identifiers.
+
+Usage: python tests/benchmarks/bench_rate_limiter.py [--threads 8] [--requests 2000] [--clients 200]
+"""
+
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.performance.sqlite_pool import get_sqlite_pool
+from services.security.sqlite_rate_limiter import SQLiteRateLimiter
+
+def run_threads(threads, requests, call):
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        barrier.wait()
+        for _ in range(requests):
+            start = time.perf_counter()
+            call()
+            latencies[index].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return elapsed, [lat for per_thread in latencies for lat in per_thread]
+
+def summarize(label, elapsed, latencies):
+    ms = np.array(latencies) * 1000
+    print(f"{label:<6} {len(latencies) / elapsed:10.0f} decisions/s  mean {ms.mean():7.3f} ms  "
+          f"p50 {np.percentile(ms, 50):7.3f} ms  p99 {np.percentile(ms, 99):7.3f} ms")
+
+def sql_check(pool, identifier, endpoint, max_requests, window_seconds):
+    def check(conn):
+        current_time = int(time.time())
+        conn.execute('DELETE FROM rate_limits WHERE identifier = ? AND endpoint = ? AND timestamp < ?',
+                     (identifier, endpoint, current_time - window_seconds))
+        count = conn.execute('''
+            SELECT COUNT(*) as count FROM rate_limits
+            WHERE identifier = ? AND endpoint = ? AND timestamp >= ?
+        ''', (identifier, endpoint, current_time - window_seconds)).fetchone()['count']
+        today = datetime.now().strftime('%Y-%m-%d')
+        if count >= max_requests:
+            conn.execute('''
+                INSERT INTO rate_limit_stats (date, blocked_requests) VALUES (?, 1)
+                ON CONFLICT(date) DO UPDATE SET blocked_requests = blocked_requests + 1
+            ''', (today,))
+            return False
+        conn.execute('INSERT INTO rate_limits (identifier, endpoint, timestamp, window_seconds) VALUES (?, ?, ?, ?)',
+                     (identifier, endpoint, current_time, window_seconds))
+        conn.execute('''
+            INSERT INTO rate_limit_stats (date, total_requests) VALUES (?, 1)
+            ON CONFLICT(date) DO UPDATE SET total_requests = total_requests + 1
+        ''', (today,))
+        return True
+
+    return pool.write(check)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--requests', type=int, default=2000, help="decisions per thread")
+    parser.add_argument('--clients', type=int, default=200, help="distinct client IPs")
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        limiter = SQLiteRateLimiter(os.path.join(temp_dir, "rate_limits.db"))
+        pool = get_sqlite_pool(os.path.join(temp_dir, "rate_limits.db"))
+        clients = [f"10.0.{i // 256}.{i % 256}" for i in range(args.clients)]
+
+        print(f"{args.threads} threads x {args.requests} decisions, {args.clients} clients, chat 30/min\n")
+
+        summarize("sql", *run_threads(args.threads, args.requests, lambda: sql_check(
+            pool, f"ip:{random.choice(clients)}", "chat", 30, 60)))
+        summarize("gcra", *run_threads(args.threads, args.requests, lambda: limiter.check_rate_limit(
+            random.choice(clients), "chat")))
+
+        started = time.perf_counter()
+        synced = limiter.flush()
+        print(f"\nbackground sync: {synced} buckets in {(time.perf_counter() - started) * 1000:.1f} ms")
+        limiter.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
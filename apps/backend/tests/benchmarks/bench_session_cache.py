@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - JWTManager.verify_token with and without the session-state cache
+
+Simulates authenticated requests from gunicorn threads: every call verifies an
+access token for one of --sessions active sessions. Without the cache each
+call also reads the sessions table; with it only misses (first sight, TTL
+expiry) and the periodic revocation poll touch the database.
+
+Reports verifications/sec, mean/p50/p99 latency and the cache hit rate.
+
+Usage: python tests/benchmarks/bench_session_cache.py [--threads 8] [--requests 2000] [--sessions 50]
+"""
+
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.database import DatabaseManager
+from core.auth import jwt_manager as jwt_manager_module
+from core.auth.jwt_manager import JWTManager
+from core.auth.session_cache import SessionStateCache
+
+def run_threads(threads, requests, call):
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        barrier.wait()
+        for _ in range(requests):
+            start = time.perf_counter()
+            call()
+            latencies[index].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return elapsed, [lat for per_thread in latencies for lat in per_thread]
+
+def summarize(label, elapsed, latencies):
+    ms = np.array(latencies) * 1000
+    print(f"{label:<10} {len(latencies) / elapsed:9.0f} verifications/s  mean {ms.mean():7.3f} ms  "
+          f"p50 {np.percentile(ms, 50):7.3f} ms  p99 {np.percentile(ms, 99):7.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--requests', type=int, default=2000, help="verifications per thread")
+    parser.add_argument('--sessions', type=int, default=50, help="distinct active sessions")
+    parser.add_argument('--ttl', type=float, default=30.0, help="cache TTL (s)")
+    parser.add_argument('--poll', type=float, default=2.0, help="revocation poll interval (s)")
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(os.path.join(temp_dir, "auth.db"))
+        jwt_manager_module.get_db_connection = lambda: db
+        manager = JWTManager(secret_key="bench-secret")
+        manager.create_user("bench@roteiros.com", "senha-bench")
+        tokens = [manager.authenticate_user("bench@roteiros.com", "senha-bench").access_token
+                  for _ in range(args.sessions)]
+
+        def verify():
+            manager.verify_token(random.choice(tokens))
+
+        print(f"{args.threads} threads x {args.requests} verifications, {args.sessions} sessions\n")
+
+        manager.session_cache = SessionStateCache(db, ttl_seconds=0)
+        summarize("no cache", *run_threads(args.threads, args.requests, verify))
+
+        manager.session_cache = SessionStateCache(db, ttl_seconds=args.ttl, revocation_poll_seconds=args.poll)
+        summarize("cached", *run_threads(args.threads, args.requests, verify))
+
+        stats = manager.session_cache.get_stats()
+        print(f"\nhit rate {stats['hit_rate'] * 100:.1f}%  misses {stats['misses']}  "
+              f"revocation polls {stats['revocation_polls']}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
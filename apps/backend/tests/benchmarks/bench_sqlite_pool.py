@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark - shared SQLite pool vs sqlite3.connect() per operation
+
+Simulates gunicorn gthread workers: N threads each issue M inserts against the
+same database file, the way SQLiteCloudManager.log_analytics and
+SQLiteRateLimiter.check_rate_limit did before the pool.
+
+- baseline: connect + PRAGMA + INSERT + commit + close per operation, guarded
+  by a process lock (the old SQLiteCloudManager._db_lock)
+- pooled: SQLiteConnectionPool.execute(), single writer with group commit
+
+Reports inserts/sec and mean/p50/p99 per-call latency.
+
+Usage: python tests/benchmarks/bench_sqlite_pool.py [--threads 8] [--ops 500]
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.performance.sqlite_pool import SQLiteConnectionPool, SQLitePoolConfig
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS analytics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        event_type TEXT,
+        event_data TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+INSERT = "INSERT INTO analytics (user_id, event_type, event_data) VALUES (?, ?, ?)"
+PAYLOAD = json.dumps({"persona": "dr_gasnelio", "question": "dose de rifampicina na PQT-U"})
+
+def run_threads(threads, ops, call):
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        barrier.wait()
+        for i in range(ops):
+            start = time.perf_counter()
+            call(f"user-{index}", i)
+            latencies[index].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return elapsed, [lat for per_thread in latencies for lat in per_thread]
+
+def bench_baseline(db_path, threads, ops):
+    lock = threading.Lock()
+
+    def call(user_id, i):
+        with lock:
+            conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("PRAGMA cache_size=10000")
+                conn.execute("PRAGMA temp_store=MEMORY")
+                conn.execute(INSERT, (user_id, "chat_query", PAYLOAD))
+                conn.commit()
+            finally:
+                conn.close()
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(SCHEMA)
+    return run_threads(threads, ops, call)
+
+def bench_pooled(db_path, threads, ops, batch_size):
+    pool = SQLiteConnectionPool(db_path, SQLitePoolConfig(write_batch_size=batch_size))
+    pool.executescript(SCHEMA)
+    try:
+        result = run_threads(threads, ops, lambda user_id, i: pool.execute(INSERT, (user_id, "chat_query", PAYLOAD)))
+        return result + (pool.get_stats(),)
+    finally:
+        pool.close()
+
+def summarize(label, elapsed, latencies):
+    ms = np.array(latencies) * 1000
+    print(f"{label:<10} {len(latencies) / elapsed:9.0f} inserts/s  mean {ms.mean():7.3f} ms  "
+          f"p50 {np.percentile(ms, 50):7.3f} ms  p99 {np.percentile(ms, 99):7.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--ops', type=int, default=500, help="inserts per thread")
+    parser.add_argument('--batch-size', type=int, default=256, help="max writes per commit")
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        print(f"{args.threads} threads x {args.ops} inserts\n")
+        summarize("baseline", *bench_baseline(os.path.join(temp_dir, "baseline.db"), args.threads, args.ops))
+
+        elapsed, latencies, stats = bench_pooled(
+            os.path.join(temp_dir, "pooled.db"), args.threads, args.ops, args.batch_size
+        )
+        summarize("pooled", elapsed, latencies)
+        print(f"\npooled commits {stats['batches']}  avg batch {stats['avg_batch_size']:.1f}  "
+              f"max batch {stats['max_batch_size']}  commit p99 {stats['commit_p99_ms']:.3f} ms")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
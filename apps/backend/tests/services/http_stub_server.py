@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Local stub of the outbound APIs (OpenRouter chat completions, HuggingFace
+feature extraction) for offline tests and benchmarks.
+
+HTTP/1.1 keep-alive server on 127.0.0.1 with a random port. connect_delay is
+paid once per new TCP connection and stands in for the TCP+TLS handshake to
+a remote host; response_delay is paid on every request.
+
+Usage:
+    with StubHTTPServer(connect_delay=0.05) as server:
+        httpx.post(f"{server.url}/api/v1/chat/completions", json={...})
+        server.connections, server.requests
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def setup(self):
+        super().setup()
+        self.server.stub.on_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, tokens):
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n" for token in tokens
+        ) + "data: [DONE]\n\n"
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        stub.on_request(self.path)
+        if stub.response_delay:
+            time.sleep(stub.response_delay)
+
+        if self.path.endswith("/chat/completions"):
+            if payload.get("stream"):
+                self._send_stream(stub.tokens)
+            else:
+                self._send_json({"choices": [{"message": {"content": "".join(stub.tokens)}}]})
+        elif "/models/" in self.path:
+            inputs = payload.get("inputs", "")
+            texts = inputs if isinstance(inputs, list) else [inputs]
+            vectors = [[float(len(text))] * stub.dimension for text in texts]
+            self._send_json(vectors if isinstance(inputs, list) else vectors[0])
+        else:
+            self._send_json({"ok": True})
+
+class StubHTTPServer:
+    """Threaded stub server counting connections and requests"""
+
+    def __init__(self, connect_delay: float = 0.0, response_delay: float = 0.0,
+                 tokens=("Resposta ", "do stub."), dimension: int = 384):
+        self.connect_delay = connect_delay
+        self.response_delay = response_delay
+        self.tokens = tuple(tokens)
+        self.dimension = dimension
+        self.connections = 0
+        self.requests = 0
+        self.paths = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def on_connection(self):
+        with self._lock:
+            self.connections += 1
+        if self.connect_delay:
+            time.sleep(self.connect_delay)
+
+    def on_request(self, path: str):
+        with self._lock:
+            self.requests += 1
+            self.paths.append(path)
+
+    def start(self) -> 'StubHTTPServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'StubHTTPServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
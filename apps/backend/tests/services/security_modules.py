@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Import core/security submodules without running core/security/__init__.py.
+
+The package __init__ pulls in the whole security framework (monitoring.py
+needs sklearn), so `from core.security.audit_segments import ...` skips every
+test on machines without it even though the module only needs cryptography.
+load_security_module registers a bare `core.security` package just for the
+import; the submodule stays in sys.modules and a later full import of the
+package reuses it.
+
+Usage:
+    audit_segments = load_security_module('audit_segments')
+"""
+
+import os
+import sys
+import types
+import importlib
+
+SECURITY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'core', 'security')
+
+def load_security_module(name: str) -> types.ModuleType:
+    if 'core.security' in sys.modules:
+        return importlib.import_module(f'core.security.{name}')
+
+    import core
+    package = types.ModuleType('core.security')
+    package.__path__ = [os.path.normpath(SECURITY_DIR)]
+    sys.modules['core.security'] = package
+    try:
+        return importlib.import_module(f'core.security.{name}')
+    finally:
+        del sys.modules['core.security']
+        if getattr(core, 'security', None) is package:
+            del core.security
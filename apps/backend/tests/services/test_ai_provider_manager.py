@@ -7,6 +7,7 @@ Tests circuit breakers, failover, async operations, and real API integrations
 import pytest
 import asyncio
 import os
+import time
 from datetime import datetime, timedelta
 from unittest.mock import Mock, patch, AsyncMock, MagicMock
 
@@ -488,5 +489,178 @@ class TestIntegrationScenarios:
 
             assert manager.health_status['openrouter'] == ProviderStatus.UNHEALTHY
 
+class TestStreamResponse:
+    """Test token streaming and pre-first-token failover"""
+
+    @pytest.mark.asyncio
+    async def test_openrouter_sse_is_parsed_into_tokens(self):
+        """Test delta contents are yielded as they arrive and comments are skipped"""
+        import httpx
+        body = (
+            ": OPENROUTER PROCESSING\n\n"
+            'data: {"choices": [{"delta": {"content": "A rifampicina "}}]}\n\n'
+            'data: {"choices": [{"delta": {"content": "é mensal."}}]}\n\n'
+            'data: {"choices": [{"delta": {}}]}\n\n'
+            "data: [DONE]\n\n"
+        )
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, text=body))
+
+        with patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test_key'}), \
+                patch('services.ai.ai_provider_manager.get_async_http_client',
+                      lambda url: httpx.AsyncClient(transport=transport)):
+            manager = AIProviderManager()
+            metadata = {}
+            chunks = [chunk async for chunk in manager.stream_response(
+                [{"role": "user", "content": "Dose?"}], metadata=metadata
+            )]
+
+        assert chunks == ["A rifampicina ", "é mensal."]
+        assert metadata['success'] is True
+        assert metadata['model_used'] == 'llama-3.2-3b'
+        assert metadata['first_token_time'] is not None
+
+    @pytest.mark.asyncio
+    async def test_failover_only_before_first_token(self):
+        """Test a model failing before streaming is replaced, one failing mid-stream is not"""
+        with patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test_key'}):
+            manager = AIProviderManager()
+
+        calls = []
+
+        async def fake_stream(model_config, messages, temperature, max_tokens):
+            calls.append(model_config.priority)
+            if model_config.priority == 1:
+                raise Exception("rate limited")
+            yield "parte 1"
+            raise Exception("connection reset")
+
+        with patch.object(manager, '_stream_model_api', fake_stream):
+            metadata = {}
+            chunks = [chunk async for chunk in manager.stream_response(
+                [{"role": "user", "content": "Teste"}], metadata=metadata
+            )]
+
+        assert calls == [1, 2]
+        assert chunks == ["parte 1"]
+        assert metadata['interrupted'] is True
+        assert metadata['success'] is False
+        assert manager.performance_metrics['openrouter']['failed_calls'] == 2
+
+    @pytest.mark.asyncio
+    async def test_no_models_streams_fallback_unless_disabled(self):
+        """Test the fallback text is streamed only when use_fallback is set"""
+        manager = AIProviderManager()
+        manager.models = {}
+        messages = [{"role": "user", "content": "dose"}]
+
+        with_fallback = [chunk async for chunk in manager.stream_response(messages)]
+        metadata = {}
+        without = [chunk async for chunk in manager.stream_response(messages, metadata=metadata, use_fallback=False)]
+
+        assert len(with_fallback) == 1 and "fallback" in with_fallback[0]
+        assert without == []
+        assert metadata['fallback_reason'] == 'no_models_available'
+
+class TestHedgedRequests:
+    """Test hedged racing between models and the adaptive hedge delay"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        with patch.dict(os.environ, {
+            'OPENROUTER_API_KEY': 'test_key',
+            'AI_HEDGE_DEFAULT_DELAY_MS': '50',
+            'AI_HEDGE_MIN_DELAY_MS': '10'
+        }):
+            self.manager = AIProviderManager()
+        self.primary, self.secondary = [name for name, _ in self.manager._available_models()]
+        self.calls = []
+        self.cancelled = []
+
+        yield
+
+    def _fake_api(self, behaviour):
+        """behaviour: model name -> (delay seconds, response text or exception)"""
+        names = {config.name: name for name, config in self.manager.models.items()}
+
+        async def call(model_config, messages, temperature, max_tokens):
+            name = names[model_config.name]
+            self.calls.append(name)
+            delay, outcome = behaviour[name]
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled.append(name)
+                raise
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        return patch.object(self.manager, '_call_model_api', call)
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged_and_cancelled(self):
+        """Test the next model races a slow primary and the loser is cancelled"""
+        with self._fake_api({self.primary: (2.0, "lenta"), self.secondary: (0.01, "rápida")}):
+            start = time.time()
+            text, metadata = await self.manager.generate_response([{"role": "user", "content": "dose"}])
+
+        assert text == "rápida"
+        assert time.time() - start < 1.0
+        assert metadata['hedged'] is True
+        assert self.cancelled == [self.primary]
+        stats = self.manager.hedge_stats
+        assert stats['hedges_launched'] == 1
+        assert stats['hedge_wins'] == 1
+        assert stats['losers_cancelled'] == 1
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_is_not_hedged(self):
+        """Test no second request is sent when the primary answers within its delay"""
+        with self._fake_api({self.primary: (0.0, "ok"), self.secondary: (0.0, "nunca")}):
+            text, metadata = await self.manager.generate_response([{"role": "user", "content": "dose"}])
+
+        assert text == "ok"
+        assert metadata['hedged'] is False
+        assert self.calls == [self.primary]
+
+    @pytest.mark.asyncio
+    async def test_failure_launches_next_model_without_waiting(self):
+        """Test a failing primary hands over immediately instead of after the delay"""
+        self.manager.hedge_default_delay = 10.0
+        with self._fake_api({self.primary: (0.0, Exception("503")), self.secondary: (0.0, "ok")}):
+            start = time.time()
+            text, metadata = await self.manager.generate_response([{"role": "user", "content": "dose"}])
+
+        assert text == "ok"
+        assert time.time() - start < 1.0
+        assert self.manager.performance_metrics['openrouter']['failed_calls'] == 1
+
+    def test_hedge_delay_follows_observed_p95(self):
+        """Test the delay is the model's p95 latency, clamped, and minimal for unstable providers"""
+        manager = self.manager
+        assert manager._hedge_delay(self.primary, 'openrouter') == pytest.approx(0.05)  # no history yet
+
+        for i in range(100):
+            manager._record_latency(self.primary, 'openrouter', 0.1 + i * 0.01)
+        assert manager._hedge_delay(self.primary, 'openrouter') == pytest.approx(1.04, abs=0.02)
+        assert sum(manager.performance_metrics['openrouter']['latency_histogram'].values()) == 100
+
+        manager.hedge_max_delay = 0.5
+        assert manager._hedge_delay(self.primary, 'openrouter') == 0.5
+
+        manager.circuit_breakers['openrouter'].state = CircuitBreakerState.HALF_OPEN
+        assert manager._hedge_delay(self.primary, 'openrouter') == pytest.approx(0.01)
+
+    @pytest.mark.asyncio
+    async def test_disabled_hedging_is_sequential(self):
+        """Test AI_HEDGE_ENABLED=false keeps strict priority order"""
+        self.manager.hedge_enabled = False
+        with self._fake_api({self.primary: (0.2, "lenta"), self.secondary: (0.0, "rápida")}):
+            text, metadata = await self.manager.generate_response([{"role": "user", "content": "dose"}])
+
+        assert text == "lenta"
+        assert self.calls == [self.primary]
+        assert 'hedged' not in metadata
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file
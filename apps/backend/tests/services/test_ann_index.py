@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the approximate nearest-neighbour engines behind LocalVectorStore
+"""
+
+import pytest
+import numpy as np
+import os
+import tempfile
+import shutil
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.ann_index import (
+    ANNLocalVectorStore, IVFFlatEngine, HNSWLIB_AVAILABLE, create_ann_engine
+)
+from services.vector_store import LocalVectorStore, VectorDocument
+
+def clustered_vectors(n, dimension=32, clusters=20, seed=0):
+    """Vectors grouped around random centres, like topic-clustered chunks"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimension))
+    labels = rng.integers(clusters, size=n)
+    return (centres[labels] + 0.3 * rng.normal(size=(n, dimension))).astype(np.float32)
+
+def make_document(i, embedding):
+    return VectorDocument(
+        id=f"chunk_{i}",
+        text=f"Chunk {i}",
+        embedding=embedding,
+        metadata={},
+        chunk_type="dosage" if i % 3 == 0 else "general",
+        priority=0.5
+    )
+
+BACKENDS = ['ivf'] + (['hnsw'] if HNSWLIB_AVAILABLE else [])
+
+class TestANNLocalVectorStore:
+    """Test ANN search keeps the LocalVectorStore contract"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        yield
+
+        shutil.rmtree(self.temp_dir)
+
+    def _fill(self, store, vectors):
+        # Skip the every-10-documents snapshot; persistence is tested separately
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(store, "_save_store", lambda: None)
+            for i, vector in enumerate(vectors):
+                store.add_document(make_document(i, vector))
+
+    def test_small_store_uses_exact_scan(self):
+        """Test the engine stays untrained below min_train_size"""
+        store = ANNLocalVectorStore(self.temp_dir, backend='ivf', min_train_size=100)
+        vectors = clustered_vectors(50)
+        self._fill(store, vectors)
+
+        results = store.search_similar(vectors[7], top_k=1)
+        assert results[0][0].id == "chunk_7"
+        assert store.get_stats()["ann"]["exact_searches"] == 1
+
+    @pytest.mark.parametrize("backend", BACKENDS)
+    def test_recall_against_exact_scan(self, backend):
+        """Test approximate top-10 overlaps the exact answer"""
+        vectors = clustered_vectors(3000)
+        ann_store = ANNLocalVectorStore(self.temp_dir, backend=backend, min_train_size=500)
+        exact_store = LocalVectorStore(os.path.join(self.temp_dir, "exact"))
+        self._fill(ann_store, vectors)
+        self._fill(exact_store, vectors)
+        assert ann_store.engine.is_trained
+
+        queries = clustered_vectors(30, seed=99)
+        recall = []
+        for query in queries:
+            expected = {doc.id for doc, _ in exact_store.search_similar(query, top_k=10)}
+            found = {doc.id for doc, _ in ann_store.search_similar(query, top_k=10)}
+            recall.append(len(expected & found) / 10)
+
+        assert np.mean(recall) >= 0.9
+        assert ann_store.get_stats()["ann"]["ann_searches"] == len(queries)
+
+    @pytest.mark.parametrize("backend", BACKENDS)
+    def test_chunk_type_filter_and_min_score(self, backend):
+        """Test filters and thresholds behave like the exact store"""
+        vectors = clustered_vectors(1200)
+        store = ANNLocalVectorStore(self.temp_dir, backend=backend, min_train_size=500)
+        self._fill(store, vectors)
+
+        results = store.search_similar(vectors[9], top_k=5, chunk_types=["dosage"])
+        assert results[0][0].id == "chunk_9"
+        assert all(doc.chunk_type == "dosage" for doc, _ in results)
+
+        results = store.search_similar(vectors[9], top_k=5, min_score=0.999)
+        assert [doc.id for doc, _ in results] == ["chunk_9"]
+
+    def test_incremental_add_and_delete(self):
+        """Test documents added or deleted after training are reflected"""
+        vectors = clustered_vectors(1000)
+        store = ANNLocalVectorStore(self.temp_dir, backend='ivf', min_train_size=500)
+        self._fill(store, vectors[:900])
+
+        for i in range(900, 1000):
+            store.add_document(make_document(i, vectors[i]))
+        assert store.search_similar(vectors[950], top_k=1)[0][0].id == "chunk_950"
+
+        store.delete_document("chunk_950")
+        assert all(doc.id != "chunk_950" for doc, _ in store.search_similar(vectors[950], top_k=5))
+
+    def test_engine_state_persists(self):
+        """Test IVF assignments are reloaded instead of retrained"""
+        vectors = clustered_vectors(800)
+        store = ANNLocalVectorStore(self.temp_dir, backend='ivf', min_train_size=500)
+        self._fill(store, vectors)
+        store._save_store()
+
+        reloaded = ANNLocalVectorStore(self.temp_dir, backend='ivf', min_train_size=500)
+        assert reloaded.engine.is_trained
+        assert reloaded.ann_stats["rebuilds"] == 0
+        assert reloaded.search_similar(vectors[123], top_k=1)[0][0].id == "chunk_123"
+
+    @pytest.mark.parametrize('backend', BACKENDS)
+    def test_engine_follows_remap_after_save(self, backend):
+        """Test rows renumbered by a save (tombstones dropped, overflow mapped) stay searchable via ANN"""
+        vectors = clustered_vectors(700)
+        store = ANNLocalVectorStore(self.temp_dir, backend=backend, min_train_size=500)
+        self._fill(store, vectors[:600])
+        store._save_store()
+
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(store, "_save_store", lambda: None)
+            for i in range(0, 100, 2):
+                store.delete_document(f"chunk_{i}")
+            for i in range(600, 700):
+                store.add_document(make_document(i, vectors[i]))
+        assert store.get_index_diagnostics()["private_rows"] == 100
+
+        store._save_store()
+        assert store.get_index_diagnostics()["private_rows"] == 0 and store.get_stats()["tombstones"] == 0
+        assert store.engine.is_trained
+        exact_searches = store.ann_stats["exact_searches"]
+        for i in (1, 301, 650):
+            assert store.search_similar(vectors[i], top_k=1)[0][0].id == f"chunk_{i}"
+        assert all(doc.id != "chunk_40" for doc, _ in store.search_similar(vectors[40], top_k=5))
+        assert store.ann_stats["exact_searches"] == exact_searches
+
+        reloaded = ANNLocalVectorStore(self.temp_dir, backend=backend, min_train_size=500)
+        assert reloaded.ann_stats["rebuilds"] == 0
+        assert reloaded.search_similar(vectors[650], top_k=1)[0][0].id == "chunk_650"
+
+    def test_engine_dropped_by_remap_is_rebuilt(self):
+        """Test an engine that cannot renumber in place (HNSW) is retrained right after a remap"""
+        vectors = clustered_vectors(600)
+        store = ANNLocalVectorStore(self.temp_dir, backend='ivf', min_train_size=500)
+        self._fill(store, vectors)
+        rebuilds = store.ann_stats["rebuilds"]
+
+        def drop_index(old_rows):
+            store.engine.centroids = None
+
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(store.engine, "remap", drop_index)
+            mp.setattr(store, "_save_store", lambda: None)
+            for i in range(0, 60, 2):
+                store.delete_document(f"chunk_{i}")
+            store.compact()
+        assert store.engine.is_trained and store.ann_stats["rebuilds"] == rebuilds + 1
+        assert store.search_similar(vectors[301], top_k=1)[0][0].id == "chunk_301"
+        assert store.ann_stats["ann_searches"] == 1
+
+    def test_hnsw_falls_back_without_hnswlib(self):
+        """Test the factory degrades to IVF when hnswlib is missing"""
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr("services.ann_index.HNSWLIB_AVAILABLE", False)
+            assert isinstance(create_ann_engine('hnsw'), IVFFlatEngine)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the async chat pipeline and the SSE /api/v1/chat/stream endpoint
+"""
+
+import pytest
+import numpy as np
+import os
+import json
+import time
+import threading
+from types import SimpleNamespace
+from flask import Flask
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import services.rag.async_chat_pipeline as async_chat_pipeline
+import services.rag.supabase_rag_system as supabase_rag_system
+from services.rag.async_chat_pipeline import AsyncChatPipeline, run_sync, iterate_sync
+from services.rag.supabase_rag_system import SupabaseRAGSystem, RAGContext
+
+STEP_DELAY = 0.2
+QUERY = "qual a dose de rifampicina em adultos?"
+
+class FakeEmbeddingService:
+    def embed_text(self, text):
+        time.sleep(STEP_DELAY)
+        return SimpleNamespace(embedding=np.array([1.0, 0.0, 0.0], dtype=np.float32))
+
+class FakeSearchEngine:
+    def __init__(self, config):
+        self.embedding_service = FakeEmbeddingService()
+
+    def is_available(self):
+        return False
+
+    def get_statistics(self):
+        return {}
+
+class SlowKnowledgeBase:
+    def enhance_context_with_structured_data(self, question, base_context):
+        time.sleep(STEP_DELAY)
+        return base_context + "\n=== PROTOCOLOS DE DOSAGEM ===\nRifampicina 600 mg mensal"
+
+class FakeAIManager:
+    """Streams a fixed answer token by token"""
+
+    def __init__(self, tokens=("A dose ", "é 600 mg ", "mensal.")):
+        self.models = {'fake': object()} if tokens else {}
+        self.tokens = tokens
+        self.messages = None
+
+    async def stream_response(self, messages, metadata=None, use_fallback=True, **kwargs):
+        self.messages = messages
+        for token in self.tokens:
+            yield token
+        metadata.update({'model_used': 'fake', 'provider': 'openrouter', 'success': True})
+
+    async def generate_response(self, messages, **kwargs):
+        self.messages = messages
+        return "".join(self.tokens), {'model_used': 'fake', 'provider': 'openrouter', 'success': True}
+
+class TestAsyncChatPipeline:
+    """Test concurrency, streaming, caching and fire-and-forget analytics"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setattr(supabase_rag_system, "get_vector_store", lambda: None)
+        monkeypatch.setattr(supabase_rag_system, "get_cloud_cache", lambda: None)
+        monkeypatch.setattr(supabase_rag_system, "SemanticSearchEngine", FakeSearchEngine)
+
+        config = SimpleNamespace(SEMANTIC_CACHE_THRESHOLD=0.9, SEMANTIC_SIMILARITY_THRESHOLD=0.6)
+        self.rag = SupabaseRAGSystem(config)
+
+        chunk = SimpleNamespace(
+            chunk=SimpleNamespace(category="dosage", priority=0.9, content="Rifampicina 600 mg uma vez ao mês"),
+            source="pcdt", weighted_score=0.9
+        )
+        self.context = RAGContext(chunks=[chunk], total_score=0.9, source_files=["pcdt"],
+                                  chunk_types=["dosage"], confidence_level="high", metadata={})
+        self.searches = []
+
+        def retrieve_context(**kwargs):
+            time.sleep(STEP_DELAY)
+            self.searches.append(kwargs["query"])
+            return self.context
+        monkeypatch.setattr(self.rag, "retrieve_context", retrieve_context)
+
+        self.analytics_release = threading.Event()
+        self.analytics_saved = threading.Event()
+
+        def save_analytics(query, response):
+            self.analytics_release.wait(5)
+            self.analytics_saved.set()
+        monkeypatch.setattr(self.rag, "_save_rag_context_to_supabase", save_analytics)
+
+        self.ai = FakeAIManager()
+        self.pipeline = AsyncChatPipeline(self.rag, self.ai, SlowKnowledgeBase())
+
+        yield
+
+        self.analytics_release.set()
+
+    def _stream(self, query=QUERY, persona="dr_gasnelio"):
+        return list(iterate_sync(self.pipeline.stream(query, persona=persona)))
+
+    def test_context_lookups_run_concurrently(self):
+        """Test embedding, vector search and structured lookup overlap"""
+        prep = run_sync(self.pipeline.prepare(QUERY))
+
+        assert prep.context is self.context
+        assert "PROTOCOLOS DE DOSAGEM" in prep.structured_context
+        assert prep.timings_ms["total"] < 3 * STEP_DELAY * 1000 * 0.8
+        assert {"embedding", "vector_search", "structured_lookup"} <= set(prep.timings_ms)
+
+    def test_stream_emits_context_tokens_and_done(self):
+        """Test token events arrive between the context and done events"""
+        events = self._stream()
+
+        names = [name for name, _ in events]
+        assert names == ["context", "token", "token", "token", "done"]
+        assert "".join(data["text"] for name, data in events if name == "token") == "A dose é 600 mg mensal."
+        done = events[-1][1]
+        assert done["model_used"] == "fake"
+        assert done["sources"] == ["pcdt (dosage)"]
+        # Structured data reaches the prompt
+        assert "Rifampicina 600 mg mensal" in self.ai.messages[1]["content"]
+
+    def test_analytics_does_not_block_the_answer(self):
+        """Test the response is returned while the analytics write is still pending"""
+        response = run_sync(self.pipeline.answer(QUERY))
+
+        assert response.answer == "A dose é 600 mg mensal."
+        assert not self.analytics_saved.is_set()
+        self.analytics_release.set()
+        assert self.analytics_saved.wait(5)
+        assert self.pipeline.get_stats()["analytics_submitted"] == 1
+
+    def test_semantic_cache_hit_skips_generation(self):
+        """Test a repeated question is streamed from the semantic cache"""
+        self._stream()
+        self.ai.tokens = ("não deveria ser usado",)
+
+        events = self._stream()
+
+        assert events[0][1]["cached"] is True
+        assert events[1][1]["text"] == "A dose é 600 mg mensal."
+        assert events[-1][1]["cache_similarity"] == pytest.approx(1.0)
+        assert self.pipeline.get_stats()["semantic_cache_hits"] == 1
+
+    def test_template_answer_when_no_provider_responds(self):
+        """Test the context-based base answer replaces the generic fallback"""
+        self.pipeline.ai_manager = FakeAIManager(tokens=())
+
+        events = self._stream()
+
+        answer = "".join(data["text"] for name, data in events if name == "token")
+        assert "Rifampicina 600 mg uma vez ao mês" in answer
+        assert events[-1][1]["model_used"] == "template"
+
+    def test_iterate_sync_closes_generator_on_early_exit(self):
+        """Test a client disconnect closes the async generator before returning"""
+        closed = threading.Event()
+
+        async def tokens():
+            try:
+                for index in range(10):
+                    yield index
+            finally:
+                closed.set()
+
+        iterator = iterate_sync(tokens())
+        assert next(iterator) == 0
+        iterator.close()
+        assert closed.is_set()
+
+    def test_out_of_scope_skips_retrieval(self):
+        """Test out-of-scope questions answer without searching"""
+        events = self._stream("qual a previsão do tempo amanhã?")
+
+        assert events[0][1]["in_scope"] is False
+        assert self.searches == []
+
+class TestChatStreamEndpoint:
+    """Test the SSE endpoint"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        from blueprints.medical_core_blueprint import medical_core_bp
+
+        class FakePipeline:
+            stats = {'errors': 0}
+
+            async def stream(self, message, persona, max_chunks):
+                yield 'context', {'persona': persona, 'sources': ['pcdt']}
+                for token in ("Olá", ", tudo bem?"):
+                    yield 'token', {'text': token}
+                yield 'done', {'confidence': 0.8}
+
+            async def answer(self, message, persona, max_chunks):
+                return SimpleNamespace(answer=f"async:{persona}", quality_score=0.8, sources=['pcdt'])
+
+        self.monkeypatch = monkeypatch
+        self.sync_calls = []
+
+        def query_rag_system(message, persona, max_chunks):
+            self.sync_calls.append(message)
+            return SimpleNamespace(answer="sync", quality_score=0.5, sources=[])
+
+        monkeypatch.setattr(async_chat_pipeline, "get_chat_pipeline", lambda: FakePipeline())
+        monkeypatch.setattr(supabase_rag_system, "query_rag_system", query_rag_system)
+
+        app = Flask(__name__)
+        app.register_blueprint(medical_core_bp)
+        self.client = app.test_client()
+
+    def test_streams_server_sent_events(self):
+        """Test tokens are sent as SSE events with the public persona in done"""
+        response = self.client.post('/api/v1/chat/stream', json={'message': 'dose?', 'persona': 'ga'})
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        events = [block.split("\n") for block in response.get_data(as_text=True).strip().split("\n\n")]
+        names = [lines[0].removeprefix("event: ") for lines in events]
+        payloads = [json.loads(lines[1].removeprefix("data: ")) for lines in events]
+
+        assert names == ["context", "token", "token", "done"]
+        assert payloads[0]["persona"] == "ga_empathetic"
+        assert payloads[-1]["persona"] == "ga"
+
+    def test_chat_uses_async_pipeline(self):
+        """Test /chat answers through the async pipeline without the sync RAG call"""
+        response = self.client.post('/api/v1/chat', json={'message': 'dose?', 'persona': 'ga'})
+
+        body = response.get_json()
+        assert response.status_code == 200
+        assert body["response"] == "async:ga_empathetic" and body["rag_used"] is True
+        assert body["sources"] == ['pcdt'] and self.sync_calls == []
+
+    def test_chat_falls_back_to_sync_rag(self):
+        """Test /chat uses query_rag_system when the pipeline is unavailable or fails"""
+        self.monkeypatch.setattr(async_chat_pipeline, "get_chat_pipeline", lambda: None)
+        response = self.client.post('/api/v1/chat', json={'message': 'dose?'})
+        assert response.get_json()["response"] == "sync"
+
+        class BrokenPipeline:
+            async def answer(self, message, persona, max_chunks):
+                raise RuntimeError("boom")
+
+        self.monkeypatch.setattr(async_chat_pipeline, "get_chat_pipeline", lambda: BrokenPipeline())
+        response = self.client.post('/api/v1/chat', json={'message': 'dose?'})
+        assert response.get_json()["response"] == "sync"
+        assert self.sync_calls == ['dose?', 'dose?']
+
+    def test_validation_matches_chat(self):
+        """Test missing message and invalid persona are rejected before streaming"""
+        assert self.client.post('/api/v1/chat/stream', json={}).status_code == 400
+        response = self.client.post('/api/v1/chat/stream', json={'message': 'oi', 'persona': 'x'})
+        assert response.get_json()["error_code"] == "INVALID_PERSONA"
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for CloudNativeCache write-behind tiering
+(local directory tiers stand in for GCS and Supabase)
+"""
+
+import pytest
+import numpy as np
+import os
+import time
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from types import SimpleNamespace
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.cache.cloud_native_cache import RealCloudNativeCache
+from services.cache.cache_tiers import LocalDirectoryCacheTier, SupabaseCacheTier
+from services.cache.write_behind import WriteBehindQueue
+
+class CountingTier(LocalDirectoryCacheTier):
+    """Directory tier that records calls and can hold writes"""
+
+    def __init__(self, directory, name):
+        super().__init__(directory, name)
+        self.gets = 0
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def get(self, cache_key):
+        self.gets += 1
+        return super().get(cache_key)
+
+    def put_many(self, entries):
+        self.release.wait(5)
+        self.batches.append([cache_key for cache_key, _ in entries])
+        return super().put_many(entries)
+
+class TestCloudNativeCache:
+    """Test write-behind, promotion and negative caching"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.gcs = CountingTier(os.path.join(self.temp_dir, "gcs"), "cloud_storage")
+        self.supabase = CountingTier(os.path.join(self.temp_dir, "supabase"), "supabase")
+        self.caches = []
+
+        yield
+
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_cache(self, **overrides):
+        settings = {'EMBEDDING_CACHE_SIZE': 100, 'CACHE_TTL_MINUTES': 60, 'CLOUD_CACHE_FLUSH_INTERVAL_MS': 10,
+                    'CLOUD_CACHE_NEGATIVE_TTL_SECONDS': 30}
+        settings.update(overrides)
+        cache = RealCloudNativeCache(SimpleNamespace(**settings), tiers=[self.gcs, self.supabase])
+        self.caches.append(cache)
+        return cache
+
+    def test_set_returns_before_persistent_tiers(self):
+        """Test set only waits for memory and the tiers are written in the background"""
+        cache = self.make_cache()
+        self.gcs.release.clear()
+
+        started = time.perf_counter()
+        assert cache.set("dose rifampicina", {"mg": 600}) is True
+        assert time.perf_counter() - started < 0.5
+        assert cache.get("dose rifampicina") == {"mg": 600}
+
+        self.gcs.release.set()
+        assert cache.flush()
+        cache_key = cache._generate_cache_key("dose rifampicina")
+        assert self.gcs.get(cache_key)["value"] == {"mg": 600}
+        assert self.supabase.get(cache_key)["value"] == {"mg": 600}
+
+    def test_repeated_keys_are_coalesced_into_one_batch(self):
+        """Test several sets of one key reach each tier once, with the last value"""
+        cache = self.make_cache(CLOUD_CACHE_FLUSH_INTERVAL_MS=200)
+        for version in range(5):
+            cache.set("pqt-u", version)
+        cache.set("clofazimina", "50mg")
+        assert cache.flush()
+
+        assert self.gcs.batches == [[cache._generate_cache_key("pqt-u"), cache._generate_cache_key("clofazimina")]]
+        assert self.gcs.get(cache._generate_cache_key("pqt-u"))["value"] == 4
+        stats = cache.get_stats()["write_behind"]
+        assert stats["coalesced"] == 4
+        assert stats["last_batch_size"] == 2
+        assert stats["queue_depth"] == 0
+
+    def test_lower_tier_hit_is_promoted(self):
+        """Test a Supabase hit is copied to memory and, asynchronously, to GCS"""
+        writer = self.make_cache()
+        writer.set("dapsona", [1, 2, 3])
+        writer.flush()
+        cache_key = writer._generate_cache_key("dapsona")
+        self.gcs.delete(cache_key)
+
+        reader = self.make_cache()
+        assert reader.get("dapsona") == [1, 2, 3]
+        assert reader.flush()
+
+        assert self.gcs.get(cache_key)["value"] == [1, 2, 3]
+        stats = reader.get_stats()
+        assert stats["stats"]["supabase_hits"] == 1
+        assert stats["stats"]["promotions"] == 1
+        assert stats["tier_latency"]["supabase"]["get"]["count"] == 1
+
+        assert reader.get("dapsona") == [1, 2, 3]
+        assert reader.get_stats()["stats"]["memory_hits"] == 1
+
+    def test_misses_are_cached_briefly(self):
+        """Test a repeated miss does not walk the tiers again until set"""
+        cache = self.make_cache()
+        assert cache.get("inexistente") is None
+        assert cache.get("inexistente") is None
+        assert self.gcs.gets == 1
+        assert cache.get_stats()["stats"]["negative_hits"] == 1
+
+        cache.set("inexistente", "agora existe")
+        cache.memory_cache.clear()
+        cache.flush()
+        assert cache.get("inexistente") == "agora existe"
+
+    def test_numpy_values_round_trip_through_tiers(self):
+        """Test embeddings come back from a persistent tier as arrays"""
+        writer = self.make_cache()
+        writer.set("embedding", np.array([0.25, 0.5], dtype=np.float32))
+        writer.flush()
+
+        value = self.make_cache().get("embedding")
+        assert isinstance(value, np.ndarray)
+        np.testing.assert_allclose(value, [0.25, 0.5])
+
+class RecordingPool:
+    """pg_pool stand-in recording the prepared statements executed"""
+
+    def __init__(self):
+        self.executed = []
+
+    @contextmanager
+    def connection(self):
+        cursor = SimpleNamespace(execute=lambda sql: None)
+        yield SimpleNamespace(cursor=lambda: nullcontext(cursor))
+
+    def execute(self, statement, params, fetch='all'):
+        self.executed.append((statement, params))
+
+class TestSupabaseCacheTier:
+    """Test the batched upsert statement sent to Postgres"""
+
+    def test_put_many_declares_text_arrays_and_casts_in_sql(self):
+        """Test list parameters are declared text[] and cast to the column types in the SQL"""
+        pool = RecordingPool()
+        tier = SupabaseCacheTier(SimpleNamespace(pg_pool=pool))
+        envelope = {'value': [1, 2], 'expires_at': '2026-01-01T00:00:00+00:00'}
+
+        assert tier.put_many([('a', envelope), ('b', envelope)]) == 2
+        (statement, params), = pool.executed
+
+        prepare_sql = ' '.join(statement.prepare_sql().split())
+        assert prepare_sql.startswith("PREPARE cache_put_many (text[], text[], text[]) AS INSERT")
+        assert "unnest($1::varchar[], $2::jsonb[], $3::timestamptz[])" in prepare_sql
+        assert statement.execute_sql() == "EXECUTE cache_put_many (%s, %s, %s)"
+        assert "unnest(%(p1)s::varchar[], %(p2)s::jsonb[], %(p3)s::timestamptz[])" in statement.plain_sql()
+        assert params[0] == ['a', 'b'] and all(isinstance(value, str) for value in params[1] + params[2])
+
+class TestWriteBehindQueue:
+    """Test the bounded queue on its own"""
+
+    def test_oldest_pending_write_is_dropped_when_full(self):
+        """Test the queue never grows past max_pending while a flush is stuck"""
+        release = threading.Event()
+        flushed = []
+
+        def flush_fn(batch):
+            release.wait(5)
+            flushed.extend(key for key, _ in batch)
+
+        queue = WriteBehindQueue(flush_fn, max_pending=2, batch_size=1, flush_interval=0)
+        queue.put("a", 1)
+        deadline = time.monotonic() + 2
+        while queue.get_stats()["queue_depth"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for key in ("b", "c", "d"):
+            queue.put(key, 1)
+
+        assert queue.get_stats()["dropped"] == 1
+        assert queue.get_pending("b") is None
+        release.set()
+        assert queue.flush()
+        assert flushed == ["a", "c", "d"]
+        queue.close()
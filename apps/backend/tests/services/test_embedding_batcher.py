@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the embedding micro-batcher and its use in UnifiedEmbeddingService
+"""
+
+import pytest
+import numpy as np
+import os
+import threading
+import tempfile
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.embedding_batcher import EmbeddingMicroBatcher
+import services.unified_embedding_service as unified_embedding_service
+
+class RecordingBackend:
+    """Batch function that records every batch it receives"""
+
+    def __init__(self, delay: float = 0.0):
+        self.batches = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, texts):
+        if self.delay:
+            threading.Event().wait(self.delay)
+        with self.lock:
+            self.batches.append(list(texts))
+        return [f"emb:{text}" for text in texts]
+
+class TestEmbeddingMicroBatcher:
+    """Test batching, coalescing and metrics"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.batchers = []
+
+        yield
+
+        for batcher in self.batchers:
+            batcher.close()
+
+    def _batcher(self, backend, **kwargs):
+        batcher = EmbeddingMicroBatcher(backend, **kwargs)
+        self.batchers.append(batcher)
+        return batcher
+
+    def test_concurrent_requests_share_a_batch(self):
+        """Test requests submitted within the window go out as one batch"""
+        backend = RecordingBackend()
+        batcher = self._batcher(backend, max_batch_size=32, max_wait_ms=200)
+
+        futures = [batcher.submit(f"pergunta {i}") for i in range(10)]
+        results = [future.result(timeout=5) for future in futures]
+
+        assert results == [f"emb:pergunta {i}" for i in range(10)]
+        assert len(backend.batches) == 1
+        assert batcher.get_stats()["batch_size_histogram"]["<=16"] == 1
+
+    def test_identical_texts_are_coalesced(self):
+        """Test identical pending texts reach the backend once"""
+        backend = RecordingBackend()
+        batcher = self._batcher(backend, max_wait_ms=100)
+
+        futures = [batcher.submit("dose de rifampicina") for _ in range(5)]
+
+        assert all(future.result(timeout=5) == "emb:dose de rifampicina" for future in futures)
+        assert backend.batches == [["dose de rifampicina"]]
+        stats = batcher.get_stats()
+        assert stats["requests"] == 5
+        assert stats["coalesced"] == 4
+
+    def test_max_batch_size_splits_batches(self):
+        """Test a full batch is dispatched without waiting for the window"""
+        backend = RecordingBackend(delay=0.05)
+        batcher = self._batcher(backend, max_batch_size=4, max_wait_ms=100)
+
+        futures = [batcher.submit(f"texto {i}") for i in range(10)]
+        for future in futures:
+            future.result(timeout=5)
+
+        assert all(len(batch) <= 4 for batch in backend.batches)
+        assert sum(len(batch) for batch in backend.batches) == 10
+
+    def test_backend_error_reaches_every_caller(self):
+        """Test a failing batch sets the exception on all its futures"""
+        def failing(texts):
+            raise RuntimeError("backend down")
+
+        batcher = self._batcher(failing, max_wait_ms=50)
+        futures = [batcher.submit("a"), batcher.submit("b")]
+
+        for future in futures:
+            with pytest.raises(RuntimeError, match="backend down"):
+                future.result(timeout=5)
+        assert batcher.get_stats()["batch_errors"] == 1
+
+        # The failed texts are no longer pending and can be retried
+        assert batcher.get_stats()["pending"] == 0
+
+    def test_wait_time_metrics(self):
+        """Test queue depth and wait-time metrics are reported"""
+        batcher = self._batcher(RecordingBackend(), max_wait_ms=20)
+        batcher.submit("x").result(timeout=5)
+
+        stats = batcher.get_stats()
+        assert stats["queue_depth"] == 0
+        assert stats["max_queue_depth"] >= 1
+        assert 0.0 <= stats["wait_ms"]["max"] < 5000
+        assert stats["avg_batch_size"] == 1.0
+
+class FakeSentenceTransformer:
+    """Stand-in for SentenceTransformer that counts encode() calls"""
+
+    instances = []
+
+    def __init__(self, model_id):
+        self.calls = []
+        FakeSentenceTransformer.instances.append(self)
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(texts)
+        vectors = [np.full(384, float(len(text)), dtype=np.float32) for text in texts]
+        return np.stack(vectors)
+
+class TestUnifiedEmbeddingServiceBatching:
+    """Test embed_text goes through the micro-batcher"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        self.temp_dir = tempfile.mkdtemp()
+        FakeSentenceTransformer.instances = []
+        monkeypatch.setenv("ENVIRONMENT", "development")
+        monkeypatch.setattr(unified_embedding_service, "SENTENCE_TRANSFORMERS_AVAILABLE", True)
+        monkeypatch.setattr(unified_embedding_service, "SentenceTransformer", FakeSentenceTransformer, raising=False)
+        config = SimpleNamespace(EMBEDDING_MICROBATCH_MAX_SIZE=16, EMBEDDING_MICROBATCH_MAX_WAIT_MS=50,
+                                 EMBEDDING_CACHE_PATH=os.path.join(self.temp_dir, "cache.sqlite3"))
+        self.service = unified_embedding_service.UnifiedEmbeddingService(config)
+        self.model = FakeSentenceTransformer.instances[-1]
+
+        yield
+
+        self.service.batcher.close()
+        self.service.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_concurrent_embed_text_uses_one_encode_call(self):
+        """Test concurrent callers are served by a single batched encode()"""
+        texts = ["tratamento", "dose", "tratamento", "efeitos adversos"] * 2
+
+        with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+            results = list(pool.map(self.service.embed_text, texts))
+
+        assert all(result.success for result in results)
+        assert results[1].embedding[0] == len("dose")
+        assert sum(len(call) for call in self.model.calls) == 3
+        stats = self.service.get_statistics()
+        assert stats["micro_batching"]["enabled"] is True
+        assert stats["micro_batching"]["requests"] + stats["cache_hits"] == len(texts)
+
+    def test_embed_batch_serves_cache_and_keeps_order(self):
+        """Test embed_batch reuses cached embeddings and returns results in input order"""
+        self.service.embed_text("dose")
+        results = self.service.embed_batch(["hanseníase", "dose", "PQT-U"])
+
+        assert [r.embedding[0] for r in results] == [len("hanseníase"), len("dose"), len("PQT-U")]
+        assert results[1].model_used.endswith("_cached")
+        assert self.model.calls[-1] == ["hanseníase", "PQT-U"]
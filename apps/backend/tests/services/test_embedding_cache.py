@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the persistent, content-addressed embedding cache
+"""
+
+import pytest
+import numpy as np
+import os
+import sqlite3
+import tempfile
+import shutil
+import subprocess
+import unicodedata
+
+# Import modules under test
+import sys
+BACKEND_ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.append(BACKEND_ROOT)
+
+from services.embedding_cache import (
+    PersistentEmbeddingCache, QUERY_PREFIX, PASSAGE_PREFIX,
+    embedding_cache_key, get_embedding_cache
+)
+
+MODEL = "intfloat/multilingual-e5-small"
+
+WRITER_SCRIPT = """
+import sys
+import numpy as np
+from services.embedding_cache import PersistentEmbeddingCache
+path, start = sys.argv[1], int(sys.argv[2])
+cache = PersistentEmbeddingCache(path, warm_entries=0)
+for i in range(start, start + 50):
+    cache.set("%s", f"texto {i}", np.full(4, i, dtype=np.float32))
+cache.close()
+""" % MODEL
+
+class TestEmbeddingCacheKey:
+    """Test key derivation"""
+
+    def test_long_texts_with_shared_prefix_do_not_collide(self):
+        """Test the whole text is hashed, not a truncated prefix"""
+        shared = "Rifampicina 600 mg dose mensal supervisionada " * 10
+        assert embedding_cache_key(MODEL, shared + "adulto") != embedding_cache_key(MODEL, shared + "criança")
+
+    def test_normalization(self):
+        """Test whitespace and Unicode composition do not change the key"""
+        composed = "hanseníase  multibacilar\n"
+        decomposed = unicodedata.normalize("NFD", " hanseníase multibacilar")
+        assert composed != decomposed
+        assert embedding_cache_key(MODEL, composed) == embedding_cache_key(MODEL, decomposed)
+
+    def test_model_and_prefix_are_part_of_the_key(self):
+        """Test the same text under another model or e5 role is a different entry"""
+        keys = {
+            embedding_cache_key(MODEL, "dose"),
+            embedding_cache_key(MODEL, "dose", QUERY_PREFIX),
+            embedding_cache_key(MODEL, "dose", PASSAGE_PREFIX),
+            embedding_cache_key("all-MiniLM-L6-v2", "dose"),
+        }
+        assert len(keys) == 4
+
+class TestPersistentEmbeddingCache:
+    """Test storage, eviction, warm load and metrics"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "embedding_cache.sqlite3")
+
+        yield
+
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip_survives_restart(self):
+        """Test vectors are stored as float32 and reload in a new instance"""
+        cache = PersistentEmbeddingCache(self.path)
+        vector = np.linspace(-1, 1, 384).astype(np.float64)
+        cache.set(MODEL, "efeitos adversos da clofazimina", vector)
+        cache.close()
+
+        reloaded = PersistentEmbeddingCache(self.path, warm_entries=0)
+        cached = reloaded.get(MODEL, "efeitos adversos da clofazimina")
+        assert cached.dtype == np.float32
+        assert np.allclose(cached, vector)
+        assert reloaded.get_stats()["disk_hits"] == 1
+
+        with sqlite3.connect(self.path) as conn:
+            blob, = conn.execute("SELECT vector FROM embeddings").fetchone()
+        assert len(blob) == 384 * 4
+
+    def test_lru_eviction(self):
+        """Test least recently used rows are evicted past max_entries"""
+        cache = PersistentEmbeddingCache(self.path, max_entries=10, memory_entries=0)
+        for i in range(10):
+            cache.set(MODEL, f"texto {i}", np.full(4, i, dtype=np.float32))
+        assert cache.get(MODEL, "texto 0") is not None  # recently used
+        cache.flush()
+
+        cache.set(MODEL, "texto novo", np.zeros(4, dtype=np.float32))
+
+        assert cache.get(MODEL, "texto 0") is not None
+        assert cache.get(MODEL, "texto 1") is None
+        assert len(cache) <= 10
+        assert cache.get_stats()["evictions"] >= 1
+
+    def test_warm_load_prefers_hot_entries(self):
+        """Test startup primes memory with the most frequently hit entries"""
+        cache = PersistentEmbeddingCache(self.path, memory_entries=0)
+        for i in range(5):
+            cache.set(MODEL, f"texto {i}", np.full(4, i, dtype=np.float32))
+        for _ in range(3):
+            cache.get(MODEL, "texto 3")
+        cache.close()
+
+        warm = PersistentEmbeddingCache(self.path, memory_entries=10, warm_entries=1)
+        assert warm.get_stats()["warm_loaded"] == 1
+        warm.get(MODEL, "texto 3")
+        assert warm.get_stats()["memory_hits"] == 1
+
+    def test_metrics(self):
+        """Test hit/miss and byte counters"""
+        cache = PersistentEmbeddingCache(self.path)
+        assert cache.get(MODEL, "ausente") is None
+        cache.set(MODEL, "presente", np.ones(8, dtype=np.float32))
+        cache.get(MODEL, "presente")
+
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["bytes_written"] == 32
+        assert stats["hit_rate"] == pytest.approx(50.0)
+        assert stats["file_bytes"] > 0
+
+    def test_cached_vectors_are_read_only_copies(self):
+        """Test callers cannot corrupt a cached vector"""
+        cache = PersistentEmbeddingCache(self.path)
+        vector = np.ones(4, dtype=np.float32)
+        cache.set(MODEL, "texto", vector)
+        vector[0] = 99
+
+        cached = cache.get(MODEL, "texto")
+        assert cached[0] == 1
+        with pytest.raises(ValueError):
+            cached[0] = 5
+
+    def test_concurrent_processes(self):
+        """Test several processes can write the same file"""
+        PersistentEmbeddingCache(self.path).close()
+        processes = [
+            subprocess.Popen([sys.executable, "-c", WRITER_SCRIPT, self.path, str(i * 50)], cwd=BACKEND_ROOT)
+            for i in range(3)
+        ]
+        for process in processes:
+            assert process.wait(60) == 0
+
+        cache = PersistentEmbeddingCache(self.path, warm_entries=0)
+        assert len(cache) == 150
+        assert cache.get(MODEL, "texto 120")[0] == 120
+
+    def test_memory_only_when_path_missing(self):
+        """Test the cache degrades to memory when no file is configured"""
+        cache = PersistentEmbeddingCache(None)
+        cache.set(MODEL, "texto", np.ones(4))
+        assert cache.get(MODEL, "texto") is not None
+        assert cache.get_stats()["persistent"] is False
+
+    def test_shared_instance_per_file(self):
+        """Test services configured with the same file share one cache"""
+        assert get_embedding_cache(path=self.path) is get_embedding_cache(path=self.path)
+
+    def test_embedding_service_uses_configured_cache(self):
+        """Test EmbeddingService gets the shared cache from its config (path and limits)"""
+        from types import SimpleNamespace
+        from services.rag.embedding_service import EmbeddingService
+
+        config = SimpleNamespace(EMBEDDING_CACHE_PATH=self.path, EMBEDDING_CACHE_MAX_ENTRIES=10,
+                                 EMBEDDING_CACHE_SIZE=5, EMBEDDING_MODEL=MODEL)
+        store = EmbeddingService(config).cache.store
+        assert store is get_embedding_cache(path=self.path)
+        assert store.max_entries == 10
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the sharded GCRA rate limiter and its SQLite bucket persistence
+"""
+
+import pytest
+import os
+import shutil
+import tempfile
+import threading
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.performance.sqlite_pool import get_sqlite_pool
+from services.security.gcra_rate_limiter import ShardedGCRALimiter, BucketPersister
+from services.security.sqlite_rate_limiter import SQLiteRateLimiter
+
+class TestShardedGCRALimiter:
+    """Test GCRA decisions on a fixed clock"""
+
+    def test_burst_then_refill(self):
+        """Test the full limit is available at once and refills one token per interval"""
+        limiter = ShardedGCRALimiter(shards=4)
+        decisions = [limiter.decide("ip:1", 5, 60, now=1000.0) for _ in range(6)]
+
+        assert [d.allowed for d in decisions] == [True] * 5 + [False]
+        assert [d.remaining for d in decisions[:5]] == [4, 3, 2, 1, 0]
+        assert decisions[5].retry_after == pytest.approx(12.0)
+
+        assert limiter.decide("ip:1", 5, 60, now=1011.0).allowed is False
+        refilled = limiter.decide("ip:1", 5, 60, now=1012.0)
+        assert refilled.allowed is True
+        assert refilled.remaining == 0
+
+    def test_keys_are_independent(self):
+        """Test one client exhausting its bucket does not affect another"""
+        limiter = ShardedGCRALimiter(shards=4)
+        for _ in range(3):
+            limiter.decide("ip:1", 3, 60, now=0.0)
+
+        assert limiter.decide("ip:1", 3, 60, now=0.0).allowed is False
+        assert limiter.decide("ip:2", 3, 60, now=0.0).allowed is True
+
+    def test_exact_under_concurrency(self):
+        """Test concurrent threads on one key never exceed the limit"""
+        limiter = ShardedGCRALimiter(shards=8)
+        results = []
+
+        def worker():
+            for _ in range(50):
+                results.append(limiter.decide("ip:hot", 100, 3600).allowed)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(True) == 100
+
+    def test_sweep_drops_full_buckets(self):
+        """Test buckets whose TAT has passed are removed"""
+        limiter = ShardedGCRALimiter(shards=4)
+        limiter.decide("ip:1", 10, 10, now=0.0)
+        limiter.decide("ip:2", 1, 100, now=0.0)
+
+        assert limiter.sweep(now=5.0) == 1
+        assert len(limiter) == 1
+        assert limiter.peek("ip:2", 1, 100, now=5.0).remaining == 0
+
+class TestBucketPersistence:
+    """Test restart survival and cross-worker consumption through the shared file"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "rate_limits.db")
+
+        yield
+
+        get_sqlite_pool(self.db_path).close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_worker(self):
+        limiter = ShardedGCRALimiter(shards=4)
+        persister = BucketPersister(limiter, get_sqlite_pool(self.db_path), interval_seconds=60)
+        persister.restore()
+        return limiter, persister
+
+    def test_state_survives_restart(self):
+        """Test a new process restores exhausted buckets from the snapshot"""
+        limiter, persister = self.make_worker()
+        for _ in range(3):
+            assert limiter.decide("ip:1|chat", 3, 3600).allowed
+        assert persister.sync() == 1
+
+        restarted, _ = self.make_worker()
+        assert restarted.decide("ip:1|chat", 3, 3600).allowed is False
+
+    def test_workers_add_their_consumption(self):
+        """Test two workers sharing the file converge on the combined usage"""
+        worker_a, persister_a = self.make_worker()
+        worker_b, persister_b = self.make_worker()
+
+        for _ in range(5):
+            assert worker_a.decide("ip:1|chat", 8, 3600).allowed
+            assert worker_b.decide("ip:1|chat", 8, 3600).allowed
+        persister_a.sync()
+        persister_b.sync()
+        persister_a.sync()
+
+        assert worker_a.decide("ip:1|chat", 8, 3600).allowed is False
+        assert worker_b.decide("ip:1|chat", 8, 3600).allowed is False
+
+    def test_limiter_flushes_stats_and_keeps_headers_info(self):
+        """Test SQLiteRateLimiter reports the same info keys and flushed daily stats"""
+        limiter = SQLiteRateLimiter(self.db_path, persist_interval=60)
+        allowed, info = limiter.check_rate_limit("10.0.0.3", "auth")
+        for _ in range(5):
+            limiter.check_rate_limit("10.0.0.3", "auth")
+
+        assert allowed is True
+        assert set(info) >= {'allowed', 'limit', 'remaining', 'reset_time', 'window_seconds', 'current_count'}
+        assert (info['limit'], info['remaining'], info['current_count']) == (5, 4, 1)
+
+        stats = limiter.get_stats()
+        assert (stats['total_requests'], stats['blocked_requests']) == (5, 1)
+        assert stats['top_limited_endpoints'] == [{'endpoint': 'auth', 'blocks': 1}]
+        limiter.close()
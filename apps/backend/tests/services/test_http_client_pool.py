@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the shared HTTP client registry (keep-alive reuse, per-loop async
+clients, shutdown and metrics) against a local stub server
+"""
+
+import pytest
+import asyncio
+import os
+from unittest.mock import patch
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.append(os.path.dirname(__file__))
+
+from http_stub_server import StubHTTPServer
+from core.performance.http_client_pool import HTTPClientRegistry, HTTPPoolConfig, origin_of
+from services.ai.ai_provider_manager import AIProviderManager
+
+class TestHTTPClientRegistry:
+    """Test pooling, reuse counters and shutdown"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.server = StubHTTPServer().start()
+        self.registry = HTTPClientRegistry(HTTPPoolConfig(max_connections=4))
+
+        yield
+
+        self.registry.close()
+        self.server.stop()
+
+    def test_origin_key(self):
+        """Test URLs of the same host share one key and default ports are explicit"""
+        assert origin_of("https://openrouter.ai/api/v1/chat/completions") == "https://openrouter.ai:443"
+        assert origin_of("https://openrouter.ai/other") == origin_of("https://openrouter.ai:443/x")
+        with pytest.raises(ValueError):
+            origin_of("/relative/path")
+
+    def test_sync_requests_reuse_one_connection(self):
+        """Test sequential requests to one host pay a single connection"""
+        url = f"{self.server.url}/api/v1/chat/completions"
+        for _ in range(5):
+            assert self.registry.client(url).post(url, json={}).status_code == 200
+
+        assert self.server.connections == 1
+        stats = self.registry.get_stats()["origins"][origin_of(url)]
+        assert stats["requests"] == 5
+        assert stats["connections_opened"] == 1
+        assert stats["connections_reused"] == 4
+        assert stats["open_connections"] == 1
+        assert stats["pool_utilization"] == 0.0
+
+    def test_one_client_per_origin(self):
+        """Test paths of one host share a client and other hosts get their own"""
+        assert self.registry.client(f"{self.server.url}/a") is self.registry.client(f"{self.server.url}/b")
+        assert self.registry.client(f"{self.server.url}/a") is not self.registry.client("https://example.org/a")
+
+    def test_async_clients_are_per_event_loop(self):
+        """Test a client is reused within a loop and never across loops"""
+        url = f"{self.server.url}/api/v1/chat/completions"
+
+        async def two_requests():
+            first = self.registry.async_client(url)
+            await first.post(url, json={})
+            second = self.registry.async_client(url)
+            await second.post(url, json={})
+            return first, second
+
+        first, second = asyncio.run(two_requests())
+        assert first is second
+        assert self.server.connections == 1
+
+        other, _ = asyncio.run(two_requests())
+        assert other is not first
+        assert self.registry.get_stats()["async_clients"] == 1  # closed loop discarded
+
+    def test_close_releases_clients(self):
+        """Test the shutdown hook closes clients and later calls get fresh ones"""
+        client = self.registry.client(self.server.url)
+        self.registry.close()
+
+        assert client.is_closed
+        assert self.registry.client(self.server.url) is not client
+
+class TestProviderCallsUsePool:
+    """Test AIProviderManager keeps its connection to the provider open"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.server = StubHTTPServer(tokens=("PQT-U ", "por 6 meses.")).start()
+        self.registry = HTTPClientRegistry()
+
+        with patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test_key'}), \
+                patch('services.ai.ai_provider_manager.get_async_http_client', self.registry.async_client):
+            self.manager = AIProviderManager()
+            for model in self.manager.models.values():
+                model.endpoint_url = f"{self.server.url}/api/v1/chat/completions"
+            yield
+
+        self.registry.close()
+        self.server.stop()
+
+    def test_generate_and_stream_share_connection(self):
+        """Test completions and streamed completions reuse one connection"""
+        messages = [{"role": "user", "content": "Duração do tratamento?"}]
+
+        async def conversation():
+            text, metadata = await self.manager.generate_response(messages)
+            streamed = [chunk async for chunk in self.manager.stream_response(messages)]
+            return text, metadata, streamed
+
+        text, metadata, streamed = asyncio.run(conversation())
+
+        assert text == "PQT-U por 6 meses."
+        assert metadata["success"] is True
+        assert streamed == ["PQT-U ", "por 6 meses."]
+        assert self.server.requests == 2
+        assert self.server.connections == 1
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for hybrid (BM25 + dense) retrieval in SemanticSearchEngine
+"""
+
+import pytest
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag import semantic_search
+from services.rag.medical_chunking import MedicalChunker
+from services.rag.semantic_search import MedicalChunk, SemanticSearchEngine
+from services.vector_store import LocalVectorStore, VectorDocument
+
+class FakeEmbeddingService:
+    """Embeddings fixos por texto; textos desconhecidos caem no vetor 'default'"""
+
+    def __init__(self, vectors, available=True):
+        self.vectors = vectors
+        self.available = available
+
+    def is_available(self):
+        return self.available
+
+    def embed_text(self, text):
+        return np.asarray(self.vectors.get(text, self.vectors['default']), dtype=np.float32)
+
+    def embed_batch(self, texts):
+        return [self.embed_text(text) for text in texts]
+
+    def get_statistics(self):
+        return {}
+
+KNOWLEDGE_BASE = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'data', 'knowledge-base', 'hanseniase.md')
+
+def make_chunk(content, category='general', priority=0.5):
+    return MedicalChunk(content=content, category=category, priority=priority, source_section='faq',
+                        word_count=len(content.split()), contains_dosage=False, contains_contraindication=False)
+
+class TestHybridSearch:
+    """Test fusion, medical weighting after fusion and the lexical fallback"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.config = SimpleNamespace(
+            EMBEDDINGS_ENABLED=True,
+            SEMANTIC_SIMILARITY_THRESHOLD=0.60,
+            LEXICAL_INDEX_DIR=os.path.join(self.temp_dir, 'lexical'),
+            HYBRID_SEARCH_ENABLED=True,
+            HYBRID_FUSION='rrf',
+            CONTENT_WEIGHTS={'dosing': 1.0, 'safety': 0.9, 'general': 0.5}
+        )
+        self.chunks = [
+            make_chunk("A clofazimina 50 mg é tomada diariamente na PQT-U multibacilar.", 'dosing', 1.0),
+            make_chunk("A hanseníase é uma doença infecciosa crônica que afeta pele e nervos.", 'general', 0.6),
+            make_chunk("Orientações gerais sobre o acompanhamento mensal na unidade de saúde.", 'general', 0.5),
+            make_chunk("A coloração da pele pode escurecer durante o tratamento, efeito reversível.", 'safety', 0.9),
+        ]
+        # o modelo denso "erra" o nome do medicamento: a query fica mais perto do chunk geral
+        self.vectors = {
+            'default': [0.0, 0.0, 1.0],
+            self.chunks[0].content: [0.2, 1.0, 0.0],
+            self.chunks[1].content: [1.0, 0.1, 0.0],
+            self.chunks[2].content: [0.7, 0.0, 0.7],
+            self.chunks[3].content: [0.5, 0.5, 0.5],
+            "dose de clofazimina": [1.0, 0.5, 0.0],
+            "pele": [1.0, 0.0, 0.0],
+        }
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_engine(self, available=True):
+        store = LocalVectorStore(os.path.join(self.temp_dir, 'vectors'))
+        service = FakeEmbeddingService(self.vectors, available)
+        with patch.object(semantic_search, '_lazy_import_embedding_service',
+                          return_value=(lambda: service, None, None)), \
+             patch.object(semantic_search, '_lazy_import_vector_store',
+                          return_value=(lambda: store, VectorDocument, None)):
+            return SemanticSearchEngine(self.config)
+
+    def test_fusion_recovers_exact_drug_name(self):
+        """Test the BM25 side lifts the chunk the dense model ranks low"""
+        engine = self.make_engine()
+        assert engine.index_medical_chunks_batch(self.chunks, 'faq.json') == (4, 0)
+        assert len(engine.lexical_index) == 4
+
+        dense = engine._dense_results(engine._dense_search("dose de clofazimina", 4, 0.1), 0.1, None, False)
+        assert dense[0].chunk.content != self.chunks[0].content
+
+        results = engine.search("dose de clofazimina", top_k=4)
+        assert results[0].chunk.content == self.chunks[0].content
+        assert results[0].metadata['retrieval'] == 'hybrid'
+        assert results[0].weighted_score == pytest.approx(results[0].score * 1.0 * 1.0)
+        assert engine.get_statistics()['hybrid_searches'] == 1
+
+    def test_medical_weights_apply_after_fusion(self):
+        """Test the same fused rank is reordered by content weight x priority"""
+        engine = self.make_engine()
+        engine.index_medical_chunks_batch(self.chunks, 'faq.json')
+
+        unweighted = engine.search("pele", top_k=4, use_medical_weights=False)
+        weighted = engine.search("pele", top_k=4)
+        assert [r.chunk.content for r in unweighted][:2] == [self.chunks[1].content, self.chunks[3].content]
+        assert weighted[0].chunk.content == self.chunks[3].content
+        for result in weighted:
+            weight = engine.content_weights[result.chunk.category] * result.chunk.priority
+            assert result.weighted_score == pytest.approx(result.score * weight)
+            assert (result.metadata['retrieval'] != 'dense' or
+                    result.weighted_score >= self.config.SEMANTIC_SIMILARITY_THRESHOLD)
+
+        filtered = engine.search("pele", top_k=4, chunk_types=['safety'])
+        assert [r.chunk.category for r in filtered] == ['safety']
+
+    def test_lexical_only_when_dense_unavailable(self):
+        """Test search keeps answering from the persisted BM25 index without embeddings"""
+        engine = self.make_engine()
+        engine.index_medical_chunks_batch(self.chunks, 'faq.json')
+
+        degraded = self.make_engine(available=False)
+        assert not degraded.is_available() and degraded.is_search_available()
+        assert len(degraded.lexical_index) == 4
+        results = degraded.search("clofazimina 50 mg", top_k=3)
+        assert results[0].chunk.content == self.chunks[0].content
+        assert {r.metadata['retrieval'] for r in results} == {'lexical'}
+        assert degraded.get_statistics()['lexical_only_searches'] == 1
+
+    def test_sparse_only_indexing_and_disabled_hybrid(self):
+        """Test index_lexical_chunks needs no embeddings and HYBRID_SEARCH_ENABLED=False keeps dense-only"""
+        engine = self.make_engine(available=False)
+        assert engine.index_lexical_chunks(self.chunks, 'faq.json') == 4
+        assert engine.search("acompanhamento mensal", top_k=1)[0].chunk.content == self.chunks[2].content
+
+        self.config.HYBRID_SEARCH_ENABLED = False
+        dense_only = self.make_engine()
+        dense_only.index_medical_chunks_batch(self.chunks, 'faq.json')
+        assert not dense_only.is_hybrid_active()
+        results = dense_only.search("dose de clofazimina", top_k=4)
+        assert results and all('retrieval' not in r.metadata for r in results)
+        assert results == sorted(results, key=lambda r: r.weighted_score, reverse=True)
+
+    def test_lexical_only_at_production_threshold(self):
+        """Test real-KB dosing questions clear the default thresholds and stopword-only matches do not"""
+        with open(KNOWLEDGE_BASE, encoding='utf-8') as f:
+            chunks = MedicalChunker().chunk_document(f.read(), 'hanseniase.md')
+        engine = self.make_engine(available=False)
+        engine.index_lexical_chunks(chunks, 'hanseniase.md')
+
+        for query, term in (("Qual a dose de rifampicina para adultos?", 'rifampicina'),
+                            ("Qual é a dose da PQT-U para adultos multibacilares?", 'PQT-U')):
+            results = engine.search(query, top_k=3)
+            assert results and any(term.lower() in r.chunk.content.lower() for r in results)
+            assert all(r.score >= engine.lexical_threshold for r in results)
+
+        assert engine.search("receita de bolo de chocolate", top_k=3) == []
+        assert engine._lexical_search("qual a dose para adultos", 5)[1] == engine.lexical_index.upper_bound("dose adultos")
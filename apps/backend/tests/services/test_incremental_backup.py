@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for incremental SQLite backups (local directory as the object store)
+"""
+
+import pytest
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.performance.sqlite_pool import get_sqlite_pool
+from services.storage.incremental_backup import IncrementalBackupManager, LocalDirectoryObjectStore
+from services.storage.sqlite_manager import SQLiteCloudManager
+
+def count_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    finally:
+        conn.close()
+
+class TestIncrementalBackup:
+    """Test full/delta cycles and point-in-time restore"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "analytics.db")
+        self.store = LocalDirectoryObjectStore(os.path.join(self.temp_dir, "bucket"))
+        self.pool = get_sqlite_pool(self.db_path)
+        self.pool.executescript("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, payload TEXT)")
+        self.insert(2000)
+
+        yield
+
+        self.pool.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def insert(self, count, start=0):
+        self.pool.executemany("INSERT INTO events (payload) VALUES (?)",
+                              [(f"evento {start + i} " + "x" * 200,) for i in range(count)])
+
+    def make_manager(self, **kwargs):
+        return IncrementalBackupManager(self.db_path, self.store, prefix="database/analytics.db.backups", **kwargs)
+
+    def test_second_cycle_ships_only_changed_pages(self):
+        """Test a small change after a full backup is shipped as a small delta"""
+        manager = self.make_manager(pages_per_step=8)
+        full = manager.run_cycle()
+        self.insert(5, start=2000)
+        delta = manager.run_cycle()
+
+        assert full["kind"] == "full"
+        assert full["backup_steps"] > 1
+        assert delta["kind"] == "delta"
+        assert delta["changed_pages"] < full["changed_pages"] // 10
+        assert delta["bytes_shipped"] < full["bytes_shipped"] // 5
+        assert manager.run_cycle()["kind"] == "unchanged"
+        assert manager.get_stats()["bytes_shipped_total"] == full["bytes_shipped"] + delta["bytes_shipped"]
+
+    def test_retention_saves_catalog_before_deleting(self):
+        """Test expired chains leave the catalog before their objects are deleted"""
+        manager = self.make_manager(keep_full=1)
+        first = manager.run_cycle(force_full=True)
+        self.insert(5, start=2000)
+        manager.run_cycle()
+        expired = [entry["key"] for entry in manager.load_catalog()]
+
+        deleted = []
+        original_delete = self.store.delete
+
+        def delete(key):
+            assert key not in [entry["key"] for entry in manager.load_catalog()]
+            deleted.append(key)
+            original_delete(key)
+
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(self.store, "delete", delete)
+            manager.run_cycle(force_full=True)
+
+        assert first["kind"] == "full" and deleted == expired
+        assert [entry["seq"] for entry in manager.load_catalog()] == [3]
+
+    def test_point_in_time_restore(self):
+        """Test restoring up to an entry replays the full and only the deltas before it"""
+        manager = self.make_manager()
+        manager.run_cycle()
+        self.insert(10, start=2000)
+        manager.run_cycle()
+        self.pool.execute("DELETE FROM events WHERE id <= 1500")
+        manager.run_cycle()
+        entries = manager.load_catalog()
+
+        restored = os.path.join(self.temp_dir, "restored.db")
+        result = manager.restore(restored, until=entries[1]["timestamp"])
+        assert result["deltas_applied"] == 1
+        assert count_rows(restored) == 2010
+
+        latest = manager.restore(restored)
+        assert latest["seq"] == entries[-1]["seq"]
+        assert count_rows(restored) == 510
+        assert latest["restore_seconds"] > 0
+
+    def test_restored_file_is_the_base_for_the_next_delta(self):
+        """Test a new process that restored at startup continues with deltas"""
+        self.make_manager().run_cycle()
+        restored = os.path.join(self.temp_dir, "restored.db")
+        manager = IncrementalBackupManager(restored, self.store, prefix="database/analytics.db.backups")
+        manager.restore(restored)
+
+        conn = sqlite3.connect(restored)
+        conn.execute("INSERT INTO events (payload) VALUES ('novo')")
+        conn.commit()
+        conn.close()
+
+        assert manager.run_cycle()["kind"] == "delta"
+
+    def test_snapshot_is_consistent_under_concurrent_writes(self):
+        """Test a stepped backup taken while the pool writes restores to an intact database"""
+        manager = self.make_manager(pages_per_step=1)
+        stop = threading.Event()
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                self.insert(1, start=10000 + i)
+                i += 1
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            manager.run_cycle()
+            manager.run_cycle()
+        finally:
+            stop.set()
+            thread.join()
+
+        restored = os.path.join(self.temp_dir, "restored.db")
+        manager.restore(restored)
+        conn = sqlite3.connect(restored)
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        conn.close()
+        assert count_rows(restored) >= 2000
+
+    def test_cloud_manager_restores_from_local_store(self):
+        """Test SQLiteCloudManager backs up and restores through a directory store"""
+        first_path = os.path.join(self.temp_dir, "app.db")
+        manager = SQLiteCloudManager(first_path, backup_store=self.store, backup_interval=3600)
+        manager.insert_user("u1", "ana@roteiros.com", "Ana")
+        assert manager.force_backup()
+        assert manager.get_stats()["backup"]["full_backups"] == 1
+        manager.close()
+
+        os.remove(first_path)
+        restored = SQLiteCloudManager(first_path, backup_store=self.store, backup_interval=3600)
+        try:
+            assert restored.get_user("u1")["email"] == "ana@roteiros.com"
+            assert restored.get_stats()["backup"]["last_restore"]["seq"] == 1
+        finally:
+            restored.close()
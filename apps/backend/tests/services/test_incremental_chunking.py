@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for diff-aware re-chunking of medical documents
+"""
+
+import pytest
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag.incremental_chunking import IncrementalChunker
+from services.rag.indexing_pipeline import IndexingPipeline, content_id
+from services.rag.lexical_index import DocumentLexicalIndex
+from services.rag.medical_chunking import MedicalChunker
+from services.vector_store import LocalVectorStore, VectorDocument
+
+GUIDE = """# Guia PQT-U
+
+## Dosagem
+
+A rifampicina 600 mg é administrada uma vez ao mês, em dose supervisionada na unidade de saúde.
+
+A clofazimina 300 mg mensal e 50 mg diária completam o esquema multibacilar da PQT-U.
+
+## Efeitos adversos
+
+A clofazimina pode causar escurecimento da pele, que é reversível após o fim do tratamento.
+
+## Orientações
+
+Orientar o paciente a trazer a cartela na consulta mensal para conferir a adesão.
+
+## Orientações
+
+Gestantes devem manter o tratamento; a PQT-U não é contraindicada na gravidez.
+"""
+
+def embed(texts):
+    return [np.full(8, len(text) % 13 + 1, dtype=np.float32) for text in texts]
+
+class TestIncrementalChunking:
+    """Test section anchors, stable chunk ids and change sets applied by the pipeline"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.chunker = MedicalChunker()
+        self.incremental = IncrementalChunker(self.chunker, state_dir=os.path.join(self.temp_dir, 'state'))
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_first_pass_matches_full_chunking(self):
+        """Test without state every chunk is added and ids equal the full-document path"""
+        # _normalize_section_name descarta letras acentuadas
+        anchors = [anchor for anchor, _ in self.chunker.detect_anchored_sections(GUIDE)]
+        assert anchors == ['guia_pqtu', 'dosagem', 'efeitos_adversos', 'orientaes', 'orientaes~2']
+
+        full = self.chunker.chunk_document(GUIDE, 'guia.md')
+        assert all(chunk.content for chunk in full)
+        assert any('Gestantes' in chunk.content for chunk in full)  # título repetido não sobrescreve
+
+        change_set = self.incremental.rechunk(GUIDE, 'guia.md')
+        assert set(change_set.added) == {content_id(chunk.content, 'guia.md') for chunk in full}
+        assert change_set.removed == [] and change_set.modified == {} and change_set.unchanged == []
+        assert change_set.sections_rechunked == 4 and change_set.sections_total == 5
+
+    def test_single_section_edit_rechunks_only_that_section(self):
+        """Test an edit re-chunks one section, keeps other ids and pairs the replaced chunk"""
+        self.incremental.commit(self.incremental.rechunk(GUIDE, 'guia.md'))
+        unchanged = self.incremental.rechunk(GUIDE, 'guia.md')
+        assert unchanged.is_empty and unchanged.sections_rechunked == 0
+        assert len(unchanged.unchanged) == len(unchanged.chunks)
+
+        edited = GUIDE.replace("reversível após o fim do tratamento.",
+                               "reversível em meses após o fim do tratamento.")
+        with patch.object(self.chunker, 'chunk_by_medical_semantics',
+                          wraps=self.chunker.chunk_by_medical_semantics) as chunk_section:
+            change_set = self.incremental.rechunk(edited, 'guia.md')
+        assert [call.args[1] for call in chunk_section.call_args_list] == ['efeitos_adversos']
+        assert change_set.added == [] and change_set.removed == []
+        (old_id, new_id), = change_set.modified.items()
+        assert old_id in unchanged.chunks and 'em meses' in change_set.chunks[new_id].text
+        assert [chunk.id for chunk in change_set.to_embed] == [new_id] and change_set.to_delete == [old_id]
+        assert set(change_set.unchanged) == set(unchanged.chunks) - {old_id}
+
+        # nova seção, seção removida e trecho que só mudou de lugar
+        restructured = edited.replace("## Orientações\n\nGestantes", "## Gestação\n\nGestantes") + \
+            "\n## Retorno\n\nAgendar retorno em 28 dias para a próxima dose supervisionada.\n"
+        self.incremental.commit(change_set)
+        change_set = self.incremental.rechunk(restructured, 'guia.md')
+        assert change_set.modified == {} and change_set.removed == []
+        assert [change_set.chunks[chunk_id].anchor for chunk_id in change_set.added] == ['retorno']
+        assert change_set.chunks[content_id(
+            "Gestantes devem manter o tratamento; a PQT-U não é contraindicada na gravidez.", 'guia.md')
+        ].anchor == 'gestao'
+
+        # diff contra o último estado gravado (edited): três seções saem inteiras
+        shortened = restructured.split("## Efeitos adversos")[0]
+        change_set = self.incremental.rechunk(shortened, 'guia.md')
+        assert change_set.added == [] and change_set.modified == {} and len(change_set.removed) == 3
+
+    def test_pipeline_applies_change_sets(self):
+        """Test the pipeline embeds only changed chunks and deletes the ones they replaced"""
+        store = LocalVectorStore(os.path.join(self.temp_dir, 'vectors'))
+        embedded = []
+
+        def counting_embed(texts):
+            embedded.extend(texts)
+            return embed(texts)
+
+        def pipeline():
+            return IndexingPipeline(store, counting_embed, VectorDocument, batch_size=2, chunk_workers=2,
+                                    embed_workers=2, manifest_path=os.path.join(self.temp_dir, 'manifest.json'))
+
+        change_set = self.incremental.rechunk(GUIDE, 'guia.md')
+        report = pipeline().run(change_sets=[change_set])
+        assert report['indexed'] == len(change_set.chunks) == len(store.documents) and report['deleted'] == 0
+        self.incremental.commit(change_set)
+        assert store.documents[change_set.added[0]].metadata['section'] == 'dosagem'
+
+        embedded.clear()
+        edited = GUIDE.replace("consulta mensal", "consulta mensal supervisionada")
+        change_set = self.incremental.rechunk(edited, 'guia.md')
+        report = pipeline().run(change_sets=[change_set])
+        assert embedded == [chunk.text for chunk in change_set.to_embed] and len(embedded) == 1
+        assert report['deleted'] == 1 and report['skipped'] == len(change_set.unchanged)
+        assert set(store.documents) == set(change_set.chunks)
+
+        # estado não gravado (falha antes do commit): a próxima passada reaplica o mesmo diff
+        embedded.clear()
+        retry = self.incremental.rechunk(edited, 'guia.md')
+        assert retry.modified == change_set.modified
+        report = pipeline().run(change_sets=[retry])
+        assert embedded == [] and set(store.documents) == set(retry.chunks)
+
+    def test_deleted_chunks_leave_the_lexical_index(self):
+        """Test on_deleted removes replaced and pruned chunks from the lexical index"""
+        store = LocalVectorStore(os.path.join(self.temp_dir, 'vectors'))
+        lexical_index = DocumentLexicalIndex()
+        path = os.path.join(self.temp_dir, 'lexical', 'semantic_chunks.json')
+
+        def on_deleted(chunk_ids):
+            for chunk_id in chunk_ids:
+                lexical_index.remove(chunk_id)
+            lexical_index.save(path)
+
+        def pipeline():
+            return IndexingPipeline(
+                store, embed, VectorDocument, batch_size=2, chunk_workers=1, embed_workers=1,
+                manifest_path=os.path.join(self.temp_dir, 'manifest.json'),
+                on_indexed=lambda chunks: [lexical_index.add(chunk.id, chunk.text) for chunk in chunks],
+                on_deleted=on_deleted)
+
+        change_set = self.incremental.rechunk(GUIDE, 'guia.md')
+        pipeline().run(change_sets=[change_set])
+        self.incremental.commit(change_set)
+        assert set(lexical_index.texts) == set(store.documents)
+
+        edited = GUIDE.replace("escurecimento da pele", "hiperpigmentação da pele")
+        change_set = self.incremental.rechunk(edited, 'guia.md')
+        assert pipeline().run(change_sets=[change_set])['deleted'] == 1
+        assert set(lexical_index.texts) == set(store.documents) == set(change_set.chunks)
+        assert lexical_index.search("escurecimento") == []
+        assert set(DocumentLexicalIndex.load(path).texts) == set(store.documents)
+
+        pipeline().run(change_sets=[self.incremental.rechunk(GUIDE.split("## Efeitos")[0], 'guia.md')],
+                       prune=True)
+        assert set(lexical_index.texts) == set(store.documents)
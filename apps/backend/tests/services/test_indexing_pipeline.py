@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the three-stage knowledge base indexing pipeline
+"""
+
+import pytest
+import os
+import json
+import shutil
+import zlib
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag import semantic_search
+from services.rag.indexing_pipeline import IndexingPipeline, PipelineChunk, legacy_chunk_id
+from services.rag.lexical_index import DocumentLexicalIndex
+from services.rag.semantic_search import MedicalChunk, SemanticSearchEngine
+from services.vector_store import LocalVectorStore, VectorDocument
+
+DOCUMENT = """# Hanseníase
+
+## Dosagem
+
+A rifampicina 600 mg é administrada uma vez ao mês, em dose supervisionada na unidade de saúde, junto com a clofazimina 300 mg.
+
+## Efeitos adversos
+
+A clofazimina pode causar escurecimento da pele, que é reversível após o fim do tratamento com a PQT-U.
+
+## Acompanhamento
+
+O paciente deve comparecer mensalmente à unidade para receber a dose supervisionada e avaliar a função neural.
+"""
+
+class CountingEmbedder:
+    """embed_batch determinístico que registra os textos recebidos e pode falhar num lote"""
+
+    def __init__(self, fail_on_batch=None):
+        self.fail_on_batch = fail_on_batch
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        if self.fail_on_batch is not None and len(self.batches) == self.fail_on_batch:
+            raise RuntimeError("modelo indisponível")
+        return [np.full(8, zlib.crc32(text.encode()) % 97 + 1, dtype=np.float32) for text in texts]
+
+    @property
+    def texts(self):
+        return [text for batch in self.batches for text in batch]
+
+def json_chunks(count, source_file='faq.json'):
+    return [PipelineChunk(text=f"Pergunta frequente número {i} sobre a dispensação da PQT-U.",
+                          chunk_type='faq', priority=0.6, source_file=source_file,
+                          metadata={'section': f'faq[{i}]', 'source_type': 'json'})
+            for i in range(count)]
+
+class TestIndexingPipeline:
+    """Test content-hash skipping, manifest resume and the per-stage report"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store_path = os.path.join(self.temp_dir, 'vectors')
+        self.manifest_path = os.path.join(self.temp_dir, 'manifest.json')
+        self.store = LocalVectorStore(self.store_path)
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_pipeline(self, embedder, **kwargs):
+        options = {'batch_size': 4, 'chunk_workers': 2, 'embed_workers': 2, 'queue_size': 2}
+        options.update(kwargs)
+        return IndexingPipeline(self.store, embedder, VectorDocument, manifest_path=self.manifest_path, **options)
+
+    def test_unchanged_chunks_are_skipped(self):
+        """Test a second run embeds nothing and an edit re-embeds only the changed chunk"""
+        embedder = CountingEmbedder()
+        report = self.make_pipeline(embedder).run(documents=[('hanseniase.md', DOCUMENT)], chunks=json_chunks(10))
+        assert report['indexed'] == report['chunks'] == 13 and report['failed'] == 0
+        assert len(self.store.documents) == 13 and len(embedder.texts) == 13
+        dosage = next(doc for doc in self.store.documents.values() if 'rifampicina' in doc.text)
+        assert dosage.chunk_type == 'dosage' and dosage.source_file == 'hanseniase.md'
+        assert dosage.metadata['content_hash'] == dosage.id
+
+        # reabrir do disco: o LocalVectorStore e o manifesto persistiram
+        self.store = LocalVectorStore(self.store_path)
+        embedder = CountingEmbedder()
+        report = self.make_pipeline(embedder).run(documents=[('hanseniase.md', DOCUMENT)], chunks=json_chunks(10))
+        assert report['skipped'] == 13 and report['indexed'] == 0 and embedder.batches == []
+
+        edited = DOCUMENT.replace('300 mg', '300 mg mensal')
+        report = self.make_pipeline(embedder).run(documents=[('hanseniase.md', edited)], chunks=json_chunks(10),
+                                                  prune=True)
+        assert report['indexed'] == 1 and report['skipped'] == 12 and report['pruned'] == 1
+        assert embedder.texts == [next(text for text in embedder.texts if 'mensal' in text)]
+        assert len(self.store.documents) == 13
+        assert not any(doc.text.endswith('clofazimina 300 mg.') for doc in self.store.documents.values())
+
+    def test_interrupted_run_resumes_from_manifest(self):
+        """Test a failed batch is not checkpointed and the next run embeds only what is missing"""
+        chunks = json_chunks(12)
+        embedder = CountingEmbedder(fail_on_batch=2)
+        report = self.make_pipeline(embedder, chunk_workers=1, embed_workers=1).run(chunks=chunks)
+        assert report['indexed'] == 8 and report['failed'] == 4 and report['errors']
+
+        with open(self.manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)['chunks']
+        assert len(manifest) == 8 and set(manifest) == set(self.store.documents)
+
+        embedder = CountingEmbedder()
+        report = self.make_pipeline(embedder).run(chunks=chunks)
+        assert report['skipped'] == 8 and report['indexed'] == 4 and len(embedder.texts) == 4
+        assert set(self.store.documents) == {chunk.id for chunk in chunks}
+
+        # force ignora o manifesto e reindexa tudo
+        embedder = CountingEmbedder()
+        report = self.make_pipeline(embedder, force=True).run(chunks=chunks)
+        assert report['indexed'] == 12 and len(embedder.texts) == 12
+
+    def test_upsert_errors_do_not_stall_the_pipeline(self):
+        """Test a raising store or on_indexed callback is reported and run() still returns"""
+        chunks = json_chunks(12)
+
+        def broken_add_documents(documents):
+            raise RuntimeError("store offline")
+
+        with patch.object(self.store, 'add_documents', broken_add_documents):
+            report = self.make_pipeline(CountingEmbedder(), batch_size=1, queue_size=1).run(chunks=chunks)
+        assert report['indexed'] == 0 and report['failed'] == 12
+        assert len(report['errors']) == 12 and all(error.startswith('upsert:') for error in report['errors'])
+        assert not os.path.exists(self.manifest_path)
+
+        def broken_on_indexed(stored):
+            raise ValueError("lexical index unavailable")
+
+        report = self.make_pipeline(CountingEmbedder(), on_indexed=broken_on_indexed).run(chunks=chunks)
+        assert report['indexed'] == 12 and report['failed'] == 0 and len(report['errors']) == 3
+        assert set(self.store.documents) == {chunk.id for chunk in chunks}
+
+    def test_drop_legacy_ids_removes_old_scheme_duplicates(self):
+        """Test rows stored under the 100-character id are deleted and current ids are kept"""
+        short = PipelineChunk(text="Dose supervisionada mensal.", chunk_type='faq', priority=0.6,
+                              source_file='faq.json')
+        chunks = [PipelineChunk(text=f"A rifampicina {i} é tomada uma vez ao mês na unidade de saúde, em dose "
+                                     f"supervisionada, junto com a clofazimina e a dapsona da PQT-U.",
+                                chunk_type='dosage', priority=1.0, source_file='faq.json')
+                  for i in range(3)] + [short]
+        assert legacy_chunk_id(short.text, short.source_file) == short.id
+        for chunk in chunks:
+            self.store.add_document(VectorDocument(id=legacy_chunk_id(chunk.text, chunk.source_file), text=chunk.text,
+                                                   embedding=np.ones(8, dtype=np.float32), metadata={},
+                                                   chunk_type='dosage', priority=1.0))
+
+        removed = []
+        pipeline = self.make_pipeline(CountingEmbedder(), on_deleted=removed.extend)
+        pipeline.run(chunks=chunks)
+        assert len(self.store.documents) == 7
+        assert pipeline.drop_legacy_ids(chunks) == 3
+        assert set(self.store.documents) == {chunk.id for chunk in chunks} and short.id not in removed
+        assert pipeline.drop_legacy_ids(chunks) == 0
+
+    def test_parallel_stages_report_throughput(self):
+        """Test parallel workers index the same set as one worker and report chunks/sec per stage"""
+        documents = [(f'doc_{i}.md', DOCUMENT.replace('Hanseníase', f'Hanseníase parte {i}')
+                      .replace('unidade', f'unidade {i}')) for i in range(6)]
+        report = self.make_pipeline(CountingEmbedder(), chunk_workers=3, embed_workers=3, queue_size=1).run(
+            documents=documents, chunks=json_chunks(20))
+        parallel_ids = set(self.store.documents)
+        assert report['indexed'] == len(parallel_ids) == 38
+
+        for name in ('chunk', 'embed', 'upsert'):
+            assert report['stages'][name]['chunks'] == 38
+            assert report['stages'][name]['chunks_per_second'] > 0
+        assert report['stages']['embed']['workers'] == 3
+
+        sequential_store = LocalVectorStore(os.path.join(self.temp_dir, 'sequential'))
+        IndexingPipeline(sequential_store, CountingEmbedder(), VectorDocument, manifest_path='',
+                         batch_size=4, chunk_workers=1, embed_workers=1).run(documents=documents,
+                                                                              chunks=json_chunks(20))
+        assert set(sequential_store.documents) == parallel_ids
+
+        dry = IndexingPipeline(sequential_store, CountingEmbedder(), VectorDocument, manifest_path='',
+                               dry_run=True).run(chunks=json_chunks(3, 'novo.json'))
+        assert dry['chunks'] == 3 and dry['indexed'] == 0
+        assert len(sequential_store.documents) == 38
+
+    def test_engine_batch_indexing_uses_bulk_upsert(self):
+        """Test index_medical_chunks_batch writes each batch with one add_documents call"""
+        service = SimpleNamespace(is_available=lambda: True, get_statistics=lambda: {},
+                                  embed_batch=lambda texts: CountingEmbedder()(texts))
+        config = SimpleNamespace(EMBEDDINGS_ENABLED=True, SEMANTIC_SIMILARITY_THRESHOLD=0.1,
+                                 LEXICAL_INDEX_DIR=os.path.join(self.temp_dir, 'lexical'))
+        with patch.object(semantic_search, '_lazy_import_embedding_service',
+                          return_value=(lambda: service, None, None)), \
+             patch.object(semantic_search, '_lazy_import_vector_store',
+                          return_value=(lambda: self.store, VectorDocument, None)):
+            engine = SemanticSearchEngine(config)
+
+        chunks = [MedicalChunk(content=f"Orientação {i} sobre a tomada diária da dapsona 100 mg.", category='dosing',
+                               priority=1.0, source_section='faq', word_count=9, contains_dosage=True,
+                               contains_contraindication=False) for i in range(5)]
+        with patch.object(self.store, 'add_document', side_effect=AssertionError("escrita por documento")), \
+             patch.object(self.store, 'add_documents', wraps=self.store.add_documents) as bulk:
+            assert engine.index_medical_chunks_batch(chunks, 'faq.json', batch_size=2) == (5, 0)
+        assert bulk.call_count == 3
+        assert len(self.store.documents) == 5 and len(engine.lexical_index) == 5
+
+    def test_engine_and_pipeline_share_chunk_ids(self):
+        """Test pipeline-indexed chunks feed the engine's lexical index under the vector store ids"""
+        config = SimpleNamespace(EMBEDDINGS_ENABLED=True, SEMANTIC_SIMILARITY_THRESHOLD=0.1,
+                                 LEXICAL_INDEX_DIR=os.path.join(self.temp_dir, 'lexical'))
+        prefix = "Esquema PQT-U para adultos multibacilares, com dose mensal supervisionada e doses diárias em casa: "
+        chunks = [PipelineChunk(text=prefix + tail, chunk_type='dosage', priority=1.0, source_file='pqtu.json',
+                                metadata={'section': 'adulto'})
+                  for tail in ("rifampicina 600 mg.", "clofazimina 50 mg.")]
+
+        lexical_index = DocumentLexicalIndex()
+
+        def on_indexed(stored):
+            for chunk in stored:
+                lexical_index.add(chunk.id, chunk.text, semantic_search.pipeline_lexical_metadata(chunk))
+
+        self.make_pipeline(CountingEmbedder(), on_indexed=on_indexed).run(chunks=chunks)
+        lexical_index.save(semantic_search.get_lexical_index_path(config))
+
+        with patch.object(semantic_search, '_lazy_import_embedding_service', return_value=(None, None, None)), \
+             patch.object(semantic_search, '_lazy_import_vector_store', return_value=(None, None, None)):
+            engine = SemanticSearchEngine(config)
+
+        # prefixo comum de 100+ caracteres não colide mais
+        ids = [engine._generate_chunk_id(chunk.text, 'pqtu.json') for chunk in chunks]
+        assert ids == [chunk.id for chunk in chunks] and len(set(ids)) == 2
+        assert set(engine.lexical_index.texts) == set(self.store.documents) == set(ids)
+        results = engine.search("clofazimina", top_k=1)
+        assert results[0].chunk.source_section == 'adulto' and 'clofazimina' in results[0].chunk.content
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the shared multi-pattern keyword matcher and the classifiers using it
+"""
+
+import pytest
+import os
+import random
+from types import SimpleNamespace
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.validation.keyword_matcher import KeywordMatcher, fold_text, get_keyword_matcher
+from core.validation.scope_detector import ScopeDetectionSystem
+from services.rag.supabase_rag_system import QUERY_TYPE_KEYWORDS, SupabaseRAGSystem
+
+VOCABULARY = {
+    'medicamentos': ['rifampicina', 'clofazimina', 'dapsona', 'pqt', 'pqt-u'],
+    'efeitos': ['efeito', 'efeito colateral', 'reação', 'urina laranja'],
+    'curtos': ['ou', 'dose', 'dosagem', 'mg']
+}
+
+class TestKeywordMatcher:
+    """Test matching semantics against the `keyword in text` loops it replaces"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.matcher = KeywordMatcher(VOCABULARY)
+
+    def test_overlapping_and_prefix_keywords_are_all_reported(self):
+        """Test a keyword that is a prefix of another one matches at the same position"""
+        found = self.matcher.categories("PQT-U: efeito colateral da dosagem")
+
+        assert found['medicamentos'] == {'pqt', 'pqt-u'}
+        assert found['efeitos'] == {'efeito', 'efeito colateral'}
+        assert found['curtos'] == {'dosagem'}
+
+    def test_accents_and_case_are_folded(self):
+        """Test accented keywords match unaccented text and vice versa"""
+        assert self.matcher.categories("REACAO à Rifampicina")['efeitos'] == {'reacao'}
+        assert self.matcher.categories("reação")['efeitos'] == {'reacao'}
+        assert fold_text("Ação DAPSONA Ç") == "acao dapsona c"
+
+    def test_matches_naive_substring_loops(self):
+        """Test random texts give the same per-category keywords as the substring loops"""
+        rng = random.Random(3)
+        words = ['rifampicina', 'pqt', '-u', 'efeito', ' colateral', 'ou', 'dose', 'agem', 'x', ' ', 'mg',
+                 'urina', ' laranja', 'reação', 'clofazimina']
+        for _ in range(300):
+            text = ''.join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+            expected = {}
+            for category, keywords in VOCABULARY.items():
+                present = {fold_text(k) for k in keywords if fold_text(k) in fold_text(text)}
+                if present:
+                    expected[category] = present
+            assert self.matcher.categories(text) == expected, text
+
+    def test_scores_sum_weights_of_distinct_keywords(self):
+        """Test repeated keywords are weighted once per category"""
+        matcher = KeywordMatcher({'a': [('dose', 0.5), ('mg', 0.25)], 'b': ['dose']})
+        assert matcher.scores("dose dose mg") == {'a': 0.75, 'b': 1.0}
+
+        hits = matcher.scan("dose mg")
+        assert [(hit.keyword, hit.category, hit.start, hit.end) for hit in hits] == [
+            ('dose', 'a', 0, 4), ('dose', 'b', 0, 4), ('mg', 'a', 5, 7)]
+
+    def test_whole_word_categories(self):
+        """Test whole_word categories ignore matches inside longer words"""
+        matcher = KeywordMatcher({'w': ['tenho', 'lei'], 's': ['lei']}, whole_word=['w'])
+        assert matcher.categories("eu tenho uma lei") == {'w': {'tenho', 'lei'}, 's': {'lei'}}
+        assert matcher.categories("mantenho leite") == {'s': {'lei'}}
+
+    def test_registry_compiles_each_vocabulary_once(self):
+        """Test the same name returns the same automaton"""
+        first = get_keyword_matcher('test_registry', {'a': ['dose']})
+        assert get_keyword_matcher('test_registry', {'a': ['outra']}) is first
+        assert get_keyword_matcher('test_registry') is first
+        with pytest.raises(KeyError):
+            get_keyword_matcher('test_registry_missing')
+
+class TestClassifiersOnMatcher:
+    """Test the scope and query-type classifiers keep their decisions"""
+
+    def test_scope_detector_decisions(self):
+        """Test the detector's own sample questions"""
+        detector = ScopeDetectionSystem()
+        in_scope = detector.detect_scope("Qual a dose de rifampicina para adultos?")
+        assert in_scope['is_in_scope'] and in_scope['category'] == 'medication_inquiry'
+
+        diagnosis = detector.detect_scope("Como saber se tenho hanseníase?")
+        assert not diagnosis['is_in_scope'] and diagnosis['category'] == 'diagnosis_request'
+        assert diagnosis['detailed_analysis']['pattern_analysis']['asks_for_diagnosis']
+
+        legal = detector.detect_scope("Posso pedir auxílio ou aposentadoria pela hanseníase?")
+        assert legal['category'] == 'administrative_legal'
+
+        comparison = detector.detect_scope("Qual é melhor, dapsona ou clofazimina?")
+        assert comparison['detailed_analysis']['pattern_analysis']['asks_comparison']
+
+    def test_rag_scope_and_query_type(self):
+        """Test is_query_in_scope and _classify_query_type through the shared automata"""
+        keywords = SupabaseRAGSystem._load_scope_keywords(None)
+        rag = SimpleNamespace(
+            scope_keywords=keywords,
+            query_matcher=get_keyword_matcher('rag_query', {
+                **{category: [(keyword, 1.0 / len(terms)) for keyword in terms]
+                   for category, terms in keywords.items()},
+                **QUERY_TYPE_KEYWORDS
+            }),
+            stats={'scope_violations': 0}
+        )
+
+        in_scope, category, confidence = SupabaseRAGSystem.is_query_in_scope(
+            rag, "Hanseniase: dose de rifampicina e clofazimina na PQT")
+        assert in_scope and category == 'hanseniase'
+        assert confidence == pytest.approx(5 / 11)
+
+        assert SupabaseRAGSystem.is_query_in_scope(rag, "Qual a capital da França?") == (False, 'unknown', 0.0)
+        assert SupabaseRAGSystem._classify_query_type(rag, "Interacao da rifampicina com anticoncepcional e droga",
+                                                      'geral') == 'interaction_queries'
+        assert SupabaseRAGSystem._classify_query_type(rag, "Qual a capital?", 'segurança') == 'safety_queries'
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the indexed query layer of the structured knowledge base
+"""
+
+import pytest
+import os
+import json
+import shutil
+import tempfile
+from unittest.mock import patch
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag import knowledge_index
+from services.rag.knowledge_index import KnowledgeIndex, load_or_build, tokenize
+from services.rag.knowledge_loader import StructuredKnowledgeBase
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'data', 'structured')
+
+def brute_force_faq(knowledge_base, question):
+    """Varredura linear: +2 por token da pergunta presente na FAQ, +1 se presente nas palavras-chave"""
+    scores = []
+    for category, entries in knowledge_base['faq']['faq_hanseniase_pqtu'].items():
+        if category == 'metadata':
+            continue
+        for item in entries.values():
+            if not isinstance(item, dict) or 'question' not in item:
+                continue
+            question_tokens = set(tokenize(item['question']))
+            keyword_tokens = {token for keyword in item.get('keywords', []) for token in tokenize(keyword)}
+            score = 0
+            for token in tokenize(question):
+                if token in knowledge_index._STOPWORDS:
+                    continue
+                score += (2 if token in question_tokens else 0) + (1 if token in keyword_tokens else 0)
+            if score:
+                scores.append((item['question'], score))
+    # sort estável: empate mantém a ordem do arquivo
+    return sorted(scores, key=lambda item: -item[1])
+
+@pytest.mark.skipif(not os.path.isdir(DATA_DIR), reason="structured data not available")
+class TestKnowledgeIndex:
+    """Test hash lookups, FAQ scoring and the compiled cache"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.temp_dir, 'structured')
+        shutil.copytree(DATA_DIR, self.data_dir)
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        with patch.object(knowledge_index, '_cache_dir', return_value=self.cache_dir):
+            self.kb = StructuredKnowledgeBase(self.data_dir)
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_medication_and_dosing_lookups(self):
+        """Test names, synonyms and age-group aliases resolve to typed entries"""
+        assert len(self.kb.knowledge_base) == 9 and all(self.kb.knowledge_base.values())
+        assert self.kb.find_medication('Rifampicina').name == 'rifampicina'
+        assert self.kb.find_medication('clofazimine').name == 'clofazimina'
+        assert self.kb.find_medication('DAP').name == 'dapsona'
+        assert self.kb.find_medication('rifamp').name == 'rifampicina'
+        assert self.kb.find_medication('talidomida') is None
+        assert self.kb.get_medication_info('dapsona')['drug_class'] == 'Sulfona antimicrobiana'
+
+        assert self.kb.find_dosing_protocol('criança').key == 'pediatric_under_30kg'
+        assert self.kb.find_dosing_protocol('30-50kg').population.startswith('Crianças ou adultos')
+        assert self.kb.get_dosing_protocol()['population'] == 'Adultos > 50kg'
+        assert self.kb.get_dosing_protocol('idoso') == {}
+
+        assert 'common' in self.kb.get_adverse_effects('rifampin')
+        assert self.kb.get_dispensing_workflow_step('etapa_02')['title']
+        assert [entry.name for entry in self.kb.index.medications_in("rifampin junto com dapsona?")] == \
+            ['rifampicina', 'dapsona']
+
+    def test_faq_search_matches_linear_scan(self):
+        """Test postings-based FAQ ranking equals scoring every entry"""
+        for question in ["Posso tomar com anticoncepcional?", "Qual a dose para criança?",
+                         "urina laranja é normal", "esqueci a dose supervisionada mensal", "xyz"]:
+            expected = brute_force_faq(self.kb.knowledge_base, question)
+            matches = self.kb.query_faq(question)
+            assert [(m.entry.question, m.score) for m in matches] == expected, question
+            assert self.kb.search_faq(question) == [m.to_dict() for m in matches]
+
+        top = self.kb.query_faq("PQT-U corta o efeito do anticoncepcional?", limit=1)[0]
+        assert top.entry.category == 'seguranca' and top.entry.answer == top.entry.gasnelio_answer
+        assert self.kb.index.faq_by_keyword('Anticoncepcional')[0] == top.entry
+        context = self.kb.enhance_context_with_structured_data("Qual a dose de clofazimina?", "")
+        assert 'CLOFAZIMINA' in context and 'PROTOCOLOS DE DOSAGEM' in context
+
+    def test_compiled_cache_reused_until_content_changes(self):
+        """Test workers load the cached index; touch keeps it, an edit rebuilds it"""
+        sources = {key: os.path.join(self.data_dir, filename) for filename, key in (
+            ('frequently_asked_questions.json', 'faq'), ('medications_mechanisms.json', 'medications'),
+            ('dosing_protocols.json', 'dosing_protocols'), ('ausente.json', 'missing'))}
+        built_kb, built, loaded = load_or_build(sources, self.cache_dir)
+        assert loaded == 3 and built_kb['missing'] == {}
+
+        with patch.object(KnowledgeIndex, 'build', side_effect=AssertionError("não deveria reconstruir")):
+            _, cached, _ = load_or_build(sources, self.cache_dir)
+            assert cached.to_dict() == built.to_dict()
+            assert cached.search_faq("dose criança") == built.search_faq("dose criança")
+
+            faq_path = sources['faq']
+            stat = os.stat(faq_path)
+            os.utime(faq_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            load_or_build(sources, self.cache_dir)
+
+        with open(sources['faq'], encoding='utf-8') as f:
+            data = json.load(f)
+        data['faq_hanseniase_pqtu']['seguranca']['nova'] = {
+            'question': 'Posso usar talidomida?', 'gasnelio_answer': 'Não na gestação.', 'keywords': ['talidomida']}
+        with open(sources['faq'], 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        _, rebuilt, _ = load_or_build(sources, self.cache_dir)
+        assert rebuilt.search_faq("talidomida")[0].entry.key == 'nova'
+
+    def test_missing_directory_leaves_empty_base(self):
+        """Test lookups on an absent data path return empty results instead of raising"""
+        kb = StructuredKnowledgeBase(os.path.join(self.temp_dir, 'nao_existe'))
+        assert kb.knowledge_base == {}
+        assert kb.search_faq("dose") == [] and kb.get_medication_info('rifampicina') == {}
+        assert kb.get_enhanced_response("dose de rifampicina", 'ga') is None
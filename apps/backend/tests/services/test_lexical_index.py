@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the BM25 lexical paragraph index
+"""
+
+import pytest
+import os
+import math
+import random
+import shutil
+import tempfile
+from collections import Counter
+from unittest.mock import patch
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.rag import lexical_index
+from services.rag.lexical_index import LexicalIndex, get_lexical_index, load_or_build, tokenize
+from services.rag.enhanced_rag_system import EnhancedRAGSystem
+
+KNOWLEDGE_BASE = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'data', 'knowledge-base', 'hanseniase.md')
+
+def brute_force_bm25(paragraphs, query, k1=1.2, b=0.75, min_chars=50):
+    """BM25 calculado direto dos tokens, sem índice"""
+    documents = {i: Counter(tokenize(p)) for i, p in enumerate(paragraphs) if len(p.strip()) >= min_chars}
+    documents = {i: tf for i, tf in documents.items() if tf}
+    average = sum(sum(tf.values()) for tf in documents.values()) / len(documents)
+    scores = {}
+    for term in set(tokenize(query)):
+        containing = [i for i, tf in documents.items() if term in tf]
+        if not containing:
+            continue
+        idf = math.log(1 + (len(documents) - len(containing) + 0.5) / (len(containing) + 0.5))
+        for i in containing:
+            tf = documents[i][term]
+            length = sum(documents[i].values())
+            scores[i] = scores.get(i, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average))
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+class TestLexicalIndex:
+    """Test scoring, pruning and persistence"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        rng = random.Random(21)
+        vocabulary = ['hanseníase', 'rifampicina', 'clofazimina', 'dapsona', 'dose', 'mensal', 'supervisionada',
+                      'paciente', 'reação', 'hansênica', 'lesões', 'pele', 'tratamento', 'PQT-U', 'criança', 'adulto',
+                      'de', 'da', 'em', 'para', 'com', 'o', 'a', 'efeitos', 'adversos', 'neurite', 'baciloscopia']
+        self.paragraphs = [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(8, 60)))
+                           for _ in range(400)] + ['curto']
+        self.text = '\n\n'.join(self.paragraphs)
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_search_matches_brute_force_bm25(self):
+        """Test pruned top-k equals exhaustive BM25 (accent-folded, case-insensitive)"""
+        index = LexicalIndex.from_text(self.text)
+        for query in ["Dose de RIFAMPICINA para criança", "reacao hansenica com neurite", "o a de",
+                      "efeitos adversos da clofazimina na pele do paciente adulto", "termo inexistente"]:
+            expected = brute_force_bm25(self.paragraphs, query)
+            for k in (1, 5, 20):
+                result = index.search(query, k=k)
+                assert [i for i, _ in result] == [i for i, _ in expected[:k]], (query, k)
+                assert [s for _, s in result] == pytest.approx([s for _, s in expected[:k]])
+        assert index.search("", k=5) == []
+        assert len(self.paragraphs) - 1 not in index.postings.get('curto', {})
+
+    def test_index_persists_and_rebuilds_on_change(self):
+        """Test the saved index is reused for the same text and rebuilt when it changes"""
+        path = os.path.join(self.temp_dir, 'kb.json')
+        built = load_or_build(self.text, path)
+        with patch.object(LexicalIndex, 'build', side_effect=AssertionError("não deveria reconstruir")):
+            loaded = load_or_build(self.text, path)
+        assert loaded.postings == built.postings
+        assert loaded.search("dapsona mensal", k=3) == built.search("dapsona mensal", k=3)
+
+        changed = self.text + "\n\nparágrafo novo sobre talidomida, exclusivo desta versão do texto"
+        rebuilt = load_or_build(changed, path)
+        assert rebuilt.source_hash != built.source_hash
+        assert rebuilt.search("talidomida", k=1)[0][0] == len(self.paragraphs)
+
+    def test_shared_index_per_text(self):
+        """Test get_lexical_index tokenizes each text once per process"""
+        with patch.object(lexical_index, '_indexes', lexical_index.OrderedDict()):
+            first = get_lexical_index(self.text, index_dir=self.temp_dir)
+            assert get_lexical_index(self.text, index_dir=self.temp_dir) is first
+            assert get_lexical_index(''.join(self.text), index_dir='') is first
+            assert len(os.listdir(self.temp_dir)) == 1
+
+class TestEnhancedContext:
+    """Test EnhancedRAGSystem.get_enhanced_context on the knowledge base"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.rag = EnhancedRAGSystem()
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @pytest.mark.skipif(not os.path.exists(KNOWLEDGE_BASE), reason="knowledge base not available")
+    def test_context_ranks_relevant_paragraphs(self):
+        """Test the top paragraph shares the question terms, with or without accents"""
+        with open(KNOWLEDGE_BASE, encoding='utf-8') as f:
+            full_text = f.read()
+        with patch.object(lexical_index, '_index_dir', return_value=self.temp_dir):
+            context = self.rag.get_enhanced_context("Qual a dose de clofazimina?", full_text)
+            assert 'clofazimina' in context.split('\n\n')[0].lower()
+            assert len(context) <= 3000
+            assert self.rag.get_enhanced_context("hanseniase", full_text) == \
+                self.rag.get_enhanced_context("hanseníase", full_text)
+
+    def test_context_falls_back_to_text_prefix(self):
+        """Test questions without indexed terms return the beginning of the text"""
+        full_text = "Primeiro parágrafo longo o bastante para ser indexado pelo sistema.\n\nSegundo."
+        with patch.object(lexical_index, '_index_dir', return_value=''):
+            assert self.rag.get_enhanced_context("zzz", full_text, max_length=20) == full_text[:20]
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for buffered analytics ingestion and the hourly/daily rollups
+"""
+
+import pytest
+import os
+import shutil
+import tempfile
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from app_config import config
+from services.analytics.medical_analytics_service import MedicalAnalyticsService
+from services.analytics.analytics_rollups import EVENT_COLUMNS
+
+def raw_event(index, timestamp, persona='dr_gasnelio', question=None, response_time=1.5, fallback=False,
+              urgency='standard', session_id='ses_1'):
+    return (f"evt_{index}", session_id, None, True, timestamp, 'chat', persona, question, response_time,
+            fallback, False, urgency, 'desktop', None)
+
+class TestMedicalAnalyticsRollups:
+    """Test the ring buffer flusher, rollup queries and backfill"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        self.temp_dir = tempfile.mkdtemp()
+        monkeypatch.setattr(config, 'ANALYTICS_FLUSH_INTERVAL_MS', 20, raising=False)
+        self.services = []
+
+        yield
+
+        for service in self.services:
+            service.close()
+            service._pool.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_service(self, name="analytics.db"):
+        service = MedicalAnalyticsService(db_path=os.path.join(self.temp_dir, name))
+        self.services.append(service)
+        return service
+
+    def insert_raw(self, service, rows):
+        placeholders = ", ".join("?" * len(EVENT_COLUMNS))
+        service._pool.executemany(
+            f"INSERT INTO medical_events ({', '.join(EVENT_COLUMNS)}) VALUES ({placeholders})", rows)
+
+    def test_events_are_written_in_batches_with_rollups(self):
+        """Test buffered events reach medical_events, the session counter and the rollups"""
+        service = self.make_service()
+        session_id = service.start_session({'session_id': 'ses_a', 'user_id': 'u1', 'is_anonymous': False})
+        for index in range(50):
+            assert service.track_event({'session_id': session_id, 'event_type': 'chat',
+                                        'persona_id': 'ga' if index % 2 else 'dr_gasnelio',
+                                        'question': 'dose pqt-u' if index % 5 == 0 else None,
+                                        'response_time': 0.4, 'fallback_used': index % 10 == 0,
+                                        'urgency_level': 'critical' if index < 5 else 'standard'})
+        assert service.flush()
+
+        with service._pool.connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM medical_events").fetchone()[0] == 50
+            assert conn.execute("SELECT total_messages FROM sessions WHERE session_id = 'ses_a'").fetchone()[0] == 50
+
+        stats = service.get_ingest_stats()
+        assert stats['flushed'] == 50
+        assert stats['batches'] < 50
+        assert stats['buffer_depth'] == 0
+
+        metrics = service.get_aggregated_metrics("2000-01-01", "2100-01-01")
+        assert metrics['events'] == 50
+        assert metrics['sessions'] == 1
+        assert metrics['unique_users'] == 1
+        assert metrics['persona_usage'] == {'ga': 25, 'dr_gasnelio': 25}
+        assert metrics['urgency_usage'] == {'critical': 5, 'standard': 45}
+        assert metrics['fallback_rate'] == pytest.approx(0.1)
+        assert metrics['resolution_rate'] == pytest.approx(20.0)
+        assert metrics['top_questions'] == ['dose pqt-u']
+        assert 0.25 <= metrics['response_time_percentiles']['p50'] <= 0.4
+
+    def test_rollups_match_raw_event_queries(self):
+        """Test whole-day and partial-day ranges agree with GROUP BY over medical_events"""
+        service = self.make_service()
+        rows = []
+        for index in range(300):
+            day = 10 + index % 3
+            hour = index % 24
+            rows.append(raw_event(index, f"2026-03-{day:02d}T{hour:02d}:15:00+00:00",
+                                  persona=('ga', 'dr_gasnelio', None)[index % 3],
+                                  question=f"pergunta {index % 7}" if index % 2 else None,
+                                  response_time=(0.1, 0.7, 4.0, 90.0)[index % 4],
+                                  fallback=index % 6 == 0))
+        self.insert_raw(service, rows)
+        service.backfill_rollups(batch_size=64)
+
+        for start, end in (("2026-03-10", "2026-03-12"),
+                           ("2026-03-10T05:00:00", "2026-03-12T08:59:59"),
+                           ("2026-03-11T00:00:00+00:00", "2026-03-11T23:59:59+00:00")):
+            metrics = service.get_aggregated_metrics(start, end)
+            end_hour = end[:13] if len(end) > 10 else f"{end}T23"
+            start_hour = start[:13] if len(start) > 10 else f"{start}T00"
+            with service._pool.connection() as conn:
+                expected_events, expected_fallbacks = conn.execute('''
+                    SELECT COUNT(*), SUM(fallback_used) FROM medical_events
+                    WHERE substr(timestamp, 1, 13) BETWEEN ? AND ?
+                ''', (start_hour, end_hour)).fetchone()
+                expected_personas = dict(conn.execute('''
+                    SELECT persona_id, COUNT(*) FROM medical_events
+                    WHERE persona_id IS NOT NULL AND substr(timestamp, 1, 13) BETWEEN ? AND ?
+                    GROUP BY persona_id
+                ''', (start_hour, end_hour)).fetchall())
+
+            assert metrics['events'] == expected_events
+            assert metrics['fallback_rate'] == pytest.approx(expected_fallbacks / expected_events)
+            assert metrics['persona_usage'] == expected_personas
+
+        metrics = service.get_aggregated_metrics("2026-03-10", "2026-03-12")
+        assert metrics['response_time_percentiles']['p99'] == pytest.approx(90.0, rel=0.35)
+        assert len(metrics['peak_hours']) == 5
+
+    def test_backfill_is_idempotent(self):
+        """Test running the backfill twice does not double the rollups"""
+        service = self.make_service()
+        self.insert_raw(service, [raw_event(i, f"2026-04-01T10:0{i % 10}:00+00:00") for i in range(40)])
+        service.backfill_rollups()
+        first = service.get_aggregated_metrics("2026-04-01", "2026-04-01")
+        service.backfill_rollups()
+        second = service.get_aggregated_metrics("2026-04-01", "2026-04-01")
+
+        assert first['events'] == second['events'] == 40
+        assert second['peak_hours'] == [10]
+
+    def test_end_session_flushes_and_counts_bounces(self):
+        """Test end_session sees buffered events and feeds the session rollup"""
+        service = self.make_service()
+        bounced = service.start_session({'session_id': 'ses_b'})
+        engaged = service.start_session({'session_id': 'ses_e'})
+        service.track_event({'session_id': bounced, 'event_type': 'chat'})
+        for _ in range(3):
+            service.track_event({'session_id': engaged, 'event_type': 'chat'})
+
+        assert service.end_session(bounced)
+        assert service.end_session(engaged)
+        assert service.end_session(engaged)  # encerrar de novo não conta outra vez
+
+        metrics = service.get_aggregated_metrics("2000-01-01", "2100-01-01")
+        assert metrics['sessions'] == 2
+        assert metrics['anonymous_sessions'] == 2
+        assert metrics['bounce_rate'] == pytest.approx(0.5)
+        assert metrics['avg_messages'] == pytest.approx(2.0)
+
+    def test_ring_buffer_drops_oldest_when_full(self, monkeypatch):
+        """Test track_event never blocks and counts dropped events once the buffer is full"""
+        monkeypatch.setattr(config, 'ANALYTICS_BUFFER_SIZE', 5, raising=False)
+        monkeypatch.setattr(config, 'ANALYTICS_FLUSH_BATCH_SIZE', 100, raising=False)
+        monkeypatch.setattr(config, 'ANALYTICS_FLUSH_INTERVAL_MS', 60000, raising=False)
+        service = self.make_service()
+
+        for index in range(8):
+            assert service.track_event({'session_id': 's', 'event_type': 'chat', 'question': f"q{index}"})
+        stats = service.get_ingest_stats()
+        assert stats['dropped'] == 3
+        assert stats['buffer_depth'] == 5
+
+        assert service.flush()
+        with service._pool.connection() as conn:
+            questions = [row[0] for row in conn.execute("SELECT question FROM medical_events ORDER BY question")]
+        assert questions == ['q3', 'q4', 'q5', 'q6', 'q7']
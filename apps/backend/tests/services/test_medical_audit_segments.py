@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the segmented, indexed encrypted audit store
+"""
+
+import pytest
+import os
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.append(os.path.dirname(__file__))
+
+from cryptography.fernet import Fernet
+
+from security_modules import load_security_module
+
+# Sem o __init__ de core.security (monitoring.py exige sklearn)
+SegmentedAuditStore = load_security_module('audit_segments').SegmentedAuditStore
+medical_audit_logger = load_security_module('medical_audit_logger')
+ActionType = medical_audit_logger.ActionType
+EncryptedLogStorage = medical_audit_logger.EncryptedLogStorage
+LGPDComplianceChecker = medical_audit_logger.LGPDComplianceChecker
+MedicalAuditLogger = medical_audit_logger.MedicalAuditLogger
+MedicalDataClassification = medical_audit_logger.MedicalDataClassification
+
+BASE_TIME = datetime(2026, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+class TestSegmentedAuditStore:
+    """Test sealing, indexed queries and the hash chain"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.key = Fernet.generate_key()
+        self.store = SegmentedAuditStore(self.temp_dir, self.key, segment_records=10)
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def fill(self, store, count):
+        for index in range(count):
+            store.append({'n': index, 'session': f"s{index // 4}"},
+                         {'session': f"s{index // 4}", 'action': 'question_asked' if index % 2 else 'system_error',
+                          'persona': 'ga'},
+                         BASE_TIME + timedelta(minutes=index))
+
+    def test_tail_is_sealed_into_segments(self):
+        """Test every segment_records appends become one encrypted segment plus sidecar"""
+        self.fill(self.store, 25)
+
+        stats = self.store.get_stats()
+        assert stats['segments'] == 2
+        assert stats['sealed_records'] == 20
+        assert stats['tail_records'] == 5
+
+        with open(os.path.join(self.store.segments_dir, '00000001.idx')) as f:
+            index = json.load(f)
+        assert index['count'] == 10
+        raw = open(os.path.join(self.store.segments_dir, '00000001.seg'), 'rb').read()
+        assert b'"s1"' not in raw and 's1' not in json.dumps(index['tags'])
+
+    def test_point_lookup_decrypts_only_matching_segments(self):
+        """Test the HMAC index selects segments and the results match a full scan"""
+        self.fill(self.store, 95)
+        with patch.object(self.store, '_read_segment', wraps=self.store._read_segment) as read_segment:
+            records = self.store.query(session='s5', action='system_error')
+            assert [record['n'] for record in records] == [20, 22]
+            assert [call.args[0] for call in read_segment.call_args_list] == [3]
+
+            read_segment.reset_mock()
+            records = self.store.query(session='s9')
+            assert [record['n'] for record in records] == [36, 37, 38, 39]
+            assert [call.args[0] for call in read_segment.call_args_list] == [4]
+
+        window = self.store.query(start=(BASE_TIME + timedelta(minutes=30)).isoformat(),
+                                  end=(BASE_TIME + timedelta(minutes=34)).isoformat())
+        assert [record['n'] for record in window] == [30, 31, 32, 33, 34]
+        assert self.store.query(session='nao-existe') == []
+
+    def test_other_processes_see_sealed_and_tail_records(self):
+        """Test a second store over the same directory reads segments and the live tail"""
+        self.fill(self.store, 13)
+        reader = SegmentedAuditStore(self.temp_dir, self.key, segment_records=10)
+        assert len(reader.query(persona='ga')) == 13
+
+    def test_orphan_tail_is_adopted_once(self):
+        """Test two workers starting together seal a dead worker's tail into one segment"""
+        self.fill(self.store, 5)
+        self.store.close()
+        orphan = os.path.join(self.temp_dir, 'tail-999999-deadbeef.log')
+        os.rename(self.store._tail_path, orphan)
+
+        read_tail = SegmentedAuditStore._read_tail
+
+        def slow_read_tail(store, path):
+            time.sleep(0.05)
+            return read_tail(store, path)
+
+        stores = []
+        with patch.object(SegmentedAuditStore, '_pid_alive', return_value=False), \
+             patch.object(SegmentedAuditStore, '_read_tail', slow_read_tail):
+            workers = [threading.Thread(target=lambda: stores.append(
+                SegmentedAuditStore(self.temp_dir, self.key, segment_records=10))) for _ in range(2)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        assert len(stores) == 2 and not os.path.exists(orphan)
+        reader = SegmentedAuditStore(self.temp_dir, self.key, segment_records=10)
+        assert sorted(record['n'] for record in reader.query(persona='ga')) == [0, 1, 2, 3, 4]
+        assert reader.verify_chain() == {'valid': True, 'segments': 1, 'broken_at': None, 'reason': None}
+
+    def test_hash_chain_detects_tampering(self):
+        """Test modified segments, edited indexes and removed segments break the chain"""
+        self.fill(self.store, 30)
+        assert self.store.verify_chain() == {'valid': True, 'segments': 3, 'broken_at': None, 'reason': None}
+
+        index_path = os.path.join(self.store.segments_dir, '00000002.idx')
+        index = json.load(open(index_path))
+        index['max_ts'] = '2000-01-01'
+        json.dump(index, open(index_path, 'w'))
+        fresh = SegmentedAuditStore(self.temp_dir, self.key, segment_records=10)
+        result = fresh.verify_chain()
+        assert not result['valid'] and result['broken_at'] == 2 and result['reason'] == 'index_tampered'
+
+        shutil.rmtree(self.temp_dir)
+        store = SegmentedAuditStore(self.temp_dir, self.key, segment_records=10)
+        self.fill(store, 30)
+        segment_path = os.path.join(store.segments_dir, '00000003.seg')
+        data = bytearray(open(segment_path, 'rb').read())
+        data[-5] ^= 1
+        open(segment_path, 'wb').write(bytes(data))
+        assert store.verify_chain()['reason'] == 'segment_tampered'
+
+        os.remove(os.path.join(store.segments_dir, '00000002.idx'))
+        fresh = SegmentedAuditStore(self.temp_dir, self.key, segment_records=10)
+        assert fresh.verify_chain()['reason'] == 'missing_segment'
+
+class TestEncryptedLogStorage:
+    """Test MedicalAuditLogger on the segmented storage"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_logged_interactions_are_queryable(self):
+        """Test session/action queries and read_records by date"""
+        audit = MedicalAuditLogger.__new__(MedicalAuditLogger)
+        audit.encrypted_storage = EncryptedLogStorage(Fernet.generate_key(), base_dir=self.temp_dir)
+        audit.compliance_checker = LGPDComplianceChecker()
+
+        first = audit.log_medical_interaction('ses_a', ActionType.QUESTION_ASKED, persona_id='ga',
+                                              question_text="dose de rifampicina?")
+        audit.log_medical_interaction('ses_b', ActionType.RESPONSE_GENERATED, persona_id='dr_gasnelio',
+                                      response_classification=MedicalDataClassification.SENSITIVE_MEDICAL)
+        audit.log_medical_interaction('ses_a', ActionType.FALLBACK_ACTIVATED)
+
+        storage = audit.encrypted_storage
+        session_records = storage.query_records(session_id='ses_a')
+        assert [record.audit_id for record in session_records][0] == first
+        assert len(session_records) == 2
+        assert len(storage.query_records(action_type=ActionType.RESPONSE_GENERATED)) == 1
+        assert storage.query_records(session_id='ses_a', persona_id='dr_gasnelio') == []
+
+        today = datetime.now(timezone.utc).strftime('%Y%m%d')
+        assert len(storage.read_records(today)) == 3
+        assert storage.verify_integrity()['valid']
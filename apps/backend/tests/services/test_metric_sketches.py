@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the mergeable quantile sketches and decaying counters
+"""
+
+import pytest
+import os
+import importlib.util
+import math
+import random
+import shutil
+import tempfile
+
+import numpy as np
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.append(os.path.dirname(__file__))
+
+from core.metrics.sketches import DDSketch, DecayingCounter, MetricsRegistry, WindowedSketch
+from security_modules import load_security_module
+
+# monitoring.py importa sklearn no topo; o resto de core.security não é necessário
+SKLEARN_AVAILABLE = importlib.util.find_spec('sklearn') is not None
+if SKLEARN_AVAILABLE:
+    monitoring = load_security_module('monitoring')
+    MetricsCollector, MetricType = monitoring.MetricsCollector, monitoring.MetricType
+
+NOW = 1_780_000_000.0
+
+def exact_quantile(values, q):
+    """Mesma definição de rank do sketch: menor valor com mais de q*(n-1) pontos até ele"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.floor(q * (len(ordered) - 1)))]
+
+class TestDDSketch:
+    """Test relative accuracy and exact merging"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.rng = random.Random(20)
+
+    @pytest.mark.parametrize("distribution", ['lognormal', 'pareto', 'uniform', 'mixed_sign'])
+    def test_quantiles_within_relative_accuracy(self, distribution):
+        """Test p50/p95/p99/p999 stay within 1% of the exact percentiles"""
+        generators = {
+            'lognormal': lambda: self.rng.lognormvariate(5, 1.5),
+            'pareto': lambda: self.rng.paretovariate(1.2),
+            'uniform': lambda: self.rng.uniform(0.5, 30000),
+            'mixed_sign': lambda: self.rng.gauss(0, 100)
+        }
+        values = [generators[distribution]() for _ in range(50000)]
+        sketch = DDSketch(0.01)
+        for value in values:
+            sketch.add(value)
+
+        for q in (0.5, 0.95, 0.99, 0.999):
+            expected = exact_quantile(values, q)
+            assert abs(sketch.quantile(q) - expected) <= 0.01 * abs(expected) + 1e-9, q
+        assert sketch.quantiles([0.99, 0.5]) == [sketch.quantile(0.99), sketch.quantile(0.5)]
+        assert sketch.quantile(0) == min(values) and sketch.quantile(1) == max(values)
+        assert sketch.count == len(values) and sketch.sum == pytest.approx(sum(values))
+
+        # np.percentile interpola entre pontos; a diferença fica dentro do mesmo limite
+        # para amostras densas
+        assert sketch.quantile(0.95) == pytest.approx(np.percentile(values, 95), rel=0.011)
+
+    def test_merge_equals_single_sketch(self):
+        """Test merging per-worker sketches gives the same buckets as one sketch"""
+        values = [self.rng.expovariate(1 / 250) for _ in range(20000)] + [0.0] * 10
+        single = DDSketch()
+        workers = [DDSketch() for _ in range(4)]
+        for index, value in enumerate(values):
+            single.add(value)
+            workers[index % 4].add(value)
+        merged = DDSketch()
+        for worker in workers:
+            merged.merge(DDSketch.from_dict(worker.to_dict()))
+
+        assert merged.positive == single.positive and merged.zero_count == 10
+        assert merged.quantiles((0.5, 0.99)) == single.quantiles((0.5, 0.99))
+        assert (merged.min, merged.max) == (single.min, single.max)
+        with pytest.raises(ValueError):
+            merged.merge(DDSketch(0.05))
+
+    def test_empty_and_bounded_bins(self):
+        """Test empty sketches and the bucket cap on extreme ranges"""
+        assert DDSketch().quantile(0.5) is None
+        sketch = DDSketch(0.01, max_bins=64)
+        for exponent in range(-5, 15):
+            for step in range(20):
+                sketch.add(10 ** exponent * (1 + step / 20))
+        assert len(sketch.positive) <= 64
+        assert sketch.quantile(0.99) == pytest.approx(exact_quantile(
+            [10 ** e * (1 + s / 20) for e in range(-5, 15) for s in range(20)], 0.99), rel=0.01)
+
+class TestWindowsAndCounters:
+    """Test time windows, decaying rates and cross-worker merging"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        yield
+
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_windows_select_recent_slots(self):
+        """Test minute/hour/day windows only include points from their span"""
+        windowed = WindowedSketch()
+        for minute in range(180):
+            windowed.add(float(minute), NOW - (179 - minute) * 60)
+
+        assert windowed.window(60, NOW).count <= 2
+        hour = windowed.window(3600, NOW)
+        assert 60 <= hour.count <= 61 and hour.min >= 118
+        assert windowed.window(86400, NOW).count == 180
+        # slots antigos da resolução de 5 s foram descartados
+        assert len(windowed.slots[0]) <= 24
+
+    def test_cascade_matches_points_in_window(self):
+        """Test rolled-up tiers (with late, out-of-order points) equal a brute-force filter"""
+        rng = random.Random(12)
+        windowed = WindowedSketch()
+        points = []
+        for step in range(20000):
+            timestamp = NOW - 90000 + step * 4.5
+            if step % 50 == 0:
+                timestamp -= rng.uniform(0, 900)
+            value = rng.expovariate(1 / 100)
+            windowed.add(value, timestamp)
+            points.append((timestamp, value))
+
+        for seconds in (60, 3600, 86400):
+            start = windowed.window_start(seconds, NOW)
+            expected = [value for timestamp, value in points if start <= timestamp]
+            sketch = windowed.window(seconds, NOW)
+            assert sketch.count == len(expected), seconds
+            assert sketch.sum == pytest.approx(sum(expected))
+            assert sketch.quantile(0.99) == pytest.approx(exact_quantile(expected, 0.99), rel=0.01)
+            # a segunda leitura usa o merge em cache dos slots fechados
+            assert windowed.window(seconds, NOW).count == sketch.count
+
+        restored = WindowedSketch.from_dict(windowed.to_dict())
+        assert restored.window(3600, NOW).count == windowed.window(3600, NOW).count
+        assert restored.rate('hour', NOW) == pytest.approx(windowed.rate('hour', NOW))
+        with pytest.raises(ValueError):
+            windowed.merge(restored)
+
+    def test_decaying_counter_rate(self):
+        """Test the decayed rate converges to the event rate and fades after it stops"""
+        counter = DecayingCounter(60)
+        for second in range(600):
+            counter.add(5, NOW + second)
+        assert counter.rate_per_second(NOW + 599) == pytest.approx(5, rel=0.02)
+        assert counter.get(NOW + 659) == pytest.approx(counter.get(NOW + 599) / 2)
+
+        other = DecayingCounter(60, 10.0, NOW + 539)
+        counter.merge(other)
+        assert counter.updated == NOW + 599
+
+    def test_registry_snapshot_and_shared_directory_merge(self):
+        """Test worker registries published to a directory merge into one view"""
+        rng = random.Random(3)
+        values = [rng.lognormvariate(4, 1) for _ in range(6000)]
+        for worker in range(3):
+            registry = MetricsRegistry()
+            for index, value in enumerate(values[worker::3]):
+                registry.record('response_time', value, NOW - 30 + index * 0.01)
+            registry.publish(self.temp_dir, f"w{worker}")
+        with open(os.path.join(self.temp_dir, 'metrics-broken.json'), 'w') as f:
+            f.write('{')
+
+        merged = MetricsRegistry.load_dir(self.temp_dir).snapshot('response_time', window='minute', now=NOW)
+        assert merged['count'] == 6000
+        assert merged['avg'] == pytest.approx(np.mean(values))
+        assert merged['p99'] == pytest.approx(exact_quantile(values, 0.99), rel=0.01)
+        assert merged['rate_per_second'] > 0
+        assert MetricsRegistry().snapshot('response_time') == {}
+
+@pytest.mark.skipif(not SKLEARN_AVAILABLE, reason="sklearn not installed (core.security.monitoring)")
+class TestMetricsCollector:
+    """Test MetricsCollector aggregates from sketches"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.collector = MetricsCollector()
+
+    def test_aggregated_stats_match_exact_values(self):
+        """Test get_aggregated_stats keeps its keys and stays within sketch accuracy"""
+        rng = random.Random(8)
+        values = [rng.uniform(50, 2000) for _ in range(5000)]
+        for value in values:
+            self.collector.record_metric(MetricType.RESPONSE_TIME, value)
+
+        stats = self.collector.get_aggregated_stats(MetricType.RESPONSE_TIME, window_minutes=5)
+        assert stats['count'] == 5000
+        assert stats['min'] == min(values) and stats['max'] == max(values)
+        assert stats['median'] == pytest.approx(np.median(values), rel=0.011)
+        assert stats['p95'] == pytest.approx(np.percentile(values, 95), rel=0.011)
+        assert self.collector.get_aggregated_stats(MetricType.ERROR_RATE) == {}
+        assert len(self.collector.get_metrics(MetricType.RESPONSE_TIME, limit=10)) == 10
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the memory-mapped vector index format
+Covers the writer/reader round trip, legacy conversion and LocalVectorStore integration
+"""
+
+import pytest
+import numpy as np
+import os
+import json
+import tempfile
+import shutil
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.mmap_vector_index import (
+    INDEX_FILENAME, MappedVectorIndex, VectorIndexFormatError,
+    write_vector_index, convert_legacy_store
+)
+from services.vector_store import LocalVectorStore, VectorDocument
+from services.rag.lightweight_vector_store import LightweightVectorStore
+
+class TestMappedVectorIndex:
+    """Test the on-disk format round trip"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, INDEX_FILENAME)
+
+        yield
+
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, dtype="float32"):
+        rng = np.random.default_rng(7)
+        raw = rng.normal(size=(5, 8)).astype(np.float32)
+        norms = np.linalg.norm(raw, axis=1)
+        vectors = raw / norms[:, None]
+        ids = [f"doc_{i}" for i in range(5)]
+        records = [{"id": doc_id, "text": f"texto {i} – hanseníase"} for i, doc_id in enumerate(ids)]
+        write_vector_index(self.path, ids, vectors, norms, np.array([0, 1, 0, 1, 0]),
+                           ["dosage", "general"], records, dtype=dtype)
+        return ids, vectors, norms
+
+    def test_round_trip(self):
+        """Test vectors, ids and records survive a write/read cycle"""
+        ids, vectors, norms = self._write()
+        index = MappedVectorIndex(self.path)
+
+        assert index.count == 5
+        assert index.dimension == 8
+        assert index.ids == ids
+        assert index.chunk_types == ["dosage", "general"]
+        assert isinstance(index.vectors.base, np.memmap) or isinstance(index.vectors, np.memmap)
+        assert np.allclose(index.vectors, vectors)
+        assert np.allclose(index.norms, norms)
+        assert list(index.chunk_codes) == [0, 1, 0, 1, 0]
+        assert index.record(3)["text"] == "texto 3 – hanseníase"
+
+    def test_float16_vectors(self):
+        """Test optional float16 vector block"""
+        _, vectors, _ = self._write(dtype="float16")
+        index = MappedVectorIndex(self.path)
+
+        assert index.vectors.dtype == np.float16
+        assert np.allclose(index.vectors, vectors, atol=1e-3)
+
+    def test_rejects_foreign_file(self):
+        """Test files without the magic header are refused"""
+        with open(self.path, "wb") as f:
+            f.write(b"not an index at all")
+
+        with pytest.raises(VectorIndexFormatError):
+            MappedVectorIndex(self.path)
+
+    def test_diagnostics_report_mapped_size(self):
+        """Test diagnostics expose mapped and resident sizes"""
+        self._write()
+        diagnostics = MappedVectorIndex(self.path).get_diagnostics()
+
+        assert diagnostics["mapped_bytes"] == os.path.getsize(self.path)
+        assert diagnostics["vectors"] == 5
+        assert "resident_bytes" in diagnostics
+
+class TestLocalVectorStoreMappedIndex:
+    """Test LocalVectorStore persistence through the mapped index"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        yield
+
+        shutil.rmtree(self.temp_dir)
+
+    def _document(self, i, embedding):
+        return VectorDocument(
+            id=f"chunk_{i}",
+            text=f"Chunk {i}",
+            embedding=embedding,
+            metadata={"order": i},
+            chunk_type="dosage" if i % 2 else "general",
+            priority=0.5
+        )
+
+    def test_reload_uses_mapped_index(self):
+        """Test a saved store reloads lazily from the mapped file"""
+        store = LocalVectorStore(self.temp_dir)
+        for i in range(12):
+            store.add_document(self._document(i, np.eye(12)[i] * (i + 1)))
+        store._save_store()
+
+        reloaded = LocalVectorStore(self.temp_dir)
+        assert reloaded.get_index_diagnostics()["mapped"] is True
+        assert len(reloaded.documents) == 12
+
+        results = reloaded.search_similar(np.eye(12)[5], top_k=1, chunk_types=["dosage"])
+        assert results[0][0].id == "chunk_5"
+        assert results[0][0].metadata == {"order": 5}
+        assert np.allclose(reloaded.get_document("chunk_7").embedding, np.eye(12)[7] * 8)
+
+    def test_mapped_store_accepts_updates(self):
+        """Test adds and deletes after a mapped load persist correctly"""
+        store = LocalVectorStore(self.temp_dir)
+        for i in range(4):
+            store.add_document(self._document(i, np.eye(6)[i]))
+        store._save_store()
+
+        mapped = LocalVectorStore(self.temp_dir)
+        mapped.add_document(self._document(4, np.eye(6)[4]))
+        mapped.delete_document("chunk_0")
+
+        reloaded = LocalVectorStore(self.temp_dir)
+        assert sorted(reloaded.documents) == ["chunk_1", "chunk_2", "chunk_3", "chunk_4"]
+        assert reloaded.search_similar(np.eye(6)[4], top_k=1)[0][0].id == "chunk_4"
+
+    def test_adds_after_mapped_load_use_overflow_segment(self):
+        """Test appends after a mapped load leave the mapping uncopied until the next save remaps"""
+        store = LocalVectorStore(self.temp_dir)
+        for i in range(4):
+            store.add_document(self._document(i, np.eye(8)[i] * 2))
+        store._save_store()
+
+        mapped = LocalVectorStore(self.temp_dir)
+        vectors = mapped._mapped_index.vectors
+        mapped.add_document(self._document(4, np.eye(8)[4] * 3))
+        mapped.add_document(self._document(1, np.eye(8)[5]))  # update of a mapped row
+
+        assert mapped._mapped_matrix is vectors
+        assert mapped.get_index_diagnostics()["private_rows"] == 1
+        assert [doc.id for doc, _ in mapped.search_similar(np.eye(8)[4], top_k=1)] == ["chunk_4"]
+        assert [doc.id for doc, _ in mapped.search_similar(np.eye(8)[5], top_k=1, chunk_types=["dosage"])] == \
+            ["chunk_1"]
+        assert np.allclose(mapped.embeddings, [np.eye(8)[0] * 2, np.eye(8)[5], np.eye(8)[2] * 2,
+                                               np.eye(8)[3] * 2, np.eye(8)[4] * 3])
+
+        mapped._save_store()
+        diagnostics = mapped.get_index_diagnostics()
+        assert diagnostics["private_rows"] == 0 and diagnostics["vectors"] == 5
+        assert mapped.search_similar(np.eye(8)[4], top_k=1)[0][0].id == "chunk_4"
+        assert np.allclose(mapped.get_document("chunk_4").embedding, np.eye(8)[4] * 3)
+        assert np.allclose(LocalVectorStore(self.temp_dir).get_document("chunk_1").embedding, np.eye(8)[5])
+
+    def test_convert_legacy_layout(self):
+        """Test embeddings.npy/metadata.json stores convert to the mapped format"""
+        embeddings = np.random.default_rng(3).normal(size=(3, 4)).astype(np.float32)
+        metadata = {
+            f"legacy_{i}": {"id": f"legacy_{i}", "text": f"Legacy {i}", "metadata": {},
+                            "chunk_type": "protocol", "priority": 0.7}
+            for i in range(3)
+        }
+        np.save(os.path.join(self.temp_dir, "embeddings.npy"), embeddings)
+        with open(os.path.join(self.temp_dir, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+
+        assert convert_legacy_store(self.temp_dir) is not None
+
+        store = LocalVectorStore(self.temp_dir)
+        assert store.get_index_diagnostics()["mapped"] is True
+        result = store.search_similar(embeddings[2], top_k=1)[0]
+        assert result[0].id == "legacy_2"
+        assert result[1] == pytest.approx(1.0, abs=1e-5)
+
+class TestLightweightMappedIndex:
+    """Test deletes, re-adds and clears after LightweightVectorStore.export_mapped_index"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        store = LightweightVectorStore(self.temp_dir)
+        # 'general' fica fora do cache: buscas passam pelo bloco mapeado
+        self.ids = [store.add_vector(f"texto {i}", np.eye(4)[i], medical_priority='general') for i in range(4)]
+        store.export_mapped_index()
+
+        yield
+
+        shutil.rmtree(self.temp_dir)
+
+    def _top_ids(self, store, query):
+        return [vector_id for vector_id, _, _ in store.search_similar(query, top_k=4, min_score=0.5)]
+
+    def test_deleted_vector_leaves_mapped_search(self):
+        """Test a deleted id is not returned from the mapped block, also after reload"""
+        store = LightweightVectorStore(self.temp_dir)
+        assert self._top_ids(store, np.eye(4)[0]) == [self.ids[0]]
+
+        assert store.delete_vector(self.ids[0]) is True
+        assert self._top_ids(store, np.eye(4)[0]) == []
+        assert self._top_ids(LightweightVectorStore(self.temp_dir), np.eye(4)[0]) == []
+
+    def test_readded_vector_replaces_mapped_copy(self):
+        """Test re-adding an id serves the new vector instead of the stale mapped row"""
+        store = LightweightVectorStore(self.temp_dir)
+        assert store.add_vector("texto 1", np.eye(4)[3], medical_priority='general') == self.ids[1]
+
+        for current in (store, LightweightVectorStore(self.temp_dir)):
+            assert self._top_ids(current, np.eye(4)[1]) == []
+            assert sorted(self._top_ids(current, np.eye(4)[3])) == sorted([self.ids[1], self.ids[3]])
+
+        # nova exportação volta a servir o id pelo bloco mapeado
+        store.export_mapped_index()
+        assert self.ids[1] in store.mapped_ids and not store._mapped_tombstones
+        assert sorted(self._top_ids(store, np.eye(4)[3])) == sorted([self.ids[1], self.ids[3]])
+
+    def test_clear_all_drops_mapped_index(self):
+        """Test clear_all unmaps and removes vector_index.bin"""
+        store = LightweightVectorStore(self.temp_dir)
+        store.clear_all()
+
+        assert store.mapped_index is None
+        assert not os.path.exists(os.path.join(self.temp_dir, INDEX_FILENAME))
+        assert self._top_ids(store, np.eye(4)[2]) == []
+        assert self._top_ids(LightweightVectorStore(self.temp_dir), np.eye(4)[2]) == []
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the pooled Postgres layer and the prepared pgvector queries
+(fake DB-API connections, no Postgres server required)
+"""
+
+import pytest
+import os
+import threading
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import psycopg2
+
+from core.performance.pg_pool import (
+    PgPoolConfig, PostgresConnectionPool, PooledConnectionProxy, PreparedStatement, LatencyHistogram
+)
+from core.cloud.pgvector_store import (
+    PgvectorStore, InMemoryPgvectorStore, to_vector_literal, to_vector_array_literal
+)
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+        self.rowcount = 1
+
+    def fetchall(self):
+        return list(self.conn.rows)
+
+    def fetchone(self):
+        return self.conn.rows[0] if self.conn.rows else None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakeConnection:
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.autocommit = False
+        self.closed = False
+        self.executed = []
+        self.rows = []
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+class TestPostgresConnectionPool:
+    """Test checkout, discard and prepared statement handling"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.opened = []
+
+        def connect(dsn):
+            conn = FakeConnection(dsn)
+            self.opened.append(conn)
+            return conn
+
+        self.connect = connect
+
+    def make_pool(self, **kwargs):
+        return PostgresConnectionPool("postgresql://fake/db", PgPoolConfig(**kwargs), connect=self.connect)
+
+    def test_connections_are_reused_in_autocommit(self):
+        """Test sequential checkouts share one autocommit connection"""
+        pool = self.make_pool(min_connections=1, max_connections=4)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        assert first is second
+        assert first.autocommit is True
+        assert len(self.opened) == 1
+
+    def test_checkout_waits_when_exhausted(self):
+        """Test a thread waits for a free connection and the wait is recorded"""
+        pool = self.make_pool(min_connections=0, max_connections=1)
+        holding = threading.Event()
+        release = threading.Event()
+
+        def holder():
+            with pool.connection():
+                holding.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=holder)
+        thread.start()
+        holding.wait(5)
+        threading.Timer(0.05, release.set).start()
+        with pool.connection():
+            pass
+        thread.join()
+
+        stats = pool.get_stats()
+        assert stats["waits"] == 1
+        assert stats["checkout_wait"]["max_ms"] >= 40
+        assert len(self.opened) == 1
+
+    def test_checkout_timeout(self):
+        """Test checkout fails after the timeout when every connection is busy"""
+        pool = self.make_pool(min_connections=0, max_connections=1)
+        with pool.connection():
+            with pytest.raises(TimeoutError):
+                with pool.connection(timeout=0.01):
+                    pass
+        assert pool.get_stats()["wait_timeouts"] == 1
+
+    def test_broken_connection_is_discarded(self):
+        """Test a connection that raised OperationalError is not reused"""
+        pool = self.make_pool(min_connections=1, max_connections=2)
+        with pytest.raises(psycopg2.OperationalError):
+            with pool.connection():
+                raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+        with pool.connection() as conn:
+            assert conn is self.opened[1]
+        assert self.opened[0].closed
+        assert pool.get_stats()["connections_discarded"] == 1
+
+    def test_statement_is_prepared_once_per_connection(self):
+        """Test PREPARE runs once and later calls only EXECUTE"""
+        pool = self.make_pool(min_connections=1, max_connections=1)
+        statement = PreparedStatement("find_doc", "SELECT * FROM docs WHERE id = $1 OR parent = $1", ("int",))
+        for doc_id in (1, 2, 3):
+            pool.execute(statement, (doc_id,))
+
+        executed = [sql for sql, _ in self.opened[0].executed]
+        assert executed.count("PREPARE find_doc (int) AS SELECT * FROM docs WHERE id = $1 OR parent = $1") == 1
+        assert executed.count("EXECUTE find_doc (%s)") == 3
+        stats = pool.get_stats()
+        assert stats["prepares"] == 1
+        assert stats["query_latency"]["find_doc"]["count"] == 3
+
+    def test_plain_mode_sends_each_parameter_once(self):
+        """Test prepared_statements=False maps $n to named parameters"""
+        pool = self.make_pool(min_connections=1, prepared_statements=False)
+        statement = PreparedStatement("find_doc", "SELECT * FROM docs WHERE id = $1 OR parent = $1", ("int",))
+        pool.execute(statement, (7,))
+
+        sql, params = self.opened[0].executed[0]
+        assert sql == "SELECT * FROM docs WHERE id = %(p1)s OR parent = %(p1)s"
+        assert params == {"p1": 7}
+
+    def test_proxy_cursor_returns_connection(self):
+        """Test pg_conn.cursor() compatibility checks out and returns a connection"""
+        pool = self.make_pool(min_connections=0, max_connections=1)
+        proxy = PooledConnectionProxy(pool)
+        with proxy.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+            assert pool.get_stats()["in_use_connections"] == 1
+
+        assert pool.get_stats()["in_use_connections"] == 0
+        assert self.opened[0].executed == [("SELECT 1;", None)]
+
+class TestPgvectorQueries:
+    """Test the pgvector query shape and the in-memory fake"""
+
+    def test_search_sends_vector_once_with_index_friendly_shape(self):
+        """Test k-NN is ordered by distance before the threshold filter"""
+        conn = FakeConnection("fake")
+        pool = PostgresConnectionPool("fake", PgPoolConfig(min_connections=0), connect=lambda dsn: conn)
+        conn.rows = [{"id": 1, "content": "PQT-U", "metadata": {}, "source": "pcdt",
+                      "created_at": None, "distance": 0.1}]
+
+        results = PgvectorStore(pool).search([0.5, 0.25], limit=3, similarity_threshold=0.8)
+
+        prepare_sql, _ = conn.executed[0]
+        execute_sql, params = conn.executed[1]
+        assert "ORDER BY embedding <=> $1" in prepare_sql
+        assert "WHERE distance < $3" in prepare_sql
+        assert execute_sql == "EXECUTE pgv_search_knowledge_vectors (%s, %s, %s)"
+        assert params == ("[0.5,0.25]", 3, pytest.approx(0.2))
+        assert results[0]["similarity"] == pytest.approx(0.9)
+
+    def test_vector_literals(self):
+        """Test vectors are adapted to the pgvector text format"""
+        assert to_vector_literal([1, 0.1, -2.5]) == "[1,0.1,-2.5]"
+        assert to_vector_array_literal([[1, 2], [3, 4]]) == '{"[1,2]","[3,4]"}'
+
+    def test_fake_store_matches_query_semantics(self):
+        """Test the fake applies the threshold after the k nearest"""
+        store = InMemoryPgvectorStore()
+        store.store_vector("rifampicina", [1.0, 0.0], {"tipo": "dose"}, "pcdt")
+        store.store_vector("clofazimina", [0.9, 0.1])
+        store.store_vector("dapsona", [0.0, 1.0])
+
+        results = store.search([1.0, 0.0], limit=2, similarity_threshold=0.5)
+        assert [r["content"] for r in results] == ["rifampicina", "clofazimina"]
+        assert results[0]["similarity"] == pytest.approx(1.0)
+
+        batch = store.search_batch([[1.0, 0.0], [0.0, 1.0]], limit=1, similarity_threshold=0.5)
+        assert [[r["content"] for r in rows] for rows in batch] == [["rifampicina"], ["dapsona"]]
+        assert store.count() == 3
+
+class TestLatencyHistogram:
+    """Test bucket counting and percentiles"""
+
+    def test_percentiles_use_bucket_bounds(self):
+        histogram = LatencyHistogram()
+        for seconds in [0.0005] * 98 + [0.04, 3.0]:
+            histogram.observe(seconds)
+
+        data = histogram.to_dict()
+        assert data["count"] == 100
+        assert data["p50_ms"] == 1.0
+        assert data["p99_ms"] == 50.0
+        assert data["buckets"]["gt_2500ms"] == 1
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the single-pass redaction engine shared by the loggers
+"""
+
+import pytest
+import os
+import re
+import random
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.logging import advanced_logger
+from core.logging.advanced_logger import SensitiveDataRedactor
+from core.logging.redaction import DIGITS, RedactionEngine, RedactionRule
+from core.logging.sanitizer import sanitize_log_input
+
+def legacy_redact(redactor, message, production):
+    """Redação anterior: findall + sub por padrão, em sequência"""
+    compiled = {name: re.compile(pattern, re.IGNORECASE)
+                for name, pattern in {**redactor.sensitive_patterns, **redactor.medical_patterns}.items()}
+    if not production:
+        compiled = {k: v for k, v in compiled.items() if k in ['cpf', 'cpf_numbers', 'credit_card', 'api_key', 'password']}
+    count = 0
+    for name, pattern in compiled.items():
+        matches = pattern.findall(message)
+        if matches:
+            count += len(matches)
+            if name in ['cpf', 'cpf_numbers']:
+                message = pattern.sub('***CPF_REDACTED***', message)
+            elif name == 'email':
+                message = pattern.sub('***EMAIL_REDACTED***', message)
+            elif name == 'api_key':
+                message = pattern.sub('***SENSITIVE_REDACTED***', message)
+            elif name == 'phone':
+                message = pattern.sub('***PHONE_REDACTED***', message)
+            elif name == 'private_ip' and production:
+                message = pattern.sub('***IP_REDACTED***', message)
+            else:
+                message = pattern.sub('***REDACTED***', message)
+    return message, count
+
+def random_line(rng, separators):
+    def digits(n):
+        return ''.join(rng.choice('0123456789') for _ in range(n))
+    tokens = [
+        lambda: f"{digits(3)}.{digits(3)}.{digits(3)}-{digits(2)}", lambda: digits(11),
+        lambda: f"{digits(2)}.{digits(3)}.{digits(3)}-{digits(1)}", lambda: f"(61) 9{digits(4)}-{digits(4)}",
+        lambda: f"+55 {digits(5)}-{digits(4)}", lambda: "joao.silva@example.com",
+        lambda: f"{digits(4)} {digits(4)} {digits(4)} {digits(4)}", lambda: "api_key=" + "a" * 24,
+        lambda: "token: " + "Zx9_" * 6, lambda: "senha=hunter22", lambda: f"192.168.{rng.randint(0, 255)}.7",
+        lambda: f"prontuario #{digits(7)}", lambda: f"{rng.randint(1, 28)}/{rng.randint(1, 12)}/19{digits(2)}",
+        lambda: f"rua das flores do campo, {digits(3)}", lambda: digits(rng.randint(1, 8)),
+        lambda: "GET /api/chat", lambda: "took 12ms", lambda: "status=200", lambda: "persona ga"
+    ]
+    return ''.join(rng.choice(tokens)() + rng.choice(separators) for _ in range(rng.randint(1, 8)))
+
+class TestRedactionEngine:
+    """Test the combined alternation against the sequential per-pattern passes"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.redactor = SensitiveDataRedactor()
+
+    @pytest.mark.parametrize("production", [True, False])
+    def test_fuzz_equivalent_to_sequential_redactor(self, production):
+        """Test random log lines redact and count exactly as before"""
+        engine = self.redactor.production_engine if production else self.redactor.development_engine
+        rng = random.Random(11)
+        for _ in range(3000):
+            line = random_line(rng, [', ', ' | ', '; '])
+            text, counts = engine.redact(line)
+            assert (text, sum(counts.values())) == legacy_redact(self.redactor, line, production), line
+
+    def test_overlaps_never_leak_more_digits(self):
+        """Test whitespace-adjacent tokens (where rules overlap) leak no more than before"""
+        rng = random.Random(5)
+        for _ in range(3000):
+            line = random_line(rng, [' ', '\t', ', '])
+            text, _ = self.redactor.production_engine.redact(line)
+            legacy_text, _ = legacy_redact(self.redactor, line, True)
+            assert len(re.findall(r'\d', text)) <= len(re.findall(r'\d', legacy_text)), line
+
+    def test_address_does_not_swallow_identifier(self):
+        """Test an address ending in a CPF redacts the whole CPF, as the sequential passes did"""
+        line = "rua Alguma Coisa Longa, 123.456.789-00"
+        text, counts = self.redactor.production_engine.redact(line)
+        assert text == "rua Alguma Coisa Longa, ***CPF_REDACTED***" and counts == {'cpf': 1}
+        assert (text, 1) == legacy_redact(self.redactor, line, True)
+
+        # endereço seguido de telefone/cartão/CPF só com números: igual aos passes sequenciais
+        for identifier in ["(61) 98765-4321", "4111 1111 1111 1111", "12345678901"]:
+            line_with_address = f"avenida das Palmeiras Altas, {identifier}"
+            text, counts = self.redactor.production_engine.redact(line_with_address)
+            assert (text, sum(counts.values())) == legacy_redact(self.redactor, line_with_address, True)
+        assert self.redactor.production_engine.detect(line) == ['cpf']
+
+    def test_counts_per_type_and_environment(self, monkeypatch):
+        """Test per-rule counts and the development subset"""
+        line = "cpf 123.456.789-00 email a.b@c.com ip 10.0.0.1 cpf 98765432100"
+        text, counts = self.redactor.production_engine.redact(line)
+        assert counts == {'cpf': 1, 'cpf_numbers': 1, 'email': 1, 'private_ip': 1}
+        assert text == ("cpf ***CPF_REDACTED*** email ***EMAIL_REDACTED*** ip ***IP_REDACTED*** "
+                        "cpf ***CPF_REDACTED***")
+
+        monkeypatch.setattr(advanced_logger.EnvironmentConfig, 'is_production', staticmethod(lambda: False))
+        text, count = self.redactor.redact_sensitive_data(line)
+        assert count == 2
+        assert 'a.b@c.com' in text and '10.0.0.1' in text
+
+    def test_lines_without_candidates_skip_the_scan(self):
+        """Test the trigger prefilter and rules without triggers"""
+        engine = RedactionEngine([RedactionRule('digits', r'\d+', '#', DIGITS),
+                                  RedactionRule('key', r'token=\w+', 'token=*', ('token',))])
+        assert not engine.has_candidates("nenhum dado sensivel aqui")
+        assert engine.redact("nenhum dado sensivel aqui") == ("nenhum dado sensivel aqui", {})
+        assert engine.redact("TOKEN=abc 42") == ("token=* #", {'key': 1, 'digits': 1})
+        assert engine.detect("x 1 token=a 2") == ['digits', 'key']
+
+        untriggered = RedactionEngine([RedactionRule('any', r'a', 'b')])
+        assert untriggered.has_candidates("banana")
+
+    def test_sanitizer_control_characters(self):
+        """Test newline/tab escaping and control character removal in one pass"""
+        assert sanitize_log_input("ataque\nforjado\r\tfim\x00\x7f") == "ataque\\nforjado\\r\\tfim"
+        assert sanitize_log_input("ação normal") == "ação normal"
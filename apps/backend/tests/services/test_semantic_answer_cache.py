@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the semantic answer cache and its use by SupabaseRAGSystem
+"""
+
+import pytest
+import numpy as np
+import os
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from services.cache.semantic_answer_cache import SemanticAnswerCache
+import services.rag.supabase_rag_system as supabase_rag_system
+from services.rag.supabase_rag_system import SupabaseRAGSystem, RAGContext, RAGResponse
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+class TestSemanticAnswerCache:
+    """Test threshold, partitions, TTL and eviction"""
+
+    def test_hit_above_threshold(self):
+        """Test a close paraphrase is served from the cache"""
+        cache = SemanticAnswerCache(threshold=0.9)
+        cache.store(unit(1, 0, 0), "dr_gasnelio", "resposta", latency_ms=1200)
+
+        value, similarity = cache.lookup(unit(1, 0.1, 0), "dr_gasnelio")
+
+        assert value == "resposta"
+        assert similarity > 0.9
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["saved_latency_ms"] == pytest.approx(1200)
+
+    def test_miss_below_threshold(self):
+        """Test a different question is not served"""
+        cache = SemanticAnswerCache(threshold=0.9)
+        cache.store(unit(1, 0, 0), "dr_gasnelio", "resposta")
+
+        assert cache.lookup(unit(1, 1, 0), "dr_gasnelio") is None
+        stats = cache.get_stats()
+        assert stats["misses"] == 1
+        assert sum(stats["similarity_histogram"].values()) == 1
+
+    def test_partition_must_match(self):
+        """Test entries of another persona are never returned"""
+        cache = SemanticAnswerCache(threshold=0.9)
+        cache.store(unit(1, 0, 0), "dr_gasnelio", "técnica")
+
+        assert cache.lookup(unit(1, 0, 0), "ga_empathetic") is None
+
+    def test_ttl_expiry(self):
+        """Test expired entries are dropped"""
+        cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=0)
+        cache.store(unit(1, 0, 0), "dr_gasnelio", "resposta")
+
+        assert cache.lookup(unit(1, 0, 0), "dr_gasnelio") is None
+        assert cache.get_stats()["expirations"] == 1
+
+    def test_size_bounded_lru_eviction(self):
+        """Test the least recently used entry makes room"""
+        cache = SemanticAnswerCache(threshold=0.99, max_entries=2)
+        cache.store(unit(1, 0, 0), "p", "a")
+        cache.store(unit(0, 1, 0), "p", "b")
+        assert cache.lookup(unit(1, 0, 0), "p")[0] == "a"
+
+        cache.store(unit(0, 0, 1), "p", "c")
+
+        assert len(cache) == 2
+        assert cache.lookup(unit(0, 1, 0), "p") is None
+        assert cache.lookup(unit(1, 0, 0), "p")[0] == "a"
+        assert cache.get_stats()["evictions"] == 1
+
+class FakeEmbeddingService:
+    """Maps each query to a fixed vector"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_text(self, text):
+        return SimpleNamespace(embedding=self.vectors[text])
+
+class FakeSearchEngine:
+    def __init__(self, config):
+        self.embedding_service = None
+
+    def is_available(self):
+        return False
+
+    def get_statistics(self):
+        return {}
+
+class TestSupabaseRAGSystemSemanticCache:
+    """Test answer_query reuses answers for paraphrases"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setattr(supabase_rag_system, "get_vector_store", lambda: None)
+        monkeypatch.setattr(supabase_rag_system, "get_cloud_cache", lambda: None)
+        monkeypatch.setattr(supabase_rag_system, "SemanticSearchEngine", FakeSearchEngine)
+
+        config = SimpleNamespace(SEMANTIC_CACHE_THRESHOLD=0.9, SEMANTIC_SIMILARITY_THRESHOLD=0.6)
+        self.rag = SupabaseRAGSystem(config)
+        self.rag.search_engine.embedding_service = FakeEmbeddingService({
+            "dose rifampicina adulto": unit(1, 0.05, 0),
+            "qual a dose de rifampicina em adultos?": unit(1, 0, 0),
+            "qual a dose de rifampicina em crianças?": unit(1, 0, 0.01),
+        })
+
+        self.generated = []
+        chunk = SimpleNamespace(chunk=SimpleNamespace(category="dosage"), source="pcdt")
+        context = RAGContext(chunks=[chunk], total_score=0.9, source_files=["pcdt"],
+                             chunk_types=["dosage"], confidence_level="high", metadata={})
+        monkeypatch.setattr(self.rag, "retrieve_context", lambda **kwargs: context)
+
+        def generate_answer(query, context, persona, enhance_with_openrouter):
+            self.generated.append(query)
+            return RAGResponse(answer=f"resposta para {query}", context=context, persona=persona,
+                               quality_score=0.9, sources=["pcdt"], limitations=[],
+                               generated_at=datetime.now(timezone.utc), processing_time_ms=900)
+        monkeypatch.setattr(self.rag, "generate_answer", generate_answer)
+
+    def test_paraphrase_is_served_from_cache(self):
+        """Test the second phrasing does not regenerate the answer"""
+        first = self.rag.answer_query("qual a dose de rifampicina em adultos?", persona="dr_gasnelio")
+        second = self.rag.answer_query("dose rifampicina adulto", persona="dr_gasnelio")
+
+        assert second.answer == first.answer
+        assert self.generated == ["qual a dose de rifampicina em adultos?"]
+        stats = self.rag.get_stats()
+        assert stats["semantic_cache_hits"] == 1
+        assert stats["semantic_cache"]["hit_rate"] == pytest.approx(50.0)
+
+    def test_patient_group_and_persona_are_not_mixed(self):
+        """Test adult answers are not reused for children or for another persona"""
+        self.rag.answer_query("qual a dose de rifampicina em adultos?", persona="dr_gasnelio")
+        self.rag.answer_query("qual a dose de rifampicina em crianças?", persona="dr_gasnelio")
+        self.rag.answer_query("qual a dose de rifampicina em adultos?", persona="ga_empathetic")
+
+        assert len(self.generated) == 3
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the JWT session-state cache and the session revocation feed
+"""
+
+import pytest
+import os
+import shutil
+import tempfile
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.database import DatabaseManager
+from core.auth import jwt_manager as jwt_manager_module
+from core.auth.jwt_manager import JWTManager
+from core.auth.session_cache import SessionStateCache
+
+class CountingDatabase:
+    """DatabaseManager wrapper counting session lookups"""
+
+    def __init__(self, db):
+        self._db = db
+        self.session_lookups = 0
+
+    def fetch_one(self, query, params=None):
+        if "FROM sessions WHERE id" in query:
+            self.session_lookups += 1
+        return self._db.fetch_one(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+class TestSessionStateCache:
+    """Test cached verify_token and revocation propagation"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = CountingDatabase(DatabaseManager(os.path.join(self.temp_dir, "auth.db")))
+        monkeypatch.setattr(jwt_manager_module, "get_db_connection", lambda: self.db)
+
+        self.manager = JWTManager(secret_key="test-secret")
+        self.manager.session_cache = SessionStateCache(self.db, ttl_seconds=60, revocation_poll_seconds=60)
+        self.manager.create_user("medica@roteiros.com", "senha-segura", roles=["educator"])
+        self.tokens = self.manager.authenticate_user("medica@roteiros.com", "senha-segura")
+
+        yield
+
+        self.db.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_repeated_verification_hits_cache(self):
+        """Test only the first verification reads the sessions table"""
+        for _ in range(5):
+            claims = self.manager.verify_token(self.tokens.access_token)
+            assert claims.email == "medica@roteiros.com"
+
+        stats = self.manager.session_cache.get_stats()
+        assert self.db.session_lookups == 1
+        assert stats["hits"] == 4
+        assert stats["hit_rate"] == pytest.approx(0.8)
+
+    def test_local_revocation_is_immediate(self):
+        """Test logout invalidates the cached entry in the same process"""
+        claims = self.manager.verify_token(self.tokens.access_token)
+
+        assert self.manager.revoke_session(claims.session_id)
+        assert self.manager.verify_token(self.tokens.access_token) is None
+
+    def test_revocation_from_another_worker_is_applied_on_poll(self):
+        """Test a revoke in another process reaches this cache through the feed"""
+        claims = self.manager.verify_token(self.tokens.access_token)
+        other_worker = SessionStateCache(self.db, ttl_seconds=60, revocation_poll_seconds=60)
+        self.db.execute("UPDATE sessions SET is_active = 0 WHERE id = ?", (claims.session_id,))
+        other_worker.record_revocation(session_id=claims.session_id, user_id=claims.user_id)
+
+        # Within the poll interval the cached state is still served
+        assert self.manager.verify_token(self.tokens.access_token) is not None
+
+        assert self.manager.session_cache.poll_revocations(force=True) == 1
+        assert self.manager.verify_token(self.tokens.access_token) is None
+        stats = self.manager.session_cache.get_stats()
+        assert stats["revocations_applied"] == 1
+        assert stats["propagation_lag_max_ms"] >= 0
+
+    def test_revoke_all_user_sessions_evicts_every_entry(self):
+        """Test a user-wide revocation drops all of that user's sessions"""
+        second = self.manager.authenticate_user("medica@roteiros.com", "senha-segura")
+        user_id = self.manager.verify_token(self.tokens.access_token).user_id
+        self.manager.verify_token(second.access_token)
+
+        assert self.manager.revoke_all_user_sessions(user_id) == 2
+        assert self.manager.verify_token(self.tokens.access_token) is None
+        assert self.manager.verify_token(second.access_token) is None
+
+    def test_zero_ttl_disables_cache(self):
+        """Test ttl_seconds=0 keeps the per-request lookup"""
+        self.manager.session_cache = SessionStateCache(self.db, ttl_seconds=0)
+        for _ in range(3):
+            assert self.manager.verify_token(self.tokens.access_token) is not None
+
+        assert self.db.session_lookups == 3
+        assert self.manager.session_cache.get_stats()["enabled"] is False
+
+    def test_cache_is_bounded(self):
+        """Test the least recently used sessions are evicted past max_entries"""
+        cache = SessionStateCache(self.db, ttl_seconds=60, max_entries=2)
+        sessions = [self.manager.authenticate_user("medica@roteiros.com", "senha-segura") for _ in range(3)]
+        for tokens in sessions:
+            session_id = self.manager.verify_token(tokens.access_token).session_id
+            assert cache.get(session_id) is not None
+
+        stats = cache.get_stats()
+        assert stats["entries"] == 2
+        assert stats["evictions"] == 1
+
+    def test_revocation_during_load_is_not_cached(self):
+        """Test a state read before a concurrent revocation is served once but not cached"""
+        claims = self.manager.verify_token(self.tokens.access_token)
+        cache = SessionStateCache(self.db, ttl_seconds=60, revocation_poll_seconds=60)
+        original_load = cache._load
+
+        def load_racing_revocation(session_id):
+            state = original_load(session_id)  # leu a sessão ainda ativa
+            self.db.execute("UPDATE sessions SET is_active = 0 WHERE id = ?", (session_id,))
+            cache.record_revocation(session_id=session_id, user_id=claims.user_id)
+            return state
+
+        cache._load = load_racing_revocation
+        assert cache.get(claims.session_id).is_active is True
+
+        cache._load = original_load
+        assert cache.get(claims.session_id).is_active is False
+        assert cache.get_stats()["stale_loads_discarded"] == 1
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the shared SQLite pool (per-thread readers, batched single writer)
+and the subsystems that persist through it
+"""
+
+import pytest
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+# Import modules under test
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from core.performance.sqlite_pool import SQLiteConnectionPool, SQLitePoolConfig, get_sqlite_pool
+from services.security.sqlite_rate_limiter import SQLiteRateLimiter
+from services.analytics.persona_stats_manager import PersonaStatsManager
+
+class TestSQLiteConnectionPool:
+    """Test connection reuse, PRAGMAs and write batching"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.pool = SQLiteConnectionPool(os.path.join(self.temp_dir, "pool.db"), SQLitePoolConfig(write_batch_size=64))
+        self.pool.executescript("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT UNIQUE);")
+
+        yield
+
+        self.pool.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_reader_connection_is_per_thread_and_tuned(self):
+        """Test each thread keeps one WAL connection with the tuned PRAGMAs"""
+        conn = self.pool.connection()
+        assert self.pool.connection() is conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -16384
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.pool.connection()))
+        thread.start()
+        thread.join()
+        assert other[0] is not conn
+        assert self.pool.get_stats()["reader_connections"] == 2
+
+    def test_readers_cannot_write(self):
+        """Test writes must go through the writer thread"""
+        with pytest.raises(sqlite3.OperationalError):
+            self.pool.connection().execute("INSERT INTO items (value) VALUES ('x')")
+
+    def test_write_is_visible_after_return(self):
+        """Test a waited write is committed before the caller reads it back"""
+        rowcount, lastrowid = self.pool.execute("INSERT INTO items (value) VALUES (?)", ("rifampicina",))
+
+        assert rowcount == 1
+        row = self.pool.connection().execute("SELECT value FROM items WHERE id = ?", (lastrowid,)).fetchone()
+        assert row["value"] == "rifampicina"
+
+    def test_concurrent_writes_are_grouped_into_batches(self):
+        """Test writes queued by many threads share commits"""
+        def worker(thread_id):
+            for i in range(50):
+                self.pool.execute("INSERT INTO items (value) VALUES (?)", (f"{thread_id}-{i}",))
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = self.pool.get_stats()
+        assert self.pool.connection().execute("SELECT COUNT(*) FROM items").fetchone()[0] == 400
+        assert stats["writes"] == 400
+        assert stats["batches"] < 400
+        assert stats["max_batch_size"] > 1
+
+    def test_failing_job_does_not_roll_back_its_batch(self):
+        """Test a failing job only undoes its own changes"""
+        self.pool.execute("INSERT INTO items (value) VALUES ('dup')")
+        release = threading.Event()
+
+        # Hold the writer so the next jobs are committed in one batch
+        blocker = self.pool.write(lambda conn: release.wait(5), wait=False)
+        ok = self.pool.execute("INSERT INTO items (value) VALUES ('ok')", wait=False)
+        bad = self.pool.execute("INSERT INTO items (value) VALUES ('dup')", wait=False)
+        release.set()
+
+        blocker.result(5)
+        assert ok.result(5)[0] == 1
+        with pytest.raises(sqlite3.IntegrityError):
+            bad.result(5)
+        values = {row[0] for row in self.pool.connection().execute("SELECT value FROM items")}
+        assert values == {"dup", "ok"}
+        assert self.pool.get_stats()["write_errors"] == 1
+
+    def test_nested_write_runs_in_current_transaction(self):
+        """Test write() called from inside a job does not deadlock"""
+        def outer(conn):
+            conn.execute("INSERT INTO items (value) VALUES ('outer')")
+            return self.pool.execute("INSERT INTO items (value) VALUES ('inner')")
+
+        assert self.pool.write(outer)[0] == 1
+        assert self.pool.connection().execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+
+    def test_close_flushes_pending_writes(self):
+        """Test fire-and-forget writes are committed before close returns"""
+        futures = [self.pool.execute("INSERT INTO items (value) VALUES (?)", (str(i),), wait=False) for i in range(20)]
+        self.pool.close()
+
+        assert all(future.done() for future in futures)
+        conn = sqlite3.connect(self.pool.db_path)
+        assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 20
+        conn.close()
+        with pytest.raises(RuntimeError):
+            self.pool.connection()
+
+class TestSubsystemsOnPool:
+    """Test the rate limiter and persona stats on the shared pool"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+        yield
+
+        for name in ("rate_limits.db", "persona_stats.db"):
+            get_sqlite_pool(os.path.join(self.temp_dir, name)).close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_rate_limit_is_exact_under_concurrency(self):
+        """Test concurrent checks never admit more than the limit"""
+        limiter = SQLiteRateLimiter(os.path.join(self.temp_dir, "rate_limits.db"))
+        limit = {'requests': 25, 'window': 60}
+        results = []
+
+        def worker():
+            for _ in range(10):
+                results.append(limiter.check_rate_limit("10.0.0.1", "chat", custom_limit=limit)[0])
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(True) == 25
+        stats = limiter.get_stats()
+        assert stats["total_requests"] == 25
+        assert stats["blocked_requests"] == 35
+
+    def test_endpoint_config_round_trip(self):
+        """Test a custom endpoint limit is read back by the next check"""
+        limiter = SQLiteRateLimiter(os.path.join(self.temp_dir, "rate_limits.db"))
+        assert limiter.set_endpoint_config("feedback", 1, 300)
+
+        assert limiter.check_rate_limit("10.0.0.2", "feedback")[0] is True
+        allowed, info = limiter.check_rate_limit("10.0.0.2", "feedback")
+        assert allowed is False
+        assert info["limit"] == 1
+
+    def test_persona_stats_are_updated_with_the_write(self):
+        """Test interaction ids and the stats cache come from the same transaction"""
+        manager = PersonaStatsManager(os.path.join(self.temp_dir, "persona_stats.db"))
+
+        first = manager.record_interaction("dr_gasnelio", response_time_ms=100)
+        second = manager.record_interaction("dr_gasnelio", response_time_ms=300, success=False)
+        assert manager.record_rating("dr_gasnelio", 4, interaction_id=first)
+
+        assert second == first + 1
+        stats = manager.get_persona_stats("dr_gasnelio")
+        assert stats["total_interactions"] == 2
+        assert stats["success_rate"] == 50.0
+        assert stats["average_rating"] == 4.0
+        assert stats["avg_response_time_ms"] == 200
@@ -306,6 +306,57 @@ class TestLocalVectorStore:
         assert retrieved_doc.text == "Persistent document"
         assert retrieved_doc.metadata["persistent"] is True
 
+    def test_search_matches_exhaustive_ranking(self):
+        """Test top-k selection agrees with a full cosine ranking"""
+        rng = np.random.default_rng(42)
+        vectors = rng.normal(size=(200, 16))
+        for i, vector in enumerate(vectors):
+            self.store.add_document(VectorDocument(
+                id=f"rank_{i}",
+                text=f"Document {i}",
+                embedding=vector,
+                metadata={},
+                chunk_type="dosage" if i % 2 else "general",
+                priority=0.5
+            ))
+
+        query = rng.normal(size=16)
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))
+
+        results = self.store.search_similar(query, top_k=10)
+        assert [doc.id for doc, _ in results] == [f"rank_{i}" for i in expected[:10]]
+
+        dosage_expected = [i for i in expected if i % 2][:5]
+        results = self.store.search_similar(query, top_k=5, chunk_types=["dosage"])
+        assert [doc.id for doc, _ in results] == [f"rank_{i}" for i in dosage_expected]
+
+    def test_delete_compaction_keeps_rows_consistent(self):
+        """Test tombstoned rows are reclaimed without breaking id lookups"""
+        for i in range(100):
+            self.store.add_document(VectorDocument(
+                id=f"compact_{i}",
+                text=f"Document {i}",
+                embedding=np.eye(100)[i],
+                metadata={},
+                chunk_type="general",
+                priority=0.5
+            ))
+
+        for i in range(0, 100, 2):
+            assert self.store.delete_document(f"compact_{i}") is True
+
+        assert self.store.get_stats()["tombstones"] == 50
+        self.store.compact()
+        assert self.store.get_stats()["tombstones"] == 0
+        assert len(self.store.doc_ids) == 50
+        assert len(self.store.embeddings) == 50
+
+        results = self.store.search_similar(np.eye(100)[51], top_k=1)
+        assert results[0][0].id == "compact_51"
+        assert results[0][1] == pytest.approx(1.0)
+        assert np.allclose(self.store.get_document("compact_99").embedding, np.eye(100)[99])
+
 class TestSupabaseVectorStore:
     """Test SupabaseVectorStore implementation"""
 
@@ -9,11 +9,20 @@ from flask import request
 import time
 import logging
 from core.logging.sanitizer import sanitize_log_input, sanitize_ip
+from services.security.gcra_rate_limiter import ShardedGCRALimiter
 
 logger = logging.getLogger(__name__)
 
-# Simple in-memory rate limiting (not suitable for production)
-_rate_limit_store: Dict[str, Dict[str, Any]] = {}
+# In-memory GCRA buckets (O(1) per request, memory bounded by active clients)
+_buckets = ShardedGCRALimiter()
+_sweep_state = {'last': 0.0}
+_SWEEP_INTERVAL = 60.0
+
+def _maybe_sweep(current_time: float):
+    """Drop full buckets at most once per interval"""
+    if current_time - _sweep_state['last'] >= _SWEEP_INTERVAL:
+        _sweep_state['last'] = current_time
+        _buckets.sweep(current_time)
 
 def rate_limit(max_requests: int = 100, window_seconds: int = 3600):
     """
@@ -29,25 +38,11 @@ def rate_limit(max_requests: int = 100, window_seconds: int = 3600):
             key = f"{client_ip}:{endpoint}"
 
             current_time = time.time()
-
-            # Clean old entries
-            if key in _rate_limit_store:
-                requests = _rate_limit_store[key]['requests']
-                _rate_limit_store[key]['requests'] = [
-                    req_time for req_time in requests
-                    if current_time - req_time < window_seconds
-                ]
-
-            # Initialize if not exists
-            if key not in _rate_limit_store:
-                _rate_limit_store[key] = {
-                    'requests': [],
-                    'first_request': current_time
-                }
+            _maybe_sweep(current_time)
 
             # Check rate limit
-            requests = _rate_limit_store[key]['requests']
-            if len(requests) >= max_requests:
+            decision = _buckets.decide(key, max_requests, window_seconds, now=current_time)
+            if not decision.allowed:
                 logger.warning("Rate limit exceeded for %s on %s", sanitize_ip(client_ip), sanitize_log_input(endpoint))
                 from flask import jsonify
                 return jsonify({
@@ -56,9 +51,6 @@ def rate_limit(max_requests: int = 100, window_seconds: int = 3600):
                     'window_seconds': window_seconds
                 }), 429
 
-            # Add current request
-            _rate_limit_store[key]['requests'].append(current_time)
-
             return f(*args, **kwargs)
         return decorated_function
     return decorator
@@ -67,28 +59,13 @@ def get_rate_limit_status(client_ip: str, endpoint: str) -> Dict[str, Any]:
     """
     Get current rate limit status for a client
     """
-    key = f"{client_ip}:{endpoint}"
-
-    if key not in _rate_limit_store:
-        return {
-            'requests_made': 0,
-            'requests_remaining': 100,  # Default limit
-            'reset_time': time.time() + 3600
-        }
-
     current_time = time.time()
-    requests = _rate_limit_store[key]['requests']
-
-    # Clean old requests
-    valid_requests = [
-        req_time for req_time in requests
-        if current_time - req_time < 3600  # Default window
-    ]
+    decision = _buckets.peek(f"{client_ip}:{endpoint}", 100, 3600, now=current_time)  # Default limit/window
 
     return {
-        'requests_made': len(valid_requests),
-        'requests_remaining': max(0, 100 - len(valid_requests)),
-        'reset_time': current_time + 3600
+        'requests_made': decision.limit - decision.remaining,
+        'requests_remaining': decision.remaining,
+        'reset_time': current_time + decision.reset_after
     }
 
 def clear_rate_limit_for_client(client_ip: str, endpoint: str = None):
@@ -96,11 +73,7 @@ def clear_rate_limit_for_client(client_ip: str, endpoint: str = None):
     Clear rate limit for a specific client
     """
     if endpoint:
-        key = f"{client_ip}:{endpoint}"
-        if key in _rate_limit_store:
-            del _rate_limit_store[key]
+        _buckets.reset(key=f"{client_ip}:{endpoint}")
     else:
         # Clear all entries for this IP
-        keys_to_remove = [key for key in _rate_limit_store.keys() if key.startswith(f"{client_ip}:")]
-        for key in keys_to_remove:
-            del _rate_limit_store[key]
\ No newline at end of file
+        _buckets.reset(prefix=f"{client_ip}:")
@@ -5,7 +5,17 @@ Knowledge Base Indexing Script - Supabase Vector Store Population
 Indexes all medical knowledge base files into Supabase PostgreSQL + pgvector
 
 USAGE:
-    python scripts/index_knowledge_base.py [--force] [--dry-run]
+    python scripts/index_knowledge_base.py [--force] [--dry-run] [--workers 2] [--batch-size 32]
+                                           [--manifest PATH] [--local PATH] [--drop-legacy-ids]
+
+Pipeline (services/rag/indexing_pipeline.py): MedicalChunker -> embeddings em lote ->
+upsert em lote. Chunks inalterados (mesmo hash de conteúdo no manifesto) são pulados;
+uma execução interrompida retoma do último lote gravado. Os markdown passam pelo
+IncrementalChunker: só seções editadas são re-divididas e os chunks substituídos ou
+removidos são apagados do store. Os chunks gravados também alimentam o índice léxico
+do SemanticSearchEngine (LEXICAL_INDEX_DIR/semantic_chunks.json). --local indexa num LocalVectorStore (sem Supabase)
+para testes offline. --drop-legacy-ids (implícito em --force) apaga as linhas gravadas com o id antigo
+(SHA-256 dos 100 primeiros caracteres), que senão ficam duplicadas ao lado do id atual.
 
 REQUIREMENTS:
     - HUGGINGFACE_TOKEN or HF_TOKEN (FREE - get at https://huggingface.co/settings/tokens)
@@ -19,11 +29,9 @@ import os
 import sys
 import json
 import logging
-import hashlib
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timezone
-import time
+from typing import List, Any, Optional
+from datetime import datetime
 
 # Configure encoding for Windows
 if os.name == 'nt':
@@ -49,9 +57,16 @@ class KnowledgeBaseIndexer:
     Generates embeddings using OpenRouter API
     """
 
-    def __init__(self, force_reindex: bool = False, dry_run: bool = False):
+    def __init__(self, force_reindex: bool = False, dry_run: bool = False, batch_size: Optional[int] = None,
+                 workers: Optional[int] = None, manifest_path: Optional[str] = None, local_path: Optional[str] = None,
+                 drop_legacy_ids: bool = False):
         self.force_reindex = force_reindex
+        self.drop_legacy_ids = drop_legacy_ids or force_reindex
         self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.workers = workers
+        self.manifest_path = manifest_path
+        self.local_path = local_path
 
         # Import after path setup
         try:
@@ -63,6 +78,7 @@ class KnowledgeBaseIndexer:
 
         # Initialize components
         self._init_components()
+        self._init_lexical_index()
 
         # Data directories
         self.data_root = script_dir.parent / "data"
@@ -75,6 +91,10 @@ class KnowledgeBaseIndexer:
             'chunks_created': 0,
             'embeddings_generated': 0,
             'documents_indexed': 0,
+            'documents_deleted': 0,
+            'legacy_ids_deleted': 0,
+            'chunks_skipped': 0,
+            'stages': {},
             'errors': [],
             'start_time': datetime.now(),
             'end_time': None
@@ -87,11 +107,23 @@ class KnowledgeBaseIndexer:
     def _init_components(self):
         """Initialize RAG components"""
         try:
-            from services.integrations.supabase_vector_store import SupabaseVectorStore, VectorDocument
+            from services.rag.incremental_chunking import IncrementalChunker
             from services.rag.medical_chunking import MedicalChunker
 
-            self.vector_store = SupabaseVectorStore(self.config)
             self.chunker = MedicalChunker()
+            self.incremental_chunker = IncrementalChunker(self.chunker)
+
+            if self.local_path:
+                from services.vector_store import LocalVectorStore, VectorDocument
+
+                self.vector_store = LocalVectorStore(self.local_path)
+                self.VectorDocument = VectorDocument
+                logger.info(f"Using local vector store: {self.local_path}")
+                return
+
+            from services.integrations.supabase_vector_store import SupabaseVectorStore, VectorDocument
+
+            self.vector_store = SupabaseVectorStore(self.config)
             self.VectorDocument = VectorDocument
 
             # Check if using Supabase or local fallback
@@ -107,6 +139,39 @@ class KnowledgeBaseIndexer:
             logger.error(f"Failed to initialize components: {e}")
             raise
 
+    def _init_lexical_index(self):
+        """Load the SemanticSearchEngine lexical index (BM25 side of hybrid search)"""
+        from services.rag.lexical_index import DocumentLexicalIndex
+        from services.rag.semantic_search import get_lexical_index_path
+
+        self.lexical_index_path = get_lexical_index_path(self.config)
+        self.lexical_index = (
+            DocumentLexicalIndex.load(self.lexical_index_path) if self.lexical_index_path else None
+        ) or DocumentLexicalIndex()
+
+    def index_lexical_chunks(self, chunks: List[Any]):
+        """IndexingPipeline on_indexed hook: add stored chunks to the lexical index"""
+        from services.rag.semantic_search import pipeline_lexical_metadata
+
+        for chunk in chunks:
+            self.lexical_index.add(chunk.id, chunk.text, pipeline_lexical_metadata(chunk))
+
+    def remove_lexical_chunks(self, chunk_ids: List[str]):
+        """IndexingPipeline on_deleted hook: drop deleted chunks from the lexical index"""
+        removed = sum(self.lexical_index.remove(chunk_id) for chunk_id in chunk_ids)
+        if removed:
+            self.save_lexical_index()
+
+    def save_lexical_index(self):
+        # an emptied index is still written, or the stale file would be reloaded
+        if not self.lexical_index_path or not (len(self.lexical_index) or os.path.exists(self.lexical_index_path)):
+            return
+        try:
+            self.lexical_index.save(self.lexical_index_path)
+            logger.info(f"Lexical index saved: {self.lexical_index_path} ({len(self.lexical_index)} chunks)")
+        except OSError as e:
+            logger.warning(f"Lexical index not saved: {e}")
+
     def _setup_rpc_function(self):
         """
         Setup RPC function for vector similarity search in Supabase
@@ -189,11 +254,11 @@ class KnowledgeBaseIndexer:
                 warnings.append("HUGGINGFACE_TOKEN not set - using local sentence-transformers model")
                 logger.info("📦 Will download multilingual-e5-small model locally (384D, ~500MB)")
 
-        # Check Supabase config
-        if not self.config.SUPABASE_URL:
+        # Check Supabase config (not needed for the local store)
+        if not self.local_path and not self.config.SUPABASE_URL:
             errors.append("SUPABASE_URL not configured")
 
-        if not self.config.SUPABASE_KEY and not self.config.SUPABASE_SERVICE_KEY:
+        if not self.local_path and not self.config.SUPABASE_KEY and not self.config.SUPABASE_SERVICE_KEY:
             errors.append("SUPABASE_KEY or SUPABASE_SERVICE_KEY required")
 
         # Check directories
@@ -219,132 +284,79 @@ class KnowledgeBaseIndexer:
         logger.info("Environment validation passed")
         return True
 
-    def get_embedding(self, text: str) -> Optional[List[float]]:
+    def get_embeddings(self, texts: List[str]) -> List[Any]:
         """
-        Generate embedding using environment-appropriate method:
-        - Local/Development: sentence-transformers library (offline, no API needed)
-        - Production/CI: HuggingFace API with GitHub Secrets
+        Generate embeddings for a batch of texts (one model.encode call per batch)
+        using sentence-transformers in every environment:
+        - Local/Development: offline, no API needed
+        - Production/CI: HuggingFace API does not serve feature-extraction for this model
 
-        Uses multilingual-e5-small model (384D) for Portuguese support
+        Uses multilingual-e5-small model (384D) for Portuguese support.
+        Raises on failure so the pipeline marks the whole batch as failed.
         """
-        try:
-            # Detect environment (same pattern as app_config.py)
+        # Cache model instance to avoid reloading on every batch
+        if not hasattr(self, '_embedding_model'):
             env = os.environ.get('ENVIRONMENT', 'development')
             model_name = "intfloat/multilingual-e5-small"
 
-            # Production/CI environment: Use HuggingFace API with GitHub Secrets
             if env in ['production', 'staging', 'hml']:
-                logger.info(f"Using HuggingFace API for {env} environment")
-
-                # Validate required secrets
-                hf_token = os.environ.get('HUGGINGFACE_API_KEY') or os.environ.get('HF_TOKEN')
-                if not hf_token:
-                    logger.error("HUGGINGFACE_API_KEY not found in GitHub Secrets")
-                    logger.info("Configure at: https://github.com/settings/secrets")
-                    return None
-
-                # Note: multilingual-e5-small doesn't support feature-extraction via API
-                # For production, we'll use sentence-transformers as well since it's more reliable
-                # Fall through to local method below
-                logger.warning("HuggingFace API doesn't support feature-extraction for this model")
-                logger.info("Using local sentence-transformers instead")
-
-            # Local Development OR Production (both use sentence-transformers)
-            logger.info(f"Loading local embedding model: {model_name}")
+                logger.info(f"HuggingFace API doesn't support feature-extraction for {model_name} - "
+                            f"using local sentence-transformers in {env}")
 
-            # Cache model instance to avoid reloading on every call
-            if not hasattr(self, '_embedding_model'):
+            try:
                 from sentence_transformers import SentenceTransformer
-                self._embedding_model = SentenceTransformer(model_name)
-                logger.info(f"Model loaded successfully (384D embeddings)")
+            except ImportError:
+                logger.error("sentence-transformers not installed")
+                logger.info("Install with: pip install sentence-transformers")
+                raise
 
-            # Generate embedding using local model
-            embedding = self._embedding_model.encode(
-                text,
-                convert_to_numpy=True,
-                show_progress_bar=False
-            )
-
-            # Convert numpy array to list
-            embedding_list = embedding.tolist()
-
-            logger.debug(f"Generated embedding ({len(embedding_list)} dimensions)")
-            return embedding_list
+            logger.info(f"Loading local embedding model: {model_name}")
+            self._embedding_model = SentenceTransformer(model_name)
+            logger.info(f"Model loaded successfully (384D embeddings)")
+
+        embeddings = self._embedding_model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        self.stats['embeddings_generated'] += len(texts)
+        return list(embeddings)
 
-        except ImportError as e:
-            logger.error(f"sentence-transformers not installed: {e}")
-            logger.info("Install with: pip install sentence-transformers")
-            return None
+    def get_embedding(self, text: str) -> Optional[List[float]]:
+        """Generate a single embedding (kept for ad-hoc use; indexing goes through get_embeddings)"""
+        try:
+            return self.get_embeddings([text])[0].tolist()
         except Exception as e:
             logger.error(f"Failed to generate embedding: {e}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
             return None
 
     def generate_chunk_id(self, text: str, source_file: str) -> str:
-        """Generate unique ID for chunk"""
-        content = f"{source_file}:{text[:100]}"
-        return hashlib.sha256(content.encode()).hexdigest()
+        """Content-addressed chunk ID (full text, so edits produce a new ID)"""
+        from services.rag.indexing_pipeline import content_id
+
+        return content_id(text, source_file)
 
-    def process_markdown_file(self, file_path: Path) -> List[Dict]:
-        """Process markdown file into chunks"""
-        logger.info(f"Processing markdown: {file_path.name}")
+    def read_markdown_file(self, file_path: Path) -> Optional[str]:
+        """Read markdown file; IncrementalChunker re-chunks only its edited sections"""
+        logger.info(f"Reading markdown: {file_path.name}")
 
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # Simple paragraph-based chunking
-            chunks = []
-            paragraphs = [p.strip() for p in content.split('\n\n') if p.strip()]
-
-            for i, paragraph in enumerate(paragraphs):
-                # Skip very short paragraphs
-                if len(paragraph) < 50:
-                    continue
-
-                # Determine priority based on content
-                priority = 0.7  # Default
-                chunk_type = 'general'
-
-                text_lower = paragraph.lower()
-
-                # Critical content detection
-                if any(term in text_lower for term in ['dosagem', 'dose', 'mg', 'comprimido']):
-                    priority = 1.0
-                    chunk_type = 'dosage'
-                elif any(term in text_lower for term in ['contraindicação', 'efeito colateral', 'reação adversa']):
-                    priority = 0.95
-                    chunk_type = 'safety'
-                elif any(term in text_lower for term in ['protocolo', 'procedimento', 'roteiro']):
-                    priority = 0.85
-                    chunk_type = 'protocol'
-
-                chunks.append({
-                    'text': paragraph,
-                    'chunk_type': chunk_type,
-                    'priority': priority,
-                    'source_file': file_path.name,
-                    'metadata': {
-                        'section': f'paragraph_{i}',
-                        'word_count': len(paragraph.split()),
-                        'source_type': 'markdown'
-                    }
-                })
-
-            logger.info(f"Extracted {len(chunks)} chunks from {file_path.name}")
-            return chunks
+                return f.read()
 
         except Exception as e:
             logger.error(f"Error processing {file_path}: {e}")
             self.stats['errors'].append(f"{file_path.name}: {str(e)}")
-            return []
+            return None
 
-    def process_json_file(self, file_path: Path, chunk_type: str, priority: float) -> List[Dict]:
-        """Process JSON file into chunks"""
+    def process_json_file(self, file_path: Path, chunk_type: str, priority: float) -> List[Any]:
+        """Process JSON file into pipeline chunks"""
         logger.info(f"Processing JSON: {file_path.name}")
 
         try:
+            from services.rag.indexing_pipeline import PipelineChunk
+
             with open(file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
 
@@ -378,18 +390,18 @@ class KnowledgeBaseIndexer:
                         refined_type = 'safety'
                         refined_priority = min(1.0, priority + 0.05)
 
-                    chunks.append({
-                        'text': text,
-                        'chunk_type': refined_type,
-                        'priority': refined_priority,
-                        'source_file': file_path.name,
-                        'metadata': {
+                    chunks.append(PipelineChunk(
+                        text=text,
+                        chunk_type=refined_type,
+                        priority=refined_priority,
+                        source_file=file_path.name,
+                        metadata={
                             'section': path,
                             'word_count': len(text.split()),
                             'source_type': 'json',
                             'original_type': chunk_type
                         }
-                    })
+                    ))
 
             extract_text_recursive(data)
 
@@ -401,61 +413,6 @@ class KnowledgeBaseIndexer:
             self.stats['errors'].append(f"{file_path.name}: {str(e)}")
             return []
 
-    def index_chunk(self, chunk: Dict) -> bool:
-        """Index a single chunk into vector store"""
-        try:
-            # Generate unique ID
-            doc_id = self.generate_chunk_id(chunk['text'], chunk['source_file'])
-
-            # Check if already indexed (unless force reindex)
-            if not self.force_reindex and not self.dry_run:
-                existing = self.vector_store.get_document(doc_id)
-                if existing:
-                    logger.debug(f"Chunk {doc_id[:8]} already indexed, skipping")
-                    return True
-
-            # Generate embedding
-            if self.dry_run:
-                logger.info(f"[DRY RUN] Would index: {chunk['source_file']} - {chunk['chunk_type']}")
-                embedding = [0.0] * 1536  # Dummy embedding for dry run
-            else:
-                embedding = self.get_embedding(chunk['text'])
-                if not embedding:
-                    logger.error(f"Failed to generate embedding for chunk {doc_id[:8]}")
-                    return False
-
-                self.stats['embeddings_generated'] += 1
-
-            # Create vector document
-            import numpy as np
-
-            vector_doc = self.VectorDocument(
-                id=doc_id,
-                text=chunk['text'],
-                embedding=np.array(embedding) if embedding else None,
-                metadata=chunk['metadata'],
-                chunk_type=chunk['chunk_type'],
-                priority=chunk['priority'],
-                source_file=chunk['source_file'],
-                created_at=datetime.now(timezone.utc)
-            )
-
-            # Add to vector store
-            if self.dry_run:
-                logger.debug(f"[DRY RUN] Would add document: {doc_id[:8]}")
-                return True
-            else:
-                success = self.vector_store.add_document(vector_doc)
-                if success:
-                    self.stats['documents_indexed'] += 1
-                    logger.debug(f"Indexed: {doc_id[:8]} - {chunk['chunk_type']} (priority: {chunk['priority']:.2f})")
-                return success
-
-        except Exception as e:
-            logger.error(f"Error indexing chunk: {e}")
-            self.stats['errors'].append(f"Indexing error: {str(e)}")
-            return False
-
     def index_all_files(self) -> bool:
         """Index all knowledge base files"""
         logger.info("Starting knowledge base indexing...")
@@ -463,14 +420,21 @@ class KnowledgeBaseIndexer:
         if not self.validate_environment():
             return False
 
+        change_sets = []
         all_chunks = []
 
-        # Process markdown files
-        logger.info("Processing markdown files...")
-        md_files = list(self.kb_dir.glob("*.md"))
+        # Re-chunk markdown files section by section against the saved chunk state
+        logger.info("Chunking markdown files...")
+        md_files = sorted(self.kb_dir.glob("*.md"))
         for md_file in md_files:
-            chunks = self.process_markdown_file(md_file)
-            all_chunks.extend(chunks)
+            content = self.read_markdown_file(md_file)
+            if content is not None:
+                change_set = self.incremental_chunker.rechunk(
+                    content, md_file.name, use_saved_state=not self.force_reindex)
+                change_sets.append(change_set)
+                logger.info(f"{md_file.name}: {change_set.sections_rechunked}/{change_set.sections_total} sections "
+                            f"re-chunked, {len(change_set.to_embed)} new chunks, "
+                            f"{len(change_set.to_delete)} to delete")
             self.stats['files_processed'] += 1
 
         # Process JSON files with metadata
@@ -496,26 +460,51 @@ class KnowledgeBaseIndexer:
             else:
                 logger.warning(f"JSON file not found: {filename}")
 
-        self.stats['chunks_created'] = len(all_chunks)
-
-        # Index all chunks
-        logger.info(f"Indexing {len(all_chunks)} chunks...")
-
-        success_count = 0
-        failed_count = 0
-
-        for i, chunk in enumerate(all_chunks):
-            if i % 50 == 0:
-                logger.info(f"Progress: {i}/{len(all_chunks)} chunks processed")
-
-            if self.index_chunk(chunk):
-                success_count += 1
-            else:
-                failed_count += 1
-
-            # Rate limiting - avoid overwhelming API
-            if not self.dry_run and i % 10 == 0:
-                time.sleep(0.5)
+        # Chunk -> embed -> upsert, skipping chunks already in the manifest
+        from services.rag.indexing_pipeline import IndexingPipeline
+
+        pipeline = IndexingPipeline(
+            self.vector_store,
+            self.get_embeddings,
+            self.VectorDocument,
+            manifest_path=self.manifest_path,
+            batch_size=self.batch_size,
+            chunk_workers=self.workers,
+            embed_workers=self.workers,
+            force=self.force_reindex,
+            dry_run=self.dry_run,
+            on_indexed=self.index_lexical_chunks,
+            on_deleted=self.remove_lexical_chunks
+        )
+        logger.info(f"Indexing {len(change_sets)} markdown documents + {len(all_chunks)} JSON chunks "
+                    f"(manifest: {pipeline.manifest_path}, {len(pipeline.manifest)} chunks already indexed)")
+        report = pipeline.run(chunks=all_chunks, change_sets=change_sets)
+
+        # Chunk state only advances once its changes reached the vector store
+        if not self.dry_run and not report['errors'] and report['failed'] == 0:
+            for change_set in change_sets:
+                self.incremental_chunker.commit(change_set)
+
+        if not self.dry_run:
+            current = all_chunks + [chunk for change_set in change_sets
+                                    for chunk in pipeline.change_set_chunks(change_set)]
+            # Rows stored under the old 100-character id next to the current one
+            if self.drop_legacy_ids and not report['errors']:
+                self.stats['legacy_ids_deleted'] = pipeline.drop_legacy_ids(current)
+            # Unchanged chunks skipped by the manifest but missing from the lexical
+            # index (indexed before it was fed by the pipeline)
+            self.index_lexical_chunks([chunk for chunk in current
+                                       if chunk.id in pipeline.manifest and chunk.id not in self.lexical_index])
+            self.save_lexical_index()
+
+        self.stats['chunks_created'] = report['chunks']
+        self.stats['chunks_skipped'] = report['skipped']
+        self.stats['documents_indexed'] = report['indexed']
+        self.stats['documents_deleted'] = report['deleted']
+        self.stats['stages'] = report['stages']
+        self.stats['errors'].extend(report['errors'])
+        failed_count = report['failed']
+        success_count = report['indexed'] + report['skipped']
 
         # Final statistics
         self.stats['end_time'] = datetime.now()
@@ -528,7 +517,14 @@ class KnowledgeBaseIndexer:
         logger.info(f"Chunks created: {self.stats['chunks_created']}")
         logger.info(f"Embeddings generated: {self.stats['embeddings_generated']}")
         logger.info(f"Documents indexed: {self.stats['documents_indexed']}")
-        logger.info(f"Success rate: {success_count}/{len(all_chunks)} ({100*success_count/len(all_chunks):.1f}%)")
+        logger.info(f"Unchanged (skipped): {self.stats['chunks_skipped']}")
+        logger.info(f"Replaced/removed (deleted): {self.stats['documents_deleted']}")
+        logger.info(f"Legacy ids deleted: {self.stats['legacy_ids_deleted']}")
+        for stage, stage_stats in self.stats['stages'].items():
+            logger.info(f"Stage {stage}: {stage_stats['chunks']} chunks, {stage_stats['chunks_per_second']} chunks/s "
+                        f"({stage_stats['workers']} workers)")
+        total = max(1, self.stats['chunks_created'])
+        logger.info(f"Success rate: {success_count}/{self.stats['chunks_created']} ({100*success_count/total:.1f}%)")
         logger.info(f"Duration: {duration}")
         logger.info(f"Errors: {len(self.stats['errors'])}")
 
@@ -540,7 +536,7 @@ class KnowledgeBaseIndexer:
         # Save report
         self.save_report()
 
-        return failed_count == 0
+        return failed_count == 0 and not report['errors']
 
     def save_report(self):
         """Save indexing report"""
@@ -556,8 +552,9 @@ class KnowledgeBaseIndexer:
                 'config': {
                     'force_reindex': self.force_reindex,
                     'dry_run': self.dry_run,
-                    'supabase_url': self.config.SUPABASE_URL,
-                    'embedding_model': 'openai/text-embedding-3-small'
+                    'supabase_url': None if self.local_path else self.config.SUPABASE_URL,
+                    'local_path': self.local_path,
+                    'embedding_model': 'intfloat/multilingual-e5-small'
                 }
             }
 
@@ -581,7 +578,7 @@ class KnowledgeBaseIndexer:
             logger.info(f"  Documents: {stats.get('supabase_documents', 0)}")
             logger.info(f"  Connected: {stats.get('supabase_connected', False)}")
 
-            doc_count = stats.get('supabase_documents', 0)
+            doc_count = stats.get('supabase_documents', stats.get('total_documents', 0))
 
             if doc_count == 0:
                 logger.error("Verification failed: No documents in vector store")
@@ -604,6 +601,12 @@ def main():
     parser = argparse.ArgumentParser(description='Index knowledge base into Supabase')
     parser.add_argument('--force', action='store_true', help='Force reindex existing documents')
     parser.add_argument('--dry-run', action='store_true', help='Dry run without actually indexing')
+    parser.add_argument('--workers', type=int, default=None, help='Threads per chunk/embed stage (INDEXING_*_WORKERS)')
+    parser.add_argument('--batch-size', type=int, default=None, help='Chunks per embedding batch (EMBEDDING_BATCH_SIZE)')
+    parser.add_argument('--manifest', default=None, help='Checkpoint manifest path (INDEXING_MANIFEST_PATH)')
+    parser.add_argument('--local', default=None, metavar='PATH', help='Index into a LocalVectorStore at PATH (offline)')
+    parser.add_argument('--drop-legacy-ids', action='store_true',
+                        help='Delete rows stored under the old 100-character chunk id (implied by --force)')
 
     args = parser.parse_args()
 
@@ -614,7 +617,12 @@ def main():
     try:
         indexer = KnowledgeBaseIndexer(
             force_reindex=args.force,
-            dry_run=args.dry_run
+            dry_run=args.dry_run,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            manifest_path=args.manifest,
+            local_path=args.local,
+            drop_legacy_ids=args.drop_legacy_ids
         )
 
         # Index all files
@@ -13,7 +13,6 @@ import logging
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timezone
-import hashlib
 
 # Configurar encoding para Windows
 if os.name == 'nt':
@@ -29,6 +28,7 @@ from app_config import config
 from services.rag.medical_chunking import MedicalChunker, ChunkPriority
 from services.integrations.supabase_vector_store import SupabaseVectorStore, VectorDocument
 from services.rag.embedding_service import get_embedding_service
+from services.rag.indexing_pipeline import content_id, legacy_chunk_id
 
 # Setup logging
 logging.basicConfig(
@@ -108,6 +108,7 @@ class JSONToSupabaseMigrator:
             "chunks_created": 0,
             "embeddings_generated": 0,
             "documents_indexed": 0,
+            "legacy_documents_deleted": 0,
             "errors": [],
             "start_time": datetime.now(),
             "end_time": None
@@ -281,10 +282,8 @@ class JSONToSupabaseMigrator:
         return base_priority
     
     def generate_document_id(self, text: str, source_file: str) -> str:
-        """Gera ID único para documento"""
-        content = f"{source_file}:{text[:100]}"
-        # SHA-256 para IDs de documento (não dados sensíveis)
-        return hashlib.sha256(content.encode()).hexdigest()
+        """Gera ID único para documento (mesmo id do pipeline de indexação)"""
+        return content_id(text, source_file)
     
     def migrate_file(self, filename: str) -> bool:
         """Migra um arquivo JSON específico"""
@@ -305,6 +304,7 @@ class JSONToSupabaseMigrator:
         
         # Processar chunks e criar documentos
         success_count = 0
+        current_ids = {self.generate_document_id(chunk["text"], filename) for chunk in chunks}
         
         for chunk in chunks:
             try:
@@ -339,6 +339,10 @@ class JSONToSupabaseMigrator:
                 if self.vector_store.add_document(vector_doc):
                     success_count += 1
                     self.migration_stats["documents_indexed"] += 1
+                    # Linha de uma migração anterior com o id antigo (100 primeiros caracteres)
+                    legacy_id = legacy_chunk_id(chunk["text"], filename)
+                    if legacy_id not in current_ids and self.vector_store.delete_document(legacy_id):
+                        self.migration_stats["legacy_documents_deleted"] += 1
                 else:
                     logger.warning(f"[WARNING] Falha ao adicionar documento {doc_id[:8]} ao vector store")
                 
@@ -383,6 +387,7 @@ class JSONToSupabaseMigrator:
         logger.info(f"[NOTE] Chunks criados: {self.migration_stats['chunks_created']}")
         logger.info(f"🧠 Embeddings gerados: {self.migration_stats['embeddings_generated']}")
         logger.info(f"[SAVE] Documentos indexados: {self.migration_stats['documents_indexed']}")
+        logger.info(f"[FIX] Ids antigos removidos: {self.migration_stats['legacy_documents_deleted']}")
         logger.info(f"⏱️ Duração: {duration}")
         logger.info(f"[ERROR] Erros: {len(self.migration_stats['errors'])}")
         